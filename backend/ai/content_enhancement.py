@@ -133,7 +133,7 @@ class ContentAnalyzer:
         """分析内容质量"""
         try:
             # 获取模型进行质量分析
-            manager = await model_manager
+            manager = model_manager
             model_id = await manager.get_best_model(TaskType.ANALYSIS)
 
             if not model_id:
@@ -145,7 +145,9 @@ class ContentAnalyzer:
             # 调用AI分析
             from backend.core.ai_service import ai_manager
             service = await ai_manager.get_service("openrouter")
-            response = await service.generate_response(analysis_prompt, model=model_id)
+            response = await manager.invoke_model(
+                model_id, lambda model: service.generate_response(analysis_prompt, model=model)
+            )
 
             # 解析AI响应
             return self._parse_quality_response(response, content)
@@ -276,7 +278,7 @@ class ContentSummarizer:
     ) -> ContentSummary:
         """生成内容摘要"""
         try:
-            manager = await model_manager
+            manager = model_manager
             model_id = await manager.get_best_model(TaskType.SUMMARIZATION)
 
             if not model_id:
@@ -288,7 +290,9 @@ class ContentSummarizer:
             # 调用AI生成摘要
             from backend.core.ai_service import ai_manager
             service = await ai_manager.get_service("openrouter")
-            response = await service.generate_response(summary_prompt, model=model_id)
+            response = await manager.invoke_model(
+                model_id, lambda model: service.generate_response(summary_prompt, model=model)
+            )
 
             # 解析摘要响应
             return self._parse_summary_response(response, content)
@@ -470,7 +474,7 @@ class ContentEnhancer:
     ) -> str:
         """生成增强内容"""
         try:
-            manager = await model_manager
+            manager = model_manager
             model_id = await manager.get_best_model(TaskType.CREATIVE)
 
             if not model_id:
@@ -484,7 +488,9 @@ class ContentEnhancer:
             # 调用AI增强
             from backend.core.ai_service import ai_manager
             service = await ai_manager.get_service("openrouter")
-            response = await service.generate_response(enhancement_prompt, model=model_id)
+            response = await manager.invoke_model(
+                model_id, lambda model: service.generate_response(enhancement_prompt, model=model)
+            )
 
             # 提取增强内容
             return self._extract_enhanced_content(response)
@@ -8,16 +8,16 @@ import time
 import json
 import statistics
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Callable, Awaitable, Set
 from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
 from abc import ABC, abstractmethod
 
 from backend.config.settings import get_settings
-from backend.core.ai_service import AIServiceManager
+from backend.core.ai_service import AIServiceManager, GeminiService
 from backend.core.openrouter_service import OpenRouterService
-from backend.core.providers.gemini_service import GeminiService
+from backend.core.resilience import UpstreamGuard, UpstreamPermit, UpstreamUnavailable
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -256,7 +256,8 @@ class ModelSelector:
         candidates = []
         for model in self.model_manager.models.values():
             if (model.status == ModelStatus.ACTIVE and
-                task_type in model.capabilities.supported_tasks):
+                task_type in model.capabilities.supported_tasks and
+                self.model_manager.upstream_guard.is_routable(model.model_id)):
                 candidates.append(model)
         return candidates
 
@@ -312,6 +313,8 @@ class ModelManager:
         self.performance_tracker = ModelPerformanceTracker()
         self.model_selector = ModelSelector(self)
         self.ai_service_manager = AIServiceManager()
+        # 按模型的熔断/摘除与自适应并发，按提供商共享并发上限
+        self.upstream_guard = UpstreamGuard()
         self._load_default_models()
 
     def _load_default_models(self):
@@ -399,7 +402,7 @@ class ModelManager:
                     cost_per_input_token=0.00025,
                     cost_per_output_token=0.0005,
                     strengths=["多语言支持", "谷歌生态", "稳定可靠"],
-                    weaknesses ["成本较高", "上下文限制"]
+                    weaknesses=["成本较高", "上下文限制"]
                 ),
                 metrics=ModelMetrics(model_id="gemini-pro"),
                 priority=5,
@@ -426,27 +429,139 @@ class ModelManager:
         )
         return model.model_id if model else None
 
-    async def get_fallback_model(self, primary_model_id: str) -> Optional[str]:
-        """获取备用模型"""
-        primary_model = self.models.get(primary_model_id)
-        if not primary_model:
-            return None
-
+    async def get_fallback_model(self, primary_model_id: str,
+                                 exclude: Optional[Set[str]] = None) -> Optional[str]:
+        """获取备用模型（跳过熔断/摘除中的模型，优先选择仍有并发余量的）"""
+        candidate = self._select_fallback(primary_model_id, exclude)
+        return candidate.model_id if candidate else None
+
+    def _select_fallback(self, primary_model_id: str, exclude: Optional[Set[str]] = None,
+                         tasks: Optional[List[TaskType]] = None) -> Optional[AIModel]:
+        if tasks is None:
+            primary_model = self.models.get(primary_model_id)
+            if not primary_model:
+                return None
+            tasks = primary_model.capabilities.supported_tasks
+
+        exclude = exclude or set()
+        guard = self.upstream_guard
         # 寻找同类型的备用模型
         fallback_candidates = [
             model for model in self.models.values()
             if (model.model_id != primary_model_id and
+                model.model_id not in exclude and
                 model.is_fallback and
                 model.status == ModelStatus.ACTIVE and
-                any(task in model.capabilities.supported_tasks
-                    for task in primary_model.capabilities.supported_tasks))
+                guard.is_routable(model.model_id) and
+                any(task in model.capabilities.supported_tasks for task in tasks))
         ]
 
         if fallback_candidates:
-            return max(fallback_candidates, key=lambda m: m.priority).model_id
+            return max(
+                fallback_candidates,
+                key=lambda m: (guard.has_capacity(m.model_id, m.provider.value), m.priority)
+            )
 
         return None
 
+    def acquire_model(self, model_id: str, allow_fallback: bool = True,
+                      provider: Optional[str] = None) -> Tuple[str, UpstreamPermit]:
+        """获取模型调用许可
+
+        模型熔断、被摘除或达到并发上限时立即转到备用模型，而不是排队等待；
+        全部不可用时抛出UpstreamUnavailable。未注册的模型需给出provider，按模型名单独保护，
+        过载时转到支持对话的备用模型。
+        """
+        tried: Set[str] = set()
+        model = self.models.get(model_id)
+        if model is None and provider is None:
+            raise UpstreamUnavailable(model_id, "unknown_model")
+        tasks = model.capabilities.supported_tasks if model else [TaskType.CHAT]
+        key, group = model_id, model.provider.value if model else provider
+
+        while key is not None:
+            tried.add(key)
+            permit = self.upstream_guard.try_acquire(key, group)
+            if permit is not None:
+                if key != model_id:
+                    logger.warning(f"Model {model_id} shed, routed to fallback {key}")
+                return key, permit
+            if not allow_fallback:
+                break
+            candidate = self._select_fallback(model_id, tried, tasks)
+            key, group = (candidate.model_id, candidate.provider.value) if candidate else (None, None)
+
+        raise UpstreamUnavailable(model_id, "no_capacity")
+
+    async def invoke_model(self, model_id: str, call: Callable[[str], Awaitable[Any]],
+                           allow_fallback: bool = True) -> Any:
+        """在并发/熔断保护下调用模型，失败或过载时使用备用模型
+
+        call接收实际选中的模型ID。
+        """
+        selected, permit = self.acquire_model(model_id, allow_fallback)
+        try:
+            async with permit:
+                return await call(selected)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            if not allow_fallback:
+                raise
+            fallback = await self.get_fallback_model(selected, exclude={model_id, selected})
+            if not fallback:
+                raise
+            logger.warning(f"Model {selected} failed ({e}), trying fallback {fallback}")
+            selected, permit = self.acquire_model(fallback, allow_fallback=False)
+            async with permit:
+                return await call(selected)
+
+    def _upstream_key(self, model: str) -> str:
+        """聊天接口的模型名对应的保护键：已注册模型按ID或OpenRouter名称的最后一段匹配"""
+        short_name = model.rsplit('/', 1)[-1]
+        return model if model in self.models or short_name not in self.models else short_name
+
+    def _upstream_target(self, key: str, service: str, model: str) -> Tuple[str, str]:
+        """选中的保护键对应的(服务, 模型)"""
+        if key == self._upstream_key(model):
+            return service, model
+        fallback = self.models[key]
+        return fallback.provider.value, fallback.model_id
+
+    def acquire_upstream(self, service: str, model: str) -> Tuple[str, str, UpstreamPermit]:
+        """按聊天接口指定的服务和模型获取调用许可，返回实际使用的(服务, 模型, 许可)
+
+        流式响应应在整个流结束后再释放许可。
+        """
+        key, permit = self.acquire_model(self._upstream_key(model), provider=service)
+        return (*self._upstream_target(key, service, model), permit)
+
+    async def invoke_upstream(self, service: str, model: str,
+                              call: Callable[[str, str], Awaitable[Any]]) -> Any:
+        """在并发/熔断保护下调用聊天接口指定的服务和模型，失败或过载时使用备用模型
+
+        call接收实际使用的服务名和模型名。
+        """
+        primary = self._upstream_key(model)
+        selected, permit = self.acquire_model(primary, provider=service)
+        try:
+            async with permit:
+                return await call(*self._upstream_target(selected, service, model))
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            fallback = self._select_fallback(selected, {primary, selected}, [TaskType.CHAT])
+            if not fallback:
+                raise
+            logger.warning(f"Model {selected} failed ({e}), trying fallback {fallback.model_id}")
+            selected, permit = self.acquire_model(fallback.model_id, allow_fallback=False)
+            async with permit:
+                return await call(fallback.provider.value, fallback.model_id)
+
+    def get_upstream_status(self) -> Dict[str, Any]:
+        """模型熔断、摘除和并发上限状态"""
+        return self.upstream_guard.get_stats()
+
     def record_model_usage(
         self,
         model_id: str,
@@ -578,12 +693,14 @@ def with_model_selection(task_type: TaskType):
             if not model_id:
                 raise ValueError(f"No suitable model found for task: {task_type}")
 
-            # 将模型ID添加到参数中
+            # 获取调用许可，过载时转到备用模型
+            model_id, permit = manager.acquire_model(model_id)
             kwargs['selected_model'] = model_id
 
+            start_time = time.time()
             try:
-                start_time = time.time()
-                result = await func(*args, **kwargs)
+                async with permit:
+                    result = await func(*args, **kwargs)
                 response_time = time.time() - start_time
 
                 # 记录成功使用
@@ -616,8 +733,10 @@ def with_model_selection(task_type: TaskType):
                 fallback_model = await manager.get_fallback_model(model_id)
                 if fallback_model:
                     logger.warning(f"Primary model {model_id} failed, trying fallback {fallback_model}")
+                    fallback_model, fallback_permit = manager.acquire_model(fallback_model, allow_fallback=False)
                     kwargs['selected_model'] = fallback_model
-                    return await func(*args, **kwargs)
+                    async with fallback_permit:
+                        return await func(*args, **kwargs)
                 else:
                     raise
 
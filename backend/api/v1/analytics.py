@@ -106,7 +106,8 @@ class MetricsQueryRequest(BaseModel):
     metric_ids: Optional[List[str]] = Field(None, description="指标ID列表")
     start_time: Optional[datetime] = Field(None, description="开始时间")
     end_time: Optional[datetime] = Field(None, description="结束时间")
-    aggregation_period: Optional[str] = Field(None, description="聚合周期")
+    aggregation_period: Optional[str] = Field(None, description="聚合周期（1m/5m/15m/1h/1d，auto按范围自动选择）")
+    max_points: int = Field(1000, ge=10, le=10000, description="auto分辨率下每个序列的最大点数")
 
 
 class DashboardSummaryResponse(BaseModel):
@@ -487,7 +488,8 @@ async def query_metrics(
             request.metric_ids,
             request.start_time,
             request.end_time,
-            request.aggregation_period
+            request.aggregation_period,
+            request.max_points
         )
 
         # 转换为响应格式
@@ -523,7 +525,8 @@ async def query_metrics(
                 "metric_ids": request.metric_ids,
                 "start_time": request.start_time.isoformat() if request.start_time else None,
                 "end_time": request.end_time.isoformat() if request.end_time else None,
-                "aggregation_period": request.aggregation_period
+                "aggregation_period": request.aggregation_period,
+                "max_points": request.max_points
             },
             "total_count": len(results)
         }
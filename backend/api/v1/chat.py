@@ -7,9 +7,11 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 import json
+from backend.ai.model_manager import model_manager
 from backend.core.ai_service import ai_manager
 from backend.core.cost_tracker import ServiceType
 from backend.core.session_manager import MessageRole
+from backend.core.resilience import Outcome, UpstreamUnavailable
 from backend.core.web_search import web_search_service
 from backend.config.settings import get_settings
 import re
@@ -133,9 +135,6 @@ async def chat(request: ChatRequest):
             session = await ai_manager.session_manager.create_session()
             session_id = session.id
         
-        # 获取AI服务
-        service = await ai_manager.get_service(request.service)
-        
         # 保存用户消息
         await ai_manager.session_manager.add_message(
             session_id=session_id,
@@ -168,16 +167,22 @@ async def chat(request: ChatRequest):
             "max_tokens": request.max_tokens
         }
         
-        if request.service == "openrouter":
-            response = await service.generate_response(prompt, request.model, **kwargs)
-        else:
-            response = await service.generate_response(prompt)
+        async def generate_with(service_name: str, model: str):
+            service = await ai_manager.get_service(service_name)
+            if service_name == "openrouter":
+                return service_name, model, await service.generate_response(prompt, model, **kwargs)
+            return service_name, model, await service.generate_response(prompt)
+        
+        # 在模型的并发/熔断保护下调用，过载或失败时转到备用模型
+        service_name, model_name, response = await model_manager.invoke_upstream(
+            request.service, request.model, generate_with
+        )
         
         # 跟踪成本和使用情况
-        service_type = ServiceType.OPENROUTER if request.service == "openrouter" else ServiceType.GEMINI
+        service_type = ServiceType.OPENROUTER if service_name == "openrouter" else ServiceType.GEMINI
         usage_record = await ai_manager.cost_tracker.track_usage(
             service=service_type,
-            model=request.model,
+            model=model_name,
             input_text=prompt,
             output_text=response,
             request_id=f"chat_{session_id}"
@@ -188,13 +193,13 @@ async def chat(request: ChatRequest):
             session_id=session_id,
             role=MessageRole.ASSISTANT,
             content=response,
-            model=f"{request.service}:{request.model}",
+            model=f"{service_name}:{model_name}",
             usage=usage_record.to_dict()
         )
         
         return ChatResponse(
             message=response,
-            model=f"{request.service}:{request.model}",
+            model=f"{service_name}:{model_name}",
             session_id=session_id,
             usage={
                 "prompt_tokens": usage_record.input_tokens,
@@ -204,6 +209,8 @@ async def chat(request: ChatRequest):
             }
         )
         
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -220,9 +227,6 @@ async def chat_stream(request: ChatRequest):
             session = await ai_manager.session_manager.create_session()
             session_id = session.id
         
-        # 获取AI服务
-        service = await ai_manager.get_service(request.service)
-        
         # 保存用户消息
         await ai_manager.session_manager.add_message(
             session_id=session_id,
@@ -248,6 +252,9 @@ async def chat_stream(request: ChatRequest):
         # 检查是否需要联网搜索并增强提示词
         prompt = await augment_with_search(prompt)
         
+        # 获取模型调用许可（过载或熔断时转到备用模型），整个流结束后才释放
+        service_name, model_name, permit = model_manager.acquire_upstream(request.service, request.model)
+        
         async def generate():
             """流式响应生成器"""
             accumulated_response = ""
@@ -257,25 +264,27 @@ async def chat_stream(request: ChatRequest):
                     "max_tokens": request.max_tokens
                 }
                 
-                if request.service == "openrouter":
-                    stream_iter = service.stream_response(prompt, request.model, **kwargs)
+                service = await ai_manager.get_service(service_name)
+                if service_name == "openrouter":
+                    stream_iter = service.stream_response(prompt, model_name, **kwargs)
                 else:
                     stream_iter = service.stream_response(prompt)
-                    
-                async for chunk in stream_iter:
-                    accumulated_response += chunk
-                    data = {
-                        "type": "content",
-                        "content": chunk,
-                        "model": f"{request.service}:{request.model}"
-                    }
-                    yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+                
+                async with permit:
+                    async for chunk in stream_iter:
+                        accumulated_response += chunk
+                        data = {
+                            "type": "content",
+                            "content": chunk,
+                            "model": f"{service_name}:{model_name}"
+                        }
+                        yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
                 
                 # 跟踪成本和使用情况
-                service_type = ServiceType.OPENROUTER if request.service == "openrouter" else ServiceType.GEMINI
+                service_type = ServiceType.OPENROUTER if service_name == "openrouter" else ServiceType.GEMINI
                 usage_record = await ai_manager.cost_tracker.track_usage(
                     service=service_type,
-                    model=request.model,
+                    model=model_name,
                     input_text=prompt,
                     output_text=accumulated_response,
                     request_id=f"stream_{session_id}"
@@ -286,7 +295,7 @@ async def chat_stream(request: ChatRequest):
                     session_id=session_id,
                     role=MessageRole.ASSISTANT,
                     content=accumulated_response,
-                    model=f"{request.service}:{request.model}",
+                    model=f"{service_name}:{model_name}",
                     usage=usage_record.to_dict()
                 )
                 
@@ -318,6 +327,9 @@ async def chat_stream(request: ChatRequest):
                     "error": str(e)
                 }
                 yield f"data: {json.dumps(error_data)}\n\n"
+            finally:
+                # 流在进入调用前失败时归还许可
+                permit.release(Outcome.IGNORED)
         
         return StreamingResponse(
             generate(),
@@ -329,6 +341,8 @@ async def chat_stream(request: ChatRequest):
             }
         )
         
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
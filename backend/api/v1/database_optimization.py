@@ -15,6 +15,7 @@ from ..optimization.index_manager import get_index_manager
 from ..optimization.connection_pool import get_connection_pool_manager
 from ..optimization.read_write_split import get_read_write_engine
 from ..optimization.database_health import get_health_monitor
+from ..optimization.prepared_statements import get_statement_registry
 from ..core.security import get_current_user, require_admin_role
 
 logger = logging.getLogger(__name__)
@@ -126,6 +127,28 @@ async def get_slow_queries(
         raise HTTPException(status_code=500, detail=f"Failed to get slow queries: {str(e)}")
 
 
+@router.get("/query/prepared-statements", summary="获取预编译语句耗时报告")
+async def get_prepared_statement_report(
+    current_user: dict = Depends(get_current_user)
+):
+    """按接口汇总具名预编译语句的Python侧耗时（编译等）与数据库执行耗时"""
+    try:
+        report = get_statement_registry().report()
+
+        return {
+            "success": True,
+            "data": report,
+            "meta": {
+                "statement_count": len(report["statements"]),
+                "generated_at": datetime.utcnow().isoformat()
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"Failed to get prepared statement report: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get prepared statement report: {str(e)}")
+
+
 # 索引管理相关API
 @router.get("/indexes/analysis", summary="获取索引分析报告")
 async def get_index_analysis(
@@ -190,8 +213,8 @@ async def generate_index_recommendations(
 async def create_recommended_index(
     table_name: str,
     column_names: List[str],
-    index_type: str = "btree",
     background_tasks: BackgroundTasks,
+    index_type: str = "btree",
     current_user: dict = Depends(require_admin_role)
 ):
     """创建推荐索引"""
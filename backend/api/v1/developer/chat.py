@@ -6,9 +6,11 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.ai.model_manager import model_manager
 from backend.core.database import get_db
 from backend.core.ai_service import ai_manager
 from backend.core.quota_manager import quota_manager
+from backend.core.resilience import Outcome, UpstreamUnavailable
 from backend.middleware.quota_check import check_api_key_and_quota
 
 router = APIRouter(prefix="/developer", tags=["Developer API"])
@@ -57,21 +59,30 @@ async def developer_chat(
     """
     user_id = auth_info["user_id"]
 
-    # 获取AI服务
-    service = await ai_manager.get_service("openrouter")
-
     if request.stream:
+        # 获取模型调用许可（过载或熔断时转到备用模型），整个流结束后才释放
+        try:
+            service_name, model_name, permit = model_manager.acquire_upstream("openrouter", request.model)
+        except UpstreamUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
         # 流式响应
         async def stream_with_quota():
             total_tokens = 0
 
-            async for chunk in service.stream_response(
-                prompt=request.message,
-                model=request.model
-            ):
-                yield f"data: {chunk}\n\n"
-                # 简单估算: 每个chunk约5个token
-                total_tokens += 5
+            try:
+                service = await ai_manager.get_service(service_name)
+                async with permit:
+                    if service_name == "openrouter":
+                        stream_iter = service.stream_response(prompt=request.message, model=model_name)
+                    else:
+                        stream_iter = service.stream_response(prompt=request.message)
+                    async for chunk in stream_iter:
+                        yield f"data: {chunk}\n\n"
+                        # 简单估算: 每个chunk约5个token
+                        total_tokens += 5
+            finally:
+                permit.release(Outcome.IGNORED)
 
             # 消费配额
             await quota_manager.consume_quota(db, user_id, 1)
@@ -84,17 +95,23 @@ async def developer_chat(
         )
     else:
         # 普通响应
-        response = await service.generate_response(
-            prompt=request.message,
-            model=request.model
-        )
+        async def generate_with(service_name: str, model: str):
+            service = await ai_manager.get_service(service_name)
+            if service_name == "openrouter":
+                return model, await service.generate_response(prompt=request.message, model=model)
+            return model, await service.generate_response(prompt=request.message)
+
+        try:
+            model_name, response = await model_manager.invoke_upstream("openrouter", request.model, generate_with)
+        except UpstreamUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
         # 消费配额
         await quota_manager.consume_quota(db, user_id, 1)
 
         return ChatResponse(
             response=response,
-            model=request.model,
+            model=model_name,
             tokens_used=100,  # TODO: 实际计算
             cost=0.001  # TODO: 实际计算
         )
\ No newline at end of file
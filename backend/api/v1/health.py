@@ -2,11 +2,13 @@
 系统健康检查API
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from backend.core.health_service import get_system_health
+from backend.core.health_service import get_system_health, health_service
+from backend.health.probe_cache import liveness
 from backend.core.ai_service import ai_manager
 from backend.core.cache_service import cache_stats, cleanup_expired_cache
 
@@ -40,13 +42,43 @@ class DetailedHealthResponse(BaseModel):
     recommendations: List[str] = Field(..., description="优化建议")
 
 
+@router.get("/health/live")
+async def get_liveness():
+    """
+    存活检查：不访问数据库、Redis或外部服务，供负载均衡器高频探测
+    """
+    return liveness()
+
+
+@router.get("/health/ready")
+async def get_readiness():
+    """
+    就绪检查：只读取后台刷新的缓存结果，不触发探测
+    """
+    snapshot = health_service.probes.snapshot()
+    services = {name: result.status for name, result in snapshot.items()}
+    unhealthy_count = len([s for s in services.values() if s == "unhealthy"])
+    if not services:
+        status = "starting"
+    elif unhealthy_count == 0:
+        status = "ready"
+    elif unhealthy_count <= len(services) / 2:
+        status = "degraded"
+    else:
+        status = "unhealthy"
+    return JSONResponse(
+        status_code=503 if status in ("starting", "unhealthy") else 200,
+        content={"status": status, "services": services, "timestamp": datetime.now().isoformat()}
+    )
+
+
 @router.get("/health", response_model=SystemHealthResponse)
-async def get_health():
+async def get_health(refresh: bool = Query(False, description="忽略缓存重新探测")):
     """
     获取系统健康状态
     """
     try:
-        health_data = await get_system_health()
+        health_data = await get_system_health(force=refresh)
         return SystemHealthResponse(**health_data)
     except Exception as e:
         raise HTTPException(
@@ -148,7 +180,8 @@ async def get_health_metrics():
                 "average_response_time": sum(s["response_time"] for s in system_health["services"]) / len(system_health["services"])
             },
             "cache": cache_stats_data,
-            "performance": system_health["performance_metrics"]
+            "performance": system_health["performance_metrics"],
+            "probes": health_service.probes.get_stats()
         }
     except Exception as e:
         raise HTTPException(
@@ -43,6 +43,14 @@ class Settings(BaseSettings):
         env="DATABASE_URL"
     )
     redis_url: str = Field(default="redis://localhost:6379/0", env="REDIS_URL")
+    db_pool_size: int = Field(default=20, env="DB_POOL_SIZE")  # 连接池常驻连接数（自适应扩缩容的下限）
+    db_max_overflow: int = Field(default=30, env="DB_MAX_OVERFLOW")  # 允许超出常驻连接数的连接数
+    db_pool_timeout: float = Field(default=30.0, env="DB_POOL_TIMEOUT")  # 获取连接的等待超时（秒）
+    db_pool_recycle: int = Field(default=3600, env="DB_POOL_RECYCLE")  # 连接回收时间（秒）
+    db_n_plus_one_threshold: int = Field(default=5, env="DB_N_PLUS_ONE_THRESHOLD")  # 同一语句形状在一个请求内重复多少次判定为疑似N+1
+    db_query_budget: int = Field(default=0, env="DB_QUERY_BUDGET")  # 单个请求的查询预算，超出即报错（测试模式使用，0为不限制）
+    db_compiled_cache_size: int = Field(default=1200, env="DB_COMPILED_CACHE_SIZE")  # SQLAlchemy编译缓存容量（每个引擎）
+    db_prepared_statement_cache_size: int = Field(default=256, env="DB_PREPARED_STATEMENT_CACHE_SIZE")  # asyncpg每个连接缓存的预处理语句数（0为禁用）
     
     # Vector Database (Supabase)
     supabase_url: Optional[str] = Field(default=None, env="SUPABASE_URL")
@@ -92,10 +100,32 @@ class Settings(BaseSettings):
     
     enable_metrics: bool = Field(default=True, env="ENABLE_METRICS")
     metrics_port: int = Field(default=9090, env="METRICS_PORT")
+    metrics_max_series_per_metric: int = Field(default=1000, env="METRICS_MAX_SERIES_PER_METRIC")  # 单个指标的标签组合上限
+    metrics_multiproc_dir: Optional[str] = Field(default=None, env="METRICS_MULTIPROC_DIR")  # 多worker快照目录，/metrics抓取时合并
+    metrics_snapshot_interval: float = Field(default=5.0, env="METRICS_SNAPSHOT_INTERVAL")  # worker写快照间隔（秒）
+    log_parser_worker_enabled: bool = Field(default=False, env="LOG_PARSER_WORKER_ENABLED")  # 日志解析放到独立进程
+    health_probe_refresh_enabled: bool = Field(default=True, env="HEALTH_PROBE_REFRESH_ENABLED")  # 后台刷新健康探针缓存
+    enable_response_compression: bool = Field(default=True, env="ENABLE_RESPONSE_COMPRESSION")  # gzip/brotli响应压缩（含流式）
+    compression_min_size: int = Field(default=1024, env="COMPRESSION_MIN_SIZE")
+    compression_offload_kb: int = Field(default=64, env="COMPRESSION_OFFLOAD_KB")  # 超过此大小的响应体在线程池中压缩
+    trace_sample_rate: float = Field(default=0.1, env="TRACE_SAMPLE_RATE")  # 尾部采样中普通Trace的保留比例
+    trace_slow_threshold_ms: float = Field(default=1000.0, env="TRACE_SLOW_THRESHOLD_MS")  # 超过此耗时的Trace全部保留
+    trace_export_path: Optional[str] = Field(default=None, env="TRACE_EXPORT_PATH")  # OTLP/JSON批量写入的文件
+    trace_export_endpoint: Optional[str] = Field(default=None, env="TRACE_EXPORT_ENDPOINT")  # 本地采集器OTLP/HTTP JSON地址
+    metrics_raw_retention_days: int = Field(default=2, env="METRICS_RAW_RETENTION_DAYS")  # 时序存储原始点保留天数
+    metrics_minute_retention_days: int = Field(default=14, env="METRICS_MINUTE_RETENTION_DAYS")  # 1m汇总保留天数
+    metrics_hour_retention_days: int = Field(default=180, env="METRICS_HOUR_RETENTION_DAYS")  # 1h汇总保留天数
+    metrics_day_retention_days: int = Field(default=1825, env="METRICS_DAY_RETENTION_DAYS")  # 1d汇总保留天数
     
     # Cache Configuration
     cache_ttl: int = Field(default=3600, env="CACHE_TTL")  # 1 hour
     enable_response_cache: bool = Field(default=True, env="ENABLE_RESPONSE_CACHE")
+    cache_memory_budget_mb: int = Field(default=256, env="CACHE_MEMORY_BUDGET_MB")  # 进程级内存缓存总预算
+    redis_max_connections: int = Field(default=50, env="REDIS_MAX_CONNECTIONS")  # 每个Redis地址共享连接池上限
+    cache_invalidation_bus_enabled: bool = Field(default=True, env="CACHE_INVALIDATION_BUS_ENABLED")  # 跨worker本地缓存失效广播
+    cache_warmup_enabled: bool = Field(default=True, env="CACHE_WARMUP_ENABLED")  # 按缓存访问记录预测并预热热点键
+    cache_codec_offload_kb: int = Field(default=64, env="CACHE_CODEC_OFFLOAD_KB")  # 超过此大小的编解码转移到线程池
+    cache_codec_rules: str = Field(default="", env="CACHE_CODEC_RULES")  # 按键前缀选择编解码器，如"api_cache:=structured,smart_cache:=pickle-fast"
     
     # API Rate Limiting
     rate_limit_requests: int = Field(default=1000, env="RATE_LIMIT_REQUESTS")
@@ -110,6 +140,12 @@ class Settings(BaseSettings):
         default="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         env="LOG_FORMAT"
     )
+    log_file: Optional[str] = Field(default=None, env="LOG_FILE")  # 为空时只输出到控制台
+    log_file_max_mb: int = Field(default=100, env="LOG_FILE_MAX_MB")  # 单个日志文件轮转大小
+    log_file_backup_count: int = Field(default=5, env="LOG_FILE_BACKUP_COUNT")
+    log_queue_size: int = Field(default=10000, env="LOG_QUEUE_SIZE")  # 异步日志队列上限，满时丢弃并计数
+    log_sample_burst: int = Field(default=50, env="LOG_SAMPLE_BURST")  # 同一消息每秒全部保留的条数，0为关闭采样
+    log_sample_every: int = Field(default=100, env="LOG_SAMPLE_EVERY")  # 超出后每N条保留1条
     
     # =============================================================================
     # Email Configuration (Optional)
@@ -7,7 +7,7 @@ Metrics Collector Module
 - 定时指标聚合
 - 多数据源整合
 - 指标预处理和清洗
-- 指标存储和缓存
+- 指标存储和缓存（嵌入式时序存储，自动1m/1h/1d降采样和分层保留）
 - 指标质量监控
 """
 
@@ -24,6 +24,7 @@ from collections import defaultdict
 import time
 
 from backend.config.settings import get_settings
+from backend.core.analytics.tsdb import DEFAULT_TIERS, TierConfig, TimeSeriesStore, merge_rollup_rows
 from backend.core.cache.multi_level_cache import cache_manager
 
 settings = get_settings()
@@ -97,10 +98,13 @@ class MetricsCollector:
         self.data_dir.mkdir(parents=True, exist_ok=True)
 
         # 存储路径
-        self.metrics_data_path = self.data_dir / "raw_metrics.jsonl"
-        self.aggregations_path = self.data_dir / "aggregations.jsonl"
+        self.metrics_data_path = self.data_dir / "raw_metrics.jsonl"  # 旧版存储，启动时迁移
         self.definitions_path = self.data_dir / "metric_definitions.json"
 
+        # 时序存储：原始点与1m/1h/1d汇总，各层独立保留期
+        self.tsdb = TimeSeriesStore(self.data_dir / "tsdb", tiers=self._build_tiers())
+        self.flush_interval = 60
+
         # 运行时状态
         self.metric_definitions: Dict[str, MetricDefinition] = {}
         self.collection_tasks: Dict[str, asyncio.Task] = {}
@@ -132,10 +136,13 @@ class MetricsCollector:
             # 加载指标定义
             await self._load_metric_definitions()
 
+            # 迁移旧版JSONL数据
+            await asyncio.to_thread(self._migrate_legacy_metrics)
+
             # 启动数据收集任务
             await self._start_collection_tasks()
 
-            # 启动聚合任务
+            # 启动存储维护任务（汇总在写入时完成）
             await self._start_aggregation_tasks()
 
             self.is_running = True
@@ -173,6 +180,9 @@ class MetricsCollector:
             self.aggregation_tasks.clear()
             self.is_running = False
 
+            # 内存头块写盘
+            await asyncio.to_thread(self.tsdb.flush)
+
             logger.info("Metrics collector stopped")
 
         except Exception as e:
@@ -227,7 +237,8 @@ class MetricsCollector:
         metric_ids: Optional[List[str]] = None,
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None,
-        aggregation_period: Optional[str] = None
+        aggregation_period: Optional[str] = None,
+        max_points: int = 1000
     ) -> List[Union[MetricData, MetricAggregation]]:
         """
         获取指标数据
@@ -236,7 +247,8 @@ class MetricsCollector:
             metric_ids: 指标ID列表
             start_time: 开始时间
             end_time: 结束时间
-            aggregation_period: 聚合周期
+            aggregation_period: 聚合周期（1m/5m/15m/1h/1d；auto按范围和max_points自动选择分辨率）
+            max_points: auto模式下每个序列的最大点数
 
         Returns:
             List[Union[MetricData, MetricAggregation]]: 指标数据列表
@@ -247,6 +259,9 @@ class MetricsCollector:
             if not end_time:
                 end_time = datetime.now()
 
+            if aggregation_period == "auto":
+                aggregation_period = self.resolve_resolution(start_time, end_time, max_points)
+
             # 尝试从缓存获取
             cache_key = f"{self.cache_key_prefix}:query:{hash(str(metric_ids) + str(start_time) + str(end_time) + str(aggregation_period))}"
             cached_result = await cache_manager.get(cache_key)
@@ -282,22 +297,32 @@ class MetricsCollector:
             end_time = datetime.now()
             start_time = self._parse_period(period, end_time)
 
-            metrics = await self.get_metrics([metric_id], start_time, end_time)
-            if not metrics:
+            # 原始层覆盖不到的周期用汇总层计算，避免读取全部原始点
+            tier = "raw" if start_time.timestamp() >= time.time() - self.tsdb.tiers["raw"].retention_seconds else "1h"
+            rows = await asyncio.to_thread(
+                self.tsdb.query, metric_id, start_time.timestamp(), end_time.timestamp(), tier
+            )
+            if not rows:
                 return {}
 
-            values = [metric.value for metric in metrics if isinstance(metric, MetricData)]
-
-            if not values:
-                return {}
+            if tier == "raw":
+                values = [value for series in rows for value in series.values]
+                latest = max(rows, key=lambda series: series.timestamps[-1]).values[-1]
+                count, total, low, high = len(values), sum(values), min(values), max(values)
+            else:
+                count = sum(sum(series.columns[0]) for series in rows)
+                total = sum(sum(series.columns[1]) for series in rows)
+                low = min(min(series.columns[2]) for series in rows)
+                high = max(max(series.columns[3]) for series in rows)
+                latest = max(rows, key=lambda series: series.timestamps[-1]).columns[4][-1]
 
             return {
-                "count": len(values),
-                "sum": sum(values),
-                "avg": sum(values) / len(values),
-                "min": min(values),
-                "max": max(values),
-                "latest": values[-1] if values else 0
+                "count": int(count),
+                "sum": total,
+                "avg": total / count,
+                "min": low,
+                "max": high,
+                "latest": latest
             }
 
         except Exception as e:
@@ -643,77 +668,45 @@ class MetricsCollector:
         return []
 
     async def _start_aggregation_tasks(self):
-        """启动聚合任务"""
-        # 定义聚合周期
-        aggregation_periods = ["1m", "5m", "15m", "1h", "1d"]
-
-        for period in aggregation_periods:
-            task = asyncio.create_task(
-                self._aggregation_loop(period)
-            )
-            self.aggregation_tasks[period] = task
+        """启动存储维护任务"""
+        self.aggregation_tasks["maintenance"] = asyncio.create_task(self._aggregation_loop())
 
-    async def _aggregation_loop(self, period: str):
-        """聚合循环"""
+    async def _aggregation_loop(self):
+        """维护循环：定期将头块写盘并清理过期分区"""
         while self.is_running:
             try:
-                # 计算聚合间隔
-                interval_seconds = self._parse_aggregation_period(period)
-                await asyncio.sleep(interval_seconds)
+                await asyncio.sleep(self.flush_interval)
 
-                # 执行聚合
-                await self._aggregate_metrics(period)
+                # 写盘与保留期清理都是文件IO，放到线程中执行
+                await asyncio.to_thread(self.tsdb.flush)
+                await asyncio.to_thread(self.tsdb.enforce_retention)
 
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                logger.error(f"Error in aggregation loop for period {period}: {e}")
-
-    async def _aggregate_metrics(self, period: str):
-        """聚合指标"""
-        try:
-            # 计算聚合时间窗口
-            end_time = datetime.now()
-            start_time = end_time - timedelta(seconds=self._parse_aggregation_period(period))
-
-            # 获取需要聚合的指标
-            for metric_id, definition in self.metric_definitions.items():
-                if definition.enabled:
-                    await self._aggregate_metric(metric_id, start_time, end_time, period)
-
-        except Exception as e:
-            logger.error(f"Error aggregating metrics for period {period}: {e}")
-
-    async def _aggregate_metric(self, metric_id: str, start_time: datetime, end_time: datetime, period: str):
-        """聚合单个指标"""
-        try:
-            # 获取原始数据
-            raw_metrics = await self._load_raw_metrics([metric_id], start_time, end_time)
-            if not raw_metrics:
-                return
-
-            values = [metric.value for metric in raw_metrics]
-            if not values:
-                return
-
-            # 计算聚合结果
-            aggregation = MetricAggregation(
-                metric_id=metric_id,
-                aggregation_period=period,
-                timestamp=end_time,
-                aggregated_value=self._apply_aggregation_method(values, self.metric_definitions[metric_id].aggregation_method),
-                sample_count=len(values),
-                min_value=min(values),
-                max_value=max(values),
-                avg_value=sum(values) / len(values),
-                sum_value=sum(values)
-            )
-
-            # 保存聚合结果
-            await self._save_aggregation(aggregation)
+                logger.error(f"Error in metrics storage maintenance: {e}")
+
+    def _build_tiers(self) -> Dict[str, TierConfig]:
+        """按配置生成各存储层的保留期"""
+        retention_days = {
+            "raw": settings.metrics_raw_retention_days,
+            "1m": settings.metrics_minute_retention_days,
+            "1h": settings.metrics_hour_retention_days,
+            "1d": settings.metrics_day_retention_days
+        }
+        return {
+            tier: TierConfig(config.step, config.partition_seconds, retention_days[tier] * 86400)
+            for tier, config in DEFAULT_TIERS.items()
+        }
 
-        except Exception as e:
-            logger.error(f"Error aggregating metric {metric_id}: {e}")
+    def resolve_resolution(self, start_time: datetime, end_time: datetime, max_points: int = 1000) -> Optional[str]:
+        """根据查询范围选择分辨率，返回None表示原始数据"""
+        intervals = [d.collection_interval for d in self.metric_definitions.values() if d.enabled]
+        tier = self.tsdb.choose_tier(
+            start_time.timestamp(), end_time.timestamp(), max_points,
+            raw_interval=min(intervals) if intervals else 60
+        )
+        return None if tier == "raw" else tier
 
     def _parse_aggregation_period(self, period: str) -> int:
         """解析聚合周期为秒数"""
@@ -779,30 +772,37 @@ class MetricsCollector:
             return 0.0
 
     async def _save_metric_data(self, metric_data: MetricData):
-        """保存指标数据"""
+        """保存指标数据（写入内存头块，由维护任务定期写盘）"""
         try:
-            # 保存到文件
-            data_dict = asdict(metric_data)
-            data_dict["timestamp"] = metric_data.timestamp.isoformat()
-            data_dict["source"] = metric_data.source.value
-
-            with open(self.metrics_data_path, 'a') as f:
-                f.write(json.dumps(data_dict) + '\n')
+            self.tsdb.append(
+                metric_data.metric_id,
+                metric_data.timestamp.timestamp(),
+                metric_data.value,
+                metric_data.labels
+            )
 
         except Exception as e:
             logger.error(f"Error saving metric data: {e}")
 
-    async def _save_aggregation(self, aggregation: MetricAggregation):
-        """保存聚合结果"""
-        try:
-            data_dict = asdict(aggregation)
-            data_dict["timestamp"] = aggregation.timestamp.isoformat()
+    def _migrate_legacy_metrics(self):
+        """将旧版raw_metrics.jsonl导入时序存储"""
+        if not self.metrics_data_path.exists():
+            return
 
-            with open(self.aggregations_path, 'a') as f:
-                f.write(json.dumps(data_dict) + '\n')
+        migrated = 0
+        with open(self.metrics_data_path, 'r') as f:
+            for line in f:
+                try:
+                    data = json.loads(line.strip())
+                    timestamp = datetime.fromisoformat(data["timestamp"]).timestamp()
+                    self.tsdb.append(data["metric_id"], timestamp, data["value"], data.get("labels"))
+                    migrated += 1
+                except Exception as e:
+                    logger.debug(f"Error parsing metric data line: {e}")
 
-        except Exception as e:
-            logger.error(f"Error saving aggregation: {e}")
+        self.tsdb.flush()
+        self.metrics_data_path.rename(self.metrics_data_path.with_suffix(".jsonl.migrated"))
+        logger.info(f"Migrated {migrated} legacy metric points into TSDB")
 
     async def _update_realtime_cache(self, metric_data: MetricData):
         """更新实时缓存"""
@@ -824,25 +824,25 @@ class MetricsCollector:
     ) -> List[MetricData]:
         """加载原始指标数据"""
         try:
-            if not self.metrics_data_path.exists():
-                return []
+            metric_ids = metric_ids or list(self.tsdb.metric_series)
+            start, end = start_time.timestamp(), end_time.timestamp()
 
             metrics = []
-            with open(self.metrics_data_path, 'r') as f:
-                for line in f:
-                    try:
-                        data = json.loads(line.strip())
-                        timestamp = datetime.fromisoformat(data["timestamp"])
-
-                        if start_time <= timestamp <= end_time:
-                            if not metric_ids or data["metric_id"] in metric_ids:
-                                data["timestamp"] = timestamp
-                                data["source"] = MetricSource(data["source"])
-                                metrics.append(MetricData(**data))
-                    except Exception as e:
-                        logger.debug(f"Error parsing metric data line: {e}")
-                        continue
-
+            for metric_id in metric_ids:
+                definition = self.metric_definitions.get(metric_id)
+                rows = await asyncio.to_thread(self.tsdb.query, metric_id, start, end, "raw")
+                for series in rows:
+                    for timestamp, value in zip(series.timestamps, series.values):
+                        metrics.append(MetricData(
+                            metric_id=metric_id,
+                            timestamp=datetime.fromtimestamp(timestamp / 1000),
+                            value=value,
+                            labels=series.labels,
+                            source=definition.source if definition else MetricSource.BUSINESS_LOGIC,
+                            quality_score=self._calculate_data_quality(value, definition) if definition else 1.0
+                        ))
+
+            metrics.sort(key=lambda metric: metric.timestamp)
             return metrics
 
         except Exception as e:
@@ -856,33 +856,71 @@ class MetricsCollector:
         end_time: datetime,
         period: str
     ) -> List[MetricAggregation]:
-        """加载聚合指标数据"""
+        """加载聚合指标数据（5m/15m由1m汇总层重新分桶）"""
         try:
-            if not self.aggregations_path.exists():
-                return []
+            metric_ids = metric_ids or list(self.tsdb.metric_series)
+            step_seconds = self._parse_aggregation_period(period)
+            tier = {"1h": "1h", "1d": "1d"}.get(period, "1m")
+            start, end = start_time.timestamp(), end_time.timestamp()
 
             metrics = []
-            with open(self.aggregations_path, 'r') as f:
-                for line in f:
-                    try:
-                        data = json.loads(line.strip())
-                        timestamp = datetime.fromisoformat(data["timestamp"])
-
-                        if (start_time <= timestamp <= end_time and
-                            data["aggregation_period"] == period):
-                            if not metric_ids or data["metric_id"] in metric_ids:
-                                data["timestamp"] = timestamp
-                                metrics.append(MetricAggregation(**data))
-                    except Exception as e:
-                        logger.debug(f"Error parsing aggregation data line: {e}")
-                        continue
-
+            for metric_id in metric_ids:
+                definition = self.metric_definitions.get(metric_id)
+                method = definition.aggregation_method if definition else "avg"
+                rows = await asyncio.to_thread(self.tsdb.query, metric_id, start, end, tier)
+                if not rows:
+                    continue
+
+                # 多个标签序列按桶合并
+                timestamps: List[int] = []
+                columns: List[List[float]] = [[] for _ in range(5)]
+                for series in rows:
+                    timestamps.extend(series.timestamps)
+                    for column, values in zip(columns, series.columns):
+                        column.extend(values)
+                order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+                timestamps, columns = merge_rollup_rows(
+                    [timestamps[i] for i in order],
+                    [[column[i] for i in order] for column in columns],
+                    step_ms=step_seconds * 1000
+                )
+
+                for i, timestamp in enumerate(timestamps):
+                    count, total, low, high, last = (column[i] for column in columns)
+                    metrics.append(MetricAggregation(
+                        metric_id=metric_id,
+                        aggregation_period=period,
+                        timestamp=datetime.fromtimestamp(timestamp / 1000),
+                        aggregated_value=self._rollup_value(method, count, total, low, high, last),
+                        sample_count=int(count),
+                        min_value=low,
+                        max_value=high,
+                        avg_value=total / count,
+                        sum_value=total
+                    ))
+
+            metrics.sort(key=lambda metric: metric.timestamp)
             return metrics
 
         except Exception as e:
             logger.error(f"Error loading aggregated metrics: {e}")
             return []
 
+    def _rollup_value(self, method: str, count: float, total: float, low: float, high: float, last: float) -> float:
+        """由汇总列计算聚合方法的结果"""
+        if method == "sum":
+            return total
+        elif method == "max":
+            return high
+        elif method == "min":
+            return low
+        elif method == "count":
+            return count
+        elif method == "last":
+            return last
+        else:
+            return total / count
+
 
 # 全局实例
 metrics_collector = MetricsCollector()
\ No newline at end of file
@@ -0,0 +1,548 @@
+"""
+嵌入式时序存储
+Embedded Time-Series Store
+
+为指标收集器提供按序列分块的磁盘存储：
+- 数据块采用Gorilla编码：时间戳delta-of-delta，数值XOR压缩
+- 每个序列按层级和时间分区写入.dat数据文件与.idx时间索引，范围查询只读取相交的数据块
+- 写入原始点时自动累积1m/1h/1d汇总（count/sum/min/max/last），各层级独立保留期
+- 最新数据先保存在内存头块中，定期（或满块时）封装写盘
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MASK64 = (1 << 64) - 1
+
+# 汇总层的列
+ROLLUP_COLUMNS = ("count", "sum", "min", "max", "last")
+
+# 数据块头：点数、列数
+BLOCK_HEADER = struct.Struct("<IB")
+# 索引项：最小时间戳、最大时间戳、偏移、长度
+INDEX_ENTRY = struct.Struct("<qqQI")
+
+
+@dataclass(frozen=True)
+class TierConfig:
+    """存储层配置（时间单位：秒）"""
+    step: int                # 汇总步长，原始层为0
+    partition_seconds: int   # 分区跨度（保留期按整个分区删除）
+    retention_seconds: int   # 保留期
+
+
+DEFAULT_TIERS: Dict[str, TierConfig] = {
+    "raw": TierConfig(0, 86400, 2 * 86400),
+    "1m": TierConfig(60, 86400, 14 * 86400),
+    "1h": TierConfig(3600, 30 * 86400, 180 * 86400),
+    "1d": TierConfig(86400, 365 * 86400, 5 * 365 * 86400),
+}
+
+
+# ----------------------------------------------------------------------
+# Gorilla编码
+# ----------------------------------------------------------------------
+
+class BitWriter:
+    """按位写入"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value: int, nbits: int):
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._bits += nbits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buffer.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self._bits:
+            return bytes(self.buffer) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self.buffer)
+
+
+class BitReader:
+    """按位读取"""
+
+    def __init__(self, data: bytes, offset: int = 0):
+        self.data = data
+        self.pos = offset * 8
+
+    def read(self, nbits: int) -> int:
+        value = 0
+        data = self.data
+        while nbits:
+            offset = self.pos & 7
+            available = 8 - offset
+            take = available if available < nbits else nbits
+            bits = (data[self.pos >> 3] >> (available - take)) & ((1 << take) - 1)
+            value = (value << take) | bits
+            nbits -= take
+            self.pos += take
+        return value
+
+    def read_signed(self, nbits: int) -> int:
+        value = self.read(nbits)
+        return value - (1 << nbits) if value >> (nbits - 1) else value
+
+
+# delta-of-delta分档：(前缀, 前缀位数, 数值位数)
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+def _encode_timestamps(writer: BitWriter, timestamps: Sequence[int]):
+    writer.write(timestamps[0] & MASK64, 64)
+    prev, prev_delta = timestamps[0], 0
+    for timestamp in timestamps[1:]:
+        delta = timestamp - prev
+        dod = delta - prev_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                limit = 1 << (value_bits - 1)
+                if -limit <= dod < limit:
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod, value_bits)
+                    break
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod, 64)
+        prev, prev_delta = timestamp, delta
+
+
+def _decode_timestamps(reader: BitReader, count: int) -> List[int]:
+    first = reader.read(64)
+    if first >> 63:
+        first -= 1 << 64
+    timestamps = [first]
+    prev, delta = first, 0
+    for _ in range(count - 1):
+        if not reader.read(1):
+            dod = 0
+        elif not reader.read(1):
+            dod = reader.read_signed(7)
+        elif not reader.read(1):
+            dod = reader.read_signed(9)
+        elif not reader.read(1):
+            dod = reader.read_signed(12)
+        else:
+            dod = reader.read_signed(64)
+        delta += dod
+        prev += delta
+        timestamps.append(prev)
+    return timestamps
+
+
+_DOUBLE = struct.Struct("<d")
+_UINT64 = struct.Struct("<Q")
+
+
+def _float_bits(value: float) -> int:
+    return _UINT64.unpack(_DOUBLE.pack(value))[0]
+
+
+def _bits_float(value: int) -> float:
+    return _DOUBLE.unpack(_UINT64.pack(value))[0]
+
+
+def _encode_values(writer: BitWriter, values: Sequence[float]):
+    prev = _float_bits(values[0])
+    writer.write(prev, 64)
+    prev_leading = prev_trailing = -1
+    for value in values[1:]:
+        current = _float_bits(value)
+        xor = current ^ prev
+        if xor == 0:
+            writer.write(0, 1)
+        else:
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if prev_leading >= 0 and leading >= prev_leading and trailing >= prev_trailing:
+                # 复用上一个有效位窗口
+                writer.write(0b10, 2)
+                writer.write(xor >> prev_trailing, 64 - prev_leading - prev_trailing)
+            else:
+                significant = 64 - leading - trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                writer.write(significant & 63, 6)
+                writer.write(xor >> trailing, significant)
+                prev_leading, prev_trailing = leading, trailing
+        prev = current
+
+
+def _decode_values(reader: BitReader, count: int) -> List[float]:
+    prev = reader.read(64)
+    values = [_bits_float(prev)]
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                significant = reader.read(6) or 64
+                trailing = 64 - leading - significant
+            prev ^= reader.read(64 - leading - trailing) << trailing
+        values.append(_bits_float(prev))
+    return values
+
+
+def encode_block(timestamps: Sequence[int], columns: Sequence[Sequence[float]]) -> bytes:
+    """编码一个数据块（时间戳为毫秒整数）"""
+    writer = BitWriter()
+    _encode_timestamps(writer, timestamps)
+    for column in columns:
+        _encode_values(writer, column)
+    return BLOCK_HEADER.pack(len(timestamps), len(columns)) + writer.getvalue()
+
+
+def decode_block(data: bytes) -> Tuple[List[int], List[List[float]]]:
+    """解码数据块"""
+    count, column_count = BLOCK_HEADER.unpack_from(data)
+    reader = BitReader(data, BLOCK_HEADER.size)
+    timestamps = _decode_timestamps(reader, count)
+    columns = [_decode_values(reader, count) for _ in range(column_count)]
+    return timestamps, columns
+
+
+# ----------------------------------------------------------------------
+# 查询结果
+# ----------------------------------------------------------------------
+
+@dataclass
+class SeriesData:
+    """一个序列在查询范围内的数据（按时间排序）"""
+    metric_id: str
+    labels: Dict[str, str]
+    timestamps: List[int]
+    columns: List[List[float]]
+
+    @property
+    def values(self) -> List[float]:
+        """原始层的数值；汇总层为last列"""
+        return self.columns[-1]
+
+
+def merge_rollup_rows(timestamps: List[int], columns: List[List[float]],
+                      step_ms: int = 0) -> Tuple[List[int], List[List[float]]]:
+    """合并汇总行：相同桶（或按step_ms重新分桶后相同）的行合并为一行
+
+    要求输入按时间排序；count/sum相加，min/max取极值，last取最后一行。
+    """
+    out_ts: List[int] = []
+    out = [[], [], [], [], []]
+    for i, timestamp in enumerate(timestamps):
+        bucket = timestamp - timestamp % step_ms if step_ms else timestamp
+        if out_ts and out_ts[-1] == bucket:
+            out[0][-1] += columns[0][i]
+            out[1][-1] += columns[1][i]
+            out[2][-1] = min(out[2][-1], columns[2][i])
+            out[3][-1] = max(out[3][-1], columns[3][i])
+            out[4][-1] = columns[4][i]
+        else:
+            out_ts.append(bucket)
+            for column, values in zip(out, columns):
+                column.append(values[i])
+    return out_ts, out
+
+
+# ----------------------------------------------------------------------
+# 存储
+# ----------------------------------------------------------------------
+
+class TimeSeriesStore:
+    """按序列分块的时序存储"""
+
+    def __init__(self, root: Path, tiers: Optional[Dict[str, TierConfig]] = None,
+                 max_block_points: int = 240):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.tiers = tiers or DEFAULT_TIERS
+        self.max_block_points = max_block_points
+        self.series_path = self.root / "series.json"
+
+        # 序列注册表
+        self.series: Dict[str, Dict] = {}
+        self.metric_series: Dict[str, List[str]] = {}
+        self._series_ids: Dict[Tuple[str, Tuple], str] = {}
+
+        # 内存头块：{(tier, series_id): ([timestamps], [[columns]])}
+        self._head: Dict[Tuple[str, str], Tuple[List[int], List[List[float]]]] = {}
+        # 未完成的汇总桶：{(tier, series_id): [bucket, count, sum, min, max, last]}
+        self._open_buckets: Dict[Tuple[str, str], List[float]] = {}
+        self._head_lock = threading.Lock()
+        # 写盘与读盘互斥，保证读取时头块与磁盘数据不重不漏
+        self._io_lock = threading.RLock()
+        self._series_dirty = False
+
+        self.stats = {
+            "points_written": 0,
+            "blocks_written": 0,
+            "bytes_written": 0,
+            "blocks_read": 0,
+            "partitions_dropped": 0
+        }
+        self._load_series()
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def series_id(self, metric_id: str, labels: Optional[Dict[str, str]] = None) -> str:
+        """获取（必要时注册）序列ID
+
+        注册在头块锁内进行，flush在线程池中保存注册表时不会与之交错。
+        """
+        label_key = tuple(sorted((labels or {}).items()))
+        key = (metric_id, label_key)
+        series_id = self._series_ids.get(key)
+        if series_id is not None:
+            return series_id
+
+        digest = hashlib.sha1(json.dumps([metric_id, label_key]).encode()).hexdigest()[:16]
+        with self._head_lock:
+            series_id = self._series_ids.get(key)
+            if series_id is None:
+                series_id = self._series_ids[key] = digest
+                self.series[series_id] = {"metric_id": metric_id, "labels": dict(label_key)}
+                self.metric_series.setdefault(metric_id, []).append(series_id)
+                self._series_dirty = True
+        return series_id
+
+    def append(self, metric_id: str, timestamp: float, value: float,
+               labels: Optional[Dict[str, str]] = None):
+        """写入一个原始点（timestamp为Unix秒），同时累积各汇总层"""
+        series_id = self.series_id(metric_id, labels)
+        timestamp_ms = int(timestamp * 1000)
+        value = float(value)
+
+        with self._head_lock:
+            self._head_append("raw", series_id, timestamp_ms, (value,))
+            for tier, config in self.tiers.items():
+                if config.step:
+                    self._accumulate(tier, series_id, timestamp_ms, value, config.step * 1000)
+        self.stats["points_written"] += 1
+
+    def _head_append(self, tier: str, series_id: str, timestamp_ms: int, values: Tuple[float, ...]):
+        head = self._head.get((tier, series_id))
+        if head is None:
+            head = self._head[(tier, series_id)] = ([], [[] for _ in values])
+        head[0].append(timestamp_ms)
+        for column, value in zip(head[1], values):
+            column.append(value)
+
+    def _accumulate(self, tier: str, series_id: str, timestamp_ms: int, value: float, step_ms: int):
+        bucket = timestamp_ms - timestamp_ms % step_ms
+        key = (tier, series_id)
+        current = self._open_buckets.get(key)
+        if current is not None and current[0] != bucket:
+            self._head_append(tier, series_id, int(current[0]), tuple(current[1:]))
+            current = None
+        if current is None:
+            self._open_buckets[key] = [bucket, 1.0, value, value, value, value]
+        else:
+            current[1] += 1
+            current[2] += value
+            current[3] = min(current[3], value)
+            current[4] = max(current[4], value)
+            current[5] = value
+
+    def flush(self, include_open: bool = True) -> int:
+        """将头块写盘；include_open时未完成的汇总桶也作为部分行写入（读取时合并）"""
+        with self._io_lock:
+            with self._head_lock:
+                if include_open:
+                    for (tier, series_id), bucket in self._open_buckets.items():
+                        self._head_append(tier, series_id, int(bucket[0]), tuple(bucket[1:]))
+                    self._open_buckets = {}
+                head, self._head = self._head, {}
+                # 在锁内取注册表快照并清除脏标记，写盘期间新注册的序列留到下一次flush
+                series = dict(self.series) if self._series_dirty else None
+                self._series_dirty = False
+
+            blocks = 0
+            for (tier, series_id), (timestamps, columns) in head.items():
+                blocks += self._write_series(tier, series_id, timestamps, columns)
+            if series is not None:
+                try:
+                    self._save_series(series)
+                except Exception:
+                    self._series_dirty = True
+                    raise
+            return blocks
+
+    def _write_series(self, tier: str, series_id: str, timestamps: List[int],
+                      columns: List[List[float]]) -> int:
+        partition_ms = self.tiers[tier].partition_seconds * 1000
+        # 按分区和块大小切分
+        groups: Dict[int, List[int]] = {}
+        for i, timestamp in enumerate(timestamps):
+            groups.setdefault(timestamp // partition_ms, []).append(i)
+
+        blocks = 0
+        for partition, indexes in groups.items():
+            directory = self.root / tier / str(partition)
+            directory.mkdir(parents=True, exist_ok=True)
+            data_path = directory / f"{series_id}.dat"
+            index_path = directory / f"{series_id}.idx"
+            with open(data_path, "ab") as data_file, open(index_path, "ab") as index_file:
+                offset = data_file.tell()
+                for start in range(0, len(indexes), self.max_block_points):
+                    chunk = indexes[start:start + self.max_block_points]
+                    block_ts = [timestamps[i] for i in chunk]
+                    block = encode_block(block_ts, [[column[i] for i in chunk] for column in columns])
+                    data_file.write(block)
+                    index_file.write(INDEX_ENTRY.pack(min(block_ts), max(block_ts), offset, len(block)))
+                    offset += len(block)
+                    blocks += 1
+                    self.stats["bytes_written"] += len(block)
+                # 先写数据再写索引，读者只会看到完整的数据块
+                data_file.flush()
+        self.stats["blocks_written"] += blocks
+        return blocks
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def query(self, metric_id: str, start: float, end: float, tier: str = "raw",
+              labels: Optional[Dict[str, str]] = None) -> List[SeriesData]:
+        """查询[start, end]（Unix秒）内的数据；只读取与范围相交的分区和数据块"""
+        start_ms, end_ms = int(start * 1000), int(end * 1000)
+        results = []
+        for series_id in self.metric_series.get(metric_id, []):
+            info = self.series[series_id]
+            if labels and any(info["labels"].get(k) != v for k, v in labels.items()):
+                continue
+            timestamps, columns = self._read_series(tier, series_id, start_ms, end_ms)
+            if timestamps:
+                results.append(SeriesData(metric_id, dict(info["labels"]), timestamps, columns))
+        return results
+
+    def _read_series(self, tier: str, series_id: str, start_ms: int,
+                     end_ms: int) -> Tuple[List[int], List[List[float]]]:
+        column_count = len(ROLLUP_COLUMNS) if self.tiers[tier].step else 1
+        rows: List[Tuple[int, Tuple[float, ...]]] = []
+
+        with self._io_lock:
+            partition_ms = self.tiers[tier].partition_seconds * 1000
+            for partition in range(start_ms // partition_ms, end_ms // partition_ms + 1):
+                directory = self.root / tier / str(partition)
+                index_path = directory / f"{series_id}.idx"
+                if not index_path.exists():
+                    continue
+                index = index_path.read_bytes()
+                entries = [INDEX_ENTRY.unpack_from(index, offset)
+                           for offset in range(0, len(index) - len(index) % INDEX_ENTRY.size, INDEX_ENTRY.size)]
+                wanted = [entry for entry in entries if entry[1] >= start_ms and entry[0] <= end_ms]
+                if not wanted:
+                    continue
+                with open(directory / f"{series_id}.dat", "rb") as data_file:
+                    for _, _, offset, length in wanted:
+                        data_file.seek(offset)
+                        timestamps, columns = decode_block(data_file.read(length))
+                        self.stats["blocks_read"] += 1
+                        rows.extend(
+                            (timestamp, tuple(column[i] for column in columns))
+                            for i, timestamp in enumerate(timestamps)
+                            if start_ms <= timestamp <= end_ms
+                        )
+
+            with self._head_lock:
+                head = self._head.get((tier, series_id))
+                if head is not None:
+                    rows.extend(
+                        (timestamp, tuple(column[i] for column in head[1]))
+                        for i, timestamp in enumerate(head[0])
+                        if start_ms <= timestamp <= end_ms
+                    )
+                bucket = self._open_buckets.get((tier, series_id))
+                if bucket is not None and start_ms <= bucket[0] <= end_ms:
+                    rows.append((int(bucket[0]), tuple(bucket[1:])))
+
+        rows.sort(key=lambda row: row[0])
+        timestamps = [row[0] for row in rows]
+        columns = [[row[1][c] for row in rows] for c in range(column_count)]
+        if self.tiers[tier].step and timestamps:
+            timestamps, columns = merge_rollup_rows(timestamps, columns)
+        return timestamps, columns
+
+    def choose_tier(self, start: float, end: float, max_points: int = 1000,
+                    raw_interval: float = 60.0, now: Optional[float] = None) -> str:
+        """选择能在max_points内覆盖范围、且仍在保留期内的最细层级"""
+        now = now or time.time()
+        span = max(end - start, 1.0)
+        for tier, config in self.tiers.items():
+            step = config.step or raw_interval
+            if span / step <= max_points and start >= now - config.retention_seconds:
+                return tier
+        return list(self.tiers)[-1]
+
+    # ------------------------------------------------------------------
+    # 维护
+    # ------------------------------------------------------------------
+
+    def enforce_retention(self, now: Optional[float] = None) -> int:
+        """删除整体超出保留期的分区"""
+        now_ms = int((now or time.time()) * 1000)
+        dropped = 0
+        with self._io_lock:
+            for tier, config in self.tiers.items():
+                tier_dir = self.root / tier
+                if not tier_dir.exists():
+                    continue
+                partition_ms = config.partition_seconds * 1000
+                cutoff = now_ms - config.retention_seconds * 1000
+                for directory in tier_dir.iterdir():
+                    if directory.name.isdigit() and (int(directory.name) + 1) * partition_ms <= cutoff:
+                        shutil.rmtree(directory, ignore_errors=True)
+                        dropped += 1
+        self.stats["partitions_dropped"] += dropped
+        return dropped
+
+    def get_stats(self) -> Dict:
+        """存储统计"""
+        disk_bytes = sum(path.stat().st_size for path in self.root.rglob("*.dat"))
+        with self._head_lock:
+            head_points = sum(len(head[0]) for head in self._head.values())
+        return {
+            **self.stats,
+            "series": len(self.series),
+            "head_points": head_points,
+            "disk_bytes": disk_bytes
+        }
+
+    def _load_series(self):
+        if not self.series_path.exists():
+            return
+        try:
+            with open(self.series_path, "r") as f:
+                self.series = json.load(f)
+            for series_id, info in self.series.items():
+                key = (info["metric_id"], tuple(sorted(info["labels"].items())))
+                self._series_ids[key] = series_id
+                self.metric_series.setdefault(info["metric_id"], []).append(series_id)
+        except Exception as e:
+            logger.error(f"Error loading TSDB series registry: {e}")
+
+    def _save_series(self, series: Dict[str, Dict]):
+        tmp_path = self.series_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(series, f)
+        os.replace(tmp_path, self.series_path)
@@ -15,12 +15,12 @@ from datetime import datetime, timedelta
 from functools import wraps, lru_cache
 from contextlib import asynccontextmanager
 import aiohttp
-import aioredis
 from fastapi import Request, Response, HTTPException
 from fastapi.concurrency import run_in_threadpool
 import psutil
 
 from backend.config.settings import get_settings
+from backend.core.cache_core import get_cache_core, MemoryTier, RedisTier
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -57,28 +57,24 @@ class PerformanceThresholds:
     error_rate_warning: float = 5.0  # 百分比
 
 class APICacheManager:
-    """API缓存管理器"""
+    """API缓存管理器（统一缓存核心上的api_cache命名空间适配器）"""
 
     def __init__(self):
+        self.core = get_cache_core()
         self.redis_client = None
-        self.memory_cache: Dict[str, Dict[str, Any]] = {}
-        self.cache_stats = {
-            "hits": 0,
-            "misses": 0,
-            "sets": 0,
-            "evictions": 0
-        }
-        self._setup_redis()
+        self.cache = self.core.namespace("api_cache", default_ttl=300, max_entries=1000)
+        self.memory_cache = self.cache.get_tier(MemoryTier)
 
     async def _setup_redis(self):
-        """设置Redis连接"""
+        """设置Redis连接（复用共享连接池）"""
+        if self.redis_client:
+            return
+
         try:
-            self.redis_client = await aioredis.from_url(
-                f"redis://{getattr(settings, 'redis_host', 'localhost')}:{getattr(settings, 'redis_port', 6379)}",
-                encoding="utf-8",
-                decode_responses=True
-            )
-            await self.redis_client.ping()
+            client = self.core.redis_client()
+            await client.ping()
+            self.redis_client = client
+            self.cache.add_tier(RedisTier(client, key_prefix=""))
             logger.info("Redis连接成功，启用分布式缓存")
         except Exception as e:
             logger.warning(f"Redis连接失败，使用内存缓存: {e}")
@@ -110,106 +106,41 @@ class APICacheManager:
 
     async def get(self, key: str) -> Optional[Any]:
         """获取缓存"""
-        # 尝试Redis
-        if self.redis_client:
-            try:
-                cached_data = await self.redis_client.get(key)
-                if cached_data:
-                    self.cache_stats["hits"] += 1
-                    return json.loads(cached_data)
-            except Exception as e:
-                logger.warning(f"Redis缓存读取失败: {e}")
-
-        # 回退到内存缓存
-        if key in self.memory_cache:
-            cache_entry = self.memory_cache[key]
-            if cache_entry["expires_at"] > datetime.now():
-                self.cache_stats["hits"] += 1
-                return cache_entry["data"]
-            else:
-                # 过期，删除
-                del self.memory_cache[key]
-                self.cache_stats["evictions"] += 1
-
-        self.cache_stats["misses"] += 1
-        return None
+        return await self.cache.get(key)
 
     async def set(self, key: str, value: Any, ttl: int = 300):
         """设置缓存"""
-        # 尝试Redis
-        if self.redis_client:
-            try:
-                await self.redis_client.setex(key, ttl, json.dumps(value, default=str))
-                self.cache_stats["sets"] += 1
-                return
-            except Exception as e:
-                logger.warning(f"Redis缓存写入失败: {e}")
-
-        # 回退到内存缓存
-        expires_at = datetime.now() + timedelta(seconds=ttl)
-        self.memory_cache[key] = {
-            "data": value,
-            "expires_at": expires_at
-        }
-        self.cache_stats["sets"] += 1
-
-        # 检查内存缓存大小
-        if len(self.memory_cache) > 1000:  # 限制内存缓存大小
-            self._evict_oldest_entries()
-
-    def _evict_oldest_entries(self):
-        """清理最旧的缓存条目"""
-        # 按过期时间排序，删除最旧的20%
-        sorted_entries = sorted(
-            self.memory_cache.items(),
-            key=lambda x: x[1]["expires_at"]
-        )
-
-        evict_count = len(sorted_entries) // 5
-        for i in range(evict_count):
-            key = sorted_entries[i][0]
-            del self.memory_cache[key]
-            self.cache_stats["evictions"] += 1
+        await self.cache.set(key, value, ttl)
 
     async def delete(self, key: str):
         """删除缓存"""
-        if self.redis_client:
-            try:
-                await self.redis_client.delete(key)
-            except Exception as e:
-                logger.warning(f"Redis缓存删除失败: {e}")
-
-        if key in self.memory_cache:
-            del self.memory_cache[key]
+        await self.cache.delete(key)
 
     async def clear_pattern(self, pattern: str):
         """按模式清理缓存"""
-        if self.redis_client:
-            try:
-                keys = await self.redis_client.keys(pattern)
-                if keys:
-                    await self.redis_client.delete(*keys)
-            except Exception as e:
-                logger.warning(f"Redis模式清理失败: {e}")
+        redis_tier = self.cache.get_tier(RedisTier)
+        if redis_tier:
+            keys = await redis_tier.scan_keys(pattern)
+            if keys:
+                await redis_tier.delete(keys)
 
         # 清理内存缓存
         keys_to_delete = [k for k in self.memory_cache.keys() if pattern in k]
-        for key in keys_to_delete:
-            del self.memory_cache[key]
-            self.cache_stats["evictions"] += 1
+        self.memory_cache.delete_local(keys_to_delete)
 
     def get_cache_stats(self) -> Dict[str, Any]:
         """获取缓存统计"""
-        total_requests = self.cache_stats["hits"] + self.cache_stats["misses"]
-        hit_rate = (self.cache_stats["hits"] / total_requests * 100) if total_requests > 0 else 0
+        stats = self.cache.stats
+        total_requests = stats.hits + stats.misses
+        hit_rate = (stats.hits / total_requests * 100) if total_requests > 0 else 0
 
         return {
             "cache_type": "redis" if self.redis_client else "memory",
-            "hits": self.cache_stats["hits"],
-            "misses": self.cache_stats["misses"],
+            "hits": stats.hits,
+            "misses": stats.misses,
             "hit_rate_percent": round(hit_rate, 2),
-            "total_cached_items": len(self.memory_cache),
-            "evictions": self.cache_stats["evictions"]
+            "total_cached_items": self.memory_cache.entry_count,
+            "evictions": self.memory_cache.stats.evictions
         }
 
 class APIPerformanceOptimizer:
@@ -340,7 +271,7 @@ class APIPerformanceOptimizer:
 
     async def invalidate_cache_pattern(self, pattern: str):
         """按模式失效缓存"""
-        await self.cache_manager.clear_pattern(f"{self.cache_manager.cache_stats['key_prefix']}:{pattern}")
+        await self.cache_manager.clear_pattern(f"{CacheConfig.key_prefix}:{pattern}")
 
     def get_performance_report(self, minutes: int = 60) -> Dict[str, Any]:
         """生成性能报告"""
@@ -0,0 +1,17 @@
+"""
+缓存系统模块
+
+提供API响应缓存、限流计数、多级缓存、缓存预热和缓存监控等功能。
+"""
+
+from .cache_manager import (
+    CacheManager, RateLimitCache, cached_response, get_cache_manager, get_rate_limit_cache
+)
+
+__all__ = [
+    "CacheManager",
+    "RateLimitCache",
+    "cached_response",
+    "get_cache_manager",
+    "get_rate_limit_cache"
+]
@@ -15,19 +15,24 @@ from fastapi import Request, Response
 from fastapi.responses import JSONResponse
 
 from backend.config.settings import get_settings
+from backend.core.cache_core import get_cache_core, MemoryTier, RedisTier
 
 logger = logging.getLogger(__name__)
 
 
 class CacheManager:
-    """高级缓存管理器"""
+    """高级缓存管理器（统一缓存核心上的api_response命名空间适配器）"""
 
     def __init__(self):
         self.settings = get_settings()
+        self.core = get_cache_core()
         self.redis_client: Optional[redis.Redis] = None
-        self.local_cache: Dict[str, Any] = {}
-        self.local_cache_timestamps: Dict[str, datetime] = {}
         self.max_local_cache_size = 1000
+        self.cache = self.core.namespace(
+            "api_response", default_ttl=300, max_entries=self.max_local_cache_size,
+            broadcast=True
+        )
+        self.local_cache = self.cache.get_tier(MemoryTier)
 
     async def initialize(self):
         """初始化缓存系统"""
@@ -35,13 +40,12 @@ class CacheManager:
             return
 
         try:
-            self.redis_client = redis.from_url(
-                self.settings.redis_url,
-                encoding="utf-8",
-                decode_responses=True
-            )
+            client = self.core.redis_client(self.settings.redis_url)
             # 测试连接
-            await self.redis_client.ping()
+            await client.ping()
+            self.redis_client = client
+            # 复用共享连接池，键和标签格式与历史数据保持一致
+            self.cache.add_tier(RedisTier(client, key_prefix=""))
             logger.info("Redis cache initialized successfully")
         except Exception as e:
             logger.warning(f"Redis not available, using local cache only: {e}")
@@ -61,32 +65,7 @@ class CacheManager:
     async def get(self, key: str) -> Optional[Any]:
         """获取缓存值"""
         try:
-            # 首先尝试本地缓存
-            if key in self.local_cache:
-                timestamp = self.local_cache_timestamps.get(key)
-                if timestamp and timestamp > datetime.utcnow() - timedelta(minutes=5):
-                    return self.local_cache[key]
-                else:
-                    # 本地缓存过期，删除
-                    del self.local_cache[key]
-                    if key in self.local_cache_timestamps:
-                        del self.local_cache_timestamps[key]
-
-            # 尝试Redis缓存
-            if self.redis_client:
-                cached_data = await self.redis_client.get(key)
-                if cached_data:
-                    try:
-                        data = json.loads(cached_data)
-                        # 同时更新本地缓存
-                        await self._set_local_cache(key, data)
-                        return data
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to decode cached data for key: {key}")
-                        await self.redis_client.delete(key)
-
-            return None
-
+            return await self.cache.get(key)
         except Exception as e:
             logger.error(f"Cache get error for key {key}: {e}")
             return None
@@ -100,65 +79,15 @@ class CacheManager:
     ) -> bool:
         """设置缓存值"""
         try:
-            # 设置本地缓存
-            await self._set_local_cache(key, value)
-
-            # 设置Redis缓存
-            if self.redis_client:
-                try:
-                    serialized_data = json.dumps(value, ensure_ascii=False)
-
-                    # 使用pipeline提高性能
-                    pipe = self.redis_client.pipeline()
-                    pipe.set(key, serialized_data, ex=expire or 300)  # 默认5分钟过期
-
-                    # 添加标签
-                    if tags:
-                        for tag in tags:
-                            tag_key = f"tag:{tag}"
-                            pipe.sadd(tag_key, key)
-                            pipe.expire(tag_key, expire or 300)
-
-                    await pipe.execute()
-                    return True
-
-                except Exception as e:
-                    logger.error(f"Redis cache set error for key {key}: {e}")
-                    return False
-
-            return True
-
+            return await self.cache.set(key, value, ttl=expire or 300, tags=tags)  # 默认5分钟过期
         except Exception as e:
             logger.error(f"Cache set error for key {key}: {e}")
             return False
 
-    async def _set_local_cache(self, key: str, value: Any):
-        """设置本地缓存"""
-        # 如果缓存已满，删除最旧的条目
-        if len(self.local_cache) >= self.max_local_cache_size:
-            oldest_key = min(
-                self.local_cache_timestamps.keys(),
-                key=lambda k: self.local_cache_timestamps[k]
-            )
-            del self.local_cache[oldest_key]
-            del self.local_cache_timestamps[oldest_key]
-
-        self.local_cache[key] = value
-        self.local_cache_timestamps[key] = datetime.utcnow()
-
     async def delete(self, key: str) -> bool:
         """删除缓存"""
         try:
-            # 删除本地缓存
-            if key in self.local_cache:
-                del self.local_cache[key]
-            if key in self.local_cache_timestamps:
-                del self.local_cache_timestamps[key]
-
-            # 删除Redis缓存
-            if self.redis_client:
-                await self.redis_client.delete(key)
-
+            await self.cache.delete(key)
             return True
 
         except Exception as e:
@@ -166,35 +95,9 @@ class CacheManager:
             return False
 
     async def delete_by_tag(self, tag: str) -> int:
-        """通过标签删除缓存"""
+        """通过标签删除缓存（作用于所有缓存命名空间）"""
         try:
-            deleted_count = 0
-
-            # 删除本地缓存中匹配的条目
-            keys_to_delete = []
-            for key in self.local_cache.keys():
-                if tag in key:
-                    keys_to_delete.append(key)
-
-            for key in keys_to_delete:
-                del self.local_cache[key]
-                if key in self.local_cache_timestamps:
-                    del self.local_cache_timestamps[key]
-                deleted_count += 1
-
-            # 删除Redis缓存中匹配的条目
-            if self.redis_client:
-                tag_key = f"tag:{tag}"
-                keys = await self.redis_client.smembers(tag_key)
-                if keys:
-                    pipe = self.redis_client.pipeline()
-                    for key in keys:
-                        pipe.delete(key)
-                    await pipe.execute()
-                    deleted_count += len(keys)
-                    await self.redis_client.delete(tag_key)
-
-            return deleted_count
+            return await self.core.invalidate_tag(tag)
 
         except Exception as e:
             logger.error(f"Cache delete by tag error for tag {tag}: {e}")
@@ -204,8 +107,7 @@ class CacheManager:
         """清空所有缓存"""
         try:
             # 清空本地缓存
-            self.local_cache.clear()
-            self.local_cache_timestamps.clear()
+            self.local_cache.clear_local()
 
             # 清空Redis缓存
             if self.redis_client:
@@ -221,8 +123,9 @@ class CacheManager:
         """获取缓存统计信息"""
         try:
             stats = {
-                "local_cache_size": len(self.local_cache),
-                "redis_available": self.redis_client is not None
+                "local_cache_size": self.local_cache.entry_count,
+                "redis_available": self.redis_client is not None,
+                "cache": self.cache.get_stats()
             }
 
             if self.redis_client:
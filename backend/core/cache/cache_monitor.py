@@ -15,9 +15,19 @@ import statistics
 import threading
 
 from backend.core.cache.multi_level_cache import get_cache_manager, CacheLevel
+from backend.monitoring.prometheus_registry import metrics_registry
 
 logger = logging.getLogger(__name__)
 
+# Prometheus指标
+CACHE_OPERATIONS = metrics_registry.counter(
+    "cache_operations_total", "缓存操作次数", ("operation", "level", "result")
+)
+CACHE_OPERATION_DURATION = metrics_registry.histogram(
+    "cache_operation_duration_seconds", "缓存操作耗时（秒）", ("operation", "level"),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+)
+
 
 class MetricType(Enum):
     """指标类型"""
@@ -554,6 +564,10 @@ class CacheMonitoringSystem:
         """记录缓存操作"""
         # 记录操作计数
         self.metrics_collector.record_counter(f"cache.{operation}.{level}")
+        result = "none" if hit is None else ("hit" if hit else "miss")
+        CACHE_OPERATIONS.labels(operation, level, result).inc()
+        if duration > 0:
+            CACHE_OPERATION_DURATION.labels(operation, level).observe(duration)
 
         # 记录耗时
         if duration > 0:
@@ -15,10 +15,12 @@ import hashlib
 import zlib
 from abc import ABC, abstractmethod
 
-import aioredis
-from aioredis import Redis
+from redis.asyncio import Redis
 from fastapi import HTTPException
 
+from backend.core.cache_core import get_cache_core
+from backend.core.cache_codecs import get_codec_registry
+
 logger = logging.getLogger(__name__)
 
 
@@ -94,25 +96,28 @@ class CacheEntry:
 
 
 class MemoryCache:
-    """L1 内存缓存实现"""
+    """L1 内存缓存实现（统一缓存核心内存层适配器，占用计入进程级内存预算）"""
 
     def __init__(self, max_size: int, default_ttl: int = 300):
         self.max_size = max_size
         self.default_ttl = default_ttl
-        self.cache: Dict[str, CacheEntry] = {}
-        self.access_order: List[str] = []
+        self.tier = get_cache_core().memory_tier(max_entries=max_size)
         self._lock = asyncio.Lock()
 
+    @property
+    def cache(self) -> Dict[str, CacheEntry]:
+        """当前缓存条目快照"""
+        return {key: self.tier.peek(key) for key in self.tier.keys()}
+
     async def get(self, key: str) -> Optional[CacheEntry]:
         """获取缓存条目"""
         async with self._lock:
-            entry = self.cache.get(key)
+            entry = self.tier.get_local(key)
             if entry:
                 if entry.is_expired():
-                    await self._remove(key)
+                    self.tier.delete_local([key])
                     return None
                 entry.update_access()
-                self._update_access_order(key)
             return entry
 
     async def set(self, key: str, value: Any, ttl: int = None) -> bool:
@@ -120,10 +125,6 @@ class MemoryCache:
         ttl = ttl or self.default_ttl
 
         async with self._lock:
-            # 检查是否需要清理空间
-            if len(self.cache) >= self.max_size and key not in self.cache:
-                await self._evict_lru()
-
             # 计算值的大小
             try:
                 if isinstance(value, (dict, list)):
@@ -144,67 +145,32 @@ class MemoryCache:
                 size_bytes=size_bytes
             )
 
-            self.cache[key] = entry
-            self._update_access_order(key)
-            return True
+            return self.tier.set_local(key, entry, ttl, size=size_bytes)
 
     async def delete(self, key: str) -> bool:
         """删除缓存条目"""
         async with self._lock:
-            if key in self.cache:
-                del self.cache[key]
-                if key in self.access_order:
-                    self.access_order.remove(key)
-                return True
-            return False
+            return self.tier.delete_local([key]) > 0
 
     async def clear(self):
         """清空缓存"""
         async with self._lock:
-            self.cache.clear()
-            self.access_order.clear()
+            self.tier.clear_local()
 
     async def get_stats(self) -> Dict:
         """获取缓存统计"""
         async with self._lock:
-            total_size = sum(entry.size_bytes for entry in self.cache.values())
-            expired_count = sum(1 for entry in self.cache.values() if entry.is_expired())
+            entries = [self.tier.peek(key) for key in self.tier.keys()]
+            expired_count = sum(1 for entry in entries if entry.is_expired())
 
             return {
-                "entries_count": len(self.cache),
+                "entries_count": len(entries),
                 "max_size": self.max_size,
-                "total_size_bytes": total_size,
+                "total_size_bytes": self.tier.used_bytes,
                 "expired_count": expired_count,
-                "hit_rate": self._calculate_hit_rate()
+                "hit_rate": self.tier.stats.hit_rate
             }
 
-    async def _evict_lru(self):
-        """淘汰最近最少使用的条目"""
-        if self.access_order:
-            lru_key = self.access_order.pop(0)
-            if lru_key in self.cache:
-                del self.cache[lru_key]
-
-    async def _remove(self, key: str):
-        """移除缓存条目"""
-        if key in self.cache:
-            del self.cache[key]
-        if key in self.access_order:
-            self.access_order.remove(key)
-
-    def _update_access_order(self, key: str):
-        """更新访问顺序"""
-        if key in self.access_order:
-            self.access_order.remove(key)
-        self.access_order.append(key)
-
-    def _calculate_hit_rate(self) -> float:
-        """计算命中率"""
-        if not self.cache:
-            return 0.0
-        total_accesses = sum(entry.access_count for entry in self.cache.values())
-        return min(1.0, (total_accesses - len(self.cache)) / max(1, total_accesses))
-
 
 class RedisCache:
     """L2 Redis缓存实现"""
@@ -221,14 +187,13 @@ class RedisCache:
             return
 
         try:
-            self._connection_pool = aioredis.ConnectionPool.from_url(
-                f"redis://{self.config.l2_host}:{self.config.l2_port}/{self.config.l2_db}",
-                password=self.config.l2_password,
-                max_connections=self.config.l2_max_connections,
-                retry_on_timeout=True
-            )
+            url = f"redis://{self.config.l2_host}:{self.config.l2_port}/{self.config.l2_db}"
+            if self.config.l2_password:
+                url = f"redis://:{self.config.l2_password}@{self.config.l2_host}:{self.config.l2_port}/{self.config.l2_db}"
 
-            self.redis = Redis(connection_pool=self._connection_pool)
+            # 使用统一缓存核心的共享连接池
+            self.redis = get_cache_core().redis_client(url)
+            self._connection_pool = self.redis.connection_pool
 
             # 测试连接
             await self.redis.ping()
@@ -248,7 +213,7 @@ class RedisCache:
         try:
             data = await self.redis.get(key)
             if data:
-                entry_data = self._deserialize(data)
+                entry_data = await self._deserialize(data)
                 if entry_data and not entry_data.is_expired():
                     entry_data.update_access()
                     return entry_data
@@ -280,7 +245,7 @@ class RedisCache:
                 compressed=self.config.compression_enabled
             )
 
-            serialized_data = self._serialize(entry)
+            serialized_data = await self._serialize(entry)
             await self.redis.setex(key, ttl, serialized_data)
             return True
 
@@ -344,32 +309,29 @@ class RedisCache:
         total = hits + misses
         return hits / max(1, total)
 
-    def _serialize(self, entry: CacheEntry) -> bytes:
-        """序列化缓存条目"""
+    @property
+    def _codec(self) -> str:
+        """按配置选择的编解码器（键前缀规则优先）"""
         if self.config.serialization_method == "pickle":
-            data = pickle.dumps(asdict(entry))
-        else:
-            # JSON序列化
-            data = json.dumps(asdict(entry), default=str).encode()
+            return "pickle-fast" if self.config.compression_enabled else "pickle"
+        return "structured" if self.config.compression_enabled else "json"
 
-        # 压缩
+    def _legacy_decode(self, data: bytes) -> Dict:
+        """解码历史格式（可选zlib压缩的json/pickle）"""
         if self.config.compression_enabled:
-            data = zlib.compress(data)
+            data = zlib.decompress(data)
+        if self.config.serialization_method == "pickle":
+            return pickle.loads(data)
+        return json.loads(data.decode())
 
-        return data
+    async def _serialize(self, entry: CacheEntry) -> bytes:
+        """序列化缓存条目（大值在线程池中编码）"""
+        return await get_codec_registry().encode(asdict(entry), key=entry.key, codec=self._codec)
 
-    def _deserialize(self, data: bytes) -> Optional[CacheEntry]:
+    async def _deserialize(self, data: bytes) -> Optional[CacheEntry]:
         """反序列化缓存条目"""
         try:
-            # 解压缩
-            if self.config.compression_enabled:
-                data = zlib.decompress(data)
-
-            if self.config.serialization_method == "pickle":
-                entry_dict = pickle.loads(data)
-            else:
-                entry_dict = json.loads(data.decode())
-
+            entry_dict = await get_codec_registry().decode(data, legacy=self._legacy_decode)
             return CacheEntry(**entry_dict)
 
         except Exception as e:
@@ -377,11 +339,10 @@ class RedisCache:
             return None
 
     async def close(self):
-        """关闭连接"""
-        if self.redis:
-            await self.redis.close()
-        if self._connection_pool:
-            await self._connection_pool.disconnect()
+        """释放客户端（共享连接池由统一缓存核心管理）"""
+        self.redis = None
+        self._connection_pool = None
+        self._initialized = False
 
 
 class PersistentCache:
@@ -552,6 +513,20 @@ class MultiLevelCacheManager:
         self._initialized = False
         self._lock = asyncio.Lock()
 
+        # 注册到统一缓存核心的统计接口和跨进程失效总线
+        self.name = "multi_level"
+        self.core = get_cache_core()
+        self.core.register(self)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计（供统一缓存核心汇总）"""
+        hits = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["l3_hits"]
+        return {**self.stats, "hits": hits}
+
+    def apply_remote_invalidation(self, keys: Dict[str, int]) -> int:
+        """应用其他进程的失效消息，删除本进程L1中较旧的副本"""
+        return sum(1 for key, version in keys.items() if self.l1_cache.tier.delete_if_older(key, version))
+
     async def initialize(self):
         """初始化缓存管理器"""
         if self._initialized:
@@ -580,6 +555,7 @@ class MultiLevelCacheManager:
             if entry:
                 self.stats["l1_hits"] += 1
                 await self._promote_to_l1_if_needed(key, entry)
+                self._observe(key, True)
                 return entry.value
 
         # L2 缓存查找
@@ -589,6 +565,7 @@ class MultiLevelCacheManager:
                 self.stats["l2_hits"] += 1
                 # 提升到L1
                 await self.l1_cache.set(key, entry.value, self.config.l1_ttl)
+                self._observe(key, True)
                 return entry.value
 
         # L3 缓存查找
@@ -599,12 +576,18 @@ class MultiLevelCacheManager:
                 # 提升到L2和L1
                 await self.l2_cache.set(key, entry.value, self.config.l2_ttl)
                 await self.l1_cache.set(key, entry.value, self.config.l1_ttl)
+                self._observe(key, True)
                 return entry.value
 
         # 未命中
         self.stats["misses"] += 1
+        self._observe(key, False)
         return None
 
+    def _observe(self, key: str, hit: bool):
+        if self.core.access_observers:
+            self.core.observe_access(self.name, key, hit)
+
     async def set(self, key: str, value: Any, ttl: int = None, levels: List[CacheLevel] = None):
         """设置缓存值（多级存储）"""
         if levels is None:
@@ -622,6 +605,10 @@ class MultiLevelCacheManager:
         if self.l3_cache and CacheLevel.L3_PERSISTENT in levels:
             await self.l3_cache.set(key, value, ttl or self.config.l3_ttl)
 
+        # 共享层已更新，通知其他进程丢弃L1副本
+        if CacheLevel.L2_REDIS in levels:
+            self.core.publish_invalidation(self.name, key)
+
     async def delete(self, key: str, levels: List[CacheLevel] = None) -> bool:
         """删除缓存值（从多级删除）"""
         if levels is None:
@@ -639,6 +626,7 @@ class MultiLevelCacheManager:
         if self.l3_cache and CacheLevel.L3_PERSISTENT in levels:
             results.append(await self.l3_cache.delete(key))
 
+        self.core.publish_invalidation(self.name, key)
         return any(results)
 
     async def clear(self, levels: List[CacheLevel] = None):
@@ -16,9 +16,11 @@ from enum import Enum
 import logging
 from abc import ABC, abstractmethod
 
-import redis
-from cachetools import TTLCache, LFUCache, LRUCache
+import fnmatch
+
 from backend.config.settings import get_settings
+from backend.core.cache_core import get_cache_core
+from backend.core.cache_codecs import get_codec_registry
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -143,29 +145,27 @@ class CacheBackend(ABC):
         """获取键列表"""
         pass
 
+    async def tagged_keys(self, tag: str) -> List[str]:
+        """获取带有指定标签的键"""
+        return []
+
 
 class MemoryCacheBackend(CacheBackend):
-    """内存缓存后端"""
+    """内存缓存后端（统一缓存核心内存层适配器）
+
+    条目按LRU顺序存放在共享内存预算下；strategy仅作记录，淘汰统一由核心执行。
+    """
 
     def __init__(self, max_size: int = 1000, strategy: CacheStrategy = CacheStrategy.LRU):
         self.max_size = max_size
         self.strategy = strategy
-
-        if strategy == CacheStrategy.LRU:
-            self.cache = LRUCache(maxsize=max_size)
-        elif strategy == CacheStrategy.LFU:
-            self.cache = LFUCache(maxsize=max_size)
-        elif strategy == CacheStrategy.TTL:
-            self.cache = TTLCache(maxsize=max_size, ttl=3600)
-        else:
-            self.cache = LRUCache(maxsize=max_size)
-
+        self.tier = get_cache_core().memory_tier(max_entries=max_size)
         self.stats = CacheStats()
 
     async def get(self, key: str) -> Optional[CacheEntry]:
         """获取缓存条目"""
         try:
-            entry = self.cache.get(key)
+            entry = self.tier.get_local(key)
             if entry:
                 if entry.is_expired:
                     await self.delete(key)
@@ -186,9 +186,9 @@ class MemoryCacheBackend(CacheBackend):
     async def set(self, entry: CacheEntry) -> bool:
         """设置缓存条目"""
         try:
-            self.cache[entry.key] = entry
+            self.tier.set_local(entry.key, entry, entry.ttl, entry.tags, size=entry.size_bytes)
             self.stats.sets += 1
-            self.stats.total_size_bytes += entry.size_bytes
+            self.stats.total_size_bytes = self.tier.used_bytes
             return True
         except Exception as e:
             logger.error(f"Memory cache set error: {e}")
@@ -197,8 +197,7 @@ class MemoryCacheBackend(CacheBackend):
     async def delete(self, key: str) -> bool:
         """删除缓存条目"""
         try:
-            if key in self.cache:
-                del self.cache[key]
+            if self.tier.delete_local([key]):
                 self.stats.deletes += 1
                 return True
             return False
@@ -209,7 +208,7 @@ class MemoryCacheBackend(CacheBackend):
     async def clear(self) -> bool:
         """清空缓存"""
         try:
-            self.cache.clear()
+            self.tier.clear_local()
             self.stats = CacheStats()
             return True
         except Exception as e:
@@ -218,11 +217,15 @@ class MemoryCacheBackend(CacheBackend):
 
     async def keys(self, pattern: str = "*") -> List[str]:
         """获取键列表"""
-        return list(self.cache.keys())
+        return [key for key in self.tier.keys() if fnmatch.fnmatchcase(key, pattern)]
+
+    async def tagged_keys(self, tag: str) -> List[str]:
+        """获取带有指定标签的键"""
+        return list(await self.tier.tagged_keys(tag))
 
 
 class RedisCacheBackend(CacheBackend):
-    """Redis缓存后端"""
+    """Redis缓存后端（使用统一缓存核心的共享异步连接池）"""
 
     def __init__(self, redis_url: str = None, key_prefix: str = "aihub:cache:"):
         self.redis_url = redis_url or settings.redis_url
@@ -234,9 +237,7 @@ class RedisCacheBackend(CacheBackend):
     def _init_redis(self):
         """初始化Redis连接"""
         try:
-            self.redis_client = redis.from_url(self.redis_url, decode_responses=False)
-            # 测试连接
-            self.redis_client.ping()
+            self.redis_client = get_cache_core().redis_client(self.redis_url)
             logger.info("Redis cache backend initialized")
         except Exception as e:
             logger.error(f"Failed to initialize Redis cache: {e}")
@@ -246,8 +247,17 @@ class RedisCacheBackend(CacheBackend):
         """生成Redis键"""
         return f"{self.key_prefix}{key}"
 
-    def _serialize_entry(self, entry: CacheEntry) -> bytes:
-        """序列化缓存条目"""
+    def _tag_key(self, tag: str) -> str:
+        """生成标签索引键"""
+        return f"{self.key_prefix}tag:{tag}"
+
+    @staticmethod
+    def _legacy_decode(data: bytes) -> Dict[str, Any]:
+        """解码历史格式（pickle + gzip）"""
+        return pickle.loads(gzip.decompress(data))
+
+    async def _serialize_entry(self, entry: CacheEntry) -> bytes:
+        """序列化缓存条目（编解码器按键前缀选择，大值在线程池中编码）"""
         data = {
             'key': entry.key,
             'value': entry.value,
@@ -259,13 +269,11 @@ class RedisCacheBackend(CacheBackend):
             'tags': entry.tags,
             'metadata': entry.metadata
         }
-        serialized = pickle.dumps(data)
-        return gzip.compress(serialized)
+        return await get_codec_registry().encode(data, key=self._make_key(entry.key), codec="pickle-fast")
 
-    def _deserialize_entry(self, data: bytes) -> CacheEntry:
+    async def _deserialize_entry(self, data: bytes) -> CacheEntry:
         """反序列化缓存条目"""
-        decompressed = gzip.decompress(data)
-        cache_data = pickle.loads(decompressed)
+        cache_data = await get_codec_registry().decode(data, legacy=self._legacy_decode)
         return CacheEntry(
             key=cache_data['key'],
             value=cache_data['value'],
@@ -284,18 +292,16 @@ class RedisCacheBackend(CacheBackend):
             return None
 
         try:
-            redis_key = self._make_key(key)
-            data = self.redis_client.get(redis_key)
+            data = await self.redis_client.get(self._make_key(key))
 
             if data:
-                entry = self._deserialize_entry(data)
+                entry = await self._deserialize_entry(data)
                 if entry.is_expired:
                     await self.delete(key)
                     self.stats.misses += 1
                     return None
 
-                # 异步更新访问统计
-                asyncio.create_task(self._update_access_stats(redis_key, entry))
+                entry.touch()
                 self.stats.hits += 1
                 return entry
             else:
@@ -306,28 +312,20 @@ class RedisCacheBackend(CacheBackend):
             self.stats.misses += 1
             return None
 
-    async def _update_access_stats(self, redis_key: str, entry: CacheEntry):
-        """更新访问统计"""
-        try:
-            entry.touch()
-            serialized = self._serialize_entry(entry)
-            self.redis_client.set(redis_key, serialized, ex=entry.ttl)
-        except Exception as e:
-            logger.error(f"Failed to update access stats: {e}")
-
     async def set(self, entry: CacheEntry) -> bool:
         """设置缓存条目"""
         if not self.redis_client:
             return False
 
         try:
-            redis_key = self._make_key(entry)
-            serialized = self._serialize_entry(entry)
+            redis_key = self._make_key(entry.key)
+            serialized = await self._serialize_entry(entry)
 
-            if entry.ttl:
-                self.redis_client.setex(redis_key, entry.ttl, serialized)
-            else:
-                self.redis_client.set(redis_key, serialized)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(redis_key, serialized, ex=entry.ttl or None)
+            for tag in entry.tags:
+                pipe.sadd(self._tag_key(tag), entry.key)
+            await pipe.execute()
 
             self.stats.sets += 1
             self.stats.total_size_bytes += entry.size_bytes
@@ -342,8 +340,7 @@ class RedisCacheBackend(CacheBackend):
             return False
 
         try:
-            redis_key = self._make_key(key)
-            result = self.redis_client.delete(redis_key) > 0
+            result = await self.redis_client.delete(self._make_key(key)) > 0
             if result:
                 self.stats.deletes += 1
             return result
@@ -357,10 +354,9 @@ class RedisCacheBackend(CacheBackend):
             return False
 
         try:
-            pattern = self._make_key("*")
-            keys = self.redis_client.keys(pattern)
+            keys = [key async for key in self.redis_client.scan_iter(match=self._make_key("*"))]
             if keys:
-                self.redis_client.delete(*keys)
+                await self.redis_client.delete(*keys)
             self.stats = CacheStats()
             return True
         except Exception as e:
@@ -373,15 +369,30 @@ class RedisCacheBackend(CacheBackend):
             return []
 
         try:
-            redis_pattern = self._make_key(pattern)
-            redis_keys = self.redis_client.keys(redis_pattern)
             # 移除前缀
             prefix_len = len(self.key_prefix)
-            return [key.decode('utf-8')[prefix_len:] for key in redis_keys]
+            return [
+                key.decode('utf-8')[prefix_len:]
+                async for key in self.redis_client.scan_iter(match=self._make_key(pattern))
+            ]
         except Exception as e:
             logger.error(f"Redis cache keys error: {e}")
             return []
 
+    async def tagged_keys(self, tag: str) -> List[str]:
+        """获取带有指定标签的键，并清除标签索引"""
+        if not self.redis_client:
+            return []
+
+        try:
+            tag_key = self._tag_key(tag)
+            members = await self.redis_client.smembers(tag_key)
+            await self.redis_client.delete(tag_key)
+            return [member.decode('utf-8') for member in members]
+        except Exception as e:
+            logger.error(f"Redis cache tag lookup error: {e}")
+            return []
+
 
 class SmartCache:
     """智能缓存管理器"""
@@ -393,6 +404,10 @@ class SmartCache:
         self.warmup_tasks: List[asyncio.Task] = []
         self._init_backends()
 
+        # 注册到统一缓存核心，参与全局标签失效和统计
+        self.name = "smart_cache"
+        get_cache_core().register(_SmartCacheParticipant(self))
+
     def _init_backends(self):
         """初始化缓存后端"""
         # 内存缓存 - L1缓存
@@ -568,17 +583,14 @@ class SmartCache:
         return decorator
 
     async def invalidate_by_tag(self, tag: str) -> int:
-        """根据标签失效缓存"""
+        """根据标签失效缓存（通过标签索引，无需扫描全部键）"""
         invalidated_count = 0
 
         for level, backend in self.backends.items():
             try:
-                keys = await backend.keys("*")
-                for key in keys:
-                    entry = await backend.get(key)
-                    if entry and tag in entry.tags:
-                        if await backend.delete(key):
-                            invalidated_count += 1
+                for key in await backend.tagged_keys(tag):
+                    if await backend.delete(key):
+                        invalidated_count += 1
             except Exception as e:
                 logger.error(f"Failed to invalidate cache by tag {tag} on level {level}: {e}")
 
@@ -586,7 +598,14 @@ class SmartCache:
 
     async def get_stats(self) -> Dict[str, Any]:
         """获取缓存统计"""
+        return self.get_core_stats()
+
+    def get_core_stats(self) -> Dict[str, Any]:
+        """同步统计，供统一缓存核心汇总"""
+        hits = sum(getattr(backend, 'stats', CacheStats()).hits for backend in self.backends.values())
         stats = {
+            "hits": hits,
+            "misses": self.global_stats.misses,
             "global": self.global_stats.to_dict(),
             "backends": {}
         }
@@ -670,6 +689,20 @@ class SmartCache:
         return 3600  # 默认1小时
 
 
+class _SmartCacheParticipant:
+    """SmartCache在统一缓存核心中的注册代理（核心统计接口为同步调用）"""
+
+    def __init__(self, cache: SmartCache):
+        self.name = cache.name
+        self._cache = cache
+
+    async def invalidate_tag(self, tag: str) -> int:
+        return await self._cache.invalidate_by_tag(tag)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._cache.get_core_stats()
+
+
 # 全局智能缓存实例
 smart_cache = SmartCache()
 
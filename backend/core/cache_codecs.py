@@ -0,0 +1,483 @@
+"""
+缓存编解码器注册表
+Cache Codec Registry
+
+为各缓存实现提供统一的值编解码：
+- 结构化数据序列化：orjson / msgpack（可选依赖），回退到标准库json / pickle
+- 按大小阈值压缩：zstd / lz4（可选依赖），回退到gzip
+- 超过字节阈值的编解码自动转移到线程池，避免阻塞事件循环（编码按值长度或同前缀键上次的编码大小预判）
+- 按键前缀选择编解码器
+- 每个编解码器的统计和基准测试
+
+编码结果带3字节帧头（魔数、序列化器ID、压缩器ID），任意进程都能按帧头解码，
+与写入时使用的编解码器无关；无帧头的历史数据交给调用方提供的legacy解码函数。
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    LZ4_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+FRAME_MAGIC = 0xCC
+FRAME_HEADER_SIZE = 3
+
+# 容器每个元素按至少这么多字节估算序列化大小（用于编码前预判是否转移到线程池）
+MIN_ITEM_BYTES = 32
+# 按键前缀记录的编码大小条目上限
+MAX_SIZE_HINTS = 4096
+
+
+@dataclass(frozen=True)
+class Serializer:
+    """序列化器"""
+    id: int
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+@dataclass(frozen=True)
+class Compressor:
+    """压缩器"""
+    id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, default=str, ensure_ascii=False).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data)
+
+
+def _pickle_dumps(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+BUILTIN_SERIALIZERS: List[Serializer] = [
+    Serializer(1, "json", _json_dumps, _json_loads),
+    Serializer(2, "pickle", _pickle_dumps, pickle.loads),
+]
+
+BUILTIN_COMPRESSORS: List[Compressor] = [
+    Compressor(0, "none", lambda data: data, lambda data: data),
+    Compressor(1, "gzip", lambda data: gzip.compress(data, compresslevel=6), gzip.decompress),
+]
+
+if ORJSON_AVAILABLE:
+    BUILTIN_SERIALIZERS.append(Serializer(
+        3, "orjson",
+        lambda value: orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS),
+        orjson.loads
+    ))
+
+if MSGPACK_AVAILABLE:
+    BUILTIN_SERIALIZERS.append(Serializer(
+        4, "msgpack",
+        lambda value: msgpack.packb(value, default=str, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False)
+    ))
+
+if ZSTD_AVAILABLE:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    BUILTIN_COMPRESSORS.append(Compressor(
+        2, "zstd",
+        lambda data: _zstd_compressor.compress(data),
+        lambda data: _zstd_decompressor.decompress(data)
+    ))
+
+if LZ4_AVAILABLE:
+    BUILTIN_COMPRESSORS.append(Compressor(3, "lz4", lz4.frame.compress, lz4.frame.decompress))
+
+
+@dataclass
+class CodecStats:
+    """编解码器统计"""
+    encodes: int = 0
+    decodes: int = 0
+    raw_bytes: int = 0
+    encoded_bytes: int = 0
+    encode_seconds: float = 0.0
+    decode_seconds: float = 0.0
+    offloaded: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["compression_ratio"] = round(self.encoded_bytes / self.raw_bytes, 4) if self.raw_bytes else 1.0
+        data["avg_encode_us"] = round(self.encode_seconds / self.encodes * 1e6, 2) if self.encodes else 0.0
+        data["avg_decode_us"] = round(self.decode_seconds / self.decodes * 1e6, 2) if self.decodes else 0.0
+        return data
+
+
+class Codec:
+    """编解码器：序列化器 + 达到阈值时启用的压缩器"""
+
+    def __init__(self, name: str, serializer: Serializer, compressor: Compressor,
+                 compress_threshold: int = 1024):
+        self.name = name
+        self.serializer = serializer
+        self.compressor = compressor
+        self.compress_threshold = compress_threshold
+        self.stats = CodecStats()
+
+    def encode(self, value: Any) -> bytes:
+        """编码为带帧头的字节串"""
+        return self.encode_sized(value)[0]
+
+    def encode_sized(self, value: Any) -> Tuple[bytes, int]:
+        """编码并返回序列化后的原始大小"""
+        start = time.perf_counter()
+        payload = self.serializer.dumps(value)
+        return self.frame(payload, time.perf_counter() - start), len(payload)
+
+    def will_compress(self, payload: bytes) -> bool:
+        return bool(self.compressor.id) and len(payload) >= self.compress_threshold
+
+    def frame(self, payload: bytes, serialize_seconds: float = 0.0) -> bytes:
+        """对已序列化的数据按阈值压缩并加帧头"""
+        start = time.perf_counter()
+        raw_size = len(payload)
+
+        compressor_id = 0
+        if self.will_compress(payload):
+            compressed = self.compressor.compress(payload)
+            # 只保留有效的压缩
+            if len(compressed) < raw_size:
+                payload = compressed
+                compressor_id = self.compressor.id
+
+        data = bytes((FRAME_MAGIC, self.serializer.id, compressor_id)) + payload
+        self.stats.encodes += 1
+        self.stats.raw_bytes += raw_size
+        self.stats.encoded_bytes += len(data)
+        self.stats.encode_seconds += serialize_seconds + time.perf_counter() - start
+        return data
+
+
+class CodecRegistry:
+    """编解码器注册表"""
+
+    def __init__(self, offload_threshold: int = 64 * 1024, max_workers: int = 2):
+        self.offload_threshold = offload_threshold
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.serializers: Dict[str, Serializer] = {}
+        self.compressors: Dict[str, Compressor] = {}
+        self._serializers_by_id: Dict[int, Serializer] = {}
+        self._compressors_by_id: Dict[int, Compressor] = {}
+        for serializer in BUILTIN_SERIALIZERS:
+            self.register_serializer(serializer)
+        for compressor in BUILTIN_COMPRESSORS:
+            self.register_compressor(compressor)
+
+        self.codecs: Dict[str, Codec] = {}
+        # 帧头(序列化器ID, 压缩器ID) -> 统计归属的编解码器
+        self._codecs_by_frame: Dict[Tuple[int, int], Codec] = {}
+        self._prefix_rules: List[Tuple[str, str]] = []
+        # (编解码器, 键前缀) -> 最近一次序列化的原始大小，用于预判是否转移到线程池
+        self._size_hints: Dict[Tuple[str, str], int] = {}
+
+        best_structured = "orjson" if ORJSON_AVAILABLE else "json"
+        best_compressor = "zstd" if ZSTD_AVAILABLE else ("lz4" if LZ4_AVAILABLE else "gzip")
+        self.register_codec("json", "json")
+        self.register_codec("json-gzip", "json", "gzip")
+        self.register_codec("pickle", "pickle")
+        self.register_codec("pickle-gzip", "pickle", "gzip")
+        self.register_codec("pickle-fast", "pickle", "lz4" if LZ4_AVAILABLE else best_compressor)
+        self.register_codec("structured", best_structured, best_compressor, compress_threshold=4096)
+        if MSGPACK_AVAILABLE:
+            self.register_codec("msgpack", "msgpack", best_compressor, compress_threshold=4096)
+        self.default_codec = "structured"
+
+    # ------------------------------------------------------------------
+    # 注册
+    # ------------------------------------------------------------------
+
+    def register_serializer(self, serializer: Serializer):
+        self.serializers[serializer.name] = serializer
+        self._serializers_by_id[serializer.id] = serializer
+
+    def register_compressor(self, compressor: Compressor):
+        self.compressors[compressor.name] = compressor
+        self._compressors_by_id[compressor.id] = compressor
+
+    def register_codec(self, name: str, serializer: str, compressor: str = "none",
+                       compress_threshold: int = 1024) -> Codec:
+        """注册编解码器；不可用的序列化器或压缩器回退到标准库实现"""
+        if serializer not in self.serializers:
+            logger.warning(f"Serializer {serializer} unavailable for codec {name}, using json")
+            serializer = "json"
+        if compressor not in self.compressors:
+            logger.warning(f"Compressor {compressor} unavailable for codec {name}, using gzip")
+            compressor = "gzip"
+
+        codec = Codec(name, self.serializers[serializer], self.compressors[compressor], compress_threshold)
+        self.codecs[name] = codec
+        self._codecs_by_frame.setdefault((codec.serializer.id, codec.compressor.id), codec)
+        self._codecs_by_frame.setdefault((codec.serializer.id, 0), codec)
+        return codec
+
+    def set_prefix_codec(self, prefix: str, codec_name: str):
+        """为键前缀指定编解码器（最长前缀优先）"""
+        if codec_name not in self.codecs:
+            raise ValueError(f"Unknown cache codec: {codec_name}")
+        self._prefix_rules = [(p, c) for p, c in self._prefix_rules if p != prefix]
+        self._prefix_rules.append((prefix, codec_name))
+        self._prefix_rules.sort(key=lambda rule: len(rule[0]), reverse=True)
+
+    def load_prefix_rules(self, rules: str):
+        """解析"prefix=codec,prefix2=codec2"格式的规则"""
+        for rule in rules.split(","):
+            if "=" not in rule:
+                continue
+            prefix, codec_name = (part.strip() for part in rule.split("=", 1))
+            try:
+                self.set_prefix_codec(prefix, codec_name)
+            except ValueError as e:
+                logger.warning(f"Ignoring cache codec rule {rule}: {e}")
+
+    def codec_for(self, key: Optional[str] = None, codec: Optional[str] = None) -> Codec:
+        """选择编解码器：键前缀规则 > 调用方默认 > 全局默认"""
+        if key is not None:
+            for prefix, codec_name in self._prefix_rules:
+                if key.startswith(prefix):
+                    return self.codecs[codec_name]
+        return self.codecs.get(codec or self.default_codec) or self.codecs[self.default_codec]
+
+    # ------------------------------------------------------------------
+    # 编解码
+    # ------------------------------------------------------------------
+
+    def encode_sync(self, value: Any, key: Optional[str] = None, codec: Optional[str] = None) -> bytes:
+        """同步编码"""
+        selected = self.codec_for(key, codec)
+        data, raw_size = selected.encode_sized(value)
+        if key is not None:
+            self._record_size_hint(selected, key, raw_size)
+        return data
+
+    @staticmethod
+    def _key_prefix(key: str) -> str:
+        # 同一前缀的键（如 user:1、user:2）通常大小相近
+        return key.rsplit(":", 1)[0]
+
+    def _record_size_hint(self, codec: Codec, key: str, raw_size: int):
+        if len(self._size_hints) >= MAX_SIZE_HINTS:
+            self._size_hints.clear()
+        self._size_hints[(codec.name, self._key_prefix(key))] = raw_size
+
+    def _should_offload_encode(self, value: Any, codec: Codec, key: Optional[str]) -> bool:
+        """编码前预判：字节串/字符串看长度，容器按元素数估算，否则看同前缀键上次的编码大小"""
+        if isinstance(value, (bytes, bytearray, str)):
+            return len(value) >= self.offload_threshold
+        if isinstance(value, (list, tuple, dict, set)) and \
+                len(value) * MIN_ITEM_BYTES >= self.offload_threshold:
+            return True
+        if key is None:
+            return False
+        return self._size_hints.get((codec.name, self._key_prefix(key)), 0) >= self.offload_threshold
+
+    def decode_sync(self, data: bytes, legacy: Optional[Callable[[bytes], Any]] = None) -> Any:
+        """同步解码；无帧头数据交给legacy解码"""
+        if len(data) < FRAME_HEADER_SIZE or data[0] != FRAME_MAGIC:
+            if legacy is None:
+                return _json_loads(data)
+            return legacy(data)
+
+        start = time.perf_counter()
+        serializer = self._serializers_by_id.get(data[1])
+        compressor = self._compressors_by_id.get(data[2])
+        if serializer is None or compressor is None:
+            raise ValueError(f"Unsupported cache frame (serializer={data[1]}, compressor={data[2]})")
+
+        payload = memoryview(data)[FRAME_HEADER_SIZE:]
+        value = serializer.loads(compressor.decompress(bytes(payload)) if compressor.id else bytes(payload))
+
+        owner = self._codecs_by_frame.get((serializer.id, compressor.id))
+        if owner is not None:
+            owner.stats.decodes += 1
+            owner.stats.decode_seconds += time.perf_counter() - start
+        return value
+
+    def _run(self, func: Callable, *args) -> "asyncio.Future":
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cache-codec")
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def encode(self, value: Any, key: Optional[str] = None, codec: Optional[str] = None) -> bytes:
+        """编码；预计较大的值序列化和压缩一起转移到线程池执行
+
+        预判未命中但序列化结果超过阈值时，压缩仍转移到线程池。
+        """
+        selected = self.codec_for(key, codec)
+        if self._should_offload_encode(value, selected, key):
+            selected.stats.offloaded += 1
+            return await self._run(self.encode_sync, value, key, selected.name)
+
+        start = time.perf_counter()
+        payload = selected.serializer.dumps(value)
+        serialize_seconds = time.perf_counter() - start
+        if key is not None:
+            self._record_size_hint(selected, key, len(payload))
+        if len(payload) >= self.offload_threshold and selected.will_compress(payload):
+            selected.stats.offloaded += 1
+            return await self._run(selected.frame, payload, serialize_seconds)
+        return selected.frame(payload, serialize_seconds)
+
+    async def decode(self, data: bytes, legacy: Optional[Callable[[bytes], Any]] = None) -> Any:
+        """解码；较大的数据转移到线程池执行（压缩数据按约4倍膨胀估算）"""
+        size = len(data)
+        if size >= FRAME_HEADER_SIZE and data[0] == FRAME_MAGIC and data[2]:
+            size *= 4
+        if size >= self.offload_threshold:
+            return await self._run(self.decode_sync, data, legacy)
+        return self.decode_sync(data, legacy)
+
+    # ------------------------------------------------------------------
+    # 统计与基准
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各编解码器统计"""
+        return {
+            "default_codec": self.default_codec,
+            "offload_threshold": self.offload_threshold,
+            "prefix_rules": dict(self._prefix_rules),
+            "available": {
+                "serializers": sorted(self.serializers),
+                "compressors": sorted(self.compressors)
+            },
+            "codecs": {name: codec.stats.to_dict() for name, codec in self.codecs.items()}
+        }
+
+    def benchmark(self, samples: Dict[str, Any], codecs: Optional[List[str]] = None,
+                  rounds: int = 20) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """对样本数据逐个编解码器测量编码/解码耗时和体积
+
+        使用独立的Codec实例，不影响线上统计。
+        """
+        results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for name in codecs or list(self.codecs):
+            template = self.codecs[name]
+            codec = Codec(name, template.serializer, template.compressor, template.compress_threshold)
+            results[name] = {}
+            for sample_name, value in samples.items():
+                try:
+                    data = codec.encode(value)
+                    start = time.perf_counter()
+                    for _ in range(rounds):
+                        codec.encode(value)
+                    encode_seconds = (time.perf_counter() - start) / rounds
+
+                    start = time.perf_counter()
+                    for _ in range(rounds):
+                        self.decode_sync(data)
+                    decode_seconds = (time.perf_counter() - start) / rounds
+                except Exception as e:
+                    results[name][sample_name] = {"error": str(e)}
+                    continue
+
+                raw_size = codec.stats.raw_bytes // codec.stats.encodes
+                results[name][sample_name] = {
+                    "raw_bytes": raw_size,
+                    "encoded_bytes": len(data),
+                    "ratio": round(len(data) / raw_size, 4) if raw_size else 1.0,
+                    "encode_us": round(encode_seconds * 1e6, 2),
+                    "decode_us": round(decode_seconds * 1e6, 2)
+                }
+        return results
+
+    def close(self):
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def sample_payloads() -> Dict[str, Any]:
+    """基准测试用的典型缓存负载：模型列表和分析报表"""
+    models = [
+        {
+            "id": f"provider/model-{i}",
+            "name": f"Model {i}",
+            "context_length": 8192 * (1 + i % 16),
+            "pricing": {"prompt": 0.0000015 * (i % 7 + 1), "completion": 0.000002 * (i % 5 + 1)},
+            "description": "General purpose chat model with tool use and long context support. " * 3,
+            "capabilities": ["chat", "tools", "vision"][: 1 + i % 3]
+        }
+        for i in range(300)
+    ]
+    analytics = {
+        "series": [
+            {"timestamp": 1700000000 + i * 60, "requests": 1000 + i % 97, "errors": i % 13,
+             "p95_ms": 120.5 + (i % 31) * 1.7}
+            for i in range(1440)
+        ],
+        "summary": {"total_requests": 1_450_000, "error_rate": 0.0123}
+    }
+    return {
+        "small": {"status": "ok", "count": 3},
+        "models": models,
+        "analytics": analytics
+    }
+
+
+_codec_registry: Optional[CodecRegistry] = None
+
+
+def get_codec_registry() -> CodecRegistry:
+    """获取全局编解码器注册表"""
+    global _codec_registry
+
+    if _codec_registry is None:
+        try:
+            from backend.config.settings import get_settings
+            settings = get_settings()
+            _codec_registry = CodecRegistry(offload_threshold=settings.cache_codec_offload_kb * 1024)
+            if settings.cache_codec_rules:
+                _codec_registry.load_prefix_rules(settings.cache_codec_rules)
+        except Exception as e:
+            logger.warning(f"Failed to load cache codec settings, using defaults: {e}")
+            _codec_registry = CodecRegistry()
+
+    return _codec_registry
+
+
+if __name__ == "__main__":
+    print(json.dumps(get_codec_registry().benchmark(sample_payloads()), indent=2, ensure_ascii=False))
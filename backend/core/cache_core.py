@@ -0,0 +1,953 @@
+"""
+统一缓存核心
+Unified Cache Core
+
+为所有缓存实现提供共享基础设施：
+- 可插拔的缓存层（内存、Redis或自定义层）
+- 进程级统一内存预算，跨命名空间按LRU淘汰
+- 按Redis地址共享的连接池
+- 跨命名空间、跨层一致的标签失效（标签代数可由失效总线跨进程同步）
+- 统一的统计接口
+
+各历史缓存类（CacheManager、CacheService、MultiLevelCache、SmartCache等）
+作为命名空间适配器构建在本模块之上。
+"""
+
+import json
+import logging
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import redis.asyncio as redis
+
+from backend.core.cache_codecs import CodecRegistry, get_codec_registry
+
+logger = logging.getLogger(__name__)
+
+
+# 估算容器大小时每层最多采样的元素数和递归深度
+_SIZE_SAMPLE = 16
+_SIZE_DEPTH = 4
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """估算值占用的字节数（容器按采样元素外推，不做完整序列化）"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value)
+    if value is None or isinstance(value, (bool, int, float)):
+        return 8
+    if _depth >= _SIZE_DEPTH:
+        return sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        count = len(value)
+        sampled = [estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+                   for k, v in islice(value.items(), _SIZE_SAMPLE)]
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        count = len(value)
+        sampled = [estimate_size(item, _depth + 1) for item in islice(value, _SIZE_SAMPLE)]
+    else:
+        return sys.getsizeof(value)
+    if not sampled:
+        return 2
+    return sum(sampled) * count // len(sampled) + 2 * count
+
+
+@dataclass
+class TierStats:
+    """缓存层统计"""
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    deletes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """命中率（0-1）"""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        data = asdict(self)
+        data["hit_rate"] = round(self.hit_rate, 4)
+        return data
+
+
+class CacheTier(ABC):
+    """缓存层接口"""
+
+    name: str = "tier"
+
+    def __init__(self):
+        self.stats = TierStats()
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """获取缓存值，未命中返回None"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: int, tags: Optional[Iterable[str]] = None) -> bool:
+        """设置缓存值"""
+
+    async def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float], Tuple[str, ...]]]:
+        """获取 (值, 剩余TTL秒数, 标签)，用于回填上层；剩余TTL为None表示未知或不过期"""
+        value = await self.get(key)
+        return None if value is None else (value, None, ())
+
+    @abstractmethod
+    async def delete(self, keys: Iterable[str]) -> int:
+        """删除缓存键，返回删除数量"""
+
+    @abstractmethod
+    async def tagged_keys(self, tag: str) -> Set[str]:
+        """获取带有指定标签的键"""
+
+    @abstractmethod
+    async def clear(self) -> bool:
+        """清空本层"""
+
+    async def delete_tag(self, tag: str, keys: Set[str]) -> None:
+        """清除标签索引"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取本层统计"""
+        return {"type": self.name, **self.stats.to_dict()}
+
+
+class TagGenerations:
+    """标签代数
+
+    每个标签对应一个单调递增的代数；条目写入时记录其标签的代数快照，
+    读取时若任一标签代数已前进则视为失效。标签失效因此是O(1)操作。
+    """
+
+    def __init__(self):
+        self._generations: Dict[str, int] = {}
+
+    def current(self, tag: str) -> int:
+        return self._generations.get(tag, 0)
+
+    def snapshot(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        """获取标签代数快照"""
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def is_stale(self, tags: Tuple[str, ...], snapshot: Tuple[int, ...]) -> bool:
+        """快照是否已过期"""
+        generations = self._generations
+        for tag, generation in zip(tags, snapshot):
+            if generations.get(tag, 0) != generation:
+                return True
+        return False
+
+    def bump(self, tag: str, to: Optional[int] = None) -> int:
+        """推进标签代数；指定to时只前进不后退"""
+        current = self._generations.get(tag, 0)
+        new = current + 1 if to is None else max(current, to)
+        self._generations[tag] = new
+        return new
+
+    def merge(self, generations: Dict[str, int]):
+        """合并远端代数（重连后同步）"""
+        for tag, generation in generations.items():
+            self.bump(tag, int(generation))
+
+    def __len__(self) -> int:
+        return len(self._generations)
+
+
+class _MemoryItem:
+    """内存缓存项"""
+    __slots__ = ("value", "expires_at", "size", "tags", "generations", "version")
+
+    def __init__(self, value: Any, expires_at: Optional[float], size: int, tags: Tuple[str, ...],
+                 generations: Tuple[int, ...] = (), version: int = 0):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+        self.generations = generations
+        # 写入时间（纳秒），用于判断跨进程失效消息是否晚于本地写入
+        self.version = version
+
+
+class MemoryBudget:
+    """进程级内存预算
+
+    所有内存层共享同一字节预算；超出预算时从占用最多的层淘汰其最久未使用条目。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.evictions = 0
+        self._tiers: List["MemoryTier"] = []
+
+    def register(self, tier: "MemoryTier"):
+        """注册内存层"""
+        if tier not in self._tiers:
+            self._tiers.append(tier)
+
+    def unregister(self, tier: "MemoryTier"):
+        """注销内存层"""
+        if tier in self._tiers:
+            self._tiers.remove(tier)
+            self.used_bytes -= tier.used_bytes
+
+    def charge(self, nbytes: int):
+        """记账并在超出预算时回收"""
+        self.used_bytes += nbytes
+        if nbytes > 0 and self.used_bytes > self.max_bytes:
+            self._reclaim()
+
+    def _reclaim(self):
+        """按占用从大到小淘汰，直至回到预算内"""
+        while self.used_bytes > self.max_bytes:
+            candidates = [tier for tier in self._tiers if tier.entry_count > 0]
+            if not candidates:
+                break
+            victim = max(candidates, key=lambda tier: tier.used_bytes)
+            if not victim.evict_lru():
+                break
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预算统计"""
+        return {
+            "max_bytes": self.max_bytes,
+            "used_bytes": self.used_bytes,
+            "utilization": round(self.used_bytes / self.max_bytes, 4) if self.max_bytes else 0.0,
+            "evictions": self.evictions,
+            "tiers": len(self._tiers)
+        }
+
+
+class MemoryTier(CacheTier):
+    """进程内LRU内存层，占用计入共享内存预算"""
+
+    name = "memory"
+
+    def __init__(self, budget: MemoryBudget, max_entries: Optional[int] = None,
+                 size_estimator: Callable[[Any], int] = estimate_size,
+                 generations: Optional[TagGenerations] = None):
+        super().__init__()
+        self.budget = budget
+        self.generations = generations
+        self.max_entries = max_entries
+        self.size_estimator = size_estimator
+        self.used_bytes = 0
+        self._items: "OrderedDict[str, _MemoryItem]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        budget.register(self)
+
+    @property
+    def entry_count(self) -> int:
+        return len(self._items)
+
+    def get_local(self, key: str) -> Optional[Any]:
+        """同步获取缓存值"""
+        item = self._items.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return None
+
+        if item.expires_at is not None and time.time() > item.expires_at:
+            self._remove(key)
+            self.stats.misses += 1
+            return None
+
+        if item.tags and self.generations is not None and \
+                self.generations.is_stale(item.tags, item.generations):
+            self._remove(key)
+            self.stats.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.stats.hits += 1
+        return item.value
+
+    def set_local(self, key: str, value: Any, ttl: Optional[int] = None,
+                  tags: Optional[Iterable[str]] = None, size: Optional[int] = None) -> bool:
+        """同步设置缓存值"""
+        if key in self._items:
+            self._remove(key)
+        elif self.max_entries and len(self._items) >= self.max_entries:
+            self.evict_lru()
+
+        tags = tuple(tags or ())
+        item = _MemoryItem(
+            value=value,
+            expires_at=time.time() + ttl if ttl and ttl > 0 else None,
+            size=size if size is not None else self.size_estimator(value),
+            tags=tags,
+            generations=self.generations.snapshot(tags) if tags and self.generations is not None else (),
+            version=time.time_ns()
+        )
+        self._items[key] = item
+        for tag in item.tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        self.used_bytes += item.size
+        self.stats.sets += 1
+        self.budget.charge(item.size)
+        return True
+
+    def delete_local(self, keys: Iterable[str]) -> int:
+        """同步删除缓存键"""
+        deleted = 0
+        for key in keys:
+            if self._remove(key):
+                deleted += 1
+        self.stats.deletes += deleted
+        return deleted
+
+    def delete_if_older(self, key: str, version: int) -> bool:
+        """仅当本地条目写入早于给定版本时删除（处理跨进程失效消息）"""
+        item = self._items.get(key)
+        if item is None or item.version >= version:
+            return False
+        self._remove(key)
+        self.stats.deletes += 1
+        return True
+
+    def peek(self, key: str) -> Optional[Any]:
+        """读取值但不影响LRU顺序和统计"""
+        item = self._items.get(key)
+        return item.value if item is not None else None
+
+    def keys(self) -> List[str]:
+        """当前所有键"""
+        return list(self._items.keys())
+
+    def evict_lru(self) -> bool:
+        """淘汰最久未使用的条目"""
+        if not self._items:
+            return False
+        key = next(iter(self._items))
+        self._remove(key)
+        self.stats.evictions += 1
+        return True
+
+    def purge_expired(self) -> int:
+        """清理过期条目"""
+        now = time.time()
+        expired = [key for key, item in self._items.items()
+                   if item.expires_at is not None and now > item.expires_at]
+        for key in expired:
+            self._remove(key)
+        return len(expired)
+
+    def _remove(self, key: str) -> bool:
+        item = self._items.pop(key, None)
+        if item is None:
+            return False
+        for tag in item.tags:
+            tagged = self._tags.get(tag)
+            if tagged is not None:
+                tagged.discard(key)
+                if not tagged:
+                    del self._tags[tag]
+        self.used_bytes -= item.size
+        self.budget.charge(-item.size)
+        return True
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.get_local(key)
+
+    async def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float], Tuple[str, ...]]]:
+        value = self.get_local(key)
+        if value is None:
+            return None
+        item = self._items[key]
+        remaining = item.expires_at - time.time() if item.expires_at is not None else None
+        return value, remaining, item.tags
+
+    async def set(self, key: str, value: Any, ttl: int, tags: Optional[Iterable[str]] = None) -> bool:
+        return self.set_local(key, value, ttl, tags)
+
+    async def delete(self, keys: Iterable[str]) -> int:
+        return self.delete_local(keys)
+
+    async def tagged_keys(self, tag: str) -> Set[str]:
+        return set(self._tags.get(tag, ()))
+
+    def clear_local(self):
+        """同步清空本层"""
+        self.budget.charge(-self.used_bytes)
+        self._items.clear()
+        self._tags.clear()
+        self.used_bytes = 0
+
+    async def clear(self) -> bool:
+        self.clear_local()
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update({
+            "entry_count": len(self._items),
+            "size_bytes": self.used_bytes,
+            "max_entries": self.max_entries
+        })
+        return stats
+
+
+class RedisPoolRegistry:
+    """按Redis地址共享的连接池注册表"""
+
+    def __init__(self, max_connections: int = 50):
+        self.max_connections = max_connections
+        self._pools: Dict[Tuple[str, bool], redis.ConnectionPool] = {}
+
+    def get_client(self, url: str, decode_responses: bool = False, **kwargs) -> redis.Redis:
+        """获取共享连接池上的客户端"""
+        pool_key = (url, decode_responses)
+        pool = self._pools.get(pool_key)
+        if pool is None:
+            pool = redis.ConnectionPool.from_url(
+                url,
+                decode_responses=decode_responses,
+                max_connections=kwargs.pop("max_connections", self.max_connections),
+                **kwargs
+            )
+            self._pools[pool_key] = pool
+            logger.info(f"Created shared Redis pool for {url}")
+        return redis.Redis(connection_pool=pool)
+
+    async def close(self):
+        """断开所有连接池"""
+        for pool in self._pools.values():
+            try:
+                await pool.disconnect()
+            except Exception as e:
+                logger.warning(f"Failed to disconnect Redis pool: {e}")
+        self._pools.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计"""
+        stats = {}
+        for (url, decode), pool in self._pools.items():
+            in_use = getattr(pool, "_in_use_connections", ())
+            available = getattr(pool, "_available_connections", ())
+            stats[f"{url}{' (decoded)' if decode else ''}"] = {
+                "max_connections": pool.max_connections,
+                "in_use": len(in_use),
+                "available": len(available)
+            }
+        return stats
+
+
+class RedisTier(CacheTier):
+    """Redis缓存层，使用共享连接池"""
+
+    name = "redis"
+
+    def __init__(self, client: redis.Redis, key_prefix: str = "",
+                 serializer: Callable[[Any], bytes] = None,
+                 deserializer: Callable[[bytes], Any] = None,
+                 codec: Optional[str] = None,
+                 legacy_decoder: Callable[[bytes], Any] = None,
+                 codecs: Optional[CodecRegistry] = None):
+        """未提供serializer/deserializer时使用编解码器注册表（按键前缀选择、大值转移到线程池），
+        legacy_decoder用于解码无帧头的历史数据
+        """
+        super().__init__()
+        self.client = client
+        self.key_prefix = key_prefix
+        self.serializer = serializer
+        self.deserializer = deserializer
+        self.codec = codec
+        self.legacy_decoder = legacy_decoder or json.loads
+        self.codecs = codecs
+
+    async def _encode(self, redis_key: str, value: Any) -> bytes:
+        if self.serializer is not None:
+            return self.serializer(value)
+        codecs = self.codecs or get_codec_registry()
+        return await codecs.encode(value, key=redis_key, codec=self.codec)
+
+    async def _decode(self, data: bytes) -> Any:
+        if self.deserializer is not None:
+            return self.deserializer(data)
+        codecs = self.codecs or get_codec_registry()
+        return await codecs.decode(data, legacy=self.legacy_decoder)
+
+    def _key(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.key_prefix}tag:{tag}"
+
+    def _entry_tags_key(self, key: str) -> str:
+        return f"{self.key_prefix}entrytags:{key}"
+
+    async def _decode_value(self, key: str, data: Optional[bytes]) -> Optional[Any]:
+        if data is None:
+            self.stats.misses += 1
+            return None
+
+        try:
+            value = await self._decode(data)
+        except Exception as e:
+            logger.error(f"Failed to decode cached data for key {key}: {e}")
+            await self.delete([key])
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        return value
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            data = await self.client.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"Redis tier get failed for {key}: {e}")
+            self.stats.misses += 1
+            return None
+        return await self._decode_value(key, data)
+
+    async def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float], Tuple[str, ...]]]:
+        """一次往返取回值、剩余TTL和条目标签"""
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.get(self._key(key))
+            pipe.pttl(self._key(key))
+            pipe.smembers(self._entry_tags_key(key))
+            data, pttl, tags = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis tier get failed for {key}: {e}")
+            self.stats.misses += 1
+            return None
+
+        value = await self._decode_value(key, data)
+        if value is None:
+            return None
+        remaining = pttl / 1000 if pttl is not None and pttl > 0 else None
+        tags = tuple(sorted(t.decode("utf-8") if isinstance(t, bytes) else t for t in tags or ()))
+        return value, remaining, tags
+
+    async def set(self, key: str, value: Any, ttl: int, tags: Optional[Iterable[str]] = None) -> bool:
+        try:
+            redis_key = self._key(key)
+            data = await self._encode(redis_key, value)
+            expires = ttl if ttl and ttl > 0 else None
+            tags = tuple(tags or ())
+            entry_tags_key = self._entry_tags_key(key)
+
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(redis_key, data, ex=expires)
+            pipe.delete(entry_tags_key)
+            if tags:
+                # 条目自身的标签随条目过期，供回填上层时保留标签
+                pipe.sadd(entry_tags_key, *tags)
+                if expires:
+                    pipe.expire(entry_tags_key, expires)
+            for tag in tags:
+                # 先读取标签索引原有TTL，再加入成员
+                pipe.ttl(self._tag_key(tag))
+                pipe.sadd(self._tag_key(tag), key)
+            results = await pipe.execute()
+
+            if tags:
+                await self._extend_tag_indexes(tags, results[-2 * len(tags)::2], expires)
+            self.stats.sets += 1
+            return True
+        except Exception as e:
+            logger.warning(f"Redis tier set failed for {key}: {e}")
+            return False
+
+    async def _extend_tag_indexes(self, tags: Tuple[str, ...], previous_ttls: List[int], expires: Optional[int]):
+        """标签索引的TTL只延长不缩短，保证不早于其中任何条目过期"""
+        pipe = self.client.pipeline(transaction=False)
+        pending = False
+        for tag, previous in zip(tags, previous_ttls):
+            tag_key = self._tag_key(tag)
+            if previous == -1:
+                continue  # 已是永久索引
+            if expires is None:
+                pipe.persist(tag_key)
+                pending = True
+            elif previous == -2 or previous < expires:
+                pipe.expire(tag_key, expires)
+                pending = True
+        if pending:
+            await pipe.execute()
+
+    async def delete(self, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        redis_keys = [self._key(key) for key in keys]
+        if not redis_keys:
+            return 0
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(*redis_keys)
+            pipe.delete(*(self._entry_tags_key(key) for key in keys))
+            deleted = (await pipe.execute())[0]
+            self.stats.deletes += deleted
+            return deleted
+        except Exception as e:
+            logger.warning(f"Redis tier delete failed: {e}")
+            return 0
+
+    async def tagged_keys(self, tag: str) -> Set[str]:
+        try:
+            members = await self.client.smembers(self._tag_key(tag))
+        except Exception as e:
+            logger.warning(f"Redis tier tag lookup failed for {tag}: {e}")
+            return set()
+        return {m.decode("utf-8") if isinstance(m, bytes) else m for m in members}
+
+    async def delete_tag(self, tag: str, keys: Set[str]) -> None:
+        try:
+            await self.client.delete(self._tag_key(tag))
+        except Exception as e:
+            logger.warning(f"Redis tier tag delete failed for {tag}: {e}")
+
+    async def scan_keys(self, pattern: str = "*") -> List[str]:
+        """按模式扫描键（不含前缀）"""
+        prefix_len = len(self.key_prefix)
+        keys = []
+        try:
+            async for redis_key in self.client.scan_iter(match=self._key(pattern), count=500):
+                if isinstance(redis_key, bytes):
+                    redis_key = redis_key.decode("utf-8")
+                keys.append(redis_key[prefix_len:])
+        except Exception as e:
+            logger.warning(f"Redis tier scan failed for {pattern}: {e}")
+        return keys
+
+    async def clear(self) -> bool:
+        keys = await self.scan_keys("*")
+        if keys:
+            await self.delete(keys)
+        return True
+
+
+class CacheNamespace:
+    """缓存命名空间：按层级顺序组合的缓存层"""
+
+    def __init__(self, name: str, tiers: List[CacheTier], default_ttl: int = 300,
+                 broadcast: bool = False):
+        self.name = name
+        self.tiers = tiers
+        self.default_ttl = default_ttl
+        # 写入/删除时是否通知其他进程失效其本地内存层
+        self.broadcast = broadcast
+        self.core: Optional["CacheCore"] = None
+        self.stats = TierStats()
+
+    def _publish(self, key: str):
+        if self.broadcast and self.core is not None:
+            self.core.publish_invalidation(self.name, key)
+
+    def _observe(self, key: str, hit: bool):
+        if self.core is not None and self.core.access_observers:
+            self.core.observe_access(self.name, key, hit)
+
+    def get_tier(self, tier_type: type) -> Optional[CacheTier]:
+        """按类型获取缓存层"""
+        for tier in self.tiers:
+            if isinstance(tier, tier_type):
+                return tier
+        return None
+
+    def add_tier(self, tier: CacheTier) -> CacheTier:
+        """追加缓存层；已有同类型的层时返回已有的层（多个适配器共享同一命名空间）"""
+        existing = self.get_tier(type(tier))
+        if existing is not None:
+            return existing
+        self.tiers.append(tier)
+        return tier
+
+    async def get(self, key: str) -> Optional[Any]:
+        """按层级查找，命中后回填更高层级
+
+        回填保留来源条目的标签（使标签失效能清除回填副本）和剩余TTL（回填副本不晚于来源过期）。
+        """
+        for index, tier in enumerate(self.tiers):
+            if index == 0:
+                # 最高层命中无需回填
+                value = await tier.get(key)
+                if value is not None:
+                    self.stats.hits += 1
+                    self._observe(key, True)
+                    return value
+                continue
+
+            entry = await tier.get_entry(key)
+            if entry is not None:
+                value, remaining, tags = entry
+                ttl = max(1, int(remaining)) if remaining is not None else self.default_ttl
+                for upper in self.tiers[:index]:
+                    await upper.set(key, value, ttl, tags)
+                self.stats.hits += 1
+                self._observe(key, True)
+                return value
+
+        self.stats.misses += 1
+        self._observe(key, False)
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None,
+                  tags: Optional[Iterable[str]] = None) -> bool:
+        """写入所有层级"""
+        ttl = ttl or self.default_ttl
+        tags = tuple(tags or ())
+        success = True
+        for tier in self.tiers:
+            success = await tier.set(key, value, ttl, tags) and success
+        self.stats.sets += 1
+        self._publish(key)
+        return success
+
+    async def delete(self, key: str) -> bool:
+        """从所有层级删除"""
+        deleted = 0
+        for tier in self.tiers:
+            deleted += await tier.delete([key])
+        self.stats.deletes += 1
+        self._publish(key)
+        return deleted > 0
+
+    async def invalidate_tag(self, tag: str) -> int:
+        """按标签失效所有层级中的条目"""
+        keys: Set[str] = set()
+        for tier in self.tiers:
+            keys |= await tier.tagged_keys(tag)
+
+        deleted = 0
+        if keys:
+            for tier in self.tiers:
+                deleted = max(deleted, await tier.delete(keys))
+        for tier in self.tiers:
+            await tier.delete_tag(tag, keys)
+
+        self.stats.deletes += deleted
+        return deleted
+
+    def apply_remote_invalidation(self, keys: Dict[str, int]) -> int:
+        """应用其他进程发来的键失效，只作用于本进程内存层"""
+        dropped = 0
+        for tier in self.tiers:
+            if isinstance(tier, MemoryTier):
+                for key, version in keys.items():
+                    if tier.delete_if_older(key, version):
+                        dropped += 1
+        return dropped
+
+    async def clear(self) -> bool:
+        """清空所有层级"""
+        success = True
+        for tier in self.tiers:
+            success = await tier.clear() and success
+        return success
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命名空间统计"""
+        return {
+            **self.stats.to_dict(),
+            "default_ttl": self.default_ttl,
+            "tiers": [tier.get_stats() for tier in self.tiers]
+        }
+
+
+class CacheCore:
+    """统一缓存核心"""
+
+    def __init__(self, memory_budget_bytes: int = 256 * 1024 * 1024,
+                 redis_url: Optional[str] = None, redis_max_connections: int = 50):
+        self.budget = MemoryBudget(memory_budget_bytes)
+        self.redis_pools = RedisPoolRegistry(redis_max_connections)
+        self.redis_url = redis_url
+        self.generations = TagGenerations()
+        self.namespaces: Dict[str, CacheNamespace] = {}
+        # 跨进程失效总线（见cache_invalidation模块），未启动时仅本进程生效
+        self.bus = None
+        # 访问观察者 (namespace, key, hit)，供缓存预热等按真实访问建模
+        self.access_observers: List[Callable[[str, str, bool], None]] = []
+
+    def memory_tier(self, max_entries: Optional[int] = None) -> MemoryTier:
+        """创建计入共享预算的内存层"""
+        return MemoryTier(self.budget, max_entries=max_entries, generations=self.generations)
+
+    def redis_client(self, url: Optional[str] = None, decode_responses: bool = False) -> Optional[redis.Redis]:
+        """获取共享连接池上的Redis客户端"""
+        url = url or self.redis_url
+        if not url:
+            return None
+        return self.redis_pools.get_client(url, decode_responses=decode_responses)
+
+    def redis_tier(self, key_prefix: str = "", url: Optional[str] = None, **kwargs) -> Optional[RedisTier]:
+        """创建使用共享连接池的Redis层"""
+        client = self.redis_client(url)
+        if client is None:
+            return None
+        return RedisTier(client, key_prefix=key_prefix, **kwargs)
+
+    def namespace(self, name: str, tiers: Optional[List[CacheTier]] = None,
+                  default_ttl: int = 300, memory: bool = True, use_redis: bool = False,
+                  max_entries: Optional[int] = None, key_prefix: Optional[str] = None,
+                  broadcast: Optional[bool] = None) -> CacheNamespace:
+        """获取或创建命名空间
+
+        未显式提供tiers时按参数组装内存层和Redis层。broadcast默认在使用Redis层时开启。
+        """
+        existing = self.namespaces.get(name)
+        if existing is not None:
+            return existing
+
+        if tiers is None:
+            tiers = []
+            if memory:
+                tiers.append(self.memory_tier(max_entries))
+            if use_redis:
+                redis_tier = self.redis_tier(key_prefix if key_prefix is not None else f"{name}:")
+                if redis_tier is not None:
+                    tiers.append(redis_tier)
+
+        namespace = CacheNamespace(
+            name, tiers, default_ttl,
+            broadcast=use_redis if broadcast is None else broadcast
+        )
+        return self.register(namespace)
+
+    def register(self, namespace: Any) -> Any:
+        """注册外部构建的命名空间，使其参与标签失效和统计
+
+        除CacheNamespace外，任何提供name和get_stats()的缓存适配器均可注册；
+        提供invalidate_tag()的适配器同时参与全局标签失效。
+        """
+        if isinstance(namespace, CacheNamespace):
+            namespace.core = self
+        self.namespaces[namespace.name] = namespace
+        return namespace
+
+    def add_access_observer(self, observer: Callable[[str, str, bool], None]):
+        """注册访问观察者，命名空间每次查找（命中或未命中）时同步调用"""
+        if observer not in self.access_observers:
+            self.access_observers.append(observer)
+
+    def remove_access_observer(self, observer: Callable[[str, str, bool], None]):
+        if observer in self.access_observers:
+            self.access_observers.remove(observer)
+
+    def observe_access(self, namespace: str, key: str, hit: bool):
+        """通知访问观察者；观察者异常不影响缓存读取"""
+        for observer in list(self.access_observers):
+            try:
+                observer(namespace, key, hit)
+            except Exception as e:
+                logger.warning(f"Cache access observer failed for {namespace}:{key}: {e}")
+
+    def publish_invalidation(self, namespace: str, key: str):
+        """通知其他进程失效指定键的本地副本"""
+        if self.bus is not None:
+            self.bus.invalidate_key(namespace, key)
+
+    def apply_remote_invalidation(self, namespace: str, keys: Dict[str, int]) -> int:
+        """应用其他进程的键失效"""
+        target = self.namespaces.get(namespace)
+        apply = getattr(target, "apply_remote_invalidation", None)
+        if apply is None:
+            return 0
+        try:
+            return apply(keys)
+        except Exception as e:
+            logger.error(f"Failed to apply remote invalidation in namespace {namespace}: {e}")
+            return 0
+
+    def clear_local_tiers(self) -> int:
+        """清空所有本进程内存层（失效消息可能丢失时的保守同步）"""
+        cleared = 0
+        for tier in list(self.budget._tiers):
+            cleared += tier.entry_count
+            tier.clear_local()
+        return cleared
+
+    def drop(self, name: str):
+        """移除命名空间并释放其内存预算"""
+        namespace = self.namespaces.pop(name, None)
+        if namespace is None:
+            return
+        for tier in getattr(namespace, "tiers", ()):
+            if isinstance(tier, MemoryTier):
+                tier.clear_local()
+                self.budget.unregister(tier)
+
+    async def invalidate_tag(self, tag: str) -> int:
+        """在所有命名空间中按标签失效，并推进标签代数通知其他进程"""
+        if self.bus is not None:
+            # 代数由总线经Redis分配，保证各进程一致
+            self.bus.invalidate_tag(tag)
+        else:
+            self.generations.bump(tag)
+
+        total = 0
+        for namespace in list(self.namespaces.values()):
+            invalidate = getattr(namespace, "invalidate_tag", None)
+            if invalidate is None:
+                continue
+            try:
+                total += await invalidate(tag)
+            except Exception as e:
+                logger.error(f"Tag invalidation failed in namespace {namespace.name}: {e}")
+        return total
+
+    def get_stats(self) -> Dict[str, Any]:
+        """统一统计接口"""
+        namespace_stats = {}
+        for name, namespace in self.namespaces.items():
+            try:
+                namespace_stats[name] = namespace.get_stats()
+            except Exception as e:
+                namespace_stats[name] = {"error": str(e)}
+
+        hits = sum(stats.get("hits", 0) for stats in namespace_stats.values())
+        misses = sum(stats.get("misses", 0) for stats in namespace_stats.values())
+        return {
+            "overall": {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                "namespaces": len(self.namespaces)
+            },
+            "memory_budget": self.budget.get_stats(),
+            "invalidation_bus": self.bus.get_stats() if self.bus is not None else None,
+            "redis_pools": self.redis_pools.get_stats(),
+            "namespaces": namespace_stats
+        }
+
+    async def close(self):
+        """关闭共享连接池"""
+        await self.redis_pools.close()
+
+
+_cache_core: Optional[CacheCore] = None
+
+
+def get_cache_core() -> CacheCore:
+    """获取全局缓存核心实例"""
+    global _cache_core
+
+    if _cache_core is None:
+        try:
+            from backend.config.settings import get_settings
+            settings = get_settings()
+            _cache_core = CacheCore(
+                memory_budget_bytes=settings.cache_memory_budget_mb * 1024 * 1024,
+                redis_url=settings.redis_url,
+                redis_max_connections=settings.redis_max_connections
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load cache settings, using defaults: {e}")
+            _cache_core = CacheCore()
+
+    return _cache_core
@@ -0,0 +1,339 @@
+"""
+跨进程缓存失效总线
+Cross-worker Cache Invalidation Bus
+
+多个worker进程各自持有本地内存缓存（L1），通过Redis pub/sub同步失效：
+- 键失效携带写入版本（纳秒时间戳），接收方只删除早于该版本的本地副本
+- 标签失效以代数形式持久化在Redis哈希中，接收方推进本地代数即可使相关条目失效
+- 短时间窗口内的失效合并为一条消息，降低发布频率
+- 订阅断开重连后从Redis恢复标签代数；若期间可能丢失键失效消息，则清空本地内存层
+- 发布失败时失效重新排队并延迟重试；积压超过上限时改为要求各进程清空本地内存层
+
+因此本地内存层可以使用较长的TTL而不会长期返回陈旧数据。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, Optional, Set
+
+from backend.core.cache_core import CacheCore, get_cache_core
+
+logger = logging.getLogger(__name__)
+
+
+class CacheInvalidationBus:
+    """基于Redis pub/sub的缓存失效总线"""
+
+    def __init__(self, core: CacheCore, redis_client: Any,
+                 channel: str = "cache:invalidate",
+                 coalesce_window: float = 0.005,
+                 max_batch: int = 500,
+                 max_pending: int = 10000,
+                 reconnect_delay: float = 1.0):
+        self.core = core
+        self.redis = redis_client
+        self.channel = channel
+        self.generations_key = f"{channel}:generations"
+        self.sequence_key = f"{channel}:seq"
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.reconnect_delay = reconnect_delay
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        # 待发布的失效：{namespace: {key: version}} 与标签集合
+        self._pending_keys: Dict[str, Dict[str, int]] = {}
+        self._pending_tags: Set[str] = set()
+        self._pending_count = 0
+        # 积压的键失效被丢弃后，下一条消息要求各进程清空本地内存层
+        self._pending_clear = False
+        # 上次发布失败，等待重试期间不因积压立即发布
+        self._backoff = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self._listener_task: Optional[asyncio.Task] = None
+        self._running = False
+        self._last_sequence = 0
+
+        self.stats = {
+            "published_messages": 0,
+            "published_keys": 0,
+            "published_tags": 0,
+            "received_messages": 0,
+            "applied_keys": 0,
+            "applied_tags": 0,
+            "resyncs": 0,
+            "full_clears": 0,
+            "requeued": 0,
+            "errors": 0
+        }
+
+    # ------------------------------------------------------------------
+    # 发布
+    # ------------------------------------------------------------------
+
+    def invalidate_key(self, namespace: str, key: str, version: Optional[int] = None):
+        """登记键失效，在合并窗口结束后发布"""
+        keys = self._pending_keys.setdefault(namespace, {})
+        if key not in keys:
+            self._pending_count += 1
+        keys[key] = version if version is not None else time.time_ns()
+        self._schedule_flush()
+
+    def invalidate_tag(self, tag: str):
+        """登记标签失效"""
+        if tag not in self._pending_tags:
+            self._pending_tags.add(tag)
+            self._pending_count += 1
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 无事件循环（同步上下文）时等待下一次发布或stop()时刷新
+            return
+
+        if self._pending_count >= self.max_batch and not self._backoff:
+            self._start_flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.coalesce_window, self._start_flush, loop)
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self.flush())
+
+    async def flush(self) -> int:
+        """发布所有待处理的失效，返回发布的条目数"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending_count and not self._pending_clear:
+            return 0
+
+        keys, tags, clear = self._pending_keys, self._pending_tags, self._pending_clear
+        self._pending_keys, self._pending_tags, self._pending_count = {}, set(), 0
+        self._pending_clear = False
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for tag in tags:
+                pipe.hincrby(self.generations_key, tag, 1)
+            pipe.incr(self.sequence_key)
+            results = await pipe.execute()
+
+            generations = {tag: int(results[i]) for i, tag in enumerate(tags)}
+            sequence = int(results[-1])
+            payload = {
+                "origin": self.worker_id,
+                "seq": sequence,
+                "keys": keys,
+                "tags": generations
+            }
+            if clear:
+                payload["clear"] = True
+            message = json.dumps(payload, separators=(",", ":"))
+            await self.redis.publish(self.channel, message)
+
+            # 使用Redis分配的代数，保证各进程代数一致
+            self.core.generations.merge(generations)
+            self._last_sequence = max(self._last_sequence, sequence)
+            self._backoff = False
+
+            published = sum(len(items) for items in keys.values()) + len(tags)
+            self.stats["published_messages"] += 1
+            self.stats["published_keys"] += published - len(tags)
+            self.stats["published_tags"] += len(tags)
+            return published
+
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to publish cache invalidation, retrying in {self.reconnect_delay}s: {e}")
+            self._requeue(keys, tags, clear)
+            return 0
+
+    def _requeue(self, keys: Dict[str, Dict[str, int]], tags: Set[str], clear: bool):
+        """发布失败的失效并回待发布集合（同一键保留较新的版本），延迟后重试"""
+        for namespace, items in keys.items():
+            pending = self._pending_keys.setdefault(namespace, {})
+            for key, version in items.items():
+                if key not in pending:
+                    self._pending_count += 1
+                pending[key] = max(pending.get(key, 0), version)
+        for tag in tags - self._pending_tags:
+            self._pending_tags.add(tag)
+            self._pending_count += 1
+        self._pending_clear = self._pending_clear or clear
+        self._backoff = True
+        self.stats["requeued"] += 1
+
+        key_count = self._pending_count - len(self._pending_tags)
+        if key_count > self.max_pending:
+            # Redis长时间不可用：不再逐键保留，恢复后要求各进程整体清空本地内存层
+            self._pending_keys = {}
+            self._pending_count = len(self._pending_tags)
+            self._pending_clear = True
+            logger.warning(f"Dropped {key_count} pending key invalidations, peers will clear local tiers")
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.reconnect_delay, self._start_flush, loop)
+
+    # ------------------------------------------------------------------
+    # 订阅
+    # ------------------------------------------------------------------
+
+    def apply_message(self, data: Any) -> bool:
+        """应用一条失效消息；返回是否被应用（自身发出的消息被忽略）"""
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        message = json.loads(data) if isinstance(data, str) else data
+        # 各进程INCR与PUBLISH之间可能交错，序号仅用于重连后判断是否错过消息
+        self._last_sequence = max(self._last_sequence, int(message.get("seq", 0)))
+
+        if message.get("origin") == self.worker_id:
+            return False
+
+        self.stats["received_messages"] += 1
+        if message.get("clear"):
+            self._full_clear()
+        for namespace, keys in message.get("keys", {}).items():
+            self.stats["applied_keys"] += self.core.apply_remote_invalidation(namespace, keys)
+        tags = message.get("tags", {})
+        if tags:
+            self.core.generations.merge(tags)
+            self.stats["applied_tags"] += len(tags)
+        return True
+
+    async def resync(self):
+        """(重新)订阅后从Redis恢复状态"""
+        generations = await self.redis.hgetall(self.generations_key)
+        self.core.generations.merge({
+            (tag.decode("utf-8") if isinstance(tag, bytes) else tag): int(generation)
+            for tag, generation in (generations or {}).items()
+        })
+
+        sequence = int(await self.redis.get(self.sequence_key) or 0)
+        if self._last_sequence and sequence > self._last_sequence:
+            # 断开期间有其他进程发布过键失效，无法逐条补偿
+            self._full_clear()
+        self._last_sequence = max(self._last_sequence, sequence)
+        self.stats["resyncs"] += 1
+
+    def _full_clear(self):
+        cleared = self.core.clear_local_tiers()
+        self.stats["full_clears"] += 1
+        logger.warning(f"Cache invalidation messages may have been missed, cleared {cleared} local entries")
+
+    async def _listen(self):
+        while self._running:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                await self.resync()
+                while self._running:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None or message.get("type") != "message":
+                        continue
+                    try:
+                        self.apply_message(message["data"])
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        logger.error(f"Failed to apply cache invalidation message: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Cache invalidation subscription lost, reconnecting: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """开始监听并挂载到缓存核心"""
+        if self._running:
+            return
+        self._running = True
+        self.core.bus = self
+        self._listener_task = asyncio.create_task(self._listen())
+        logger.info(f"Cache invalidation bus started on channel {self.channel} ({self.worker_id})")
+
+    async def stop(self):
+        """刷新待发布的失效并停止监听"""
+        self._running = False
+        await self.flush()
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener_task = None
+        if self.core.bus is self:
+            self.core.bus = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取总线统计"""
+        return {
+            **self.stats,
+            "worker_id": self.worker_id,
+            "running": self._running,
+            "pending": self._pending_count,
+            "pending_clear": self._pending_clear,
+            "last_sequence": self._last_sequence,
+            "tag_generations": len(self.core.generations)
+        }
+
+
+_invalidation_bus: Optional[CacheInvalidationBus] = None
+
+
+async def start_invalidation_bus() -> Optional[CacheInvalidationBus]:
+    """启动全局失效总线（Redis不可用时返回None，各进程缓存退化为独立运行）"""
+    global _invalidation_bus
+
+    if _invalidation_bus is not None:
+        return _invalidation_bus
+
+    core = get_cache_core()
+    client = core.redis_client()
+    if client is None:
+        return None
+
+    try:
+        await client.ping()
+    except Exception as e:
+        logger.warning(f"Redis unavailable, cache invalidation bus disabled: {e}")
+        return None
+
+    _invalidation_bus = CacheInvalidationBus(core, client)
+    await _invalidation_bus.start()
+    return _invalidation_bus
+
+
+async def stop_invalidation_bus():
+    """停止全局失效总线"""
+    global _invalidation_bus
+
+    if _invalidation_bus is not None:
+        await _invalidation_bus.stop()
+        _invalidation_bus = None
@@ -9,6 +9,8 @@ from typing import Any, Optional, Dict, Union
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+from backend.core.cache_core import get_cache_core, CacheNamespace, TierStats
+
 
 @dataclass
 class CacheItem:
@@ -33,15 +35,18 @@ class CacheItem:
 
 
 class CacheService:
-    """内存缓存服务"""
+    """内存缓存服务（统一缓存核心上的内存命名空间适配器）"""
 
-    def __init__(self, default_ttl: int = 300, max_size: int = 1000):
+    def __init__(self, default_ttl: int = 300, max_size: int = 1000, name: str = "service"):
         self.default_ttl = default_ttl
         self.max_size = max_size
-        self._cache: Dict[str, CacheItem] = {}
-        self._access_times: Dict[str, float] = {}
-        self._hits = 0
-        self._misses = 0
+        self.name = name
+        self._core = get_cache_core()
+        self._tier = self._core.memory_tier(max_entries=max_size)
+        # 写入和删除经失效总线通知其他worker
+        self._namespace = self._core.register(
+            CacheNamespace(name, [self._tier], default_ttl, broadcast=True)
+        )
 
     def _make_key(self, key: str, *args, **kwargs) -> str:
         """生成缓存键"""
@@ -51,100 +56,51 @@ class CacheService:
             return f"{key}:{hashlib.md5(params.encode()).hexdigest()}"
         return key
 
-    def _evict_if_needed(self):
-        """如果需要，驱逐最旧的缓存项"""
-        if len(self._cache) < self.max_size:
-            return
-
-        # 找到最久未访问的项
-        oldest_key = min(self._access_times.keys(),
-                        key=lambda k: self._access_times[k])
-
-        del self._cache[oldest_key]
-        del self._access_times[oldest_key]
-
     def set(self, key: str, value: Any, ttl: Optional[int] = None,
             *args, **kwargs) -> str:
         """设置缓存"""
         cache_key = self._make_key(key, *args, **kwargs)
 
         # 计算过期时间
-        expires_at = None
-        if ttl is not None:
-            expires_at = time.time() + ttl
-        elif self.default_ttl > 0:
-            expires_at = time.time() + self.default_ttl
-
-        # 驱逐旧缓存
-        self._evict_if_needed()
-
-        # 设置新缓存
-        self._cache[cache_key] = CacheItem(
-            value=value,
-            expires_at=expires_at
-        )
-        self._access_times[cache_key] = time.time()
+        if ttl is None and self.default_ttl > 0:
+            ttl = self.default_ttl
 
+        self._tier.set_local(cache_key, value, ttl)
+        self._core.publish_invalidation(self.name, cache_key)
         return cache_key
 
     def get(self, key: str, *args, **kwargs) -> Optional[Any]:
         """获取缓存"""
         cache_key = self._make_key(key, *args, **kwargs)
-
-        if cache_key not in self._cache:
-            self._misses += 1
-            return None
-
-        item = self._cache[cache_key]
-
-        # 检查是否过期
-        if item.is_expired():
-            del self._cache[cache_key]
-            del self._access_times[cache_key]
-            self._misses += 1
-            return None
-
-        # 更新访问时间
-        self._access_times[cache_key] = time.time()
-        self._hits += 1
-
-        return item.value
+        return self._tier.get_local(cache_key)
 
     def delete(self, key: str, *args, **kwargs):
         """删除缓存"""
         cache_key = self._make_key(key, *args, **kwargs)
-
-        if cache_key in self._cache:
-            del self._cache[cache_key]
-            del self._access_times[cache_key]
+        self._tier.delete_local([cache_key])
+        self._core.publish_invalidation(self.name, cache_key)
 
     def clear(self):
         """清空缓存"""
-        self._cache.clear()
-        self._access_times.clear()
-        self._hits = 0
-        self._misses = 0
+        self._tier.clear_local()
+        self._tier.stats = TierStats()
 
     def get_stats(self) -> Dict[str, Any]:
         """获取缓存统计"""
-        total_requests = self._hits + self._misses
-        hit_rate = (self._hits / total_requests) if total_requests > 0 else 0
+        stats = self._tier.stats
 
         return {
-            "hits": self._hits,
-            "misses": self._misses,
-            "hit_rate": hit_rate,
-            "total_items": len(self._cache),
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "hit_rate": stats.hit_rate,
+            "total_items": self._tier.entry_count,
             "max_size": self.max_size,
             "memory_usage": self._estimate_memory_usage()
         }
 
     def _estimate_memory_usage(self) -> str:
         """估算内存使用量"""
-        total_size = 0
-        for key, item in self._cache.items():
-            total_size += len(key.encode())
-            total_size += len(str(item.value).encode())
+        total_size = self._tier.used_bytes
 
         # 转换为人类可读格式
         if total_size < 1024:
@@ -156,18 +112,7 @@ class CacheService:
 
     def cleanup_expired(self):
         """清理过期缓存"""
-        current_time = time.time()
-        expired_keys = []
-
-        for key, item in self._cache.items():
-            if item.is_expired():
-                expired_keys.append(key)
-
-        for key in expired_keys:
-            del self._cache[key]
-            del self._access_times[key]
-
-        return len(expired_keys)
+        return self._tier.purge_expired()
 
 
 # 全局缓存实例
@@ -5,6 +5,7 @@ Week 6 Day 2: 性能优化和调优 - 缓存系统优化
 """
 
 import asyncio
+import fnmatch
 import json
 import time
 import hashlib
@@ -16,13 +17,10 @@ from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
 from contextlib import asynccontextmanager
-import aioredis
-import aiomcache
-from cachetools import TTLCache, LRUCache
 from functools import wraps
-import numpy as np
 
 from backend.config.settings import get_settings
+from backend.core.cache_core import get_cache_core, CacheNamespace, CacheTier
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -75,447 +73,106 @@ class CacheStats:
     size_bytes: int = 0
     entry_count: int = 0
 
-class MemoryCache:
-    """内存缓存实现"""
+def _build_codec(config: CacheConfig) -> Tuple[str, Callable[[bytes], Any]]:
+    """根据配置选择编解码器名称，并构建历史格式（首字节标记是否压缩）的解码函数"""
+    if config.serialization == "pickle":
+        codec = "pickle-fast" if config.compression else "pickle"
+    else:
+        codec = "structured" if config.compression else "json"
 
-    def __init__(self, config: CacheConfig):
-        self.config = config
-        self.cache: Dict[str, CacheEntry] = {}
-        self.access_order = []  # LRU访问顺序
-        self.stats = CacheStats()
-        self._lock = asyncio.Lock()
-
-    def _generate_cache_key(self, key: str, version: int = 1) -> str:
-        """生成缓存键"""
-        return f"{key}:v{version}"
-
-    async def get(self, key: str) -> Optional[Any]:
-        """获取缓存值"""
-        async with self._lock:
-            entry = self.cache.get(key)
-            if entry is None:
-                self.stats.misses += 1
-                return None
-
-            # 检查是否过期
-            if datetime.now() > entry.expires_at:
-                await self.delete(key)
-                self.stats.misses += 1
-                return None
-
-            # 更新访问信息
-            entry.access_count += 1
-            entry.last_accessed = datetime.now()
-            self._update_access_order(key)
-
-            self.stats.hits += 1
-            return self._deserialize_value(entry.value, entry.compressed)
-
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """设置缓存值"""
-        async with self._lock:
-            try:
-                current_time = datetime.now()
-                actual_ttl = ttl or self.config.ttl
-                expires_at = current_time + timedelta(seconds=actual_ttl)
-
-                # 序列化值
-                serialized_value, compressed = self._serialize_value(value)
-
-                entry = CacheEntry(
-                    key=key,
-                    value=serialized_value,
-                    created_at=current_time,
-                    expires_at=expires_at,
-                    size_bytes=len(serialized_value),
-                    compressed=compressed
-                )
-
-                # 检查容量限制
-                if len(self.cache) >= self.config.max_size:
-                    await self._evict_entries()
-
-                self.cache[key] = entry
-                self._update_access_order(key)
-
-                self.stats.sets += 1
-                self.stats.entry_count = len(self.cache)
-                self.stats.size_bytes += entry.size_bytes
-
-                return True
-
-            except Exception as e:
-                logger.error(f"内存缓存设置失败: {e}")
-                return False
-
-    async def delete(self, key: str) -> bool:
-        """删除缓存值"""
-        async with self._lock:
-            if key in self.cache:
-                entry = self.cache[key]
-                del self.cache[key]
-                self.access_order.remove(key)
-                self.stats.deletes += 1
-                self.stats.entry_count = len(self.cache)
-                self.stats.size_bytes -= entry.size_bytes
-                return True
-            return False
-
-    async def clear(self) -> bool:
-        """清空缓存"""
-        async with self._lock:
-            self.cache.clear()
-            self.access_order.clear()
-            self.stats = CacheStats()
-            return True
-
-    def _update_access_order(self, key: str):
-        """更新访问顺序"""
-        if key in self.access_order:
-            self.access_order.remove(key)
-        self.access_order.append(key)
-
-    async def _evict_entries(self):
-        """驱逐缓存条目"""
-        if not self.access_order:
-            return
-
-        if self.config.eviction_policy == CachePolicy.LRU:
-            # 删除最少使用的条目
-            evict_count = max(1, len(self.cache) // 10)  # 删除10%
-            for _ in range(evict_count):
-                if self.access_order:
-                    key_to_evict = self.access_order.pop(0)
-                    if key_to_evict in self.cache:
-                        entry = self.cache[key_to_evict]
-                        del self.cache[key_to_evict]
-                        self.stats.evictions += 1
-                        self.stats.size_bytes -= entry.size_bytes
-
-        elif self.config.eviction_policy == CachePolicy.FIFO:
-            # 删除最旧的条目
-            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k].created_at)
-            entry = self.cache[oldest_key]
-            del self.cache[oldest_key]
-            self.access_order.remove(oldest_key)
-            self.stats.evictions += 1
-            self.stats.size_bytes -= entry.size_bytes
-
-    def _serialize_value(self, value: Any) -> Tuple[bytes, bool]:
-        """序列化值"""
-        try:
-            if self.config.serialization == "json":
-                serialized = json.dumps(value, default=str).encode('utf-8')
-            elif self.config.serialization == "pickle":
-                serialized = pickle.dumps(value)
-            else:
-                serialized = str(value).encode('utf-8')
-
-            # 压缩
-            if self.config.compression and len(serialized) > 1024:  # 只压缩大于1KB的数据
-                compressed = gzip.compress(serialized)
-                if len(compressed) < len(serialized):  # 只在压缩有效时使用
-                    return compressed, True
-
-            return serialized, False
-
-        except Exception as e:
-            logger.error(f"序列化失败: {e}")
-            return str(value).encode('utf-8'), False
-
-    def _deserialize_value(self, serialized: bytes, compressed: bool) -> Any:
-        """反序列化值"""
-        try:
-            # 解压缩
-            if compressed:
-                serialized = gzip.decompress(serialized)
-
-            if self.config.serialization == "json":
-                return json.loads(serialized.decode('utf-8'))
-            elif self.config.serialization == "pickle":
-                return pickle.loads(serialized)
-            else:
-                return serialized.decode('utf-8')
-
-        except Exception as e:
-            logger.error(f"反序列化失败: {e}")
-            return serialized.decode('utf-8', errors='ignore')
-
-    def get_stats(self) -> Dict[str, Any]:
-        """获取缓存统计"""
-        total_requests = self.stats.hits + self.stats.misses
-        hit_rate = (self.stats.hits / total_requests * 100) if total_requests > 0 else 0
-
-        return {
-            "type": "memory",
-            "hits": self.stats.hits,
-            "misses": self.stats.misses,
-            "hit_rate_percent": round(hit_rate, 2),
-            "sets": self.stats.sets,
-            "deletes": self.stats.deletes,
-            "evictions": self.stats.evictions,
-            "entry_count": self.stats.entry_count,
-            "size_bytes": self.stats.size_bytes,
-            "max_size": self.config.max_size
-        }
-
-class RedisCache:
-    """Redis缓存实现"""
-
-    def __init__(self, config: CacheConfig):
-        self.config = config
-        self.redis_client: Optional[aioredis.Redis] = None
-        self.stats = CacheStats()
-        self._lock = asyncio.Lock()
-
-    async def _get_client(self) -> aioredis.Redis:
-        """获取Redis客户端"""
-        if self.redis_client is None:
-            await self._connect()
-        return self.redis_client
-
-    async def _connect(self):
-        """连接Redis"""
-        try:
-            self.redis_client = await aioredis.from_url(
-                f"redis://{getattr(settings, 'redis_host', 'localhost')}:{getattr(settings, 'redis_port', 6379)}",
-                encoding="utf-8",
-                decode_responses=False  # 使用二进制数据
-            )
-            await self.redis_client.ping()
-            logger.info("Redis连接成功")
-        except Exception as e:
-            logger.error(f"Redis连接失败: {e}")
-            raise
-
-    async def get(self, key: str) -> Optional[Any]:
-        """获取缓存值"""
-        try:
-            client = await self._get_client()
-            serialized = await client.get(key)
-
-            if serialized is None:
-                self.stats.misses += 1
-                return None
-
-            # 解析元数据
-            metadata_length = int.from_bytes(serialized[:4], byteorder='big')
-            metadata = json.loads(serialized[4:4+metadata_length].decode('utf-8'))
-            value_bytes = serialized[4+metadata_length:]
-
-            # 检查是否过期
-            if datetime.now() > datetime.fromisoformat(metadata['expires_at']):
-                await self.delete(key)
-                self.stats.misses += 1
-                return None
-
-            self.stats.hits += 1
-            return self._deserialize_value(value_bytes, metadata.get('compressed', False))
+    def legacy_deserialize(data: bytes) -> Any:
+        payload = gzip.decompress(data[1:]) if data[:1] == b"\x01" else data[1:]
+        if config.serialization == "pickle":
+            return pickle.loads(payload)
+        elif config.serialization == "json":
+            return json.loads(payload.decode('utf-8'))
+        return payload.decode('utf-8')
 
-        except Exception as e:
-            logger.error(f"Redis获取失败: {e}")
-            self.stats.misses += 1
-            return None
-
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """设置缓存值"""
-        try:
-            client = await self._get_client()
-            actual_ttl = ttl or self.config.ttl
-            expires_at = datetime.now() + timedelta(seconds=actual_ttl)
-
-            # 序列化值
-            value_bytes, compressed = self._serialize_value(value)
-
-            # 构建元数据
-            metadata = {
-                'expires_at': expires_at.isoformat(),
-                'compressed': compressed,
-                'created_at': datetime.now().isoformat(),
-                'version': 1
-            }
-            metadata_bytes = json.dumps(metadata).encode('utf-8')
-            metadata_length = len(metadata_bytes).to_bytes(4, byteorder='big')
-
-            # 组合数据
-            serialized = metadata_length + metadata_bytes + value_bytes
-
-            success = await client.setex(key, actual_ttl, serialized)
-            if success:
-                self.stats.sets += 1
-                return True
-
-        except Exception as e:
-            logger.error(f"Redis设置失败: {e}")
-
-        return False
-
-    async def delete(self, key: str) -> bool:
-        """删除缓存值"""
-        try:
-            client = await self._get_client()
-            result = await client.delete(key)
-            if result > 0:
-                self.stats.deletes += 1
-                return True
-        except Exception as e:
-            logger.error(f"Redis删除失败: {e}")
-
-        return False
-
-    async def clear_pattern(self, pattern: str) -> int:
-        """按模式删除缓存"""
-        try:
-            client = await self._get_client()
-            keys = await client.keys(pattern)
-            if keys:
-                deleted_count = await client.delete(*keys)
-                self.stats.deletes += deleted_count
-                return deleted_count
-        except Exception as e:
-            logger.error(f"Redis模式删除失败: {e}")
-
-        return 0
-
-    def _serialize_value(self, value: Any) -> Tuple[bytes, bool]:
-        """序列化值（与MemoryCache相同）"""
-        try:
-            if self.config.serialization == "json":
-                serialized = json.dumps(value, default=str).encode('utf-8')
-            elif self.config.serialization == "pickle":
-                serialized = pickle.dumps(value)
-            else:
-                serialized = str(value).encode('utf-8')
+    return codec, legacy_deserialize
 
-            if self.config.compression and len(serialized) > 1024:
-                compressed = gzip.compress(serialized)
-                if len(compressed) < len(serialized):
-                    return compressed, True
-
-            return serialized, False
-
-        except Exception as e:
-            logger.error(f"序列化失败: {e}")
-            return str(value).encode('utf-8'), False
-
-    def _deserialize_value(self, serialized: bytes, compressed: bool) -> Any:
-        """反序列化值（与MemoryCache相同）"""
-        try:
-            if compressed:
-                serialized = gzip.decompress(serialized)
-
-            if self.config.serialization == "json":
-                return json.loads(serialized.decode('utf-8'))
-            elif self.config.serialization == "pickle":
-                return pickle.loads(serialized)
-            else:
-                return serialized.decode('utf-8')
-
-        except Exception as e:
-            logger.error(f"反序列化失败: {e}")
-            return serialized.decode('utf-8', errors='ignore')
-
-    def get_stats(self) -> Dict[str, Any]:
-        """获取缓存统计"""
-        total_requests = self.stats.hits + self.stats.misses
-        hit_rate = (self.stats.hits / total_requests * 100) if total_requests > 0 else 0
-
-        return {
-            "type": "redis",
-            "hits": self.stats.hits,
-            "misses": self.stats.misses,
-            "hit_rate_percent": round(hit_rate, 2),
-            "sets": self.stats.sets,
-            "deletes": self.stats.deletes,
-            "connected": self.redis_client is not None
-        }
 
 class MultiLevelCache:
-    """多层缓存系统"""
+    """多层缓存系统（统一缓存核心上的命名空间适配器）"""
 
-    def __init__(self, config: CacheConfig):
+    def __init__(self, config: CacheConfig, name: str = "default"):
         self.config = config
-        self.caches = {}
-        self.stats = CacheStats()
+        self.name = name
+        self.caches: Dict[CacheLevel, CacheTier] = {}
+
+        core = get_cache_core()
+        codec, legacy_decoder = _build_codec(config)
 
         # 初始化缓存层级
         for level in config.cache_levels:
             if level == CacheLevel.L1_MEMORY:
-                self.caches[level] = MemoryCache(config)
+                self.caches[level] = core.memory_tier(max_entries=config.max_size)
             elif level == CacheLevel.L2_REDIS:
-                self.caches[level] = RedisCache(config)
+                tier = core.redis_tier(
+                    key_prefix=f"cache:{name}:",
+                    codec=codec,
+                    legacy_decoder=legacy_decoder
+                )
+                if tier is not None:
+                    self.caches[level] = tier
+
+        self.namespace = core.register(
+            CacheNamespace(f"cache_system:{name}", list(self.caches.values()), config.ttl)
+        )
+
+    @property
+    def stats(self) -> CacheStats:
+        """多层统计"""
+        ns_stats = self.namespace.stats
+        return CacheStats(
+            hits=ns_stats.hits,
+            misses=ns_stats.misses,
+            sets=ns_stats.sets,
+            deletes=ns_stats.deletes,
+            evictions=sum(tier.stats.evictions for tier in self.caches.values())
+        )
 
     async def get(self, key: str) -> Optional[Any]:
-        """获取缓存值（按层级查找）"""
-        for level in self.config.cache_levels:
-            if level in self.caches:
-                cache = self.caches[level]
-                value = await cache.get(key)
-                if value is not None:
-                    # 将值回填到更高级的缓存
-                    await self._backfill_higher_levels(key, value, level)
-                    self.stats.hits += 1
-                    return value
-
-        self.stats.misses += 1
-        return None
-
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """设置缓存值（设置到所有层级）"""
-        success = True
-        for cache in self.caches.values():
-            result = await cache.set(key, value, ttl)
-            success = success and result
-
-        if success:
-            self.stats.sets += 1
+        """获取缓存值（按层级查找，命中后回填更高层级）"""
+        return await self.namespace.get(key)
 
-        return success
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None,
+                  tags: Optional[List[str]] = None) -> bool:
+        """设置缓存值（设置到所有层级）"""
+        return await self.namespace.set(key, value, ttl or self.config.ttl, tags)
 
     async def delete(self, key: str) -> bool:
         """删除缓存值（从所有层级删除）"""
-        success = True
-        for cache in self.caches.values():
-            result = await cache.delete(key)
-            success = success and result
+        return await self.namespace.delete(key)
 
-        if success:
-            self.stats.deletes += 1
-
-        return success
+    async def invalidate_tag(self, tag: str) -> int:
+        """按标签失效"""
+        return await self.namespace.invalidate_tag(tag)
 
     async def clear_pattern(self, pattern: str) -> Dict[CacheLevel, int]:
         """按模式清理缓存"""
         results = {}
         for level, cache in self.caches.items():
-            if hasattr(cache, 'clear_pattern'):
-                count = await cache.clear_pattern(pattern)
-                results[level] = count
+            if hasattr(cache, 'scan_keys'):
+                keys = await cache.scan_keys(pattern)
             else:
-                results[level] = 0
+                keys = [key for key in cache.keys() if fnmatch.fnmatchcase(key, pattern)]
+            results[level] = await cache.delete(keys) if keys else 0
 
         return results
 
-    async def _backfill_higher_levels(self, key: str, value: Any, found_level: CacheLevel):
-        """将值回填到更高级的缓存"""
-        found_index = self.config.cache_levels.index(found_level)
-        for i in range(found_index):
-            higher_level = self.config.cache_levels[i]
-            if higher_level in self.caches:
-                await self.caches[higher_level].set(key, value, self.config.ttl // 2)  # 更短的TTL
-
     def get_stats(self) -> Dict[str, Any]:
         """获取多层缓存统计"""
-        total_requests = self.stats.hits + self.stats.misses
-        hit_rate = (self.stats.hits / total_requests * 100) if total_requests > 0 else 0
+        stats = self.stats
+        total_requests = stats.hits + stats.misses
+        hit_rate = (stats.hits / total_requests * 100) if total_requests > 0 else 0
 
         return {
             "multi_level": {
-                "hits": self.stats.hits,
-                "misses": self.stats.misses,
+                "hits": stats.hits,
+                "misses": stats.misses,
                 "hit_rate_percent": round(hit_rate, 2),
-                "sets": self.stats.sets,
-                "deletes": self.stats.deletes
+                "sets": stats.sets,
+                "deletes": stats.deletes
             },
             "levels": {
                 level.value: cache.get_stats()
@@ -535,7 +192,7 @@ class CacheManager:
         if config is None:
             config = self.default_config
 
-        cache = MultiLevelCache(config)
+        cache = MultiLevelCache(config, name)
         self.caches[name] = cache
         logger.info(f"注册缓存实例: {name}")
         return cache
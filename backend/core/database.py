@@ -1,78 +1,378 @@
 """
 Database Connection Manager
+
+进程级引擎注册表：同一数据库URL只创建一个同步引擎和一个异步引擎，连接池容量由
+ConnectionPoolManager的自适应扩缩容调整；请求级会话通过contextvars在中间件和处理函数之间共享
 """
 
-from typing import AsyncGenerator
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.util import greenlet_spawn
 
 from backend.config.settings import get_settings
-from backend.models.base import Base
+from backend.monitoring.prometheus_registry import metrics_registry
+from backend.optimization.prepared_statements import install_statement_timing, prepared_statement_name
+from backend.optimization.query_instrumentation import install_query_instrumentation
 
 settings = get_settings()
 
+DB_POOL_CHECKOUT_WAIT = metrics_registry.histogram(
+    "db_pool_checkout_wait_seconds", "从连接池获取连接的等待时间（秒）", ("pool",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+DB_POOL_CHECKOUT_TIMEOUTS = metrics_registry.counter(
+    "db_pool_checkout_timeouts_total", "获取连接超时次数", ("pool",)
+)
+DB_SESSIONS_OPENED = metrics_registry.counter(
+    "db_sessions_opened_total", "创建的数据库会话数", ("kind", "scope")
+)
 
-# Synchronous engine for migrations and initial setup
-def get_sync_engine():
-    """获取同步数据库引擎"""
-    database_url = settings.get_database_url()
 
-    # Convert async URL to sync URL if needed
+class _InstrumentedPoolMixin:
+    """记录连接获取等待时间，支持按新容量重建"""
+
+    _retired = False
+
+    def _do_get(self):
+        start = time.perf_counter()
+        label = getattr(self, "logging_name", None) or "default"
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.labels(label).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(label).observe(time.perf_counter() - start)
+
+    def _do_return_conn(self, record):
+        if self._retired:
+            # 扩缩容后旧池不再复用连接，归还时直接关闭
+            record.close()
+            self._dec_overflow()
+            return
+        super()._do_return_conn(record)
+
+    def resized(self, pool_size: int, max_overflow: int):
+        """与recreate()相同配置、新容量的连接池"""
+        return self.__class__(
+            self._creator,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pre_ping=self._pre_ping,
+            use_lifo=self._pool.use_lifo,
+            timeout=self._timeout,
+            recycle=self._recycle,
+            echo=self.echo,
+            logging_name=self._orig_logging_name,
+            reset_on_return=self._reset_on_return,
+            _dispatch=self.dispatch,
+            dialect=self._dialect,
+        )
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    """同步引擎连接池"""
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """异步引擎连接池"""
+
+
+def _sync_url(database_url: str) -> str:
     if database_url.startswith("postgresql+asyncpg://"):
-        database_url = database_url.replace("postgresql+asyncpg://", "postgresql://")
+        return database_url.replace("postgresql+asyncpg://", "postgresql://")
+    if database_url.startswith("sqlite+aiosqlite:///"):
+        return database_url.replace("sqlite+aiosqlite:///", "sqlite:///")
+    return database_url
+
+
+def _async_url(database_url: str) -> str:
+    if database_url.startswith("postgresql://"):
+        return database_url.replace("postgresql://", "postgresql+asyncpg://")
+    if database_url.startswith("sqlite:///"):
+        return database_url.replace("sqlite:///", "sqlite+aiosqlite:///")
+    return database_url
+
+
+def _is_memory_sqlite(database_url: str) -> bool:
+    return database_url.startswith("sqlite") and (":memory:" in database_url or database_url.rstrip("/").endswith(":"))
+
+
+class EngineRegistry:
+    """进程级数据库引擎注册表"""
+
+    def __init__(self):
+        self._engines: Dict[Tuple[str, str], Any] = {}
+        self._sizing: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._session_factories: Dict[Any, Any] = {}
+        self._lock = threading.Lock()
+
+    def default_pool_sizing(self) -> Dict[str, Any]:
+        return {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+            "pool_recycle": settings.db_pool_recycle,
+        }
+
+    def _engine_kwargs(self, database_url: str, name: str, asynchronous: bool, sizing: Dict[str, Any]):
+        kwargs: Dict[str, Any] = {
+            "echo": settings.show_sql_queries,
+            "pool_pre_ping": True,
+            "query_cache_size": settings.db_compiled_cache_size,
+        }
+        if asynchronous and database_url.startswith("postgresql+asyncpg"):
+            kwargs["connect_args"] = {
+                "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+                "prepared_statement_name_func": prepared_statement_name,
+            }
+        if not _is_memory_sqlite(database_url):
+            kwargs.update(sizing)
+            kwargs["poolclass"] = InstrumentedAsyncQueuePool if asynchronous else InstrumentedQueuePool
+            kwargs["pool_logging_name"] = f"{name}-{'async' if asynchronous else 'sync'}"
+        return kwargs
+
+    def _get_engine(self, database_url: Optional[str], name: str, asynchronous: bool, pool_options):
+        url = database_url or settings.get_database_url()
+        url = _async_url(url) if asynchronous else _sync_url(url)
+        key = ("async" if asynchronous else "sync", url)
+        engine = self._engines.get(key)
+        if engine is not None:
+            return engine
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                sizing = {**self.default_pool_sizing(), **pool_options}
+                factory = create_async_engine if asynchronous else create_engine
+                engine = factory(url, **self._engine_kwargs(url, name, asynchronous, sizing))
+                install_query_instrumentation(engine)
+                install_statement_timing(engine)
+                self._engines[key] = engine
+                self._sizing[key] = sizing
+        return engine
+
+    def get_async_engine(self, database_url: Optional[str] = None, name: str = "default",
+                         **pool_options) -> AsyncEngine:
+        """获取异步引擎；pool_options只在首次创建时生效"""
+        return self._get_engine(database_url, name, True, pool_options)
+
+    def get_sync_engine(self, database_url: Optional[str] = None, name: str = "default",
+                        **pool_options) -> Engine:
+        """获取同步引擎；pool_options只在首次创建时生效"""
+        return self._get_engine(database_url, name, False, pool_options)
+
+    def get_async_session_factory(self, database_url: Optional[str] = None) -> async_sessionmaker:
+        engine = self.get_async_engine(database_url)
+        factory = self._session_factories.get(engine)
+        if factory is None:
+            factory = self._session_factories[engine] = async_sessionmaker(
+                engine,
+                class_=AsyncSession,
+                expire_on_commit=False,
+                autocommit=False,
+                autoflush=False,
+            )
+        return factory
+
+    def get_sync_session_factory(self, database_url: Optional[str] = None) -> sessionmaker:
+        engine = self.get_sync_engine(database_url)
+        factory = self._session_factories.get(engine)
+        if factory is None:
+            factory = self._session_factories[engine] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        return factory
+
+    def _find(self, database_url: str, asynchronous: bool):
+        url = _async_url(database_url) if asynchronous else _sync_url(database_url)
+        key = ("async" if asynchronous else "sync", url)
+        return key, self._engines.get(key)
+
+    async def resize(self, database_url: str, pool_size: int, max_overflow: Optional[int] = None,
+                     asynchronous: bool = True) -> bool:
+        """调整连接池容量：以新容量重建连接池，旧池的空闲连接关闭，借出的连接归还时关闭"""
+        key, engine = self._find(database_url, asynchronous)
+        if engine is None:
+            return False
+        sync_engine = engine.sync_engine if asynchronous else engine
+        old_pool = sync_engine.pool
+        if not isinstance(old_pool, _InstrumentedPoolMixin):
+            return False
+        sizing = self._sizing[key]
+        max_overflow = sizing["max_overflow"] if max_overflow is None else max_overflow
+        if pool_size == sizing["pool_size"] and max_overflow == sizing["max_overflow"]:
+            return False
+        with self._lock:
+            sync_engine.pool = old_pool.resized(pool_size, max_overflow)
+            old_pool._retired = True
+            sizing.update(pool_size=pool_size, max_overflow=max_overflow)
+        if asynchronous:
+            # 异步驱动的连接需要在greenlet中关闭
+            await greenlet_spawn(old_pool.dispose)
+        else:
+            old_pool.dispose()
+        return True
+
+    def pool_status(self) -> Dict[str, Dict[str, Any]]:
+        """各引擎连接池的当前状态"""
+        status = {}
+        for (kind, url), engine in list(self._engines.items()):
+            pool = engine.sync_engine.pool if kind == "async" else engine.pool
+            entry = {"kind": kind, **self._sizing[(kind, url)]}
+            if isinstance(pool, QueuePool):
+                entry.update(
+                    size=pool.size(),
+                    checked_in=pool.checkedin(),
+                    checked_out=pool.checkedout(),
+                    overflow=pool.overflow(),
+                )
+            status[engine.url.render_as_string(hide_password=True)] = entry
+        return status
+
+    async def dispose_all(self):
+        """关闭所有引擎"""
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+            self._sizing.clear()
+            self._session_factories.clear()
+        for engine in engines:
+            if isinstance(engine, AsyncEngine):
+                await engine.dispose()
+            else:
+                engine.dispose()
 
-    return create_engine(
-        database_url,
-        echo=settings.show_sql_queries,
-        pool_pre_ping=True,
-    )
+
+engine_registry = EngineRegistry()
+
+
+def get_engine_registry() -> EngineRegistry:
+    """获取进程级引擎注册表"""
+    return engine_registry
+
+
+# Synchronous engine for migrations and initial setup
+def get_sync_engine():
+    """获取同步数据库引擎"""
+    return engine_registry.get_sync_engine()
 
 
 # Asynchronous engine for FastAPI endpoints
 def get_async_engine():
     """获取异步数据库引擎"""
-    database_url = settings.get_database_url()
-
-    # Convert to async URL if needed
-    if database_url.startswith("postgresql://"):
-        database_url = database_url.replace("postgresql://", "postgresql+asyncpg://")
-    elif database_url.startswith("sqlite:///"):
-        database_url = database_url.replace("sqlite:///", "sqlite+aiosqlite:///")
-
-    return create_async_engine(
-        database_url,
-        echo=settings.show_sql_queries,
-        pool_pre_ping=True,
-    )
+    return engine_registry.get_async_engine()
 
 
 # Session factories
 def get_sync_session_factory():
     """获取同步会话工厂"""
-    engine = get_sync_engine()
-    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return engine_registry.get_sync_session_factory()
 
 
 def get_async_session_factory():
     """获取异步会话工厂"""
-    engine = get_async_engine()
-    return async_sessionmaker(
-        engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
-        autocommit=False,
-        autoflush=False,
-    )
+    return engine_registry.get_async_session_factory()
+
+
+class RequestSessions:
+    """一个请求内共享的数据库会话，首次使用时创建"""
+
+    __slots__ = ("sync_session", "async_session")
+
+    def __init__(self):
+        self.sync_session: Optional[Session] = None
+        self.async_session: Optional[AsyncSession] = None
+
+    def get_sync_session(self) -> Session:
+        if self.sync_session is None:
+            self.sync_session = get_sync_session_factory()()
+            DB_SESSIONS_OPENED.labels("sync", "request").inc()
+        return self.sync_session
+
+    def get_async_session(self) -> AsyncSession:
+        if self.async_session is None:
+            self.async_session = get_async_session_factory()()
+            DB_SESSIONS_OPENED.labels("async", "request").inc()
+        return self.async_session
+
+    @property
+    def opened(self) -> int:
+        return (self.sync_session is not None) + (self.async_session is not None)
+
+    async def close(self):
+        """关闭会话，未提交的事务回滚"""
+        if self.async_session is not None:
+            await self.async_session.close()
+            self.async_session = None
+        if self.sync_session is not None:
+            self.sync_session.close()
+            self.sync_session = None
+
+
+_request_sessions: ContextVar[Optional[RequestSessions]] = ContextVar("request_db_sessions", default=None)
+
+
+@asynccontextmanager
+async def request_session_scope() -> AsyncIterator[RequestSessions]:
+    """请求级会话作用域：作用域内get_db、request_db和get_request_session复用同一个会话"""
+    sessions = RequestSessions()
+    token = _request_sessions.set(sessions)
+    try:
+        yield sessions
+    finally:
+        _request_sessions.reset(token)
+        await sessions.close()
+
+
+def get_request_session() -> Session:
+    """当前请求的同步会话；不在请求作用域内时返回新会话，由调用方关闭"""
+    sessions = _request_sessions.get()
+    if sessions is not None:
+        return sessions.get_sync_session()
+    DB_SESSIONS_OPENED.labels("sync", "standalone").inc()
+    return get_sync_session_factory()()
+
+
+@contextmanager
+def request_db() -> Iterator[Session]:
+    """中间件和服务使用的同步会话：请求内共享，作用域外创建临时会话并在退出时关闭"""
+    sessions = _request_sessions.get()
+    if sessions is not None:
+        yield sessions.get_sync_session()
+        return
+    session = get_request_session()
+    try:
+        yield session
+    finally:
+        session.close()
 
 
 # Dependency for FastAPI endpoints
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     数据库会话依赖
-    用于FastAPI依赖注入
+    用于FastAPI依赖注入；请求作用域内复用请求级会话，会话由作用域关闭
     """
+    sessions = _request_sessions.get()
+    if sessions is not None:
+        session = sessions.get_async_session()
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        return
+
     SessionLocal = get_async_session_factory()
+    DB_SESSIONS_OPENED.labels("async", "standalone").inc()
     async with SessionLocal() as session:
         try:
             yield session
@@ -86,6 +386,8 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
 
 def init_db():
     """初始化数据库 - 创建所有表"""
+    from backend.models.base import Base
+
     engine = get_sync_engine()
     Base.metadata.create_all(bind=engine)
     print("✅ Database tables created successfully")
@@ -93,6 +395,8 @@ def init_db():
 
 def drop_db():
     """删除所有数据库表 - 仅用于开发/测试"""
+    from backend.models.base import Base
+
     engine = get_sync_engine()
     Base.metadata.drop_all(bind=engine)
     print("⚠️  All database tables dropped")
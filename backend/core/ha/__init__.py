@@ -9,8 +9,8 @@ from .load_balancer import *
 from .health_check import *
 from .failover import *
 from .cluster_management import *
-from .service_discovery import *
 from .circuit_breaker import *
+from .setup import HighAvailabilityConfig, HASetup, get_ha_config, setup_production_ha
 
 __all__ = [
     # Load Balancer
@@ -35,12 +35,7 @@ __all__ = [
     'ClusterManager',
     'Node',
     'ClusterConfig',
-    'ClusterStatus',
-
-    # Service Discovery
-    'ServiceRegistry',
-    'ServiceInstance',
-    'DiscoveryConfig',
+    'ClusterState',
 
     # Circuit Breaker
     'CircuitBreaker',
@@ -49,6 +44,7 @@ __all__ = [
 
     # Configuration
     'HighAvailabilityConfig',
+    'HASetup',
     'get_ha_config',
     'setup_production_ha'
 ]
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""
+熔断器
+Week 6 Day 5: 负载均衡和高可用配置
+
+HA组件使用的熔断器，实现位于 backend.core.resilience
+"""
+
+from backend.core.resilience import (
+    CircuitBreaker, CircuitBreakerConfig, CircuitState, UpstreamGuard, UpstreamUnavailable
+)
+
+__all__ = [
+    'CircuitBreaker',
+    'CircuitBreakerConfig',
+    'CircuitState',
+    'UpstreamGuard',
+    'UpstreamUnavailable'
+]
@@ -10,7 +10,7 @@ import json
 import hashlib
 import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Set
+from typing import Dict, List, Any, Optional, Set, Callable
 from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
@@ -14,14 +14,17 @@ from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
 import redis
+from backend.core.resilience import (
+    CircuitBreakerConfig, OutlierDetectionConfig, Outcome, UpstreamGuard
+)
 from .load_balancer import BackendServer, BackendStatus
 
 class FailoverStrategy(Enum):
     """故障转移策略"""
     ACTIVE_PASSIVE = "active_passive"     # 主备模式
-    ACTIVE_ACTIVE = "active_active"      双活模式
-    MULTI_ACTIVE = "multi_active"         多活模式
-    GEO_REDUNDANT = "geo_redundant"       地理冗余
+    ACTIVE_ACTIVE = "active_active"      # 双活模式
+    MULTI_ACTIVE = "multi_active"         # 多活模式
+    GEO_REDUNDANT = "geo_redundant"       # 地理冗余
 
 class FailoverState(Enum):
     """故障转移状态"""
@@ -65,6 +68,9 @@ class FailoverConfig:
     max_failover_attempts: int = 3        # 最大故障转移尝试次数
     enable_sticky_sessions: bool = True    # 启用会话粘性
     session_affinity_timeout: int = 3600   # 会话亲和性超时
+    circuit_recovery_timeout: int = 30     # 熔断后多久开始半开探测
+    recovery_success_threshold: int = 2    # 半开探测连续成功多少次才恢复
+    outlier_consecutive_errors: int = 5    # 业务请求连续5xx/超时多少次摘除节点
 
 @dataclass
 class Node:
@@ -95,6 +101,19 @@ class FailoverManager:
         self.redis_client: Optional[redis.Redis] = None
         self.is_running = False
 
+        # 节点熔断：探测失败打开，半开状态连续探测成功后才恢复，避免节点反复抖动
+        self.upstream_guard = UpstreamGuard(
+            breaker_config=CircuitBreakerConfig(
+                consecutive_failures=config.failure_detection_threshold,
+                recovery_timeout=config.circuit_recovery_timeout,
+                half_open_max_calls=1,
+                success_threshold=config.recovery_success_threshold
+            ),
+            outlier_config=OutlierDetectionConfig(
+                consecutive_errors=config.outlier_consecutive_errors
+            )
+        )
+
         # 回调函数
         self.failover_callbacks: List[Callable[[FailoverEvent], None]] = []
         self.recovery_callbacks: List[Callable[[FailoverEvent], None]] = []
@@ -184,20 +203,37 @@ class FailoverManager:
                 logging.error(f"Recovery check loop error: {str(e)}")
                 await asyncio.sleep(self.config.recovery_check_interval)
 
+    async def _probe_node(self, node: Node) -> Optional[bool]:
+        """探测节点并记录到熔断器；熔断打开期间不探测，返回None"""
+        breaker = self.upstream_guard.breaker(node.id)
+        if not breaker.allow_request():
+            return None
+        is_healthy = await self._ping_node(node)
+        if is_healthy:
+            breaker.record_success()
+            self.upstream_guard.outliers.record_success(node.id)
+        else:
+            breaker.record_failure()
+        return is_healthy
+
+    def _is_recovered(self, node: Node) -> bool:
+        return self.upstream_guard.is_routable(node.id)
+
     async def _check_node_health(self) -> None:
         """检查节点健康状态"""
         for node in self.nodes.values():
             try:
                 # 检查节点是否响应
-                is_healthy = await self._ping_node(node)
+                is_healthy = await self._probe_node(node)
+                if is_healthy is None:
+                    continue
 
                 if is_healthy:
-                    if node.status == BackendStatus.UNHEALTHY:
+                    node.last_heartbeat = datetime.now()
+                    if node.status == BackendStatus.UNHEALTHY and self._is_recovered(node):
                         node.status = BackendStatus.HEALTHY
                         node.failure_count = 0
                         logging.info(f"Node {node.id} is now healthy")
-
-                    node.last_heartbeat = datetime.now()
                 else:
                     node.failure_count += 1
                     node.status = BackendStatus.UNHEALTHY
@@ -237,13 +273,39 @@ class FailoverManager:
 
         for node in unhealthy_nodes:
             try:
-                is_healthy = await self._ping_node(node)
-                if is_healthy:
+                is_healthy = await self._probe_node(node)
+                if is_healthy and self._is_recovered(node):
                     await self._recover_node(node)
 
             except Exception as e:
                 logging.error(f"Recovery check failed for node {node.id}: {str(e)}")
 
+    async def report_request_result(self, node_id: str, success: bool,
+                                    status_code: Optional[int] = None, timed_out: bool = False) -> None:
+        """上报转发到节点的业务请求结果
+
+        连续5xx/超时的节点被摘除并标记为不健康；主节点被摘除时触发故障转移。
+        """
+        node = self.nodes.get(node_id)
+        if node is None:
+            return
+
+        if timed_out:
+            outcome = Outcome.TIMEOUT
+        elif success:
+            outcome = Outcome.SUCCESS
+        elif status_code is not None and status_code < 500:
+            outcome = Outcome.IGNORED
+        else:
+            outcome = Outcome.ERROR
+        self.upstream_guard.record(node_id, outcome)
+
+        if node.status != BackendStatus.UNHEALTHY and not self.upstream_guard.is_routable(node_id):
+            node.status = BackendStatus.UNHEALTHY
+            logging.warning(f"Node {node_id} ejected after consecutive request failures")
+            if node.role == "primary" and self.state == FailoverState.NORMAL:
+                await self._trigger_failover(node, FailoverTrigger.ERROR_RATE_HIGH)
+
     async def _ping_node(self, node: Node) -> bool:
         """ping节点"""
         try:
@@ -509,7 +571,9 @@ class FailoverManager:
                     "status": node.status.value,
                     "last_heartbeat": node.last_heartbeat.isoformat(),
                     "failure_count": node.failure_count,
-                    "last_failover": node.last_failover.isoformat() if node.last_failover else None
+                    "last_failover": node.last_failover.isoformat() if node.last_failover else None,
+                    "circuit": self.upstream_guard.breaker(node_id).get_stats(),
+                    "outlier": self.upstream_guard.outliers.get_stats(node_id)
                 }
                 for node_id, node in self.nodes.items()
             },
@@ -23,6 +23,7 @@ class HealthStatus(Enum):
     UNHEALTHY = "unhealthy"
     DEGRADED = "degraded"
     UNKNOWN = "unknown"
+    CRITICAL = "critical"
 
 class CheckType(Enum):
     """检查类型"""
@@ -186,25 +187,26 @@ class HealthChecker:
     async def _execute_check(self, config: HealthCheckConfig) -> HealthCheckResult:
         """执行健康检查"""
         start_time = time.time()
-        last_result = self.results.get(config.check_id)
+
+        check_functions = {
+            CheckType.HTTP_ENDPOINT: self._check_http_endpoint,
+            CheckType.TCP_PORT: self._check_tcp_port,
+            CheckType.DATABASE: self._check_database,
+            CheckType.REDIS: self._check_redis,
+            CheckType.DISK_SPACE: self._check_disk_space,
+            CheckType.MEMORY_USAGE: self._check_memory_usage,
+            CheckType.CPU_USAGE: self._check_cpu_usage,
+            CheckType.CUSTOM: self._check_custom,
+        }
 
         try:
-            if config.check_type == CheckType.HTTP_ENDPOINT:
-                result = await self._check_http_endpoint(config)
-            elif config.check_type == CheckType.TCP_PORT:
-                result = await self._check_tcp_port(config)
-            elif config.check_type == CheckType.DATABASE:
-                result = await self._check_database(config)
-            elif config.check_type == CheckType.REDIS:
-                result = await self._check_redis(config)
-            elif config.check_type == CheckType.DISK_SPACE:
-                result = await self._check_disk_space(config)
-            elif config.check_type == CheckType.MEMORY_USAGE:
-                result = await self._check_memory_usage(config)
-            elif config.check_type == CheckType.CPU_USAGE:
-                result = await self._check_cpu_usage(config)
-            elif config.check_type == CheckType.CUSTOM:
-                result = await self._check_custom(config)
+            check_function = check_functions.get(config.check_type)
+            if check_function is not None:
+                # 整个检查（含重试）受单项超时约束，慢依赖不会拖住检查循环
+                result = await asyncio.wait_for(
+                    check_function(config),
+                    timeout=config.timeout * (config.retries + 1) + config.retry_delay * config.retries
+                )
             else:
                 result = HealthCheckResult(
                     check_id="",
@@ -219,6 +221,16 @@ class HealthChecker:
 
             return result
 
+        except asyncio.TimeoutError:
+            return HealthCheckResult(
+                check_id="",
+                check_name=config.check_name,
+                check_type=config.check_type,
+                status=HealthStatus.UNHEALTHY,
+                message="Check timed out",
+                response_time=time.time() - start_time,
+                timestamp=datetime.utcnow()
+            )
         except Exception as e:
             return HealthCheckResult(
                 check_id="",
@@ -233,6 +245,7 @@ class HealthChecker:
     async def _update_result(self, check_id: str, new_result: HealthCheckResult) -> None:
         """更新检查结果"""
         old_result = self.results.get(check_id)
+        new_result.check_id = check_id
 
         # 继承之前的失败次数
         if old_result:
@@ -464,7 +477,7 @@ class HealthChecker:
         password = params.get("password")
         db = params.get("db", 0)
 
-        try:
+        def ping():
             redis_client = redis.Redis(
                 host=host,
                 port=port,
@@ -474,11 +487,15 @@ class HealthChecker:
             )
 
             # 执行ping命令
-            result = redis_client.ping()
+            ok = redis_client.ping()
+            # 获取Redis信息
+            return ok, redis_client.info() if ok else {}
+
+        try:
+            # 同步客户端放到线程中执行，不阻塞事件循环
+            result, info = await asyncio.to_thread(ping)
 
             if result:
-                # 获取Redis信息
-                info = redis_client.info()
                 return HealthCheckResult(
                     check_id="",
                     check_name=config.check_name,
@@ -628,7 +645,7 @@ class HealthChecker:
         interval = params.get("interval", 1)  # 采样间隔（秒）
 
         try:
-            cpu_percent = psutil.cpu_percent(interval=interval)
+            cpu_percent = await asyncio.to_thread(psutil.cpu_percent, interval)
 
             details = {
                 "cpu_percent": cpu_percent,
@@ -6,11 +6,14 @@ Week 6 Day 5: 负载均衡和高可用配置
 """
 
 import asyncio
+import inspect
 import time
 import random
 import hashlib
+from bisect import bisect
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Optional, Callable, Iterable, Iterator, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
@@ -27,6 +30,7 @@ class LoadBalancingStrategy(Enum):
     URL_HASH = "url_hash"
     RANDOM = "random"
     CONSISTENT_HASH = "consistent_hash"
+    POWER_OF_TWO_CHOICES = "power_of_two_choices"  # 随机取两台，选EWMA延迟×负载较低者
 
 class BackendStatus(Enum):
     """后端服务器状态"""
@@ -52,6 +56,14 @@ class BackendServer:
     failed_requests: int = 0
     metadata: Dict[str, Any] = None
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        # 状态或权重变化时通知所属负载均衡器重建可用视图（包括直接修改属性的情况）
+        if name in _VIEW_FIELDS:
+            listener = self.__dict__.get('_view_listener')
+            if listener is not None:
+                listener()
+
     @property
     def url(self) -> str:
         return f"http://{self.host}:{self.port}"
@@ -74,6 +86,208 @@ class BackendServer:
         # 更新成功率
         self.success_rate = (self.total_requests - self.failed_requests) / self.total_requests
 
+_VIEW_FIELDS = frozenset(('status', 'weight'))
+
+
+def _hash64(key: str) -> int:
+    """跨进程稳定的64位哈希"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class ConsistentHashRing:
+    """虚拟节点一致性哈希环
+
+    每个节点按权重放置 replicas×weight 个虚拟节点；节点增删时只有落在其虚拟节点区间的键迁移，
+    约为 1/N，而取模哈希几乎全部重映射。
+    """
+
+    def __init__(self, nodes: Iterable[Tuple[str, int]] = (), replicas: int = 100):
+        self.replicas = replicas
+        points = []
+        for node_id, weight in nodes:
+            for i in range(self.replicas * max(1, weight)):
+                points.append((_hash64(f"{node_id}#{i}"), node_id))
+        points.sort()
+        self._hashes = [h for h, _ in points]
+        self._owners = [node_id for _, node_id in points]
+        self.node_count = len(set(self._owners))
+
+    def __len__(self) -> int:
+        return self.node_count
+
+    def get(self, key: str) -> Optional[str]:
+        """键所属节点"""
+        if not self._hashes:
+            return None
+        index = bisect(self._hashes, _hash64(key))
+        return self._owners[index % len(self._owners)]
+
+    def iter_nodes(self, key: str) -> Iterator[str]:
+        """从键的位置顺时针依次给出不同节点，用于首选节点不可用时的回退"""
+        if not self._hashes:
+            return
+        total = len(self._owners)
+        start = bisect(self._hashes, _hash64(key))
+        seen = set()
+        for offset in range(total):
+            node_id = self._owners[(start + offset) % total]
+            if node_id not in seen:
+                seen.add(node_id)
+                yield node_id
+                if len(seen) == self.node_count:
+                    return
+
+
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+class BackendResponseError(Exception):
+    """后端返回非成功状态码"""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"HTTP {status_code}: {body}")
+        self.status_code = status_code
+        # 4xx是请求本身的问题，换后端重试也不会成功
+        self.retryable = status_code >= 500
+
+
+class RetryBudget:
+    """重试预算：滑动窗口内重试数不超过 请求数×ratio + 每秒保底数×窗口秒数
+
+    代替固定的每请求重试次数，后端整体故障时重试不会把流量放大数倍。
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 5.0, window: int = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests = [0] * window
+        self._retries = [0] * window
+        self._slot_seconds = [0] * window
+        self.rejected = 0
+
+    def _slot(self) -> int:
+        second = int(time.monotonic())
+        index = second % self.window
+        if self._slot_seconds[index] != second:
+            self._slot_seconds[index] = second
+            self._requests[index] = 0
+            self._retries[index] = 0
+        return index
+
+    def _total(self, counts: List[int]) -> int:
+        oldest = int(time.monotonic()) - self.window
+        return sum(count for count, second in zip(counts, self._slot_seconds) if second > oldest)
+
+    def record_request(self) -> None:
+        self._requests[self._slot()] += 1
+
+    def try_withdraw(self) -> bool:
+        """申请一次重试额度"""
+        index = self._slot()
+        allowed = self._total(self._requests) * self.ratio + self.min_per_second * self.window
+        if self._total(self._retries) + 1 > allowed:
+            self.rejected += 1
+            return False
+        self._retries[index] += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests_in_window": self._total(self._requests),
+            "retries_in_window": self._total(self._retries),
+            "rejected": self.rejected
+        }
+
+
+async def _redis_call(client: Any, method: str, *args) -> Any:
+    """兼容同步与异步Redis客户端；同步客户端放到线程中执行"""
+    func = getattr(client, method)
+    if inspect.iscoroutinefunction(func):
+        return await func(*args)
+    result = await asyncio.to_thread(func, *args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+class SessionAffinityTable:
+    """有界的会话亲和性表：本地LRU+TTL，配置Redis时跨节点共享"""
+
+    def __init__(self, max_size: int = 100000, ttl: float = 3600, redis_client: Any = None,
+                 key_prefix: str = "ha:lb:affinity:"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # session_id -> (backend_id, 过期时间)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get_local(session_id) is not None
+
+    def get_local(self, session_id: str) -> Optional[str]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        backend_id, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return backend_id
+
+    def _store(self, session_id: str, backend_id: str) -> None:
+        self._entries[session_id] = (backend_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, session_id: str) -> Optional[str]:
+        """查询会话绑定的后端；本地未命中时查Redis"""
+        backend_id = self.get_local(session_id)
+        if backend_id is not None or self.redis_client is None:
+            return backend_id
+        try:
+            value = await _redis_call(self.redis_client, "get", self.key_prefix + session_id)
+        except Exception as e:
+            logging.warning(f"Session affinity lookup failed: {str(e)}")
+            return None
+        if value is None:
+            return None
+        backend_id = value.decode() if isinstance(value, bytes) else value
+        self._store(session_id, backend_id)
+        return backend_id
+
+    async def set(self, session_id: str, backend_id: str) -> None:
+        """绑定会话；绑定未变化且未过半TTL时不重复写Redis"""
+        entry = self._entries.get(session_id)
+        now = time.monotonic()
+        unchanged = entry is not None and entry[0] == backend_id and entry[1] - now > self.ttl / 2
+        if unchanged:
+            self._entries.move_to_end(session_id)
+            return
+        self._store(session_id, backend_id)
+        if self.redis_client is not None:
+            try:
+                await _redis_call(self.redis_client, "setex", self.key_prefix + session_id, int(self.ttl), backend_id)
+            except Exception as e:
+                logging.warning(f"Session affinity write failed: {str(e)}")
+
+    def discard(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
+
+    def purge_expired(self) -> int:
+        """清理过期条目"""
+        now = time.monotonic()
+        expired = [sid for sid, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for session_id in expired:
+            del self._entries[session_id]
+        return len(expired)
+
+
 @dataclass
 class LoadBalancingConfig:
     """负载均衡配置"""
@@ -85,8 +299,15 @@ class LoadBalancingConfig:
     retry_delay: float = 1.0
     sticky_sessions: bool = False
     session_affinity_timeout: int = 3600
+    session_affinity_max_entries: int = 100000  # 本地亲和性表上限（LRU淘汰）
     connection_timeout: int = 30
     read_timeout: int = 60
+    keepalive_timeout: int = 30  # 后端连接池空闲连接保持时间
+    retry_budget_ratio: float = 0.2  # 重试（含对冲）请求数不超过正常请求的比例
+    retry_budget_min_per_second: float = 5.0  # 低流量时每秒至少允许的重试数
+    hedge_requests: bool = False  # 幂等请求超过p95延迟后向另一后端发对冲请求
+    hedge_percentile: float = 0.95
+    hedge_min_delay: float = 0.01
 
 class LoadBalancer:
     """负载均衡器"""
@@ -95,17 +316,40 @@ class LoadBalancer:
         self.config = config
         self.backends: Dict[str, BackendServer] = {}
         self.current_index = 0
-        self.session_affinity: Dict[str, str] = {}  # session_id -> backend_id
+        self.session_affinity = SessionAffinityTable(
+            max_size=config.session_affinity_max_entries,
+            ttl=config.session_affinity_timeout
+        )
         self.redis_client: Optional[redis.Redis] = None
-        self._lock = asyncio.Lock()
+        self.retry_budget = RetryBudget(config.retry_budget_ratio, config.retry_budget_min_per_second)
+
+        # 每个后端一个长连接会话（keep-alive连接池）
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        # 最近请求延迟，用于计算对冲延迟
+        self._latencies: deque = deque(maxlen=512)
+        self._hedge_delay: Optional[float] = None
+        self._latency_samples_since_update = 0
+        self.hash_ring_replicas = 100
+
+        # 可用后端视图：只在成员、状态或权重变化时重建，请求路径上不再逐个过滤
+        self._view_version = 0
+        self._built_version = -1
+        self._built_size = 0
+        self._available: List[BackendServer] = []
+        self._ring: Optional[ConsistentHashRing] = None
+        self._swrr_weights: Dict[str, int] = {}
 
         # 统计信息
         self.total_requests = 0
         self.total_failures = 0
+        self.total_retries = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
 
     async def initialize(self, redis_client: Optional[redis.Redis] = None) -> None:
         """初始化负载均衡器"""
         self.redis_client = redis_client
+        self.session_affinity.redis_client = redis_client
 
         # 启动健康检查
         asyncio.create_task(self._health_check_loop())
@@ -116,83 +360,123 @@ class LoadBalancer:
     def add_backend(self, backend: BackendServer) -> None:
         """添加后端服务器"""
         self.backends[backend.id] = backend
+        object.__setattr__(backend, '_view_listener', self._invalidate_view)
+        self._invalidate_view()
         logging.info(f"Added backend server: {backend.id} ({backend.url})")
 
     def remove_backend(self, backend_id: str) -> bool:
         """移除后端服务器"""
         if backend_id in self.backends:
-            del self.backends[backend_id]
+            backend = self.backends.pop(backend_id)
+            object.__setattr__(backend, '_view_listener', None)
+            self._invalidate_view()
+            session = self._sessions.pop(backend_id, None)
+            if session is not None and not session.closed:
+                try:
+                    asyncio.get_running_loop().create_task(session.close())
+                except RuntimeError:
+                    pass
             logging.info(f"Removed backend server: {backend_id}")
             return True
         return False
 
+    def _invalidate_view(self) -> None:
+        self._view_version += 1
+
+    def _available_view(self) -> List[BackendServer]:
+        """健康后端列表（按加入顺序），变化后首次访问时重建"""
+        if self._built_version != self._view_version or self._built_size != len(self.backends):
+            self._available = [b for b in self.backends.values() if b.status == BackendStatus.HEALTHY]
+            self._ring = None
+            self._swrr_weights = {b.id: 0 for b in self._available}
+            self._built_version = self._view_version
+            self._built_size = len(self.backends)
+        return self._available
+
+    def _hash_ring(self) -> ConsistentHashRing:
+        view = self._available_view()
+        if self._ring is None:
+            self._ring = ConsistentHashRing(((b.id, b.weight) for b in view), self.hash_ring_replicas)
+        return self._ring
+
+    @staticmethod
+    def _has_capacity(backend: BackendServer) -> bool:
+        return backend.current_connections < backend.max_connections
+
     async def select_backend(self, request_context: Dict[str, Any] = None) -> Optional[BackendServer]:
         """选择后端服务器"""
-        if not self.backends:
-            return None
-
-        # 过滤可用的后端服务器
-        available_backends = [
-            backend for backend in self.backends.values()
-            if backend.is_available
-        ]
+        return self.select_backend_nowait(request_context)
 
-        if not available_backends:
+    def select_backend_nowait(self, request_context: Dict[str, Any] = None) -> Optional[BackendServer]:
+        """同步选择后端服务器（选择过程不涉及IO）"""
+        backends = self._available_view()
+        if not backends:
             return None
 
+        strategy = self.config.strategy
+        context = request_context or {}
+
         # 根据策略选择后端
-        if self.config.strategy == LoadBalancingStrategy.ROUND_ROBIN:
-            return await self._round_robin_select(available_backends)
-        elif self.config.strategy == LoadBalancingStrategy.WEIGHTED_ROUND_ROBIN:
-            return await self._weighted_round_robin_select(available_backends)
-        elif self.config.strategy == LoadBalancingStrategy.LEAST_CONNECTIONS:
-            return await self._least_connections_select(available_backends)
-        elif self.config.strategy == LoadBalancingStrategy.LEAST_RESPONSE_TIME:
-            return await self._least_response_time_select(available_backends)
-        elif self.config.strategy == LoadBalancingStrategy.IP_HASH:
-            return await self._ip_hash_select(available_backends, request_context)
-        elif self.config.strategy == LoadBalancingStrategy.URL_HASH:
-            return await self._url_hash_select(available_backends, request_context)
-        elif self.config.strategy == LoadBalancingStrategy.RANDOM:
-            return await self._random_select(available_backends)
-        elif self.config.strategy == LoadBalancingStrategy.CONSISTENT_HASH:
-            return await self._consistent_hash_select(available_backends, request_context)
+        if strategy == LoadBalancingStrategy.ROUND_ROBIN:
+            backend = self._round_robin_select(backends)
+        elif strategy == LoadBalancingStrategy.WEIGHTED_ROUND_ROBIN:
+            backend = self._weighted_round_robin_select(backends)
+        elif strategy == LoadBalancingStrategy.LEAST_CONNECTIONS:
+            backend = self._least_connections_select(backends)
+        elif strategy == LoadBalancingStrategy.LEAST_RESPONSE_TIME:
+            backend = self._least_response_time_select(backends)
+        elif strategy == LoadBalancingStrategy.POWER_OF_TWO_CHOICES:
+            backend = self._power_of_two_select(backends)
+        elif strategy == LoadBalancingStrategy.IP_HASH:
+            backend = self._hash_select(context.get("client_ip", "127.0.0.1"))
+        elif strategy == LoadBalancingStrategy.URL_HASH:
+            backend = self._hash_select(context.get("url", "/"))
+        elif strategy == LoadBalancingStrategy.CONSISTENT_HASH:
+            backend = self._hash_select(context.get("session_id") or context.get("client_ip", "127.0.0.1"))
+        elif strategy == LoadBalancingStrategy.RANDOM:
+            backend = random.choice(backends)
         else:
-            return available_backends[0]
+            backend = backends[0]
 
-    async def _round_robin_select(self, backends: List[BackendServer]) -> BackendServer:
-        """轮询选择"""
-        async with self._lock:
-            backend = backends[self.current_index % len(backends)]
-            self.current_index += 1
+        if backend is not None and self._has_capacity(backend):
             return backend
 
-    async def _weighted_round_robin_select(self, backends: List[BackendServer]) -> BackendServer:
-        """加权轮询选择"""
-        total_weight = sum(backend.weight for backend in backends)
-        if total_weight == 0:
-            return backends[0]
+        # 选中的后端连接已满：在有容量的后端中取连接数最少者
+        candidates = [b for b in backends if self._has_capacity(b)]
+        return min(candidates, key=lambda b: b.current_connections) if candidates else None
 
-        # 计算累积权重
-        cumulative_weights = []
-        current_weight = 0
+    def _round_robin_select(self, backends: List[BackendServer]) -> BackendServer:
+        """轮询选择"""
+        backend = backends[self.current_index % len(backends)]
+        self.current_index += 1
+        return backend
+
+    def _weighted_round_robin_select(self, backends: List[BackendServer]) -> BackendServer:
+        """平滑加权轮询（nginx算法）：权重 5:1:1 产生 a a b a c a a 而不是连续5次a"""
+        weights = self._swrr_weights
+        total_weight = 0
+        best = None
+        best_weight = 0
         for backend in backends:
-            current_weight += backend.weight
-            cumulative_weights.append((backend, current_weight))
-
-        # 随机选择
-        random_weight = random.randint(1, total_weight)
-        for backend, cumulative_weight in cumulative_weights:
-            if random_weight <= cumulative_weight:
-                return backend
-
-        return backends[-1]
+            if backend.current_connections >= backend.max_connections:
+                continue
+            weight = backend.weight
+            current = weights[backend.id] + weight
+            weights[backend.id] = current
+            total_weight += weight
+            if best is None or current > best_weight:
+                best, best_weight = backend, current
+
+        if best is None:
+            return backends[0]
+        weights[best.id] = best_weight - total_weight
+        return best
 
-    async def _least_connections_select(self, backends: List[BackendServer]) -> BackendServer:
+    def _least_connections_select(self, backends: List[BackendServer]) -> BackendServer:
         """最少连接选择"""
         return min(backends, key=lambda b: b.current_connections)
 
-    async def _least_response_time_select(self, backends: List[BackendServer]) -> BackendServer:
+    def _least_response_time_select(self, backends: List[BackendServer]) -> BackendServer:
         """最短响应时间选择"""
         # 只考虑成功率 > 80% 的服务器
         healthy_backends = [b for b in backends if b.success_rate > 0.8]
@@ -201,31 +485,80 @@ class LoadBalancer:
 
         return min(healthy_backends, key=lambda b: b.response_time)
 
-    async def _ip_hash_select(self, backends: List[BackendServer], context: Dict[str, Any]) -> BackendServer:
-        """IP哈希选择"""
-        client_ip = context.get("client_ip", "127.0.0.1")
-        hash_value = int(hashlib.md5(client_ip.encode()).hexdigest(), 16)
-        backend_index = hash_value % len(backends)
-        return backends[backend_index]
-
-    async def _url_hash_select(self, backends: List[BackendServer], context: Dict[str, Any]) -> BackendServer:
-        """URL哈希选择"""
-        url = context.get("url", "/")
-        hash_value = int(hashlib.md5(url.encode()).hexdigest(), 16)
-        backend_index = hash_value % len(backends)
-        return backends[backend_index]
-
-    async def _random_select(self, backends: List[BackendServer]) -> BackendServer:
-        """随机选择"""
-        return random.choice(backends)
-
-    async def _consistent_hash_select(self, backends: List[BackendServer], context: Dict[str, Any]) -> BackendServer:
-        """一致性哈希选择"""
-        # 简化的一致性哈希实现
-        identifier = context.get("session_id") or context.get("client_ip", "127.0.0.1")
-        hash_value = int(hashlib.sha256(identifier.encode()).hexdigest(), 16)
-        backend_index = hash_value % len(backends)
-        return backends[backend_index]
+    @staticmethod
+    def _load_score(backend: BackendServer) -> float:
+        """EWMA延迟 × (在途连接+1) / 权重，越小越好；未有延迟样本的后端得分为0以便预热"""
+        return backend.response_time * (backend.current_connections + 1) / (backend.weight * max(backend.success_rate, 0.1))
+
+    def _power_of_two_select(self, backends: List[BackendServer]) -> BackendServer:
+        """二选一：随机取两台，选负载得分较低者，O(1)且避免羊群效应"""
+        count = len(backends)
+        if count == 1:
+            return backends[0]
+        i = int(random.random() * count)
+        j = int(random.random() * (count - 1))
+        first, second = backends[i], backends[j + 1 if j >= i else j]
+        return first if self._load_score(first) <= self._load_score(second) else second
+
+    def _hash_select(self, key: str) -> Optional[BackendServer]:
+        """哈希环选择；首选节点连接已满时顺时针取下一个节点"""
+        ring = self._hash_ring()
+        backends = self.backends
+        backend = backends.get(ring.get(key))
+        if backend is not None and self._has_capacity(backend):
+            return backend
+        for backend_id in ring.iter_nodes(key):
+            backend = backends.get(backend_id)
+            if backend is not None and self._has_capacity(backend):
+                return backend
+        return None
+
+    def _get_session(self, backend: BackendServer) -> aiohttp.ClientSession:
+        """后端的长连接会话，首次使用时创建"""
+        session = self._sessions.get(backend.id)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=backend.max_connections,
+                keepalive_timeout=self.config.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    connect=self.config.connection_timeout,
+                    total=self.config.read_timeout
+                )
+            )
+            self._sessions[backend.id] = session
+        return session
+
+    async def close(self) -> None:
+        """关闭所有后端连接池"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+
+    def _select_alternate(self, request_context: Dict[str, Any], excluded: set) -> Optional[BackendServer]:
+        """重试/对冲时选择另一个后端：排除已尝试的后端后取负载得分最低者"""
+        candidates = [
+            b for b in self._available_view()
+            if b.id not in excluded and self._has_capacity(b)
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=self._load_score)
+
+    def _record_latency(self, response_time: float) -> None:
+        self._latencies.append(response_time)
+        self._latency_samples_since_update += 1
+        # 每64个样本重新计算一次分位数
+        if self._latency_samples_since_update >= 64 and len(self._latencies) >= 64:
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.config.hedge_percentile))
+            self._hedge_delay = max(self.config.hedge_min_delay, ordered[index])
+            self._latency_samples_since_update = 0
 
     async def make_request(
         self,
@@ -236,39 +569,120 @@ class LoadBalancer:
         params: Dict[str, str] = None,
         request_context: Dict[str, Any] = None
     ) -> Dict[str, Any]:
-        """发起请求到后端服务器"""
+        """发起请求到后端服务器
+
+        失败时在重试预算内换后端重试；幂等请求在开启对冲后，超过p95延迟仍未返回时
+        向另一后端并发请求，取先成功的结果。
+        """
         request_context = request_context or {}
         self.total_requests += 1
+        self.retry_budget.record_request()
 
         # 检查会话亲和性
-        if self.config.sticky_sessions:
-            session_id = request_context.get("session_id")
-            if session_id and session_id in self.session_affinity:
-                backend_id = self.session_affinity[session_id]
-                backend = self.backends.get(backend_id)
-                if backend and backend.is_available:
-                    return await self._make_request_to_backend(
-                        backend, method, url, headers, data, params
-                    )
+        backend = None
+        session_id = request_context.get("session_id") if self.config.sticky_sessions else None
+        if session_id:
+            backend_id = await self.session_affinity.get(session_id)
+            if backend_id is not None:
+                candidate = self.backends.get(backend_id)
+                if candidate and candidate.is_available:
+                    backend = candidate
 
         # 选择后端服务器
-        backend = await self.select_backend(request_context)
+        if backend is None:
+            backend = self.select_backend_nowait(request_context)
         if not backend:
             raise Exception("No available backend servers")
 
         # 记录会话亲和性
-        if self.config.sticky_sessions and request_context.get("session_id"):
-            self.session_affinity[request_context["session_id"]] = backend.id
+        if session_id:
+            await self.session_affinity.set(session_id, backend.id)
 
-        # 发起请求
+        idempotent = request_context.get("idempotent", method.upper() in IDEMPOTENT_METHODS)
+        hedge = self.config.hedge_requests and idempotent
+        tried = set()
+        last_exception = None
+
+        for attempt in range(1, max(self.config.max_retries, 1) + 1):
+            try:
+                if hedge:
+                    result = await self._hedged_request(backend, method, url, headers, data, params,
+                                                        request_context, tried)
+                else:
+                    result = await self._make_request_to_backend(backend, method, url, headers, data, params)
+                result["attempt"] = attempt
+                return result
+            except BackendResponseError as e:
+                last_exception = e
+                if not e.retryable:
+                    break
+            except Exception as e:
+                last_exception = e
+
+            tried.add(backend.id)
+            if attempt >= self.config.max_retries or not self.retry_budget.try_withdraw():
+                break
+            self.total_retries += 1
+
+            alternate = self._select_alternate(request_context, tried)
+            if alternate is None:
+                # 没有其他可用后端时退避后重试同一后端
+                await asyncio.sleep(self.config.retry_delay)
+            else:
+                backend = alternate
+
+        # 所有重试都失败
+        self.total_failures += 1
+        raise last_exception or Exception("Request failed after all retries")
+
+    async def _hedged_request(
+        self,
+        primary: BackendServer,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        data: Any,
+        params: Dict[str, str],
+        request_context: Dict[str, Any],
+        tried: set
+    ) -> Dict[str, Any]:
+        """对冲请求：主请求超过对冲延迟未返回时向另一后端再发一次"""
+        first = asyncio.ensure_future(
+            self._make_request_to_backend(primary, method, url, headers, data, params)
+        )
+        delay = self._hedge_delay
+        if delay is None:
+            # 延迟样本不足，不做对冲
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        alternate = self._select_alternate(request_context, tried | {primary.id})
+        if alternate is None or not self.retry_budget.try_withdraw():
+            return await first
+
+        self.hedged_requests += 1
+        second = asyncio.ensure_future(
+            self._make_request_to_backend(alternate, method, url, headers, data, params)
+        )
+        pending = {first, second}
+        error: Optional[BaseException] = None
         try:
-            backend.current_connections += 1
-            result = await self._make_request_to_backend(
-                backend, method, url, headers, data, params
-            )
-            return result
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
         finally:
-            backend.current_connections -= 1
+            for task in pending:
+                task.cancel()
+        tried.add(alternate.id)
+        raise error
 
     async def _make_request_to_backend(
         self,
@@ -279,58 +693,46 @@ class LoadBalancer:
         data: Any = None,
         params: Dict[str, str] = None
     ) -> Dict[str, Any]:
-        """向特定后端服务器发起请求"""
+        """向特定后端服务器发起一次请求（复用该后端的连接池）"""
         start_time = time.time()
-        last_exception = None
-
-        for attempt in range(self.config.max_retries):
-            try:
-                # 构建完整URL
-                full_url = f"{backend.url}{url}"
-
-                # 发起HTTP请求
-                async with aiohttp.ClientSession(
-                    timeout=aiohttp.ClientTimeout(
-                        connect=self.config.connection_timeout,
-                        total=self.config.read_timeout
-                    )
-                ) as session:
-                    async with session.request(
-                        method,
-                        full_url,
-                        headers=headers,
-                        json=data if isinstance(data, dict) else None,
-                        params=params
-                    ) as response:
-                        response_time = time.time() - start_time
-                        response_data = {
-                            "status_code": response.status,
-                            "headers": dict(response.headers),
-                            "body": await response.text(),
-                            "response_time": response_time,
-                            "backend_id": backend.id,
-                            "attempt": attempt + 1
-                        }
-
-                        # 更新服务器统计
-                        success = 200 <= response.status < 400
-                        backend.update_stats(success, response_time)
-
-                        if success:
-                            return response_data
-                        else:
-                            last_exception = Exception(f"HTTP {response.status}: {response_data['body']}")
-
-            except Exception as e:
-                last_exception = e
-                backend.update_stats(False, time.time() - start_time)
-
-                if attempt < self.config.max_retries - 1:
-                    await asyncio.sleep(self.config.retry_delay)
+        backend.current_connections += 1
+        try:
+            # 构建完整URL
+            full_url = f"{backend.url}{url}"
+
+            async with self._get_session(backend).request(
+                method,
+                full_url,
+                headers=headers,
+                json=data if isinstance(data, dict) else None,
+                params=params
+            ) as response:
+                body = await response.text()
+                response_time = time.time() - start_time
+
+                # 更新服务器统计
+                success = 200 <= response.status < 400
+                backend.update_stats(success, response_time)
+                self._record_latency(response_time)
+
+                if not success:
+                    raise BackendResponseError(response.status, body)
+
+                return {
+                    "status_code": response.status,
+                    "headers": dict(response.headers),
+                    "body": body,
+                    "response_time": response_time,
+                    "backend_id": backend.id
+                }
 
-        # 所有重试都失败
-        self.total_failures += 1
-        raise last_exception or Exception("Request failed after all retries")
+        except (BackendResponseError, asyncio.CancelledError):
+            raise
+        except Exception:
+            backend.update_stats(False, time.time() - start_time)
+            raise
+        finally:
+            backend.current_connections -= 1
 
     async def _health_check_loop(self) -> None:
         """健康检查循环"""
@@ -369,11 +771,11 @@ class LoadBalancer:
         try:
             health_url = f"{backend.url}{self.config.health_check_path}"
 
-            async with aiohttp.ClientSession(
+            async with self._get_session(backend).get(
+                health_url,
                 timeout=aiohttp.ClientTimeout(total=self.config.health_check_timeout)
-            ) as session:
-                async with session.get(health_url) as response:
-                    return response.status == 200
+            ) as response:
+                return response.status == 200
 
         except Exception:
             return False
@@ -383,16 +785,7 @@ class LoadBalancer:
         while True:
             try:
                 # 清理过期的会话亲和性记录
-                current_time = datetime.now()
-                expired_sessions = [
-                    session_id for session_id, timestamp in self.session_affinity.items()
-                    if isinstance(timestamp, datetime) and
-                    (current_time - timestamp).seconds > self.config.session_affinity_timeout
-                ]
-
-                for session_id in expired_sessions:
-                    del self.session_affinity[session_id]
-
+                self.session_affinity.purge_expired()
                 await asyncio.sleep(300)  # 每5分钟清理一次
 
             except Exception as e:
@@ -416,11 +809,19 @@ class LoadBalancer:
         return {
             "total_backends": len(self.backends),
             "healthy_backends": healthy_backends,
+            "available_backends": len([b for b in self._available_view() if self._has_capacity(b)]),
             "unhealthy_backends": len(self.backends) - healthy_backends,
             "total_connections": total_connections,
             "strategy": self.config.strategy.value,
             "total_requests": self.total_requests,
             "total_failures": self.total_failures,
+            "total_retries": self.total_retries,
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": self._hedge_delay,
+            "retry_budget": self.retry_budget.get_stats(),
+            "session_affinity_entries": len(self.session_affinity),
+            "pooled_sessions": len(self._sessions),
             "success_rate": (self.total_requests - self.total_failures) / max(self.total_requests, 1),
             "average_response_time": avg_response_time,
             "backends": {
@@ -525,4 +926,72 @@ class MultiRegionLoadBalancer:
         return {
             region_name: load_balancer.get_statistics()
             for region_name, load_balancer in self.regions.items()
-        }
\ No newline at end of file
+        }
+
+def benchmark_load_balancer(backend_count: int = 20, selections: int = 100000,
+                            keys: int = 50000) -> Dict[str, Any]:
+    """选择开销与成员变化时键迁移比例基准"""
+    rng = random.Random(7)
+
+    def build(strategy: LoadBalancingStrategy) -> LoadBalancer:
+        lb = LoadBalancer(LoadBalancingConfig(strategy=strategy))
+        for i in range(backend_count):
+            backend = BackendServer(id=f"backend-{i}", host=f"10.0.0.{i}", port=8000, weight=1 + i % 3)
+            backend.response_time = rng.uniform(0.01, 0.2)
+            lb.add_backend(backend)
+        return lb
+
+    # 旧实现每次请求都要过滤整个后端列表
+    lb = build(LoadBalancingStrategy.ROUND_ROBIN)
+    start = time.perf_counter()
+    for _ in range(selections):
+        [b for b in lb.backends.values() if b.is_available]
+    legacy_filter_ns = round((time.perf_counter() - start) / selections * 1e9, 1)
+
+    contexts = [{"client_ip": f"10.1.{i >> 8}.{i & 255}", "session_id": f"session-{i}"} for i in range(4096)]
+    selection_ns = {}
+    for strategy in (LoadBalancingStrategy.ROUND_ROBIN, LoadBalancingStrategy.WEIGHTED_ROUND_ROBIN,
+                     LoadBalancingStrategy.LEAST_CONNECTIONS, LoadBalancingStrategy.POWER_OF_TWO_CHOICES,
+                     LoadBalancingStrategy.CONSISTENT_HASH):
+        lb = build(strategy)
+        select = lb.select_backend_nowait
+        start = time.perf_counter()
+        for i in range(selections):
+            select(contexts[i & 4095])
+        selection_ns[strategy.value] = round((time.perf_counter() - start) / selections * 1e9, 1)
+
+    key_list = [f"session-{i}" for i in range(keys)]
+
+    def moved(before: Dict[str, str], after: Dict[str, str]) -> float:
+        return round(sum(1 for k in key_list if before[k] != after[k]) / len(key_list) * 100, 2)
+
+    lb = build(LoadBalancingStrategy.CONSISTENT_HASH)
+    original = {k: lb._hash_select(k).id for k in key_list}
+    lb.add_backend(BackendServer(id=f"backend-{backend_count}", host="10.0.1.1", port=8000, weight=2))
+    added = {k: lb._hash_select(k).id for k in key_list}
+    lb.remove_backend("backend-0")
+    removed = {k: lb._hash_select(k).id for k in key_list}
+
+    # 旧实现：sha256(id) % len(backends)
+    def modulo(ids: List[str]) -> Dict[str, str]:
+        return {k: ids[int(hashlib.sha256(k.encode()).hexdigest(), 16) % len(ids)] for k in key_list}
+
+    ids = [f"backend-{i}" for i in range(backend_count)]
+    modulo_before = modulo(ids)
+    modulo_added = modulo(ids + [f"backend-{backend_count}"])
+
+    return {
+        "backends": backend_count,
+        "selection_ns": selection_ns,
+        "legacy_filter_ns": legacy_filter_ns,
+        "remap_percent": {
+            "ring_add_backend": moved(original, added),
+            "ring_remove_backend": moved(added, removed),
+            "modulo_add_backend": moved(modulo_before, modulo_added)
+        }
+    }
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(benchmark_load_balancer(), indent=2))
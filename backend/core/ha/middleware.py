@@ -17,7 +17,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import ASGIApp
 
 from .load_balancer import LoadBalancer, LoadBalancingConfig, BackendServer
-from .health_check import HealthChecker, HealthCheckConfig, CheckType
+from .health_check import HealthChecker, HealthCheckConfig, CheckType, HealthStatus
 from .failover import FailoverManager, FailoverConfig, FailoverStrategy
 from .cluster_management import ClusterManager, ClusterConfig
 from .setup import HAConfig, HASetup
@@ -409,19 +409,17 @@ class HealthCheckMiddleware(BaseHTTPMiddleware):
         """处理健康检查请求"""
         if request.url.path == self.health_path:
             try:
-                # 执行健康检查
-                result = await self.health_checker.execute_check()
-
-                status_code = 200 if result.is_healthy else 503
+                # 只读取后台检查循环的最新结果，高频探测不会触发对依赖的访问
+                summary = self.health_checker.get_health_summary()
+                unhealthy = summary["overall_status"] in (HealthStatus.UNHEALTHY.value, HealthStatus.CRITICAL.value)
 
                 return JSONResponse(
-                    status_code=status_code,
+                    status_code=503 if unhealthy else 200,
                     content={
-                        "status": result.status.value,
-                        "message": result.message,
-                        "timestamp": result.timestamp.isoformat(),
-                        "response_time": result.response_time,
-                        "details": result.details
+                        "status": summary["overall_status"],
+                        "message": f"{summary['healthy_checks']}/{summary['total_checks']} checks healthy",
+                        "timestamp": summary["last_updated"],
+                        "details": summary["checks"]
                     }
                 )
 
@@ -10,7 +10,7 @@ import json
 import logging
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from dataclasses import asdict
+from dataclasses import dataclass, asdict
 from pathlib import Path
 import redis
 
@@ -704,7 +704,7 @@ class HASetup:
 
         return overall_status
 
-    def cleanup(self) -> None:
+    async def cleanup(self) -> None:
         """清理资源"""
         try:
             if self.cluster_manager:
@@ -713,6 +713,8 @@ class HASetup:
                 await self.failover_manager.cleanup()
             if self.health_checker:
                 await self.health_checker.stop()
+            if self.load_balancer:
+                await self.load_balancer.close()
             if self.redis_client:
                 self.redis_client.close()
             logging.info("HA system cleaned up")
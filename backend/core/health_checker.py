@@ -20,6 +20,7 @@ import logging
 from backend.config.settings import get_settings
 from backend.database import get_db
 from backend.models.developer import Developer, DeveloperAPIKey
+from backend.health.probe_cache import ProbeCache
 
 logger = logging.getLogger(__name__)
 
@@ -101,33 +102,47 @@ class HealthChecker:
             }
         }
 
-    async def run_all_checks(self) -> Dict[str, Any]:
-        """运行所有健康检查"""
+        # (检查名, 检查函数, 组件类型, 缓存秒数, 超时秒数)
+        self.probes = ProbeCache()
+        for name, method, component_type, ttl, timeout in [
+            ("database", self.check_database, ComponentType.DATABASE, 30, 5),
+            ("redis", self.check_redis, ComponentType.REDIS, 30, 3),
+            ("disk_space", self.check_disk_space, ComponentType.DISK_SPACE, 300, 2),
+            ("memory", self.check_memory, ComponentType.MEMORY, 30, 2),
+            ("cpu", self.check_cpu, ComponentType.CPU, 30, 3),
+            ("network", self.check_network, ComponentType.NETWORK, 120, 7),
+            ("api_service", self.check_api_service, ComponentType.API_SERVICE, 30, 5),
+            ("ai_services", self.check_ai_services, ComponentType.AI_SERVICE, 120, 12),
+        ]:
+            self.probes.register(name, method, ttl=ttl, timeout=timeout,
+                                 on_error=self._probe_failure(component_type))
+
+    @staticmethod
+    def _probe_failure(component_type: ComponentType):
+        def build(component: str, error: BaseException) -> HealthCheck:
+            if isinstance(error, asyncio.TimeoutError):
+                message = f"Health check timed out: {component}"
+            else:
+                message = f"Health check failed: {error}"
+            return HealthCheck(
+                component=component,
+                component_type=component_type,
+                status=HealthStatus.UNHEALTHY,
+                message=message,
+                details={"error": message}
+            )
+        return build
+
+    async def run_all_checks(self, force: bool = False) -> Dict[str, Any]:
+        """运行所有健康检查（各检查并发、独立超时，结果按TTL缓存）"""
         start_time = time.time()
         results = {}
 
-        # 并发执行所有检查
-        check_tasks = [
-            self.check_database(),
-            self.check_redis(),
-            self.check_disk_space(),
-            self.check_memory(),
-            self.check_cpu(),
-            self.check_network(),
-            self.check_api_service(),
-            self.check_ai_services()
-        ]
-
         try:
-            # 等待所有检查完成
-            check_results = await asyncio.gather(*check_tasks, return_exceptions=True)
+            check_results = await self.probes.get_many(force=force)
 
             # 处理结果
-            for i, result in enumerate(check_results):
-                if isinstance(result, Exception):
-                    logger.error(f"Health check failed: {result}")
-                    continue
-
+            for result in check_results.values():
                 if result:
                     self.checks[result.component] = result
                     results[result.component] = result.to_dict()
@@ -164,25 +179,29 @@ class HealthChecker:
         component = "postgresql"
         details = {}
 
-        try:
+        def query():
             # 测试数据库连接
             db = next(get_db())
+            try:
+                # 执行简单查询
+                result = db.execute("SELECT 1")
+                result.fetchone()
+
+                # 检查连接数
+                connection_result = db.execute("SELECT count(*) FROM pg_stat_activity")
+                active_connections = connection_result.scalar()
+
+                # 检查数据库大小
+                size_result = db.execute("""
+                    SELECT pg_size_pretty(pg_database_size(current_database())) as size
+                """)
+                return active_connections, size_result.scalar()
+            finally:
+                db.close()
 
-            # 执行简单查询
-            result = db.execute("SELECT 1")
-            result.fetchone()
-
-            # 检查连接数
-            connection_result = db.execute("SELECT count(*) FROM pg_stat_activity")
-            active_connections = connection_result.scalar()
-
-            # 检查数据库大小
-            size_result = db.execute("""
-                SELECT pg_size_pretty(pg_database_size(current_database())) as size
-            """)
-            db_size = size_result.scalar()
-
-            db.close()
+        try:
+            # 同步驱动放到线程中执行，超时不会阻塞事件循环
+            active_connections, db_size = await asyncio.to_thread(query)
 
             details.update({
                 "active_connections": active_connections,
@@ -378,7 +397,7 @@ class HealthChecker:
 
         try:
             # 获取CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
+            cpu_percent = await asyncio.to_thread(psutil.cpu_percent, 1)
             cpu_count = psutil.cpu_count()
             load_avg = psutil.getloadavg()
 
@@ -430,19 +449,17 @@ class HealthChecker:
             connected_hosts = []
             failed_hosts = []
 
-            for host in test_hosts:
+            async def reachable(host: str) -> bool:
                 try:
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    sock.settimeout(5)
-                    result = sock.connect_ex((host, 53))
-                    sock.close()
-
-                    if result == 0:
-                        connected_hosts.append(host)
-                    else:
-                        failed_hosts.append(host)
+                    _, writer = await asyncio.wait_for(asyncio.open_connection(host, 53), timeout=5)
+                    writer.close()
+                    return True
                 except Exception:
-                    failed_hosts.append(host)
+                    return False
+
+            # 各主机并发探测
+            for host, ok in zip(test_hosts, await asyncio.gather(*(reachable(h) for h in test_hosts))):
+                (connected_hosts if ok else failed_hosts).append(host)
 
             # 获取网络IO统计
             net_io = psutil.net_io_counters()
@@ -737,21 +754,9 @@ class HealthChecker:
         ]
 
     async def run_specific_check(self, component: str) -> HealthCheck:
-        """运行特定的健康检查"""
-        check_methods = {
-            "database": self.check_database,
-            "redis": self.check_redis,
-            "disk_space": self.check_disk_space,
-            "memory": self.check_memory,
-            "cpu": self.check_cpu,
-            "network": self.check_network,
-            "api_service": self.check_api_service,
-            "ai_services": self.check_ai_services
-        }
-
-        method = check_methods.get(component)
-        if method:
-            return await method()
+        """运行特定的健康检查（绕过缓存）"""
+        if component in self.probes:
+            return await self.probes.refresh(component)
         else:
             return HealthCheck(
                 component=component,
@@ -11,6 +11,7 @@ import aiohttp
 from backend.config.settings import get_settings
 from backend.core.ai_service import ai_manager
 from backend.core.cache_service import cache_service
+from backend.health.probe_cache import ProbeCache
 
 @dataclass
 class ServiceHealth:
@@ -40,6 +41,28 @@ class HealthService:
         self.settings = get_settings()
         self._session: Optional[aiohttp.ClientSession] = None
 
+        # 外部依赖探测结果按TTL缓存；Gemini探测会产生一次真实生成调用，缓存时间更长
+        self.probes = ProbeCache()
+        self.probes.register("openrouter", self.check_openrouter_health, ttl=60, timeout=12,
+                             on_error=self._probe_failure("OpenRouter"))
+        self.probes.register("gemini", self.check_gemini_health, ttl=300, timeout=15,
+                             on_error=self._probe_failure("Gemini"))
+        self.probes.register("file_storage", self.check_database_health, ttl=30, timeout=5,
+                             on_error=self._probe_failure("FileStorage"))
+
+    @staticmethod
+    def _probe_failure(name: str):
+        def build(_probe: str, error: BaseException) -> ServiceHealth:
+            timed_out = isinstance(error, asyncio.TimeoutError)
+            return ServiceHealth(
+                name=name,
+                status="unhealthy",
+                response_time=0.0,
+                last_check=datetime.now().isoformat(),
+                error_message="Request timeout" if timed_out else f"Health check failed: {error}"
+            )
+        return build
+
     async def _get_session(self) -> aiohttp.ClientSession:
         """获取HTTP会话"""
         if self._session is None or self._session.closed:
@@ -197,34 +220,10 @@ class HealthService:
                 error_message=str(e)
             )
 
-    async def get_system_health(self) -> SystemHealth:
-        """获取系统整体健康状态"""
-        # 并行检查所有服务
-        health_checks = await asyncio.gather(
-            self.check_openrouter_health(),
-            self.check_gemini_health(),
-            self.check_database_health(),
-            return_exceptions=True
-        )
-
-        services = []
-        unhealthy_count = 0
-
-        for check in health_checks:
-            if isinstance(check, ServiceHealth):
-                services.append(check)
-                if check.status == "unhealthy":
-                    unhealthy_count += 1
-            else:
-                # 处理异常情况
-                services.append(ServiceHealth(
-                    name="Unknown",
-                    status="unhealthy",
-                    response_time=0.0,
-                    last_check=datetime.now().isoformat(),
-                    error_message=f"Health check failed: {str(check)}"
-                ))
-                unhealthy_count += 1
+    async def get_system_health(self, force: bool = False) -> SystemHealth:
+        """获取系统整体健康状态（默认读取缓存结果，force时并发重新探测）"""
+        services = list((await self.probes.get_many(force=force)).values())
+        unhealthy_count = len([s for s in services if s.status == "unhealthy"])
 
         # 确定整体状态
         if unhealthy_count == 0:
@@ -274,16 +273,17 @@ class HealthService:
 
     async def cleanup(self):
         """清理资源"""
+        await self.probes.stop()
         if self._session and not self._session.closed:
             await self._session.close()
 
 # 全局健康服务实例
 health_service = HealthService()
 
-async def get_system_health() -> Dict[str, Any]:
+async def get_system_health(force: bool = False) -> Dict[str, Any]:
     """获取系统健康状态（API端点使用）"""
     try:
-        health = await health_service.get_system_health()
+        health = await health_service.get_system_health(force)
         return asdict(health)
     except Exception as e:
         return {
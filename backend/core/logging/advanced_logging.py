@@ -1,22 +1,30 @@
 """
 高级日志分析系统
 Week 5 Day 5: 系统监控和运维增强 - 高级日志分析
+
+流式分析模式：
+- 各异常检测器随日志到达增量维护窗口状态，单条日志的检测开销与窗口大小无关
+- 日志统计按小时桶增量累计，查询时只合并桶
+- 模式匹配先用合并正则一次扫描，再按必需字面量预过滤，保持原有的模式优先级
+- 批量解析可放到独立进程中执行，原始日志通过队列投递
 """
 
 import asyncio
 import json
+import math
 import re
 import gzip
 import hashlib
 import time
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Union, Tuple
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Any, Union, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
-from collections import defaultdict, Counter
+from collections import defaultdict, deque, Counter
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import uuid
 
 from backend.config.settings import get_settings
@@ -47,6 +55,18 @@ class LogCategory(Enum):
     AUDIT = "audit"
 
 
+SEVERITY_SCORES = {
+    LogLevel.TRACE: 1,
+    LogLevel.DEBUG: 2,
+    LogLevel.INFO: 3,
+    LogLevel.WARN: 4,
+    LogLevel.ERROR: 5,
+    LogLevel.FATAL: 6
+}
+
+ERROR_LEVELS = (LogLevel.ERROR, LogLevel.FATAL)
+
+
 class AnomalyType(Enum):
     """异常类型"""
     SPIKE = "spike"                     # 峰值异常
@@ -74,25 +94,20 @@ class LogEntry:
     tags: List[str] = None
     metadata: Dict[str, Any] = None
     raw_data: str = ""
+    id: str = ""
 
     def __post_init__(self):
         if self.tags is None:
             self.tags = []
         if self.metadata is None:
             self.metadata = {}
+        if not self.id:
+            self.id = uuid.uuid4().hex
 
     @property
     def severity_score(self) -> int:
         """严重程度评分"""
-        severity_scores = {
-            LogLevel.TRACE: 1,
-            LogLevel.DEBUG: 2,
-            LogLevel.INFO: 3,
-            LogLevel.WARN: 4,
-            LogLevel.ERROR: 5,
-            LogLevel.FATAL: 6
-        }
-        return severity_scores.get(self.level, 3)
+        return SEVERITY_SCORES.get(self.level, 3)
 
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -137,6 +152,11 @@ class LogAnomaly:
     resolved: bool = False
     resolved_at: Optional[datetime] = None
 
+    @property
+    def severity_score(self) -> int:
+        """异常严重程度评分"""
+        return SEVERITY_SCORES.get(self.severity, 3)
+
     def to_dict(self) -> Dict[str, Any]:
         data = asdict(self)
         data['anomaly_type'] = self.anomaly_type.value
@@ -169,12 +189,77 @@ class LogAggregation:
         return data
 
 
+# 结构化日志字段提取
+_TIMESTAMP_RE = re.compile(r'(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})')
+_LEVEL_RE = re.compile(r'\b(TRACE|DEBUG|INFO|WARN|ERROR|FATAL)\b', re.IGNORECASE)
+_MESSAGE_RES = (re.compile(r']\s*(.+)$'), re.compile(r'\s-\s(.+)$'))
+_TRACE_ID_RE = re.compile(r'trace[ _-]?id[=:]\s*([a-f0-9\-]+)', re.IGNORECASE)
+_USER_ID_RE = re.compile(r'user[ _-]?id[=:]\s*(\w+)', re.IGNORECASE)
+
+_NAMED_GROUP_RE = re.compile(r'\(\?P<\w+>')
+_BACKREF_RE = re.compile(r'\(\?P=|\\\d')
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
+
+def required_literal(regex: str) -> str:
+    """提取正则中必然出现的最长字面量（仅顶层、无分支时），用于匹配前的子串预过滤"""
+    if "|" in regex:
+        return ""
+
+    best, run = "", []
+    depth, i = 0, 0
+
+    def flush():
+        nonlocal best
+        if len(run) > len(best):
+            best = "".join(run)
+        run.clear()
+
+    while i < len(regex):
+        char = regex[i]
+        if char == "\\":
+            escaped = regex[i + 1:i + 2]
+            i += 2
+            if not escaped or escaped.isalnum():
+                flush()
+                continue
+            char = escaped
+        elif char == "[":
+            flush()
+            i = regex.find("]", i + 2) + 1 or len(regex)
+            continue
+        elif char in "()":
+            flush()
+            depth += 1 if char == "(" else -1
+            i += 1
+            continue
+        elif char in _REGEX_META:
+            flush()
+            i += 1
+            continue
+        else:
+            i += 1
+
+        if depth:
+            continue
+        quantifier = regex[i:i + 1]
+        if quantifier in ("?", "*", "{"):
+            flush()
+        else:
+            run.append(char)
+            if quantifier == "+":
+                flush()
+    flush()
+    return best if best.isascii() else ""
+
+
 class LogParser:
     """日志解析器"""
 
     def __init__(self):
         self.patterns: List[LogPattern] = []
         self.custom_parsers: Dict[str, re.Pattern] = {}
+        self._compiled_count = -1
         self._load_default_patterns()
 
     def _load_default_patterns(self):
@@ -263,20 +348,20 @@ class LogParser:
     def _parse_structured_log(self, raw_log: str, source: str) -> LogEntry:
         """解析结构化日志"""
         # 提取时间戳
-        timestamp_match = re.search(r'(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})', raw_log)
+        timestamp_match = _TIMESTAMP_RE.search(raw_log)
         timestamp = datetime.fromisoformat(timestamp_match.group(1).replace(' ', 'T')) if timestamp_match else datetime.utcnow()
 
         # 提取日志级别
-        level_match = re.search(r'\b(TRACE|DEBUG|INFO|WARN|ERROR|FATAL)\b', raw_log, re.IGNORECASE)
+        level_match = _LEVEL_RE.search(raw_log)
         level = LogLevel(level_match.group().upper()) if level_match else LogLevel.INFO
 
         # 提取消息
-        message_match = re.search(r']\s*(.+)$', raw_log) or re.search(r'\s-\s(.+)$', raw_log)
+        message_match = _MESSAGE_RES[0].search(raw_log) or _MESSAGE_RES[1].search(raw_log)
         message = message_match.group(1).strip() if message_match else raw_log
 
         # 提取其他字段
-        trace_id_match = re.search(r'trace[ _-]?id[=:]\s*([a-f0-9\-]+)', raw_log, re.IGNORECASE)
-        user_id_match = re.search(r'user[ _-]?id[=:]\s*(\w+)', raw_log, re.IGNORECASE)
+        trace_id_match = _TRACE_ID_RE.search(raw_log)
+        user_id_match = _USER_ID_RE.search(raw_log)
 
         return LogEntry(
             timestamp=timestamp,
@@ -290,16 +375,65 @@ class LogParser:
         )
 
     def match_pattern(self, log_entry: LogEntry) -> Optional[LogPattern]:
-        """匹配日志模式"""
-        for pattern in self.patterns:
-            if re.search(pattern.regex, log_entry.message, re.IGNORECASE):
-                pattern.match_count += 1
-                return pattern
+        """匹配日志模式（按模式顺序取第一个匹配）
+
+        合并正则一次扫描即可排除绝大多数不匹配的消息；命中第k个模式时，
+        只需再检查排在它之前、且通过字面量预过滤的模式。
+        """
+        if self._compiled_count != len(self.patterns):
+            self._compile_patterns()
+
+        message = log_entry.message
+        combined_match = self._combined.search(message) if self._combined else None
+        if combined_match is not None:
+            candidates = range(int(combined_match.lastgroup[2:]))
+        else:
+            candidates = self._standalone
+
+        lowered = None
+        for index in candidates:
+            compiled, literal = self._compiled[index]
+            if literal:
+                if lowered is None:
+                    lowered = message.lower()
+                if literal not in lowered:
+                    continue
+            if compiled.search(message):
+                return self._record_match(self.patterns[index])
+
+        if combined_match is not None:
+            return self._record_match(self.patterns[int(combined_match.lastgroup[2:])])
         return None
 
+    def _record_match(self, pattern: LogPattern) -> LogPattern:
+        pattern.match_count += 1
+        return pattern
+
+    def _compile_patterns(self):
+        """编译各模式、字面量预过滤和合并正则"""
+        self._compiled = []
+        self._standalone = []
+        alternatives = []
+        for index, pattern in enumerate(self.patterns):
+            self._compiled.append((re.compile(pattern.regex, re.IGNORECASE),
+                                   required_literal(pattern.regex).lower()))
+            if _BACKREF_RE.search(pattern.regex):
+                # 含反向引用的模式去掉命名组后无法合并，单独匹配
+                self._standalone.append(index)
+            else:
+                alternatives.append(f"(?P<_p{index}>{_NAMED_GROUP_RE.sub('(?:', pattern.regex)})")
+
+        try:
+            self._combined = re.compile("|".join(alternatives), re.IGNORECASE) if alternatives else None
+        except re.error:
+            self._combined = None
+            self._standalone = list(range(len(self.patterns)))
+        self._compiled_count = len(self.patterns)
+
     def add_pattern(self, pattern: LogPattern):
         """添加新模式"""
         self.patterns.append(pattern)
+        self._compiled_count = -1
 
     def get_pattern_statistics(self) -> Dict[str, Any]:
         """获取模式统计"""
@@ -317,7 +451,11 @@ class LogParser:
 
 
 class LogAnalyzer:
-    """日志分析器"""
+    """日志分析器
+
+    analyze_logs对给定日志列表做批量检测；observe为流式模式，
+    每条日志到达时更新各检测器的增量状态并返回新发现的异常。
+    """
 
     def __init__(self):
         self.anomaly_detectors = [
@@ -327,6 +465,28 @@ class LogAnalyzer:
             PatternChangeDetector()
         ]
 
+    def observe(self, log_entry: LogEntry) -> List[LogAnomaly]:
+        """流式检测单条日志"""
+        anomalies = []
+        for detector in self.anomaly_detectors:
+            try:
+                anomalies.extend(detector.observe(log_entry))
+            except Exception as e:
+                logger.error(f"Streaming anomaly detection failed for {detector.__class__.__name__}: {e}")
+        return anomalies
+
+    def tick(self, now: datetime) -> List[LogAnomaly]:
+        """无新日志时的定期检查（如持续静默）"""
+        anomalies = []
+        for detector in self.anomaly_detectors:
+            anomalies.extend(detector.tick(now))
+        return anomalies
+
+    def reset(self):
+        """清空流式状态"""
+        for detector in self.anomaly_detectors:
+            detector.reset()
+
     async def analyze_logs(
         self,
         logs: List[LogEntry],
@@ -384,18 +544,184 @@ class LogAnalyzer:
         }
 
 
+class _StatsBucket:
+    """一小时、一个分类的日志统计"""
+    __slots__ = ("total", "levels", "sources", "errors", "severity_sum", "performance")
+
+    def __init__(self):
+        self.total = 0
+        self.levels: Counter = Counter()
+        self.sources: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.severity_sum = 0
+        self.performance = 0
+
+
+class LogStatisticsAccumulator:
+    """增量日志统计：按(小时, 分类)累计，查询时只合并桶，与日志条数无关"""
+
+    max_error_messages = 200  # 每个桶保留的错误消息种类上限
+
+    def __init__(self, retention_hours: int = 168):
+        self.retention_hours = retention_hours
+        self.buckets: Dict[Tuple[datetime, LogCategory], _StatsBucket] = {}
+
+    def add(self, log: LogEntry):
+        """累计一条日志"""
+        hour = log.timestamp.replace(minute=0, second=0, microsecond=0)
+        key = (hour, log.category)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = _StatsBucket()
+            self._expire(hour)
+
+        bucket.total += 1
+        bucket.levels[log.level] += 1
+        bucket.sources[log.source] += 1
+        bucket.severity_sum += log.severity_score
+        if log.category == LogCategory.PERFORMANCE:
+            bucket.performance += 1
+        if log.level in ERROR_LEVELS:
+            message = log.message[:100]
+            if message in bucket.errors or len(bucket.errors) < self.max_error_messages:
+                bucket.errors[message] += 1
+
+    def _expire(self, newest_hour: datetime):
+        cutoff = newest_hour - timedelta(hours=self.retention_hours)
+        for key in [key for key in self.buckets if key[0] < cutoff]:
+            del self.buckets[key]
+
+    def get_statistics(self, since: datetime, category: Optional[LogCategory] = None) -> Dict[str, Any]:
+        """合并since所在小时及之后的桶，输出与LogAnalyzer.get_log_statistics相同的结构"""
+        since_hour = since.replace(minute=0, second=0, microsecond=0)
+        total = severity_sum = performance = 0
+        levels: Counter = Counter()
+        categories: Counter = Counter()
+        sources: Counter = Counter()
+        errors: Counter = Counter()
+        time_distribution: Dict[str, int] = defaultdict(int)
+
+        for (hour, bucket_category), bucket in self.buckets.items():
+            if hour < since_hour or (category and bucket_category != category):
+                continue
+            total += bucket.total
+            severity_sum += bucket.severity_sum
+            performance += bucket.performance
+            levels.update(bucket.levels)
+            categories[bucket_category] += bucket.total
+            sources.update(bucket.sources)
+            errors.update(bucket.errors)
+            time_distribution[hour.strftime("%Y-%m-%d %H:00")] += bucket.total
+
+        if not total:
+            return {}
+
+        error_count = sum(count for level, count in levels.items() if level in ERROR_LEVELS)
+        return {
+            "total_logs": total,
+            "level_distribution": {level.value: count for level, count in levels.items()},
+            "category_distribution": {item.value: count for item, count in categories.items()},
+            "source_distribution": dict(sources),
+            "time_distribution": dict(sorted(time_distribution.items())),
+            "error_rate": error_count / total * 100,
+            "avg_severity": severity_sum / total,
+            "top_errors": [{"message": msg, "count": count} for msg, count in errors.most_common(10)],
+            "performance_logs_count": performance
+        }
+
+
 class AnomalyDetector(ABC):
     """异常检测器基类"""
 
+    def __init__(self):
+        self.reset()
+
     @abstractmethod
     async def detect(self, logs: List[LogEntry], time_window: timedelta) -> List[LogAnomaly]:
         """检测异常"""
         pass
 
+    def reset(self):
+        """重置流式状态"""
+
+    def observe(self, log: LogEntry) -> List[LogAnomaly]:
+        """流式检测：用一条新日志更新窗口状态，O(1)"""
+        return []
+
+    def tick(self, now: datetime) -> List[LogAnomaly]:
+        """定期检查"""
+        return []
+
 
 class ErrorSpikeDetector(AnomalyDetector):
     """错误峰值检测器"""
 
+    bucket_minutes = 5
+    history_buckets = 12  # 流式模式下用于计算基线的历史桶数
+    min_errors = 5
+
+    def reset(self):
+        self._bucket: Optional[datetime] = None
+        self._bucket_count = 0
+        self._bucket_ids: Deque[str] = deque(maxlen=100)
+        self._reported = False
+        self._history: Deque[int] = deque()
+        self._history_sum = 0.0
+        self._history_sumsq = 0.0
+
+    def observe(self, log: LogEntry) -> List[LogAnomaly]:
+        """当前桶的错误数超过历史桶均值+2个标准差时告警（每个桶最多一次）"""
+        if log.level not in ERROR_LEVELS:
+            return []
+
+        bucket = self._get_time_bucket(log.timestamp, self.bucket_minutes)
+        if bucket != self._bucket:
+            if self._bucket is not None:
+                self._close_bucket()
+            self._bucket = bucket
+            self._bucket_count = 0
+            self._bucket_ids.clear()
+            self._reported = False
+
+        self._bucket_count += 1
+        self._bucket_ids.append(log.id)
+
+        # 与批量模式一致：至少3个有错误的桶（含当前桶）才判断
+        if self._reported or len(self._history) < 2 or self._bucket_count <= self.min_errors:
+            return []
+
+        count = len(self._history)
+        avg_errors = self._history_sum / count
+        std_dev = math.sqrt(max(self._history_sumsq / count - avg_errors ** 2, 0.0))
+        threshold = avg_errors + 2 * std_dev
+        if self._bucket_count <= threshold:
+            return []
+
+        self._reported = True
+        return [LogAnomaly(
+            anomaly_id=str(uuid.uuid4()),
+            anomaly_type=AnomalyType.SPIKE,
+            description=f"Error spike detected: {self._bucket_count} errors in {self.bucket_minutes} minutes (threshold: {threshold:.1f})",
+            detected_at=datetime.utcnow(),
+            severity=LogLevel.ERROR,
+            affected_logs=list(self._bucket_ids),
+            metrics={
+                "error_count": self._bucket_count,
+                "threshold": threshold,
+                "std_dev": std_dev,
+                "avg_errors": avg_errors
+            }
+        )]
+
+    def _close_bucket(self):
+        if len(self._history) >= self.history_buckets:
+            oldest = self._history.popleft()
+            self._history_sum -= oldest
+            self._history_sumsq -= oldest * oldest
+        self._history.append(self._bucket_count)
+        self._history_sum += self._bucket_count
+        self._history_sumsq += self._bucket_count * self._bucket_count
+
     async def detect(self, logs: List[LogEntry], time_window: timedelta) -> List[LogAnomaly]:
         """检测错误峰值"""
         anomalies = []
@@ -448,6 +774,45 @@ class ErrorSpikeDetector(AnomalyDetector):
 class ErrorBurstDetector(AnomalyDetector):
     """错误爆发检测器"""
 
+    window = timedelta(minutes=1)
+    threshold = 10
+
+    def reset(self):
+        self._errors: Deque[Tuple[datetime, str]] = deque()
+        self._last_reported: Optional[datetime] = None
+
+    def observe(self, log: LogEntry) -> List[LogAnomaly]:
+        """滑动1分钟窗口内错误数超过阈值时告警（同一窗口内不重复告警）"""
+        if log.level not in ERROR_LEVELS:
+            return []
+
+        errors = self._errors
+        errors.append((log.timestamp, log.id))
+        window_start = log.timestamp - self.window
+        while errors and errors[0][0] < window_start:
+            errors.popleft()
+
+        if len(errors) <= self.threshold:
+            return []
+        if self._last_reported is not None and log.timestamp - self._last_reported < self.window:
+            return []
+
+        self._last_reported = log.timestamp
+        return [LogAnomaly(
+            anomaly_id=str(uuid.uuid4()),
+            anomaly_type=AnomalyType.ERROR_BURST,
+            description=f"Error burst detected: {len(errors)} errors in 1 minute",
+            detected_at=datetime.utcnow(),
+            severity=LogLevel.ERROR,
+            affected_logs=[log_id for _, log_id in errors],
+            metrics={
+                "error_count": len(errors),
+                "time_window": 60,
+                "start_time": errors[0][0].isoformat(),
+                "end_time": errors[-1][0].isoformat()
+            }
+        )]
+
     async def detect(self, logs: List[LogEntry], time_window: timedelta) -> List[LogAnomaly]:
         """检测错误爆发"""
         anomalies = []
@@ -493,6 +858,54 @@ class ErrorBurstDetector(AnomalyDetector):
 class SilenceDetector(AnomalyDetector):
     """静默检测器"""
 
+    max_gap = timedelta(minutes=10)
+    min_logs = 10
+
+    def reset(self):
+        self._last_time: Optional[datetime] = None
+        self._seen = 0
+        self._silence_reported = False
+
+    def observe(self, log: LogEntry) -> List[LogAnomaly]:
+        """与上一条日志的间隔超过10分钟时告警"""
+        previous = self._last_time
+        self._seen += 1
+        if previous is None or log.timestamp > previous:
+            self._last_time = log.timestamp
+
+        reported, self._silence_reported = self._silence_reported, False
+        if previous is None or reported or self._seen <= self.min_logs:
+            return []
+        gap = log.timestamp - previous
+        if gap <= self.max_gap:
+            return []
+        return [self._silence_anomaly(gap, previous, log.timestamp.isoformat())]
+
+    def tick(self, now: datetime) -> List[LogAnomaly]:
+        """长时间没有任何新日志时告警（同一静默期只告警一次）"""
+        if self._last_time is None or self._silence_reported or self._seen < self.min_logs:
+            return []
+        gap = now - self._last_time
+        if gap <= self.max_gap:
+            return []
+        self._silence_reported = True
+        return [self._silence_anomaly(gap, self._last_time, None)]
+
+    def _silence_anomaly(self, gap: timedelta, last_time: datetime, next_time: Optional[str]) -> LogAnomaly:
+        return LogAnomaly(
+            anomaly_id=str(uuid.uuid4()),
+            anomaly_type=AnomalyType.SILENCE,
+            description=f"Silence detected: {gap.total_seconds():.0f} seconds without logs",
+            detected_at=datetime.utcnow(),
+            severity=LogLevel.WARN,
+            affected_logs=[],
+            metrics={
+                "silence_duration_seconds": gap.total_seconds(),
+                "last_log_time": last_time.isoformat(),
+                "next_log_time": next_time
+            }
+        )
+
     async def detect(self, logs: List[LogEntry], time_window: timedelta) -> List[LogAnomaly]:
         """检测异常静默"""
         anomalies = []
@@ -527,9 +940,88 @@ class SilenceDetector(AnomalyDetector):
         return anomalies
 
 
+_DIGITS_RE = re.compile(r'\d+')
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_SPACES_RE = re.compile(r'\s+')
+
+
 class PatternChangeDetector(AnomalyDetector):
     """模式变化检测器"""
 
+    half_size = 50  # 流式模式下前后两半窗口各自的错误数
+    similarity_threshold = 0.3
+
+    def reset(self):
+        self._older: Deque[str] = deque()
+        self._newer: Deque[Tuple[str, str]] = deque()
+        self._older_counts: Dict[str, int] = defaultdict(int)
+        self._newer_counts: Dict[str, int] = defaultdict(int)
+        self._totals: Dict[str, int] = {}
+        self._ratio_sum = 0.0
+        self._changed = False
+
+    def observe(self, log: LogEntry) -> List[LogAnomaly]:
+        """比较最近两段错误窗口的消息模式分布
+
+        相似度为各模式min(c1, c2)/(c1 + c2)的平均值，每条错误最多改变三个模式的计数，
+        因此增量维护相似度的开销为O(1)。
+        """
+        if log.level not in ERROR_LEVELS:
+            return []
+
+        pattern = self._extract_pattern(log.message)
+        self._newer.append((pattern, log.id))
+        self._update(pattern, 0, 1)
+        if len(self._newer) > self.half_size:
+            moved, _ = self._newer.popleft()
+            self._update(moved, 1, -1)
+            self._older.append(moved)
+            if len(self._older) > self.half_size:
+                self._update(self._older.popleft(), -1, 0)
+
+        if len(self._older) < self.half_size or not self._totals:
+            return []
+
+        similarity = self._ratio_sum / len(self._totals)
+        if similarity >= self.similarity_threshold:
+            self._changed = False
+            return []
+        if self._changed:
+            return []
+
+        self._changed = True
+        return [LogAnomaly(
+            anomaly_id=str(uuid.uuid4()),
+            anomaly_type=AnomalyType.PATTERN_CHANGE,
+            description=f"Pattern change detected: similarity = {similarity:.2f}",
+            detected_at=datetime.utcnow(),
+            severity=LogLevel.WARN,
+            affected_logs=[log_id for _, log_id in self._newer],
+            metrics={
+                "pattern_similarity": similarity,
+                "first_half_patterns": sum(1 for count in self._older_counts.values() if count),
+                "second_half_patterns": sum(1 for count in self._newer_counts.values() if count)
+            }
+        )]
+
+    def _update(self, pattern: str, older_delta: int, newer_delta: int):
+        self._ratio_sum -= self._ratio(pattern)
+        self._older_counts[pattern] += older_delta
+        self._newer_counts[pattern] += newer_delta
+        total = self._older_counts[pattern] + self._newer_counts[pattern]
+        if total:
+            self._totals[pattern] = total
+            self._ratio_sum += self._ratio(pattern)
+        else:
+            self._totals.pop(pattern, None)
+            del self._older_counts[pattern], self._newer_counts[pattern]
+
+    def _ratio(self, pattern: str) -> float:
+        total = self._totals.get(pattern)
+        if not total:
+            return 0.0
+        return min(self._older_counts[pattern], self._newer_counts[pattern]) / total
+
     async def detect(self, logs: List[LogEntry], time_window: timedelta) -> List[LogAnomaly]:
         """检测模式变化"""
         anomalies = []
@@ -590,9 +1082,9 @@ class PatternChangeDetector(AnomalyDetector):
     def _extract_pattern(self, message: str) -> str:
         """提取消息模式"""
         # 简化的模式提取：移除数字、特殊字符等
-        pattern = re.sub(r'\d+', '<NUM>', message)
-        pattern = re.sub(r'[^\w\s]', ' ', pattern)
-        pattern = re.sub(r'\s+', ' ', pattern).strip().lower()
+        pattern = _DIGITS_RE.sub('<NUM>', message)
+        pattern = _PUNCTUATION_RE.sub(' ', pattern)
+        pattern = _SPACES_RE.sub(' ', pattern).strip().lower()
         return pattern
 
 
@@ -684,6 +1176,140 @@ class LogAggregator:
         )
 
 
+# 解析进程内的解析器
+_worker_parser: Optional[LogParser] = None
+
+
+def _init_parser_worker(patterns: List[LogPattern]):
+    """解析进程初始化：使用主进程当前的模式列表"""
+    global _worker_parser
+    _worker_parser = LogParser()
+    _worker_parser.patterns = list(patterns)
+
+
+def _parse_batch_in_worker(raw_logs: List[str], source: str) -> List[Tuple[LogEntry, Optional[str]]]:
+    """在解析进程中解析并匹配一批日志"""
+    results = []
+    for raw_log in raw_logs:
+        entry = _worker_parser.parse_log_entry(raw_log, source)
+        if entry is None:
+            continue
+        pattern = _worker_parser.match_pattern(entry)
+        if pattern:
+            entry.tags.append(f"pattern:{pattern.pattern_id}")
+        results.append((entry, pattern.pattern_id if pattern else None))
+    return results
+
+
+class LogParserWorker:
+    """独立进程日志解析器
+
+    原始日志先进入有界队列，后台任务按批取出交给解析进程，
+    解析结果按到达顺序回调给主进程做统计和异常检测。
+    """
+
+    def __init__(
+        self,
+        parser: LogParser,
+        on_parsed: Callable[[List[Tuple[LogEntry, Optional[str]]]], None],
+        batch_size: int = 500,
+        queue_size: int = 10000
+    ):
+        self.parser = parser
+        self.on_parsed = on_parsed
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.parsed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pattern_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        """启动解析进程和投递任务"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._ensure_executor()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """处理完队列中剩余日志后停止"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    def submit(self, raw_log: str, source: str = "unknown") -> bool:
+        """投递一条原始日志；队列满时丢弃并计数"""
+        try:
+            self._queue.put_nowait((raw_log, source))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def parse_batch(self, raw_logs: List[str], source: str) -> List[Tuple[LogEntry, Optional[str]]]:
+        """在解析进程中解析一批日志"""
+        self._ensure_executor()
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self._executor, _parse_batch_in_worker, raw_logs, source)
+        self.parsed += len(results)
+        return results
+
+    def _ensure_executor(self):
+        # 模式列表变化后重建解析进程
+        if self._executor is not None and self._pattern_count == len(self.parser.patterns):
+            return
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._pattern_count = len(self.parser.patterns)
+        self._executor = ProcessPoolExecutor(
+            max_workers=1, initializer=_init_parser_worker, initargs=(list(self.parser.patterns),)
+        )
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                # 相邻的同来源日志合为一批
+                start = 0
+                for i in range(1, len(batch) + 1):
+                    if i == len(batch) or batch[i][1] != batch[start][1]:
+                        results = await self.parse_batch([raw for raw, _ in batch[start:i]], batch[start][1])
+                        self.on_parsed(results)
+                        start = i
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Log parser worker failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "parsed": self.parsed,
+            "dropped": self.dropped
+        }
+
+
 class AdvancedLogManager:
     """高级日志管理器"""
 
@@ -691,27 +1317,44 @@ class AdvancedLogManager:
         self.parser = LogParser()
         self.analyzer = LogAnalyzer()
         self.aggregator = LogAggregator()
-        self.log_entries: List[LogEntry] = []
-        self.anomalies: List[LogAnomaly] = []
+        self.statistics = LogStatisticsAccumulator()
         self.max_entries = 100000
+        self.log_entries: Deque[LogEntry] = deque(maxlen=self.max_entries)
+        self.anomalies: Deque[LogAnomaly] = deque(maxlen=1000)
+        self.parser_worker = LogParserWorker(self.parser, self._accept_parsed)
+
+    async def start_parser_worker(self):
+        """启动独立进程解析"""
+        await self.parser_worker.start()
+
+    async def stop_parser_worker(self):
+        """停止独立进程解析"""
+        await self.parser_worker.stop()
+
+    def submit_log(self, raw_log: str, source: str = "unknown") -> bool:
+        """投递原始日志到解析进程（未启动时在当前进程解析）"""
+        if self.parser_worker.running:
+            return self.parser_worker.submit(raw_log, source)
+        log_entry = self.parser.parse_log_entry(raw_log, source)
+        if log_entry:
+            self._analyze_new_log(log_entry)
+        return log_entry is not None
 
     async def ingest_log(self, raw_log: str, source: str = "unknown") -> Optional[LogEntry]:
         """摄取日志"""
         log_entry = self.parser.parse_log_entry(raw_log, source)
         if log_entry:
-            self.log_entries.append(log_entry)
-
-            # 限制存储数量
-            if len(self.log_entries) > self.max_entries:
-                self.log_entries = self.log_entries[-self.max_entries:]
-
-            # 异步分析
-            asyncio.create_task(self._analyze_new_log(log_entry))
+            self._analyze_new_log(log_entry)
 
         return log_entry
 
     async def ingest_logs_batch(self, raw_logs: List[str], source: str = "batch") -> List[LogEntry]:
-        """批量摄取日志"""
+        """批量摄取日志（解析进程已启动时在解析进程中解析）"""
+        if self.parser_worker.running:
+            results = await self.parser_worker.parse_batch(raw_logs, source)
+            self._accept_parsed(results)
+            return [entry for entry, _ in results]
+
         log_entries = []
         for raw_log in raw_logs:
             entry = await self.ingest_log(raw_log, source)
@@ -719,29 +1362,32 @@ class AdvancedLogManager:
                 log_entries.append(entry)
         return log_entries
 
-    async def _analyze_new_log(self, log_entry: LogEntry):
+    def _accept_parsed(self, results: List[Tuple[LogEntry, Optional[str]]]):
+        """接收解析进程的结果（模式已在解析进程中匹配）"""
+        patterns = {pattern.pattern_id: pattern for pattern in self.parser.patterns}
+        for entry, pattern_id in results:
+            if pattern_id in patterns:
+                patterns[pattern_id].match_count += 1
+            self._record_entry(entry)
+
+    def _analyze_new_log(self, log_entry: LogEntry):
         """分析新日志"""
         try:
             # 模式匹配
             pattern = self.parser.match_pattern(log_entry)
             if pattern:
                 log_entry.tags.append(f"pattern:{pattern.pattern_id}")
-
-            # 异常检测（如果有足够的日志）
-            if len(self.log_entries) > 100:
-                recent_logs = self.log_entries[-100:]
-                new_anomalies = await self.analyzer.analyze_logs(recent_logs)
-
-                # 只添加新的异常
-                for anomaly in new_anomalies:
-                    if anomaly.anomaly_id not in [a.anomaly_id for a in self.anomalies]:
-                        self.anomalies.append(anomaly)
-                        if len(self.anomalies) > 1000:  # 限制异常数量
-                            self.anomalies = self.anomalies[-1000:]
+            self._record_entry(log_entry)
 
         except Exception as e:
             logger.error(f"Failed to analyze log entry: {e}")
 
+    def _record_entry(self, log_entry: LogEntry):
+        """存储日志并增量更新统计与异常检测"""
+        self.log_entries.append(log_entry)
+        self.statistics.add(log_entry)
+        self.anomalies.extend(self.analyzer.observe(log_entry))
+
     async def search_logs(
         self,
         query: Optional[str] = None,
@@ -754,7 +1400,7 @@ class AdvancedLogManager:
         limit: int = 100
     ) -> List[LogEntry]:
         """搜索日志"""
-        filtered_logs = self.log_entries
+        filtered_logs = list(self.log_entries)
 
         # 应用过滤器
         if query:
@@ -789,7 +1435,8 @@ class AdvancedLogManager:
         limit: int = 50
     ) -> List[LogAnomaly]:
         """获取日志异常"""
-        anomalies = self.anomalies
+        self.anomalies.extend(self.analyzer.tick(datetime.utcnow()))
+        anomalies = list(self.anomalies)
 
         if unresolved_only:
             anomalies = [a for a in anomalies if not a.resolved]
@@ -816,12 +1463,10 @@ class AdvancedLogManager:
     ) -> Dict[str, Any]:
         """获取日志统计"""
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        recent_logs = [log for log in self.log_entries if log.timestamp >= cutoff_time]
-
-        if category:
-            recent_logs = [log for log in recent_logs if log.category == category]
+        if isinstance(category, str):
+            category = LogCategory(category)
 
-        stats = self.analyzer.get_log_statistics(recent_logs)
+        stats = self.statistics.get_statistics(cutoff_time, category)
         stats["pattern_statistics"] = self.parser.get_pattern_statistics()
 
         # 异常统计
@@ -852,7 +1497,7 @@ class AdvancedLogManager:
         filters: Optional[Dict[str, Any]] = None
     ) -> Union[str, bytes]:
         """导出日志"""
-        logs = self.log_entries
+        logs = list(self.log_entries)
 
         # 应用过滤器
         if filters:
@@ -909,18 +1554,41 @@ async def get_advanced_log_manager() -> AdvancedLogManager:
     return advanced_log_manager
 
 
-# 为LogAnomaly添加severity_score属性
-@property
-def severity_score(self) -> int:
-    """异常严重程度评分"""
-    severity_scores = {
-        LogLevel.TRACE: 1,
-        LogLevel.DEBUG: 2,
-        LogLevel.INFO: 3,
-        LogLevel.WARN: 4,
-        LogLevel.ERROR: 5,
-        LogLevel.FATAL: 6
-    }
-    return severity_scores.get(self.severity, 3)
-
-LogAnomaly.severity_score = severity_score
\ No newline at end of file
+def benchmark_streaming_analysis(window_sizes: Tuple[int, ...] = (1000, 10000, 50000),
+                                 probes: int = 200) -> Dict[str, Dict[str, float]]:
+    """流式检测与批量检测的单条日志检测延迟对比（微秒）"""
+    base = datetime(2024, 1, 1)
+    results = {}
+    for size in window_sizes:
+        logs = [
+            LogEntry(
+                timestamp=base + timedelta(seconds=i),
+                level=LogLevel.ERROR if i % 7 == 0 else LogLevel.INFO,
+                category=LogCategory.APPLICATION,
+                message=f"request {i} failed with code {i % 13}",
+                source="bench"
+            )
+            for i in range(size + probes)
+        ]
+
+        analyzer = LogAnalyzer()
+        for log in logs[:size]:
+            analyzer.observe(log)
+        start = time.perf_counter()
+        for log in logs[size:]:
+            analyzer.observe(log)
+        streaming_us = (time.perf_counter() - start) / probes * 1e6
+
+        # 批量模式每条新日志都要重新扫描整个窗口
+        batch_runs = max(1, probes // 50)
+        start = time.perf_counter()
+        for i in range(batch_runs):
+            asyncio.run(LogAnalyzer().analyze_logs(logs[i:size + i]))
+        batch_us = (time.perf_counter() - start) / batch_runs * 1e6
+
+        results[str(size)] = {"streaming_us": round(streaming_us, 2), "batch_us": round(batch_us, 1)}
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_streaming_analysis(), indent=2))
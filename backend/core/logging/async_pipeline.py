@@ -0,0 +1,469 @@
+"""
+异步日志管道
+Async Logging Pipeline
+
+请求路径上只做过滤、采样和一次JSON序列化，然后非阻塞地放入有界队列；
+写文件、flush和日志轮转都在独立的写线程中批量完成，磁盘变慢时丢弃并计数而不是阻塞事件循环。
+"""
+
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+from backend.config.settings import get_settings
+from backend.monitoring.prometheus_registry import metrics_registry
+
+settings = get_settings()
+
+LOG_RECORDS_DROPPED = metrics_registry.counter(
+    "log_records_dropped_total", "日志队列已满时丢弃的记录数", ("level",)
+)
+LOG_RECORDS_SUPPRESSED = metrics_registry.counter(
+    "log_records_suppressed_total", "被重复日志采样丢弃的记录数", ("logger",), max_series=200
+)
+
+# LogRecord自带的属性，其余属性视为extra字段写入JSON
+_RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_STOP = object()
+
+
+def dumps_json(payload: Dict[str, Any]) -> str:
+    """序列化为一行JSON，优先使用orjson"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload, default=str).decode()
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class JsonLineFormatter(logging.Formatter):
+    """JSON行格式化器，结果缓存在记录上供多个处理器复用"""
+
+    def __init__(self, service_name: str = "ai-hub"):
+        super().__init__()
+        self.service_name = service_name
+        self._second = -1
+        self._second_prefix = ""
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._second:
+            # 同一秒内的记录复用秒级前缀，只拼接毫秒
+            self._second_prefix = datetime.fromtimestamp(second, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            self._second = second
+        return f"{self._second_prefix}.{int((created - second) * 1000):03d}Z"
+
+    def format(self, record: logging.LogRecord) -> str:
+        cached = getattr(record, "_json", None)
+        if cached is not None:
+            return cached
+
+        payload = {
+            "timestamp": self._timestamp(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "service": self.service_name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exception"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+
+        record._json = dumps_json(payload)
+        return record._json
+
+
+class PassthroughFormatter(logging.Formatter):
+    """写线程侧格式化器：直接输出入队前已序列化的文本"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        cached = getattr(record, "_json", None)
+        return cached if cached is not None else record.getMessage()
+
+
+class LogSampler(logging.Filter):
+    """重复日志采样与限速
+
+    以(logger, 级别, 消息模板)为键，每个窗口内前burst条全部保留，
+    之后每sample_every条保留1条；窗口结束后的第一条记录带上被丢弃的条数。
+    达到exempt_level的记录不参与采样。
+    """
+
+    def __init__(self, burst: int = 50, sample_every: int = 100, window: float = 1.0,
+                 exempt_level: int = logging.ERROR, max_keys: int = 10000):
+        super().__init__()
+        self.burst = burst
+        self.sample_every = max(1, sample_every)
+        self.window = window
+        self.exempt_level = exempt_level
+        self.max_keys = max_keys
+        self._windows: Dict[tuple, List] = {}
+        self.suppressed_total = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.exempt_level:
+            return True
+
+        # 使用插值前的模板，f-string拼出的消息各不相同，无法合并
+        msg = record.msg if isinstance(record.msg, str) else type(record.msg).__name__
+        key = (record.name, record.levelno, msg)
+        state = self._windows.get(key)
+        if state is None or record.created - state[0] >= self.window:
+            if state is None and len(self._windows) >= self.max_keys:
+                self._windows.clear()
+            suppressed = state[2] if state is not None else 0
+            # [窗口起点, 窗口内条数, 窗口内丢弃条数]
+            state = [record.created, 0, 0]
+            self._windows[key] = state
+            if suppressed:
+                record.suppressed = suppressed
+
+        state[1] += 1
+        over = state[1] - self.burst
+        if over <= 0:
+            return True
+        if over % self.sample_every == 0:
+            record.sample_rate = self.sample_every
+            return True
+
+        state[2] += 1
+        self.suppressed_total += 1
+        LOG_RECORDS_SUPPRESSED.labels(record.name).inc()
+        return False
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """非阻塞入队处理器
+
+    在调用方完成参数插值、异常格式化和JSON序列化，队列已满时丢弃并按级别计数。
+    """
+
+    def __init__(self, log_queue: queue.Queue, formatter: Optional[logging.Formatter] = None):
+        super().__init__(log_queue)
+        self.setFormatter(formatter or JsonLineFormatter())
+        self.dropped: Dict[str, int] = defaultdict(int)
+        self.enqueued = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        data = self.format(record)
+        prepared = copy.copy(record)
+        prepared.message = prepared.msg = record.getMessage()
+        prepared.args = None
+        prepared.exc_info = None
+        prepared.exc_text = None
+        prepared.stack_info = None
+        prepared._json = data
+        return prepared
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped[record.levelname] += 1
+            LOG_RECORDS_DROPPED.labels(record.levelname).inc()
+
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """写线程专用的轮转文件处理器
+
+    逐条写入不flush，由写线程在每批结束后统一flush；按已写字节数判断轮转，
+    不再每条记录stat/seek；轮转出的文件在后台线程gzip压缩。
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 100 * 1024 * 1024, backup_count: int = 5,
+                 encoding: str = "utf-8", compress: bool = True):
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self._size = self.stream.tell() if self.stream else 0
+        self._compressor: Optional[ThreadPoolExecutor] = None
+        self._compressing = None
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = self._rotate_compressed
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        return self.maxBytes > 0 and self._size >= self.maxBytes
+
+    def doRollover(self):
+        # 上一个文件仍在压缩时先等待，避免备份编号错位（只阻塞写线程）
+        if self._compressing is not None:
+            self._compressing.result()
+            self._compressing = None
+        super().doRollover()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+                self._size = 0
+            if self.stream is None:
+                self.stream = self._open()
+            line = self.format(record) + self.terminator
+            self.stream.write(line)
+            self._size += len(line)
+        except Exception:
+            self.handleError(record)
+
+    def _rotate_compressed(self, source: str, dest: str):
+        """重命名后立即返回，压缩在后台进行"""
+        if not os.path.exists(source):
+            return
+        pending = dest[:-3] if dest.endswith(".gz") else dest + ".rotating"
+        os.replace(source, pending)
+        if self._compressor is None:
+            self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-gzip")
+        self._compressing = self._compressor.submit(_gzip_file, pending, dest)
+
+    def close(self):
+        super().close()
+        if self._compressor is not None:
+            self._compressor.shutdown(wait=True)
+            self._compressor = None
+
+
+def _gzip_file(source: str, dest: str):
+    try:
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+    except OSError:
+        logging.getLogger(__name__).warning("Failed to compress rotated log %s", source, exc_info=True)
+
+
+class LogWriterThread:
+    """日志写线程：批量出队，逐个处理器写入，每批结束后统一flush"""
+
+    def __init__(self, log_queue: queue.Queue, handlers: Iterable[logging.Handler],
+                 batch_size: int = 512, flush_interval: float = 0.5):
+        self.queue = log_queue
+        self.handlers = list(handlers)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.batches = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """投递停止标记，等待写完已入队的记录"""
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            for record in batch:
+                if record is _STOP:
+                    stop = True
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                self.written += 1
+
+            for handler in self.handlers:
+                try:
+                    handler.flush()
+                except Exception:
+                    pass
+            self.batches += 1
+            if stop:
+                return
+
+
+class AsyncLoggingPipeline:
+    """异步日志管道：入队处理器 + 有界队列 + 写线程"""
+
+    def __init__(self, handlers: Iterable[logging.Handler], queue_size: int = 10000,
+                 formatter: Optional[logging.Formatter] = None, sampler: Optional[LogSampler] = None,
+                 batch_size: int = 512):
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handlers = list(handlers)
+        for handler in self.handlers:
+            handler.setFormatter(PassthroughFormatter())
+        self.handler = BoundedQueueHandler(self.queue, formatter)
+        self.sampler = sampler
+        if sampler is not None:
+            self.handler.addFilter(sampler)
+        self.writer = LogWriterThread(self.queue, self.handlers, batch_size=batch_size)
+        self._attached: List[tuple] = []
+
+    def start(self):
+        self.writer.start()
+
+    def stop(self):
+        """恢复日志器原有处理器，写完队列后关闭"""
+        for logger, previous in self._attached:
+            logger.removeHandler(self.handler)
+            for handler in previous:
+                logger.addHandler(handler)
+        self._attached.clear()
+        self.writer.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def attach(self, logger: logging.Logger):
+        """将日志器的输出全部改为经由本管道"""
+        previous = list(logger.handlers)
+        for handler in previous:
+            logger.removeHandler(handler)
+        logger.addHandler(self.handler)
+        self._attached.append((logger, previous))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "enqueued": self.handler.enqueued,
+            "dropped": dict(self.handler.dropped),
+            "suppressed": self.sampler.suppressed_total if self.sampler else 0,
+            "written": self.writer.written,
+            "batches": self.writer.batches,
+        }
+
+
+# 全局日志管道
+_log_pipeline: Optional[AsyncLoggingPipeline] = None
+
+
+def setup_async_logging(log_file: Optional[str] = None, level: Optional[str] = None,
+                        console: bool = True) -> AsyncLoggingPipeline:
+    """为根日志器安装异步日志管道（重复调用返回已安装的管道）"""
+    global _log_pipeline
+    if _log_pipeline is not None:
+        return _log_pipeline
+
+    handlers: List[logging.Handler] = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    log_file = log_file or settings.log_file
+    if log_file:
+        handlers.append(BufferedRotatingFileHandler(
+            log_file,
+            max_bytes=settings.log_file_max_mb * 1024 * 1024,
+            backup_count=settings.log_file_backup_count
+        ))
+
+    sampler = None
+    if settings.log_sample_burst > 0:
+        sampler = LogSampler(burst=settings.log_sample_burst, sample_every=settings.log_sample_every)
+
+    pipeline = AsyncLoggingPipeline(handlers, queue_size=settings.log_queue_size, sampler=sampler)
+    root = logging.getLogger()
+    root.setLevel((level or settings.log_level).upper())
+    pipeline.attach(root)
+    pipeline.start()
+
+    metrics_registry.callback_gauge("log_queue_depth", "日志队列中待写入的记录数", pipeline.queue.qsize)
+    _log_pipeline = pipeline
+    return pipeline
+
+
+def shutdown_async_logging():
+    """写完已入队的日志后停止写线程"""
+    global _log_pipeline
+    if _log_pipeline is None:
+        return
+    _log_pipeline.stop()
+    _log_pipeline = None
+
+
+def get_log_pipeline() -> Optional[AsyncLoggingPipeline]:
+    """获取已安装的异步日志管道"""
+    return _log_pipeline
+
+
+def benchmark_slow_disk(records: int = 2000, write_delay: float = 0.002) -> Dict[str, Any]:
+    """模拟慢磁盘，对比同步写入与经由管道时调用方的单条耗时"""
+
+    class SlowHandler(logging.Handler):
+        def emit(self, record):
+            time.sleep(write_delay)
+
+    def measure(logger: logging.Logger, count: int) -> List[float]:
+        durations = []
+        for i in range(count):
+            start = time.perf_counter()
+            logger.info("request handled", extra={"path": "/api/v1/chat", "status_code": 200, "i": i})
+            durations.append(time.perf_counter() - start)
+        durations.sort()
+        return durations
+
+    def p99(durations: List[float]) -> float:
+        return durations[int(len(durations) * 0.99) - 1] * 1e6
+
+    sync_logger = logging.getLogger("benchmark.sync")
+    sync_logger.propagate = False
+    sync_logger.setLevel(logging.INFO)
+    sync_handler = SlowHandler()
+    sync_handler.setFormatter(JsonLineFormatter())
+    sync_logger.handlers = [sync_handler]
+    # 同步写入每条都等磁盘，只测一小部分避免基准本身耗时过长
+    sync = measure(sync_logger, min(records, 200))
+
+    async_logger = logging.getLogger("benchmark.async")
+    async_logger.propagate = False
+    async_logger.setLevel(logging.INFO)
+    pipeline = AsyncLoggingPipeline([SlowHandler()], queue_size=records // 2)
+    pipeline.attach(async_logger)
+    pipeline.start()
+    queued = measure(async_logger, records)
+    pipeline.stop()
+
+    return {
+        "orjson": ORJSON_AVAILABLE,
+        "sync_p99_us": round(p99(sync), 1),
+        "async_p99_us": round(p99(queued), 1),
+        "async_dropped": dict(pipeline.handler.dropped),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_slow_disk(), indent=2))
@@ -6,7 +6,9 @@ Week 5 Day 3: 系统监控和运维自动化
 import json
 import logging
 import asyncio
-from datetime import datetime, timezone
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
 from enum import Enum
@@ -15,12 +17,11 @@ import traceback
 from pathlib import Path
 import gzip
 import threading
-from queue import Queue, Empty
-from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty, Full
 import redis
-from pythonjsonlogger import jsonlogger
 
 from backend.config.settings import get_settings
+from backend.core.logging.async_pipeline import AsyncLoggingPipeline, BufferedRotatingFileHandler, dumps_json
 
 settings = get_settings()
 
@@ -100,34 +101,17 @@ class LogEntry:
         }
 
 
-class StructuredLogger(jsonlogger.JsonLogger):
+class StructuredLogger(logging.Logger):
     """结构化日志记录器"""
 
-    def __init__(self, name: str, category: LogCategory):
-        super().__init__(name, fmt="%(message) %(level)s %(name)s %(pathname)s %(lineno)s")
+    def __init__(self, name: str, category: LogCategory, handler: logging.Handler):
+        super().__init__(name)
         self.category = category
-        self.addHandler(self._get_handler())
+        self.addHandler(handler)
 
-    def _get_handler(self):
-        """获取日志处理器"""
-        from logging.handlers import RotatingFileHandler
-
-        handler = RotatingFileHandler(
-            f"logs/{self.category.value}.log",
-            maxBytes=100 * 1024 * 1024,  # 100MB
-            backupCount=5
-        )
-
-        formatter = jsonlogger.JsonFormatter(
-            '%(asctime)s %(name)s %(levelname)s %(message)s'
-        )
-        handler.setFormatter(formatter)
-
-        return handler
-
-    def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None):
+    def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
         """创建日志记录"""
-        record = super().makeRecord(name, level, fn, lno, msg, args, exc_info, func, extra)
+        record = super().makeRecord(name, level, fn, lno, msg, args, exc_info, func, extra, sinfo)
 
         # 添加分类信息
         record.category = self.category.value
@@ -135,6 +119,17 @@ class StructuredLogger(jsonlogger.JsonLogger):
         return record
 
 
+class _CategoryFilter(logging.Filter):
+    """按分类把记录分发到对应文件"""
+
+    def __init__(self, category: str):
+        super().__init__()
+        self.category = category
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return getattr(record, "category", None) == self.category
+
+
 class LogCollector:
     """日志收集器"""
 
@@ -143,6 +138,7 @@ class LogCollector:
         self.redis_client = None
         self.batch_size = 100
         self.flush_interval = 5  # 秒
+        self.dropped = 0
         self._init_redis()
         self._init_loggers()
 
@@ -159,18 +155,31 @@ class LogCollector:
         """初始化日志记录器"""
         self.loggers = {}
 
+        # 各分类文件的写入和轮转都在日志管道的写线程中进行
+        handlers = []
+        for category in LogCategory:
+            handler = BufferedRotatingFileHandler(
+                f"logs/{category.value}.log",
+                max_bytes=100 * 1024 * 1024,  # 100MB
+                backup_count=5
+            )
+            handler.addFilter(_CategoryFilter(category.value))
+            handlers.append(handler)
+        self.pipeline = AsyncLoggingPipeline(handlers, queue_size=settings.log_queue_size)
+        self.pipeline.start()
+
         for category in LogCategory:
             logger_name = f"aihub.{category.value}"
-            self.loggers[category.value] = StructuredLogger(logger_name, category)
+            self.loggers[category.value] = StructuredLogger(logger_name, category, self.pipeline.handler)
 
     def log(self, entry: LogEntry):
         """记录日志"""
         try:
             # 添加到队列
             self.log_queue.put_nowait(entry)
-        except Exception as e:
-            print(f"Failed to queue log entry: {e}")
-            # 降级到标准日志
+        except Full:
+            # 收集队列已满时计数并降级到非阻塞的管道日志
+            self.dropped += 1
             self._fallback_log(entry)
 
     def _fallback_log(self, entry: LogEntry):
@@ -185,10 +194,11 @@ class LogCollector:
         while True:
             try:
                 batch = []
-                deadline = asyncio.time() + self.flush_interval
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + self.flush_interval
 
                 # 收集批量日志
-                while len(batch) < self.batch_size and asyncio.time() < deadline:
+                while len(batch) < self.batch_size and loop.time() < deadline:
                     try:
                         entry = self.log_queue.get_nowait()
                         batch.append(entry)
@@ -208,70 +218,57 @@ class LogCollector:
     async def _process_batch(self, batch: List[LogEntry]):
         """处理批量日志"""
         try:
-            # 转换为字典
-            log_dicts = [entry.to_dict() for entry in batch]
+            # 每条日志只序列化一次，Redis和文件共用
+            lines = [dumps_json(entry.to_dict()) for entry in batch]
 
-            # 存储到Redis
+            # Redis管道和文件写入都是阻塞IO，放到线程中执行
             if self.redis_client:
-                pipe = self.redis_client.pipeline()
+                await asyncio.to_thread(self._store_to_redis, batch, lines)
 
-                # 存储日志到不同的key
-                for i, log_dict in enumerate(log_dicts):
-                    key = f"logs:{log_dict['category']}:{int(log_dict['timestamp'].replace('.', ''))}"
-                    pipe.setex(key, 7 * 24 * 3600, json.dumps(log_dict))  # 保留7天
+            await self._write_to_files(batch, lines)
 
-                # 存储到最近日志列表
-                for log_dict in log_dicts:
-                    key = f"recent_logs:{log_dict['category']}"
-                    pipe.lpush(key, json.dumps(log_dict))
-                    pipe.ltrim(key, 0, 1000)  # 保留最近1000条
+        except Exception as e:
+            print(f"Failed to process log batch: {e}")
 
-                pipe.execute()
+    def _store_to_redis(self, batch: List[LogEntry], lines: List[str]):
+        """批量存储到Redis"""
+        pipe = self.redis_client.pipeline()
 
-            # 异步写入文件（如果需要）
-            await self._write_to_files(batch)
+        # 存储日志到不同的key
+        for entry, line in zip(batch, lines):
+            key = f"logs:{entry.category.value}:{int(entry.timestamp.timestamp() * 1_000_000)}"
+            pipe.setex(key, 7 * 24 * 3600, line)  # 保留7天
 
-        except Exception as e:
-            print(f"Failed to process log batch: {e}")
+        # 存储到最近日志列表
+        for entry, line in zip(batch, lines):
+            key = f"recent_logs:{entry.category.value}"
+            pipe.lpush(key, line)
+            pipe.ltrim(key, 0, 1000)  # 保留最近1000条
+
+        pipe.execute()
 
-    async def _write_to_files(self, batch: List[LogEntry]):
+    async def _write_to_files(self, batch: List[LogEntry], lines: List[str]):
         """异步写入日志文件"""
         # 按分类分组
         by_category = {}
-        for entry in batch:
-            category = entry.category.value
-            if category not in by_category:
-                by_category[category] = []
-            by_category[category].append(entry)
-
-        # 并发写入
-        with ThreadPoolExecutor(max_workers=len(by_category)) as executor:
-            loop = asyncio.get_event_loop()
-            tasks = []
-
-            for category, entries in by_category.items():
-                task = loop.run_in_executor(
-                    executor,
-                    self._write_category_to_file,
-                    category,
-                    entries
-                )
-                tasks.append(task)
+        for entry, line in zip(batch, lines):
+            by_category.setdefault(entry.category.value, []).append(line)
 
-            await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(self._write_categories_to_files, by_category)
 
-    def _write_category_to_file(self, category: str, entries: List[LogEntry]):
+    def _write_categories_to_files(self, by_category: Dict[str, List[str]]):
         """写入分类日志文件"""
-        try:
-            log_file = Path(f"logs/{category}/{datetime.now().strftime('%Y-%m-%d')}.log")
-            log_file.parent.mkdir(parents=True, exist_ok=True)
+        day = datetime.now().strftime('%Y-%m-%d')
+        for category, lines in by_category.items():
+            try:
+                log_file = Path(f"logs/{category}/{day}.log")
+                log_file.parent.mkdir(parents=True, exist_ok=True)
 
-            with open(log_file, 'a', encoding='utf-8') as f:
-                for entry in entries:
-                    f.write(json.dumps(entry.to_dict(), default=str) + '\n')
+                with open(log_file, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
 
-        except Exception as e:
-            print(f"Failed to write log file for {category}: {e}")
+            except Exception as e:
+                print(f"Failed to write log file for {category}: {e}")
 
     async def search_logs(
         self,
@@ -438,7 +435,7 @@ class ContextLogger:
             function=function,
             line_number=line_number,
             thread_id=threading.get_ident(),
-            process_id=asyncio.current_task().get_name() if asyncio.current_task() else os.getpid(),
+            process_id=os.getpid(),
             **{**self.context, **kwargs}
         )
 
@@ -497,7 +494,7 @@ def log_operation(category: LogCategory = LogCategory.API, level: LogLevel = Log
 
             try:
                 logger.log(
-                    level=level,
+                    level,
                     f"Operation started: {func.__name__}",
                     request_id=request_id,
                     tags=["operation_start"]
@@ -23,6 +23,8 @@ from collections import defaultdict, deque
 import elasticsearch
 from elasticsearch import Elasticsearch
 
+from backend.core.logging.async_pipeline import AsyncLoggingPipeline, BufferedRotatingFileHandler, dumps_json
+
 class LogLevel(Enum):
     """日志级别"""
     DEBUG = "DEBUG"
@@ -89,7 +91,11 @@ class StructuredFormatter(logging.Formatter):
         self.service_name = service_name
 
     def format(self, record: logging.LogRecord) -> str:
-        """格式化日志记录"""
+        """格式化日志记录（结果缓存在记录上，多个处理器只序列化一次）"""
+        cached = getattr(record, '_json', None)
+        if cached is not None:
+            return cached
+
         log_entry = LogEntry(
             timestamp=datetime.fromtimestamp(record.created),
             level=LogLevel(record.levelname),
@@ -110,7 +116,9 @@ class StructuredFormatter(logging.Formatter):
             error_traceback=self._format_traceback(record) if record.exc_info else None
         )
 
-        return json.dumps(log_entry.to_dict(), ensure_ascii=False)
+        record._log_entry = log_entry
+        record._json = dumps_json(log_entry.to_dict())
+        return record._json
 
     def _get_category(self, record: logging.LogRecord) -> LogCategory:
         """获取日志分类"""
@@ -464,6 +472,7 @@ class ProductionLogger:
             flush_interval=config.get('flush_interval', 60)
         )
         self.analyzer = LogAnalyzer()
+        self.pipelines: Dict[str, AsyncLoggingPipeline] = {}
         self.elasticsearch_client = None
         self.s3_client = None
         self.is_initialized = False
@@ -540,26 +549,20 @@ class ProductionLogger:
 
         # 创建格式化器
         formatter = StructuredFormatter(self.config.get('service_name', 'ai-hub'))
+        handlers = []
 
         # 控制台处理器
         if self.config.get('console_logging', True):
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
+            handlers.append(logging.StreamHandler())
 
         # 文件处理器
         if 'file_logging' in self.config:
             file_config = self.config['file_logging']
-            log_file = Path(file_config['path'])
-            log_file.parent.mkdir(parents=True, exist_ok=True)
-
-            file_handler = logging.handlers.RotatingFileHandler(
-                filename=log_file,
-                maxBytes=file_config.get('max_bytes', 100 * 1024 * 1024),  # 100MB
-                backupCount=file_config.get('backup_count', 5)
-            )
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            handlers.append(BufferedRotatingFileHandler(
+                str(file_config['path']),
+                max_bytes=file_config.get('max_bytes', 100 * 1024 * 1024),  # 100MB
+                backup_count=file_config.get('backup_count', 5)
+            ))
 
         # 添加聚合器处理器
         class AggregationHandler(logging.Handler):
@@ -569,35 +572,39 @@ class ProductionLogger:
 
             def emit(self, record):
                 try:
-                    # 解析日志记录
-                    log_data = json.loads(self.format(record))
-                    log_entry = LogEntry(
-                        timestamp=datetime.fromisoformat(log_data['timestamp']),
-                        level=LogLevel(log_data['level']),
-                        category=LogCategory(log_data['category']),
-                        service=log_data['service'],
-                        message=log_data['message'],
-                        module=log_data['module'],
-                        function=log_data['function'],
-                        line_number=log_data.get('line_number'),
-                        user_id=log_data.get('user_id'),
-                        session_id=log_data.get('session_id'),
-                        request_id=log_data.get('request_id'),
-                        correlation_id=log_data.get('correlation_id'),
-                        tags=log_data.get('tags', []),
-                        metadata=log_data.get('metadata', {}),
-                        duration_ms=log_data.get('duration_ms'),
-                        error_traceback=log_data.get('error_traceback')
-                    )
+                    # 格式化时已生成LogEntry，无需再解析JSON
+                    log_entry = getattr(record, '_log_entry', None)
+                    if log_entry is None:
+                        formatter.format(record)
+                        log_entry = record._log_entry
                     self.aggregator.add_log(log_entry)
                 except Exception as e:
                     logging.error(f"Failed to aggregate log: {str(e)}")
 
-        aggregation_handler = AggregationHandler(self.aggregator)
-        logger.addHandler(aggregation_handler)
+        handlers.append(AggregationHandler(self.aggregator))
+
+        if not self.config.get('async_logging', True):
+            for handler in handlers:
+                handler.setFormatter(formatter)
+                logger.addHandler(handler)
+            return logger
+
+        # 调用方只序列化并入队，写控制台/文件、轮转和聚合都在写线程中完成
+        pipeline = AsyncLoggingPipeline(
+            handlers,
+            queue_size=self.config.get('queue_size', 10000),
+            formatter=formatter
+        )
+        pipeline.attach(logger)
+        pipeline.start()
+        self.pipelines[name] = pipeline
 
         return logger
 
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """获取各日志器异步管道的队列和丢弃统计"""
+        return {name: pipeline.get_stats() for name, pipeline in self.pipelines.items()}
+
     async def search_logs(self, query: Dict[str, Any], limit: int = 100) -> List[LogEntry]:
         """搜索日志"""
         try:
@@ -791,6 +798,10 @@ class ProductionLogger:
         """清理资源"""
         try:
             await self.aggregator.stop_aggregation()
+            # 写完队列中剩余日志，join放到线程中避免阻塞事件循环
+            for pipeline in self.pipelines.values():
+                await asyncio.to_thread(pipeline.stop)
+            self.pipelines.clear()
             logging.info("Production logger cleaned up")
         except Exception as e:
             logging.error(f"Error during cleanup: {str(e)}")
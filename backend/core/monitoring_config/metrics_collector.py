@@ -20,6 +20,14 @@ import traceback
 import inspect
 from functools import wraps
 
+from backend.monitoring.prometheus_registry import metrics_registry
+
+# Prometheus指标
+_OPERATION_DURATION = metrics_registry.histogram(
+    "operation_duration_seconds", "业务操作耗时（秒）", ("operation", "status")
+)
+_ERRORS = metrics_registry.counter("application_errors_total", "应用错误数", ("error_type", "severity"))
+
 class MetricType(Enum):
     """指标类型"""
     COUNTER = "counter"
@@ -471,6 +479,7 @@ class MetricsCollector:
             request_id=kwargs.get('request_id')
         )
         self.performance_tracker.record_operation(performance_data)
+        _OPERATION_DURATION.labels(operation_name, "success" if success else "error").observe(duration_ms / 1000)
 
     def record_error(self, error: Exception, severity: ErrorSeverity = ErrorSeverity.MEDIUM, context: Dict[str, Any] = None, **kwargs) -> None:
         """记录错误"""
@@ -489,6 +498,7 @@ class MetricsCollector:
             function=kwargs.get('function', '')
         )
         self.error_tracker.record_error(error_data)
+        _ERRORS.labels(error_data.error_type, severity.value).inc()
 
     def record_usage(self, endpoint: str, method: str, status_code: int, response_time_ms: float, request_size: int = 0, response_size: int = 0, **kwargs) -> None:
         """记录使用数据"""
@@ -16,8 +16,10 @@ import threading
 import weakref
 
 import aioredis
-import asyncpg
 from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from backend.core.database import get_engine_registry
 
 logger = logging.getLogger(__name__)
 
@@ -95,7 +97,11 @@ class ResourceMetrics:
 
 
 class DatabaseConnectionPool:
-    """数据库连接池管理器"""
+    """数据库连接池管理器
+
+    连接来自进程级引擎注册表的共享异步引擎，与ORM会话使用同一个连接池；
+    查询直接在asyncpg驱动连接上执行。
+    """
 
     def __init__(
         self,
@@ -110,10 +116,10 @@ class DatabaseConnectionPool:
         self.min_size = min_size
         self.max_size = max_size
         self.max_inactive_time = max_inactive_time
-        self.max_queries = max_queries
+        self.max_queries = max_queries  # 共享连接池按pool_recycle回收连接，不再按查询数回收
         self.command_timeout = command_timeout
 
-        self.pool: Optional[asyncpg.Pool] = None
+        self.engine: Optional[AsyncEngine] = None
         self.metrics = ResourceMetrics(
             resource_id=f"db_pool_{hash(dsn) % 10000:04d}",
             resource_type=ResourceType.DATABASE,
@@ -125,21 +131,22 @@ class DatabaseConnectionPool:
 
     async def initialize(self):
         """初始化连接池"""
-        if self.pool is not None:
+        if self.engine is not None:
             return
 
         async with self._lock:
-            if self.pool is not None:
+            if self.engine is not None:
                 return
 
             try:
-                self.pool = await asyncpg.create_pool(
+                # min_size为常驻连接数，超出部分作为溢出连接
+                self.engine = get_engine_registry().get_async_engine(
                     self.dsn,
-                    min_size=self.min_size,
-                    max_size=self.max_size,
-                    command_timeout=self.command_timeout,
-                    max_inactive_connection_lifetime=self.max_inactive_time,
-                    max_queries_per_connection=self.max_queries
+                    name="resource-manager",
+                    pool_size=self.min_size,
+                    max_overflow=max(self.max_size - self.min_size, 0),
+                    pool_timeout=self.command_timeout,
+                    pool_recycle=self.max_inactive_time
                 )
 
                 self.metrics.status = ResourceStatus.HEALTHY
@@ -154,16 +161,19 @@ class DatabaseConnectionPool:
 
     async def execute_query(self, query: str, *args, timeout: Optional[float] = None) -> Any:
         """执行数据库查询"""
-        if self.pool is None:
+        if self.engine is None:
             await self.initialize()
 
         start_time = time.time()
         success = True
 
         try:
-            async with self.pool.acquire(timeout=timeout or self.command_timeout) as conn:
-                result = await conn.fetch(query, *args)
-                self.metrics.current_connections = self.pool.get_size()
+            async with self.engine.connect() as conn:
+                raw_connection = await conn.get_raw_connection()
+                result = await raw_connection.driver_connection.fetch(
+                    query, *args, timeout=timeout or self.command_timeout
+                )
+                self.metrics.current_connections = self._open_connections()
                 return result
 
         except Exception as e:
@@ -176,18 +186,21 @@ class DatabaseConnectionPool:
             response_time = time.time() - start_time
             self.metrics.update_usage(response_time, success)
 
+    def _open_connections(self) -> int:
+        pool = self.engine.pool
+        return pool.checkedin() + pool.checkedout()
+
     async def close(self):
-        """关闭连接池"""
-        if self.pool:
-            await self.pool.close()
-            self.pool = None
+        """释放连接池引用（共享引擎在应用关闭时由注册表统一关闭）"""
+        if self.engine:
+            self.engine = None
             logger.info(f"Database connection pool closed: {self.metrics.resource_id}")
 
     def get_metrics(self) -> ResourceMetrics:
         """获取连接池指标"""
-        if self.pool:
-            self.metrics.current_connections = self.pool.get_size()
-            self.metrics.max_connections = self.pool.get_max_size()
+        if self.engine:
+            self.metrics.current_connections = self._open_connections()
+            self.metrics.max_connections = self.max_size
             self.metrics.last_health_check = time.time()
 
         return self.metrics
@@ -473,10 +486,9 @@ class ResourceManager:
                 if hasattr(pool, 'redis'):
                     # Redis健康检查
                     await pool.redis.ping()
-                elif hasattr(pool, 'pool'):
+                elif isinstance(pool, DatabaseConnectionPool):
                     # 数据库健康检查
-                    async with pool.pool.acquire() as conn:
-                        await conn.fetch("SELECT 1")
+                    await pool.execute_query("SELECT 1")
 
                 # 更新健康状态
                 metrics = pool.get_metrics()
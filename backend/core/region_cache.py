@@ -10,6 +10,9 @@ import logging
 import json
 import hashlib
 import asyncio
+import ipaddress
+import time
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Union, Tuple
 from enum import Enum
@@ -18,6 +21,8 @@ from pydantic import BaseModel
 import redis.asyncio as redis
 from pathlib import Path
 
+from backend.core.cache_core import get_cache_core
+
 logger = logging.getLogger(__name__)
 
 class CacheRegion(Enum):
@@ -63,18 +68,111 @@ class CacheEntry:
     region: CacheRegion
     checksum: str
 
+# 缓存条目编码版本，条目中的值直接内嵌为JSON对象，只需解析一次
+ENTRY_FORMAT_VERSION = 2
+
+# 默认IP段到区域映射
+DEFAULT_IP_RANGES = {
+    "asia_pacific": ["1.0.0.0/8", "203.0.0.0/8", "202.0.0.0/8"],
+    "europe": ["81.0.0.0/8", "82.0.0.0/8", "83.0.0.0/8"],
+    "americas": ["192.0.0.0/8", "172.0.0.0/8", "10.0.0.0/8"],
+    "china": ["58.0.0.0/8", "59.0.0.0/8", "60.0.0.0/8"]
+}
+
+
+class _TrieNode:
+    """CIDR前缀树节点"""
+    __slots__ = ("children", "region")
+
+    def __init__(self):
+        self.children: List[Optional["_TrieNode"]] = [None, None]
+        self.region: Optional[CacheRegion] = None
+
+
+class IPRegionTrie:
+    """基于CIDR前缀树的IP到区域解析器（最长前缀匹配）"""
+
+    def __init__(self):
+        self._roots = {4: _TrieNode(), 6: _TrieNode()}
+        self.size = 0
+
+    def insert(self, cidr: str, region: CacheRegion):
+        """插入CIDR网段"""
+        network = ipaddress.ip_network(cidr, strict=False)
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+
+        for i in range(network.prefixlen):
+            bit = (bits >> (width - 1 - i)) & 1
+            child = node.children[bit]
+            if child is None:
+                child = _TrieNode()
+                node.children[bit] = child
+            node = child
+
+        node.region = region
+        self.size += 1
+
+    def lookup(self, ip: str) -> Optional[CacheRegion]:
+        """查找IP所属区域，返回最长前缀匹配结果"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        node = self._roots[address.version]
+        bits = int(address)
+        width = address.max_prefixlen
+        best = node.region
+
+        for i in range(width):
+            node = node.children[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                break
+            if node.region is not None:
+                best = node.region
+
+        return best
+
+
 class RegionCacheManager:
     """区域缓存管理器"""
 
+    # 缓存级别查找顺序
+    LEVEL_ORDER = [CacheLevel.L1_EDGE, CacheLevel.L2_REGIONAL, CacheLevel.L3_GLOBAL]
+
+    # 未指定区域时的候选区域顺序
+    DEFAULT_REGION_ORDER = [CacheRegion.AMERICAS, CacheRegion.EUROPE, CacheRegion.ASIA_PACIFIC]
+
+    # 访问统计在Redis中的哈希键
+    ACCESS_STATS_KEY = "region_cache:access_stats"
+
     def __init__(self, config_path: str = "config/cache_config.json"):
         self.config_path = Path(config_path)
         self.cache_connections: Dict[CacheRegion, redis.Redis] = {}
         self.cache_policies: Dict[str, CachePolicy] = {}
         self.cache_stats: Dict[CacheRegion, Dict[str, Any]] = {}
 
-        # 初始化配置
+        # IP区域解析前缀树
+        self.ip_trie = IPRegionTrie()
+
+        # 对冲查询延迟（秒），首选区域未在该时间内返回时并发查询其他候选区域
+        self.hedge_delay = 0.01
+
+        # 内存中累积的访问统计，按批次刷新到Redis
+        self._pending_access: Dict[CacheRegion, Counter] = {}
+        self._pending_access_total = 0
+        self.access_flush_threshold = 1000
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # 初始化配置（Redis连接在get_cache_manager中异步建立）
         self._load_config()
-        self._initialize_connections()
+        self._connections_initialized = False
+
+        # 注册到统一缓存核心的统计接口
+        self.name = "region_cache"
+        get_cache_core().register(self)
 
         logger.info("Region cache manager initialized")
 
@@ -181,17 +279,28 @@ class RegionCacheManager:
 
         self.config = config
 
+        # 构建IP区域前缀树
+        for region_name, ranges in config.get("ip_ranges", DEFAULT_IP_RANGES).items():
+            try:
+                region = CacheRegion(region_name)
+            except ValueError:
+                logger.warning(f"Unknown region in ip_ranges: {region_name}")
+                continue
+            for cidr in ranges:
+                try:
+                    self.ip_trie.insert(cidr, region)
+                except ValueError as e:
+                    logger.warning(f"Invalid CIDR {cidr} for region {region_name}: {e}")
+
     async def _initialize_connections(self):
-        """初始化Redis连接"""
+        """初始化Redis连接（使用统一缓存核心的共享连接池）"""
+        self._connections_initialized = True
         for region_name, region_config in self.config["regions"].items():
             try:
                 region = CacheRegion(region_name)
-                connection = redis.Redis(
-                    host=region_config["host"],
-                    port=region_config["port"],
-                    db=region_config["db"],
-                    max_connections=region_config["max_connections"],
-                    decode_responses=False
+                connection = get_cache_core().redis_pools.get_client(
+                    f"redis://{region_config['host']}:{region_config['port']}/{region_config['db']}",
+                    max_connections=region_config["max_connections"]
                 )
 
                 # 测试连接
@@ -217,22 +326,10 @@ class RegionCacheManager:
     async def get_region_from_ip(self, ip_address: str) -> CacheRegion:
         """根据IP地址确定区域"""
         try:
-            # 这里应该使用GeoIP数据库
-            # 简化实现，实际应该使用MaxMind GeoIP或类似服务
-
-            # 示例IP范围映射
-            ip_ranges = {
-                CacheRegion.ASIA_PACIFIC: ["1.0.0.0/8", "203.0.0.0/8", "202.0.0.0/8"],
-                CacheRegion.EUROPE: ["81.0.0.0/8", "82.0.0.0/8", "83.0.0.0/8"],
-                CacheRegion.AMERICAS: ["192.0.0.0/8", "172.0.0.0/8", "10.0.0.0/8"],
-                CacheRegion.CHINA: ["58.0.0.0/8", "59.0.0.0/8", "60.0.0.0/8"]
-            }
-
-            # 简化的IP匹配逻辑
-            for region, ranges in ip_ranges.items():
-                for ip_range in ranges:
-                    if self._ip_in_range(ip_address, ip_range):
-                        return region
+            # 基于CIDR前缀树的最长前缀匹配，实际部署可替换为GeoIP数据
+            region = self.ip_trie.lookup(ip_address)
+            if region is not None:
+                return region
 
             # 默认返回美洲区域
             return CacheRegion.AMERICAS
@@ -243,61 +340,160 @@ class RegionCacheManager:
 
     def _ip_in_range(self, ip: str, ip_range: str) -> bool:
         """检查IP是否在指定范围内"""
-        # 简化实现，实际应该使用proper IP range checking
-        return False
+        try:
+            return ipaddress.ip_address(ip) in ipaddress.ip_network(ip_range, strict=False)
+        except ValueError:
+            return False
+
+    async def _candidate_regions(self, region: Optional[CacheRegion],
+                                 user_ip: Optional[str]) -> List[CacheRegion]:
+        """确定候选查找区域，最近的区域排在最前"""
+        if region is not None:
+            return [region] if region in self.cache_connections else []
+
+        order = list(self.DEFAULT_REGION_ORDER)
+        if user_ip:
+            nearest = await self.get_region_from_ip(user_ip)
+            if nearest in order:
+                order.remove(nearest)
+            order.insert(0, nearest)
+
+        return [r for r in order if r in self.cache_connections]
+
+    async def _probe_region(self, region: CacheRegion, key: str,
+                            levels: List[CacheLevel]) -> Optional[Tuple[CacheLevel, Any]]:
+        """在单个区域内通过管道一次性探测所有缓存级别"""
+        connection = self.cache_connections[region]
+        cache_keys = [f"{level.value}:{key}" for level in levels]
 
-    async def get(self, key: str, region: CacheRegion = None,
-                  cache_level: CacheLevel = CacheLevel.L1_EDGE) -> Optional[Any]:
-        """获取缓存值"""
         try:
-            if region is None:
-                # 尝试从最近的区域开始查找
-                regions = [CacheRegion.AMERICAS, CacheRegion.EUROPE, CacheRegion.ASIA_PACIFIC]
-            else:
-                regions = [region]
+            pipe = connection.pipeline(transaction=False)
+            for cache_key in cache_keys:
+                pipe.get(cache_key)
+            results = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to probe cache key {key} in region {region}: {e}")
+            return None
 
-            # 按照级别顺序查找
-            levels = [CacheLevel.L1_EDGE, CacheLevel.L2_REGIONAL, CacheLevel.L3_GLOBAL]
+        now = time.time()
+        expired_keys = []
+        hit = None
 
-            for target_region in regions:
-                if target_region not in self.cache_connections:
-                    continue
+        for level, cache_key, cached_data in zip(levels, cache_keys, results):
+            if not cached_data:
+                continue
+            try:
+                found, value = self._decode_entry(cached_data, now)
+            except Exception as e:
+                logger.warning(f"Failed to decode cache entry {cache_key}: {e}")
+                continue
 
-                connection = self.cache_connections[target_region]
+            if not found:
+                expired_keys.append(cache_key)
+                continue
 
-                for level in levels:
-                    if cache_level and level != cache_level:
-                        continue
+            hit = (level, value)
+            self._update_access_stats(region, cache_key)
+            break
 
-                    # 构造缓存键
-                    cache_key = f"{level.value}:{key}"
+        if expired_keys:
+            try:
+                await connection.delete(*expired_keys)
+            except Exception as e:
+                logger.warning(f"Failed to delete expired cache entries: {e}")
+
+        return hit
+
+    def _encode_entry(self, key: str, value: Any, content_type: str, created_at: float,
+                      expires_at: float, size_bytes: int, cache_level: CacheLevel,
+                      region: CacheRegion, checksum: str) -> str:
+        """编码缓存条目，值直接内嵌，无需二次解析"""
+        return json.dumps({
+            "format": ENTRY_FORMAT_VERSION,
+            "key": key,
+            "value": value,
+            "content_type": content_type,
+            "created_at": created_at,
+            "expires_at": expires_at,
+            "size_bytes": size_bytes,
+            "cache_level": cache_level.value,
+            "region": region.value,
+            "checksum": checksum
+        }, ensure_ascii=False)
+
+    def _decode_entry(self, cached_data: Union[str, bytes], now: float) -> Tuple[bool, Any]:
+        """解码缓存条目，返回(是否有效, 值)"""
+        cache_entry = json.loads(cached_data)
+
+        if cache_entry.get("format") == ENTRY_FORMAT_VERSION:
+            if now > cache_entry["expires_at"]:
+                return False, None
+            return True, cache_entry["value"]
+
+        # 兼容旧格式：值为二次编码的JSON字符串，过期时间为ISO格式
+        expires_at = datetime.fromisoformat(cache_entry["expires_at"])
+        if datetime.now() > expires_at:
+            return False, None
+        return True, json.loads(cache_entry["value"])
 
-                    try:
-                        # 获取缓存数据
-                        cached_data = await connection.get(cache_key)
-                        if cached_data:
-                            # 解析缓存条目
-                            cache_entry = json.loads(cached_data)
-
-                            # 检查是否过期
-                            expires_at = datetime.fromisoformat(cache_entry["expires_at"])
-                            if datetime.now() > expires_at:
-                                # 过期，删除缓存
-                                await connection.delete(cache_key)
-                                continue
-
-                            # 更新访问统计
-                            await self._update_access_stats(target_region, cache_key)
-
-                            # 返回值
-                            logger.debug(f"Cache hit for key {key} in region {target_region}, level {level}")
-                            return json.loads(cache_entry["value"])
-
-                    except Exception as e:
-                        logger.warning(f"Failed to get cache entry {cache_key}: {e}")
-                        continue
+    async def get(self, key: str, region: CacheRegion = None,
+                  cache_level: CacheLevel = CacheLevel.L1_EDGE,
+                  user_ip: str = None) -> Optional[Any]:
+        """获取缓存值
+
+        多个候选区域时先查询最近区域，超过对冲延迟后并发查询其余区域，
+        最先命中的结果胜出，其余查询被取消。
+        """
+        try:
+            regions = await self._candidate_regions(region, user_ip)
+            levels = [level for level in self.LEVEL_ORDER
+                      if not cache_level or level == cache_level]
+
+            if not regions or not levels:
+                logger.debug(f"Cache miss for key {key}")
+                return None
+
+            if len(regions) == 1:
+                hit = await self._probe_region(regions[0], key, levels)
+                if hit is not None:
+                    logger.debug(f"Cache hit for key {key} in region {regions[0]}, level {hit[0]}")
+                    return hit[1]
+                self._record_miss(regions[0])
+                logger.debug(f"Cache miss for key {key}")
+                return None
+
+            pending = {
+                asyncio.ensure_future(self._probe_region(regions[0], key, levels)): regions[0]
+            }
+            remaining = regions[1:]
+
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(
+                        pending.keys(),
+                        timeout=self.hedge_delay if remaining else None,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+
+                    # 首选区域未及时返回（或未命中），启动对冲查询
+                    if remaining and (not done or all(t.result() is None for t in done)):
+                        for hedge_region in remaining:
+                            task = asyncio.ensure_future(self._probe_region(hedge_region, key, levels))
+                            pending[task] = hedge_region
+                        remaining = []
+
+                    for task in done:
+                        hit_region = pending.pop(task)
+                        hit = task.result()
+                        if hit is not None:
+                            logger.debug(f"Cache hit for key {key} in region {hit_region}, level {hit[0]}")
+                            return hit[1]
+            finally:
+                for task in pending:
+                    task.cancel()
 
             # 缓存未命中
+            self._record_miss(regions[0])
             logger.debug(f"Cache miss for key {key}")
             return None
 
@@ -336,32 +532,22 @@ class RegionCacheManager:
                 return False
 
             # 为每个缓存级别设置值
-            current_time = datetime.now()
+            current_time = time.time()
             value_json = json.dumps(value, ensure_ascii=False)
             checksum = hashlib.md5(value_json.encode()).hexdigest()
+            size_bytes = len(value_json.encode('utf-8'))
 
+            pipe = connection.pipeline(transaction=False)
             for cache_level in policy.cache_levels:
                 # 计算过期时间
                 ttl_seconds = policy.ttl[cache_level]
-                expires_at = current_time + timedelta(seconds=ttl_seconds)
-
-                # 创建缓存条目
-                cache_entry = CacheEntry(
-                    key=key,
-                    value=value_json,
-                    content_type=policy.content_type,
-                    created_at=current_time,
-                    expires_at=expires_at,
-                    access_count=0,
-                    last_accessed=current_time,
-                    size_bytes=len(value_json.encode('utf-8')),
-                    cache_level=cache_level,
-                    region=target_region,
-                    checksum=checksum
-                )
 
-                # 序列化缓存条目
-                cache_data = json.dumps(asdict(cache_entry), default=str)
+                # 序列化缓存条目（单次编码）
+                cache_data = self._encode_entry(
+                    key, value, policy.content_type, current_time,
+                    current_time + ttl_seconds, size_bytes, cache_level,
+                    target_region, checksum
+                )
 
                 # 压缩数据（如果启用）
                 if policy.compression_enabled:
@@ -373,10 +559,12 @@ class RegionCacheManager:
 
                 # 存储到Redis
                 cache_key = f"{cache_level.value}:{key}"
-                await connection.setex(cache_key, ttl_seconds, cache_data)
+                pipe.setex(cache_key, ttl_seconds, cache_data)
+
+            await pipe.execute()
 
-                # 更新统计信息
-                self.cache_stats[target_region]["sets"] += 1
+            # 更新统计信息
+            self.cache_stats[target_region]["sets"] += len(policy.cache_levels)
 
             logger.debug(f"Cache set for key {key} in region {target_region}")
             return True
@@ -456,15 +644,48 @@ class RegionCacheManager:
             logger.error(f"Failed to invalidate cache pattern {pattern}: {e}")
             return 0
 
-    async def _update_access_stats(self, region: CacheRegion, cache_key: str):
-        """更新访问统计"""
+    def _update_access_stats(self, region: CacheRegion, cache_key: str):
+        """更新访问统计（仅在内存中累积，由flush_access_stats批量写入）"""
         try:
-            if region in self.cache_connections:
+            if region in self.cache_stats:
                 self.cache_stats[region]["hits"] += 1
-                # 这里可以更新更详细的统计信息
+
+            self._pending_access.setdefault(region, Counter())[cache_key] += 1
+            self._pending_access_total += 1
+
+            if (self._pending_access_total >= self.access_flush_threshold and
+                    (self._flush_task is None or self._flush_task.done())):
+                self._flush_task = asyncio.ensure_future(self.flush_access_stats())
         except Exception as e:
             logger.warning(f"Failed to update access stats: {e}")
 
+    def _record_miss(self, region: CacheRegion):
+        """记录未命中"""
+        if region in self.cache_stats:
+            self.cache_stats[region]["misses"] += 1
+
+    async def flush_access_stats(self) -> int:
+        """将累积的访问计数批量写入各区域Redis"""
+        pending = self._pending_access
+        self._pending_access = {}
+        self._pending_access_total = 0
+
+        flushed = 0
+        for region, counts in pending.items():
+            connection = self.cache_connections.get(region)
+            if connection is None or not counts:
+                continue
+            try:
+                pipe = connection.pipeline(transaction=False)
+                for cache_key, count in counts.items():
+                    pipe.hincrby(self.ACCESS_STATS_KEY, cache_key, count)
+                await pipe.execute()
+                flushed += len(counts)
+            except Exception as e:
+                logger.warning(f"Failed to flush access stats for region {region}: {e}")
+
+        return flushed
+
     def _check_geo_restrictions(self, region: CacheRegion, restrictions: List[str]) -> bool:
         """检查地理位置限制"""
         if "same_country" in restrictions:
@@ -486,6 +707,14 @@ class RegionCacheManager:
         # 实现加密逻辑
         return data
 
+    def get_stats(self) -> Dict[str, Any]:
+        """汇总各区域统计（供统一缓存核心使用）"""
+        return {
+            "hits": sum(stats.get("hits", 0) for stats in self.cache_stats.values()),
+            "misses": sum(stats.get("misses", 0) for stats in self.cache_stats.values()),
+            "regions": {region.value: stats for region, stats in self.cache_stats.items()}
+        }
+
     async def get_cache_stats(self, region: CacheRegion = None) -> Dict[str, Any]:
         """获取缓存统计信息"""
         try:
@@ -594,6 +823,8 @@ class RegionCacheManager:
 
     async def close_connections(self):
         """关闭所有连接"""
+        await self.flush_access_stats()
+
         for region, connection in self.cache_connections.items():
             try:
                 await connection.close()
@@ -606,4 +837,6 @@ cache_manager = RegionCacheManager()
 
 async def get_cache_manager() -> RegionCacheManager:
     """获取缓存管理器实例"""
+    if not cache_manager._connections_initialized:
+        await cache_manager._initialize_connections()
     return cache_manager
\ No newline at end of file
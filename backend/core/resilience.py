@@ -0,0 +1,520 @@
+"""
+上游弹性控制
+Upstream Resilience
+
+为AI提供商/模型、路由区域和HA节点提供自适应并发限制、异常实例摘除和熔断器
+Adaptive concurrency limits, outlier ejection and circuit breakers for upstream dependencies
+"""
+
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Set
+
+from backend.monitoring.prometheus_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Prometheus指标
+UPSTREAM_SHED = metrics_registry.counter(
+    "upstream_requests_shed_total", "因熔断、摘除或并发上限被拒绝的上游请求", ("upstream", "reason")
+)
+UPSTREAM_EJECTIONS = metrics_registry.counter(
+    "upstream_ejections_total", "上游实例因连续错误被摘除的次数", ("upstream",)
+)
+
+Clock = Callable[[], float]
+
+
+class CircuitState(Enum):
+    """熔断器状态"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class Outcome(Enum):
+    """一次上游调用的结果分类"""
+    SUCCESS = "success"
+    ERROR = "error"        # 5xx、连接错误
+    TIMEOUT = "timeout"
+    OVERLOAD = "overload"  # 429：只收缩并发上限，不计入熔断
+    IGNORED = "ignored"    # 4xx等调用方错误，不影响上游状态
+
+
+class UpstreamUnavailable(Exception):
+    """上游不可用（熔断、摘除或达到并发上限），调用方应降级而不是排队"""
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"Upstream {upstream} unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for attr in ("status_code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def classify_exception(error: BaseException) -> Outcome:
+    """把异常归类为上游结果"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return Outcome.TIMEOUT
+    status = _status_code(error)
+    if status is not None:
+        if status == 429:
+            return Outcome.OVERLOAD
+        if status == 408 or status == 504:
+            return Outcome.TIMEOUT
+        if status >= 500:
+            return Outcome.ERROR
+        return Outcome.IGNORED
+    if isinstance(error, (ValueError, TypeError, KeyError)):
+        # 本地参数或解析错误，与上游健康无关
+        return Outcome.IGNORED
+    return Outcome.ERROR
+
+
+@dataclass
+class CircuitBreakerConfig:
+    """熔断器配置"""
+    failure_rate_threshold: float = 0.5  # 窗口内失败率达到该值时打开
+    minimum_calls: int = 10              # 窗口内调用数不足时不按失败率打开
+    window_size: int = 50                # 统计最近多少次调用
+    consecutive_failures: int = 5        # 连续失败次数达到该值时直接打开
+    recovery_timeout: float = 30.0       # 打开后多久进入半开
+    half_open_max_calls: int = 3         # 半开状态同时放行的探测请求数
+    success_threshold: int = 2           # 半开状态连续成功多少次后关闭
+
+
+class CircuitBreaker:
+    """熔断器：关闭 → 打开 → 半开探测 → 关闭"""
+
+    def __init__(self, name: str, config: Optional[CircuitBreakerConfig] = None,
+                 clock: Clock = time.monotonic):
+        self.name = name
+        self.config = config or CircuitBreakerConfig()
+        self._clock = clock
+        self._state = CircuitState.CLOSED
+        self._results = bytearray()  # 最近调用结果，1表示失败
+        self._failures = 0
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and self._clock() - self._opened_at >= self.config.recovery_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+        return self._state
+
+    def is_open(self) -> bool:
+        return self.state == CircuitState.OPEN
+
+    def allow_request(self) -> bool:
+        """是否放行请求；半开状态下占用一个探测名额"""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and self._half_open_in_flight < self.config.half_open_max_calls:
+            self._half_open_in_flight += 1
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._state == CircuitState.HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.config.success_threshold:
+                self._close()
+            return
+        self._consecutive_failures = 0
+        self._push(0)
+
+    def record_failure(self) -> None:
+        if self._state == CircuitState.HALF_OPEN:
+            self._open()
+            return
+        if self._state == CircuitState.OPEN:
+            return
+        self._consecutive_failures += 1
+        self._push(1)
+        window = len(self._results)
+        if (self._consecutive_failures >= self.config.consecutive_failures or
+                (window >= self.config.minimum_calls and
+                 self._failures / window >= self.config.failure_rate_threshold)):
+            self._open()
+
+    def record_ignored(self) -> None:
+        """调用结果与上游健康无关时归还半开探测名额"""
+        if self._state == CircuitState.HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _push(self, failed: int) -> None:
+        self._results.append(failed)
+        self._failures += failed
+        if len(self._results) > self.config.window_size:
+            self._failures -= self._results.pop(0)
+
+    def _open(self) -> None:
+        if self._state != CircuitState.OPEN:
+            logger.warning(f"Circuit {self.name} opened")
+        self._state = CircuitState.OPEN
+        self._opened_at = self._clock()
+        self.times_opened += 1
+
+    def _close(self) -> None:
+        logger.info(f"Circuit {self.name} closed")
+        self._state = CircuitState.CLOSED
+        self._results.clear()
+        self._failures = 0
+        self._consecutive_failures = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        window = len(self._results)
+        return {
+            "state": self.state.value,
+            "failure_rate": round(self._failures / window, 4) if window else 0.0,
+            "consecutive_failures": self._consecutive_failures,
+            "times_opened": self.times_opened
+        }
+
+
+@dataclass
+class OutlierDetectionConfig:
+    """异常实例摘除配置"""
+    consecutive_errors: int = 5         # 连续5xx/超时次数达到该值时摘除
+    base_ejection_time: float = 30.0    # 摘除时长 = 基础时长 × 已摘除次数
+    max_ejection_time: float = 300.0
+    max_ejection_percent: float = 50.0  # 同一分组内最多摘除的实例比例
+
+
+class OutlierDetector:
+    """按连续错误摘除异常实例，同一分组内至少保留一部分实例"""
+
+    def __init__(self, config: Optional[OutlierDetectionConfig] = None, clock: Clock = time.monotonic):
+        self.config = config or OutlierDetectionConfig()
+        self._clock = clock
+        self._consecutive: Dict[str, int] = {}
+        self._ejected_until: Dict[str, float] = {}
+        self._ejection_count: Dict[str, int] = {}
+        self._groups: Dict[str, Set[str]] = {}
+        self._group_of: Dict[str, str] = {}
+
+    def track(self, key: str, group: Optional[str] = None) -> None:
+        """登记实例所属分组"""
+        group = group or key
+        if self._group_of.get(key) != group:
+            previous = self._group_of.get(key)
+            if previous is not None:
+                self._groups[previous].discard(key)
+            self._group_of[key] = group
+            self._groups.setdefault(group, set()).add(key)
+
+    def is_ejected(self, key: str) -> bool:
+        until = self._ejected_until.get(key)
+        if until is None:
+            return False
+        if self._clock() >= until:
+            del self._ejected_until[key]
+            self._consecutive[key] = 0
+            return False
+        return True
+
+    def record_success(self, key: str) -> None:
+        self._consecutive[key] = 0
+
+    def record_failure(self, key: str, group: Optional[str] = None) -> bool:
+        """记录一次错误，返回是否因此被摘除"""
+        self.track(key, group)
+        count = self._consecutive.get(key, 0) + 1
+        self._consecutive[key] = count
+        if count < self.config.consecutive_errors or self.is_ejected(key):
+            return False
+
+        members = self._groups[self._group_of[key]]
+        ejected = sum(1 for member in members if self.is_ejected(member))
+        if members and (ejected + 1) / len(members) * 100 > self.config.max_ejection_percent and ejected > 0:
+            return False
+
+        times = self._ejection_count.get(key, 0) + 1
+        self._ejection_count[key] = times
+        duration = min(self.config.base_ejection_time * times, self.config.max_ejection_time)
+        self._ejected_until[key] = self._clock() + duration
+        UPSTREAM_EJECTIONS.labels(key).inc()
+        logger.warning(f"Upstream {key} ejected for {duration:.0f}s after {count} consecutive errors")
+        return True
+
+    def get_stats(self, key: str) -> Dict[str, Any]:
+        ejected = self.is_ejected(key)
+        return {
+            "ejected": ejected,
+            "ejected_for_seconds": round(self._ejected_until[key] - self._clock(), 3) if ejected else 0.0,
+            "consecutive_errors": self._consecutive.get(key, 0),
+            "ejection_count": self._ejection_count.get(key, 0)
+        }
+
+
+@dataclass
+class ConcurrencyLimitConfig:
+    """自适应并发限制配置"""
+    initial_limit: int = 20
+    min_limit: int = 1
+    max_limit: int = 500
+    tolerance: float = 1.5     # 延迟超过长期基线多少倍开始收缩
+    smoothing: float = 0.2     # 每个样本对上限的调整幅度
+    long_window: int = 600     # 长期延迟基线的EWMA窗口（样本数）
+    backoff_ratio: float = 0.9  # 超时/过载时的乘性下降比例
+
+
+class AdaptiveConcurrencyLimiter:
+    """梯度算法的自适应并发上限
+
+    以长期延迟EWMA为基线，单次延迟高于 基线×tolerance 时按比例收缩上限，
+    否则以 sqrt(limit) 的余量缓慢增长；超时/过载按AIMD乘性下降。
+    """
+
+    def __init__(self, config: Optional[ConcurrencyLimitConfig] = None):
+        self.config = config or ConcurrencyLimitConfig()
+        self.limit = float(self.config.initial_limit)
+        self.in_flight = 0
+        self._long_rtt: Optional[float] = None
+        self.rejected = 0
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.config.min_limit, int(self.limit))
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.current_limit
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.current_limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: Optional[float] = None, dropped: bool = False) -> None:
+        """归还名额；latency为None时不参与上限调整"""
+        in_flight = self.in_flight
+        self.in_flight = max(0, in_flight - 1)
+        config = self.config
+        if dropped:
+            self.limit = max(config.min_limit, self.limit * config.backoff_ratio)
+            return
+        if latency is None or latency <= 0:
+            return
+
+        if self._long_rtt is None:
+            self._long_rtt = latency
+        else:
+            self._long_rtt += (latency - self._long_rtt) / config.long_window
+            # 延迟已恢复时让基线更快回落，避免长期停留在拥塞期的高基线
+            if self._long_rtt > latency * 2:
+                self._long_rtt *= 0.95
+
+        # 并发远未用满时延迟不能说明上限是否合适
+        if in_flight < self.limit / 2:
+            return
+
+        gradient = max(0.5, min(1.0, config.tolerance * self._long_rtt / latency))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - config.smoothing) + target * config.smoothing
+        self.limit = max(config.min_limit, min(config.max_limit, limit))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.current_limit,
+            "in_flight": self.in_flight,
+            "baseline_latency": round(self._long_rtt, 4) if self._long_rtt is not None else None,
+            "rejected": self.rejected
+        }
+
+
+class UpstreamPermit:
+    """一次上游调用的许可；必须调用release（或作为async with使用）"""
+
+    __slots__ = ('guard', 'key', 'group', 'started', 'released')
+
+    def __init__(self, guard: 'UpstreamGuard', key: str, group: Optional[str]):
+        self.guard = guard
+        self.key = key
+        self.group = group
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self, outcome: Outcome = Outcome.SUCCESS) -> None:
+        if not self.released:
+            self.released = True
+            self.guard._release(self, outcome, time.monotonic() - self.started)
+
+    async def __aenter__(self) -> 'UpstreamPermit':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        if exc is None:
+            self.release(Outcome.SUCCESS)
+        elif isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            # 请求取消或客户端中途断开流式响应，与上游健康无关
+            self.release(Outcome.IGNORED)
+        else:
+            self.release(classify_exception(exc))
+        return False
+
+
+class UpstreamGuard:
+    """按上游组合并发限制、异常摘除和熔断
+
+    key为具体上游（如模型），group为其所属分组（如提供商）。分组共享一个并发上限，
+    异常摘除的比例上限也按分组计算。获取不到许可时立即返回，由调用方降级。
+    """
+
+    def __init__(self, limit_config: Optional[ConcurrencyLimitConfig] = None,
+                 breaker_config: Optional[CircuitBreakerConfig] = None,
+                 outlier_config: Optional[OutlierDetectionConfig] = None,
+                 group_limit_config: Optional[ConcurrencyLimitConfig] = None,
+                 clock: Clock = time.monotonic):
+        self.limit_config = limit_config or ConcurrencyLimitConfig()
+        self.group_limit_config = group_limit_config or ConcurrencyLimitConfig(
+            initial_limit=self.limit_config.initial_limit * 4,
+            max_limit=self.limit_config.max_limit * 4
+        )
+        self.breaker_config = breaker_config or CircuitBreakerConfig()
+        self._clock = clock
+        self.outliers = OutlierDetector(outlier_config, clock)
+        self._limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+        self._group_limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def limiter(self, key: str) -> AdaptiveConcurrencyLimiter:
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = AdaptiveConcurrencyLimiter(self.limit_config)
+        return limiter
+
+    def group_limiter(self, group: str) -> AdaptiveConcurrencyLimiter:
+        limiter = self._group_limiters.get(group)
+        if limiter is None:
+            limiter = self._group_limiters[group] = AdaptiveConcurrencyLimiter(self.group_limit_config)
+        return limiter
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(key, self.breaker_config, self._clock)
+        return breaker
+
+    def is_routable(self, key: str) -> bool:
+        """未被摘除且熔断器未打开（不考虑瞬时并发）"""
+        breaker = self._breakers.get(key)
+        return not self.outliers.is_ejected(key) and (breaker is None or not breaker.is_open())
+
+    def has_capacity(self, key: str, group: Optional[str] = None) -> bool:
+        if not self.is_routable(key):
+            return False
+        if group is not None and not self.group_limiter(group).has_capacity():
+            return False
+        return self.limiter(key).has_capacity()
+
+    def try_acquire(self, key: str, group: Optional[str] = None) -> Optional[UpstreamPermit]:
+        """尝试获取许可，不可用时返回None"""
+        reason = self._acquire(key, group)
+        if reason is not None:
+            UPSTREAM_SHED.labels(key, reason).inc()
+            return None
+        return UpstreamPermit(self, key, group)
+
+    def acquire(self, key: str, group: Optional[str] = None) -> UpstreamPermit:
+        """获取许可，不可用时抛出UpstreamUnavailable"""
+        reason = self._acquire(key, group)
+        if reason is not None:
+            UPSTREAM_SHED.labels(key, reason).inc()
+            raise UpstreamUnavailable(key, reason)
+        return UpstreamPermit(self, key, group)
+
+    def _acquire(self, key: str, group: Optional[str]) -> Optional[str]:
+        self.outliers.track(key, group)
+        if self.outliers.is_ejected(key):
+            return "ejected"
+        breaker = self.breaker(key)
+        if not breaker.allow_request():
+            return "circuit_open"
+        group_limiter = self.group_limiter(group) if group is not None else None
+        if group_limiter is not None and not group_limiter.try_acquire():
+            breaker.record_ignored()
+            return "group_concurrency"
+        if not self.limiter(key).try_acquire():
+            if group_limiter is not None:
+                group_limiter.release()
+            breaker.record_ignored()
+            return "concurrency"
+        return None
+
+    def _release(self, permit: UpstreamPermit, outcome: Outcome, latency: float) -> None:
+        key, group = permit.key, permit.group
+        limiters = [self.limiter(key)]
+        if group is not None:
+            limiters.append(self.group_limiter(group))
+
+        breaker = self.breaker(key)
+        if outcome == Outcome.SUCCESS:
+            for limiter in limiters:
+                limiter.release(latency)
+            breaker.record_success()
+            self.outliers.record_success(key)
+        elif outcome in (Outcome.TIMEOUT, Outcome.OVERLOAD):
+            for limiter in limiters:
+                limiter.release(dropped=True)
+            if outcome == Outcome.TIMEOUT:
+                breaker.record_failure()
+                self.outliers.record_failure(key, group)
+            else:
+                breaker.record_ignored()
+        elif outcome == Outcome.ERROR:
+            for limiter in limiters:
+                limiter.release()
+            breaker.record_failure()
+            self.outliers.record_failure(key, group)
+        else:
+            for limiter in limiters:
+                limiter.release()
+            breaker.record_ignored()
+
+    def record(self, key: str, outcome: Outcome, group: Optional[str] = None) -> None:
+        """记录未经过许可的观测结果（如健康探测），只影响熔断和摘除"""
+        self.outliers.track(key, group)
+        breaker = self.breaker(key)
+        if outcome == Outcome.SUCCESS:
+            breaker.record_success()
+            self.outliers.record_success(key)
+        elif outcome in (Outcome.ERROR, Outcome.TIMEOUT):
+            breaker.record_failure()
+            self.outliers.record_failure(key, group)
+
+    def get_stats(self) -> Dict[str, Any]:
+        keys = set(self._limiters) | set(self._breakers)
+        return {
+            "upstreams": {
+                key: {
+                    "routable": self.is_routable(key),
+                    "concurrency": self.limiter(key).get_stats(),
+                    "circuit": self.breaker(key).get_stats(),
+                    "outlier": self.outliers.get_stats(key)
+                }
+                for key in sorted(keys)
+            },
+            "groups": {group: limiter.get_stats() for group, limiter in self._group_limiters.items()}
+        }
@@ -0,0 +1,297 @@
+"""
+路由决策加速
+Routing Hot Path
+
+GeoIP网段缓存、路由规则编译与索引、区域距离表和短TTL路由决策缓存
+GeoIP prefix cache, compiled and indexed routing rules, region distance tables and decision cache
+"""
+
+import ipaddress
+import time
+from collections import OrderedDict
+from math import asin, cos, radians, sin, sqrt
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371
+
+# 谓词参数：(geo_info, request_path, headers, user_context, user_agent)
+Predicate = Callable[[Optional[Dict[str, Any]], str, Optional[Dict[str, str]], Optional[Dict[str, Any]], Optional[str]], bool]
+
+_MISSING = object()
+
+
+def ip_prefix_key(ip_address: str) -> Optional[Hashable]:
+    """IPv4取/24，IPv6取/48作为缓存键；非法地址返回None"""
+    head, dot, last = ip_address.rpartition('.')
+    if dot and ':' not in head and last.isdigit() and len(last) <= 3 and int(last) < 256:
+        return head
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+    if address.version == 4:
+        return str(address).rpartition('.')[0]
+    return address.packed[:6]
+
+
+class GeoIPCache:
+    """按网段缓存的GeoIP查询结果（LRU + TTL），查询失败的结果同样缓存"""
+
+    def __init__(self, lookup: Callable[[str], Optional[Dict[str, Any]]], max_size: int = 65536,
+                 ttl: float = 3600):
+        self.lookup = lookup
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        key = ip_prefix_key(ip_address)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        result = self.lookup(ip_address)
+        self._entries[key] = (now + self.ttl, result)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def _path_segment(path: str) -> str:
+    """路径第一段，例如 /api/v1/chat -> api"""
+    start = 1 if path.startswith('/') else 0
+    end = path.find('/', start)
+    return path[start:] if end < 0 else path[start:end]
+
+
+class CompiledRule:
+    """编译后的路由规则"""
+
+    __slots__ = ('rule', 'rule_id', 'countries', 'path_prefixes', 'segments', 'predicates')
+
+    def __init__(self, rule: Any, countries: Optional[frozenset], path_prefixes: Optional[Tuple[str, ...]],
+                 predicates: List[Predicate]):
+        self.rule = rule
+        self.rule_id = rule.rule_id
+        self.countries = countries
+        self.path_prefixes = path_prefixes
+        # 只有第一段完整（如 /api/）的前缀可以按段索引，其余放入任意路径桶
+        segments = None
+        if path_prefixes is not None:
+            segments = set()
+            for prefix in path_prefixes:
+                rest = prefix.lstrip('/')
+                if '/' not in rest:
+                    segments = None
+                    break
+                segments.add(rest.split('/', 1)[0])
+        self.segments = frozenset(segments) if segments is not None else None
+        self.predicates = tuple(predicates)
+
+    def matches(self, geo_info, request_path, headers, user_context, user_agent) -> bool:
+        for predicate in self.predicates:
+            if not predicate(geo_info, request_path, headers, user_context, user_agent):
+                return False
+        return True
+
+
+def _context_equals(field: str, expected: Any) -> Predicate:
+    def predicate(geo_info, request_path, headers, user_context, user_agent):
+        return (user_context.get(field) if user_context else None) == expected
+    return predicate
+
+
+def compile_rule(rule: Any, region_status_check: Callable[[str], bool]) -> CompiledRule:
+    """把规则条件编译为谓词闭包
+
+    geo_location和path_prefix条件提取为索引键，其余条件编译为闭包；
+    region_status_check(status) 返回是否存在处于该状态的区域。
+    """
+    countries: Optional[frozenset] = None
+    path_prefixes: Optional[Tuple[str, ...]] = None
+    predicates: List[Predicate] = []
+
+    for condition in rule.conditions:
+        condition_type = condition["type"]
+        expected_value = condition.get("value")
+        expected_values = condition.get("values")
+        if expected_values is None:
+            expected_values = [] if expected_value is None else [expected_value]
+
+        if condition_type == "geo_location":
+            allowed = frozenset(expected_values)
+            countries = allowed if countries is None else countries & allowed
+
+        elif condition_type == "path_prefix":
+            prefixes = tuple(expected_values)
+            path_prefixes = prefixes if path_prefixes is None else tuple(
+                p for p in path_prefixes if p.startswith(prefixes)
+            )
+
+        elif condition_type == "health_status":
+            status = expected_value
+            predicates.append(
+                lambda geo_info, request_path, headers, user_context, user_agent, status=status:
+                region_status_check(status)
+            )
+
+        elif condition_type == "performance_tier":
+            predicates.append(_context_equals("performance_tier", expected_value))
+
+        elif condition_type == "user_tier":
+            predicates.append(_context_equals("tier", expected_value))
+
+        # 未知条件类型与原解释执行逻辑一致：忽略
+
+    return CompiledRule(rule, countries, path_prefixes, predicates)
+
+
+class RuleIndex:
+    """按国家和路径第一段索引的规则集
+
+    (国家, 路径段) 对应的候选规则列表按需计算并缓存，请求只需检查候选规则的剩余谓词。
+    """
+
+    def __init__(self, rules: Iterable[Any], region_status_check: Callable[[str], bool],
+                 max_candidate_lists: int = 4096):
+        self.compiled = [
+            compile_rule(rule, region_status_check)
+            for rule in sorted(rules, key=lambda r: r.priority)
+            if rule.enabled
+        ]
+        self.max_candidate_lists = max_candidate_lists
+        self._candidates: Dict[Tuple[Optional[str], str], Tuple[CompiledRule, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.compiled)
+
+    def candidates(self, country: Optional[str], segment: str) -> Tuple[CompiledRule, ...]:
+        key = (country, segment)
+        result = self._candidates.get(key)
+        if result is None:
+            result = tuple(
+                rule for rule in self.compiled
+                if (rule.countries is None or country in rule.countries) and
+                (rule.segments is None or segment in rule.segments)
+            )
+            if len(self._candidates) >= self.max_candidate_lists:
+                self._candidates.clear()
+            self._candidates[key] = result
+        return result
+
+    def match(self, geo_info: Optional[Dict[str, Any]] = None, user_agent: Optional[str] = None,
+              request_path: Optional[str] = None, headers: Optional[Dict[str, str]] = None,
+              user_context: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """返回按优先级排序的匹配规则"""
+        country = geo_info.get("country") if geo_info else None
+        path = request_path or ""
+        matched = []
+        for rule in self.candidates(country, _path_segment(path)):
+            if rule.path_prefixes is not None and not path.startswith(rule.path_prefixes):
+                continue
+            if rule.matches(geo_info, path, headers, user_context, user_agent):
+                matched.append(rule.rule)
+        return matched
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """两点之间的大圆距离（公里）"""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * asin(sqrt(a)) * EARTH_RADIUS_KM
+
+
+class DistanceTable:
+    """区域坐标预先转为弧度，按客户端坐标缓存到各区域的距离"""
+
+    def __init__(self, locations: Dict[str, Dict[str, Any]], max_size: int = 16384):
+        self._regions = [
+            (region, radians(location["lat"]), radians(location["lon"]), cos(radians(location["lat"])))
+            for region, location in locations.items()
+            if "lat" in location and "lon" in location
+        ]
+        self.max_size = max_size
+        self._cache: Dict[Tuple[float, float], Dict[str, float]] = {}
+
+    def distances(self, lat: float, lon: float) -> Dict[str, float]:
+        """客户端坐标到各区域的距离（公里）"""
+        key = (lat, lon)
+        result = self._cache.get(key)
+        if result is None:
+            lat_r, lon_r = radians(lat), radians(lon)
+            cos_lat = cos(lat_r)
+            result = {}
+            for region, region_lat, region_lon, region_cos in self._regions:
+                a = sin((region_lat - lat_r) / 2) ** 2 + cos_lat * region_cos * sin((region_lon - lon_r) / 2) ** 2
+                result[region] = 2 * asin(sqrt(min(1.0, a))) * EARTH_RADIUS_KM
+            if len(self._cache) >= self.max_size:
+                self._cache.clear()
+            self._cache[key] = result
+        return result
+
+    def distance(self, lat: float, lon: float, region: str) -> float:
+        return self.distances(lat, lon)[region]
+
+
+class DecisionCache:
+    """短TTL路由决策缓存；命中时由调用方校验结果是否仍然可用"""
+
+    def __init__(self, ttl: float = 1.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic() and (validate is None or validate(entry[1])):
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if len(self._entries) >= self.max_size:
+            now = time.monotonic()
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
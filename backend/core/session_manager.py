@@ -8,6 +8,8 @@ from dataclasses import dataclass, asdict
 from enum import Enum
 from concurrent.futures import ThreadPoolExecutor
 
+from backend.core.cache_core import MemoryTier, get_cache_core
+
 class MessageRole(str, Enum):
     USER = "user"
     ASSISTANT = "assistant"
@@ -47,10 +49,12 @@ class SessionManager:
         self.sessions_dir.mkdir(exist_ok=True)
         self.sessions_index_file = self.data_dir / "sessions_index.json"
         self._executor = ThreadPoolExecutor(max_workers=4)
-        # 内存缓存
-        self._sessions_cache: Dict[str, Session] = {}
-        self._cache_ttl = 300  # 5分钟缓存
-        self._cache_timestamps: Dict[str, float] = {}
+        # 内存缓存（统一缓存核心上的sessions命名空间，写入经失效总线通知其他worker）
+        self._cache_ttl = 3600
+        self._cache = get_cache_core().namespace(
+            "sessions", default_ttl=self._cache_ttl, max_entries=10000, broadcast=True
+        )
+        self._sessions_cache: MemoryTier = self._cache.get_tier(MemoryTier)
     
     def generate_session_id(self) -> str:
         """生成唯一的会话ID"""
@@ -60,18 +64,17 @@ class SessionManager:
         """生成唯一的消息ID"""
         return str(uuid.uuid4())
 
-    def _is_cache_valid(self, session_id: str) -> bool:
-        """检查缓存是否有效"""
-        if session_id not in self._cache_timestamps:
-            return False
-        import time
-        return time.time() - self._cache_timestamps[session_id] < self._cache_ttl
+    def _fill_cache(self, session_id: str, session: Session):
+        """读取后填充本地缓存（不通知其他worker）"""
+        self._sessions_cache.set_local(session_id, session, ttl=self._cache_ttl)
+
+    async def _update_cache(self, session_id: str, session: Session):
+        """写入后更新缓存，并使其他worker的副本失效"""
+        await self._cache.set(session_id, session)
 
-    def _update_cache(self, session_id: str, session: Session):
-        """更新缓存"""
-        import time
-        self._sessions_cache[session_id] = session
-        self._cache_timestamps[session_id] = time.time()
+    async def _invalidate_cache(self, session_id: str):
+        """删除缓存，并使其他worker的副本失效"""
+        await self._cache.delete(session_id)
 
     async def _read_json_file(self, file_path: Path) -> Dict[str, Any]:
         """异步读取JSON文件"""
@@ -119,15 +122,16 @@ class SessionManager:
         await self._update_sessions_index(session)
 
         # 更新缓存
-        self._update_cache(session_id, session)
+        await self._update_cache(session_id, session)
 
         return session
     
     async def get_session(self, session_id: str) -> Optional[Session]:
         """获取会话信息（带缓存）"""
         # 检查缓存
-        if self._is_cache_valid(session_id):
-            return self._sessions_cache.get(session_id)
+        cached = self._sessions_cache.get_local(session_id)
+        if cached is not None:
+            return cached
 
         session_file = self.sessions_dir / f"{session_id}.json"
 
@@ -140,7 +144,7 @@ class SessionManager:
             session = Session(**session_data)
 
             # 更新缓存
-            self._update_cache(session_id, session)
+            self._fill_cache(session_id, session)
 
             return session
         except Exception as e:
@@ -196,6 +200,7 @@ class SessionManager:
             
             # 更新索引
             await self._update_sessions_index(session)
+            await self._update_cache(session_id, session)
             
             return message
             
@@ -285,6 +290,7 @@ class SessionManager:
             
             # 从索引中移除
             await self._remove_from_index(session_id)
+            await self._invalidate_cache(session_id)
             
             return True
             
@@ -317,6 +323,7 @@ class SessionManager:
             
             # 更新索引
             await self._update_sessions_index(session)
+            await self._update_cache(session_id, session)
             
             return True
             
@@ -20,8 +20,24 @@ import aiohttp
 import geoip2.database
 import geoip2.errors
 
+from backend.core.resilience import Outcome, UpstreamGuard
+from backend.core.routing_engine import DecisionCache, DistanceTable, GeoIPCache, RuleIndex, haversine_km
+from backend.monitoring.prometheus_registry import metrics_registry
+
 logger = logging.getLogger(__name__)
 
+# Prometheus指标
+REGION_PROBE_LATENCY = metrics_registry.histogram(
+    "smart_routing_probe_seconds", "区域健康探测耗时（秒）", ("region",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+REGION_PROBE_FAILURES = metrics_registry.counter(
+    "smart_routing_probe_failures_total", "区域健康探测失败次数", ("region",)
+)
+ROUTING_DECISIONS = metrics_registry.counter(
+    "smart_routing_decisions_total", "路由决策次数", ("region",)
+)
+
 class RoutingStrategy(Enum):
     """路由策略"""
     GEOGRAPHIC = "geographic"      # 基于地理位置
@@ -30,6 +46,10 @@ class RoutingStrategy(Enum):
     COST_OPTIMIZED = "cost_optimized"  # 基于成本优化
     HYBRID = "hybrid"              # 混合策略
 
+# 依赖实时负载的策略，结果不进入决策缓存
+LOAD_DEPENDENT_STRATEGIES = frozenset((RoutingStrategy.LOAD_BALANCED, RoutingStrategy.HYBRID))
+LOAD_HEADROOM_RATIO = 0.8  # 连接数低于容量的80%才参与负载均衡或复用缓存结果
+
 class RegionStatus(Enum):
     """区域状态"""
     HEALTHY = "healthy"
@@ -85,10 +105,20 @@ class SmartRouter:
         self.rules: List[RoutingRule] = []
         self.metrics_history: Dict[str, List[RoutingMetrics]] = {}
         self.geoip_reader = None
+        self._background_tasks: List[asyncio.Task] = []
+        # 区域熔断与异常摘除（健康探测和实际请求结果共同驱动）
+        self.upstream_guard = UpstreamGuard()
 
         # 初始化配置
         self._load_config()
+        routing_config = self.config.get("routing", {})
+        self.decision_cache = DecisionCache(ttl=routing_config.get("decision_cache_ttl", 1.0))
         self._initialize_geoip()
+        self.geo_cache = GeoIPCache(
+            self._lookup_geo,
+            max_size=routing_config.get("geoip_cache_size", 65536),
+            ttl=routing_config.get("geoip_cache_ttl", 3600)
+        )
         self._initialize_endpoints()
         self._initialize_rules()
 
@@ -175,7 +205,10 @@ class SmartRouter:
                 "health_check_enabled": True,
                 "metrics_retention_days": 30,
                 "failover_enabled": True,
-                "failover_timeout": 10
+                "failover_timeout": 10,
+                "decision_cache_ttl": 1.0,
+                "geoip_cache_size": 65536,
+                "geoip_cache_ttl": 3600
             },
             "performance_thresholds": {
                 "max_response_time_ms": 500,
@@ -229,6 +262,10 @@ class SmartRouter:
             )
             self.endpoints[region_code] = endpoint
 
+        self.distance_table = DistanceTable({
+            region_code: endpoint.location for region_code, endpoint in self.endpoints.items()
+        })
+
     def _initialize_rules(self):
         """初始化路由规则"""
         default_rules = [
@@ -307,14 +344,35 @@ class SmartRouter:
             )
         ]
 
-        self.rules = sorted(default_rules, key=lambda x: x.priority)
+        self.set_rules(default_rules)
+
+    def set_rules(self, rules: List[RoutingRule]):
+        """替换路由规则并重新编译索引"""
+        self.rules = sorted(rules, key=lambda x: x.priority)
+        self.rule_index = RuleIndex(self.rules, self._has_region_with_status)
+        self.decision_cache.clear()
+
+    def _has_region_with_status(self, status: str) -> bool:
+        expected_status = RegionStatus(status)
+        for endpoint in self.endpoints.values():
+            if endpoint.status == expected_status:
+                return True
+        return False
 
     def _start_background_tasks(self):
-        """启动后台任务"""
+        """启动后台任务（没有运行中的事件循环时推迟到 get_smart_router）"""
+        if any(not task.done() for task in self._background_tasks):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        self._background_tasks = []
         if self.config["routing"]["health_check_enabled"]:
-            asyncio.create_task(self._health_check_loop())
+            self._background_tasks.append(loop.create_task(self._health_check_loop()))
 
-        asyncio.create_task(self._metrics_cleanup_loop())
+        self._background_tasks.append(loop.create_task(self._metrics_cleanup_loop()))
 
     async def route_request(self, client_ip: str = None,
                           user_agent: str = None,
@@ -323,25 +381,38 @@ class SmartRouter:
                           user_context: Dict[str, Any] = None) -> Optional[str]:
         """路由请求到最佳端点"""
         try:
-            # 获取客户端地理位置
-            geo_info = await self._get_geo_info(client_ip) if client_ip else None
+            # 获取客户端地理位置（按网段缓存）
+            geo_info = self.geo_cache.get(client_ip) if client_ip else None
 
-            # 评估路由规则
-            matching_rules = await self._evaluate_rules(
+            # 评估路由规则（编译后的规则索引）
+            matching_rules = self.rule_index.match(
                 geo_info, user_agent, request_path, headers, user_context
             )
 
-            # 根据规则确定路由
-            if matching_rules:
-                selected_endpoint = await self._apply_rules(matching_rules, geo_info, user_context)
-            else:
-                # 使用默认策略
-                selected_endpoint = await self._default_routing(geo_info, user_context)
+            # 相同规则集合和客户端位置在短时间内复用路由结果
+            decision_key = (
+                tuple(rule.rule_id for rule in matching_rules),
+                (geo_info.get("country"), geo_info.get("lat"), geo_info.get("lon")) if geo_info else None
+            )
+            # 负载均衡/混合策略按实时负载选择，每次重新计算，不复用缓存结果
+            cacheable = self._is_cacheable(matching_rules)
+            selected_endpoint = self.decision_cache.get(decision_key, self._is_selectable) if cacheable else None
+
+            if selected_endpoint is None:
+                # 根据规则确定路由
+                if matching_rules:
+                    selected_endpoint = await self._apply_rules(matching_rules, geo_info, user_context)
+                else:
+                    # 使用默认策略
+                    selected_endpoint = await self._default_routing(geo_info, user_context)
+                if selected_endpoint and cacheable:
+                    self.decision_cache.set(decision_key, selected_endpoint)
 
             if selected_endpoint:
                 # 更新负载信息
                 await self._update_load(selected_endpoint.region_code, "increment")
-                logger.info(f"Routed request to {selected_endpoint.region_code}")
+                ROUTING_DECISIONS.labels(selected_endpoint.region_code).inc()
+                logger.debug("Routed request to %s", selected_endpoint.region_code)
                 return selected_endpoint.endpoint_url
 
             return None
@@ -350,8 +421,26 @@ class SmartRouter:
             logger.error(f"Routing failed: {e}")
             return None
 
+    def _is_cacheable(self, rules: List[RoutingRule]) -> bool:
+        """路由结果是否与实时负载无关，可以短时间复用"""
+        if rules:
+            return not any(rule.strategy in LOAD_DEPENDENT_STRATEGIES for rule in rules)
+        return RoutingStrategy(self.config["routing"]["default_strategy"]) not in LOAD_DEPENDENT_STRATEGIES
+
+    def _is_selectable(self, endpoint: RegionEndpoint) -> bool:
+        """缓存的路由结果是否仍可使用：端点健康且负载未超过负载均衡的阈值"""
+        return (
+            endpoint.status == RegionStatus.HEALTHY
+            and self.endpoints.get(endpoint.region_code) is endpoint
+            and endpoint.current_load["connections"] < endpoint.capacity["max_connections"] * LOAD_HEADROOM_RATIO
+        )
+
     async def _get_geo_info(self, ip_address: str) -> Optional[Dict[str, Any]]:
         """获取IP地理位置信息"""
+        return self.geo_cache.get(ip_address)
+
+    def _lookup_geo(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """查询GeoIP数据库（只在网段缓存未命中时调用）"""
         try:
             if not self.geoip_reader:
                 return None
@@ -384,61 +473,7 @@ class SmartRouter:
                             headers: Dict[str, str] = None,
                             user_context: Dict[str, Any] = None) -> List[RoutingRule]:
         """评估路由规则"""
-        matching_rules = []
-
-        for rule in self.rules:
-            if not rule.enabled:
-                continue
-
-            # 检查规则条件
-            conditions_met = await self._check_rule_conditions(
-                rule.conditions, geo_info, user_agent, request_path, headers, user_context
-            )
-
-            if conditions_met:
-                matching_rules.append(rule)
-
-        return matching_rules
-
-    async def _check_rule_conditions(self, conditions: List[Dict[str, Any]],
-                                   geo_info: Dict[str, Any] = None,
-                                   user_agent: str = None,
-                                   request_path: str = None,
-                                   headers: Dict[str, str] = None,
-                                   user_context: Dict[str, Any] = None) -> bool:
-        """检查规则条件"""
-        for condition in conditions:
-            condition_type = condition["type"]
-            operator = condition["operator"]
-            expected_value = condition.get("value")
-            expected_values = condition.get("values", [])
-
-            if condition_type == "geo_location":
-                if not geo_info or geo_info.get("country") not in expected_values:
-                    return False
-
-            elif condition_type == "health_status":
-                expected_status = RegionStatus(expected_value)
-                healthy_regions = [
-                    region for region, endpoint in self.endpoints.items()
-                    if endpoint.status == expected_status
-                ]
-                if not healthy_regions:
-                    return False
-
-            elif condition_type == "performance_tier":
-                user_tier = user_context.get("performance_tier") if user_context else None
-                if user_tier != expected_value:
-                    return False
-
-            elif condition_type == "user_tier":
-                user_tier = user_context.get("tier") if user_context else None
-                if user_tier != expected_value:
-                    return False
-
-            # 可以添加更多条件类型...
-
-        return True
+        return self.rule_index.match(geo_info, user_agent, request_path, headers, user_context)
 
     async def _apply_rules(self, rules: List[RoutingRule],
                          geo_info: Dict[str, Any] = None,
@@ -580,7 +615,7 @@ class SmartRouter:
                 ) * 100
 
                 # 权重 inversely proportional to load
-                if load_percentage < 80:  # 只考虑负载低于80%的端点
+                if load_percentage < LOAD_HEADROOM_RATIO * 100:  # 只考虑负载低于80%的端点
                     weight = max(1, 100 - int(load_percentage))
                     weighted_endpoints.append((endpoint, weight))
 
@@ -637,9 +672,8 @@ class SmartRouter:
 
                 # 地理位置得分
                 if geo_info and strategy_type == "geographic":
-                    distance = self._calculate_distance(
-                        geo_info.get("lat", 0), geo_info.get("lon", 0),
-                        endpoint.location["lat"], endpoint.location["lon"]
+                    distance = self.distance_table.distance(
+                        geo_info.get("lat") or 0, geo_info.get("lon") or 0, endpoint.region_code
                     )
                     geo_score = max(0, 100 - distance / 100)  # 距离越近得分越高
                     score += geo_score * 0.4
@@ -703,18 +737,7 @@ class SmartRouter:
     def _calculate_distance(self, lat1: float, lon1: float,
                           lat2: float, lon2: float) -> float:
         """计算两点之间的距离（公里）"""
-        from math import radians, cos, sin, asin, sqrt
-
-        # 转换为弧度
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-
-        # haversine公式
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        r = 6371  # 地球半径（公里）
-        return c * r
+        return haversine_km(lat1, lon1, lat2, lon2)
 
     async def _update_load(self, region_code: str, action: str):
         """更新负载信息"""
@@ -729,6 +752,35 @@ class SmartRouter:
         except Exception as e:
             logger.error(f"Failed to update load: {e}")
 
+    async def report_request_result(self, region_code: str, success: bool,
+                                    status_code: Optional[int] = None, timed_out: bool = False):
+        """上报路由后实际请求的结果
+
+        连续5xx/超时的区域被临时摘除，失败率过高时熔断，之后由健康探测半开恢复。
+        """
+        if timed_out:
+            outcome = Outcome.TIMEOUT
+        elif success:
+            outcome = Outcome.SUCCESS
+        elif status_code == 429:
+            outcome = Outcome.OVERLOAD
+        elif status_code is not None and status_code < 500:
+            outcome = Outcome.IGNORED
+        else:
+            outcome = Outcome.ERROR
+
+        self.upstream_guard.record(region_code, outcome)
+        await self._update_load(region_code, "decrement")
+        self._sync_upstream_state(region_code)
+
+    def _sync_upstream_state(self, region_code: str):
+        """熔断或被摘除的区域标记为不健康，不参与路由"""
+        endpoint = self.endpoints.get(region_code)
+        if (endpoint and endpoint.status != RegionStatus.MAINTENANCE and
+                not self.upstream_guard.is_routable(region_code)):
+            endpoint.status = RegionStatus.UNHEALTHY
+            endpoint.health_score = 0
+
     async def _health_check_loop(self):
         """健康检查循环"""
         while True:
@@ -762,6 +814,9 @@ class SmartRouter:
 
                         # 记录指标
                         await self._record_metrics(region_code, response_time, 1.0 if response.status == 200 else 0.0)
+                        self.upstream_guard.record(
+                            region_code, Outcome.SUCCESS if response.status == 200 else Outcome.ERROR
+                        )
 
             except Exception as e:
                 logger.warning(f"Health check failed for {region_code}: {e}")
@@ -769,6 +824,11 @@ class SmartRouter:
                 endpoint.health_score = 0
                 endpoint.latency_ms = 9999
                 await self._record_metrics(region_code, 9999, 0.0)
+                self.upstream_guard.record(
+                    region_code, Outcome.TIMEOUT if isinstance(e, asyncio.TimeoutError) else Outcome.ERROR
+                )
+
+            self._sync_upstream_state(region_code)
 
     async def _record_metrics(self, region_code: str, response_time_ms: float,
                             success_rate: float):
@@ -789,6 +849,10 @@ class SmartRouter:
 
             self.metrics_history[region_code].append(metric)
 
+            REGION_PROBE_LATENCY.labels(region_code).observe(response_time_ms / 1000)
+            if success_rate < 1.0:
+                REGION_PROBE_FAILURES.labels(region_code).inc()
+
             # 限制历史记录数量
             max_records = 1000
             if len(self.metrics_history[region_code]) > max_records:
@@ -830,6 +894,7 @@ class SmartRouter:
 
             total_requests = 0
             total_successes = 0
+            upstreams = self.upstream_guard.get_stats()["upstreams"]
 
             for region_code, endpoint in self.endpoints.items():
                 endpoint_stats = {
@@ -840,6 +905,9 @@ class SmartRouter:
                     "capacity": endpoint.capacity,
                     "cost_per_request": endpoint.cost_per_request
                 }
+                if region_code in upstreams:
+                    endpoint_stats["circuit"] = upstreams[region_code]["circuit"]
+                    endpoint_stats["outlier"] = upstreams[region_code]["outlier"]
 
                 # 计算最近的统计
                 if region_code in self.metrics_history:
@@ -863,6 +931,8 @@ class SmartRouter:
             stats["total_requests"] = total_requests
             if total_requests > 0:
                 stats["overall_success_rate"] = total_successes / total_requests
+            stats["geoip_cache"] = self.geo_cache.get_stats()
+            stats["decision_cache"] = self.decision_cache.get_stats()
 
             return stats
 
@@ -873,6 +943,8 @@ class SmartRouter:
     async def close(self):
         """关闭路由器"""
         try:
+            for task in self._background_tasks:
+                task.cancel()
             if self.geoip_reader:
                 self.geoip_reader.close()
             logger.info("Smart router closed")
@@ -884,4 +956,62 @@ smart_router = SmartRouter()
 
 async def get_smart_router() -> SmartRouter:
     """获取智能路由器实例"""
-    return smart_router
\ No newline at end of file
+    smart_router._start_background_tasks()
+    return smart_router
+
+
+def benchmark_smart_router(requests: int = 50000, prefixes: int = 500,
+                           config_path: str = "/tmp/smart_routing_benchmark.json") -> Dict[str, Any]:
+    """路由决策开销基准：冷缓存与热缓存下每次route_request的耗时（微秒）"""
+    import random
+
+    router = SmartRouter(config_path)
+    countries = ["US", "CA", "DE", "FR", "SG", "JP", "BR", "ZA"]
+
+    def fake_lookup(ip_address: str) -> Dict[str, Any]:
+        index = hash(ip_address.rpartition('.')[0]) % len(countries)
+        return {"country": countries[index], "city": "Bench", "lat": index * 7.5, "lon": index * 20.0}
+
+    router.geo_cache.lookup = fake_lookup
+    rng = random.Random(7)
+    ips = [
+        f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+        for _ in range(prefixes)
+    ]
+    contexts = [{"tier": "free"}, {"performance_tier": "premium"}, {}]
+    workload = [
+        (f"{rng.choice(ips)}.{rng.randint(1, 254)}", f"/api/v1/{rng.choice(['chat', 'models', 'files'])}",
+         rng.choice(contexts))
+        for _ in range(requests)
+    ]
+
+    async def run() -> float:
+        start = time.perf_counter()
+        for client_ip, path, context in workload:
+            await router.route_request(client_ip=client_ip, request_path=path, user_context=context)
+        return (time.perf_counter() - start) / len(workload) * 1e6
+
+    async def measure() -> Dict[str, float]:
+        router.decision_cache.ttl = 0
+        router.geo_cache.ttl = 0
+        uncached = await run()
+        router.decision_cache.ttl = 60
+        router.geo_cache.ttl = 3600
+        await run()
+        cached = await run()
+        return {"uncached_us": round(uncached, 2), "cached_us": round(cached, 2)}
+
+    result = asyncio.run(measure())
+    for endpoint in router.endpoints.values():
+        endpoint.current_load["connections"] = 0
+    return {
+        "requests": requests,
+        "prefixes": prefixes,
+        "route_request": result,
+        "geoip_cache": router.geo_cache.get_stats(),
+        "decision_cache": router.decision_cache.get_stats()
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_smart_router(), indent=2))
\ No newline at end of file
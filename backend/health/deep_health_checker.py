@@ -18,15 +18,29 @@ from enum import Enum
 import logging
 import subprocess
 import threading
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 from backend.config.settings import get_settings
 from backend.database import get_db
+from backend.health.probe_cache import ProbeCache
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+def _timed_query(sql: str) -> float:
+    """在工作线程中执行同步查询，返回耗时"""
+    session_gen = get_db()
+    db = next(session_gen)
+    try:
+        start_time = time.time()
+        db.execute(sql).fetchone()
+        return time.time() - start_time
+    finally:
+        session_gen.close()
+
+
 class HealthStatus(Enum):
     """健康状态"""
     HEALTHY = "healthy"
@@ -135,6 +149,10 @@ class ComponentHealth:
         if self.metrics is None:
             self.metrics = {}
 
+    @property
+    def is_healthy(self) -> bool:
+        return self.status in [HealthStatus.HEALTHY, HealthStatus.DEGRADED]
+
     @property
     def success_rate(self) -> float:
         if self.total_checks == 0:
@@ -242,14 +260,8 @@ class HealthCheckExecutor:
     async def _check_database_connection(self) -> HealthCheckResult:
         """检查数据库连接"""
         try:
-            db = next(get_db())
-            start_time = time.time()
-
-            # 执行简单查询
-            result = db.execute("SELECT 1 as test")
-            result.fetchone()
-
-            response_time = time.time() - start_time
+            # 同步驱动放到线程中执行，超时不会阻塞事件循环
+            response_time = await asyncio.to_thread(_timed_query, "SELECT 1 as test")
 
             # 检查连接池状态
             pool_info = {
@@ -289,17 +301,18 @@ class HealthCheckExecutor:
                     timestamp=datetime.utcnow()
                 )
 
-            redis_client = redis.from_url(settings.redis_url)
-            start_time = time.time()
-
-            # 执行ping命令
-            result = redis_client.ping()
+            def ping():
+                redis_client = redis.from_url(settings.redis_url, socket_timeout=3)
+                start_time = time.time()
+                # 执行ping命令
+                ok = redis_client.ping()
+                elapsed = time.time() - start_time
+                # 获取Redis信息
+                return ok, elapsed, redis_client.info() if ok else {}
 
-            response_time = time.time() - start_time
+            result, response_time, info = await asyncio.to_thread(ping)
 
             if result:
-                # 获取Redis信息
-                info = redis_client.info()
 
                 return HealthCheckResult(
                     check_id="redis_connection",
@@ -435,7 +448,7 @@ class HealthCheckExecutor:
     async def _check_cpu_usage(self) -> HealthCheckResult:
         """检查CPU使用"""
         try:
-            cpu_percent = psutil.cpu_percent(interval=1)
+            cpu_percent = await asyncio.to_thread(psutil.cpu_percent, 1)
             load_avg = psutil.getloadavg()
 
             # 确定状态
@@ -482,7 +495,7 @@ class HealthCheckExecutor:
         try:
             # 检查DNS解析
             start_time = time.time()
-            socket.gethostbyname('google.com')
+            await asyncio.get_running_loop().getaddrinfo('google.com', 80)
             dns_time = time.time() - start_time
 
             # 检查外部连接
@@ -713,9 +726,8 @@ class HealthCheckExecutor:
 
             # 检查常用域名的SSL证书
             domains = ['google.com', 'github.com']
-            cert_results = {}
 
-            for domain in domains:
+            def inspect(domain: str) -> Dict[str, Any]:
                 try:
                     context = ssl.create_default_context()
                     with socket.create_connection((domain, 443), timeout=5) as sock:
@@ -727,16 +739,19 @@ class HealthCheckExecutor:
                                 expiry_date = datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z')
                                 days_until_expiry = (expiry_date - datetime.utcnow()).days
 
-                                cert_results[domain] = {
+                                return {
                                     "status": "OK",
                                     "expiry_date": expiry_date.isoformat(),
                                     "days_until_expiry": days_until_expiry,
                                     "issuer": cert.get('issuer', [{}])[0].get('organizationName', 'Unknown')
                                 }
-                            else:
-                                cert_results[domain] = {"status": "NO_CERT"}
+                            return {"status": "NO_CERT"}
                 except Exception as e:
-                    cert_results[domain] = {"status": "ERROR", "error": str(e)}
+                    return {"status": "ERROR", "error": str(e)}
+
+            # 各域名并发检查，握手在线程中进行
+            inspected = await asyncio.gather(*(asyncio.to_thread(inspect, domain) for domain in domains))
+            cert_results = dict(zip(domains, inspected))
 
             # 检查是否有即将过期的证书
             min_days = min([r.get("days_until_expiry", 999) for r in cert_results.values() if "days_until_expiry" in r], default=999)
@@ -908,27 +923,30 @@ class HealthCheckExecutor:
                     timestamp=datetime.utcnow()
                 )
 
-            redis_client = redis.from_url(settings.redis_url)
-
             # 测试缓存性能
             test_key = "health_check_cache_test"
             test_value = f"test_value_{int(time.time())}"
 
-            # 测试写入性能
-            start_time = time.time()
-            redis_client.set(test_key, test_value, ex=60)
-            write_time = time.time() - start_time
+            def measure():
+                redis_client = redis.from_url(settings.redis_url, socket_timeout=3)
 
-            # 测试读取性能
-            start_time = time.time()
-            retrieved_value = redis_client.get(test_key)
-            read_time = time.time() - start_time
+                # 测试写入性能
+                start_time = time.time()
+                redis_client.set(test_key, test_value, ex=60)
+                write_time = time.time() - start_time
+
+                # 测试读取性能
+                start_time = time.time()
+                retrieved_value = redis_client.get(test_key)
+                read_time = time.time() - start_time
 
-            # 清理
-            redis_client.delete(test_key)
+                # 清理
+                redis_client.delete(test_key)
 
-            # 获取Redis信息
-            info = redis_client.info()
+                # 获取Redis信息
+                return write_time, read_time, retrieved_value, redis_client.info()
+
+            write_time, read_time, retrieved_value, info = await asyncio.to_thread(measure)
             hit_rate = info.get("keyspace_hits", 0) / max(info.get("keyspace_hits", 0) + info.get("keyspace_misses", 0), 1) * 100
 
             # 确定状态
@@ -973,13 +991,8 @@ class HealthCheckExecutor:
     async def _check_database_performance(self) -> HealthCheckResult:
         """检查数据库性能"""
         try:
-            db = next(get_db())
-
             # 测试查询性能
-            start_time = time.time()
-            result = db.execute("SELECT COUNT(*) FROM sqlite_master")
-            result.fetchone()
-            query_time = time.time() - start_time
+            query_time = await asyncio.to_thread(_timed_query, "SELECT COUNT(*) FROM sqlite_master")
 
             # 测试连接池
             pool_status = {
@@ -1027,8 +1040,10 @@ class DeepHealthChecker:
         self.executor = HealthCheckExecutor()
         self.health_checks: Dict[str, HealthCheck] = {}
         self.component_health: Dict[str, ComponentHealth] = {}
-        self.check_history: List[HealthCheckResult] = []
         self.max_history = 10000
+        self.check_history: deque = deque(maxlen=self.max_history)
+        # 每项检查按自身interval缓存，频繁调用的API只读缓存
+        self.probes = ProbeCache()
         self._register_default_checks()
 
     def _register_default_checks(self):
@@ -1181,22 +1196,20 @@ class DeepHealthChecker:
         ]
 
         for check in default_checks:
-            self.health_checks[check.check_id] = check
-            self.component_health[check.check_id] = ComponentHealth(
-                component_id=check.check_id,
-                name=check.name,
-                status=HealthStatus.UNKNOWN,
-                last_check=datetime.utcnow(),
-                uptime_percentage=0.0,
-                total_checks=0,
-                successful_checks=0,
-                failed_checks=0,
-                avg_response_time=0.0,
-                dependencies=check.dependencies
-            )
-
-    async def run_check(self, check_id: str) -> Optional[HealthCheckResult]:
-        """运行单个健康检查"""
+            self.add_health_check(check)
+
+    def _register_probe(self, health_check: HealthCheck):
+        """注册到探针缓存；超时由执行器按检查配置处理"""
+        check_id = health_check.check_id
+        self.probes.register(
+            check_id,
+            lambda: self._execute_and_record(check_id),
+            ttl=health_check.interval,
+            timeout=None
+        )
+
+    async def run_check(self, check_id: str, force: bool = False) -> Optional[HealthCheckResult]:
+        """运行单个健康检查（检查间隔内返回缓存结果，force时重新执行）"""
         health_check = self.health_checks.get(check_id)
         if not health_check:
             logger.error(f"Health check not found: {check_id}")
@@ -1206,6 +1219,12 @@ class DeepHealthChecker:
             logger.debug(f"Health check disabled: {check_id}")
             return None
 
+        return await self.probes.get(check_id, force=force)
+
+    async def _execute_and_record(self, check_id: str) -> HealthCheckResult:
+        """执行检查并更新组件状态和历史"""
+        health_check = self.health_checks[check_id]
+
         # 检查依赖
         for dependency in health_check.dependencies:
             dep_health = self.component_health.get(dependency)
@@ -1227,29 +1246,39 @@ class DeepHealthChecker:
 
         # 记录历史
         self.check_history.append(result)
-        if len(self.check_history) > self.max_history:
-            self.check_history = self.check_history[-self.max_history:]
 
         return result
 
-    async def run_all_checks(self, check_type: Optional[CheckType] = None) -> Dict[str, HealthCheckResult]:
-        """运行所有健康检查"""
+    async def run_all_checks(self, check_type: Optional[CheckType] = None,
+                             force: bool = False) -> Dict[str, HealthCheckResult]:
+        """运行所有健康检查
+
+        无依赖关系的检查并发执行；依赖其他检查的项在其依赖完成后的下一批执行，
+        整体耗时约为各批次中最慢检查的超时之和。
+        """
         results = {}
 
         # 过滤检查类型
-        checks_to_run = self.health_checks.values()
+        checks_to_run = [c for c in self.health_checks.values() if c.enabled]
         if check_type:
             checks_to_run = [c for c in checks_to_run if c.check_type == check_type]
 
-        # 并发执行检查
-        tasks = []
-        for health_check in checks_to_run:
-            if health_check.enabled:
-                task = asyncio.create_task(self.run_check(health_check.check_id))
-                tasks.append(task)
-
-        if tasks:
-            check_results = await asyncio.gather(*tasks, return_exceptions=True)
+        pending = {c.check_id: c for c in checks_to_run}
+        while pending:
+            wave = [
+                check_id for check_id, check in pending.items()
+                if not any(dep in pending for dep in check.dependencies)
+            ]
+            if not wave:
+                # 循环依赖：剩余检查一起执行
+                wave = list(pending)
+            for check_id in wave:
+                del pending[check_id]
+
+            check_results = await asyncio.gather(
+                *(self.run_check(check_id, force=force) for check_id in wave),
+                return_exceptions=True
+            )
 
             for result in check_results:
                 if isinstance(result, Exception):
@@ -1351,7 +1380,7 @@ class DeepHealthChecker:
         """获取健康检查历史"""
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
 
-        history = self.check_history
+        history = list(self.check_history)
         if check_id:
             history = [h for h in history if h.check_id == check_id]
 
@@ -1367,6 +1396,7 @@ class DeepHealthChecker:
     def add_health_check(self, health_check: HealthCheck):
         """添加健康检查"""
         self.health_checks[health_check.check_id] = health_check
+        self._register_probe(health_check)
 
         # 初始化组件健康状态
         if health_check.check_id not in self.component_health:
@@ -1389,6 +1419,7 @@ class DeepHealthChecker:
             del self.health_checks[check_id]
         if check_id in self.component_health:
             del self.component_health[check_id]
+        self.probes.unregister(check_id)
         return True
 
     def enable_check(self, check_id: str, enabled: bool = True):
@@ -1397,38 +1428,15 @@ class DeepHealthChecker:
             self.health_checks[check_id].enabled = enabled
 
     async def start_continuous_monitoring(self):
-        """启动持续监控"""
+        """启动持续监控：每项检查按自身interval在后台刷新"""
         logger.info("Starting continuous health monitoring...")
-
-        async def monitoring_loop():
-            while True:
-                try:
-                    # 运行所有基础检查
-                    await self.run_all_checks(CheckType.BASIC)
-
-                    # 等待下一次检查
-                    await asyncio.sleep(60)  # 每分钟检查一次基础健康
-
-                except Exception as e:
-                    logger.error(f"Health monitoring loop error: {e}")
-                    await asyncio.sleep(60)
-
-        asyncio.create_task(monitoring_loop())
-
-        # 启动深度检查（每15分钟）
-        async def deep_check_loop():
-            while True:
-                try:
-                    await self.run_all_checks(CheckType.DEEP)
-                    await asyncio.sleep(900)  # 每15分钟
-                except Exception as e:
-                    logger.error(f"Deep health check loop error: {e}")
-                    await asyncio.sleep(900)
-
-        asyncio.create_task(deep_check_loop())
-
+        self.probes.start()
         logger.info("Continuous health monitoring started")
 
+    async def stop_continuous_monitoring(self):
+        """停止持续监控"""
+        await self.probes.stop()
+
 
 # 全局深��健康检查器
 deep_health_checker = DeepHealthChecker()
@@ -0,0 +1,231 @@
+"""
+健康探针缓存
+统一的探针执行层：并发执行、单探针超时、按探针TTL缓存、过期后后台刷新
+
+负载均衡器高频探测 /health 时只读取缓存结果，不会放大为对数据库、Redis和外部HTTP的请求。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ProbeFunc = Callable[[], Awaitable[Any]]
+ErrorFactory = Callable[[str, BaseException], Any]
+
+_PROCESS_STARTED = time.time()
+_DEFAULT = object()
+
+
+def default_error_result(name: str, error: BaseException) -> Dict[str, Any]:
+    """探针失败或超时时的默认结果"""
+    if isinstance(error, asyncio.TimeoutError):
+        message = "Probe timed out"
+    else:
+        message = f"Probe failed: {error}"
+    return {"name": name, "status": "unhealthy", "error": message}
+
+
+class _ProbeEntry:
+    """单个探针的配置与缓存状态"""
+
+    __slots__ = ('name', 'probe', 'ttl', 'timeout', 'max_stale', 'on_error',
+                 'result', 'checked_at', 'task')
+
+    def __init__(self, name: str, probe: ProbeFunc, ttl: float, timeout: Optional[float],
+                 max_stale: float, on_error: ErrorFactory):
+        self.name = name
+        self.probe = probe
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_stale = max_stale
+        self.on_error = on_error
+        self.result: Any = None
+        self.checked_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def age(self, now: float) -> float:
+        return float('inf') if self.checked_at is None else now - self.checked_at
+
+
+class ProbeCache:
+    """带TTL的健康探针缓存
+
+    - 新鲜结果直接返回
+    - 过期但未超过max_stale时返回旧结果，并在后台刷新（stale-while-revalidate）
+    - 无结果或过期太久时等待刷新；同一探针的并发请求共享一次执行
+    """
+
+    def __init__(self, default_ttl: float = 30.0, default_timeout: Optional[float] = 5.0,
+                 stale_factor: float = 4.0, refresh_ahead: float = 0.8):
+        self.default_ttl = default_ttl
+        self.default_timeout = default_timeout
+        self.stale_factor = stale_factor
+        self.refresh_ahead = refresh_ahead
+        self._entries: Dict[str, _ProbeEntry] = {}
+        self._refresher: Optional[asyncio.Task] = None
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "executions": 0,
+            "timeouts": 0,
+            "errors": 0
+        }
+
+    def register(self, name: str, probe: ProbeFunc, ttl: Optional[float] = None,
+                 timeout: Any = _DEFAULT, on_error: Optional[ErrorFactory] = None,
+                 max_stale: Optional[float] = None):
+        """注册探针；timeout为None表示不设外层超时（探针自行处理）"""
+        ttl = self.default_ttl if ttl is None else ttl
+        self._entries[name] = _ProbeEntry(
+            name=name,
+            probe=probe,
+            ttl=ttl,
+            timeout=self.default_timeout if timeout is _DEFAULT else timeout,
+            max_stale=ttl * self.stale_factor if max_stale is None else max_stale,
+            on_error=on_error or default_error_result
+        )
+
+    def unregister(self, name: str):
+        """移除探针"""
+        entry = self._entries.pop(name, None)
+        if entry is not None and entry.task is not None and not entry.task.done():
+            entry.task.cancel()
+
+    def names(self):
+        return list(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def peek(self, name: str) -> Tuple[Any, Optional[float]]:
+        """只读缓存：返回 (结果, 距上次检查秒数)，不触发任何探测"""
+        entry = self._entries.get(name)
+        if entry is None or entry.checked_at is None:
+            return None, None
+        return entry.result, time.monotonic() - entry.checked_at
+
+    def snapshot(self) -> Dict[str, Any]:
+        """所有已有缓存结果，不触发任何探测"""
+        return {name: entry.result for name, entry in self._entries.items() if entry.checked_at is not None}
+
+    async def get(self, name: str, force: bool = False) -> Any:
+        """获取探针结果"""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(name)
+
+        if not force:
+            age = entry.age(time.monotonic())
+            if age < entry.ttl:
+                self.stats["hits"] += 1
+                return entry.result
+            if age < entry.max_stale:
+                self.stats["stale_hits"] += 1
+                self._schedule(entry)
+                return entry.result
+
+        self.stats["misses"] += 1
+        # shield：单个调用方被取消时不影响其他等待同一次执行的调用方
+        return await asyncio.shield(self._schedule(entry))
+
+    async def get_many(self, names: Optional[Iterable[str]] = None, force: bool = False) -> Dict[str, Any]:
+        """并发获取多个探针结果，总耗时受最慢探针的超时约束"""
+        names = list(self._entries) if names is None else [n for n in names if n in self._entries]
+        results = await asyncio.gather(*(self.get(name, force) for name in names))
+        return dict(zip(names, results))
+
+    async def refresh(self, name: str) -> Any:
+        """强制刷新单个探针"""
+        return await self.get(name, force=True)
+
+    def _schedule(self, entry: _ProbeEntry) -> asyncio.Task:
+        if entry.task is None or entry.task.done():
+            entry.task = asyncio.get_running_loop().create_task(self._execute(entry))
+        return entry.task
+
+    async def _execute(self, entry: _ProbeEntry) -> Any:
+        self.stats["executions"] += 1
+        try:
+            if entry.timeout is None:
+                result = await entry.probe()
+            else:
+                result = await asyncio.wait_for(entry.probe(), timeout=entry.timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError as e:
+            self.stats["timeouts"] += 1
+            logger.warning(f"Health probe {entry.name} timed out after {entry.timeout}s")
+            result = entry.on_error(entry.name, e)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Health probe {entry.name} failed: {e}")
+            result = entry.on_error(entry.name, e)
+
+        entry.result = result
+        entry.checked_at = time.monotonic()
+        return result
+
+    async def _refresh_loop(self, tick: float):
+        while True:
+            try:
+                now = time.monotonic()
+                for entry in list(self._entries.values()):
+                    # 提前刷新，保证请求路径上总是命中新鲜结果
+                    if entry.age(now) >= entry.ttl * self.refresh_ahead:
+                        self._schedule(entry)
+                await asyncio.sleep(tick)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Health probe refresh loop error: {e}")
+                await asyncio.sleep(tick)
+
+    def start(self, tick: float = 1.0):
+        """启动后台刷新"""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop(tick))
+
+    async def stop(self):
+        """停止后台刷新并取消进行中的探针"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        pending = [entry.task for entry in self._entries.values() if entry.task is not None and not entry.task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    @property
+    def is_running(self) -> bool:
+        return self._refresher is not None and not self._refresher.done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存命中与执行统计"""
+        now = time.monotonic()
+        return {
+            **self.stats,
+            "probes": {
+                name: {
+                    "ttl": entry.ttl,
+                    "timeout": entry.timeout,
+                    "age_seconds": None if entry.checked_at is None else round(now - entry.checked_at, 3),
+                    "in_flight": entry.task is not None and not entry.task.done()
+                }
+                for name, entry in self._entries.items()
+            },
+            "background_refresh": self.is_running
+        }
+
+
+def liveness() -> Dict[str, Any]:
+    """存活检查：只说明进程和事件循环可响应，不访问任何依赖"""
+    return {
+        "status": "alive",
+        "uptime_seconds": round(time.time() - _PROCESS_STARTED, 3)
+    }
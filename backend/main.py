@@ -2,6 +2,7 @@
 AI Hub Platform - Main Application Entry Point
 """
 
+import asyncio
 import os
 import sys
 from pathlib import Path
@@ -11,14 +12,26 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from backend.api.v1.router import api_router
 from backend.config.settings import get_settings
 from backend.middleware.error_handler import ErrorHandlingMiddleware, PerformanceMiddleware, setup_error_handlers
 from backend.middleware.api_key_auth import APIKeyAuthMiddleware
+from backend.middleware.db_session import DatabaseSessionMiddleware
+from backend.middleware.performance_middleware import PerformanceOptimizationMiddleware
 from backend.core.ha.middleware import HAMiddleware, LoadBalancingMiddleware, HealthCheckMiddleware
 from backend.core.ha.setup import HAConfig, LoadBalancingConfig, HealthCheckConfig, FailoverConfig, ClusterConfig
+from backend.core.cache_invalidation import start_invalidation_bus, stop_invalidation_bus
+from backend.core.cache.cache_warmup import start_warmup_manager, stop_warmup_manager
+from backend.monitoring.distributed_tracing import distributed_tracing
+from backend.monitoring.prometheus_registry import CONTENT_TYPE_LATEST, metrics_registry
+from backend.core.logging.advanced_logging import advanced_log_manager
+from backend.core.logging.async_pipeline import setup_async_logging, shutdown_async_logging
+from backend.core.health_service import health_service
+from backend.core.database import get_engine_registry, get_sync_engine
+from backend.optimization.query_optimizer import get_query_optimizer
 
 # Get settings instance
 settings = get_settings()
@@ -82,9 +95,20 @@ if settings.environment == "production":
 app.add_middleware(PerformanceMiddleware)
 app.add_middleware(ErrorHandlingMiddleware)
 
+# Response compression and request metrics (pure ASGI, streams compressed incrementally)
+app.add_middleware(
+    PerformanceOptimizationMiddleware,
+    enable_compression=settings.enable_response_compression,
+    min_compression_size=settings.compression_min_size,
+    compression_offload_threshold=settings.compression_offload_kb * 1024
+)
+
 # API Key authentication middleware (added after error handling)
 app.add_middleware(APIKeyAuthMiddleware)
 
+# Request-scoped database sessions (outside API key auth so middlewares and endpoints share sessions)
+app.add_middleware(DatabaseSessionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -105,6 +129,117 @@ setup_error_handlers(app)
 app.include_router(api_router, prefix="/api/v1", tags=["api"])
 
 
+@app.on_event("startup")
+async def startup_cache_invalidation():
+    """启动跨worker缓存失效总线"""
+    if settings.cache_invalidation_bus_enabled:
+        await start_invalidation_bus()
+
+
+@app.on_event("shutdown")
+async def shutdown_cache_invalidation():
+    """停止跨worker缓存失效总线"""
+    await stop_invalidation_bus()
+
+
+@app.on_event("startup")
+async def startup_cache_warmup():
+    """订阅缓存访问并启动预测性预热"""
+    if settings.cache_warmup_enabled:
+        await start_warmup_manager()
+
+
+@app.on_event("shutdown")
+async def shutdown_cache_warmup():
+    """停止缓存预热调度"""
+    await stop_warmup_manager()
+
+
+@app.on_event("startup")
+async def startup_tracing():
+    """启动追踪清理与批量导出任务"""
+    distributed_tracing.start_background_tasks()
+
+
+@app.on_event("shutdown")
+async def shutdown_tracing():
+    """刷新未导出的追踪数据"""
+    await distributed_tracing.shutdown()
+
+
+@app.on_event("startup")
+async def startup_metrics_snapshot():
+    """多worker部署时定期写入指标快照"""
+    metrics_registry.start_snapshot_task(settings.metrics_snapshot_interval)
+
+
+@app.on_event("shutdown")
+async def shutdown_metrics_snapshot():
+    """写入最后一次指标快照"""
+    await metrics_registry.stop_snapshot_task()
+
+
+@app.on_event("startup")
+async def startup_async_logging():
+    """安装异步日志管道，请求路径上不再同步写日志"""
+    setup_async_logging()
+
+
+@app.on_event("shutdown")
+async def shutdown_logging_pipeline():
+    """写完队列中剩余日志后停止写线程"""
+    await asyncio.to_thread(shutdown_async_logging)
+
+
+@app.on_event("startup")
+async def startup_log_parser_worker():
+    """启动独立进程日志解析"""
+    if settings.log_parser_worker_enabled:
+        await advanced_log_manager.start_parser_worker()
+
+
+@app.on_event("shutdown")
+async def shutdown_log_parser_worker():
+    """处理完排队日志后停止解析进程"""
+    await advanced_log_manager.stop_parser_worker()
+
+
+@app.on_event("startup")
+async def startup_health_probes():
+    """后台刷新依赖健康探针，/health 请求只读缓存"""
+    if settings.health_probe_refresh_enabled:
+        health_service.probes.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_health_probes():
+    """停止健康探针刷新并关闭HTTP会话"""
+    await health_service.cleanup()
+
+
+@app.on_event("startup")
+async def startup_query_instrumentation():
+    """请求内重复语句（疑似N+1查询）汇总到查询优化器报告，语句耗时记入索引顾问的工作负载"""
+    optimizer = get_query_optimizer(engine=get_sync_engine())
+    optimizer.enable_n_plus_one_detection()
+    optimizer.enable_workload_capture()
+
+
+@app.on_event("shutdown")
+async def shutdown_database_engines():
+    """关闭共享数据库引擎和连接池"""
+    await get_engine_registry().dispose_all()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus指标抓取端点（合并所有worker）"""
+    if not settings.enable_metrics:
+        return Response(status_code=404)
+    body = await asyncio.to_thread(metrics_registry.render)
+    return Response(body, media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/")
 async def root():
     """根路径，返回API基本信息"""
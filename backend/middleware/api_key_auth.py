@@ -10,7 +10,7 @@ from starlette.responses import Response
 import logging
 
 from datetime import datetime
-from backend.database import get_db
+from backend.core.database import request_db
 from backend.services.developer_api_service import DeveloperAPIService
 from backend.models.developer import DeveloperAPIKey
 
@@ -69,41 +69,40 @@ class APIKeyAuthMiddleware(BaseHTTPMiddleware):
 
             # 验证API密钥有效性
             try:
-                # 这里需要获取数据库连接来验证API密钥
-                # 由于中间件中无法直接使用Depends，我们需要手动处理
-                db = next(get_db())
-                api_service = DeveloperAPIService(db)
-
-                api_key_obj = await api_service.validate_api_key(api_key)
-                if not api_key_obj:
-                    logger.warning(f"Invalid API key: {api_key[:8]}... for path: {path}")
-                    return Response(
-                        content='{"error": "Invalid API key", "message": "The provided API key is invalid or expired"}',
-                        status_code=401,
-                        media_type="application/json"
-                    )
-
-                # 检查API密钥权限
-                if not await self._check_api_key_permissions(api_key_obj, path, request.method):
-                    logger.warning(f"Insufficient permissions for API key: {api_key[:8]}... for path: {path}")
-                    return Response(
-                        content='{"error": "Insufficient permissions", "message": "Your API key does not have permission to access this endpoint"}',
-                        status_code=403,
-                        media_type="application/json"
-                    )
-
-                # 检查速率限制
-                if not await self._check_rate_limit(api_key_obj):
-                    logger.warning(f"Rate limit exceeded for API key: {api_key[:8]}...")
-                    return Response(
-                        content='{"error": "Rate limit exceeded", "message": "You have exceeded the rate limit for your API key"}',
-                        status_code=429,
-                        media_type="application/json"
-                    )
-
-                # 将API密钥信息添加到请求状态中
-                request.state.api_key = api_key_obj
-                request.state.developer_id = api_key_obj.developer_id
+                # 中间件中无法使用Depends，使用请求级共享会话验证API密钥
+                with request_db() as db:
+                    api_service = DeveloperAPIService(db)
+
+                    api_key_obj = await api_service.validate_api_key(api_key)
+                    if not api_key_obj:
+                        logger.warning(f"Invalid API key: {api_key[:8]}... for path: {path}")
+                        return Response(
+                            content='{"error": "Invalid API key", "message": "The provided API key is invalid or expired"}',
+                            status_code=401,
+                            media_type="application/json"
+                        )
+
+                    # 检查API密钥权限
+                    if not await self._check_api_key_permissions(api_key_obj, path, request.method):
+                        logger.warning(f"Insufficient permissions for API key: {api_key[:8]}... for path: {path}")
+                        return Response(
+                            content='{"error": "Insufficient permissions", "message": "Your API key does not have permission to access this endpoint"}',
+                            status_code=403,
+                            media_type="application/json"
+                        )
+
+                    # 检查速率限制
+                    if not await self._check_rate_limit(api_key_obj):
+                        logger.warning(f"Rate limit exceeded for API key: {api_key[:8]}...")
+                        return Response(
+                            content='{"error": "Rate limit exceeded", "message": "You have exceeded the rate limit for your API key"}',
+                            status_code=429,
+                            media_type="application/json"
+                        )
+
+                    # 将API密钥信息添加到请求状态中
+                    request.state.api_key = api_key_obj
+                    request.state.developer_id = api_key_obj.developer_id
 
             except Exception as e:
                 logger.error(f"Error validating API key: {str(e)}")
@@ -112,8 +111,6 @@ class APIKeyAuthMiddleware(BaseHTTPMiddleware):
                     status_code=500,
                     media_type="application/json"
                 )
-            finally:
-                db.close()
 
         response = await call_next(request)
         return response
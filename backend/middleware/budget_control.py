@@ -15,7 +15,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 from sqlalchemy.orm import Session
 
-from backend.core.database import get_db
+from backend.core.database import request_db
 from backend.services.budget_service import BudgetService, BudgetExceededException
 from backend.services.org_api_key_service import OrgApiKeyService, ApiKeyQuotaExceededException, ApiKeyExpiredException
 from backend.models.budget import BudgetStatus
@@ -144,9 +144,9 @@ class BudgetControlMiddleware(BaseHTTPMiddleware):
     async def _validate_api_key(self, api_key: str):
         """Validate API key and return key record"""
         try:
-            db = next(get_db())
-            key_service = self._get_api_key_service(db)
-            return await key_service.validate_api_key(api_key)
+            with request_db() as db:
+                key_service = self._get_api_key_service(db)
+                return await key_service.validate_api_key(api_key)
         except Exception as e:
             logger.error(f"Error validating API key: {e}")
             return None
@@ -177,12 +177,12 @@ class BudgetControlMiddleware(BaseHTTPMiddleware):
     async def _check_budget_limits(self, organization_id: str, estimated_cost: Decimal):
         """Check if the organization has sufficient budget"""
         try:
-            db = next(get_db())
-            budget_service = self._get_budget_service(db)
+            with request_db() as db:
+                budget_service = self._get_budget_service(db)
 
-            # Check budget limit
-            if self.enable_hard_limits:
-                await budget_service.check_budget_limit(organization_id, estimated_cost)
+                # Check budget limit
+                if self.enable_hard_limits:
+                    await budget_service.check_budget_limit(organization_id, estimated_cost)
 
         except BudgetExceededException:
             raise
@@ -193,30 +193,30 @@ class BudgetControlMiddleware(BaseHTTPMiddleware):
     async def _record_usage(self, request: Request, actual_cost: Decimal):
         """Record actual usage after successful request completion"""
         try:
-            db = next(get_db())
-            budget_service = self._get_budget_service(db)
-
-            # Get request context
-            organization_id = getattr(request.state, 'organization_id', None)
-            api_key_id = getattr(request.state, 'api_key_id', None)
-            user_id = getattr(request.state, 'user_id', 'system')  # Default to system user
-
-            if not organization_id or not api_key_id:
-                return
-
-            # Determine service and model from request
-            service, model = self._extract_service_info(request)
-
-            # Record usage
-            await budget_service.record_usage(
-                organization_id=organization_id,
-                user_id=user_id,
-                team_id=None,  # Can be extracted from request if needed
-                service=service,
-                model=model,
-                tokens=0,  # Would be calculated from actual response
-                cost=actual_cost
-            )
+            with request_db() as db:
+                budget_service = self._get_budget_service(db)
+
+                # Get request context
+                organization_id = getattr(request.state, 'organization_id', None)
+                api_key_id = getattr(request.state, 'api_key_id', None)
+                user_id = getattr(request.state, 'user_id', 'system')  # Default to system user
+
+                if not organization_id or not api_key_id:
+                    return
+
+                # Determine service and model from request
+                service, model = self._extract_service_info(request)
+
+                # Record usage
+                await budget_service.record_usage(
+                    organization_id=organization_id,
+                    user_id=user_id,
+                    team_id=None,  # Can be extracted from request if needed
+                    service=service,
+                    model=model,
+                    tokens=0,  # Would be calculated from actual response
+                    cost=actual_cost
+                )
 
         except Exception as e:
             logger.error(f"Error recording usage: {e}")
@@ -319,9 +319,9 @@ async def check_request_budget(request: Request, estimated_cost: Decimal) -> boo
         if not organization_id:
             return True
 
-        db = next(get_db())
-        budget_service = BudgetService(db)
-        return await budget_service.check_budget_limit(organization_id, estimated_cost)
+        with request_db() as db:
+            budget_service = BudgetService(db)
+            return await budget_service.check_budget_limit(organization_id, estimated_cost)
 
     except Exception as e:
         logger.error(f"Error checking request budget: {e}")
@@ -0,0 +1,38 @@
+"""
+请求级数据库会话中间件
+为每个HTTP请求建立会话作用域：中间件、服务和端点依赖在同一请求内复用同一个同步会话和
+同一个异步会话，响应结束后统一关闭（纯ASGI实现，会话作用域覆盖流式响应的整个发送过程）。
+同时统计请求内执行的语句，检测疑似N+1查询；配置DB_QUERY_BUDGET时超出预算的请求报错。
+"""
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from backend.config.settings import get_settings
+from backend.core.database import request_session_scope
+from backend.middleware.performance_middleware import route_label
+from backend.optimization.query_instrumentation import track_queries
+
+settings = get_settings()
+
+
+class DatabaseSessionMiddleware:
+    """请求级数据库会话作用域"""
+
+    def __init__(self, app: ASGIApp, query_budget: int = None, n_plus_one_threshold: int = None):
+        self.app = app
+        budget = settings.db_query_budget if query_budget is None else query_budget
+        self.query_budget = budget or None
+        self.n_plus_one_threshold = n_plus_one_threshold or settings.db_n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries(scope["path"], self.query_budget, self.n_plus_one_threshold) as tracker:
+            try:
+                async with request_session_scope():
+                    await self.app(scope, receive, send)
+            finally:
+                # 路由完成后scope中才有endpoint，按路由模板归并统计
+                tracker.name = f"{scope.get('method', '')} {route_label(scope)}"
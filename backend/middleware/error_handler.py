@@ -1,10 +1,13 @@
 """
 统一错误处理中间件
+
+中间件均为纯ASGI实现，避免BaseHTTPMiddleware每层额外的任务切换和响应体转发。
 """
 
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
-from fastapi.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from typing import Union
 import logging
 import time
@@ -15,28 +18,50 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
+class ErrorHandlingMiddleware:
     """统一错误处理中间件"""
 
-    async def dispatch(self, request: Request, call_next):
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = time.time()
+        response_started = False
 
-        try:
-            response = await call_next(request)
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
 
-            # 记录请求处理时间
-            process_time = time.time() - start_time
-            if process_time > 1.0:  # 超过1秒的请求记录警告
-                logger.warning(
-                    f"Slow request: {request.method} {request.url.path} "
-                    f"took {process_time:.2f}s"
-                )
+                # 记录请求处理时间
+                process_time = time.time() - start_time
+                if process_time > 1.0:  # 超过1秒的请求记录警告
+                    logger.warning(
+                        f"Slow request: {scope['method']} {scope['path']} "
+                        f"took {process_time:.2f}s"
+                    )
 
-            # 添加响应头
-            response.headers["X-Process-Time"] = str(process_time)
-            return response
+                # 添加响应头
+                MutableHeaders(scope=message)["X-Process-Time"] = str(process_time)
+            await send(message)
 
-        except HTTPException as e:
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            # 响应已开始发送时无法再返回错误响应
+            if response_started:
+                raise
+            response = self._error_response(e)
+            await response(scope, receive, send)
+
+    @staticmethod
+    def _error_response(e: Exception) -> JSONResponse:
+        """将异常转换为错误响应"""
+        if isinstance(e, HTTPException):
             # HTTP异常直接返回
             logger.warning(f"HTTP Exception: {e.status_code} - {e.detail}")
             return JSONResponse(
@@ -49,7 +74,7 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
                 }
             )
 
-        except ValueError as e:
+        if isinstance(e, ValueError):
             # 参数验证错误
             logger.error(f"Validation Error: {str(e)}")
             return JSONResponse(
@@ -61,7 +86,7 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
                 }
             )
 
-        except PermissionError as e:
+        if isinstance(e, PermissionError):
             # 权限错误
             logger.error(f"Permission Error: {str(e)}")
             return JSONResponse(
@@ -73,7 +98,7 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
                 }
             )
 
-        except FileNotFoundError as e:
+        if isinstance(e, FileNotFoundError):
             # 文件未找到
             logger.error(f"File Not Found: {str(e)}")
             return JSONResponse(
@@ -85,53 +110,61 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
                 }
             )
 
-        except Exception as e:
-            # 其他未捕获的异常
-            logger.error(f"Unhandled Exception: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+        # 其他未捕获的异常
+        logger.error(f"Unhandled Exception: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
 
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "error": True,
-                    "message": "服务器内部错误",
-                    "type": "internal_error",
-                    "detail": str(e) if logger.isEnabledFor(logging.DEBUG) else None
-                }
-            )
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": True,
+                "message": "服务器内部错误",
+                "type": "internal_error",
+                "detail": str(e) if logger.isEnabledFor(logging.DEBUG) else None
+            }
+        )
 
 
-class PerformanceMiddleware(BaseHTTPMiddleware):
+class PerformanceMiddleware:
     """性能监控中间件"""
 
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        # 记录请求开始
-        logger.info(f"Request started: {request.method} {request.url.path}")
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        try:
-            response = await call_next(request)
+        start_time = time.time()
+        method, path = scope["method"], scope["path"]
 
-            # 计算处理时间
-            process_time = time.time() - start_time
+        # 记录请求开始
+        logger.info(f"Request started: {method} {path}")
 
-            # 记录性能数据
-            logger.info(
-                f"Request completed: {request.method} {request.url.path} "
-                f"- Status: {response.status_code} - Time: {process_time:.3f}s"
-            )
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # 计算处理时间
+                process_time = time.time() - start_time
 
-            # 添加性能头
-            response.headers["X-Process-Time"] = f"{process_time:.3f}s"
-            response.headers["X-Request-ID"] = str(id(request))
+                # 记录性能数据
+                logger.info(
+                    f"Request completed: {method} {path} "
+                    f"- Status: {message['status']} - Time: {process_time:.3f}s"
+                )
 
-            return response
+                # 添加性能头
+                headers = MutableHeaders(scope=message)
+                headers["X-Process-Time"] = f"{process_time:.3f}s"
+                headers["X-Request-ID"] = str(id(scope))
+            await send(message)
 
+        try:
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
             process_time = time.time() - start_time
             logger.error(
-                f"Request failed: {request.method} {request.url.path} "
+                f"Request failed: {method} {path} "
                 f"- Time: {process_time:.3f}s - Error: {str(e)}"
             )
             raise
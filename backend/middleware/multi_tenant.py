@@ -11,9 +11,10 @@ from fastapi import Request, HTTPException, status
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import bindparam, select
 
-from backend.core.database import get_db
+from backend.core.database import request_db
+from backend.optimization.prepared_statements import prepared_statement
 from backend.models.member import Member, OrganizationRole
 from backend.models.user import User
 from backend.models.org_api_key import OrgApiKey
@@ -21,6 +22,15 @@ from backend.models.organization import Organization
 
 logger = logging.getLogger(__name__)
 
+# Membership lookups run on every tenant-scoped request
+MEMBER_ROLE = prepared_statement(
+    "multi_tenant.member_role",
+    lambda: select(Member.role).where(
+        Member.user_id == bindparam("user_id"),
+        Member.organization_id == bindparam("organization_id")
+    )
+)
+
 
 class MultiTenantMiddleware(BaseHTTPMiddleware):
     """
@@ -101,46 +111,45 @@ class MultiTenantMiddleware(BaseHTTPMiddleware):
     async def _get_context_from_api_key(self, api_key: str) -> Optional[dict]:
         """Get organization context from API key"""
         try:
-            db = next(get_db())
-
-            # Find API key in database
-            org_api_key = db.execute(
-                select(OrgApiKey)
-                .where(OrgApiKey.key_hash == self._hash_api_key(api_key))
-                .where(OrgApiKey.status == "active")
-            ).scalar_one_or_none()
-
-            if not org_api_key:
-                logger.warning(f"Invalid API key attempted: {api_key[:8]}...")
-                return None
-
-            # Check if API key is expired
-            if org_api_key.expires_at and org_api_key.expires_at < datetime.utcnow():
-                logger.warning(f"Expired API key attempted: {org_api_key.key_prefix}")
-                return None
-
-            # Update last used timestamp
-            org_api_key.last_used_at = datetime.utcnow()
-            db.commit()
-
-            # Get organization details
-            organization = db.execute(
-                select(Organization)
-                .where(Organization.id == org_api_key.organization_id)
-            ).scalar_one_or_none()
-
-            if not organization:
-                logger.error(f"Organization not found for API key: {org_api_key.key_prefix}")
-                return None
-
-            return {
-                "organization_id": str(org_api_key.organization_id),
-                "organization_name": organization.name,
-                "api_key_id": str(org_api_key.id),
-                "api_key_name": org_api_key.name,
-                "api_key_permissions": org_api_key.permissions,
-                "source": "api_key"
-            }
+            with request_db() as db:
+                # Find API key in database
+                org_api_key = db.execute(
+                    select(OrgApiKey)
+                    .where(OrgApiKey.key_hash == self._hash_api_key(api_key))
+                    .where(OrgApiKey.status == "active")
+                ).scalar_one_or_none()
+
+                if not org_api_key:
+                    logger.warning(f"Invalid API key attempted: {api_key[:8]}...")
+                    return None
+
+                # Check if API key is expired
+                if org_api_key.expires_at and org_api_key.expires_at < datetime.utcnow():
+                    logger.warning(f"Expired API key attempted: {org_api_key.key_prefix}")
+                    return None
+
+                # Update last used timestamp
+                org_api_key.last_used_at = datetime.utcnow()
+                db.commit()
+
+                # Get organization details
+                organization = db.execute(
+                    select(Organization)
+                    .where(Organization.id == org_api_key.organization_id)
+                ).scalar_one_or_none()
+
+                if not organization:
+                    logger.error(f"Organization not found for API key: {org_api_key.key_prefix}")
+                    return None
+
+                return {
+                    "organization_id": str(org_api_key.organization_id),
+                    "organization_name": organization.name,
+                    "api_key_id": str(org_api_key.id),
+                    "api_key_name": org_api_key.name,
+                    "api_key_permissions": org_api_key.permissions,
+                    "source": "api_key"
+                }
 
         except Exception as e:
             logger.error(f"Error extracting context from API key: {e}")
@@ -155,24 +164,23 @@ class MultiTenantMiddleware(BaseHTTPMiddleware):
     async def _get_context_from_header(self, org_id: str, request: Request) -> Optional[dict]:
         """Get organization context from header (for internal requests)"""
         try:
-            db = next(get_db())
-
-            # Validate organization exists
-            organization = db.execute(
-                select(Organization)
-                .where(Organization.id == org_id)
-                .where(Organization.status == "active")
-            ).scalar_one_or_none()
-
-            if not organization:
-                logger.warning(f"Invalid organization ID in header: {org_id}")
-                return None
-
-            return {
-                "organization_id": org_id,
-                "organization_name": organization.name,
-                "source": "header"
-            }
+            with request_db() as db:
+                # Validate organization exists
+                organization = db.execute(
+                    select(Organization)
+                    .where(Organization.id == org_id)
+                    .where(Organization.status == "active")
+                ).scalar_one_or_none()
+
+                if not organization:
+                    logger.warning(f"Invalid organization ID in header: {org_id}")
+                    return None
+
+                return {
+                    "organization_id": org_id,
+                    "organization_name": organization.name,
+                    "source": "header"
+                }
 
         except Exception as e:
             logger.error(f"Error extracting context from header: {e}")
@@ -238,20 +246,19 @@ class OrganizationContextMiddleware(BaseHTTPMiddleware):
     async def _get_user_role(self, user_id: str, organization_id: str) -> Optional[OrganizationRole]:
         """Get user's role in organization"""
         try:
-            db = next(get_db())
-
-            member = db.execute(
-                select(Member)
-                .where(
-                    Member.user_id == user_id,
-                    Member.organization_id == organization_id
-                )
-            ).scalar_one_or_none()
+            with request_db() as db:
+                member = db.execute(
+                    select(Member)
+                    .where(
+                        Member.user_id == user_id,
+                        Member.organization_id == organization_id
+                    )
+                ).scalar_one_or_none()
+
+                if member:
+                    return OrganizationRole(member.role)
 
-            if member:
-                return OrganizationRole(member.role)
-
-            return None
+                return None
 
         except Exception as e:
             logger.error(f"Error getting user role: {e}")
@@ -334,17 +341,16 @@ class PermissionValidationMiddleware(BaseHTTPMiddleware):
     async def _validate_user_access(self, user_id: str, organization_id: str) -> bool:
         """Validate user has access to organization"""
         try:
-            db = next(get_db())
-
-            member = db.execute(
-                select(Member)
-                .where(
-                    Member.user_id == user_id,
-                    Member.organization_id == organization_id
-                )
-            ).scalar_one_or_none()
+            with request_db() as db:
+                member = db.execute(
+                    select(Member)
+                    .where(
+                        Member.user_id == user_id,
+                        Member.organization_id == organization_id
+                    )
+                ).scalar_one_or_none()
 
-            return member is not None
+                return member is not None
 
         except Exception as e:
             logger.error(f"Error validating user access: {e}")
@@ -431,25 +437,13 @@ def get_user_organizations(db: Session, user_id: str) -> list:
 
 def get_user_role_in_organization(db: Session, user_id: str, organization_id: str) -> Optional[OrganizationRole]:
     """Get user's role in a specific organization"""
-    member = db.execute(
-        select(backend.models.member.Member)
-        .where(
-            backend.models.member.Member.user_id == user_id,
-            backend.models.member.Member.organization_id == organization_id
-        )
-    ).scalar_one_or_none()
+    role = MEMBER_ROLE.execute(db, user_id=user_id, organization_id=organization_id).scalar_one_or_none()
 
-    if member:
-        return OrganizationRole(member.role)
+    if role:
+        return OrganizationRole(role)
     return None
 
 
 def validate_organization_membership(db: Session, user_id: str, organization_id: str) -> bool:
     """Validate user is a member of the organization"""
-    return db.execute(
-        select(backend.models.member.Member)
-        .where(
-            backend.models.member.Member.user_id == user_id,
-            backend.models.member.Member.organization_id == organization_id
-        )
-    ).scalar_one_or_none() is not None
\ No newline at end of file
+    return MEMBER_ROLE.execute(db, user_id=user_id, organization_id=organization_id).first() is not None
\ No newline at end of file
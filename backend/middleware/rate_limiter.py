@@ -347,8 +347,21 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
     async def _log_request(self, request: Request, response: Response, process_time: float, client_ip: str):
         """记录请求日志"""
-        log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
+        # 根据状态码选择日志级别
+        if response.status_code >= 500:
+            level, message = logging.ERROR, "Server Error"
+        elif response.status_code >= 400:
+            level, message = logging.WARNING, "Client Error"
+        elif process_time > 2.0:  # 超过2秒的慢请求
+            level, message = logging.WARNING, "Slow Request"
+        else:
+            level, message = logging.INFO, "Request"
+
+        if not logger.isEnabledFor(level):
+            return
+
+        # 固定消息模板+结构化字段，由异步日志管道序列化并按模板采样
+        logger.log(level, message, extra={
             "method": request.method,
             "path": request.url.path,
             "query": str(request.query_params),
@@ -357,17 +370,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             "client_ip": client_ip,
             "user_agent": request.headers.get("user-agent", ""),
             "content_length": request.headers.get("content-length", "0")
-        }
-
-        # 根据状态码选择日志级别
-        if response.status_code >= 500:
-            logger.error(f"Server Error: {log_data}")
-        elif response.status_code >= 400:
-            logger.warning(f"Client Error: {log_data}")
-        elif process_time > 2.0:  # 超过2秒的慢请求
-            logger.warning(f"Slow Request: {log_data}")
-        else:
-            logger.info(f"Request: {log_data}")
+        })
 
     def _start_background_tasks(self):
         """启动后台任务"""
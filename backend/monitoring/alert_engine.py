@@ -4,12 +4,15 @@
 """
 import asyncio
 import json
-from typing import Dict, List, Optional, Callable, Any
+import re
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Callable, Any, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 from enum import Enum
 import logging
-from collections import defaultdict
+from collections import defaultdict, deque
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +39,7 @@ class AlertCondition:
     enabled: bool = True
     tags: Optional[Dict[str, str]] = None
     description: Optional[str] = None
+    hysteresis: float = 0.0  # 数值条件触发后，需越过阈值该幅度才视为恢复
 
 @dataclass
 class AlertIncident:
@@ -54,35 +58,155 @@ class AlertIncident:
     context: Optional[Dict[str, Any]] = None
     notification_sent: bool = False
 
+def compile_predicate(operator: str, threshold: Any, offset: float = 0.0) -> Optional[Callable[[Any], bool]]:
+    """将条件编译为单参数闭包，阈值转换和正则编译只做一次
+
+    offset用于滞回：正数表示把阈值向"更容易满足"的方向移动。
+    """
+    if operator in ('>', '>=', '<', '<='):
+        limit = float(threshold)
+        if operator == '>':
+            limit -= offset
+            return lambda value: float(value) > limit
+        if operator == '>=':
+            limit -= offset
+            return lambda value: float(value) >= limit
+        if operator == '<':
+            limit += offset
+            return lambda value: float(value) < limit
+        limit += offset
+        return lambda value: float(value) <= limit
+    if operator == '=':
+        return lambda value: value == threshold
+    if operator == '!=':
+        return lambda value: value != threshold
+    if operator == 'in':
+        return lambda value: value in threshold
+    if operator == 'not_in':
+        return lambda value: value not in threshold
+    if operator == 'contains':
+        needle = str(threshold)
+        return lambda value: needle in str(value)
+    if operator == 'not_contains':
+        needle = str(threshold)
+        return lambda value: needle not in str(value)
+    if operator == 'regex':
+        pattern = re.compile(str(threshold))
+        return lambda value: pattern.search(str(value)) is not None
+    return None
+
+
+class _RuleState:
+    """单条规则的编译结果与持续时间/滞回状态"""
+
+    __slots__ = ('rule', 'operator', 'threshold', 'hysteresis', 'duration_minutes',
+                 'trigger', 'hold', 'duration', 'active_since')
+
+    def __init__(self, rule: AlertCondition):
+        self.rule = rule
+        self.active_since: Optional[datetime] = None
+        self.compile()
+
+    def compile(self):
+        rule = self.rule
+        self.operator = rule.operator
+        self.threshold = rule.threshold
+        self.hysteresis = rule.hysteresis
+        self.duration_minutes = rule.duration_minutes
+        self.trigger = compile_predicate(rule.operator, rule.threshold)
+        # 已进入触发状态时使用放宽后的条件判断是否仍在触发，避免阈值附近抖动
+        self.hold = (compile_predicate(rule.operator, rule.threshold, rule.hysteresis)
+                     if rule.hysteresis else self.trigger)
+        self.duration = timedelta(minutes=rule.duration_minutes)
+
+    def ensure_current(self):
+        """规则属性被直接修改（如API更新阈值）时重新编译"""
+        rule = self.rule
+        if (rule.threshold is not self.threshold or rule.operator is not self.operator or
+                rule.hysteresis != self.hysteresis or rule.duration_minutes != self.duration_minutes):
+            self.compile()
+
+
+class _Suppression:
+    """预处理后的抑制配置"""
+
+    __slots__ = ('window_seconds', 'hours', 'weekends')
+
+    def __init__(self, config: Dict):
+        window = config.get('time_window_minutes')
+        self.window_seconds = window * 60 if window is not None else None
+        self.hours = frozenset(config.get('suppress_hours') or ())
+        self.weekends = bool(config.get('suppress_weekends'))
+
+
 class AlertEngine:
     """告警引擎核心"""
 
-    def __init__(self):
+    def __init__(self, max_incident_history: int = 10000):
         self.rules: Dict[str, AlertCondition] = {}
         self.incidents: Dict[str, AlertIncident] = {}  # rule_id -> incident
-        self.active_conditions: Dict[str, datetime] = {}  # rule_id -> start_time
         self.notification_handlers: List[Callable] = []
         self.suppression_rules: Dict[str, Dict] = {}  # rule_id -> suppression_config
-        self.evaluation_history: List[Dict] = []
         self.max_history_size = 1000
+        # (时间, 指标, 值, 触发的规则)，定长环形缓冲
+        self.evaluation_history: deque = deque(maxlen=self.max_history_size)
+
+        self._states: Dict[str, _RuleState] = {}
+        self._rules_by_metric: Dict[str, List[_RuleState]] = defaultdict(list)
+        self._suppressions: Dict[str, _Suppression] = {}
+
+        # 按触发时间排序的有界事件历史
+        self.max_incident_history = max_incident_history
+        self._history: List[AlertIncident] = []
+        self._history_times: List[datetime] = []
+        self._incidents_by_id: Dict[str, AlertIncident] = {}
+
+    @property
+    def active_conditions(self) -> Dict[str, datetime]:
+        """rule_id -> 条件开始满足的时间"""
+        return {
+            rule_id: state.active_since
+            for rule_id, state in self._states.items()
+            if state.active_since is not None
+        }
 
     def add_rule(self, condition: AlertCondition):
-        """添加告警���则"""
+        """添加告警规则"""
+        if condition.id in self._states:
+            self._unindex(condition.id)
         self.rules[condition.id] = condition
+        state = _RuleState(condition)
+        self._states[condition.id] = state
+        self._rules_by_metric[condition.metric_name].append(state)
+        if state.trigger is None:
+            logger.warning(f"Unknown operator: {condition.operator}")
         logger.info(f"Added alert rule: {condition.name} ({condition.id})")
 
+    def _unindex(self, rule_id: str):
+        state = self._states.pop(rule_id, None)
+        if state is None:
+            return
+        bucket = self._rules_by_metric.get(state.rule.metric_name)
+        if bucket is not None:
+            bucket.remove(state)
+            if not bucket:
+                del self._rules_by_metric[state.rule.metric_name]
+
     def remove_rule(self, rule_id: str):
         """移除告警规则"""
         if rule_id in self.rules:
             del self.rules[rule_id]
+            self._unindex(rule_id)
             # 清理相关告警事件
             if rule_id in self.incidents:
                 self.incidents[rule_id].status = AlertStatus.RESOLVED
                 self.incidents[rule_id].resolved_at = datetime.utcnow()
-            if rule_id in self.active_conditions:
-                del self.active_conditions[rule_id]
             logger.info(f"Removed alert rule: {rule_id}")
 
+    def get_rules_for_metric(self, metric_name: str) -> List[AlertCondition]:
+        """获取某指标上已启用的规则"""
+        return [state.rule for state in self._rules_by_metric.get(metric_name, ()) if state.rule.enabled]
+
     def enable_rule(self, rule_id: str):
         """启用告警规则"""
         if rule_id in self.rules:
@@ -93,6 +217,8 @@ class AlertEngine:
         """禁用告警规则"""
         if rule_id in self.rules:
             self.rules[rule_id].enabled = False
+            if rule_id in self._states:
+                self._states[rule_id].active_since = None
             logger.info(f"Disabled alert rule: {rule_id}")
 
     def add_notification_handler(self, handler: Callable):
@@ -102,98 +228,95 @@ class AlertEngine:
     def add_suppression_rule(self, rule_id: str, config: Dict):
         """添加告警抑制规则"""
         self.suppression_rules[rule_id] = config
+        self._suppressions[rule_id] = _Suppression(config)
 
     async def evaluate_metric(self, metric_name: str, value: Any, timestamp: datetime = None, context: Dict = None):
         """评估指标是否触发告警"""
         if timestamp is None:
             timestamp = datetime.utcnow()
 
-        # 记录评估历史
-        evaluation_record = {
-            'timestamp': timestamp.isoformat(),
-            'metric_name': metric_name,
-            'value': value,
-            'triggered_rules': []
-        }
+        triggered_rules = []
 
-        # 检查所有相关规则
-        for rule_id, condition in self.rules.items():
-            if not condition.enabled or condition.metric_name != metric_name:
+        # 只检查该指标上的规则
+        for state in self._rules_by_metric.get(metric_name, ()):
+            rule = state.rule
+            if not rule.enabled:
                 continue
 
             try:
-                # 评估条件
-                is_triggered = self._evaluate_condition(value, condition)
+                state.ensure_current()
+                engaged = state.active_since is not None
+                predicate = state.hold if engaged else state.trigger
+                if predicate is None:
+                    continue
+
+                try:
+                    is_triggered = predicate(value)
+                except Exception as e:
+                    logger.error(f"Error evaluating condition {rule.id}: {e}")
+                    is_triggered = False
 
                 if is_triggered:
-                    await self._handle_condition_trigger(rule_id, condition, value, timestamp, context)
-                    evaluation_record['triggered_rules'].append(rule_id)
-                else:
-                    await self._handle_condition_resolve(rule_id, condition, timestamp)
+                    await self._handle_condition_trigger(state, value, timestamp, context)
+                    triggered_rules.append(rule.id)
+                elif engaged or rule.id in self.incidents:
+                    self._handle_condition_resolve(state, timestamp)
 
             except Exception as e:
-                logger.error(f"Error evaluating rule {rule_id}: {e}")
+                logger.error(f"Error evaluating rule {rule.id}: {e}")
 
         # 保存评估历史
-        self.evaluation_history.append(evaluation_record)
-        if len(self.evaluation_history) > self.max_history_size:
-            self.evaluation_history = self.evaluation_history[-self.max_history_size:]
+        self.evaluation_history.append((timestamp, metric_name, value, triggered_rules))
 
     def _evaluate_condition(self, value: Any, condition: AlertCondition) -> bool:
         """评估条件是否满足"""
-        operators = {
-            '>': lambda a, b: float(a) > float(b),
-            '<': lambda a, b: float(a) < float(b),
-            '>=': lambda a, b: float(a) >= float(b),
-            '<=': lambda a, b: float(a) <= float(b),
-            '=': lambda a, b: a == b,
-            '!=': lambda a, b: a != b,
-            'in': lambda a, b: a in b,
-            'not_in': lambda a, b: a not in b,
-            'contains': lambda a, b: str(b) in str(a),
-            'not_contains': lambda a, b: str(b) not in str(a),
-            'regex': lambda a, b: bool(re.search(str(b), str(a))),
-        }
+        state = self._states.get(condition.id)
+        if state is not None and state.rule is condition:
+            state.ensure_current()
+            operator_func = state.trigger
+        else:
+            operator_func = compile_predicate(condition.operator, condition.threshold)
 
-        operator_func = operators.get(condition.operator)
         if not operator_func:
             logger.warning(f"Unknown operator: {condition.operator}")
             return False
 
         try:
-            return operator_func(value, condition.threshold)
+            return operator_func(value)
         except Exception as e:
             logger.error(f"Error evaluating condition {condition.id}: {e}")
             return False
 
-    async def _handle_condition_trigger(self, rule_id: str, condition: AlertCondition,
-                                      value: Any, timestamp: datetime, context: Dict = None):
+    async def _handle_condition_trigger(self, state: _RuleState, value: Any, timestamp: datetime,
+                                        context: Dict = None):
         """处理条件触发"""
+        rule_id = state.rule.id
+
         # 检查抑制规则
-        if self._is_suppressed(rule_id, timestamp):
+        if rule_id in self._suppressions and self._is_suppressed(rule_id, timestamp):
             return
 
         # 记录触发时间
-        if rule_id not in self.active_conditions:
-            self.active_conditions[rule_id] = timestamp
+        if state.active_since is None:
+            state.active_since = timestamp
             return
 
         # 检查持续时间
-        trigger_duration = timestamp - self.active_conditions[rule_id]
-        if trigger_duration >= timedelta(minutes=condition.duration_minutes):
-            await self._create_alert_incident(rule_id, condition, value, timestamp, context)
+        if timestamp - state.active_since >= state.duration:
+            incident = self.incidents.get(rule_id)
+            if incident is None or incident.status != AlertStatus.ACTIVE:
+                await self._create_alert_incident(rule_id, state.rule, value, timestamp, context)
 
-    async def _handle_condition_resolve(self, rule_id: str, condition: AlertCondition, timestamp: datetime):
+    def _handle_condition_resolve(self, state: _RuleState, timestamp: datetime):
         """处理条件解决"""
-        if rule_id in self.active_conditions:
-            del self.active_conditions[rule_id]
+        state.active_since = None
 
         # 解决告警事件
-        if rule_id in self.incidents and self.incidents[rule_id].status == AlertStatus.ACTIVE:
-            incident = self.incidents[rule_id]
+        incident = self.incidents.get(state.rule.id)
+        if incident is not None and incident.status == AlertStatus.ACTIVE:
             incident.status = AlertStatus.RESOLVED
             incident.resolved_at = timestamp
-            logger.info(f"Resolved alert incident: {rule_id}")
+            logger.info(f"Resolved alert incident: {state.rule.id}")
 
     async def _create_alert_incident(self, rule_id: str, condition: AlertCondition,
                                    value: Any, timestamp: datetime, context: Dict = None):
@@ -218,11 +341,31 @@ class AlertEngine:
         )
 
         self.incidents[rule_id] = incident
+        self._record_incident(incident)
         logger.warning(f"Alert triggered: {message}")
 
         # 发送通知
         await self._send_notifications(incident)
 
+    def _record_incident(self, incident: AlertIncident):
+        """写入按时间排序的事件历史，超出上限时淘汰最早的一半"""
+        if not self._history_times or incident.triggered_at >= self._history_times[-1]:
+            self._history_times.append(incident.triggered_at)
+            self._history.append(incident)
+        else:
+            index = bisect_left(self._history_times, incident.triggered_at)
+            self._history_times.insert(index, incident.triggered_at)
+            self._history.insert(index, incident)
+        self._incidents_by_id[incident.id] = incident
+
+        if len(self._history) > self.max_incident_history:
+            cut = len(self._history) - self.max_incident_history // 2
+            for expired in self._history[:cut]:
+                if self._incidents_by_id.get(expired.id) is expired:
+                    del self._incidents_by_id[expired.id]
+            del self._history[:cut]
+            del self._history_times[:cut]
+
     def _generate_alert_message(self, condition: AlertCondition, value: Any, context: Dict = None) -> str:
         """生成告警消息"""
         operator_symbols = {
@@ -275,55 +418,47 @@ class AlertEngine:
 
     def _is_suppressed(self, rule_id: str, timestamp: datetime) -> bool:
         """检查告警是否被抑制"""
-        if rule_id not in self.suppression_rules:
+        suppression = self._suppressions.get(rule_id)
+        if suppression is None:
             return False
 
-        suppression_config = self.suppression_rules[rule_id]
-
-        # 时间窗口抑制
-        if 'time_window_minutes' in suppression_config:
-            window_minutes = suppression_config['time_window_minutes']
-
-            # 检查最近是否有相同告警
-            for incident in self.incidents.values():
-                if (incident.rule_id == rule_id and
-                    incident.status == AlertStatus.ACTIVE and
-                    (timestamp - incident.triggered_at).total_seconds() < window_minutes * 60):
-                    return True
+        # 时间窗口抑制：同一规则只有一个当前事件，直接检查
+        if suppression.window_seconds is not None:
+            incident = self.incidents.get(rule_id)
+            if (incident is not None and incident.status == AlertStatus.ACTIVE and
+                    (timestamp - incident.triggered_at).total_seconds() < suppression.window_seconds):
+                return True
 
         # 时间段抑制
-        if 'suppress_hours' in suppression_config:
-            suppress_hours = suppression_config['suppress_hours']
-            if timestamp.hour in suppress_hours:
-                return True
+        if suppression.hours and timestamp.hour in suppression.hours:
+            return True
 
         # 工作日/周末抑制
-        if 'suppress_weekends' in suppression_config and suppression_config['suppress_weekends']:
-            if timestamp.weekday() >= 5:  # 周六、周日
-                return True
+        if suppression.weekends and timestamp.weekday() >= 5:  # 周六、周日
+            return True
 
         return False
 
     async def acknowledge_alert(self, incident_id: str, acknowledged_by: str, notes: str = None):
         """确认告警"""
-        for incident in self.incidents.values():
-            if incident.id == incident_id and incident.status == AlertStatus.ACTIVE:
-                incident.acknowledged_at = datetime.utcnow()
-                incident.acknowledged_by = acknowledged_by
-                incident.notes = notes
-                logger.info(f"Alert acknowledged: {incident_id} by {acknowledged_by}")
-                return True
+        incident = self._incidents_by_id.get(incident_id)
+        if incident is not None and incident.status == AlertStatus.ACTIVE:
+            incident.acknowledged_at = datetime.utcnow()
+            incident.acknowledged_by = acknowledged_by
+            incident.notes = notes
+            logger.info(f"Alert acknowledged: {incident_id} by {acknowledged_by}")
+            return True
         return False
 
     async def resolve_alert(self, incident_id: str, resolved_by: str, notes: str = None):
         """手动解决告警"""
-        for incident in self.incidents.values():
-            if incident.id == incident_id and incident.status == AlertStatus.ACTIVE:
-                incident.status = AlertStatus.RESOLVED
-                incident.resolved_at = datetime.utcnow()
-                incident.notes = notes
-                logger.info(f"Alert resolved: {incident_id} by {resolved_by}")
-                return True
+        incident = self._incidents_by_id.get(incident_id)
+        if incident is not None and incident.status == AlertStatus.ACTIVE:
+            incident.status = AlertStatus.RESOLVED
+            incident.resolved_at = datetime.utcnow()
+            incident.notes = notes
+            logger.info(f"Alert resolved: {incident_id} by {resolved_by}")
+            return True
         return False
 
     def get_active_alerts(self, severity: AlertSeverity = None) -> List[AlertIncident]:
@@ -336,24 +471,22 @@ class AlertEngine:
         return sorted(alerts, key=lambda x: x.triggered_at, reverse=True)
 
     def get_alert_history(self, hours: int = 24) -> List[AlertIncident]:
-        """获取告警历史"""
+        """获取告警历史（按触发时间二分定位起点）"""
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        return [
-            incident for incident in self.incidents.values()
-            if incident.triggered_at >= cutoff_time
-        ]
+        return self._history[bisect_left(self._history_times, cutoff_time):]
 
     def get_rules_status(self) -> Dict[str, Dict]:
         """获取规则状态"""
+        active_conditions = self.active_conditions
         return {
             rule_id: {
                 'name': rule.name,
                 'enabled': rule.enabled,
                 'severity': rule.severity.value,
                 'metric_name': rule.metric_name,
-                'current_status': 'active' if rule_id in self.active_conditions else 'normal',
-                'active_since': self.active_conditions.get(rule_id).isoformat() if rule_id in self.active_conditions else None,
-                'last_triggered': None
+                'current_status': 'active' if rule_id in active_conditions else 'normal',
+                'active_since': active_conditions[rule_id].isoformat() if rule_id in active_conditions else None,
+                'last_triggered': self.incidents[rule_id].triggered_at.isoformat() if rule_id in self.incidents else None
             }
             for rule_id, rule in self.rules.items()
         }
@@ -361,20 +494,15 @@ class AlertEngine:
     def get_evaluation_stats(self, hours: int = 1) -> Dict:
         """获取评估统计"""
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        recent_evaluations = [
-            eval for eval in self.evaluation_history
-            if datetime.fromisoformat(eval['timestamp']) >= cutoff_time
-        ]
+        recent_evaluations = [record for record in self.evaluation_history if record[0] >= cutoff_time]
 
         total_evaluations = len(recent_evaluations)
-        triggered_evaluations = len([eval for eval in recent_evaluations if eval['triggered_rules']])
+        triggered_evaluations = len([record for record in recent_evaluations if record[3]])
 
         # 统计各指标的触发次数
         metric_triggers = defaultdict(int)
-        for eval in recent_evaluations:
-            for rule_id in eval['triggered_rules']:
-                if rule_id in self.rules:
-                    metric_triggers[self.rules[rule_id].metric_name] += 1
+        for _, metric_name, _, triggered_rules in recent_evaluations:
+            metric_triggers[metric_name] += len(triggered_rules)
 
         return {
             'period_hours': hours,
@@ -407,4 +535,47 @@ class AlertEngine:
         ]
 
 # 全局告警引擎实例
-alert_engine = AlertEngine()
\ No newline at end of file
+alert_engine = AlertEngine()
+
+
+def benchmark_alert_engine(samples: int = 100000, metrics: int = 500, rules_per_metric: int = 4) -> Dict[str, float]:
+    """评估吞吐基准（独立引擎实例，不影响全局告警）"""
+    engine = AlertEngine()
+    operators = ['>', '<', '>=', '!=']
+    for m in range(metrics):
+        for r in range(rules_per_metric):
+            engine.add_rule(AlertCondition(
+                id=f"bench_{m}_{r}",
+                name=f"bench {m}/{r}",
+                metric_name=f"metric_{m}",
+                operator=operators[r % len(operators)],
+                threshold=90.0 if operators[r % len(operators)] != '<' else 1.0,
+                duration_minutes=1,
+                severity=AlertSeverity.WARNING,
+                hysteresis=2.0 if r == 0 else 0.0
+            ))
+
+    base = datetime.utcnow()
+    names = [f"metric_{i % metrics}" for i in range(samples)]
+    values = [float((i * 7919) % 100) for i in range(samples)]
+
+    async def run():
+        evaluate = engine.evaluate_metric
+        for i in range(samples):
+            await evaluate(names[i], values[i], base + timedelta(seconds=i // metrics))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    return {
+        "samples": samples,
+        "rules": metrics * rules_per_metric,
+        "samples_per_second": round(samples / elapsed),
+        "us_per_sample": round(elapsed / samples * 1e6, 2),
+        "incidents": len(engine._history)
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_alert_engine(), indent=2))
@@ -42,6 +42,7 @@ class IntegratedAlertSystem:
         self.auto_train_models = True
         self.model_training_interval_hours = 24
         self.min_samples_for_training = 500
+        self._pending_training_task: Optional[asyncio.Task] = None
 
     async def start_monitoring(self):
         """启动智能告警监控"""
@@ -66,6 +67,7 @@ class IntegratedAlertSystem:
     def stop_monitoring(self):
         """停止智能告警监控"""
         self.running = False
+        anomaly_detector.shutdown_training_pool()
         logger.info("Integrated alert system stopped")
 
     async def _monitoring_loop(self):
@@ -126,12 +128,29 @@ class IntegratedAlertSystem:
             anomaly_alerts = []
             all_notifications = {}
 
+            # 所有指标的异常检测在一次批量打分中完成，已有模型的指标不会触发训练
+            histories = {
+                metric_name: smart_alerting._get_historical_data(metric_name, lookback_hours=48)
+                for metric_name in current_metrics
+            }
+            anomaly_results = anomaly_detector.detect_anomalies_batch({
+                metric_name: (
+                    {'value': metric_data['value'], 'timestamp': metric_data['timestamp']},
+                    histories[metric_name]
+                )
+                for metric_name, metric_data in current_metrics.items()
+                if len(histories[metric_name]) >= 100
+            })
+            self._schedule_pending_training()
+
             # 对每个指标进行智能告警评估
             for metric_name, metric_data in current_metrics.items():
                 try:
                     # 智能告警评估
                     smart_alert = await smart_alerting.evaluate_smart_alert(
-                        metric_name, metric_data['value'], metric_data['timestamp']
+                        metric_name, metric_data['value'], metric_data['timestamp'],
+                        historical_data=histories[metric_name],
+                        anomaly_result=anomaly_results.get(metric_name)
                     )
 
                     if smart_alert:
@@ -314,6 +333,14 @@ class IntegratedAlertSystem:
             }
         }
 
+    def _schedule_pending_training(self):
+        """检测中缺少模型的指标交给进程池训练，同一时间只运行一个训练任务"""
+        if not self.auto_train_models or not anomaly_detector.has_pending_training:
+            return
+        if self._pending_training_task is not None and not self._pending_training_task.done():
+            return
+        self._pending_training_task = asyncio.create_task(anomaly_detector.train_pending_async())
+
     async def _train_anomaly_models(self):
         """训练异常检测模型"""
         if not self.auto_train_models:
@@ -329,8 +356,8 @@ class IntegratedAlertSystem:
                 logger.warning("No training data available")
                 return
 
-            # 训练模型
-            results = anomaly_detector.retrain_all_models(training_data)
+            # 在进程池中训练模型，不阻塞告警评估
+            results = await anomaly_detector.train_models_async(training_data, force_retrain=True)
 
             trained_count = sum(1 for success in results.values() if success)
             total_count = len(results)
@@ -2,6 +2,10 @@
 机器学习异常检测模块
 基于Isolation Forest和其他算法实现智能异常检测
 """
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
@@ -16,6 +20,11 @@ import json
 import logging
 from collections import defaultdict, deque
 
+from backend.monitoring.anomaly_scoring import (
+    FEATURE_NAMES, MIN_SERIES_LENGTH, CompiledForest, ForestBank, feature_matrix, last_row_features,
+    series_arrays
+)
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -41,137 +50,54 @@ class ModelPerformance:
     training_samples: int
 
 class FeatureExtractor:
-    """特征提取��"""
+    """特征提取器"""
 
     def __init__(self):
-        self.feature_names = [
-            'value', 'rate_of_change', 'moving_avg_5', 'moving_avg_15', 'moving_avg_60',
-            'volatility_5', 'volatility_15', 'trend_slope_15', 'trend_slope_60',
-            'hour_of_day', 'day_of_week', 'is_weekend', 'is_business_hours',
-            'deviation_from_mean', 'deviation_from_median', 'percentile_rank',
-            'z_score', 'iqr_score', 'seasonal_deviation'
-        ]
+        self.feature_names = list(FEATURE_NAMES)
 
     def extract_features(self, data: List[Dict], current_index: int = -1) -> np.ndarray:
-        """从时间序列数据中提取特征"""
-        if not data or len(data) < 5:
+        """从时间序列数据中提取单个点的特征"""
+        if not data or len(data) < MIN_SERIES_LENGTH:
             return np.zeros(len(self.feature_names))
-
         if current_index == -1:
-            current_index = len(data) - 1
+            return last_row_features(*series_arrays(data))
+        return feature_matrix(*series_arrays(data), rows=[current_index])[0]
 
-        current_point = data[current_index]
-        current_value = current_point.get('value', 0)
-        current_time = datetime.fromisoformat(current_point['timestamp'])
+    def extract_feature_matrix(self, data: List[Dict]) -> np.ndarray:
+        """一次性提取整条序列所有点的特征"""
+        return feature_matrix(*series_arrays(data))
 
-        # 基础特征
-        features = {}
 
-        # 1. 当前值
-        features['value'] = current_value
+def _fit_isolation_forest(features: np.ndarray):
+    """标准化并训练Isolation Forest"""
+    scaler = StandardScaler()
+    scaled_features = scaler.fit_transform(features)
+
+    model = IsolationForest(
+        contamination=0.1,  # 假设10%的异常率
+        random_state=42,
+        n_estimators=100,
+        max_samples='auto',
+        bootstrap=False
+    )
+    model.fit(scaled_features)
+    return model, scaler, scaled_features
+
+
+def _train_in_worker(values: np.ndarray, hours: np.ndarray, weekdays: np.ndarray,
+                     min_samples: int) -> Optional[Tuple[Any, Any, np.ndarray]]:
+    """训练进程中执行：提取特征并训练，返回模型、标准化器和标准化后的训练特征"""
+    features = feature_matrix(values, hours, weekdays)
+    features = features[~np.isnan(features).any(axis=1)]
+    if len(features) < min_samples:
+        return None
+    return _fit_isolation_forest(features)
 
-        # 2. 变化率
-        if current_index > 0:
-            prev_value = data[current_index - 1].get('value', 0)
-            features['rate_of_change'] = (current_value - prev_value) / max(abs(prev_value), 1)
-        else:
-            features['rate_of_change'] = 0
-
-        # 3. 移动平均
-        features['moving_avg_5'] = self._calculate_moving_average(data, current_index, 5)
-        features['moving_avg_15'] = self._calculate_moving_average(data, current_index, 15)
-        features['moving_avg_60'] = self._calculate_moving_average(data, current_index, 60)
-
-        # 4. 波动率
-        features['volatility_5'] = self._calculate_volatility(data, current_index, 5)
-        features['volatility_15'] = self._calculate_volatility(data, current_index, 15)
-
-        # 5. 趋势斜率
-        features['trend_slope_15'] = self._calculate_trend_slope(data, current_index, 15)
-        features['trend_slope_60'] = self._calculate_trend_slope(data, current_index, 60)
-
-        # 6. 时间特征
-        features['hour_of_day'] = current_time.hour
-        features['day_of_week'] = current_time.weekday()
-        features['is_weekend'] = 1 if current_time.weekday() >= 5 else 0
-        features['is_business_hours'] = 1 if 9 <= current_time.hour <= 17 else 0
-
-        # 7. 统计特征
-        values = [point.get('value', 0) for point in data[:current_index + 1]]
-        if values:
-            mean_val = np.mean(values)
-            median_val = np.median(values)
-            std_val = np.std(values) if len(values) > 1 else 1
-
-            features['deviation_from_mean'] = (current_value - mean_val) / max(std_val, 1)
-            features['deviation_from_median'] = (current_value - median_val) / max(std_val, 1)
-
-            # 百分位排名
-            features['percentile_rank'] = (sum(1 for v in values if v <= current_value) / len(values)) * 100
-
-            # Z-score
-            features['z_score'] = (current_value - mean_val) / max(std_val, 1)
-
-            # IQR分数
-            if len(values) > 3:
-                q75, q25 = np.percentile(values, [75, 25])
-                iqr = q75 - q25
-                features['iqr_score'] = (current_value - median_val) / max(iqr, 1)
-            else:
-                features['iqr_score'] = 0
-
-            # 季节性偏差（基于小时的偏差）
-            hourly_values = defaultdict(list)
-            for point in data:
-                time = datetime.fromisoformat(point['timestamp'])
-                hourly_values[time.hour].append(point.get('value', 0))
-
-            if current_time.hour in hourly_values and len(hourly_values[current_time.hour]) > 2:
-                hourly_avg = np.mean(hourly_values[current_time.hour])
-                hourly_std = np.std(hourly_values[current_time.hour])
-                features['seasonal_deviation'] = (current_value - hourly_avg) / max(hourly_std, 1)
-            else:
-                features['seasonal_deviation'] = 0
-        else:
-            # 默认值
-            for feature in ['deviation_from_mean', 'deviation_from_median', 'percentile_rank',
-                          'z_score', 'iqr_score', 'seasonal_deviation']:
-                features[feature] = 0
-
-        # 返回特征向量（按固定顺序）
-        return np.array([features.get(name, 0) for name in self.feature_names])
-
-    def _calculate_moving_average(self, data: List[Dict], current_index: int, window: int) -> float:
-        """计算移动平均"""
-        start_index = max(0, current_index - window + 1)
-        values = [point.get('value', 0) for point in data[start_index:current_index + 1]]
-        return np.mean(values) if values else 0
-
-    def _calculate_volatility(self, data: List[Dict], current_index: int, window: int) -> float:
-        """计算波动率（标准差）"""
-        start_index = max(0, current_index - window + 1)
-        values = [point.get('value', 0) for point in data[start_index:current_index + 1]]
-        return np.std(values) if len(values) > 1 else 0
-
-    def _calculate_trend_slope(self, data: List[Dict], current_index: int, window: int) -> float:
-        """计算趋势斜率"""
-        start_index = max(0, current_index - window + 1)
-        if current_index - start_index < 2:
-            return 0
-
-        x = np.arange(len(data[start_index:current_index + 1]))
-        y = np.array([point.get('value', 0) for point in data[start_index:current_index + 1]])
-
-        # 线性回归计算斜率
-        if len(x) > 1 and len(y) > 1:
-            slope = np.polyfit(x, y, 1)[0]
-            return slope
-        return 0
 
 class AnomalyDetector:
     """异常检测器主类"""
 
-    def __init__(self, model_dir: str = "models/anomaly_detection"):
+    def __init__(self, model_dir: str = "models/anomaly_detection", training_workers: int = 2):
         self.models = {}  # metric_name -> model
         self.scalers = {}  # metric_name -> scaler
         self.feature_extractor = FeatureExtractor()
@@ -182,6 +108,13 @@ class AnomalyDetector:
         self.max_training_samples = 5000
         self.detection_threshold = -0.1  # Isolation Forest阈值
 
+        # 已编译模型，所有指标一次遍历打分；模型只在训练或首次使用时从磁盘加载
+        self.forest_bank = ForestBank()
+        self._missing_models = set()  # 磁盘上也不存在模型的指标，避免每次检测都访问磁盘
+        self._pending_training: Dict[str, List[Dict]] = {}  # 检测时发现缺少模型的指标 -> 历史数据，等待进程池训练
+        self.training_workers = training_workers
+        self._training_pool: Optional[ProcessPoolExecutor] = None
+
     def train_model(self, metric_name: str, historical_data: List[Dict],
                    force_retrain: bool = False) -> bool:
         """训练异常检测模型"""
@@ -208,47 +141,18 @@ class AnomalyDetector:
             logger.info(f"Training anomaly detection model for {metric_name} with {len(historical_data)} samples")
 
             # 提取特征
-            features = []
-            valid_indices = []
-
-            for i in range(len(historical_data)):
-                try:
-                    feature_vector = self.feature_extractor.extract_features(historical_data, i)
-                    if not np.isnan(feature_vector).any():
-                        features.append(feature_vector)
-                        valid_indices.append(i)
-                except Exception as e:
-                    logger.warning(f"Failed to extract features for {metric_name} at index {i}: {e}")
+            features = self.feature_extractor.extract_feature_matrix(historical_data)
+            features = features[~np.isnan(features).any(axis=1)]
 
             if len(features) < self.min_training_samples:
                 logger.warning(f"Insufficient valid features for {metric_name}: {len(features)} < {self.min_training_samples}")
                 return False
 
-            features = np.array(features)
-
-            # 数据标准化
-            scaler = StandardScaler()
-            scaled_features = scaler.fit_transform(features)
-
-            # 训练Isolation Forest模型
-            model = IsolationForest(
-                contamination=0.1,  # 假设10%的异常率
-                random_state=42,
-                n_estimators=100,
-                max_samples='auto',
-                bootstrap=False
-            )
-
-            model.fit(scaled_features)
-
-            # 保存模型和标准化器
-            self.models[metric_name] = model
-            self.scalers[metric_name] = scaler
-            self.training_data[metric_name] = historical_data
+            model, scaler, scaled_features = _fit_isolation_forest(features)
 
             # 评估模型性能
             performance = self._evaluate_model(model, scaled_features)
-            self.performance_metrics[metric_name] = performance
+            self._install_model(metric_name, model, scaler, performance, historical_data)
 
             # 保存模型到文件
             self._save_model(metric_name, model, scaler, performance)
@@ -260,69 +164,93 @@ class AnomalyDetector:
             logger.error(f"Failed to train model for {metric_name}: {e}")
             return False
 
+    def _install_model(self, metric_name: str, model, scaler, performance: ModelPerformance,
+                       historical_data: List[Dict]):
+        """将训练好的模型放入内存缓存并编译"""
+        self.models[metric_name] = model
+        self.scalers[metric_name] = scaler
+        self.training_data[metric_name] = historical_data
+        self.performance_metrics[metric_name] = performance
+        self.forest_bank.add(metric_name, CompiledForest(model, scaler))
+        self._missing_models.discard(metric_name)
+
+    def _ensure_model(self, metric_name: str) -> bool:
+        """内存中没有模型时从磁盘加载一次"""
+        if metric_name in self.forest_bank:
+            return True
+        if metric_name in self.models:
+            self.forest_bank.add(metric_name, CompiledForest(self.models[metric_name], self.scalers[metric_name]))
+            return True
+        if metric_name in self._missing_models:
+            return False
+        if self.load_model(metric_name):
+            return True
+        self._missing_models.add(metric_name)
+        return False
+
     def detect_anomaly(self, metric_name: str, current_data: Dict,
                       historical_data: List[Dict] = None) -> Optional[AnomalyResult]:
         """检测异常"""
         try:
-            if metric_name not in self.models:
-                # 如果没有模型，尝试训练一个
-                if historical_data and len(historical_data) >= self.min_training_samples:
-                    if not self.train_model(metric_name, historical_data):
-                        return None
-                else:
-                    return None
-
-            model = self.models[metric_name]
-            scaler = self.scalers[metric_name]
-
-            # 获取历史数据用于特征提取
-            if historical_data is None:
-                historical_data = self.training_data.get(metric_name, [])
-
-            if not historical_data:
+            if not self._ensure_model(metric_name):
+                # 检测路径不训练模型，交给进程池在后台训练
+                self._queue_training(metric_name, historical_data)
                 return None
 
-            # 确保当前数据在历史数据的末尾
-            training_data = historical_data.copy()
-            training_data.append(current_data)
+            return self.detect_anomalies_batch({metric_name: (current_data, historical_data)}).get(metric_name)
 
-            # 提取特征
-            features = self.feature_extractor.extract_features(training_data, -1)
-
-            if np.isnan(features).any():
-                logger.warning(f"Invalid features detected for {metric_name}")
-                return None
+        except Exception as e:
+            logger.error(f"Failed to detect anomaly for {metric_name}: {e}")
+            return None
 
-            # 标准化特征
-            scaled_features = scaler.transform([features])[0]
+    def detect_anomalies_batch(self, points: Dict[str, Tuple[Dict, Optional[List[Dict]]]]) -> Dict[str, AnomalyResult]:
+        """批量检测：{指标: (当前数据, 历史数据)}，所有已有模型的指标一次打分
 
-            # 预测异常
-            anomaly_score = model.decision_function([scaled_features])[0]
-            is_anomaly = model.predict([scaled_features])[0] == -1
+        没有模型的指标跳过并加入待训练队列，由train_pending_async在后台补齐。
+        """
+        features = {}
+        for metric_name, (current_data, historical_data) in points.items():
+            try:
+                if not self._ensure_model(metric_name):
+                    self._queue_training(metric_name, historical_data)
+                    continue
+
+                # 获取历史数据用于特征提取
+                if historical_data is None:
+                    historical_data = self.training_data.get(metric_name, [])
+                if not historical_data:
+                    continue
+
+                # 当前数据放在历史数据的末尾
+                vector = self.feature_extractor.extract_features(historical_data + [current_data], -1)
+                if np.isnan(vector).any():
+                    logger.warning(f"Invalid features detected for {metric_name}")
+                    continue
+                features[metric_name] = vector
 
-            # 计算置信度
-            confidence = self._calculate_confidence(anomaly_score, metric_name)
+            except Exception as e:
+                logger.error(f"Failed to extract features for {metric_name}: {e}")
 
-            # 计算特征贡献
-            feature_contributions = self._calculate_feature_contributions(
-                scaled_features, model, metric_name
-            )
+        if not features:
+            return {}
 
-            result = AnomalyResult(
-                is_anomaly=is_anomaly,
-                anomaly_score=float(anomaly_score),
-                confidence=float(confidence),
-                feature_contributions=feature_contributions,
-                detected_at=datetime.utcnow(),
+        scores = self.forest_bank.score(features)
+        detected_at = datetime.utcnow()
+        results = {}
+        for metric_name, score in scores.items():
+            anomaly_score = float(score[0])
+            scaled_features = self.forest_bank.forests[metric_name].scale_features(features[metric_name])[0]
+            results[metric_name] = AnomalyResult(
+                # 与IsolationForest.predict一致：decision_function < 0 即为异常
+                is_anomaly=anomaly_score < 0,
+                anomaly_score=anomaly_score,
+                confidence=float(self._calculate_confidence(anomaly_score, metric_name)),
+                feature_contributions=self._calculate_feature_contributions(scaled_features),
+                detected_at=detected_at,
                 model_version=self._get_model_version(metric_name),
                 threshold_used=self.detection_threshold
             )
-
-            return result
-
-        except Exception as e:
-            logger.error(f"Failed to detect anomaly for {metric_name}: {e}")
-            return None
+        return results
 
     def _evaluate_model(self, model, features: np.ndarray) -> ModelPerformance:
         """评估模型性能"""
@@ -380,48 +308,19 @@ class AnomalyDetector:
         confidence = max(0, min(1, abs(adjusted_score) * 2))
         return confidence
 
-    def _calculate_feature_contributions(self, features: np.ndarray, model, metric_name: str) -> Dict[str, float]:
-        """计算特征对异常检测的贡献度"""
-        try:
-            # 简化的特征贡献计算
-            feature_names = self.feature_extractor.feature_names
-
-            # 计算每个特征与平均值的偏差
-            if metric_name in self.training_data and len(self.training_data[metric_name]) > 10:
-                # 使用训练数据计算特征统计
-                training_features = []
-                for i in range(min(100, len(self.training_data[metric_name]))):
-                    feat = self.feature_extractor.extract_features(self.training_data[metric_name], i)
-                    if not np.isnan(feat).any():
-                        training_features.append(feat)
-
-                if training_features:
-                    training_features = np.array(training_features)
-                    feature_means = np.mean(training_features, axis=0)
-                    feature_stds = np.std(training_features, axis=0)
-
-                    contributions = {}
-                    for i, name in enumerate(feature_names):
-                        if i < len(features) and i < len(feature_means) and feature_stds[i] > 0:
-                            z_score = abs(features[i] - feature_means[i]) / feature_stds[i]
-                            contributions[name] = float(z_score)
-                        else:
-                            contributions[name] = 0.0
-
-                    return contributions
-
-            # 回退到简单的特征值贡献
-            return {name: float(abs(features[i]) if i < len(features) else 0.0)
-                   for i, name in enumerate(feature_names)}
+    def _calculate_feature_contributions(self, scaled_features: np.ndarray) -> Dict[str, float]:
+        """计算特征对异常检测的贡献度
 
-        except Exception as e:
-            logger.error(f"Failed to calculate feature contributions: {e}")
-            return {}
+        标准化后的特征即为相对训练集均值的z分数，无需重新提取训练特征。
+        """
+        return {
+            name: float(abs(scaled_features[i])) if i < len(scaled_features) else 0.0
+            for i, name in enumerate(self.feature_extractor.feature_names)
+        }
 
     def _save_model(self, metric_name: str, model, scaler, performance: ModelPerformance):
         """保存模型到文件"""
         try:
-            import os
             os.makedirs(self.model_dir, exist_ok=True)
 
             model_data = {
@@ -453,6 +352,8 @@ class AnomalyDetector:
             self.models[metric_name] = model_data['model']
             self.scalers[metric_name] = model_data['scaler']
             self.performance_metrics[metric_name] = model_data['performance']
+            self.forest_bank.add(metric_name, CompiledForest(model_data['model'], model_data['scaler']))
+            self._missing_models.discard(metric_name)
 
             logger.info(f"Model loaded for {metric_name} from {model_file}")
             return True
@@ -511,10 +412,74 @@ class AnomalyDetector:
 
         return results
 
+    async def train_models_async(self, training_data: Dict[str, List[Dict]],
+                                 force_retrain: bool = False) -> Dict[str, bool]:
+        """在进程池中并行训练，训练期间事件循环和检测不受影响"""
+        if self._training_pool is None:
+            self._training_pool = ProcessPoolExecutor(max_workers=self.training_workers)
+
+        loop = asyncio.get_running_loop()
+        jobs = {}
+        results = {}
+        for metric_name, data in training_data.items():
+            performance = self.performance_metrics.get(metric_name)
+            if (not force_retrain and metric_name in self.models and performance and
+                    datetime.utcnow() - performance.training_date < timedelta(days=7)):
+                results[metric_name] = True
+                continue
+            if len(data) < self.min_training_samples:
+                results[metric_name] = False
+                continue
+
+            data = data[-self.max_training_samples:]
+            values, hours, weekdays = series_arrays(data)
+            jobs[metric_name] = (data, loop.run_in_executor(
+                self._training_pool, _train_in_worker, values, hours, weekdays, self.min_training_samples
+            ))
+
+        for metric_name, (data, job) in jobs.items():
+            try:
+                trained = await job
+                if trained is None:
+                    results[metric_name] = False
+                    continue
+                model, scaler, scaled_features = trained
+                performance = await asyncio.to_thread(self._evaluate_model, model, scaled_features)
+                self._install_model(metric_name, model, scaler, performance, data)
+                await asyncio.to_thread(self._save_model, metric_name, model, scaler, performance)
+                results[metric_name] = True
+                logger.info(f"Successfully trained model for {metric_name} - F1: {performance.f1_score:.3f}")
+            except Exception as e:
+                logger.error(f"Failed to train model for {metric_name}: {e}")
+                results[metric_name] = False
+
+        return results
+
+    def _queue_training(self, metric_name: str, historical_data: Optional[List[Dict]]):
+        """记录缺少模型的指标，数据足够时等待后台训练"""
+        if historical_data and len(historical_data) >= self.min_training_samples:
+            self._pending_training[metric_name] = historical_data
+
+    @property
+    def has_pending_training(self) -> bool:
+        return bool(self._pending_training)
+
+    async def train_pending_async(self) -> Dict[str, bool]:
+        """训练检测时排队的指标"""
+        pending, self._pending_training = self._pending_training, {}
+        if not pending:
+            return {}
+        return await self.train_models_async(pending)
+
+    def shutdown_training_pool(self):
+        """关闭训练进程池"""
+        if self._training_pool is not None:
+            self._training_pool.shutdown(wait=False, cancel_futures=True)
+            self._training_pool = None
+
     def cleanup_old_models(self, days_threshold: int = 30):
         """清理旧模型"""
         try:
-            import os
             if not os.path.exists(self.model_dir):
                 return
 
@@ -536,4 +501,47 @@ class AnomalyDetector:
             logger.error(f"Failed to cleanup old models: {e}")
 
 # 全局异常检测器实例
-anomaly_detector = AnomalyDetector()
\ No newline at end of file
+anomaly_detector = AnomalyDetector()
+
+
+def benchmark_batch_detection(metrics: int = 300, points: int = 500) -> Dict[str, Any]:
+    """对比逐指标调用sklearn打分与批量打分的单次评估耗时"""
+    import tempfile
+    import time
+
+    detector = AnomalyDetector(model_dir=tempfile.mkdtemp(prefix="anomaly_bench_"))
+    rng = np.random.default_rng(0)
+    start = datetime(2024, 1, 1)
+    histories = {}
+    for i in range(metrics):
+        values = 100 + 10 * np.sin(np.arange(points) / 20) + rng.normal(0, 3, points)
+        histories[f"metric_{i}"] = [
+            {'value': float(v), 'timestamp': (start + timedelta(minutes=5 * k)).isoformat()}
+            for k, v in enumerate(values)
+        ]
+    for name, history in histories.items():
+        detector.train_model(name, history, force_retrain=True)
+
+    current = {'value': 160.0, 'timestamp': (start + timedelta(minutes=5 * points)).isoformat()}
+    requests = {name: (current, history) for name, history in histories.items()}
+
+    started = time.perf_counter()
+    for name, history in histories.items():
+        features = detector.feature_extractor.extract_features(history + [current], -1)
+        detector.models[name].decision_function(detector.scalers[name].transform([features]))
+    per_metric = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = detector.detect_anomalies_batch(requests)
+    batched = time.perf_counter() - started
+
+    return {
+        'metrics': metrics,
+        'per_metric_ms': round(per_metric * 1000, 1),
+        'batched_ms': round(batched * 1000, 1),
+        'anomalies': sum(1 for result in results.values() if result.is_anomaly),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_batch_detection(), indent=2))
@@ -0,0 +1,380 @@
+"""
+异常检测向量化计算
+Vectorized feature extraction and batched Isolation Forest scoring
+
+特征一次性按整条序列用前缀和计算；IsolationForest的树展平为数组，
+所有指标的待检测点在一次遍历中完成打分，不再逐指标、逐点调用decision_function。
+"""
+from bisect import bisect_right, insort
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FEATURE_NAMES = [
+    'value', 'rate_of_change', 'moving_avg_5', 'moving_avg_15', 'moving_avg_60',
+    'volatility_5', 'volatility_15', 'trend_slope_15', 'trend_slope_60',
+    'hour_of_day', 'day_of_week', 'is_weekend', 'is_business_hours',
+    'deviation_from_mean', 'deviation_from_median', 'percentile_rank',
+    'z_score', 'iqr_score', 'seasonal_deviation'
+]
+
+MIN_SERIES_LENGTH = 5
+
+
+def series_arrays(data: Sequence[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """将[{value, timestamp}]转换为数值、小时、星期数组，时间戳只解析一次"""
+    n = len(data)
+    values = np.empty(n)
+    hours = np.empty(n, dtype=np.int64)
+    weekdays = np.empty(n, dtype=np.int64)
+    for i, point in enumerate(data):
+        timestamp = point['timestamp']
+        if not isinstance(timestamp, datetime):
+            timestamp = datetime.fromisoformat(timestamp)
+        values[i] = point.get('value', 0)
+        hours[i] = timestamp.hour
+        weekdays[i] = timestamp.weekday()
+    return values, hours, weekdays
+
+
+def _window_bounds(rows: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    starts = np.maximum(0, rows - window + 1)
+    return starts, rows + 1 - starts
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0.0], np.cumsum(values)))
+
+
+def _expanding_quantiles(values: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """每行前缀的中位数、25/75分位数和不大于当前值的个数（有序前缀增量插入，按numpy默认线性插值）"""
+    count = len(rows)
+    median = np.empty(count)
+    q25 = np.empty(count)
+    q75 = np.empty(count)
+    rank = np.empty(count)
+
+    wanted = np.zeros(len(values), dtype=bool)
+    wanted[rows] = True
+    position = {row: k for k, row in enumerate(rows)}
+    ordered: List[float] = []
+
+    def quantile(q: float) -> float:
+        pos = q * (len(ordered) - 1)
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+    for i in range(int(rows.max()) + 1):
+        insort(ordered, values[i])
+        if wanted[i]:
+            k = position[i]
+            median[k] = quantile(0.5)
+            q25[k] = quantile(0.25)
+            q75[k] = quantile(0.75)
+            rank[k] = bisect_right(ordered, values[i])
+    return median, q25, q75, rank
+
+
+def _window_slope(window: np.ndarray) -> float:
+    length = len(window)
+    if length < 3:
+        return 0.0
+    x = np.arange(length) - (length - 1) / 2
+    return float(x @ (window - window.mean()) / (x @ x))
+
+
+def last_row_features(values: np.ndarray, hours: np.ndarray, weekdays: np.ndarray) -> np.ndarray:
+    """只计算最后一个点的特征（每次检测的路径），结果与feature_matrix最后一行一致"""
+    n = len(values)
+    out = np.zeros(len(FEATURE_NAMES))
+    if n < MIN_SERIES_LENGTH:
+        return out
+
+    current = values[-1]
+    previous = values[-2]
+    out[0] = current
+    out[1] = (current - previous) / max(abs(previous), 1)
+    out[2] = values[-5:].mean()
+    out[3] = values[-15:].mean()
+    out[4] = values[-60:].mean()
+    out[5] = values[-5:].std()
+    out[6] = values[-15:].std()
+    out[7] = _window_slope(values[-15:])
+    out[8] = _window_slope(values[-60:])
+
+    hour = int(hours[-1])
+    weekday = int(weekdays[-1])
+    out[9] = hour
+    out[10] = weekday
+    out[11] = weekday >= 5
+    out[12] = 9 <= hour <= 17
+
+    ordered = np.sort(values)
+
+    def quantile(q: float) -> float:
+        pos = q * (n - 1)
+        low = int(pos)
+        high = min(low + 1, n - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+    mean = values.mean()
+    std = max(values.std(), 1)
+    median = quantile(0.5)
+    out[13] = out[16] = (current - mean) / std
+    out[14] = (current - median) / std
+    out[15] = np.searchsorted(ordered, current, side='right') / n * 100
+    out[17] = (current - median) / max(quantile(0.75) - quantile(0.25), 1)
+
+    same_hour = values[hours == hour]
+    if len(same_hour) > 2:
+        out[18] = (current - same_hour.mean()) / max(same_hour.std(), 1)
+    return out
+
+
+def feature_matrix(values: np.ndarray, hours: np.ndarray, weekdays: np.ndarray,
+                   rows: Optional[Iterable[int]] = None) -> np.ndarray:
+    """计算指定行（默认全部）的特征矩阵，每行只使用该点及之前的数据，季节性基线使用整条序列"""
+    n = len(values)
+    rows = np.arange(n) if rows is None else np.asarray(list(rows), dtype=np.int64)
+    rows = np.where(rows < 0, rows + n, rows)
+    out = np.zeros((len(rows), len(FEATURE_NAMES)))
+    if n < MIN_SERIES_LENGTH or not len(rows):
+        return out
+
+    current = values[rows]
+    # 方差和斜率对平移不变，先去中心化以减小前缀和的舍入误差
+    centered = values - values.mean()
+    sums = _prefix(centered)
+    squares = _prefix(centered * centered)
+    weighted = _prefix(centered * np.arange(n))
+
+    out[:, 0] = current
+    previous = np.where(rows > 0, values[np.maximum(rows - 1, 0)], 0.0)
+    out[:, 1] = np.where(rows > 0, (current - previous) / np.maximum(np.abs(previous), 1), 0.0)
+
+    def window_stats(window: int):
+        starts, counts = _window_bounds(rows, window)
+        total = sums[rows + 1] - sums[starts]
+        mean = total / counts
+        var = np.maximum((squares[rows + 1] - squares[starts]) / counts - mean * mean, 0.0)
+        return starts, counts, total, mean, var
+
+    for column, window in ((2, 5), (3, 15), (4, 60)):
+        _, _, _, mean, _ = window_stats(window)
+        out[:, column] = mean + values.mean()
+
+    for column, window in ((5, 5), (6, 15)):
+        _, counts, _, _, var = window_stats(window)
+        out[:, column] = np.where(counts > 1, np.sqrt(var), 0.0)
+
+    for column, window in ((7, 15), (8, 60)):
+        starts, counts, total, _, _ = window_stats(window)
+        length = counts.astype(float)
+        sum_x = length * (length - 1) / 2
+        sum_xx = (length - 1) * length * (2 * length - 1) / 6
+        sum_xy = weighted[rows + 1] - weighted[starts] - starts * total
+        denominator = length * sum_xx - sum_x * sum_x
+        slope = np.divide(length * sum_xy - sum_x * total, denominator,
+                          out=np.zeros(len(rows)), where=denominator > 0)
+        out[:, column] = np.where(counts >= 3, slope, 0.0)
+
+    hour = hours[rows]
+    weekday = weekdays[rows]
+    out[:, 9] = hour
+    out[:, 10] = weekday
+    out[:, 11] = weekday >= 5
+    out[:, 12] = (hour >= 9) & (hour <= 17)
+
+    counts = rows + 1.0
+    mean = sums[rows + 1] / counts
+    var = np.maximum(squares[rows + 1] / counts - mean * mean, 0.0)
+    std = np.maximum(np.where(counts > 1, np.sqrt(var), 1.0), 1.0)
+    deviation = (centered[rows] - mean) / std
+    median, q25, q75, rank = _expanding_quantiles(values, rows)
+    out[:, 13] = deviation
+    out[:, 14] = (current - median) / std
+    out[:, 15] = rank / counts * 100
+    out[:, 16] = deviation
+    out[:, 17] = np.where(counts > 3, (current - median) / np.maximum(q75 - q25, 1), 0.0)
+
+    hour_counts = np.bincount(hours, minlength=24).astype(float)
+    hour_sums = np.bincount(hours, weights=values, minlength=24)
+    hour_means = np.divide(hour_sums, hour_counts, out=np.zeros_like(hour_sums), where=hour_counts > 0)
+    hour_squares = np.bincount(hours, weights=(values - hour_means[hours]) ** 2, minlength=24)
+    hour_stds = np.sqrt(np.divide(hour_squares, hour_counts, out=np.zeros_like(hour_squares), where=hour_counts > 0))
+    out[:, 18] = np.where(
+        hour_counts[hour] > 2,
+        (current - hour_means[hour]) / np.maximum(hour_stds[hour], 1),
+        0.0
+    )
+    return out
+
+
+def average_path_length(n_samples) -> np.ndarray:
+    """n个样本的二叉搜索树平均未命中路径长度（与IsolationForest一致）"""
+    n = np.asarray(n_samples, dtype=float)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    large = n > 2
+    result[large] = 2.0 * (np.log(n[large] - 1.0) + np.euler_gamma) - 2.0 * (n[large] - 1.0) / n[large]
+    return result
+
+
+class CompiledForest:
+    """展平后的IsolationForest及其StandardScaler"""
+
+    def __init__(self, model, scaler=None):
+        lefts, rights, features, thresholds, leaf_values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        estimators_features = getattr(model, 'estimators_features_', None)
+        for index, estimator in enumerate(model.estimators_):
+            tree = estimator.tree_
+            left = np.asarray(tree.children_left, dtype=np.int64)
+            right = np.asarray(tree.children_right, dtype=np.int64)
+            feature = np.asarray(tree.feature, dtype=np.int64)
+            threshold = np.asarray(tree.threshold, dtype=float).copy()
+            node_count = len(left)
+            is_leaf = left == -1
+
+            # 逐层向下传播深度，迭代次数等于树高
+            depth = np.zeros(node_count, dtype=np.int64)
+            internal = np.flatnonzero(~is_leaf)
+            while True:
+                propagated = depth.copy()
+                propagated[left[internal]] = depth[internal] + 1
+                propagated[right[internal]] = depth[internal] + 1
+                if np.array_equal(propagated, depth):
+                    break
+                depth = propagated
+            max_depth = max(max_depth, int(depth.max()))
+
+            if estimators_features is not None:
+                columns = np.asarray(estimators_features[index], dtype=np.int64)
+                feature = np.where(is_leaf, 0, columns[np.maximum(feature, 0)])
+            else:
+                feature = np.where(is_leaf, 0, feature)
+
+            # 叶子节点自环且阈值为+inf，统一迭代max_depth次即可停在叶子上
+            own = np.arange(node_count) + offset
+            lefts.append(np.where(is_leaf, own, left + offset))
+            rights.append(np.where(is_leaf, own, right + offset))
+            threshold[is_leaf] = np.inf
+            thresholds.append(threshold)
+            features.append(feature)
+            leaf_values.append(np.where(
+                is_leaf, depth + average_path_length(np.asarray(tree.n_node_samples)), 0.0
+            ))
+            roots.append(offset)
+            offset += node_count
+
+        self.left = np.concatenate(lefts).astype(np.int32)
+        self.right = np.concatenate(rights).astype(np.int32)
+        self.feature = np.concatenate(features).astype(np.int16)
+        self.threshold = np.concatenate(thresholds)
+        self.leaf_value = np.concatenate(leaf_values)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.max_depth = max_depth
+        self.n_trees = len(roots)
+        self.denominator = self.n_trees * float(average_path_length([model.max_samples_])[0])
+        self.offset = float(model.offset_)
+        self.mean = None if scaler is None else np.asarray(scaler.mean_, dtype=float)
+        self.scale = None if scaler is None else np.asarray(scaler.scale_, dtype=float)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.left)
+
+    def scale_features(self, features: np.ndarray) -> np.ndarray:
+        """标准化并按sklearn的float32精度取整"""
+        features = np.atleast_2d(np.asarray(features, dtype=float))
+        if self.mean is not None:
+            features = (features - self.mean) / self.scale
+        return features.astype(np.float32).astype(float)
+
+    def decision_function(self, features: np.ndarray) -> np.ndarray:
+        """单个模型打分，等价于scaler.transform后调用model.decision_function"""
+        bank = ForestBank()
+        bank.add("_", self)
+        return bank.score({"_": features})["_"]
+
+
+class ForestBank:
+    """多个已编译模型拼接成一组数组，一次遍历完成所有指标的打分"""
+
+    def __init__(self):
+        self.forests: Dict[str, CompiledForest] = {}
+        self._dirty = True
+        self._offsets: Dict[str, int] = {}
+
+    def add(self, name: str, forest: CompiledForest):
+        self.forests[name] = forest
+        self._dirty = True
+
+    def remove(self, name: str):
+        if self.forests.pop(name, None) is not None:
+            self._dirty = True
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.forests
+
+    def _rebuild(self):
+        """模型集合变化（训练、加载）时重建，检测时只读"""
+        offsets, offset = {}, 0
+        for name, forest in self.forests.items():
+            offsets[name] = offset
+            offset += forest.node_count
+        forests = list(self.forests.values())
+        if forests:
+            self._left = np.concatenate([f.left.astype(np.int64) + offsets[n] for n, f in self.forests.items()])
+            self._right = np.concatenate([f.right.astype(np.int64) + offsets[n] for n, f in self.forests.items()])
+            self._feature = np.concatenate([f.feature for f in forests]).astype(np.int64)
+            self._threshold = np.concatenate([f.threshold for f in forests])
+            self._leaf_value = np.concatenate([f.leaf_value for f in forests])
+            self._max_depth = max(f.max_depth for f in forests)
+        self._offsets = offsets
+        self._dirty = False
+
+    def score(self, features: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """对{指标: 特征矩阵}批量打分，返回{指标: decision_function分数}"""
+        names = [name for name in features if name in self.forests]
+        if not names:
+            return {}
+        if self._dirty:
+            self._rebuild()
+
+        blocks, nodes, samples, sizes = [], [], [], []
+        sample_base = 0
+        for name in names:
+            forest = self.forests[name]
+            matrix = forest.scale_features(features[name])
+            rows = len(matrix)
+            blocks.append(matrix)
+            sizes.append(rows)
+            # 每个(样本, 树)一条路径
+            nodes.append(np.tile(forest.roots + self._offsets[name], rows))
+            samples.append(np.repeat(np.arange(sample_base, sample_base + rows), forest.n_trees))
+            sample_base += rows
+
+        X = np.concatenate(blocks)
+        node = np.concatenate(nodes)
+        sample = np.concatenate(samples)
+        for _ in range(self._max_depth):
+            go_left = X[sample, self._feature[node]] <= self._threshold[node]
+            node = np.where(go_left, self._left[node], self._right[node])
+
+        depths = np.bincount(sample, weights=self._leaf_value[node], minlength=sample_base)
+
+        results, start = {}, 0
+        for name, rows in zip(names, sizes):
+            forest = self.forests[name]
+            path = depths[start:start + rows]
+            if forest.denominator:
+                path = path / forest.denominator
+            else:
+                path = np.ones_like(path)
+            results[name] = -(2.0 ** -path) - forest.offset
+            start += rows
+        return results
@@ -1,6 +1,10 @@
 """
 业务监控模块
 追踪API使用、AI模型调用、用户会话等业务指标
+
+API和AI模型调用保存在列式环形缓冲区（固定内存，供导出使用），
+同时按时间桶聚合（计数、求和、DDSketch分位数、HyperLogLog用户去重），
+统计查询的耗时与时间桶数成正比，与调用次数无关。
 """
 import json
 import time
@@ -11,8 +15,30 @@ from collections import defaultdict, deque
 import uuid
 import logging
 
+import numpy as np
+
+from backend.monitoring.metric_store import (
+    ColumnarRingBuffer, DDSketch, HyperLogLog, StringInterner, TimeBucketedAggregates
+)
+from backend.monitoring.prometheus_registry import metrics_registry
+
 logger = logging.getLogger(__name__)
 
+# Prometheus指标（HTTP请求由性能中间件统计）
+AI_MODEL_CALLS = metrics_registry.counter(
+    "ai_model_calls_total", "AI模型调用次数", ("model", "provider", "status")
+)
+AI_MODEL_TOKENS = metrics_registry.counter(
+    "ai_model_tokens_total", "AI模型消耗的token数", ("model", "provider", "kind")
+)
+AI_MODEL_COST = metrics_registry.counter(
+    "ai_model_cost_usd_total", "AI模型调用成本（美元）", ("model", "provider")
+)
+AI_MODEL_LATENCY = metrics_registry.histogram(
+    "ai_model_response_seconds", "AI模型响应耗时（秒）", ("model", "provider"),
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+)
+
 @dataclass
 class BusinessMetric:
     """业务指标数据结构"""
@@ -62,10 +88,40 @@ class AIModelMetric:
 class BusinessMonitor:
     """业务监控器"""
 
-    def __init__(self):
+    def __init__(self, max_metrics_size: int = 10000, bucket_seconds: int = 300,
+                 retention_hours: int = 24 * 7):
         self.metrics: List[BusinessMetric] = []
-        self.api_calls: List[APICallMetric] = []
-        self.ai_model_calls: List[AIModelMetric] = []
+        self.max_metrics_size = max_metrics_size
+
+        # 字符串驻留（高基数字段设置容量上限）
+        self._endpoints = StringInterner(10000)
+        self._methods = StringInterner(32)
+        self._users = StringInterner(1000000)
+        self._user_agents = StringInterner(10000)
+        self._ips = StringInterner(100000)
+        self._models = StringInterner(1000)
+        self._providers = StringInterner(100)
+        self._error_messages = StringInterner(1000)
+
+        # 最近的原始调用记录
+        self._api_buffer = ColumnarRingBuffer(max_metrics_size, {
+            'timestamp': np.float64, 'endpoint': np.int32, 'method': np.int32,
+            'user': np.int32, 'response_time': np.float64, 'status_code': np.int16,
+            'request_size': np.int64, 'response_size': np.int64,
+            'user_agent': np.int32, 'ip_address': np.int32
+        })
+        self._ai_buffer = ColumnarRingBuffer(max_metrics_size, {
+            'timestamp': np.float64, 'model': np.int32, 'provider': np.int32,
+            'user': np.int32, 'prompt_tokens': np.int64, 'completion_tokens': np.int64,
+            'cost': np.float64, 'response_time': np.float64, 'success': np.bool_,
+            'error_message': np.int32
+        })
+
+        # 按时间桶聚合（端点/模型 × 时间桶）
+        retention_seconds = retention_hours * 3600
+        self._api_buckets = TimeBucketedAggregates(bucket_seconds, retention_seconds)
+        self._ai_buckets = TimeBucketedAggregates(bucket_seconds, retention_seconds)
+
         self.active_sessions: Dict[str, datetime] = {}
         self.daily_stats: Dict[str, Dict] = defaultdict(lambda: defaultdict(int))
         self.real_time_stats = {
@@ -74,58 +130,129 @@ class BusinessMonitor:
             'errors_per_minute': deque(maxlen=60),    # 最近60分钟的错误
             'response_times': deque(maxlen=1000),     # 最近1000个响应时间
         }
-        self.max_metrics_size = 10000
+
+    @property
+    def api_calls(self) -> List[APICallMetric]:
+        """缓冲区内的API调用记录（按时间顺序）"""
+        return self._api_calls_since(None)
+
+    @property
+    def ai_model_calls(self) -> List[AIModelMetric]:
+        """缓冲区内的AI模型调用记录（按时间顺序）"""
+        return self._ai_calls_since(None)
+
+    def _api_calls_since(self, since: Optional[float]) -> List[APICallMetric]:
+        columns = self._api_buffer.select(since)
+        return [
+            APICallMetric(
+                endpoint=self._endpoints.lookup(endpoint),
+                method=self._methods.lookup(method),
+                user_id=self._users.lookup(user),
+                response_time=float(response_time),
+                status_code=int(status_code),
+                request_size=int(request_size),
+                response_size=int(response_size),
+                timestamp=datetime.utcfromtimestamp(timestamp),
+                user_agent=self._user_agents.lookup(user_agent),
+                ip_address=self._ips.lookup(ip_address)
+            )
+            for timestamp, endpoint, method, user, response_time, status_code,
+                request_size, response_size, user_agent, ip_address in zip(
+                columns['timestamp'].tolist(), columns['endpoint'].tolist(),
+                columns['method'].tolist(), columns['user'].tolist(),
+                columns['response_time'].tolist(), columns['status_code'].tolist(),
+                columns['request_size'].tolist(), columns['response_size'].tolist(),
+                columns['user_agent'].tolist(), columns['ip_address'].tolist()
+            )
+        ]
+
+    def _ai_calls_since(self, since: Optional[float]) -> List[AIModelMetric]:
+        columns = self._ai_buffer.select(since)
+        return [
+            AIModelMetric(
+                model_name=self._models.lookup(model),
+                provider=self._providers.lookup(provider),
+                user_id=self._users.lookup(user),
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                cost=cost,
+                response_time=response_time,
+                success=success,
+                error_message=self._error_messages.lookup(error_message) or None,
+                timestamp=datetime.utcfromtimestamp(timestamp)
+            )
+            for timestamp, model, provider, user, prompt_tokens, completion_tokens,
+                cost, response_time, success, error_message in zip(
+                columns['timestamp'].tolist(), columns['model'].tolist(),
+                columns['provider'].tolist(), columns['user'].tolist(),
+                columns['prompt_tokens'].tolist(), columns['completion_tokens'].tolist(),
+                columns['cost'].tolist(), columns['response_time'].tolist(),
+                columns['success'].tolist(), columns['error_message'].tolist()
+            )
+        ]
 
     def track_api_call(self, endpoint: str, method: str, user_id: str,
                       response_time: float, status_code: int,
                       request_size: int = 0, response_size: int = 0,
                       user_agent: str = '', ip_address: str = ''):
         """追踪API调用"""
-        metric = APICallMetric(
-            endpoint=endpoint,
-            method=method,
-            user_id=user_id,
+        timestamp = time.time()
+        endpoint_id = self._endpoints.intern(endpoint)
+        user = self._users.intern(user_id)
+
+        self._api_buffer.append(
+            timestamp=timestamp,
+            endpoint=endpoint_id,
+            method=self._methods.intern(method),
+            user=user,
             response_time=response_time,
             status_code=status_code,
             request_size=request_size,
             response_size=response_size,
-            timestamp=datetime.utcnow(),
-            user_agent=user_agent,
-            ip_address=ip_address
+            user_agent=self._user_agents.intern(user_agent),
+            ip_address=self._ips.intern(ip_address)
         )
+        self._api_buckets.add(timestamp, endpoint_id, user, response_time, status_code >= 400)
 
-        self.api_calls.append(metric)
-        self._update_real_time_stats(metric)
-        self._update_daily_stats(metric)
-
-        # 保持列表大小在合理范围内
-        if len(self.api_calls) > self.max_metrics_size:
-            self.api_calls = self.api_calls[-self.max_metrics_size:]
+        self._update_real_time_stats(response_time, status_code)
+        self._update_daily_stats(timestamp, endpoint, method, status_code)
 
     def track_ai_model_usage(self, model_name: str, provider: str, user_id: str,
                            prompt_tokens: int, completion_tokens: int,
                            cost: float, response_time: float,
                            success: bool = True, error_message: str = None):
         """追踪AI模型使用情况"""
-        metric = AIModelMetric(
-            model_name=model_name,
-            provider=provider,
-            user_id=user_id,
+        timestamp = time.time()
+        model_id = self._models.intern(model_name)
+        user = self._users.intern(user_id)
+        total_tokens = prompt_tokens + completion_tokens
+
+        self._ai_buffer.append(
+            timestamp=timestamp,
+            model=model_id,
+            provider=self._providers.intern(provider),
+            user=user,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
-            total_tokens=prompt_tokens + completion_tokens,
             cost=cost,
             response_time=response_time,
             success=success,
-            error_message=error_message
+            error_message=self._error_messages.intern(error_message)
         )
+        self._ai_buckets.add(timestamp, model_id, user, response_time, not success, {
+            'tokens': total_tokens,
+            'cost': cost,
+            'success_time': response_time if success else 0.0
+        })
 
-        self.ai_model_calls.append(metric)
-        self._update_ai_stats(metric)
+        self._update_ai_stats(timestamp, model_name, total_tokens, cost, success)
 
-        # 保持列表大小在合理范围内
-        if len(self.ai_model_calls) > self.max_metrics_size:
-            self.ai_model_calls = self.ai_model_calls[-self.max_metrics_size:]
+        AI_MODEL_CALLS.labels(model_name, provider, "success" if success else "error").inc()
+        AI_MODEL_TOKENS.labels(model_name, provider, "prompt").inc(prompt_tokens)
+        AI_MODEL_TOKENS.labels(model_name, provider, "completion").inc(completion_tokens)
+        AI_MODEL_COST.labels(model_name, provider).inc(cost)
+        AI_MODEL_LATENCY.labels(model_name, provider).observe(response_time)
 
     def track_user_session(self, user_id: str, session_id: str, action: str = 'start'):
         """追踪用户会话"""
@@ -163,7 +290,7 @@ class BusinessMonitor:
         if len(self.metrics) > self.max_metrics_size:
             self.metrics = self.metrics[-self.max_metrics_size:]
 
-    def _update_real_time_stats(self, metric: APICallMetric):
+    def _update_real_time_stats(self, response_time: float, status_code: int):
         """更新实时统计"""
         current_minute = datetime.utcnow().minute
 
@@ -175,7 +302,7 @@ class BusinessMonitor:
         })
 
         # 更新错误计数
-        if metric.status_code >= 400:
+        if status_code >= 400:
             self.real_time_stats['errors_per_minute'].append({
                 'minute': current_minute,
                 'count': 1,
@@ -184,154 +311,125 @@ class BusinessMonitor:
 
         # 更新响应时间
         self.real_time_stats['response_times'].append({
-            'time': metric.response_time,
+            'time': response_time,
             'timestamp': datetime.utcnow()
         })
 
-    def _update_daily_stats(self, metric: APICallMetric):
+    def _update_daily_stats(self, timestamp: float, endpoint: str, method: str, status_code: int):
         """更新每日统计"""
-        date_key = metric.timestamp.strftime('%Y-%m-%d')
+        date_key = time.strftime('%Y-%m-%d', time.gmtime(timestamp))
 
         self.daily_stats[date_key]['total_requests'] += 1
-        self.daily_stats[date_key][f'requests_{metric.method}'] += 1
-        self.daily_stats[date_key][f'endpoint_{metric.endpoint.replace("/", "_")}'] += 1
+        self.daily_stats[date_key][f'requests_{method}'] += 1
+        self.daily_stats[date_key][f'endpoint_{endpoint.replace("/", "_")}'] += 1
 
-        if metric.status_code >= 400:
+        if status_code >= 400:
             self.daily_stats[date_key]['total_errors'] += 1
 
-    def _update_ai_stats(self, metric: AIModelMetric):
+    def _update_ai_stats(self, timestamp: float, model_name: str, total_tokens: int,
+                         cost: float, success: bool):
         """更新AI模型统计"""
-        date_key = metric.timestamp.strftime('%Y-%m-%d')
+        date_key = time.strftime('%Y-%m-%d', time.gmtime(timestamp))
 
         self.daily_stats[date_key]['ai_calls_total'] += 1
-        self.daily_stats[date_key]['ai_tokens_total'] += metric.total_tokens
-        self.daily_stats[date_key]['ai_cost_total'] += metric.cost
-        self.daily_stats[date_key][f'ai_calls_{metric.model_name.replace(":", "_")}'] += 1
+        self.daily_stats[date_key]['ai_tokens_total'] += total_tokens
+        self.daily_stats[date_key]['ai_cost_total'] += cost
+        self.daily_stats[date_key][f'ai_calls_{model_name.replace(":", "_")}'] += 1
 
-        if not metric.success:
+        if not success:
             self.daily_stats[date_key]['ai_errors_total'] += 1
 
     def get_api_stats(self, hours: int = 24) -> Dict:
-        """获取API统计数据"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        recent_calls = [call for call in self.api_calls if call.timestamp >= cutoff_time]
+        """获取API统计数据（按时间桶合并，窗口精度为一个桶）"""
+        endpoints, users = self._api_buckets.summarize(hours * 3600)
+        total_requests = sum(aggregate.count for aggregate in endpoints.values())
 
-        if not recent_calls:
+        if not total_requests:
             return {'period_hours': hours, 'total_requests': 0}
 
         # 基础统计
-        total_requests = len(recent_calls)
-        successful_requests = len([c for c in recent_calls if c.status_code < 400])
-        error_rate = (total_requests - successful_requests) / total_requests * 100
+        errors = sum(aggregate.errors for aggregate in endpoints.values())
+        successful_requests = total_requests - errors
+        error_rate = errors / total_requests * 100
 
         # 响应时间统计
-        response_times = [c.response_time for c in recent_calls]
-        avg_response_time = sum(response_times) / len(response_times)
-        p95_response_time = sorted(response_times)[int(len(response_times) * 0.95)]
-        p99_response_time = sorted(response_times)[int(len(response_times) * 0.99)]
-
-        # 端点统计
-        endpoint_stats = defaultdict(lambda: {'count': 0, 'total_time': 0, 'errors': 0})
-        for call in recent_calls:
-            endpoint_stats[call.endpoint]['count'] += 1
-            endpoint_stats[call.endpoint]['total_time'] += call.response_time
-            if call.status_code >= 400:
-                endpoint_stats[call.endpoint]['errors'] += 1
-
-        # 用户统计
-        unique_users = len(set(call.user_id for call in recent_calls))
+        latency = DDSketch(self._api_buckets.relative_accuracy)
+        for aggregate in endpoints.values():
+            latency.merge(aggregate.latency)
 
         return {
             'period_hours': hours,
             'total_requests': total_requests,
             'successful_requests': successful_requests,
             'error_rate_percent': round(error_rate, 2),
-            'unique_users': unique_users,
-            'avg_response_time_ms': round(avg_response_time * 1000, 2),
-            'p95_response_time_ms': round(p95_response_time * 1000, 2),
-            'p99_response_time_ms': round(p99_response_time * 1000, 2),
+            'unique_users': users.count(),
+            'avg_response_time_ms': round(latency.mean * 1000, 2),
+            'p95_response_time_ms': round(latency.quantile(0.95) * 1000, 2),
+            'p99_response_time_ms': round(latency.quantile(0.99) * 1000, 2),
             'top_endpoints': [
                 {
-                    'endpoint': endpoint,
-                    'count': stats['count'],
-                    'avg_time_ms': round(stats['total_time'] / stats['count'] * 1000, 2),
-                    'error_count': stats['errors']
+                    'endpoint': self._endpoints.lookup(endpoint_id),
+                    'count': aggregate.count,
+                    'avg_time_ms': round(aggregate.latency.mean * 1000, 2),
+                    'p95_time_ms': round(aggregate.latency.quantile(0.95) * 1000, 2),
+                    'error_count': aggregate.errors
                 }
-                for endpoint, stats in sorted(endpoint_stats.items(),
-                                            key=lambda x: x[1]['count'], reverse=True)[:10]
+                for endpoint_id, aggregate in sorted(endpoints.items(),
+                                                     key=lambda x: x[1].count, reverse=True)[:10]
             ]
         }
 
     def get_ai_model_stats(self, hours: int = 24) -> Dict:
-        """获取AI模型使用统计"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        recent_calls = [call for call in self.ai_model_calls if call.timestamp >= cutoff_time]
+        """获取AI模型使用统计（按时间桶合并，窗口精度为一个桶）"""
+        models, _ = self._ai_buckets.summarize(hours * 3600)
+        total_calls = sum(aggregate.count for aggregate in models.values())
 
-        if not recent_calls:
+        if not total_calls:
             return {'period_hours': hours, 'total_calls': 0}
 
         # 基础统计
-        total_calls = len(recent_calls)
-        successful_calls = len([c for c in recent_calls if c.success])
+        successful_calls = total_calls - sum(aggregate.errors for aggregate in models.values())
         success_rate = successful_calls / total_calls * 100
 
         # Token和成本统计
-        total_tokens = sum(c.total_tokens for c in recent_calls)
-        total_cost = sum(c.cost for c in recent_calls)
+        total_tokens = sum(aggregate.totals.get('tokens', 0) for aggregate in models.values())
+        total_cost = sum(aggregate.totals.get('cost', 0) for aggregate in models.values())
 
-        # 响应时间统计
-        response_times = [c.response_time for c in recent_calls if c.success]
-        avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-
-        # 模型统计
-        model_stats = defaultdict(lambda: {
-            'count': 0, 'tokens': 0, 'cost': 0, 'errors': 0, 'total_time': 0
-        })
-        for call in recent_calls:
-            model_stats[call.model_name]['count'] += 1
-            model_stats[call.model_name]['tokens'] += call.total_tokens
-            model_stats[call.model_name]['cost'] += call.cost
-            model_stats[call.model_name]['total_time'] += call.response_time
-            if not call.success:
-                model_stats[call.model_name]['errors'] += 1
+        # 响应时间统计（仅成功调用）
+        success_time = sum(aggregate.totals.get('success_time', 0) for aggregate in models.values())
+        avg_response_time = success_time / successful_calls if successful_calls else 0
 
         return {
             'period_hours': hours,
             'total_calls': total_calls,
             'successful_calls': successful_calls,
             'success_rate_percent': round(success_rate, 2),
-            'total_tokens': total_tokens,
+            'total_tokens': int(total_tokens),
             'total_cost_usd': round(total_cost, 4),
             'avg_response_time_s': round(avg_response_time, 2),
             'top_models': [
                 {
-                    'model_name': model,
-                    'calls': stats['count'],
-                    'tokens': stats['tokens'],
-                    'cost_usd': round(stats['cost'], 4),
-                    'avg_time_s': round(stats['total_time'] / stats['count'], 2) if stats['count'] > 0 else 0,
-                    'error_count': stats['errors']
+                    'model_name': self._models.lookup(model_id),
+                    'calls': aggregate.count,
+                    'tokens': int(aggregate.totals.get('tokens', 0)),
+                    'cost_usd': round(aggregate.totals.get('cost', 0), 4),
+                    'avg_time_s': round(aggregate.latency.mean, 2),
+                    'p95_time_s': round(aggregate.latency.quantile(0.95), 2),
+                    'error_count': aggregate.errors
                 }
-                for model, stats in sorted(model_stats.items(),
-                                         key=lambda x: x[1]['count'], reverse=True)[:10]
+                for model_id, aggregate in sorted(models.items(),
+                                                  key=lambda x: x[1].count, reverse=True)[:10]
             ]
         }
 
     def get_user_activity_stats(self, hours: int = 24) -> Dict:
-        """获取用户活动统计"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-
-        # API活动用户
-        active_api_users = set(
-            call.user_id for call in self.api_calls
-            if call.timestamp >= cutoff_time
-        )
+        """获取用户活动统计（用户数为HyperLogLog估计值）"""
+        _, api_users = self._api_buckets.summarize(hours * 3600)
+        _, ai_users = self._ai_buckets.summarize(hours * 3600)
 
-        # AI使用用户
-        active_ai_users = set(
-            call.user_id for call in self.ai_model_calls
-            if call.timestamp >= cutoff_time
-        )
+        all_users = HyperLogLog(api_users.precision)
+        all_users.merge(api_users)
+        all_users.merge(ai_users)
 
         # 当前活跃会话
         current_active_users = len(set(
@@ -340,11 +438,11 @@ class BusinessMonitor:
 
         return {
             'period_hours': hours,
-            'active_api_users': len(active_api_users),
-            'active_ai_users': len(active_ai_users),
+            'active_api_users': api_users.count(),
+            'active_ai_users': ai_users.count(),
             'current_active_sessions': len(self.active_sessions),
             'current_active_users': current_active_users,
-            'unique_users_today': len(active_api_users | active_ai_users)
+            'unique_users_today': all_users.count()
         }
 
     def get_real_time_stats(self) -> Dict:
@@ -404,16 +502,17 @@ class BusinessMonitor:
     def export_metrics(self, filename: str, metric_type: str = 'all', hours: int = 24):
         """导出指标到文件"""
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        cutoff_timestamp = time.time() - hours * 3600
         data = {}
 
         if metric_type in ('all', 'api'):
-            api_data = [asdict(call) for call in self.api_calls if call.timestamp >= cutoff_time]
+            api_data = [asdict(call) for call in self._api_calls_since(cutoff_timestamp)]
             for item in api_data:
                 item['timestamp'] = item['timestamp'].isoformat()
             data['api_calls'] = api_data
 
         if metric_type in ('all', 'ai'):
-            ai_data = [asdict(call) for call in self.ai_model_calls if call.timestamp >= cutoff_time]
+            ai_data = [asdict(call) for call in self._ai_calls_since(cutoff_timestamp)]
             for item in ai_data:
                 item['timestamp'] = item['timestamp'].isoformat()
             data['ai_model_calls'] = ai_data
@@ -430,4 +529,8 @@ class BusinessMonitor:
         logger.info(f"Exported metrics to {filename}")
 
 # 全局业务监控器实例
-business_monitor = BusinessMonitor()
\ No newline at end of file
+business_monitor = BusinessMonitor()
+
+metrics_registry.callback_gauge(
+    "business_active_sessions", "当前活跃会话数", lambda: len(business_monitor.active_sessions)
+)
\ No newline at end of file
@@ -1,27 +1,77 @@
 """
 分布式追踪系统
 Week 5 Day 5: 系统监控和运维增强 - 分布式追踪
+
+低开销实现：
+- Span使用整数ID（128位trace_id / 64位span_id）和单调纳秒时钟，导出时才格式化
+- 追踪上下文基于contextvars，在asyncio任务间隔离
+- 尾部采样：本地根Span结束后按整条Trace决策，慢请求和错误Trace全部保留，其余按采样率保留
+- 保留的Span进入有界缓冲区，由后台导出器按OTLP/JSON批量写入文件或本地采集器
 """
 
 import asyncio
-import uuid
-import time
+import contextvars
+import hashlib
 import json
+import os
 import random
+import socket
+import time
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Union
-from dataclasses import dataclass, asdict
 from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
 import logging
-from contextlib import asynccontextmanager
-import threading
-from collections import defaultdict
 
 from backend.config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 单调时钟换算到Unix纳秒时间的偏移（进程启动时锚定一次）
+_CLOCK_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+_id_random = random.Random()
+
+
+def now_ns() -> int:
+    """单调递增的Unix纳秒时间"""
+    return time.perf_counter_ns() + _CLOCK_OFFSET_NS
+
+
+def _new_trace_id() -> int:
+    return _id_random.getrandbits(128) or 1
+
+
+def _new_span_id() -> int:
+    return _id_random.getrandbits(64) or 1
+
+
+def _ns_to_datetime(value: int) -> datetime:
+    return datetime.utcfromtimestamp(value / 1e9)
+
+
+def _datetime_to_ns(value: datetime) -> int:
+    return int((value - datetime(1970, 1, 1)).total_seconds() * 1e9)
+
+
+def format_trace_id(trace_id: int) -> str:
+    return f"{trace_id:032x}"
+
+
+def format_span_id(span_id: Optional[int]) -> Optional[str]:
+    return f"{span_id:016x}" if span_id else None
+
+
+def parse_id(value: Union[str, int, None]) -> Optional[int]:
+    """解析十六进制ID（接口和请求头中的ID均为十六进制字符串）"""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value, 16)
+    except ValueError:
+        return None
+
 
 class SpanStatus(Enum):
     """Span状态"""
@@ -40,13 +90,29 @@ class SpanKind(Enum):
     INTERNAL = "internal"
 
 
+# OTLP枚举值
+OTLP_SPAN_KIND = {
+    SpanKind.INTERNAL: 1,
+    SpanKind.SERVER: 2,
+    SpanKind.CLIENT: 3,
+    SpanKind.PRODUCER: 4,
+    SpanKind.CONSUMER: 5
+}
+OTLP_STATUS_OK = 1
+OTLP_STATUS_ERROR = 2
+
+
 @dataclass
 class SpanEvent:
     """Span事件"""
-    timestamp: datetime
+    timestamp_ns: int
     name: str
     attributes: Dict[str, Any]
 
+    @property
+    def timestamp(self) -> datetime:
+        return _ns_to_datetime(self.timestamp_ns)
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "timestamp": self.timestamp.isoformat(),
@@ -58,88 +124,112 @@ class SpanEvent:
 @dataclass
 class SpanLink:
     """Span链接"""
-    trace_id: str
-    span_id: str
+    trace_id: int
+    span_id: int
     attributes: Dict[str, Any]
 
     def to_dict(self) -> Dict[str, Any]:
         return {
-            "trace_id": self.trace_id,
-            "span_id": self.span_id,
+            "trace_id": format_trace_id(self.trace_id),
+            "span_id": format_span_id(self.span_id),
             "attributes": self.attributes
         }
 
 
-@dataclass
 class Span:
-    """追踪Span"""
-    trace_id: str
-    span_id: str
-    parent_span_id: Optional[str]
-    operation_name: str
-    start_time: datetime
-    end_time: Optional[datetime]
-    status: SpanStatus
-    kind: SpanKind
-    service_name: str
-    resource: Dict[str, Any]
-    attributes: Dict[str, Any]
-    events: List[SpanEvent]
-    links: List[SpanLink]
-    tags: Dict[str, str]
-
-    def __post_init__(self):
-        if not self.events:
-            self.events = []
-        if not self.links:
-            self.links = []
-        if not self.tags:
-            self.tags = {}
+    """追踪Span（紧凑记录，事件/链接/标签按需创建）"""
+
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "operation_name", "start_ns",
+                 "end_ns", "status", "kind", "service_name", "resource", "attributes",
+                 "events", "links", "tags", "is_local_root")
+
+    def __init__(self, trace_id: int, span_id: int, parent_span_id: Optional[int],
+                 operation_name: str, start_ns: int, kind: SpanKind = SpanKind.INTERNAL,
+                 service_name: str = "", resource: Optional[Dict[str, Any]] = None,
+                 attributes: Optional[Dict[str, Any]] = None,
+                 links: Optional[List[SpanLink]] = None, is_local_root: bool = False):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_span_id = parent_span_id
+        self.operation_name = operation_name
+        self.start_ns = start_ns
+        self.end_ns: Optional[int] = None
+        self.status = SpanStatus.OK
+        self.kind = kind
+        self.service_name = service_name
+        self.resource = resource if resource is not None else {}
+        self.attributes = attributes if attributes is not None else {}
+        self.events: Optional[List[SpanEvent]] = None
+        self.links = links
+        self.tags: Optional[Dict[str, str]] = None
+        self.is_local_root = is_local_root
+
+    @property
+    def start_time(self) -> datetime:
+        return _ns_to_datetime(self.start_ns)
+
+    @property
+    def end_time(self) -> Optional[datetime]:
+        return _ns_to_datetime(self.end_ns) if self.end_ns else None
 
     @property
     def duration_ms(self) -> Optional[float]:
         """获取持续时间（毫秒）"""
-        if self.end_time:
-            return (self.end_time - self.start_time).total_seconds() * 1000
+        if self.end_ns:
+            return (self.end_ns - self.start_ns) / 1e6
         return None
 
+    def set_span_attribute(self, key: str, value: Any):
+        """设置Span属性"""
+        self.attributes[key] = value
+
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
         return {
-            "trace_id": self.trace_id,
-            "span_id": self.span_id,
-            "parent_span_id": self.parent_span_id,
+            "trace_id": format_trace_id(self.trace_id),
+            "span_id": format_span_id(self.span_id),
+            "parent_span_id": format_span_id(self.parent_span_id),
             "operation_name": self.operation_name,
             "start_time": self.start_time.isoformat(),
-            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "end_time": self.end_time.isoformat() if self.end_ns else None,
             "duration_ms": self.duration_ms,
             "status": self.status.value,
             "kind": self.kind.value,
             "service_name": self.service_name,
             "resource": self.resource,
             "attributes": self.attributes,
-            "events": [event.to_dict() for event in self.events],
-            "links": [link.to_dict() for link in self.links],
-            "tags": self.tags
+            "events": [event.to_dict() for event in self.events or ()],
+            "links": [link.to_dict() for link in self.links or ()],
+            "tags": self.tags or {}
         }
 
 
-@dataclass
 class Trace:
-    """追踪"""
-    trace_id: str
-    spans: List[Span]
-    start_time: datetime
-    end_time: Optional[datetime]
-    status: SpanStatus
-    services: List[str]
-    duration_ms: Optional[float]
-
-    def __post_init__(self):
-        if not self.spans:
-            self.spans = []
-        if not self.services:
-            self.services = []
+    """追踪（尾部采样保留下来的完整Trace）"""
+
+    __slots__ = ("trace_id", "spans", "start_ns", "end_ns", "status", "services")
+
+    def __init__(self, trace_id: int, spans: List[Span]):
+        self.trace_id = trace_id
+        self.spans = spans
+        self.start_ns = min(span.start_ns for span in spans)
+        self.end_ns = max(span.end_ns or span.start_ns for span in spans)
+        self.status = SpanStatus.ERROR if any(
+            span.status == SpanStatus.ERROR for span in spans
+        ) else SpanStatus.OK
+        self.services = list(dict.fromkeys(span.service_name for span in spans))
+
+    @property
+    def start_time(self) -> datetime:
+        return _ns_to_datetime(self.start_ns)
+
+    @property
+    def end_time(self) -> datetime:
+        return _ns_to_datetime(self.end_ns)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
 
     @property
     def span_count(self) -> int:
@@ -148,10 +238,10 @@ class Trace:
 
     def to_dict(self) -> Dict[str, Any]:
         return {
-            "trace_id": self.trace_id,
+            "trace_id": format_trace_id(self.trace_id),
             "span_count": self.span_count,
             "start_time": self.start_time.isoformat(),
-            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "end_time": self.end_time.isoformat(),
             "duration_ms": self.duration_ms,
             "status": self.status.value,
             "services": self.services,
@@ -159,35 +249,43 @@ class Trace:
         }
 
 
+_current_context: contextvars.ContextVar[Optional["TraceContext"]] = contextvars.ContextVar(
+    "trace_context", default=None
+)
+
+
 class TraceContext:
-    """追踪上下文"""
+    """追踪上下文（基于contextvars，各asyncio任务独立）"""
 
-    _local = threading.local()
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "baggage_items", "span")
 
-    def __init__(self, trace_id: str, span_id: str, parent_span_id: Optional[str] = None):
+    def __init__(self, trace_id: int, span_id: int, parent_span_id: Optional[int] = None,
+                 span: Optional[Span] = None):
         self.trace_id = trace_id
         self.span_id = span_id
         self.parent_span_id = parent_span_id
         self.baggage_items: Dict[str, str] = {}
+        # 本进程内的Span；从请求头提取的远程上下文为None
+        self.span = span
 
     @classmethod
     def current(cls) -> Optional['TraceContext']:
         """获取当前上下文"""
-        return getattr(cls._local, 'context', None)
+        return _current_context.get()
 
     @classmethod
-    def set_current(cls, context: 'TraceContext'):
+    def set_current(cls, context: Optional['TraceContext']):
         """设置当前上下文"""
-        cls._local.context = context
+        _current_context.set(context)
 
     @classmethod
     def clear(cls):
         """清除当前上下文"""
-        cls._local.context = None
+        _current_context.set(None)
 
     def with_baggage(self, key: str, value: str) -> 'TraceContext':
         """添加行李项"""
-        new_context = TraceContext(self.trace_id, self.span_id, self.parent_span_id)
+        new_context = TraceContext(self.trace_id, self.span_id, self.parent_span_id, self.span)
         new_context.baggage_items = self.baggage_items.copy()
         new_context.baggage_items[key] = value
         return new_context
@@ -196,11 +294,12 @@ class TraceContext:
 class Tracer:
     """追踪器"""
 
-    def __init__(self, service_name: str):
+    def __init__(self, service_name: str, on_end: Optional[Callable[[Span], None]] = None):
         self.service_name = service_name
-        self.active_spans: Dict[str, Span] = {}
-        self.traces: Dict[str, Trace] = {}
-        self.sampler: Sampler = Sampler()
+        self.active_spans: Dict[int, Span] = {}
+        self.resource = self._get_resource()
+        # Span结束回调（由追踪管理器挂载尾部采样和导出）
+        self.on_end = on_end
 
     def start_span(
         self,
@@ -209,85 +308,46 @@ class Tracer:
         kind: SpanKind = SpanKind.INTERNAL,
         attributes: Optional[Dict[str, Any]] = None,
         links: Optional[List[SpanLink]] = None,
-        start_time: Optional[datetime] = None
+        start_time: Optional[datetime] = None,
+        parent_context: Optional[TraceContext] = None
     ) -> Span:
-        """开始新的Span"""
-        trace_id = parent_span.trace_id if parent_span else str(uuid.uuid4())
-        span_id = str(uuid.uuid4())
-        parent_span_id = parent_span.span_id if parent_span else None
-
-        # 采样决策
-        if not parent_span and not self.sampler.should_sample(trace_id):
-            # 不采样，返回空Span
-            return self._create_noop_span(trace_id, span_id, operation_name)
+        """开始新的Span（采样在Trace结束后决定）"""
+        if parent_span is not None:
+            trace_id, parent_span_id = parent_span.trace_id, parent_span.span_id
+        elif parent_context is not None:
+            trace_id, parent_span_id = parent_context.trace_id, parent_context.span_id
+        else:
+            trace_id, parent_span_id = _new_trace_id(), None
 
         span = Span(
-            trace_id=trace_id,
-            span_id=span_id,
-            parent_span_id=parent_span_id,
-            operation_name=operation_name,
-            start_time=start_time or datetime.utcnow(),
-            end_time=None,
-            status=SpanStatus.OK,
-            kind=kind,
-            service_name=self.service_name,
-            resource=self._get_resource(),
-            attributes=attributes or {},
-            events=[],
-            links=links or [],
-            tags={}
+            trace_id,
+            _new_span_id(),
+            parent_span_id,
+            operation_name,
+            _datetime_to_ns(start_time) if start_time else now_ns(),
+            kind,
+            self.service_name,
+            self.resource,
+            attributes,
+            links,
+            is_local_root=parent_span is None
         )
-
-        self.active_spans[span_id] = span
-
-        # 如果没有父Span，创建新的Trace
-        if not parent_span:
-            self.traces[trace_id] = Trace(
-                trace_id=trace_id,
-                spans=[],
-                start_time=span.start_time,
-                end_time=None,
-                status=SpanStatus.OK,
-                services=[self.service_name],
-                duration_ms=None
-            )
-
+        self.active_spans[span.span_id] = span
         return span
 
     def finish_span(self, span: Span, end_time: Optional[datetime] = None, status: SpanStatus = SpanStatus.OK):
         """结束Span"""
-        span.end_time = end_time or datetime.utcnow()
+        span.end_ns = _datetime_to_ns(end_time) if end_time else now_ns()
         span.status = status
-
-        # 从活跃Span中移除
-        if span.span_id in self.active_spans:
-            del self.active_spans[span.span_id]
-
-        # 添加到Trace
-        if span.trace_id in self.traces:
-            trace = self.traces[span.trace_id]
-            trace.spans.append(span)
-
-            # 更新Trace信息
-            if span.service_name not in trace.services:
-                trace.services.append(span.service_name)
-
-            # 更新Trace的结束时间和状态
-            if trace.end_time is None or span.end_time > trace.end_time:
-                trace.end_time = span.end_time
-                trace.duration_ms = (trace.end_time - trace.start_time).total_seconds() * 1000
-
-            if status == SpanStatus.ERROR:
-                trace.status = SpanStatus.ERROR
+        self.active_spans.pop(span.span_id, None)
+        if self.on_end is not None:
+            self.on_end(span)
 
     def add_span_event(self, span: Span, name: str, attributes: Optional[Dict[str, Any]] = None):
         """添加Span事件"""
-        event = SpanEvent(
-            timestamp=datetime.utcnow(),
-            name=name,
-            attributes=attributes or {}
-        )
-        span.events.append(event)
+        if span.events is None:
+            span.events = []
+        span.events.append(SpanEvent(now_ns(), name, attributes or {}))
 
     def set_span_attribute(self, span: Span, key: str, value: Any):
         """设置Span属性"""
@@ -295,89 +355,321 @@ class Tracer:
 
     def set_span_tag(self, span: Span, key: str, value: str):
         """设置Span标签"""
+        if span.tags is None:
+            span.tags = {}
         span.tags[key] = value
 
-    def get_trace(self, trace_id: str) -> Optional[Trace]:
-        """获取Trace"""
-        return self.traces.get(trace_id)
-
-    def get_active_span(self, span_id: str) -> Optional[Span]:
+    def get_active_span(self, span_id: Union[int, str]) -> Optional[Span]:
         """获取活跃Span"""
-        return self.active_spans.get(span_id)
+        return self.active_spans.get(parse_id(span_id))
 
     def _get_resource(self) -> Dict[str, Any]:
-        """获取资源信息"""
+        """获取资源信息（每个追踪器创建一次，各Span共享）"""
         return {
             "service.name": self.service_name,
             "service.version": "1.0.0",
-            "host.name": "localhost",
+            "host.name": socket.gethostname(),
             "process.pid": os.getpid(),
             "telemetry.sdk.name": "aihub-tracer",
             "telemetry.sdk.version": "1.0.0"
         }
 
-    def _create_noop_span(self, trace_id: str, span_id: str, operation_name: str) -> Span:
-        """创建空操作Span（不采样时使用）"""
-        return Span(
-            trace_id=trace_id,
-            span_id=span_id,
-            parent_span_id=None,
-            operation_name=operation_name,
-            start_time=datetime.utcnow(),
-            end_time=datetime.utcnow(),
-            status=SpanStatus.OK,
-            kind=SpanKind.INTERNAL,
-            service_name=self.service_name,
-            resource={},
-            attributes={},
-            events=[],
-            links=[],
-            tags={}
-        )
-
 
 class Sampler:
-    """采样器"""
+    """概率采样器（基于trace_id的确定性采样）"""
 
     def __init__(self, sample_rate: float = 0.1):
         self.sample_rate = max(0.0, min(1.0, sample_rate))
 
-    def should_sample(self, trace_id: str) -> bool:
+    def should_sample(self, trace_id: Union[int, str]) -> bool:
         """决定是否采样"""
         if self.sample_rate >= 1.0:
             return True
         if self.sample_rate <= 0.0:
             return False
 
-        # 基于trace_id的确定性采样
-        hash_value = int(hashlib.md5(trace_id.encode()).hexdigest(), 16)
-        return (hash_value % 10000) < (self.sample_rate * 10000)
+        if isinstance(trace_id, str):
+            trace_id = int(hashlib.md5(trace_id.encode()).hexdigest(), 16)
+        # trace_id本身是随机数，取低64位即可
+        return (trace_id & 0xFFFFFFFFFFFFFFFF) < self.sample_rate * 2 ** 64
+
+
+class TailSampler:
+    """尾部采样器
+
+    同一Trace的Span在本地根Span结束前暂存；根Span结束时整条Trace一起决策：
+    有错误或耗时超过阈值的Trace全部保留，其余交给概率采样器。
+    """
+
+    def __init__(self, sampler: Sampler, slow_threshold_ms: float = 1000.0,
+                 max_pending_traces: int = 10000, decision_wait_ms: float = 60000.0):
+        self.sampler = sampler
+        self.slow_threshold_ns = int(slow_threshold_ms * 1e6)
+        self.max_pending_traces = max_pending_traces
+        self.decision_wait_ns = int(decision_wait_ms * 1e6)
+        self.pending: "OrderedDict[int, List[Span]]" = OrderedDict()
+        self.stats = {
+            "kept_error": 0,
+            "kept_slow": 0,
+            "kept_sampled": 0,
+            "dropped": 0,
+            "evicted_pending": 0
+        }
+
+    def on_end(self, span: Span) -> Optional[List[Span]]:
+        """登记结束的Span；Trace决策为保留时返回其全部Span"""
+        spans = self.pending.get(span.trace_id)
+        if spans is None:
+            if span.is_local_root:
+                # 单Span的Trace无需暂存
+                return self._decide([span], span)
+            spans = self.pending[span.trace_id] = []
+            if len(self.pending) > self.max_pending_traces:
+                self.pending.popitem(last=False)
+                self.stats["evicted_pending"] += 1
+        spans.append(span)
+
+        if span.is_local_root:
+            del self.pending[span.trace_id]
+            return self._decide(spans, span)
+        return None
+
+    def _decide(self, spans: List[Span], root: Span) -> Optional[List[Span]]:
+        if root.status == SpanStatus.ERROR or any(s.status == SpanStatus.ERROR for s in spans):
+            self.stats["kept_error"] += 1
+            return spans
+        if root.end_ns - root.start_ns >= self.slow_threshold_ns:
+            self.stats["kept_slow"] += 1
+            return spans
+        if self.sampler.should_sample(root.trace_id):
+            self.stats["kept_sampled"] += 1
+            return spans
+        self.stats["dropped"] += 1
+        return None
+
+    def expire(self, now: Optional[int] = None) -> int:
+        """丢弃等待过久仍未结束的Trace（如根Span丢失）"""
+        cutoff = (now or now_ns()) - self.decision_wait_ns
+        expired = 0
+        while self.pending:
+            trace_id, spans = next(iter(self.pending.items()))
+            if spans[0].end_ns > cutoff:
+                break
+            self.pending.popitem(last=False)
+            expired += 1
+        self.stats["evicted_pending"] += expired
+        return expired
+
+
+class SpanBuffer:
+    """有界Span缓冲区
+
+    基于deque：append/popleft在GIL下是原子操作，生产者（请求路径）无需加锁；
+    缓冲区满时覆盖最旧的Span并计数。
+    """
+
+    def __init__(self, capacity: int = 20000):
+        self.capacity = capacity
+        self._spans: Deque[Span] = deque(maxlen=capacity)
+        self.dropped = 0
+
+    def extend(self, spans: List[Span]):
+        overflow = len(self._spans) + len(spans) - self.capacity
+        if overflow > 0:
+            self.dropped += overflow
+        self._spans.extend(spans)
+
+    def drain(self, limit: int) -> List[Span]:
+        batch = []
+        spans = self._spans
+        while spans and len(batch) < limit:
+            batch.append(spans.popleft())
+        return batch
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in (attributes or {}).items()]
+
+
+def span_to_otlp(span: Span) -> Dict[str, Any]:
+    """转换为OTLP/JSON Span"""
+    record = {
+        "traceId": format_trace_id(span.trace_id),
+        "spanId": format_span_id(span.span_id),
+        "name": span.operation_name,
+        "kind": OTLP_SPAN_KIND[span.kind],
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": _otlp_attributes({**span.attributes, **(span.tags or {})}),
+        "status": {"code": OTLP_STATUS_ERROR if span.status == SpanStatus.ERROR else OTLP_STATUS_OK}
+    }
+    if span.parent_span_id:
+        record["parentSpanId"] = format_span_id(span.parent_span_id)
+    if span.status not in (SpanStatus.OK, SpanStatus.ERROR):
+        record["status"]["message"] = span.status.value
+    if span.events:
+        record["events"] = [
+            {"timeUnixNano": str(event.timestamp_ns), "name": event.name,
+             "attributes": _otlp_attributes(event.attributes)}
+            for event in span.events
+        ]
+    if span.links:
+        record["links"] = [
+            {"traceId": format_trace_id(link.trace_id), "spanId": format_span_id(link.span_id),
+             "attributes": _otlp_attributes(link.attributes)}
+            for link in span.links
+        ]
+    return record
+
+
+def build_otlp_batch(spans: List[Span]) -> Dict[str, Any]:
+    """按服务（resource）分组构建OTLP/JSON ExportTraceServiceRequest"""
+    by_service: Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+    for span in spans:
+        entry = by_service.get(span.service_name)
+        if entry is None:
+            entry = by_service[span.service_name] = (span.resource, [])
+        entry[1].append(span_to_otlp(span))
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes(resource)},
+                "scopeSpans": [{
+                    "scope": {"name": "aihub-tracer", "version": "1.0.0"},
+                    "spans": otlp_spans
+                }]
+            }
+            for resource, otlp_spans in by_service.values()
+        ]
+    }
+
+
+class OTLPJsonExporter:
+    """后台批量导出器：OTLP/JSON写入文件（每批一行）或POST到本地采集器"""
+
+    def __init__(self, buffer: SpanBuffer, path: Optional[str] = None,
+                 endpoint: Optional[str] = None, batch_size: int = 512,
+                 interval: float = 2.0):
+        self.buffer = buffer
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._session = None
+        self.stats = {
+            "exported_batches": 0,
+            "exported_spans": 0,
+            "failed_batches": 0
+        }
+
+    async def export_once(self) -> int:
+        """导出一批Span，返回导出数量"""
+        spans = self.buffer.drain(self.batch_size)
+        if not spans:
+            return 0
+
+        payload = json.dumps(build_otlp_batch(spans), separators=(",", ":"))
+        try:
+            if self.path:
+                await asyncio.to_thread(self._append_line, payload)
+            if self.endpoint:
+                await self._post(payload)
+            self.stats["exported_batches"] += 1
+            self.stats["exported_spans"] += len(spans)
+            return len(spans)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.error(f"Trace export failed ({len(spans)} spans dropped): {e}")
+            return 0
+
+    async def flush(self) -> int:
+        """导出缓冲区内全部Span"""
+        total = 0
+        while len(self.buffer):
+            exported = await self.export_once()
+            if not exported:
+                break
+            total += exported
+        return total
+
+    def _append_line(self, payload: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+    async def _post(self, payload: str):
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+        async with self._session.post(self.endpoint, data=payload,
+                                      headers={"Content-Type": "application/json"}) as response:
+            if response.status >= 400:
+                raise RuntimeError(f"collector returned HTTP {response.status}")
+
+    async def _run(self, on_tick: Optional[Callable[[], None]] = None):
+        while True:
+            try:
+                await asyncio.sleep(self.interval)
+                if on_tick is not None:
+                    on_tick()
+                while len(self.buffer) and await self.export_once():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Trace exporter error: {e}")
+
+    def start(self, on_tick: Optional[Callable[[], None]] = None):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(on_tick))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
 
 class TraceCollector:
-    """追踪收集器"""
+    """追踪收集器（保存尾部采样保留的Trace，供查询接口使用）"""
 
-    def __init__(self):
-        self.traces: Dict[str, Trace] = {}
-        self.max_traces = 10000
+    def __init__(self, max_traces: int = 10000):
+        self.traces: "OrderedDict[int, Trace]" = OrderedDict()
+        self.max_traces = max_traces
         self.retention_hours = 24
 
     def collect_trace(self, trace: Trace):
-        """收集Trace"""
+        """收集Trace（按到达顺序淘汰最旧的Trace）"""
         self.traces[trace.trace_id] = trace
-
-        # 限制存储数量
+        self.traces.move_to_end(trace.trace_id)
         if len(self.traces) > self.max_traces:
-            # 删除最旧的Trace
-            oldest_trace_id = min(
-                self.traces.keys(),
-                key=lambda tid: self.traces[tid].start_time
-            )
-            del self.traces[oldest_trace_id]
+            self.traces.popitem(last=False)
 
-    def get_trace(self, trace_id: str) -> Optional[Trace]:
+    def get_trace(self, trace_id: Union[int, str]) -> Optional[Trace]:
         """获取Trace"""
-        return self.traces.get(trace_id)
+        return self.traces.get(parse_id(trace_id))
 
     def search_traces(
         self,
@@ -392,6 +684,10 @@ class TraceCollector:
     ) -> List[Trace]:
         """搜索Trace"""
         filtered_traces = []
+        if isinstance(status, str):
+            status = SpanStatus(status)
+        start_ns = _datetime_to_ns(start_time) if start_time else None
+        end_ns = _datetime_to_ns(end_time) if end_time else None
 
         for trace in self.traces.values():
             # 服务名过滤
@@ -403,17 +699,16 @@ class TraceCollector:
                 continue
 
             # 时间过滤
-            if start_time and trace.start_time < start_time:
+            if start_ns and trace.start_ns < start_ns:
                 continue
-            if end_time and trace.start_time > end_time:
+            if end_ns and trace.start_ns > end_ns:
                 continue
 
             # 持续时间过滤
-            if trace.duration_ms:
-                if min_duration_ms and trace.duration_ms < min_duration_ms:
-                    continue
-                if max_duration_ms and trace.duration_ms > max_duration_ms:
-                    continue
+            if min_duration_ms and trace.duration_ms < min_duration_ms:
+                continue
+            if max_duration_ms and trace.duration_ms > max_duration_ms:
+                continue
 
             # 操作名过滤
             if operation_name:
@@ -423,12 +718,12 @@ class TraceCollector:
             filtered_traces.append(trace)
 
         # 按开始时间排序
-        filtered_traces.sort(key=lambda t: t.start_time, reverse=True)
+        filtered_traces.sort(key=lambda t: t.start_ns, reverse=True)
         return filtered_traces[:limit]
 
     def get_service_statistics(self, hours: int = 1) -> Dict[str, Any]:
         """获取服务统计"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        cutoff_ns = now_ns() - int(hours * 3600 * 1e9)
 
         stats = {
             "total_traces": 0,
@@ -452,7 +747,7 @@ class TraceCollector:
         total_duration = 0.0
 
         for trace in self.traces.values():
-            if trace.start_time < cutoff_time:
+            if trace.start_ns < cutoff_ns:
                 continue
 
             total_traces += 1
@@ -461,14 +756,13 @@ class TraceCollector:
             if trace.status == SpanStatus.ERROR:
                 total_errors += 1
 
-            if trace.duration_ms:
-                total_duration += trace.duration_ms
+            total_duration += trace.duration_ms
 
             # 按服务分组统计
             for service in trace.services:
                 service_data[service]["trace_count"] += 1
                 service_data[service]["span_count"] += len(trace.spans)
-                service_data[service]["total_duration"] += trace.duration_ms or 0
+                service_data[service]["total_duration"] += trace.duration_ms
 
                 if trace.status == SpanStatus.ERROR:
                     service_data[service]["error_count"] += 1
@@ -497,11 +791,11 @@ class TraceCollector:
 
     def cleanup_old_traces(self):
         """清理旧Trace"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        cutoff_ns = now_ns() - int(self.retention_hours * 3600 * 1e9)
 
         old_trace_ids = [
             trace_id for trace_id, trace in self.traces.items()
-            if trace.start_time < cutoff_time
+            if trace.start_ns < cutoff_ns
         ]
 
         for trace_id in old_trace_ids:
@@ -510,70 +804,113 @@ class TraceCollector:
         logger.info(f"Cleaned up {len(old_trace_ids)} old traces")
 
 
-class DistributedTracingManager:
-    """分布式追踪管理器"""
+class SpanScope:
+    """Span作用域：进入时开始Span并设为当前上下文，退出时结束Span并恢复上下文
 
-    def __init__(self):
-        self.tracers: Dict[str, Tracer] = {}
-        self.collector = TraceCollector()
-        self.sample_rate = getattr(settings, 'TRACE_SAMPLE_RATE', 0.1)
+    使用普通类而非asynccontextmanager，省去每个Span的生成器开销。
+    """
 
-    def get_tracer(self, service_name: str) -> Tracer:
-        """获取追踪器"""
-        if service_name not in self.tracers:
-            self.tracers[service_name] = Tracer(service_name)
-        return self.tracers[service_name]
+    __slots__ = ("tracer", "operation_name", "kind", "attributes", "span", "_token")
 
-    @asynccontextmanager
-    async def trace_span(
-        self,
-        operation_name: str,
-        service_name: str = "aihub-backend",
-        kind: SpanKind = SpanKind.INTERNAL,
-        attributes: Optional[Dict[str, Any]] = None
-    ):
-        """追踪Span上下文管理器"""
-        tracer = self.get_tracer(service_name)
+    def __init__(self, tracer: Tracer, operation_name: str, kind: SpanKind,
+                 attributes: Optional[Dict[str, Any]]):
+        self.tracer = tracer
+        self.operation_name = operation_name
+        self.kind = kind
+        self.attributes = attributes
+        self.span: Optional[Span] = None
+        self._token = None
 
-        # 获取当前上下文
-        current_context = TraceContext.current()
-        parent_span = None
-
-        if current_context:
-            # 查找父Span
-            for tracer_instance in self.tracers.values():
-                parent_span = tracer_instance.get_active_span(current_context.span_id)
-                if parent_span:
-                    break
-
-        span = tracer.start_span(
-            operation_name=operation_name,
-            parent_span=parent_span,
-            kind=kind,
-            attributes=attributes
+    def __enter__(self) -> Span:
+        # 获取当前上下文（本地父Span或从请求头提取的远程上下文）
+        current_context = _current_context.get()
+        parent_span = current_context.span if current_context else None
+
+        span = self.span = self.tracer.start_span(
+            self.operation_name,
+            parent_span,
+            self.kind,
+            self.attributes,
+            parent_context=current_context if parent_span is None else None
         )
 
         # 设置新的上下文
-        new_context = TraceContext(span.trace_id, span.span_id, span.parent_span_id)
-        if current_context:
+        new_context = TraceContext(span.trace_id, span.span_id, span.parent_span_id, span)
+        if current_context and current_context.baggage_items:
             # 继承行李项
             new_context.baggage_items = current_context.baggage_items.copy()
-        TraceContext.set_current(new_context)
+        self._token = _current_context.set(new_context)
+        return span
 
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        span = self.span
         try:
-            yield span
-            tracer.finish_span(span, status=SpanStatus.OK)
-        except Exception as e:
-            tracer.finish_span(span, status=SpanStatus.ERROR)
-            tracer.set_span_attribute(span, "error.message", str(e))
-            raise
+            if exc is not None and isinstance(exc, Exception):
+                span.attributes["error.message"] = str(exc)
+                self.tracer.finish_span(span, status=SpanStatus.ERROR)
+            else:
+                self.tracer.finish_span(span, status=SpanStatus.OK)
         finally:
             # 恢复之前的上下文
-            TraceContext.set_current(current_context)
+            _current_context.reset(self._token)
+        return False
+
+    async def __aenter__(self) -> Span:
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return self.__exit__(exc_type, exc, tb)
+
+
+class DistributedTracingManager:
+    """分布式追踪管理器"""
+
+    def __init__(self, sample_rate: Optional[float] = None,
+                 slow_threshold_ms: Optional[float] = None,
+                 export_path: Optional[str] = None,
+                 export_endpoint: Optional[str] = None,
+                 buffer_size: int = 20000):
+        self.tracers: Dict[str, Tracer] = {}
+        self.collector = TraceCollector()
+        self.sample_rate = sample_rate if sample_rate is not None else getattr(settings, 'trace_sample_rate', 0.1)
+        self.tail_sampler = TailSampler(
+            Sampler(self.sample_rate),
+            slow_threshold_ms if slow_threshold_ms is not None else getattr(
+                settings, 'trace_slow_threshold_ms', 1000.0
+            )
+        )
+        self.span_buffer = SpanBuffer(buffer_size)
+        export_path = export_path or getattr(settings, 'trace_export_path', None)
+        export_endpoint = export_endpoint or getattr(settings, 'trace_export_endpoint', None)
+        self.exporter = OTLPJsonExporter(
+            self.span_buffer, path=export_path, endpoint=export_endpoint
+        ) if export_path or export_endpoint else None
 
-            # 收集完成的Trace
-            if span.trace_id in tracer.traces:
-                self.collector.collect_trace(tracer.traces[span.trace_id])
+    def get_tracer(self, service_name: str) -> Tracer:
+        """获取追踪器"""
+        tracer = self.tracers.get(service_name)
+        if tracer is None:
+            tracer = self.tracers[service_name] = Tracer(service_name, on_end=self._on_span_end)
+        return tracer
+
+    def _on_span_end(self, span: Span):
+        """Span结束：尾部采样，保留的Trace进入查询存储和导出缓冲区"""
+        spans = self.tail_sampler.on_end(span)
+        if spans is None:
+            return
+        self.collector.collect_trace(Trace(span.trace_id, spans))
+        if self.exporter is not None:
+            self.span_buffer.extend(spans)
+
+    def trace_span(
+        self,
+        operation_name: str,
+        service_name: str = "aihub-backend",
+        kind: SpanKind = SpanKind.INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None
+    ) -> "SpanScope":
+        """追踪Span上下文管理器（async with / with 均可）"""
+        return SpanScope(self.get_tracer(service_name), operation_name, kind, attributes)
 
     def inject_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
         """注入追踪头"""
@@ -582,8 +919,8 @@ class DistributedTracingManager:
             return headers
 
         headers = headers.copy()
-        headers["X-Trace-Id"] = current_context.trace_id
-        headers["X-Parent-Span-Id"] = current_context.span_id
+        headers["X-Trace-Id"] = format_trace_id(current_context.trace_id)
+        headers["X-Parent-Span-Id"] = format_span_id(current_context.span_id)
 
         # 注入行李项
         for key, value in current_context.baggage_items.items():
@@ -593,8 +930,8 @@ class DistributedTracingManager:
 
     def extract_headers(self, headers: Dict[str, str]) -> Optional[TraceContext]:
         """提取追踪头"""
-        trace_id = headers.get("X-Trace-Id")
-        parent_span_id = headers.get("X-Parent-Span-Id")
+        trace_id = parse_id(headers.get("X-Trace-Id"))
+        parent_span_id = parse_id(headers.get("X-Parent-Span-Id"))
 
         if not trace_id or not parent_span_id:
             return None
@@ -623,7 +960,21 @@ class DistributedTracingManager:
 
     async def get_service_statistics(self, hours: int = 1) -> Dict[str, Any]:
         """获取服务统计"""
-        return self.collector.get_service_statistics(hours)
+        stats = self.collector.get_service_statistics(hours)
+        stats["sampling"] = self.get_pipeline_stats()
+        return stats
+
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """获取采样与导出统计"""
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_threshold_ms": self.tail_sampler.slow_threshold_ns / 1e6,
+            "pending_traces": len(self.tail_sampler.pending),
+            **self.tail_sampler.stats,
+            "buffered_spans": len(self.span_buffer),
+            "dropped_spans": self.span_buffer.dropped,
+            **(self.exporter.stats if self.exporter else {})
+        }
 
     def start_background_tasks(self):
         """启动后台任务"""
@@ -638,6 +989,15 @@ class DistributedTracingManager:
 
         asyncio.create_task(cleanup_task())
 
+        # 批量导出，并清理等待过久的未完成Trace
+        if self.exporter is not None:
+            self.exporter.start(on_tick=self.tail_sampler.expire)
+
+    async def shutdown(self):
+        """停止导出并刷新缓冲区"""
+        if self.exporter is not None:
+            await self.exporter.stop()
+
 
 # 全局分布式追踪管理器
 distributed_tracing = DistributedTracingManager()
@@ -661,37 +1021,91 @@ def trace_span(
                 operation_name=operation_name,
                 service_name=service_name,
                 kind=kind,
-                attributes=attributes
+                attributes=dict(attributes) if attributes else None
             ) as span:
-                # 添加函数参数作为属性
-                if hasattr(span, 'set_span_attribute'):
-                    span.set_span_attribute("function.name", func.__name__)
-                    span.set_span_attribute("function.module", func.__module__)
+                # 添加函数信息作为属性
+                span_attributes = span.attributes
+                span_attributes["function.name"] = func.__name__
+                span_attributes["function.module"] = func.__module__
 
                 try:
                     result = await func(*args, **kwargs)
 
                     # 添加结果信息
-                    if hasattr(span, 'set_span_attribute'):
-                        span.set_span_attribute("function.success", True)
-                        if isinstance(result, dict):
-                            span.set_span_attribute("result.type", "dict")
-                        elif isinstance(result, str):
-                            span.set_span_attribute("result.type", "string")
-                            span.set_span_attribute("result.length", len(result))
+                    span_attributes["function.success"] = True
+                    if isinstance(result, dict):
+                        span_attributes["result.type"] = "dict"
+                    elif isinstance(result, str):
+                        span_attributes["result.type"] = "string"
+                        span_attributes["result.length"] = len(result)
 
                     return result
 
                 except Exception as e:
-                    if hasattr(span, 'set_span_attribute'):
-                        span.set_span_attribute("function.success", False)
-                        span.set_span_attribute("error.type", type(e).__name__)
+                    span_attributes["function.success"] = False
+                    span_attributes["error.type"] = type(e).__name__
                     raise
 
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
         return wrapper
     return decorator
 
 
-# 导入缺失的模块
-import os
-import hashlib
\ No newline at end of file
+def benchmark_tracing_overhead(iterations: int = 5000, spans_per_request: int = 3,
+                               handler_work: int = 200, upstream_ms: float = 200.0) -> Dict[str, float]:
+    """测量追踪在模拟聊天处理路径上的开销
+
+    模拟请求：序列化一段与聊天响应规模相当的消息列表；追踪为一个根Span和若干子Span
+    （会话加载、模型调用、保存消息）。overhead_percent按本地处理耗时加上游模型延迟
+    （upstream_ms，不实际等待）计算，cpu_overhead_percent只与本地处理耗时比较。
+    """
+    messages = [{"role": "user" if i % 2 else "assistant", "content": "token " * 40, "index": i}
+                for i in range(handler_work // 10)]
+
+    def handle() -> int:
+        size = 0
+        for _ in range(10):
+            size += len(json.dumps(messages))
+        return size
+
+    manager = DistributedTracingManager(sample_rate=0.1, slow_threshold_ms=1000)
+
+    async def plain():
+        handle()
+
+    async def empty():
+        pass
+
+    async def spans_only():
+        async with manager.trace_span("POST /api/v1/chat", kind=SpanKind.SERVER):
+            for i in range(spans_per_request):
+                async with manager.trace_span(f"chat.step.{i}"):
+                    pass
+
+    async def measure(request) -> float:
+        for _ in range(min(200, iterations)):
+            await request()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await request()
+        return (time.perf_counter() - started) / iterations * 1_000_000
+
+    async def run() -> Tuple[float, float]:
+        # 单独测量追踪自身的耗时（扣除空协程），避免与处理耗时的抖动混在一起
+        handler_us = await measure(plain)
+        tracing_us = min([await measure(spans_only) for _ in range(3)]) - await measure(empty)
+        return handler_us, tracing_us
+
+    handler_us, tracing_us = asyncio.run(run())
+    return {
+        "handler_us": round(handler_us, 2),
+        "tracing_us_per_request": round(tracing_us, 2),
+        "overhead_percent": round(tracing_us / (handler_us + upstream_ms * 1000) * 100, 3),
+        "cpu_overhead_percent": round(tracing_us / handler_us * 100, 2),
+        **{key: value for key, value in manager.tail_sampler.stats.items() if value}
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_tracing_overhead(), indent=2))
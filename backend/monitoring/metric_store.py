@@ -0,0 +1,294 @@
+"""
+列式指标存储
+Columnar Metric Store
+
+为业务监控提供固定内存的指标存储：
+- StringInterner：端点、用户等字符串驻留为整数ID
+- ColumnarRingBuffer：按字段预分配的NumPy环形缓冲区，保存最近的原始记录
+- DDSketch：可合并的流式分位数草图（相对误差有界）
+- HyperLogLog：可合并的去重计数
+- TimeBucketedAggregates：按时间桶和实体（端点、模型）聚合的计数、求和与草图
+
+统计查询只遍历时间桶内的聚合，耗时与桶数成正比，与调用次数无关。
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class StringInterner:
+    """字符串驻留表，超过容量的新字符串映射到溢出ID"""
+
+    OVERFLOW = "__other__"
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._ids: Dict[str, int] = {}
+        self._strings: List[str] = []
+        self.overflow_id = self.intern(self.OVERFLOW)
+
+    def intern(self, value: Optional[str]) -> int:
+        value = value or ""
+        existing = self._ids.get(value)
+        if existing is not None:
+            return existing
+        if len(self._strings) >= self.max_size:
+            return self.overflow_id
+        new_id = len(self._strings)
+        self._ids[value] = new_id
+        self._strings.append(value)
+        return new_id
+
+    def lookup(self, value_id: int) -> str:
+        return self._strings[value_id]
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+
+class ColumnarRingBuffer:
+    """按字段预分配的环形缓冲区"""
+
+    def __init__(self, capacity: int, columns: Dict[str, Any]):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in columns.items()}
+        self._next = 0
+        self.size = 0
+
+    def append(self, **values):
+        index = self._next
+        for name, column in self.columns.items():
+            column[index] = values[name]
+        self._next = (index + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def _order(self) -> np.ndarray:
+        """按写入顺序排列的下标"""
+        if self.size < self.capacity:
+            return np.arange(self.size)
+        return (np.arange(self.capacity) + self._next) % self.capacity
+
+    def select(self, since: Optional[float] = None, time_column: str = "timestamp") -> Dict[str, np.ndarray]:
+        """按写入顺序返回（可按时间过滤的）各列"""
+        order = self._order()
+        if since is not None:
+            order = order[self.columns[time_column][order] >= since]
+        return {name: column[order] for name, column in self.columns.items()}
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class DDSketch:
+    """DDSketch流式分位数草图
+
+    按对数间隔分桶，任意分位数的相对误差不超过relative_accuracy；
+    两个参数相同的草图可以无损合并。
+    """
+
+    __slots__ = ("relative_accuracy", "_gamma", "_ln_gamma", "min_value", "bins",
+                 "zero_count", "count", "sum", "min", "max")
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-9):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._ln_gamma = math.log(self._gamma)
+        self.min_value = min_value
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, weight: int = 1):
+        if value > self.min_value:
+            key = math.ceil(math.log(value) / self._ln_gamma)
+            self.bins[key] = self.bins.get(key, 0) + weight
+        else:
+            self.zero_count += weight
+        self.count += weight
+        self.sum += value * weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "DDSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        bins = self.bins
+        for key, count in other.bins.items():
+            bins[key] = bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return max(0.0, self.min)
+
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def _mix64(value: int) -> int:
+    """splitmix64混淆，用于HyperLogLog哈希"""
+    value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """HyperLogLog去重计数（固定2^precision字节，可合并）"""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 10):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, item_id: int):
+        hashed = _mix64(item_id)
+        index = hashed >> (64 - self.precision)
+        remaining = (hashed << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.precision + 1 if remaining == 0 else (64 - remaining.bit_length()) + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # 小基数使用线性计数
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class EntityAggregate:
+    """单个实体（端点、模型）在一个时间桶内的聚合"""
+
+    __slots__ = ("count", "errors", "latency", "totals")
+
+    def __init__(self, relative_accuracy: float):
+        self.count = 0
+        self.errors = 0
+        self.latency = DDSketch(relative_accuracy)
+        self.totals: Dict[str, float] = {}
+
+    def add(self, latency: float, error: bool, totals: Optional[Dict[str, float]] = None):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.latency.add(latency)
+        if totals:
+            for name, value in totals.items():
+                self.totals[name] = self.totals.get(name, 0) + value
+
+    def merge(self, other: "EntityAggregate"):
+        self.count += other.count
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+        for name, value in other.totals.items():
+            self.totals[name] = self.totals.get(name, 0) + value
+
+
+class TimeBucket:
+    """一个时间桶：各实体聚合 + 用户去重"""
+
+    __slots__ = ("start", "entities", "users")
+
+    def __init__(self, start: float, hll_precision: int):
+        self.start = start
+        self.entities: Dict[int, EntityAggregate] = {}
+        self.users = HyperLogLog(hll_precision)
+
+
+class TimeBucketedAggregates:
+    """按时间桶组织的实体聚合，超过保留期的桶被丢弃"""
+
+    def __init__(self, bucket_seconds: int = 300, retention_seconds: int = 7 * 24 * 3600,
+                 relative_accuracy: float = 0.01, hll_precision: int = 10,
+                 clock: Callable[[], float] = time.time):
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+        self.relative_accuracy = relative_accuracy
+        self.hll_precision = hll_precision
+        self.clock = clock
+        self.buckets: "OrderedDict[float, TimeBucket]" = OrderedDict()
+
+    def _bucket(self, timestamp: float) -> TimeBucket:
+        start = timestamp - timestamp % self.bucket_seconds
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = TimeBucket(start, self.hll_precision)
+            if len(self.buckets) > 1 and start < next(reversed(self.buckets)):
+                # 乱序到达的旧时间戳：保持桶按时间排序
+                self.buckets = OrderedDict(sorted(self.buckets.items()))
+            self._expire(timestamp)
+        return bucket
+
+    def _expire(self, now: float):
+        cutoff = now - self.retention_seconds
+        while self.buckets:
+            start = next(iter(self.buckets))
+            if start + self.bucket_seconds > cutoff:
+                break
+            self.buckets.popitem(last=False)
+
+    def add(self, timestamp: float, entity_id: int, user_id: int, latency: float,
+            error: bool, totals: Optional[Dict[str, float]] = None):
+        bucket = self._bucket(timestamp)
+        aggregate = bucket.entities.get(entity_id)
+        if aggregate is None:
+            aggregate = bucket.entities[entity_id] = EntityAggregate(self.relative_accuracy)
+        aggregate.add(latency, error, totals)
+        bucket.users.add(user_id)
+
+    def window(self, seconds: float) -> Iterable[TimeBucket]:
+        """与最近seconds秒有交集的桶"""
+        cutoff = self.clock() - seconds
+        for start in reversed(self.buckets):
+            if start + self.bucket_seconds <= cutoff:
+                break
+            yield self.buckets[start]
+
+    def summarize(self, seconds: float) -> Tuple[Dict[int, EntityAggregate], HyperLogLog]:
+        """合并窗口内各桶，返回每个实体的聚合和用户去重草图"""
+        merged: Dict[int, EntityAggregate] = {}
+        users = HyperLogLog(self.hll_precision)
+        for bucket in self.window(seconds):
+            users.merge(bucket.users)
+            for entity_id, aggregate in bucket.entities.items():
+                target = merged.get(entity_id)
+                if target is None:
+                    target = merged[entity_id] = EntityAggregate(self.relative_accuracy)
+                target.merge(aggregate)
+        return merged, users
+
+    def __len__(self) -> int:
+        return len(self.buckets)
@@ -0,0 +1,548 @@
+"""
+Prometheus指标注册表
+Prometheus Instrumentation Registry
+
+统一的进程内指标注册表，替代各模块按需扫描原始记录列表的统计方式：
+- Counter / Gauge / 固定桶Histogram，热路径更新为O(1)（一次字典查找 + 一次加法）
+- 每个指标的标签组合数有上限，超出后归入溢出序列并计数，防止高基数标签撑爆内存
+- 回调Gauge在抓取时求值，用于暴露已有组件的当前状态
+- 多进程部署时各worker定期写快照文件，抓取时合并为一份文本输出（Prometheus文本格式0.0.4）
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+from backend.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认延迟桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 超出标签基数上限时使用的标签值
+OVERFLOW_LABEL_VALUE = "__overflow__"
+
+# 多进程Gauge合并方式
+GAUGE_MODES = ("sum", "max", "min", "liveall")
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_string(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ----------------------------------------------------------------------
+# 指标子序列
+# ----------------------------------------------------------------------
+
+class CounterChild:
+    """计数器序列"""
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented by non-negative amounts")
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class GaugeChild:
+    """仪表序列"""
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def snapshot(self):
+        return self.value
+
+
+class HistogramChild:
+    """固定桶直方图序列（桶计数非累计存储，输出时累加）"""
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts) + [self.sum]
+
+
+# ----------------------------------------------------------------------
+# 指标族
+# ----------------------------------------------------------------------
+
+class MetricFamily:
+    """指标族：同名、同标签集的一组序列"""
+
+    type_name = "untyped"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str,
+                 labelnames: Sequence[str] = (), max_series: Optional[int] = None):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series or registry.max_series_per_metric
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        self.overflowed = 0
+        self._default = None if self.labelnames else self.labels()
+
+    def labels(self, *values, **kwargs):
+        """获取标签对应的序列（首次访问时创建，超过基数上限时返回溢出序列）"""
+        # 快速路径：标签值已是字符串时直接命中
+        child = self._children.get(values)
+        if child is not None:
+            return child
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(map(str, values))
+        child = self._children.get(key)
+        if child is not None:
+            return child
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                if len(self._children) >= self.max_series:
+                    self.overflowed += 1
+                    key = (OVERFLOW_LABEL_VALUE,) * len(self.labelnames)
+                    child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        """删除一个序列"""
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> Dict[Tuple[str, ...], object]:
+        """当前各序列的快照值"""
+        return {key: child.snapshot() for key, child in list(self._children.items())}
+
+
+class Counter(MetricFamily):
+    """计数器"""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(MetricFamily):
+    """仪表"""
+
+    type_name = "gauge"
+
+    def __init__(self, *args, multiprocess_mode: str = "sum", **kwargs):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"Unknown multiprocess_mode: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(*args, **kwargs)
+
+    def _new_child(self):
+        return GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+
+class CallbackGauge(Gauge):
+    """回调仪表：抓取时调用函数求值
+
+    函数返回单个数值，或{标签值元组: 数值}映射。
+    """
+
+    def __init__(self, registry, name, documentation, function: Callable, labelnames=(), **kwargs):
+        self.function = function
+        super().__init__(registry, name, documentation, labelnames, **kwargs)
+
+    def collect(self):
+        try:
+            result = self.function()
+        except Exception as e:
+            logger.debug(f"Callback gauge {self.name} failed: {e}")
+            return {}
+        if isinstance(result, Mapping):
+            collected = {}
+            for key, value in list(result.items())[:self.max_series]:
+                key = key if isinstance(key, tuple) else (key,)
+                collected[tuple(str(item) for item in key)] = float(value)
+            return collected
+        return {(): float(result)} if result is not None else {}
+
+
+class Histogram(MetricFamily):
+    """固定桶直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets if bound != math.inf))
+        super().__init__(*args, **kwargs)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+
+# ----------------------------------------------------------------------
+# 注册表
+# ----------------------------------------------------------------------
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self, max_series_per_metric: int = 1000, multiprocess_dir: Optional[str] = None):
+        self.max_series_per_metric = max_series_per_metric
+        self.multiprocess_dir = Path(multiprocess_dir) if multiprocess_dir else None
+        self._families: Dict[str, MetricFamily] = {}
+        self._lock = threading.Lock()
+        self._label_cache: Dict[Tuple, str] = {}
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    def _register(self, cls, name: str, documentation: str, labelnames=(), **kwargs) -> MetricFamily:
+        with self._lock:
+            existing = self._families.get(name)
+            if existing is not None:
+                if type(existing) is not cls or existing.labelnames != tuple(labelnames):
+                    raise ValueError(f"Metric {name} already registered with a different type or labels")
+                return existing
+            family = self._families[name] = cls(self, name, documentation, labelnames, **kwargs)
+            return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                max_series: Optional[int] = None) -> Counter:
+        """注册（或获取已有）计数器"""
+        return self._register(Counter, name, documentation, labelnames, max_series=max_series)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              max_series: Optional[int] = None, multiprocess_mode: str = "sum") -> Gauge:
+        """注册（或获取已有）仪表"""
+        return self._register(Gauge, name, documentation, labelnames, max_series=max_series,
+                              multiprocess_mode=multiprocess_mode)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS, max_series: Optional[int] = None) -> Histogram:
+        """注册（或获取已有）直方图"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets,
+                              max_series=max_series)
+
+    def callback_gauge(self, name: str, documentation: str, function: Callable,
+                       labelnames: Sequence[str] = (), multiprocess_mode: str = "sum") -> CallbackGauge:
+        """注册回调仪表（重复注册时替换回调函数）"""
+        with self._lock:
+            family = CallbackGauge(self, name, documentation, function, labelnames,
+                                   multiprocess_mode=multiprocess_mode)
+            self._families[name] = family
+            return family
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._families.pop(name, None)
+
+    def get(self, name: str) -> Optional[MetricFamily]:
+        return self._families.get(name)
+
+    # ------------------------------------------------------------------
+    # 快照与多进程合并
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """当前进程所有指标的快照（可JSON序列化）"""
+        families = {}
+        for name, family in list(self._families.items()):
+            families[name] = {
+                "type": family.type_name,
+                "help": family.documentation,
+                "labelnames": list(family.labelnames),
+                "mode": getattr(family, "multiprocess_mode", None),
+                "buckets": list(getattr(family, "buckets", ())),
+                "samples": [[list(key), value] for key, value in family.collect().items()]
+            }
+        overflow = {name: family.overflowed for name, family in self._families.items() if family.overflowed}
+        if overflow:
+            families["metrics_label_overflow_total"] = {
+                "type": "counter",
+                "help": "超出标签基数上限而归入溢出序列的新标签组合数",
+                "labelnames": ["metric"], "mode": None, "buckets": [],
+                "samples": [[[name], count] for name, count in overflow.items()]
+            }
+        return families
+
+    def write_snapshot(self, directory: Optional[Union[str, Path]] = None) -> Optional[Path]:
+        """将本进程快照原子写入多进程目录"""
+        directory = Path(directory) if directory else self.multiprocess_dir
+        if directory is None:
+            return None
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}.json"
+        tmp_path = directory / f".{os.getpid()}.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        return path
+
+    def start_snapshot_task(self, interval: float = 5.0):
+        """启动定期写快照任务（仅配置了多进程目录时）"""
+        if self.multiprocess_dir is None or self._snapshot_task is not None:
+            return
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop(interval))
+
+    async def stop_snapshot_task(self):
+        """停止写快照任务并写入最后一次快照"""
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+        if self.multiprocess_dir is not None:
+            await asyncio.to_thread(self.write_snapshot)
+
+    async def _snapshot_loop(self, interval: float):
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await asyncio.to_thread(self.write_snapshot)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error writing metrics snapshot: {e}")
+
+    def collect_all(self) -> Dict[str, Dict]:
+        """合并本进程与其他worker快照"""
+        own = self.snapshot()
+        if self.multiprocess_dir is None or not self.multiprocess_dir.exists():
+            return own
+
+        snapshots = [(os.getpid(), True, own)]
+        for path in self.multiprocess_dir.glob("*.json"):
+            if not path.stem.isdigit() or int(path.stem) == os.getpid():
+                continue
+            pid = int(path.stem)
+            try:
+                with open(path, "r") as f:
+                    snapshots.append((pid, _pid_alive(pid), json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.debug(f"Skipping metrics snapshot {path}: {e}")
+        return merge_snapshots(snapshots)
+
+    # ------------------------------------------------------------------
+    # 文本输出
+    # ------------------------------------------------------------------
+
+    def render(self) -> str:
+        """生成Prometheus文本格式输出"""
+        lines: List[str] = []
+        for name, family in sorted(self.collect_all().items()):
+            if not family["samples"]:
+                continue
+            labelnames = tuple(family["labelnames"])
+            lines.append(f"# HELP {name} {_escape(family['help'])}")
+            lines.append(f"# TYPE {name} {family['type']}")
+
+            if family["type"] == "histogram":
+                bounds = [_format_value(bound) for bound in family["buckets"]] + ["+Inf"]
+                for key, value in family["samples"]:
+                    cumulative = 0
+                    for bound, count in zip(bounds, value[:-1]):
+                        cumulative += count
+                        labels = _label_string(labelnames, key, f'le="{bound}"')
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = self._labels(labelnames, key)
+                    lines.append(f"{name}_sum{labels} {_format_value(value[-1])}")
+                    lines.append(f"{name}_count{labels} {cumulative}")
+            else:
+                for key, value in family["samples"]:
+                    lines.append(f"{name}{self._labels(labelnames, key)} {_format_value(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+    def _labels(self, labelnames: Tuple[str, ...], values: Sequence[str]) -> str:
+        key = (labelnames, tuple(values))
+        text = self._label_cache.get(key)
+        if text is None:
+            if len(self._label_cache) > 100000:
+                self._label_cache.clear()
+            text = self._label_cache[key] = _label_string(labelnames, values)
+        return text
+
+
+def merge_snapshots(snapshots: Iterable[Tuple[int, bool, Dict[str, Dict]]]) -> Dict[str, Dict]:
+    """合并多个进程的快照
+
+    计数器和直方图累加（已退出进程的累计值保留）；仪表按multiprocess_mode合并，
+    已退出进程的仪表丢弃。
+    """
+    merged: Dict[str, Dict] = {}
+    values: Dict[str, Dict[Tuple[str, ...], object]] = {}
+
+    for pid, alive, families in snapshots:
+        for name, family in families.items():
+            kind = family["type"]
+            if kind == "gauge" and not alive:
+                continue
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = dict(family, samples=[])
+                if kind == "gauge" and family.get("mode") == "liveall":
+                    target["labelnames"] = list(family["labelnames"]) + ["pid"]
+                values[name] = {}
+            series = values[name]
+            mode = family.get("mode")
+
+            for key, value in family["samples"]:
+                key = tuple(key)
+                if kind == "gauge" and mode == "liveall":
+                    key = key + (str(pid),)
+                current = series.get(key)
+                if current is None:
+                    series[key] = list(value) if isinstance(value, list) else value
+                elif kind == "histogram":
+                    if len(current) == len(value):
+                        series[key] = [a + b for a, b in zip(current, value)]
+                elif kind == "gauge" and mode == "max":
+                    series[key] = max(current, value)
+                elif kind == "gauge" and mode == "min":
+                    series[key] = min(current, value)
+                else:
+                    series[key] = current + value
+
+    for name, family in merged.items():
+        family["samples"] = [[list(key), value] for key, value in values[name].items()]
+    return merged
+
+
+# ----------------------------------------------------------------------
+# 全局实例
+# ----------------------------------------------------------------------
+
+metrics_registry = MetricsRegistry(
+    max_series_per_metric=getattr(settings, 'metrics_max_series_per_metric', 1000),
+    multiprocess_dir=getattr(settings, 'metrics_multiproc_dir', None)
+)
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取全局指标注册表"""
+    return metrics_registry
+
+
+def benchmark_instrumentation(updates: int = 200000, series: int = 500) -> Dict[str, float]:
+    """热路径更新开销与抓取耗时基准（独立注册表，不影响全局指标）"""
+    import time
+
+    registry = MetricsRegistry()
+    requests = registry.counter("bench_requests_total", "bench", ("route", "status"))
+    latency = registry.histogram("bench_latency_seconds", "bench", ("route",))
+    routes = [f"/api/v1/route/{i}" for i in range(series)]
+
+    start = time.perf_counter()
+    for i in range(updates):
+        route = routes[i % series]
+        requests.labels(route, "200").inc()
+        latency.labels(route).observe((i % 1000) / 1000)
+    update_ns = (time.perf_counter() - start) / updates * 1e9
+
+    start = time.perf_counter()
+    body = registry.render()
+    render_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "update_ns": round(update_ns, 1),
+        "render_ms": round(render_ms, 2),
+        "series": series * 2,
+        "exposition_bytes": len(body)
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_instrumentation(), indent=2))
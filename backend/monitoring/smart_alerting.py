@@ -62,13 +62,19 @@ class SmartAlerting:
         self.correlation_window_minutes = 10
 
     async def evaluate_smart_alert(self, metric_name: str, current_value: float,
-                                  timestamp: datetime = None, context: Dict = None) -> Optional[SmartAlert]:
-        """智能告警评估"""
+                                  timestamp: datetime = None, context: Dict = None,
+                                  historical_data: List[Dict] = None,
+                                  anomaly_result: Optional[AnomalyResult] = None) -> Optional[SmartAlert]:
+        """智能告警评估
+
+        historical_data和anomaly_result可由调用方批量预先计算后传入。
+        """
         if timestamp is None:
             timestamp = datetime.utcnow()
 
         # 获取历史数据
-        historical_data = self._get_historical_data(metric_name, lookback_hours=48)
+        if historical_data is None:
+            historical_data = self._get_historical_data(metric_name, lookback_hours=48)
         if len(historical_data) < 10:
             return None
 
@@ -78,6 +84,7 @@ class SmartAlerting:
             current_value=current_value,
             timestamp=timestamp,
             historical_data=historical_data,
+            anomaly_result=anomaly_result,
             business_context=self._get_business_context(metric_name),
             system_context=self._get_system_context()
         )
@@ -115,10 +122,7 @@ class SmartAlerting:
         """评估基于规则的告警"""
         try:
             # 获取相关的告警规则
-            relevant_rules = [
-                rule for rule in alert_engine.rules.values()
-                if rule.metric_name == context.metric_name and rule.enabled
-            ]
+            relevant_rules = alert_engine.get_rules_for_metric(context.metric_name)
 
             triggered_rules = []
             for rule in relevant_rules:
@@ -157,15 +161,17 @@ class SmartAlerting:
             if len(context.historical_data) < 100:
                 return None
 
-            # 执行异常检测
-            current_data = {
-                'value': context.current_value,
-                'timestamp': context.timestamp.isoformat()
-            }
+            anomaly_result = context.anomaly_result
+            if anomaly_result is None:
+                # 执行异常检测
+                current_data = {
+                    'value': context.current_value,
+                    'timestamp': context.timestamp.isoformat()
+                }
 
-            anomaly_result = self.anomaly_detector.detect_anomaly(
-                context.metric_name, current_data, context.historical_data
-            )
+                anomaly_result = self.anomaly_detector.detect_anomaly(
+                    context.metric_name, current_data, context.historical_data
+                )
 
             if anomaly_result and anomaly_result.is_anomaly:
                 # 根据异常分数确定严重程度
@@ -0,0 +1,94 @@
+"""
+批量加载 - Batch Loading
+DataLoader式批量加载器：一批键用一条 IN 查询取回并按键缓存；服务层遍历结果行时用它代替
+逐行查询关联对象，避免N+1查询
+"""
+
+from typing import Any, Callable, Dict, Generic, Hashable, Iterable, List, Mapping, Optional, Sequence, TypeVar
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """按键批量加载并缓存
+
+    batch_fn接收去重后的一批键，返回 {键: 值}；未返回的键取default。
+    """
+
+    def __init__(self, batch_fn: Callable[[List[K]], Mapping[K, V]], max_batch_size: int = 500,
+                 default: Optional[V] = None):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.default = default
+        self._cache: Dict[K, V] = {}
+        self.batches = 0
+
+    def load(self, key: K) -> V:
+        return self.load_many([key])[0]
+
+    def load_many(self, keys: Iterable[K]) -> List[V]:
+        """按keys顺序返回值，未缓存的键分批一次取回"""
+        keys = list(keys)
+        missing = list(dict.fromkeys(key for key in keys if key is not None and key not in self._cache))
+        for start in range(0, len(missing), self.max_batch_size):
+            chunk = missing[start:start + self.max_batch_size]
+            found = self.batch_fn(chunk)
+            self.batches += 1
+            for key in chunk:
+                self._cache[key] = found.get(key, self.default)
+        return [self._cache.get(key, self.default) for key in keys]
+
+    def load_map(self, keys: Iterable[K]) -> Dict[K, V]:
+        keys = list(keys)
+        return dict(zip(keys, self.load_many(keys)))
+
+    def prime(self, key: K, value: V):
+        """写入已知的值，之后不再查询"""
+        self._cache.setdefault(key, value)
+
+    def clear(self, key: Optional[K] = None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+
+def model_loader(session: Session, column, *criteria, options: Sequence[Any] = ()) -> BatchLoader:
+    """按列值加载实体，如 model_loader(db, Role.id, options=[selectinload(Role.permissions)])"""
+    model = column.class_
+
+    def batch(keys):
+        stmt = select(model).where(column.in_(keys), *criteria).options(*options)
+        return {getattr(obj, column.key): obj for obj in session.execute(stmt).scalars().all()}
+
+    return BatchLoader(batch)
+
+
+def group_loader(session: Session, column, *criteria, options: Sequence[Any] = (), order_by=None) -> BatchLoader:
+    """一对多：按外键列加载实体列表，没有记录的键得到空列表"""
+    model = column.class_
+
+    def batch(keys):
+        stmt = select(model).where(column.in_(keys), *criteria).options(*options)
+        if order_by is not None:
+            stmt = stmt.order_by(order_by)
+        groups = {key: [] for key in keys}
+        for obj in session.execute(stmt).scalars().all():
+            groups[getattr(obj, column.key)].append(obj)
+        return groups
+
+    return BatchLoader(batch)
+
+
+def aggregate_loader(session: Session, column, aggregate, *criteria, default: Any = 0) -> BatchLoader:
+    """按列分组聚合，如 aggregate_loader(db, Member.team_id, func.count(Member.id))"""
+
+    def batch(keys):
+        stmt = select(column, aggregate).where(column.in_(keys), *criteria).group_by(column)
+        return {key: value for key, value in session.execute(stmt).all()}
+
+    return BatchLoader(batch, default=default)
@@ -9,15 +9,31 @@ from typing import Dict, List, Optional, Any, Callable, AsyncGenerator
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
 from contextlib import asynccontextmanager, asynccontextmanager
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
 import logging
 from collections import deque, defaultdict
 import psutil
 
+from backend.core.database import get_engine_registry
+
 logger = logging.getLogger(__name__)
 
+# 传给共享引擎注册表的连接池容量参数
+POOL_SIZING_KEYS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle')
+
+
+def recommend_pool_size(current_size: int, utilization_rate: float, min_size: int, max_size: int,
+                        scale_up: float = 0.8, scale_down: float = 0.3,
+                        up_step: int = 5, down_step: int = 2) -> int:
+    """根据连接使用率计算目标连接池大小：使用率高时扩容，低时缩容，范围 [min_size, max_size]"""
+    if utilization_rate > scale_up and current_size < max_size:
+        return min(current_size + up_step, max_size)
+    if utilization_rate < scale_down and current_size > min_size:
+        return max(current_size - down_step, min_size)
+    return current_size
+
 @dataclass
 class ConnectionPoolStats:
     """连接池统计信息"""
@@ -61,27 +77,11 @@ class ConnectionPoolManager:
         self.connection_metrics: Dict[str, ConnectionMetrics] = {}
         self.active_connections: Dict[str, Dict] = {}
 
-        # 默认配置
+        # 默认配置（pool_size等容量参数来自settings，引擎由进程级注册表共享）
+        self.registry = get_engine_registry()
         self.default_config = {
-            'pool_size': 20,  # 基础连接数
-            'max_overflow': 30,  # 溢出连接数
-            'pool_timeout': 30,  # 获取连接超时时间（秒）
-            'pool_recycle': 3600,  # 连接回收时间（秒）
+            **self.registry.default_pool_sizing(),
             'pool_pre_ping': True,  # 连接前ping检查
-            'pool_reset_on_return': 'rollback',  # 连接返回时的操作
-            'echo': False,  # SQL日志
-            'future': True,  # 使用Future API
-            'isolation_level': 'READ_COMMITTED',
-            'poolclass': QueuePool,
-            'connect_args': {
-                'connect_timeout': 10,
-                'command_timeout': 30,
-                'server_settings': {
-                    'application_name': 'ai-hub-pool',
-                    'timezone': 'UTC'
-                }
-            },
-            'pool_reset_on_return': 'commit'
         }
 
         # 合并用户配置
@@ -107,19 +107,10 @@ class ConnectionPoolManager:
         try:
             logger.info("Initializing database connection pool...")
 
-            # 创建异步引擎
-            self.engine = create_async_engine(
-                self.database_url,
-                **self.config
-            )
-
-            # 创建session工厂
-            self.session_factory = sessionmaker(
-                bind=self.engine,
-                class_=AsyncSession,
-                expire_on_commit=False,
-                autoflush=False
-            )
+            # 获取共享异步引擎，同一URL在进程内只有一个连接池
+            sizing = {key: self.config[key] for key in POOL_SIZING_KEYS if key in self.config}
+            self.engine = self.registry.get_async_engine(self.database_url, name="pool-manager", **sizing)
+            self.session_factory = self.registry.get_async_session_factory(self.database_url)
 
             # 测试连接
             await self._test_connection()
@@ -380,12 +371,16 @@ class ConnectionPoolManager:
             if len(self.scaling_history) > 100:
                 self.scaling_history.popleft()
 
-            # 检查是否需要扩容
-            if utilization_rate > self.auto_scale_threshold['scale_up']:
+            target_size = recommend_pool_size(
+                current_size, utilization_rate,
+                min_size=self.config['pool_size'],
+                max_size=self.config['pool_size'] + self.config['max_overflow'],
+                scale_up=self.auto_scale_threshold['scale_up'],
+                scale_down=self.auto_scale_threshold['scale_down']
+            )
+            if target_size > current_size:
                 await self._scale_up_pool()
-
-            # 检查是否需要缩容
-            elif utilization_rate < self.auto_scale_threshold['scale_down'] and current_size > self.config['pool_size']:
+            elif target_size < current_size:
                 await self._scale_down_pool()
 
         except Exception as e:
@@ -401,8 +396,7 @@ class ConnectionPoolManager:
             if current_size < max_size:
                 new_size = min(current_size + 5, max_size)
                 logger.info(f"Scaling up pool from {current_size} to {new_size}")
-                # 实际的扩容需要重新创建引擎
-                # 这是一个复杂操作，需要谨慎处理
+                await self._resize_pool(new_size)
 
         except Exception as e:
             logger.error(f"Error scaling up pool: {e}")
@@ -417,12 +411,16 @@ class ConnectionPoolManager:
             if current_size > min_size:
                 new_size = max(current_size - 2, min_size)
                 logger.info(f"Scaling down pool from {current_size} to {new_size}")
-                # 实际的缩容需要重新创建引擎
-                # 这是一个复杂操作，需要谨慎处理
+                await self._resize_pool(new_size)
 
         except Exception as e:
             logger.error(f"Error scaling down pool: {e}")
 
+    async def _resize_pool(self, new_size: int) -> bool:
+        """调整共享连接池的常驻连接数，常驻与溢出连接总数上限不变"""
+        max_size = self.config['max_overflow'] + self.config['pool_size']
+        return await self.registry.resize(self.database_url, new_size, max(max_size - new_size, 0))
+
     async def _monitor_system_resources(self):
         """监控系统资源"""
         if not self.monitoring_enabled:
@@ -550,9 +548,8 @@ class ConnectionPoolManager:
         }
 
     async def close_pool(self):
-        """关闭连接池"""
+        """停止管理连接池（共享引擎由注册表在应用关闭时释放）"""
         if self.engine:
-            await self.engine.dispose()
             self.engine = None
             self.session_factory = None
             logger.info("Database connection pool closed")
@@ -566,11 +563,12 @@ class ConnectionPoolManager:
             # 更新配置
             self.config.update(new_config)
 
-            # 需要重新创建引擎来应用新配置
-            await self.close_pool()
-
-            # 使用新配置重新初始化
-            success = await self.initialize_pool()
+            # 容量参数通过重建共享引擎的连接池生效
+            if not self.engine:
+                success = await self.initialize_pool()
+            else:
+                await self.registry.resize(self.database_url, self.config['pool_size'], self.config['max_overflow'])
+                success = True
 
             if success:
                 logger.info("Pool settings optimized successfully")
@@ -579,7 +577,6 @@ class ConnectionPoolManager:
             else:
                 # 恢复旧配置
                 self.config = old_config
-                await self.initialize_pool()
                 logger.warning("Failed to apply new settings, reverted to old config")
 
             return success
@@ -594,15 +591,10 @@ class ConnectionPoolManager:
             if not self.engine:
                 return 0
 
-            pool = self.engine.pool
-
-            # 关闭所有连接
-            await pool.dispose()
+            cleaned = self.engine.pool.checkedin()
 
-            cleaned = pool.size() + pool.overflow()
-
-            # 重新创建连接池
-            await pool.recreate()
+            # 关闭空闲连接并以相同配置重建连接池，借出的连接归还时关闭
+            await self.engine.dispose()
 
             logger.info(f"Force cleaned up {cleaned} connections")
             return cleaned
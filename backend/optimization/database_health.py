@@ -243,6 +243,19 @@ class DatabaseHealthMonitor:
             }
         }
 
+    def _build_metric(self, name: str, value: float) -> HealthMetric:
+        """按指标配置创建健康指标"""
+        config = self.metrics_config[name]
+        return HealthMetric(
+            name=name,
+            metric_type=config["type"],
+            value=value,
+            threshold_warning=config["warning"],
+            threshold_critical=config["critical"],
+            unit=config["unit"],
+            description=config["description"]
+        )
+
     async def start_monitoring(self):
         """启动监控"""
         if self.is_monitoring:
@@ -292,19 +305,23 @@ class DatabaseHealthMonitor:
 
         for node in all_nodes:
             try:
-                await self._check_node_health(node)
+                await self._check_node_health(node, engine)
             except Exception as e:
                 logger.error(f"Health check failed for node {node.id}: {e}")
 
-    async def _check_node_health(self, node: DatabaseNode):
+    async def _check_node_health(self, node: DatabaseNode, rw_engine):
         """检查单个节点的健康状态"""
-        db_engine = engine.engines.get(node.id)
+        db_engine = rw_engine.engines.get(node.id)
         if not db_engine:
             return
 
         # 收集各项指标
         metrics = await self._collect_metrics(node, db_engine)
 
+        # 复制延迟反馈给读写分离路由（动态权重和超出SLO时摘除）
+        if "replication_lag" in metrics:
+            rw_engine.update_replication_lag(node.id, metrics["replication_lag"].value)
+
         # 计算整体健康状态
         overall_status = self._calculate_overall_status(metrics)
 
@@ -373,12 +390,7 @@ class DatabaseHealthMonitor:
             checked_out = pool.checkedout()
 
             pool_usage = (checked_out / pool_size) * 100 if pool_size > 0 else 0
-            metrics["connection_pool_usage"] = HealthMetric(
-                name="connection_pool_usage",
-                metric_type=MetricType.CONNECTION,
-                value=pool_usage,
-                **self.metrics_config["connection_pool_usage"]
-            )
+            metrics["connection_pool_usage"] = self._build_metric("connection_pool_usage", pool_usage)
 
             # 活跃连接数（从数据库获取）
             async with db_engine.begin() as conn:
@@ -392,12 +404,7 @@ class DatabaseHealthMonitor:
                 max_connections = 100  # 默认值，应该从配置获取
                 active_usage = (active_count / max_connections) * 100
 
-                metrics["active_connections"] = HealthMetric(
-                    name="active_connections",
-                    metric_type=MetricType.CONNECTION,
-                    value=active_usage,
-                    **self.metrics_config["active_connections"]
-                )
+                metrics["active_connections"] = self._build_metric("active_connections", active_usage)
 
         except Exception as e:
             logger.error(f"Failed to collect connection metrics: {e}")
@@ -421,12 +428,7 @@ class DatabaseHealthMonitor:
                 row = result.first()
 
                 if row and row.total_calls > 0:
-                    metrics["query_response_time"] = HealthMetric(
-                        name="query_response_time",
-                        metric_type=MetricType.PERFORMANCE,
-                        value=row.avg_response_time,
-                        **self.metrics_config["query_response_time"]
-                    )
+                    metrics["query_response_time"] = self._build_metric("query_response_time", row.avg_response_time)
 
                 # 慢查询数量
                 result = await conn.execute(text("""
@@ -436,12 +438,7 @@ class DatabaseHealthMonitor:
                 """))
                 slow_count = result.scalar() or 0
 
-                metrics["slow_queries"] = HealthMetric(
-                    name="slow_queries",
-                    metric_type=MetricType.PERFORMANCE,
-                    value=slow_count,
-                    **self.metrics_config["slow_queries"]
-                )
+                metrics["slow_queries"] = self._build_metric("slow_queries", slow_count)
 
                 # 锁等待时间
                 result = await conn.execute(text("""
@@ -453,12 +450,7 @@ class DatabaseHealthMonitor:
                 """))
                 avg_wait = result.scalar() or 0
 
-                metrics["lock_wait_time"] = HealthMetric(
-                    name="lock_wait_time",
-                    metric_type=MetricType.PERFORMANCE,
-                    value=avg_wait,
-                    **self.metrics_config["lock_wait_time"]
-                )
+                metrics["lock_wait_time"] = self._build_metric("lock_wait_time", avg_wait)
 
         except Exception as e:
             logger.error(f"Failed to collect performance metrics: {e}")
@@ -475,38 +467,18 @@ class DatabaseHealthMonitor:
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/')
 
-            metrics["cpu_usage"] = HealthMetric(
-                name="cpu_usage",
-                metric_type=MetricType.RESOURCE,
-                value=cpu_percent,
-                **self.metrics_config["cpu_usage"]
-            )
+            metrics["cpu_usage"] = self._build_metric("cpu_usage", cpu_percent)
 
-            metrics["memory_usage"] = HealthMetric(
-                name="memory_usage",
-                metric_type=MetricType.RESOURCE,
-                value=memory.percent,
-                **self.metrics_config["memory_usage"]
-            )
+            metrics["memory_usage"] = self._build_metric("memory_usage", memory.percent)
 
             disk_usage_percent = (disk.used / disk.total) * 100
-            metrics["disk_usage"] = HealthMetric(
-                name="disk_usage",
-                metric_type=MetricType.RESOURCE,
-                value=disk_usage_percent,
-                **self.metrics_config["disk_usage"]
-            )
+            metrics["disk_usage"] = self._build_metric("disk_usage", disk_usage_percent)
 
             # 磁盘I/O
             disk_io = psutil.disk_io_counters()
             if disk_io:
                 # 简化的I/O使用率计算
-                metrics["disk_io_usage"] = HealthMetric(
-                    name="disk_io_usage",
-                    metric_type=MetricType.RESOURCE,
-                    value=50.0,  # 简化值，实际应该基于历史数据计算
-                    **self.metrics_config["disk_io_usage"]
-                )
+                metrics["disk_io_usage"] = self._build_metric("disk_io_usage", 50.0)  # 简化值，实际应该基于历史数据计算
 
         except Exception as e:
             logger.error(f"Failed to collect resource metrics: {e}")
@@ -519,27 +491,19 @@ class DatabaseHealthMonitor:
 
         try:
             async with db_engine.begin() as conn:
-                # 复制延迟
+                # 复制延迟（已回放到接收位置时为0，避免主库空闲时误报）
                 result = await conn.execute(text("""
                     SELECT
-                        COALESCE(EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())), 0) as lag_seconds
+                        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())), 0)
+                        END as lag_seconds
                 """))
                 lag = result.scalar() or 0
 
-                metrics["replication_lag"] = HealthMetric(
-                    name="replication_lag",
-                    metric_type=MetricType.REPLICATION,
-                    value=lag,
-                    **self.metrics_config["replication_lag"]
-                )
+                metrics["replication_lag"] = self._build_metric("replication_lag", float(lag))
 
                 # 复制同步率（简化计算）
-                metrics["replication_sync"] = HealthMetric(
-                    name="replication_sync",
-                    metric_type=MetricType.REPLICATION,
-                    value=99.5,  # 简化值，实际应该基于WAL位置计算
-                    **self.metrics_config["replication_sync"]
-                )
+                metrics["replication_sync"] = self._build_metric("replication_sync", 99.5)  # 简化值，实际应该基于WAL位置计算
 
         except Exception as e:
             logger.error(f"Failed to collect replication metrics: {e}")
@@ -562,12 +526,7 @@ class DatabaseHealthMonitor:
                 total_size = result.scalar() or 0
 
                 # 基于历史数据计算增长率（简化为固定值）
-                metrics["table_size_growth"] = HealthMetric(
-                    name="table_size_growth",
-                    metric_type=MetricType.STORAGE,
-                    value=5.0,  # MB/hour，实际应该基于历史数据计算
-                    **self.metrics_config["table_size_growth"]
-                )
+                metrics["table_size_growth"] = self._build_metric("table_size_growth", 5.0)  # MB/hour，实际应该基于历史数据计算
 
                 # 索引使用率
                 result = await conn.execute(text("""
@@ -580,12 +539,7 @@ class DatabaseHealthMonitor:
                 """))
                 usage_rate = result.scalar() or 0
 
-                metrics["index_usage"] = HealthMetric(
-                    name="index_usage",
-                    metric_type=MetricType.STORAGE,
-                    value=usage_rate,
-                    **self.metrics_config["index_usage"]
-                )
+                metrics["index_usage"] = self._build_metric("index_usage", usage_rate)
 
         except Exception as e:
             logger.error(f"Failed to collect storage metrics: {e}")
@@ -0,0 +1,888 @@
+"""
+索引顾问 - Workload-driven Index Advisor
+基于采集的工作负载（QueryOptimizer记录的规范化语句与耗时）推荐索引：
+- 用词法分析提取每条语句对各表的等值、范围、排序、分组和连接列
+- 用列统计信息估算选择性，生成候选索引
+- 评估候选索引：有hypopg扩展时用假设索引的EXPLAIN代价，或在SQLite副本上回放工作负载，
+  否则使用基于统计信息的代价模型
+- 贪心选择收益最大的索引，输出按预计节省耗时排序的创建/删除建议
+"""
+
+import logging
+import math
+import re
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from backend.optimization.sql_classifier import get_sql_classifier, tokenize
+
+logger = logging.getLogger(__name__)
+
+# 代价模型常数（相对单位：顺序读一行 = 1）
+RANDOM_ROW_COST = 4.0  # 索引扫描回表读一行
+SORT_ROW_COST = 0.5  # 排序一行（乘以log2(n)）
+INDEX_MAINTENANCE_COST = 2.0  # 写入一行时每个索引每层B树的维护代价
+DEFAULT_ROW_COUNT = 1000.0
+DEFAULT_EQ_SELECTIVITY = 0.005  # 无统计信息时的等值选择性（与PostgreSQL默认值一致）
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+
+_TABLE_INTRO = frozenset(("FROM", "JOIN", "UPDATE", "INTO"))
+_CLAUSE_WORDS = frozenset((
+    "SELECT", "WHERE", "GROUP", "ORDER", "LIMIT", "OFFSET", "HAVING", "UNION", "INTERSECT", "EXCEPT",
+    "RETURNING", "FOR", "WINDOW", "SET", "VALUES", "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "FULL",
+    "CROSS", "NATURAL", "OUTER", "LATERAL", "WITH", "FETCH", "FROM", "AS", "DEFAULT"
+))
+_EXPRESSION_WORDS = frozenset((
+    "AND", "OR", "NOT", "IN", "IS", "NULL", "BETWEEN", "LIKE", "ILIKE", "EXISTS", "ANY", "ALL", "CASE", "WHEN",
+    "THEN", "ELSE", "END", "ASC", "DESC", "NULLS", "FIRST", "LAST", "TRUE", "FALSE", "DISTINCT", "BY", "CAST",
+    "INTERVAL", "CURRENT_TIMESTAMP", "CURRENT_DATE", "NOW"
+)) | _CLAUSE_WORDS
+_COMPARISONS = frozenset(("=", "<", ">", "<=", ">="))
+_LITERAL_KINDS = frozenset(("estring", "string", "dollar", "number", "param"))
+
+
+@dataclass
+class TableAccess:
+    """一条语句对一张表的访问方式"""
+    table: str
+    equality: List[str] = field(default_factory=list)
+    ranges: List[str] = field(default_factory=list)
+    joins: List[str] = field(default_factory=list)
+    order_by: List[str] = field(default_factory=list)
+    group_by: List[str] = field(default_factory=list)
+    read: bool = True
+    write: bool = False
+
+
+def _add(columns: List[str], column: str):
+    if column not in columns:
+        columns.append(column)
+
+
+def _name(value: str) -> str:
+    if value[:1] in ('"', '`'):
+        return value[1:-1]
+    return value.lower()
+
+
+class _StatementParser:
+    """基于词法单元提取表和列的使用方式"""
+
+    def __init__(self, sql: str, known_columns: Optional[Dict[str, Set[str]]] = None):
+        self.tokens = list(tokenize(sql))
+        self.known_columns = known_columns or {}
+        self.aliases: Dict[str, str] = {}
+        self.accesses: Dict[str, TableAccess] = {}
+        words = [value.upper() for kind, value in self.tokens if kind == "word"]
+        self.leading = words[0] if words else ""
+
+    def _is_name(self, index: int) -> bool:
+        if index >= len(self.tokens):
+            return False
+        kind, value = self.tokens[index]
+        return kind == "ident" or (kind == "word" and value.upper() not in _EXPRESSION_WORDS)
+
+    def _read_ref(self, index: int) -> Tuple[Optional[List[str]], int]:
+        """读取 a.b.c 形式的名称，返回 (各段, 下一个位置)"""
+        if not self._is_name(index):
+            return None, index
+        parts = [_name(self.tokens[index][1])]
+        index += 1
+        while (index + 1 < len(self.tokens) and self.tokens[index] == ("punct", ".")
+               and self.tokens[index + 1][0] in ("word", "ident")):
+            parts.append(_name(self.tokens[index + 1][1]))
+            index += 2
+        return parts, index
+
+    def _access(self, table: str) -> TableAccess:
+        access = self.accesses.get(table)
+        if access is None:
+            access = self.accesses[table] = TableAccess(table)
+        return access
+
+    def _collect_tables(self):
+        tokens = self.tokens
+        index = 0
+        while index < len(tokens):
+            kind, value = tokens[index]
+            intro = value.upper() if kind == "word" else ""
+            if intro not in _TABLE_INTRO:
+                index += 1
+                continue
+            index += 1
+            while True:
+                parts, after = self._read_ref(index)
+                if parts is None:
+                    break
+                if after < len(tokens) and tokens[after] == ("punct", "(") and intro != "INTO":
+                    break  # 表函数
+                table = parts[-1]
+                access = self._access(table)
+                self.aliases[table] = table
+                if intro == "INTO" or intro == "UPDATE" or (intro == "FROM" and self.leading == "DELETE"):
+                    access.write = True
+                    access.read = intro != "INTO"
+                index = after
+                if index < len(tokens) and tokens[index][0] == "word" and tokens[index][1].upper() == "AS":
+                    index += 1
+                if self._is_name(index):
+                    self.aliases[_name(tokens[index][1])] = table
+                    index += 1
+                if intro == "FROM" and index < len(tokens) and tokens[index] == ("punct", ","):
+                    index += 1
+                    continue
+                break
+
+    def _resolve(self, parts: List[str]) -> Optional[Tuple[str, str]]:
+        if len(parts) >= 2:
+            table = self.aliases.get(parts[-2])
+            return (table, parts[-1]) if table else None
+        column = parts[0]
+        if len(self.accesses) == 1:
+            return next(iter(self.accesses)), column
+        owners = [table for table in self.accesses if column in self.known_columns.get(table, ())]
+        return (owners[0], column) if len(owners) == 1 else None
+
+    def _column_at(self, index: int) -> Tuple[Optional[Tuple[str, str]], int]:
+        """index处的列引用（排除函数调用）"""
+        parts, after = self._read_ref(index)
+        if parts is None or (after < len(self.tokens) and self.tokens[after] == ("punct", "(")):
+            return None, index
+        return self._resolve(parts), after
+
+    def _is_literal(self, index: int) -> bool:
+        return index < len(self.tokens) and self.tokens[index][0] in _LITERAL_KINDS
+
+    def _record_predicate(self, column: Tuple[str, str], operator: str, pattern: Optional[str] = None):
+        table, name = column
+        access = self._access(table)
+        if operator in ("=", "IN", "IS"):
+            _add(access.equality, name)
+        elif operator == "LIKE":
+            if not (pattern or "").startswith(("'%", "'_")):
+                _add(access.ranges, name)
+        else:
+            _add(access.ranges, name)
+
+    def _parse_predicate(self, index: int) -> int:
+        """解析 index 处开始的一个比较，返回下一个位置"""
+        tokens = self.tokens
+        column, after = self._column_at(index)
+        if column is None and self._is_literal(index) and index + 2 < len(tokens):
+            # ? = column
+            kind, operator = tokens[index + 1]
+            if kind == "punct" and operator in _COMPARISONS:
+                other, other_after = self._column_at(index + 2)
+                if other is not None:
+                    flipped = {"<": ">", ">": "<", "<=": ">=", ">=": "<="}.get(operator, operator)
+                    self._record_predicate(other, flipped)
+                    return other_after
+            return index + 1
+        if column is None or after >= len(tokens):
+            return max(after, index + 1)
+
+        kind, value = tokens[after]
+        upper = value.upper() if kind == "word" else value
+        if kind == "punct" and value in _COMPARISONS:
+            other, other_after = self._column_at(after + 1)
+            if other is not None:
+                # 连接条件：两侧的列都可能用于嵌套循环查找
+                for table, name in (column, other):
+                    _add(self._access(table).joins, name)
+                return other_after
+            self._record_predicate(column, value)
+            return after + 1
+        if upper == "IN":
+            self._record_predicate(column, "IN")
+        elif upper == "BETWEEN":
+            self._record_predicate(column, "BETWEEN")
+        elif upper == "LIKE":
+            pattern = tokens[after + 1][1] if after + 1 < len(tokens) else None
+            self._record_predicate(column, "LIKE", pattern)
+        elif upper == "IS" and after + 1 < len(tokens) and tokens[after + 1][1].upper() == "NULL":
+            self._record_predicate(column, "IS")
+        return after
+
+    def _parse_column_list(self, index: int, target: str) -> int:
+        """解析 ORDER BY / GROUP BY 列表，任一项不是普通列时整个列表不可用索引"""
+        tokens = self.tokens
+        items: List[Tuple[str, str]] = []
+        plain = True
+        depth = 0
+        while index < len(tokens):
+            kind, value = tokens[index]
+            upper = value.upper() if kind == "word" else value
+            if depth == 0 and (value == ")" or value == ";" or (kind == "word" and upper in _CLAUSE_WORDS)):
+                break
+            if value == "(":
+                depth += 1
+                plain = False
+            elif value == ")":
+                depth -= 1
+            elif kind == "word" and upper in ("ASC", "DESC", "NULLS", "FIRST", "LAST"):
+                pass
+            elif value == "," or depth:
+                pass
+            else:
+                column, after = self._column_at(index)
+                if column is None:
+                    plain = False
+                    index += 1
+                    continue
+                items.append(column)
+                index = after
+                continue
+            index += 1
+        tables = {table for table, _ in items}
+        if plain and len(tables) == 1:
+            access = self._access(tables.pop())
+            setattr(access, target, [name for _, name in items])
+        return index
+
+    def parse(self) -> Dict[str, TableAccess]:
+        if self.leading not in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+            return {}
+        self._collect_tables()
+        if not self.accesses:
+            return {}
+
+        tokens = self.tokens
+        clause_stack: List[Optional[str]] = []
+        clause: Optional[str] = None
+        index = 0
+        while index < len(tokens):
+            kind, value = tokens[index]
+            upper = value.upper() if kind == "word" else value
+            if value == "(":
+                clause_stack.append(clause)
+                index += 1
+                continue
+            if value == ")":
+                clause = clause_stack.pop() if clause_stack else None
+                index += 1
+                continue
+            if kind == "word" and upper in ("ORDER", "GROUP") and index + 1 < len(tokens) \
+                    and tokens[index + 1][1].upper() == "BY":
+                index = self._parse_column_list(index + 2, "order_by" if upper == "ORDER" else "group_by")
+                clause = None
+                continue
+            if kind == "word" and upper in ("WHERE", "ON", "HAVING"):
+                clause = "predicate"
+                index += 1
+                continue
+            if kind == "word" and upper in _CLAUSE_WORDS:
+                clause = None
+                index += 1
+                continue
+            if clause == "predicate":
+                index = self._parse_predicate(index)
+                continue
+            index += 1
+        return self.accesses
+
+
+def extract_table_accesses(sql: str, known_columns: Optional[Dict[str, Set[str]]] = None) -> Dict[str, TableAccess]:
+    """提取语句对各表的访问方式；known_columns用于把未限定的列归属到表"""
+    try:
+        return _StatementParser(sql, known_columns).parse()
+    except Exception as e:
+        logger.debug(f"Failed to parse statement for index advice: {e}")
+        return {}
+
+
+def extract_columns(sql: str, *kinds: str) -> List[str]:
+    """提取语句中指定用途（equality/ranges/joins/order_by/group_by）的列名"""
+    columns: List[str] = []
+    for access in extract_table_accesses(sql).values():
+        for kind in kinds:
+            for column in getattr(access, kind):
+                _add(columns, column)
+    return columns
+
+
+@dataclass
+class WorkloadEntry:
+    """工作负载中的一种语句"""
+    fingerprint: str
+    sample: str
+    parameters: Any = None
+    calls: int = 0
+    total_time_ms: float = 0.0
+
+    @property
+    def avg_time_ms(self) -> float:
+        return self.total_time_ms / self.calls if self.calls else 0.0
+
+
+class Workload:
+    """按规范化指纹聚合的语句调用次数和耗时"""
+
+    def __init__(self, max_entries: int = 2000):
+        self.max_entries = max_entries
+        self._entries: Dict[str, WorkloadEntry] = {}
+
+    def record(self, statement: str, execution_time_ms: float, calls: int = 1, parameters: Any = None):
+        fingerprint = get_sql_classifier().fingerprint(statement)
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            if len(self._entries) >= self.max_entries:
+                # 容量已满时淘汰累计耗时最少的语句
+                coldest = min(self._entries.values(), key=lambda e: e.total_time_ms)
+                if coldest.total_time_ms >= execution_time_ms * calls:
+                    return
+                del self._entries[coldest.fingerprint]
+            entry = self._entries[fingerprint] = WorkloadEntry(fingerprint, statement, parameters)
+        entry.calls += calls
+        entry.total_time_ms += execution_time_ms * calls
+
+    def entries(self, min_calls: int = 1) -> List[WorkloadEntry]:
+        return [entry for entry in self._entries.values() if entry.calls >= min_calls]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@dataclass
+class ColumnStatistics:
+    """列统计信息"""
+    n_distinct: float
+    null_frac: float = 0.0
+
+
+@dataclass
+class TableStatistics:
+    """表统计信息"""
+    row_count: float
+    columns: Dict[str, ColumnStatistics] = field(default_factory=dict)
+
+    def eq_selectivity(self, column: str) -> float:
+        stats = self.columns.get(column)
+        if stats is None or stats.n_distinct <= 0:
+            return DEFAULT_EQ_SELECTIVITY
+        return min(1.0, (1.0 - stats.null_frac) / stats.n_distinct)
+
+    def range_selectivity(self, column: str) -> float:
+        stats = self.columns.get(column)
+        if stats is not None and stats.n_distinct <= 1:
+            return 1.0
+        return DEFAULT_RANGE_SELECTIVITY
+
+
+@dataclass(frozen=True)
+class IndexDefinition:
+    """索引定义（已有或候选）"""
+    table: str
+    columns: Tuple[str, ...]
+    name: Optional[str] = None
+    unique: bool = False
+    primary: bool = False
+
+    @property
+    def index_name(self) -> str:
+        return self.name or f"idx_{self.table}_{'_'.join(self.columns)}"[:63]
+
+    def create_sql(self) -> str:
+        return f"CREATE INDEX {self.index_name} ON {self.table} ({', '.join(self.columns)})"
+
+    def drop_sql(self) -> str:
+        return f"DROP INDEX {self.index_name}"
+
+    def same_columns(self, other: "IndexDefinition") -> bool:
+        return self.table == other.table and self.columns == other.columns
+
+    def covers(self, other: "IndexDefinition") -> bool:
+        """other的列是本索引列的前缀"""
+        return self.table == other.table and self.columns[:len(other.columns)] == other.columns
+
+
+@dataclass
+class IndexAdvice:
+    """索引建议"""
+    action: str  # create / drop
+    table: str
+    columns: List[str]
+    name: str
+    sql: str
+    projected_savings_ms: float  # 采集窗口内预计节省的语句总耗时
+    improvement_percent: float  # 占工作负载总耗时的比例
+    affected_statements: List[str]
+    reason: str
+
+
+def _rows(connection, sql: str, parameters: Any = None):
+    """SQLAlchemy连接与DB-API连接统一执行原始SQL"""
+    if hasattr(connection, "exec_driver_sql"):
+        return connection.exec_driver_sql(sql, parameters or ()).fetchall()
+    return connection.execute(sql, parameters or ()).fetchall()
+
+
+def load_postgres_statistics(connection, tables: Iterable[str]) -> Dict[str, TableStatistics]:
+    """从pg_class和pg_stats读取行数与列的不同值个数"""
+    tables = list(tables)
+    statistics: Dict[str, TableStatistics] = {}
+    for name, reltuples in _rows(connection, """
+        SELECT c.relname, c.reltuples FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.relname = ANY(%s)
+    """, (tables,)):
+        statistics[name] = TableStatistics(row_count=max(float(reltuples), 0.0))
+    for table, column, n_distinct, null_frac in _rows(connection, """
+        SELECT tablename, attname, n_distinct, null_frac FROM pg_stats
+        WHERE schemaname = current_schema() AND tablename = ANY(%s)
+    """, (tables,)):
+        table_stats = statistics.get(table)
+        if table_stats is None:
+            continue
+        # n_distinct为负数时表示不同值占行数的比例
+        distinct = -n_distinct * table_stats.row_count if n_distinct < 0 else n_distinct
+        table_stats.columns[column] = ColumnStatistics(float(distinct), float(null_frac or 0.0))
+    return statistics
+
+
+def load_postgres_indexes(connection, tables: Iterable[str]) -> List[IndexDefinition]:
+    """读取表上的已有索引（表达式索引不参与分析）"""
+    rows = _rows(connection, """
+        SELECT t.relname, i.relname, ix.indisunique, ix.indisprimary,
+               array_agg(a.attname ORDER BY k.ord)
+        FROM pg_index ix
+        JOIN pg_class t ON t.oid = ix.indrelid
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ord) ON true
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+        WHERE n.nspname = current_schema() AND t.relname = ANY(%s)
+        GROUP BY t.relname, i.relname, ix.indisunique, ix.indisprimary
+    """, (list(tables),))
+    return [IndexDefinition(table, tuple(columns), name, bool(unique), bool(primary))
+            for table, name, unique, primary, columns in rows]
+
+
+def load_sqlite_statistics(connection, tables: Optional[Iterable[str]] = None) -> Dict[str, TableStatistics]:
+    """统计SQLite表的行数和各列不同值个数（用于采样副本，直接全表计算）"""
+    if tables is None:
+        tables = [row[0] for row in _rows(connection, "SELECT name FROM sqlite_master WHERE type = 'table' "
+                                                      "AND name NOT LIKE 'sqlite_%'")]
+    statistics = {}
+    for table in tables:
+        columns = [row[1] for row in _rows(connection, f'PRAGMA table_info("{table}")')]
+        if not columns:
+            continue
+        selects = ", ".join(f'COUNT(DISTINCT "{c}"), SUM("{c}" IS NULL)' for c in columns)
+        row = _rows(connection, f'SELECT COUNT(*), {selects} FROM "{table}"')[0]
+        row_count = float(row[0])
+        table_stats = TableStatistics(row_count=row_count)
+        for position, column in enumerate(columns):
+            distinct, nulls = row[1 + position * 2], row[2 + position * 2] or 0
+            table_stats.columns[column] = ColumnStatistics(
+                float(distinct), float(nulls) / row_count if row_count else 0.0
+            )
+        statistics[table] = table_stats
+    return statistics
+
+
+def load_sqlite_indexes(connection, tables: Iterable[str]) -> List[IndexDefinition]:
+    indexes = []
+    for table in tables:
+        for column in _rows(connection, f'PRAGMA table_info("{table}")'):
+            # INTEGER PRIMARY KEY 即rowid，不出现在index_list中
+            if column[5] == 1 and str(column[2]).upper() == "INTEGER":
+                indexes.append(IndexDefinition(table, (column[1],), f"{table}_rowid", True, True))
+        for _, name, unique, origin, *_ in _rows(connection, f'PRAGMA index_list("{table}")'):
+            columns = tuple(row[2] for row in _rows(connection, f'PRAGMA index_info("{name}")'))
+            if columns and None not in columns:
+                indexes.append(IndexDefinition(table, columns, name, bool(unique), origin == "pk"))
+    return indexes
+
+
+class CostModelEvaluator:
+    """基于统计信息的代价模型：比较顺序扫描、索引扫描和排序的估算代价"""
+
+    name = "cost_model"
+
+    def __init__(self, statistics: Dict[str, TableStatistics], known_columns: Optional[Dict[str, Set[str]]] = None):
+        self.statistics = statistics
+        self.known_columns = known_columns or {t: set(s.columns) for t, s in statistics.items()}
+        self._accesses: Dict[str, Dict[str, TableAccess]] = {}
+
+    def accesses(self, entry: WorkloadEntry) -> Dict[str, TableAccess]:
+        accesses = self._accesses.get(entry.fingerprint)
+        if accesses is None:
+            accesses = self._accesses[entry.fingerprint] = extract_table_accesses(entry.sample, self.known_columns)
+        return accesses
+
+    def workload_costs(self, entries: Sequence[WorkloadEntry], indexes: Sequence[IndexDefinition]) -> Dict[str, float]:
+        by_table: Dict[str, List[IndexDefinition]] = {}
+        for index in indexes:
+            by_table.setdefault(index.table, []).append(index)
+        costs = {}
+        for entry in entries:
+            accesses = self.accesses(entry)
+            if accesses:
+                costs[entry.fingerprint] = sum(
+                    self.access_cost(access, by_table.get(access.table, ())) for access in accesses.values()
+                )
+        return costs
+
+    def access_cost(self, access: TableAccess, indexes: Sequence[IndexDefinition]) -> float:
+        stats = self.statistics.get(access.table) or TableStatistics(DEFAULT_ROW_COUNT)
+        rows = max(stats.row_count, 1.0)
+        cost = 0.0
+        if access.read:
+            cost += self._scan_cost(access, indexes, stats, rows)
+        if access.write:
+            cost += 1.0 + len(indexes) * (math.log2(rows) + 1) * INDEX_MAINTENANCE_COST
+        return cost
+
+    def _scan_cost(self, access: TableAccess, indexes, stats: TableStatistics, rows: float) -> float:
+        equality = set(access.equality) | set(access.joins)
+        ranges = set(access.ranges) - equality
+        selectivity = 1.0
+        for column in equality:
+            selectivity *= stats.eq_selectivity(column)
+        for column in ranges:
+            selectivity *= stats.range_selectivity(column)
+        result_rows = rows * selectivity
+        order = access.order_by or access.group_by
+        sort_cost = self._sort_cost(result_rows) if order else 0.0
+
+        best = rows + sort_cost
+        for index in indexes:
+            matched = 0
+            leading_eq = 0
+            index_selectivity = 1.0
+            for column in index.columns:
+                if column in equality and matched == leading_eq:
+                    index_selectivity *= stats.eq_selectivity(column)
+                    leading_eq += 1
+                    matched += 1
+                elif column in ranges:
+                    index_selectivity *= stats.range_selectivity(column)
+                    matched += 1
+                    break
+                else:
+                    break
+            ordered = bool(order) and (
+                all(column in equality for column in order) or
+                list(index.columns[leading_eq:leading_eq + len(order)]) == list(order)
+            )
+            if matched == 0 and not ordered:
+                continue
+            fetched = rows * index_selectivity
+            cost = math.log2(rows) + 1 + fetched * RANDOM_ROW_COST + (0.0 if ordered else sort_cost)
+            best = min(best, cost)
+        return best
+
+    @staticmethod
+    def _sort_cost(rows: float) -> float:
+        return rows * math.log2(rows + 1) * SORT_ROW_COST if rows > 1 else 0.0
+
+
+_PYFORMAT_RE = re.compile(r"%\((\w+)\)s")
+_NUMERIC_RE = re.compile(r"\$(\d+)")
+
+
+def to_sqlite_paramstyle(sql: str) -> str:
+    """把PostgreSQL驱动的参数占位符转换为SQLite可用的形式"""
+    sql = _PYFORMAT_RE.sub(r":\1", sql)
+    sql = _NUMERIC_RE.sub(r"?\1", sql)
+    return sql.replace("%s", "?")
+
+
+class SQLiteReplayEvaluator:
+    """在SQLite副本上回放工作负载：按索引配置建索引后执行采集的语句，以虚拟机指令数作为代价
+
+    副本应包含被分析表的（采样）数据；每个配置在事务中评估后回滚，副本不被修改。
+    执行失败的语句（如PostgreSQL专有语法）不参与评估。
+    """
+
+    name = "sqlite_replay"
+
+    def __init__(self, database: Any = ":memory:", progress_step: int = 10):
+        self.connection = database if isinstance(database, sqlite3.Connection) \
+            else sqlite3.connect(database, isolation_level=None)
+        self.connection.isolation_level = None
+        self.progress_step = progress_step
+        self.failed: Set[str] = set()
+
+    def statistics(self) -> Dict[str, TableStatistics]:
+        return load_sqlite_statistics(self.connection)
+
+    def existing_indexes(self, tables: Iterable[str]) -> List[IndexDefinition]:
+        return load_sqlite_indexes(self.connection, tables)
+
+    def workload_costs(self, entries: Sequence[WorkloadEntry], indexes: Sequence[IndexDefinition]) -> Dict[str, float]:
+        connection = self.connection
+        tables = {index.table for index in indexes} | {
+            table for entry in entries for table in extract_table_accesses(entry.sample)
+        }
+        existing = load_sqlite_indexes(connection, tables)
+        wanted = list(indexes)
+        steps = [0]
+
+        def count_steps():
+            steps[0] += 1
+            return 0
+
+        costs = {}
+        connection.execute("BEGIN")
+        try:
+            for index in existing:
+                if not index.primary and not any(index.same_columns(w) for w in wanted):
+                    connection.execute(f'DROP INDEX "{index.index_name}"')
+            for number, index in enumerate(wanted):
+                if not any(index.same_columns(e) for e in existing):
+                    columns = ", ".join(f'"{c}"' for c in index.columns)
+                    connection.execute(f'CREATE INDEX "advisor_{number}" ON "{index.table}" ({columns})')
+
+            connection.set_progress_handler(count_steps, self.progress_step)
+            for entry in entries:
+                if entry.fingerprint in self.failed:
+                    continue
+                steps[0] = 0
+                try:
+                    cursor = connection.execute(to_sqlite_paramstyle(entry.sample), entry.parameters or ())
+                    cursor.fetchall()
+                except sqlite3.Error as e:
+                    logger.debug(f"Replay failed for {entry.fingerprint[:80]}: {e}")
+                    self.failed.add(entry.fingerprint)
+                    continue
+                costs[entry.fingerprint] = float(steps[0] * self.progress_step + 1)
+        finally:
+            connection.set_progress_handler(None, 0)
+            connection.execute("ROLLBACK")
+        return costs
+
+
+class HypotheticalIndexEvaluator:
+    """PostgreSQL hypopg扩展：创建假设索引（隐藏待删除的索引）后比较规划器的EXPLAIN代价
+
+    带占位符的语句优先代入采集到的参数；没有参数时在PostgreSQL 16+上用GENERIC_PLAN。
+    仍无法EXPLAIN的语句交给fallback评估器（通常是CostModelEvaluator），各语句只比较自身代价的变化。
+    """
+
+    name = "hypothetical_explain"
+
+    def __init__(self, connection, existing: Sequence[IndexDefinition] = (), fallback=None):
+        self.connection = connection  # 同步SQLAlchemy连接
+        self.existing = list(existing)
+        self.fallback = fallback
+        self.failed: Set[str] = set()
+        self._generic_plan: Optional[bool] = None
+
+    @staticmethod
+    def available(connection) -> bool:
+        try:
+            return bool(_rows(connection, "SELECT 1 FROM pg_extension WHERE extname = 'hypopg'"))
+        except Exception:
+            return False
+
+    def _supports_generic_plan(self) -> bool:
+        """EXPLAIN (GENERIC_PLAN)需要PostgreSQL 16+"""
+        if self._generic_plan is None:
+            try:
+                self._generic_plan = int(_rows(self.connection, "SHOW server_version_num")[0][0]) >= 160000
+            except Exception:
+                self._generic_plan = False
+        return self._generic_plan
+
+    def _explain_cost(self, entry: WorkloadEntry) -> Optional[float]:
+        sql, parameters = entry.sample, entry.parameters
+        options = "FORMAT JSON"
+        if parameters and _NUMERIC_RE.search(sql) and not isinstance(parameters, dict):
+            # asyncpg的$n占位符改为%s，参数按出现顺序展开
+            order = [int(number) - 1 for number in _NUMERIC_RE.findall(sql)]
+            sql = _NUMERIC_RE.sub("%s", sql)
+            parameters = tuple(parameters[i] for i in order)
+        elif not parameters:
+            sql = _PYFORMAT_RE.sub("%s", sql)
+            position = [0]
+
+            def numbered(_):
+                position[0] += 1
+                return f"${position[0]}"
+
+            sql = re.sub(r"%s", numbered, sql)
+            if position[0] or _NUMERIC_RE.search(sql):
+                if not self._supports_generic_plan():
+                    return None
+                options = "FORMAT JSON, GENERIC_PLAN"
+            parameters = None
+        try:
+            with self.connection.begin_nested():
+                plan = _rows(self.connection, f"EXPLAIN ({options}) {sql}", parameters)[0][0]
+        except Exception as e:
+            logger.debug(f"EXPLAIN failed for {entry.fingerprint[:80]}: {e}")
+            return None
+        if isinstance(plan, str):
+            import json
+            plan = json.loads(plan)
+        return float(plan[0]["Plan"]["Total Cost"])
+
+    def workload_costs(self, entries: Sequence[WorkloadEntry], indexes: Sequence[IndexDefinition]) -> Dict[str, float]:
+        hidden = [e for e in self.existing if not e.primary and not any(e.same_columns(i) for i in indexes)]
+        created = [i for i in indexes if not any(i.same_columns(e) for e in self.existing)]
+        costs = {}
+        try:
+            for index in hidden:
+                _rows(self.connection, "SELECT hypopg_hide_index(%s::regclass)", (index.index_name,))
+            for index in created:
+                _rows(self.connection, "SELECT * FROM hypopg_create_index(%s)", (index.create_sql(),))
+            for entry in entries:
+                if entry.fingerprint in self.failed:
+                    continue
+                cost = self._explain_cost(entry)
+                if cost is not None:
+                    costs[entry.fingerprint] = cost
+                    continue
+                self.failed.add(entry.fingerprint)
+                if self.fallback is not None:
+                    logger.info(f"Cannot EXPLAIN {entry.fingerprint[:80]}, using {self.fallback.name} instead")
+                else:
+                    logger.warning(f"Cannot EXPLAIN {entry.fingerprint[:80]}, statement skipped")
+        finally:
+            _rows(self.connection, "SELECT hypopg_reset()")
+            if hidden:
+                _rows(self.connection, "SELECT hypopg_unhide_all_indexes()")
+        if self.fallback is not None:
+            unexplained = [entry for entry in entries if entry.fingerprint in self.failed]
+            if unexplained:
+                costs.update(self.fallback.workload_costs(unexplained, indexes))
+        return costs
+
+
+class IndexAdvisor:
+    """工作负载驱动的索引顾问"""
+
+    def __init__(self, entries: Sequence[WorkloadEntry], statistics: Optional[Dict[str, TableStatistics]] = None,
+                 existing_indexes: Sequence[IndexDefinition] = (), evaluator=None, max_index_columns: int = 3):
+        self.entries = [entry for entry in entries if entry.calls > 0]
+        self.statistics = statistics or {}
+        self.existing_indexes = list(existing_indexes)
+        self.evaluator = evaluator or CostModelEvaluator(self.statistics)
+        self.max_index_columns = max_index_columns
+        self.known_columns = {table: set(stats.columns) for table, stats in self.statistics.items()}
+        self.total_time_ms = sum(entry.total_time_ms for entry in self.entries)
+
+    def _usable(self, table: str, columns: Sequence[str]) -> bool:
+        if not self.statistics:
+            return True
+        known = self.known_columns.get(table)
+        return known is not None and all(column in known for column in columns)
+
+    def candidates(self) -> List[IndexDefinition]:
+        """根据各语句的访问方式生成候选索引：等值列按选择性排列，再接范围列或排序列"""
+        found: Dict[Tuple[str, Tuple[str, ...]], IndexDefinition] = {}
+
+        def add(table: str, columns: Sequence[str]):
+            columns = tuple(dict.fromkeys(columns))[:self.max_index_columns]
+            if not columns or not self._usable(table, columns):
+                return
+            candidate = IndexDefinition(table, columns)
+            if any(existing.covers(candidate) for existing in self.existing_indexes):
+                return
+            found.setdefault((table, columns), candidate)
+
+        for entry in self.entries:
+            for access in extract_table_accesses(entry.sample, self.known_columns).values():
+                if not access.read:
+                    continue
+                stats = self.statistics.get(access.table) or TableStatistics(DEFAULT_ROW_COUNT)
+                equality = sorted(dict.fromkeys(access.equality), key=stats.eq_selectivity)
+                if equality:
+                    add(access.table, equality)
+                for column in access.ranges:
+                    add(access.table, equality + [column])
+                for order in (access.order_by, access.group_by):
+                    if order:
+                        add(access.table, equality + list(order))
+                for column in access.joins:
+                    add(access.table, [column])
+        return list(found.values())
+
+    def _savings(self, baseline: Dict[str, float], costs: Dict[str, float]) -> Tuple[float, List[Tuple[float, str]]]:
+        """按代价变化比例折算采集到的语句耗时"""
+        savings = 0.0
+        affected = []
+        for entry in self.entries:
+            before, after = baseline.get(entry.fingerprint), costs.get(entry.fingerprint)
+            if before is None or after is None or before <= 0:
+                continue
+            change = entry.total_time_ms * (1.0 - after / before)
+            savings += change
+            if abs(change) > 1e-9:
+                affected.append((change, entry.fingerprint))
+        affected.sort(reverse=True)
+        return savings, affected
+
+    def _percent(self, savings: float) -> float:
+        return round(savings / self.total_time_ms * 100, 2) if self.total_time_ms else 0.0
+
+    def recommend(self, max_create: int = 5, min_savings_ms: float = 0.0) -> List[IndexAdvice]:
+        """贪心选择收益最大的索引，再检查已有索引能否删除；结果按预计节省耗时排序"""
+        if not self.entries:
+            return []
+        configuration = list(self.existing_indexes)
+        baseline = self.evaluator.workload_costs(self.entries, configuration)
+        remaining = self.candidates()
+        advice: List[IndexAdvice] = []
+
+        for _ in range(max_create):
+            best = None
+            for candidate in remaining:
+                costs = self.evaluator.workload_costs(self.entries, configuration + [candidate])
+                savings, affected = self._savings(baseline, costs)
+                if savings > min_savings_ms and (best is None or savings > best[1]):
+                    best = (candidate, savings, affected, costs)
+            if best is None:
+                break
+            candidate, savings, affected, costs = best
+            advice.append(IndexAdvice(
+                action="create",
+                table=candidate.table,
+                columns=list(candidate.columns),
+                name=candidate.index_name,
+                sql=candidate.create_sql(),
+                projected_savings_ms=round(savings, 3),
+                improvement_percent=self._percent(savings),
+                affected_statements=[fingerprint for change, fingerprint in affected if change > 0][:5],
+                reason=f"{len([c for c, _ in affected if c > 0])}类语句代价下降（评估方式：{self.evaluator.name}）"
+            ))
+            configuration.append(candidate)
+            remaining.remove(candidate)
+            baseline = costs
+
+        for index in list(self.existing_indexes):
+            if index.unique or index.primary:
+                continue
+            without = [i for i in configuration if i is not index]
+            costs = self.evaluator.workload_costs(self.entries, without)
+            savings, affected = self._savings(baseline, costs)
+            if any(change < -max(1e-6, 0.01 * self._entry_time(fingerprint)) for change, fingerprint in affected):
+                continue  # 有语句依赖该索引
+            redundant = any(other is not index and other.covers(index) for other in configuration)
+            advice.append(IndexAdvice(
+                action="drop",
+                table=index.table,
+                columns=list(index.columns),
+                name=index.index_name,
+                sql=index.drop_sql(),
+                projected_savings_ms=round(max(savings, 0.0), 3),
+                improvement_percent=self._percent(max(savings, 0.0)),
+                affected_statements=[fingerprint for change, fingerprint in affected if change > 0][:5],
+                reason="被其他索引的前缀覆盖" if redundant else "采集的工作负载未使用该索引"
+            ))
+            configuration = without
+            baseline = costs
+
+        advice.sort(key=lambda a: a.projected_savings_ms, reverse=True)
+        return advice
+
+    def _entry_time(self, fingerprint: str) -> float:
+        for entry in self.entries:
+            if entry.fingerprint == fingerprint:
+                return entry.total_time_ms
+        return 0.0
@@ -14,6 +14,11 @@ import logging
 import re
 from collections import defaultdict
 
+from backend.optimization.index_advisor import (
+    CostModelEvaluator, HypotheticalIndexEvaluator, IndexAdvice, IndexAdvisor, Workload, extract_columns,
+    extract_table_accesses, load_postgres_indexes, load_postgres_statistics
+)
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -49,6 +54,7 @@ class IndexManager:
     def __init__(self, db_session: Session):
         self.db = db_session
         self.recommendations = []
+        self.workload_advice: List[IndexAdvice] = []
         self.index_monitoring_enabled = True
         self.auto_index_creation = False  # 生产环境建议手动创建
         self.analysis_history = []
@@ -539,7 +545,7 @@ class IndexManager:
                     reason=f"列组合 '{', '.join(combo)}' 经常一起使用（{frequency}次）",
                     impact_score=impact_score,
                     estimated_improvement=self._estimate_improvement(impact_score),
-                    query_patterns=[p['query_preview'] for p in query_patterns[:2] if any(col in p['query_preview'] for col in combo)] or p['query_preview'] for p in query_patterns if any(col in p['query_preview'] for col in combo)],
+                    query_patterns=[p['query_preview'] for p in query_patterns if any(col in p['query_preview'] for col in combo)][:2],
                     priority=self._determine_priority(impact_score)
                 )
 
@@ -599,38 +605,42 @@ class IndexManager:
 
     def _extract_where_columns(self, query: str) -> List[str]:
         """提取WHERE条件中的列"""
-        # 简化的列提取，实际应用中需要更复杂的SQL解析
-        where_match = re.search(r'where\s+(.+?)(?:\s+order|$|group\s+)', query, re.IGNORECASE)
-        if where_match:
-            where_clause = where_match.group(1)
-            # 提取列名（简化处理）
-            columns = re.findall(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\s*[\=<>!]+|\b([a-zA-Z_][a-zA-Z0-9_]*)\s+in\b', where_clause)
-            return [col[0] if col[0] else col[1] for col in columns]
-        return []
+        return extract_columns(query, "equality", "ranges")
 
     def _extract_join_columns(self, query: str) -> List[str]:
         """提取JOIN条件中的列"""
-        join_columns = []
-        join_matches = re.findall(r'join\s+\w+\s+(?:as\s+\w+\s+)?on\s+([^=\s]+)\s*=\s*([^=\s]+)', query, re.IGNORECASE)
-        for match in join_matches:
-            join_columns.extend([match[0].strip(), match[1].strip()])
-        return list(set(join_columns))
+        return extract_columns(query, "joins")
 
     def _extract_order_columns(self, query: str) -> List[str]:
         """提取ORDER BY中的列"""
-        order_match = re.search(r'order\s+by\s+(.+?)(?:\s+limit|$|group\s+)', query, re.IGNORECASE)
-        if order_match:
-            order_clause = order_match.group(1)
-            return [col.strip() for col in order_clause.split(',')]
-        return []
+        return extract_columns(query, "order_by")
 
     def _extract_group_columns(self, query: str) -> List[str]:
         """提取GROUP BY中的列"""
-        group_match = re.search(r'group\s+by\s+(.+?)(?:\s+order|$|having\s+)', query, re.IGNORECASE)
-        if group_match:
-            group_clause = group_match.group(1)
-            return [col.strip() for col in group_clause.split(',')]
-        return []
+        return extract_columns(query, "group_by")
+
+    async def advise_from_workload(self, workload: Workload, evaluator=None, max_create: int = 5) -> List[IndexAdvice]:
+        """根据采集的工作负载给出创建/删除建议（按预计节省耗时排序）"""
+        entries = workload.entries()
+        tables = sorted({table for entry in entries for table in extract_table_accesses(entry.sample)})
+
+        def advise(session):
+            conn = session.connection()
+            statistics = load_postgres_statistics(conn, tables)
+            existing = load_postgres_indexes(conn, tables)
+            chosen = evaluator
+            if chosen is None:
+                chosen = CostModelEvaluator(statistics)
+                if HypotheticalIndexEvaluator.available(conn):
+                    chosen = HypotheticalIndexEvaluator(conn, existing, chosen)
+            return IndexAdvisor(entries, statistics, existing, chosen).recommend(max_create=max_create)
+
+        try:
+            self.workload_advice = await self.db.run_sync(advise) if entries else []
+        except Exception as e:
+            logger.error(f"Failed to advise indexes from workload: {e}")
+            self.workload_advice = []
+        return self.workload_advice
 
     async def create_recommended_indexes(self, recommendations: List[IndexRecommendation], auto_create: bool = False) -> Dict[str, bool]:
         """创建推荐的索引"""
@@ -719,7 +729,8 @@ class IndexManager:
             'high_priority_count': len([r for r in self.recommendations if r.priority == 'high']),
             'medium_priority_count': len([r for r in self.recommendations if r.priority == 'medium']),
             'low_priority_count': len([r for r in self.recommendations if r.priority == 'low']),
-            'recommendations': [asdict(r) for r in self.recommendations[:20]]  # 返回前20个推荐
+            'recommendations': [asdict(r) for r in self.recommendations[:20]],  # 返回前20个推荐
+            'workload_advice': [asdict(a) for a in self.workload_advice[:20]]
         }
 
 # 全局索引管理器实例
@@ -0,0 +1,228 @@
+"""
+预编译语句注册表 - Prepared Statement Registry
+热点服务查询注册为具名语句：用lambda_stmt构建一次，参数全部用bindparam传入，执行时直接命中
+SQLAlchemy的编译缓存；PostgreSQL(asyncpg)上同时使用驱动的预处理语句缓存，语句名带注册名前缀。
+按接口统计每条语句的Python侧耗时（构建、缓存键、编译、参数处理）与数据库执行耗时，
+用于衡量消除的Python侧开销。
+"""
+
+import logging
+import time
+import uuid
+import weakref
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import event, lambda_stmt
+from sqlalchemy.engine.interfaces import CacheStats
+
+from backend.optimization.query_instrumentation import (
+    QueryTracker, add_workload_listener, get_current_tracker
+)
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_ENDPOINT = "(background)"
+
+
+@dataclass
+class _Execution:
+    """一次具名语句执行的时间点"""
+    name: str
+    started: float
+    cursor_started: Optional[float] = None
+    cursor_finished: Optional[float] = None
+    cache_hit: bool = False
+
+
+@dataclass
+class StatementTiming:
+    """同一接口内一条具名语句的累计耗时（毫秒）"""
+    calls: int = 0
+    cache_hits: int = 0
+    python_ms_hit: float = 0.0
+    python_ms_miss: float = 0.0
+    execute_ms: float = 0.0
+
+    def add(self, other: "StatementTiming"):
+        self.calls += other.calls
+        self.cache_hits += other.cache_hits
+        self.python_ms_hit += other.python_ms_hit
+        self.python_ms_miss += other.python_ms_miss
+        self.execute_ms += other.execute_ms
+
+    def summary(self, build_ms: float) -> Dict[str, Any]:
+        misses = self.calls - self.cache_hits
+        python_ms = self.python_ms_hit + self.python_ms_miss
+        avg_hit = self.python_ms_hit / self.cache_hits if self.cache_hits else None
+        avg_miss = self.python_ms_miss / misses if misses else None
+        return {
+            "calls": self.calls,
+            "compiled_cache_hits": self.cache_hits,
+            "compiled_cache_misses": misses,
+            "avg_python_ms": round(python_ms / self.calls, 4) if self.calls else 0.0,
+            "avg_execute_ms": round(self.execute_ms / self.calls, 4) if self.calls else 0.0,
+            # 未命中与命中的Python侧耗时之差即编译耗时
+            "compile_ms": round(max(avg_miss - avg_hit, 0.0), 4) if avg_hit is not None and avg_miss is not None
+            else None,
+            "python_share_percent": round(python_ms / (python_ms + self.execute_ms) * 100, 2)
+            if python_ms + self.execute_ms else 0.0,
+            # 每次调用都重新构建语句时多出的耗时
+            "build_ms_saved": round(build_ms * self.calls, 4)
+        }
+
+
+_current_execution: ContextVar[Optional[_Execution]] = ContextVar("prepared_execution", default=None)
+
+
+class PreparedStatement:
+    """具名语句：首次执行时用lambda_stmt构建，之后复用同一语句对象"""
+
+    def __init__(self, registry: "StatementRegistry", name: str, builder: Callable[[], Any]):
+        self.registry = registry
+        self.name = name
+        self.builder = builder
+        self.build_ms = 0.0
+        self._statement = None
+
+    @property
+    def statement(self):
+        if self._statement is None:
+            started = time.perf_counter()
+            self._statement = lambda_stmt(self.builder)
+            self.build_ms = (time.perf_counter() - started) * 1000
+        return self._statement
+
+    def execute(self, session, **params):
+        """在Session或Connection上执行"""
+        execution = _Execution(self.name, time.perf_counter())
+        token = _current_execution.set(execution)
+        try:
+            return session.execute(self.statement, params)
+        finally:
+            _current_execution.reset(token)
+            self.registry.record(execution)
+
+    async def execute_async(self, session, **params):
+        """在AsyncSession或AsyncConnection上执行"""
+        execution = _Execution(self.name, time.perf_counter())
+        token = _current_execution.set(execution)
+        try:
+            return await session.execute(self.statement, params)
+        finally:
+            _current_execution.reset(token)
+            self.registry.record(execution)
+
+
+class StatementRegistry:
+    """具名预编译语句注册表"""
+
+    def __init__(self):
+        self.statements: Dict[str, PreparedStatement] = {}
+        self.endpoints: Dict[str, Dict[str, StatementTiming]] = {}
+        # 请求作用域结束前接口名尚未确定（中间件按路由模板重命名），先挂在最外层作用域上
+        self._pending: "weakref.WeakKeyDictionary[QueryTracker, Dict[str, StatementTiming]]" = \
+            weakref.WeakKeyDictionary()
+        add_workload_listener(self._flush_scope)
+
+    def register(self, name: str, builder: Callable[[], Any]) -> PreparedStatement:
+        """注册具名语句；builder为无参lambda，参数用bindparam声明"""
+        statement = self.statements.get(name)
+        if statement is None:
+            statement = self.statements[name] = PreparedStatement(self, name, builder)
+        return statement
+
+    def get(self, name: str) -> PreparedStatement:
+        return self.statements[name]
+
+    def record(self, execution: _Execution):
+        if execution.cursor_started is None:
+            return
+        finished = execution.cursor_finished or execution.cursor_started
+        python_ms = (execution.cursor_started - execution.started) * 1000
+        timing = StatementTiming(
+            calls=1,
+            cache_hits=1 if execution.cache_hit else 0,
+            python_ms_hit=python_ms if execution.cache_hit else 0.0,
+            python_ms_miss=0.0 if execution.cache_hit else python_ms,
+            execute_ms=(finished - execution.cursor_started) * 1000
+        )
+
+        tracker = get_current_tracker()
+        while tracker is not None and tracker.parent is not None:
+            tracker = tracker.parent
+        if tracker is None:
+            self._add(BACKGROUND_ENDPOINT, execution.name, timing)
+            return
+        pending = self._pending.setdefault(tracker, {})
+        pending.setdefault(execution.name, StatementTiming()).add(timing)
+
+    def _add(self, endpoint: str, name: str, timing: StatementTiming):
+        self.endpoints.setdefault(endpoint, {}).setdefault(name, StatementTiming()).add(timing)
+
+    def _flush_scope(self, tracker: QueryTracker):
+        for name, timing in self._pending.pop(tracker, {}).items():
+            self._add(tracker.name, name, timing)
+
+    def report(self) -> Dict[str, Any]:
+        """按接口汇总各具名语句的Python侧耗时与执行耗时"""
+        totals: Dict[str, StatementTiming] = {}
+        endpoints = {}
+        for endpoint, timings in self.endpoints.items():
+            endpoints[endpoint] = {}
+            for name, timing in timings.items():
+                endpoints[endpoint][name] = timing.summary(self.statements[name].build_ms)
+                totals.setdefault(name, StatementTiming()).add(timing)
+        return {
+            "statements": {
+                name: {"build_ms": round(statement.build_ms, 4),
+                       **totals.get(name, StatementTiming()).summary(statement.build_ms)}
+                for name, statement in self.statements.items()
+            },
+            "endpoints": endpoints
+        }
+
+    def reset(self):
+        self.endpoints.clear()
+        self._pending.clear()
+
+
+statement_registry = StatementRegistry()
+
+
+def get_statement_registry() -> StatementRegistry:
+    return statement_registry
+
+
+def prepared_statement(name: str, builder: Callable[[], Any]) -> PreparedStatement:
+    """在全局注册表中注册具名语句"""
+    return statement_registry.register(name, builder)
+
+
+def prepared_statement_name() -> str:
+    """asyncpg预处理语句名：带上正在执行的具名语句，便于在pg_prepared_statements中识别"""
+    execution = _current_execution.get()
+    prefix = execution.name.replace(".", "_") if execution else "stmt"
+    return f"__ahub_{prefix}_{uuid.uuid4().hex[:12]}__"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    execution = _current_execution.get()
+    if execution is not None and execution.cursor_started is None:
+        execution.cursor_started = time.perf_counter()
+        execution.cache_hit = getattr(context, "cache_hit", None) is CacheStats.CACHE_HIT
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    execution = _current_execution.get()
+    if execution is not None:
+        execution.cursor_finished = time.perf_counter()
+
+
+def install_statement_timing(engine) -> None:
+    """在引擎上注册具名语句计时事件（异步引擎注册在sync_engine上），重复调用无副作用"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
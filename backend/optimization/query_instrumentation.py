@@ -0,0 +1,199 @@
+"""
+查询检测 - Query Instrumentation
+基于SQLAlchemy引擎事件统计一个请求内执行的语句：按规范化指纹计数，同一形状的语句重复执行
+达到阈值时判定为疑似N+1查询并通知监听者（QueryOptimizer）；设置查询预算时超出即失败，用于测试。
+最外层作用域结束时把语句统计交给工作负载监听者，供索引顾问分析
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+
+from backend.optimization.sql_classifier import get_sql_classifier
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+
+
+@dataclass
+class StatementStats:
+    """同一指纹语句的执行统计"""
+    fingerprint: str
+    sample: str
+    count: int = 0
+    total_time: float = 0.0  # 秒
+    sample_parameters: Any = None
+
+
+@dataclass
+class NPlusOneReport:
+    """疑似N+1查询"""
+    scope: str
+    fingerprint: str
+    count: int
+    total_time_ms: float
+    sample: str
+
+
+class QueryBudgetExceeded(AssertionError):
+    """作用域内执行的语句数超出查询预算"""
+
+
+class QueryTracker:
+    """一个请求（或代码块）内执行的语句统计"""
+
+    def __init__(self, name: str = "request", budget: Optional[int] = None,
+                 n_plus_one_threshold: int = DEFAULT_N_PLUS_ONE_THRESHOLD,
+                 parent: Optional["QueryTracker"] = None):
+        self.name = name
+        self.budget = budget
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.parent = parent
+        self.statements: Dict[str, StatementStats] = {}
+        self.query_count = 0
+        self.total_time = 0.0
+
+    def record(self, statement: str, duration: float, parameters: Any = None):
+        """记录一次执行，外层作用域同样计数"""
+        fingerprint = get_sql_classifier().fingerprint(statement)
+        tracker = self
+        while tracker is not None:
+            stats = tracker.statements.get(fingerprint)
+            if stats is None:
+                stats = tracker.statements[fingerprint] = StatementStats(
+                    fingerprint, statement, sample_parameters=parameters
+                )
+            stats.count += 1
+            stats.total_time += duration
+            tracker.query_count += 1
+            tracker.total_time += duration
+            tracker = tracker.parent
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.query_count > self.budget
+
+    def n_plus_one(self) -> List[NPlusOneReport]:
+        """重复次数达到阈值的语句形状，按次数降序"""
+        repeated = [s for s in self.statements.values() if s.count >= self.n_plus_one_threshold]
+        repeated.sort(key=lambda s: s.count, reverse=True)
+        return [
+            NPlusOneReport(
+                scope=self.name,
+                fingerprint=s.fingerprint,
+                count=s.count,
+                total_time_ms=round(s.total_time * 1000, 3),
+                sample=s.sample
+            )
+            for s in repeated
+        ]
+
+    def summary(self) -> Dict:
+        return {
+            "scope": self.name,
+            "query_count": self.query_count,
+            "distinct_statements": len(self.statements),
+            "total_time_ms": round(self.total_time * 1000, 3),
+            "budget": self.budget,
+            "n_plus_one": [report.__dict__ for report in self.n_plus_one()]
+        }
+
+
+_current_tracker: ContextVar[Optional[QueryTracker]] = ContextVar("query_tracker", default=None)
+_n_plus_one_listeners: List[Callable[[QueryTracker, List[NPlusOneReport]], None]] = []
+_workload_listeners: List[Callable[[QueryTracker], None]] = []
+
+
+def add_n_plus_one_listener(callback: Callable[[QueryTracker, List[NPlusOneReport]], None]):
+    """注册疑似N+1查询的回调，作用域结束时调用"""
+    if callback not in _n_plus_one_listeners:
+        _n_plus_one_listeners.append(callback)
+
+
+def remove_n_plus_one_listener(callback: Callable[[QueryTracker, List[NPlusOneReport]], None]):
+    if callback in _n_plus_one_listeners:
+        _n_plus_one_listeners.remove(callback)
+
+
+def add_workload_listener(callback: Callable[[QueryTracker], None]):
+    """注册工作负载回调，最外层作用域结束时以其语句统计调用"""
+    if callback not in _workload_listeners:
+        _workload_listeners.append(callback)
+
+
+def remove_workload_listener(callback: Callable[[QueryTracker], None]):
+    if callback in _workload_listeners:
+        _workload_listeners.remove(callback)
+
+
+def get_current_tracker() -> Optional[QueryTracker]:
+    return _current_tracker.get()
+
+
+@contextmanager
+def track_queries(name: str = "request", budget: Optional[int] = None,
+                  n_plus_one_threshold: int = DEFAULT_N_PLUS_ONE_THRESHOLD) -> Iterator[QueryTracker]:
+    """统计作用域内执行的语句；正常退出时超出budget抛出QueryBudgetExceeded"""
+    tracker = QueryTracker(name, budget, n_plus_one_threshold, parent=_current_tracker.get())
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+        reports = tracker.n_plus_one()
+        if reports:
+            logger.warning(
+                f"Possible N+1 queries in {tracker.name}: "
+                + "; ".join(f"{r.count}x {r.fingerprint[:120]}" for r in reports)
+            )
+            for callback in list(_n_plus_one_listeners):
+                try:
+                    callback(tracker, reports)
+                except Exception as e:
+                    logger.error(f"N+1 listener failed: {e}")
+        if tracker.parent is None and tracker.statements:
+            for callback in list(_workload_listeners):
+                try:
+                    callback(tracker)
+                except Exception as e:
+                    logger.error(f"Workload listener failed: {e}")
+
+    if tracker.over_budget:
+        raise QueryBudgetExceeded(
+            f"{tracker.name} executed {tracker.query_count} queries, budget is {tracker.budget}: "
+            + ", ".join(f"{s.count}x {s.fingerprint[:80]}" for s in
+                        sorted(tracker.statements.values(), key=lambda s: s.count, reverse=True)[:5])
+        )
+
+
+def query_budget(max_queries: int, name: str = "test") -> Iterator[QueryTracker]:
+    """测试用：代码块执行的语句超过max_queries时失败"""
+    return track_queries(name, budget=max_queries)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_tracker.get() is not None:
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return
+    starts = conn.info.get("query_start_time")
+    duration = time.perf_counter() - starts.pop() if starts else 0.0
+    tracker.record(statement, duration, None if executemany else parameters)
+
+
+def install_query_instrumentation(engine) -> None:
+    """在引擎上注册语句统计事件（异步引擎注册在sync_engine上），重复调用无副作用"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -16,6 +16,14 @@ import logging
 import re
 from collections import defaultdict, deque
 
+from backend.optimization.index_advisor import (
+    CostModelEvaluator, HypotheticalIndexEvaluator, IndexAdvisor, Workload, extract_table_accesses,
+    load_postgres_indexes, load_postgres_statistics, load_sqlite_indexes, load_sqlite_statistics
+)
+from backend.optimization.query_instrumentation import (
+    NPlusOneReport, QueryTracker, add_n_plus_one_listener, add_workload_listener, install_query_instrumentation
+)
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -31,6 +39,8 @@ class QueryProfile:
     database: str
     plan_analysis: Optional[Dict] = None
     optimization_suggestions: List[str] = None
+    calls: int = 1  # 聚合记录时为执行次数，execution_time为平均耗时
+    parameters: Optional[Any] = None
 
 @dataclass
 class SlowQuery:
@@ -69,6 +79,61 @@ class QueryOptimizer:
         # 慢查询阈值（毫秒）
         self.slow_query_threshold = 1000  # 1秒
 
+        # 疑似N+1查询：(作用域, 语句指纹) -> 统计
+        self.n_plus_one_patterns: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+        # 采集的工作负载（规范化语句 -> 调用次数与耗时），供索引顾问分析
+        self.workload = Workload()
+
+    def enable_n_plus_one_detection(self, engine=None):
+        """在引擎上启用语句统计，并接收各请求作用域结束时检测到的疑似N+1查询"""
+        install_query_instrumentation(engine or self.engine)
+        add_n_plus_one_listener(self.record_n_plus_one)
+
+    def record_n_plus_one(self, tracker: QueryTracker, reports: List[NPlusOneReport]):
+        """记录疑似N+1查询"""
+        for report in reports:
+            key = (report.scope, report.fingerprint)
+            pattern = self.n_plus_one_patterns.get(key)
+            if pattern is None:
+                if len(self.n_plus_one_patterns) >= 1000:
+                    continue
+                pattern = self.n_plus_one_patterns[key] = {
+                    'scope': report.scope,
+                    'fingerprint': report.fingerprint,
+                    'sample': report.sample,
+                    'occurrences': 0,
+                    'max_repeat': 0,
+                    'total_time_ms': 0.0
+                }
+            pattern['occurrences'] += 1
+            pattern['max_repeat'] = max(pattern['max_repeat'], report.count)
+            pattern['total_time_ms'] += report.total_time_ms
+            pattern['last_seen'] = datetime.utcnow()
+
+    def enable_workload_capture(self, engine=None):
+        """在引擎上启用语句统计，各请求结束时把语句耗时记入工作负载"""
+        install_query_instrumentation(engine or self.engine)
+        add_workload_listener(self.record_workload)
+
+    def record_workload(self, tracker: QueryTracker):
+        """把一个请求作用域的语句统计记为查询性能（每种语句一条聚合记录）"""
+        now = datetime.utcnow()
+        database = self.engine.url.database if self.engine is not None and self.engine.url else "unknown"
+        for stats in tracker.statements.values():
+            self._record_query_profile(QueryProfile(
+                query_name=tracker.name,
+                query=stats.sample,
+                execution_time=stats.total_time * 1000 / stats.count,
+                rows_returned=0,
+                bytes_received=0,
+                index_used=None,
+                timestamp=now,
+                database=database,
+                calls=stats.count,
+                parameters=stats.sample_parameters
+            ))
+
     @asynccontextmanager
     async def profile_query(self, query_name: str):
         """查询性能分析上下文管理器"""
@@ -103,10 +168,12 @@ class QueryOptimizer:
     def _record_query_profile(self, profile: QueryProfile):
         """记录查询性能"""
         self.query_profiles.append(profile)
+        if profile.query:
+            self.workload.record(profile.query, profile.execution_time, profile.calls, profile.parameters)
 
         # 更新性能统计
-        self.performance_stats['total_queries'] += 1
-        self.performance_stats['total_time'] += profile.execution_time
+        self.performance_stats['total_queries'] += profile.calls
+        self.performance_stats['total_time'] += profile.execution_time * profile.calls
         self.performance_stats['avg_time'] = (
             self.performance_stats['total_time'] / self.performance_stats['total_queries']
         )
@@ -184,153 +251,51 @@ class QueryOptimizer:
 
         return query.lower()
 
-    async def create_optimal_indexes(self):
-        """创建优化索引"""
+    def advise_indexes_sync(self, evaluator=None, max_create: int = 5, min_calls: int = 1) -> List[Dict]:
+        """根据采集的工作负载给出索引建议（创建/删除，按预计节省耗时排序）
+
+        PostgreSQL安装了hypopg扩展时用假设索引的EXPLAIN代价评估，否则用统计信息代价模型；
+        也可传入SQLiteReplayEvaluator在SQLite副本上回放工作负载。
+        """
+        entries = self.workload.entries(min_calls)
+        if not entries:
+            return []
+        tables = sorted({table for entry in entries for table in extract_table_accesses(entry.sample)})
+
+        with self.engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                statistics = load_postgres_statistics(conn, tables)
+                existing = load_postgres_indexes(conn, tables)
+                if evaluator is None and HypotheticalIndexEvaluator.available(conn):
+                    evaluator = HypotheticalIndexEvaluator(conn, existing, CostModelEvaluator(statistics))
+            elif conn.dialect.name == "sqlite":
+                statistics = load_sqlite_statistics(conn, tables)
+                existing = load_sqlite_indexes(conn, tables)
+            else:
+                statistics, existing = {}, []
+
+            advisor = IndexAdvisor(entries, statistics, existing, evaluator or CostModelEvaluator(statistics))
+            return [asdict(advice) for advice in advisor.recommend(max_create=max_create)]
+
+    async def advise_indexes(self, evaluator=None, max_create: int = 5, min_calls: int = 1) -> List[Dict]:
+        """advise_indexes_sync的异步版本（在线程中执行）"""
+        return await asyncio.to_thread(self.advise_indexes_sync, evaluator, max_create, min_calls)
+
+    async def create_optimal_indexes(self, max_create: int = 5, min_savings_ms: float = 1.0):
+        """按工作负载索引建议创建索引（只执行创建建议，删除建议需人工确认）"""
         try:
-            # 定义需要创建的索引
-            indexes_to_create = [
-                # 用户表索引
-                {
-                    'name': 'idx_users_email_active',
-                    'table': 'users',
-                    'columns': ['email'],
-                    'unique': True,
-                    'where': 'is_active = true',
-                    'description': '用户邮箱激活状态索引'
-                },
-                {
-                    'name': 'idx_users_org_created',
-                    'table': 'users',
-                    'columns': ['organization_id', 'created_at'],
-                    'description': '组织用户创建时间复合索引'
-                },
-                {
-                    'name': 'idx_users_type_created',
-                    'table': 'users',
-                    'columns': ['type', 'created_at'],
-                    'description': '用户类型创建时间复合索引'
-                },
-
-                # API密钥表索引
-                {
-                    'name': 'idx_api_keys_user_active',
-                    'table': 'api_keys',
-                    'columns': ['user_id', 'is_active'],
-                    'description': '用户API密钥状态索引'
-                },
-                {
-                    'name': 'idx_api_keys_last_used',
-                    'table': 'api_keys',
-                    'columns': ['last_used_at'],
-                    'description': 'API密钥最后使用时间索引'
-                },
-                {
-                    'name': 'idx_api_keys_expires',
-                    'table': 'api_keys',
-                    'columns': ['expires_at'],
-                    'description': 'API密钥过期时间索引'
-                },
-
-                # 会话表索引
-                {
-                    'name': 'idx_sessions_user_created',
-                    'table': 'sessions',
-                    'columns': ['user_id', 'created_at'],
-                    'description': '用户会话创建时间索引'
-                },
-                {
-                    'name': 'idx_sessions_active_created',
-                    'table': 'sessions',
-                    'columns': ['is_active', 'created_at'],
-                    'where': 'is_active = true',
-                    'description': '活跃会话创建时间索引'
-                },
-
-                # 使用记录表索引
-                {
-                    'name': 'idx_usage_records_user_date',
-                    'table': 'usage_records',
-                    'columns': ['user_id', 'created_at'],
-                    'description': '用户使用记录日期索引'
-                },
-                {
-                    'name': 'idx_usage_records_model_date',
-                    'table': 'usage_records',
-                    'columns': ['model_name', 'created_at'],
-                    'description': '模型使用记录日期索引'
-                },
-                {
-                    'name': 'idx_usage_records_org_date',
-                    'table': 'usage_records',
-                    'columns': ['organization_id', 'created_at'],
-                    'description': '组织使用记录日期索引'
-                },
-
-                # 组织表索引
-                {
-                    'name': 'idx_organizations_created',
-                    'table': 'organizations',
-                    'columns': ['created_at'],
-                    'description': '组织创建时间索引'
-                },
-                {
-                    'name': 'idx_organizations_plan',
-                    'table': 'organizations',
-                    'columns': ['subscription_plan'],
-                    'description': '组织订阅计划索引'
-                },
-
-                # 团队表索引
-                {
-                    'name': 'idx_teams_org_created',
-                    'table': 'teams',
-                    'columns': ['organization_id', 'created_at'],
-                    'description': '组织团队创建时间索引'
-                },
-
-                # 预算表索引
-                {
-                    'name': 'idx_budgets_org_period',
-                    'table': 'budgets',
-                    'columns': ['organization_id', 'period_start', 'period_end'],
-                    'description': '组织预算周期复合索引'
-                },
-                {
-                    'name': 'idx_budgets_user',
-                    'table': 'budgets',
-                    'columns': ['user_id'],
-                    'description': '用户预算索引'
-                },
-
-                # 监控数据索引
-                {
-                    'name': 'idx_performance_metrics_name_time',
-                    'table': 'performance_metrics',
-                    'columns': ['metric_name', 'timestamp'],
-                    'description': '性能指标名称时间索引'
-                },
-                {
-                    'name': 'idx_business_metrics_user_time',
-                    'table': 'business_metrics',
-                    'columns': ['user_id', 'timestamp'],
-                    'description': '业务指标用户时间索引'
-                },
-                {
-                    'name': 'idx_business_metrics_org_time',
-                    'table': 'business_metrics',
-                    'columns': ['organization_id', 'timestamp'],
-                    'description': '业务指标组织时间索引'
-                },
-                {
-                    'name': 'idx_system_metrics_host_time',
-                    'table': 'system_metrics',
-                    'columns': ['host_name', 'timestamp'],
-                    'description': '系统指标主机时间索引'
-                }
-            ]
+            advice = await self.advise_indexes(max_create=max_create)
 
             created_count = 0
-            for index_config in indexes_to_create:
+            for item in advice:
+                if item['action'] != 'create' or item['projected_savings_ms'] < min_savings_ms:
+                    continue
+                index_config = {
+                    'name': item['name'],
+                    'table': item['table'],
+                    'columns': item['columns'],
+                    'description': item['reason']
+                }
                 if await self._create_index(index_config):
                     created_count += 1
 
@@ -643,6 +608,15 @@ class QueryOptimizer:
                 'total_profiles': len(self.query_profiles),
                 'index_suggestions': self.index_suggestions
             },
+            'n_plus_one': {
+                'total_patterns': len(self.n_plus_one_patterns),
+                'top_10': [
+                    {**pattern, 'last_seen': pattern['last_seen'].isoformat()}
+                    for pattern in sorted(self.n_plus_one_patterns.values(),
+                                          key=lambda x: x['total_time_ms'],
+                                          reverse=True)[:10]
+                ]
+            },
             'recommendations': self._generate_performance_recommendations()
         }
 
@@ -664,6 +638,11 @@ class QueryOptimizer:
         if len(self.index_suggestions) > 0:
             recommendations.append(f"发现{len(self.index_suggestions)}个索引优化建议")
 
+        if self.n_plus_one_patterns:
+            recommendations.append(
+                f"发现{len(self.n_plus_one_patterns)}个疑似N+1查询模式，建议使用批量加载（BatchLoader）或预加载关联"
+            )
+
         return recommendations
 
 # 全局查询优化器实例
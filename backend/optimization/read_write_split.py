@@ -7,11 +7,12 @@ import asyncio
 import time
 import random
 import logging
-from typing import Dict, List, Any, Optional, Union, Callable, AsyncGenerator
+from typing import Dict, List, Any, Optional, Union, Callable, AsyncGenerator, Iterator, Tuple
 from enum import Enum
 from dataclasses import dataclass, field
-from contextlib import asynccontextmanager
-from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from collections import OrderedDict, defaultdict, deque
 import statistics
 
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
@@ -21,6 +22,7 @@ from sqlalchemy import text
 import asyncpg
 
 from .connection_pool import ConnectionPoolManager
+from .sql_classifier import SQLClassifier, StatementInfo, StatementKind
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +60,11 @@ class DatabaseNode:
     error_count: int = 0
     connection_count: int = 0
     weight: int = 1  # 负载均衡权重
+    replay_lsn: Optional[int] = None  # 从库已回放的WAL位置
+    replay_lsn_checked_at: float = 0.0
+    replication_lag: Optional[float] = None  # 复制延迟（秒）
+    lag_ejected: bool = False  # 复制延迟超出SLO被摘除
+    latency_ewma: float = 0.0  # 查询耗时EWMA（毫秒）
 
     def get_connection_url(self) -> str:
         """获取数据库连接URL"""
@@ -89,6 +96,49 @@ class LoadBalanceStats:
     last_used: float = field(default_factory=time.time)
 
 
+_KIND_TO_QUERY_TYPE = {
+    StatementKind.READ: QueryType.READ,
+    StatementKind.WRITE: QueryType.WRITE,
+    StatementKind.TRANSACTION: QueryType.TRANSACTION,
+    StatementKind.ANALYTICS: QueryType.ANALYTICS,
+}
+
+# 当前请求所属的一致性会话（读己之写、事务粘滞）
+_consistency_key: ContextVar[Optional[str]] = ContextVar("read_write_consistency_key", default=None)
+
+
+@contextmanager
+def consistency_scope(session_key: str) -> Iterator[None]:
+    """在作用域内的get_session调用使用同一个一致性会话"""
+    token = _consistency_key.set(session_key)
+    try:
+        yield
+    finally:
+        _consistency_key.reset(token)
+
+
+def parse_lsn(value: Any) -> Optional[int]:
+    """把PostgreSQL的LSN文本（如 16/B374D848）转换为整数"""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    high, _, low = str(value).partition('/')
+    try:
+        return (int(high, 16) << 32) | int(low, 16)
+    except ValueError:
+        return None
+
+
+@dataclass
+class RoutingSessionState:
+    """一致性会话的路由状态"""
+    write_lsn: Optional[int] = None  # 最近一次写入后主库的WAL位置
+    write_time: float = 0.0
+    pinned: Optional[Tuple[DatabaseNode, AsyncSession, str]] = None  # 事务期间固定的主库会话
+    transaction_writes: bool = False
+
+
 class LoadBalanceStrategy(Enum):
     """负载均衡策略"""
     ROUND_ROBIN = "round_robin"      # 轮询
@@ -96,6 +146,7 @@ class LoadBalanceStrategy(Enum):
     LEAST_CONNECTIONS = "least_connections"  # 最少连接
     RESPONSE_TIME = "response_time"  # 响应时间
     RANDOM = "random"               # 随机
+    ADAPTIVE = "adaptive"           # 按复制延迟、连接饱和度和耗时动态加权
 
 
 class ReadWriteSplitEngine:
@@ -106,10 +157,21 @@ class ReadWriteSplitEngine:
         master_node: DatabaseNode,
         replica_nodes: List[DatabaseNode],
         analytics_nodes: Optional[List[DatabaseNode]] = None,
-        load_balance_strategy: LoadBalanceStrategy = LoadBalanceStrategy.LEAST_CONNECTIONS,
+        load_balance_strategy: LoadBalanceStrategy = LoadBalanceStrategy.ADAPTIVE,
         health_check_interval: int = 30,
         failure_detection_threshold: int = 3,
-        max_retry_attempts: int = 3
+        max_retry_attempts: int = 3,
+        classifier_cache_size: int = 10000,
+        lsn_tracking: bool = True,
+        lsn_refresh_interval: float = 0.2,
+        lag_safety_margin: float = 0.5,
+        read_your_writes_window: float = 5.0,
+        max_routing_sessions: int = 100000,
+        replica_lag_slo: float = 10.0,
+        lag_readmit_ratio: float = 0.5,
+        latency_ewma_alpha: float = 0.2,
+        analytics_queue_limit: int = 100,
+        analytics_queue_timeout: float = 30.0
     ):
         self.master_node = master_node
         self.replica_nodes = replica_nodes or []
@@ -119,6 +181,36 @@ class ReadWriteSplitEngine:
         self.failure_detection_threshold = failure_detection_threshold
         self.max_retry_attempts = max_retry_attempts
 
+        # 语句分类与一致性路由
+        self.classifier = SQLClassifier(classifier_cache_size)
+        self.lsn_tracking = lsn_tracking
+        self.lsn_refresh_interval = lsn_refresh_interval
+        self.lag_safety_margin = lag_safety_margin
+        self.read_your_writes_window = read_your_writes_window
+        self.max_routing_sessions = max_routing_sessions
+        self._routing_sessions: "OrderedDict[str, RoutingSessionState]" = OrderedDict()
+        self._replay_refreshes: Dict[str, asyncio.Task] = {}
+        self.routing_stats = {
+            "replica_reads": 0,
+            "master_reads_consistency": 0,
+            "master_reads_fallback": 0,
+            "pinned_statements": 0,
+            "tracked_writes": 0,
+            "lag_ejections": 0
+        }
+
+        # 复制延迟SLO与动态权重
+        self.replica_lag_slo = replica_lag_slo
+        self.lag_readmit_ratio = lag_readmit_ratio
+        self.latency_ewma_alpha = latency_ewma_alpha
+
+        # 分析库排队
+        self.analytics_queue_limit = analytics_queue_limit
+        self.analytics_queue_timeout = analytics_queue_timeout
+        self._analytics_slots: Dict[str, asyncio.Semaphore] = {}
+        self._analytics_waiting: Dict[str, int] = defaultdict(int)
+        self.analytics_stats = {"queued": 0, "rejected": 0, "timeouts": 0, "total_wait_ms": 0.0}
+
         # 连接引擎
         self.engines: Dict[str, AsyncEngine] = {}
         self.session_factories: Dict[str, sessionmaker] = {}
@@ -144,6 +236,7 @@ class ReadWriteSplitEngine:
     def _initialize_stats(self):
         """初始化统计信息"""
         all_nodes = [self.master_node] + self.replica_nodes + self.analytics_nodes
+        self.nodes_by_id = {node.id: node for node in all_nodes}
         for node in all_nodes:
             self.node_health[node.id] = True
             self.load_balance_stats[node.id] = LoadBalanceStats(
@@ -211,47 +304,28 @@ class ReadWriteSplitEngine:
             raise
 
     def _classify_query(self, query_text: str) -> QueryType:
-        """分类查询类型"""
-        query_upper = query_text.strip().upper()
-
-        # 事务操作
-        if any(keyword in query_upper for keyword in ['BEGIN', 'START TRANSACTION', 'COMMIT', 'ROLLBACK']):
-            return QueryType.TRANSACTION
-
-        # 写操作
-        elif any(keyword in query_upper for keyword in ['INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP', 'ALTER']):
-            return QueryType.WRITE
-
-        # 分析查询（复杂SELECT）
-        elif any(keyword in query_upper for keyword in ['GROUP BY', 'HAVING', 'WINDOW', 'WITH', 'OVER']):
-            return QueryType.ANALYTICS
-
-        # 读查询
-        else:
-            return QueryType.READ
-
-    def _select_node_for_read(self, query_type: QueryType = QueryType.READ) -> DatabaseNode:
-        """为读操作选择最优节点"""
-        available_nodes = []
+        """分类查询类型（词法分析，结果按语句文本缓存）"""
+        return _KIND_TO_QUERY_TYPE[self.classifier.classify(query_text).kind]
 
+    def _read_candidates(self, query_type: QueryType) -> List[DatabaseNode]:
+        """可用于读操作的健康节点"""
         if query_type == QueryType.ANALYTICS and self.analytics_nodes:
-            available_nodes = [
-                node for node in self.analytics_nodes
-                if node.is_available and self.node_health[node.id]
-            ]
+            nodes = self.analytics_nodes
         else:
-            available_nodes = [
-                node for node in self.replica_nodes
-                if node.is_available and self.node_health[node.id]
-            ]
-
-        # 如果没有可用的从库，回退到主库
-        if not available_nodes:
-            logger.warning("No available replica nodes, falling back to master")
-            return self.master_node
+            nodes = self.replica_nodes
+        return [
+            node for node in nodes
+            if node.is_available and self.node_health[node.id] and not node.lag_ejected
+        ]
 
-        # 根据负载均衡策略选择节点
-        if self.load_balance_strategy == LoadBalanceStrategy.ROUND_ROBIN:
+    def _balance(self, available_nodes: List[DatabaseNode]) -> DatabaseNode:
+        """根据负载均衡策略选择节点"""
+        if available_nodes[0].role == DatabaseRole.ANALYTICS:
+            # 分析库按排队长度选择
+            return min(available_nodes, key=self._analytics_load)
+        if self.load_balance_strategy == LoadBalanceStrategy.ADAPTIVE:
+            return self._adaptive_select(available_nodes)
+        elif self.load_balance_strategy == LoadBalanceStrategy.ROUND_ROBIN:
             return self._round_robin_select(available_nodes)
         elif self.load_balance_strategy == LoadBalanceStrategy.WEIGHTED_ROUND_ROBIN:
             return self._weighted_round_robin_select(available_nodes)
@@ -264,6 +338,202 @@ class ReadWriteSplitEngine:
         else:
             return available_nodes[0]
 
+    def _select_node_for_read(self, query_type: QueryType = QueryType.READ) -> DatabaseNode:
+        """为读操作选择最优节点"""
+        available_nodes = self._read_candidates(query_type)
+
+        # 如果没有可用的从库，回退到主库
+        if not available_nodes:
+            logger.warning("No available replica nodes, falling back to master")
+            return self.master_node
+
+        return self._balance(available_nodes)
+
+    async def _select_read_node(
+        self,
+        query_type: QueryType,
+        state: Optional[RoutingSessionState]
+    ) -> DatabaseNode:
+        """为一致性会话选择读节点：写入后只使用已追上该写入的从库"""
+        candidates = self._read_candidates(query_type)
+        if not candidates:
+            logger.warning("No available replica nodes, falling back to master")
+            self.routing_stats["master_reads_fallback"] += 1
+            return self.master_node
+
+        if state is not None and state.write_time:
+            if time.time() - state.write_time >= self.read_your_writes_window:
+                state.write_time = 0.0
+                state.write_lsn = None
+            else:
+                fresh = [node for node in candidates if self._is_caught_up(node, state)]
+                if not fresh and state.write_lsn is not None:
+                    await self._refresh_replay_lsns(candidates)
+                    fresh = [node for node in candidates if self._is_caught_up(node, state)]
+                if not fresh:
+                    self.routing_stats["master_reads_consistency"] += 1
+                    return self.master_node
+                candidates = fresh
+
+        self.routing_stats["replica_reads"] += 1
+        return self._balance(candidates)
+
+    def _is_caught_up(self, node: DatabaseNode, state: RoutingSessionState) -> bool:
+        """从库是否已包含会话最近一次写入"""
+        if state.write_lsn is not None:
+            return node.replay_lsn is not None and node.replay_lsn >= state.write_lsn
+        if node.replication_lag is not None:
+            return time.time() - state.write_time > node.replication_lag + self.lag_safety_margin
+        return False
+
+    async def _refresh_replay_lsns(self, nodes: List[DatabaseNode]):
+        """刷新从库回放位置（按节点限频，并发请求共享一次查询）"""
+        if not self.lsn_tracking:
+            return
+        now = time.time()
+        tasks = []
+        for node in nodes:
+            task = self._replay_refreshes.get(node.id)
+            if task is None or task.done():
+                if now - node.replay_lsn_checked_at < self.lsn_refresh_interval or node.id not in self.engines:
+                    continue
+                task = asyncio.ensure_future(self._refresh_replay_lsn(node))
+                self._replay_refreshes[node.id] = task
+            tasks.append(task)
+        if tasks:
+            await asyncio.gather(*(asyncio.shield(task) for task in tasks), return_exceptions=True)
+
+    async def _refresh_replay_lsn(self, node: DatabaseNode):
+        """查询从库回放位置和复制延迟"""
+        engine = self.engines.get(node.id)
+        if not engine:
+            return
+        try:
+            async with engine.connect() as conn:
+                result = await conn.execute(text(
+                    "SELECT pg_last_wal_replay_lsn(), "
+                    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())) END"
+                ))
+                replay_lsn, lag = result.one()
+            node.replay_lsn = parse_lsn(replay_lsn)
+            self.update_replication_lag(node.id, float(lag) if lag is not None else None)
+        except Exception as e:
+            logger.debug(f"Failed to refresh replay position for {node.id}: {e}")
+        finally:
+            node.replay_lsn_checked_at = time.time()
+
+    def update_replication_lag(self, node_id: str, lag: Optional[float]):
+        """更新从库复制延迟；超出SLO时摘除，回落到SLO×readmit比例以下时恢复"""
+        node = self.nodes_by_id.get(node_id)
+        if node is None or node.role == DatabaseRole.MASTER:
+            return
+        node.replication_lag = lag
+        if lag is None:
+            return
+        if not node.lag_ejected and lag > self.replica_lag_slo:
+            node.lag_ejected = True
+            self.routing_stats["lag_ejections"] += 1
+            logger.warning(
+                f"Replica {node.id} ejected: replication lag {lag:.1f}s exceeds SLO {self.replica_lag_slo}s"
+            )
+        elif node.lag_ejected and lag <= self.replica_lag_slo * self.lag_readmit_ratio:
+            node.lag_ejected = False
+            logger.info(f"Replica {node.id} readmitted: replication lag {lag:.1f}s")
+
+    def _dynamic_weight(self, node: DatabaseNode) -> float:
+        """动态权重：静态权重 × 复制延迟余量 × 空闲连接比例 ÷ 耗时EWMA"""
+        weight = float(node.weight)
+        if node.replication_lag is not None and self.replica_lag_slo > 0:
+            weight *= max(0.05, 1.0 - node.replication_lag / self.replica_lag_slo)
+        capacity = node.pool_size + node.max_overflow
+        if capacity > 0:
+            in_use = self.load_balance_stats[node.id].current_connections
+            weight *= max(0.05, 1.0 - in_use / capacity)
+        return weight / (1.0 + node.latency_ewma)
+
+    def _adaptive_select(self, nodes: List[DatabaseNode]) -> DatabaseNode:
+        """按动态权重随机选择节点"""
+        if len(nodes) == 1:
+            return nodes[0]
+        weights = [self._dynamic_weight(node) for node in nodes]
+        if sum(weights) <= 0:
+            return self._least_connections_select(nodes)
+        return random.choices(nodes, weights=weights)[0]
+
+    def _analytics_load(self, node: DatabaseNode) -> float:
+        """分析库负载：执行中和排队的查询数 / 并发容量"""
+        in_use = self.load_balance_stats[node.id].current_connections
+        return (in_use + self._analytics_waiting[node.id]) / max(node.pool_size, 1)
+
+    async def _acquire_analytics_slot(self, node: DatabaseNode) -> asyncio.Semaphore:
+        """分析查询按节点并发容量排队；队列已满或等待超时时拒绝"""
+        slots = self._analytics_slots.get(node.id)
+        if slots is None:
+            slots = self._analytics_slots[node.id] = asyncio.Semaphore(max(node.pool_size, 1))
+        if slots.locked():
+            if self._analytics_waiting[node.id] >= self.analytics_queue_limit:
+                self.analytics_stats["rejected"] += 1
+                raise RuntimeError(f"Analytics queue for node {node.id} is full")
+            self.analytics_stats["queued"] += 1
+
+        self._analytics_waiting[node.id] += 1
+        start_time = time.time()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.analytics_queue_timeout)
+        except asyncio.TimeoutError:
+            self.analytics_stats["timeouts"] += 1
+            raise RuntimeError(f"Timed out waiting for analytics node {node.id}") from None
+        finally:
+            self._analytics_waiting[node.id] -= 1
+            self.analytics_stats["total_wait_ms"] += (time.time() - start_time) * 1000
+        return slots
+
+    def _get_routing_state(self, session_key: str) -> RoutingSessionState:
+        """获取（或创建）一致性会话状态，按LRU限制数量"""
+        state = self._routing_sessions.get(session_key)
+        if state is None:
+            state = self._routing_sessions[session_key] = RoutingSessionState()
+            while len(self._routing_sessions) > self.max_routing_sessions:
+                _, evicted = self._routing_sessions.popitem(last=False)
+                if evicted.pinned is not None:
+                    asyncio.ensure_future(self._release_pinned(evicted, rollback=True))
+        else:
+            self._routing_sessions.move_to_end(session_key)
+        return state
+
+    async def release_routing_session(self, session_key: str):
+        """结束一致性会话（请求结束或用户登出时调用），回滚未结束的事务"""
+        state = self._routing_sessions.pop(session_key, None)
+        if state is not None and state.pinned is not None:
+            await self._release_pinned(state, rollback=True)
+
+    async def _release_pinned(self, state: RoutingSessionState, rollback: bool = False):
+        """释放事务期间固定的会话"""
+        if state.pinned is None:
+            return
+        node, session, session_id = state.pinned
+        state.pinned = None
+        state.transaction_writes = False
+        try:
+            if rollback:
+                await session.rollback()
+        finally:
+            await self._record_connection_end(node.id, session_id)
+            await session.close()
+
+    async def _record_write(self, state: RoutingSessionState, session: AsyncSession):
+        """记录会话写入位置，之后的读取只发往已回放到该位置的从库"""
+        state.write_time = time.time()
+        state.write_lsn = None
+        if self.lsn_tracking:
+            try:
+                result = await session.execute(text("SELECT pg_current_wal_lsn()"))
+                state.write_lsn = parse_lsn(result.scalar())
+            except Exception as e:
+                logger.debug(f"Failed to read master WAL position: {e}")
+        self.routing_stats["tracked_writes"] += 1
+
     def _round_robin_select(self, nodes: List[DatabaseNode]) -> DatabaseNode:
         """轮询选择节点"""
         node_ids = [node.id for node in nodes]
@@ -303,17 +573,29 @@ class ReadWriteSplitEngine:
     async def get_session(
         self,
         query_text: Optional[str] = None,
-        force_master: bool = False
+        force_master: bool = False,
+        session_key: Optional[str] = None
     ) -> AsyncGenerator[AsyncSession, None]:
-        """获取数据库会话（自动路由）"""
-        if query_text:
-            query_type = self._classify_query(query_text)
-        else:
-            query_type = QueryType.READ
+        """获取数据库会话（自动路由）
+
+        session_key（或consistency_scope设置的键）标识一个一致性会话：BEGIN到COMMIT/ROLLBACK之间
+        复用同一个主库会话；写入后的读取只发往已追上该写入的从库，否则读主库。
+        """
+        info = self.classifier.classify(query_text) if query_text else None
+        query_type = _KIND_TO_QUERY_TYPE[info.kind] if info else QueryType.READ
+        session_key = session_key or _consistency_key.get()
+        state = self._get_routing_state(session_key) if session_key else None
+
+        if state is not None and state.pinned is not None:
+            async with self._pinned_session(state, info, query_type) as session:
+                yield session
+            return
 
         # 选择节点
         if force_master or query_type in [QueryType.WRITE, QueryType.TRANSACTION]:
             node = self.master_node
+        elif state is not None:
+            node = await self._select_read_node(query_type, state)
         else:
             node = self._select_node_for_read(query_type)
 
@@ -322,37 +604,77 @@ class ReadWriteSplitEngine:
         if not session_factory:
             raise RuntimeError(f"No session factory available for node {node.id}")
 
+        # 分析库排队
+        analytics_slot = None
+        if node.role == DatabaseRole.ANALYTICS:
+            analytics_slot = await self._acquire_analytics_slot(node)
+
         # 创建会话并执行查询
         start_time = time.time()
         session_id = f"session_{int(time.time() * 1000)}_{id(asyncio.current_task())}"
+        session = session_factory()
+        await self._record_connection_start(node.id, session_id)
+        pinned = False
 
         try:
-            session = session_factory()
-            await self._record_connection_start(node.id, session_id)
-
             yield session
 
             # 记录成功统计
             execution_time = (time.time() - start_time) * 1000
             await self._record_query_stats(node.id, query_type, execution_time, True)
 
+            if state is not None and node is self.master_node:
+                if info is not None and info.transaction == "begin":
+                    # 事务开始：后续语句固定使用该会话直到提交或回滚
+                    state.pinned = (node, session, session_id)
+                    state.transaction_writes = False
+                    pinned = True
+                elif query_type == QueryType.WRITE or (
+                        query_type == QueryType.TRANSACTION and info.transaction == "end"):
+                    await self._record_write(state, session)
+
         except Exception as e:
-            # 记录失败统计
+            # 记录失败统计；会话已交给调用方使用，不能在此换节点重试
             execution_time = (time.time() - start_time) * 1000
             await self._record_query_stats(node.id, query_type, execution_time, False, str(e))
-
-            # 如果是从库失败，尝试重试到主库
-            if node.role == DatabaseRole.REPLICA and not force_master:
-                logger.warning(f"Replica {node.id} failed, retrying on master: {e}")
-                async with self.get_session(query_text, force_master=True) as master_session:
-                    yield master_session
-            else:
-                raise
+            if node.role != DatabaseRole.MASTER:
+                logger.warning(f"Query on {node.role.value} {node.id} failed: {e}")
+            raise
 
         finally:
-            await self._record_connection_end(node.id, session_id)
-            if 'session' in locals():
+            if not pinned:
+                await self._record_connection_end(node.id, session_id)
                 await session.close()
+            if analytics_slot is not None:
+                analytics_slot.release()
+
+    @asynccontextmanager
+    async def _pinned_session(
+        self,
+        state: RoutingSessionState,
+        info: Optional[StatementInfo],
+        query_type: QueryType
+    ) -> AsyncGenerator[AsyncSession, None]:
+        """事务进行中：返回固定的主库会话"""
+        node, session, _ = state.pinned
+        start_time = time.time()
+        self.routing_stats["pinned_statements"] += 1
+        try:
+            yield session
+        except Exception as e:
+            execution_time = (time.time() - start_time) * 1000
+            await self._record_query_stats(node.id, query_type, execution_time, False, str(e))
+            await self._release_pinned(state, rollback=True)
+            raise
+
+        execution_time = (time.time() - start_time) * 1000
+        await self._record_query_stats(node.id, query_type, execution_time, True)
+        if query_type == QueryType.WRITE:
+            state.transaction_writes = True
+        if info is not None and info.transaction == "end":
+            if state.transaction_writes:
+                await self._record_write(state, session)
+            await self._release_pinned(state)
 
     async def _record_connection_start(self, node_id: str, session_id: str):
         """记录连接开始"""
@@ -385,10 +707,16 @@ class ReadWriteSplitEngine:
         else:
             stats.avg_response_time = (stats.avg_response_time * 0.9 + execution_time * 0.1)
 
-        # 更新错误率
-        if not success:
-            node = self._get_node_by_id(node_id)
-            if node:
+        node = self.nodes_by_id.get(node_id)
+        if node:
+            if success:
+                # 更新耗时EWMA
+                if node.latency_ewma == 0:
+                    node.latency_ewma = execution_time
+                else:
+                    node.latency_ewma += self.latency_ewma_alpha * (execution_time - node.latency_ewma)
+            else:
+                # 更新错误率
                 node.error_count += 1
 
         # 记录查询历史
@@ -406,11 +734,7 @@ class ReadWriteSplitEngine:
 
     def _get_node_by_id(self, node_id: str) -> Optional[DatabaseNode]:
         """根据ID获取节点"""
-        all_nodes = [self.master_node] + self.replica_nodes + self.analytics_nodes
-        for node in all_nodes:
-            if node.id == node_id:
-                return node
-        return None
+        return self.nodes_by_id.get(node_id)
 
     async def _health_check_loop(self):
         """健康检查循环"""
@@ -445,7 +769,7 @@ class ReadWriteSplitEngine:
         try:
             async with engine.begin() as conn:
                 result = await conn.execute(text("SELECT 1"))
-                await result.fetchone()
+                result.fetchone()
 
             response_time = (time.time() - start_time) * 1000
             node.response_time = response_time
@@ -460,6 +784,10 @@ class ReadWriteSplitEngine:
             # 重置错误计数
             node.error_count = 0
 
+            # 从库同时刷新回放位置和复制延迟
+            if node.role != DatabaseRole.MASTER:
+                await self._refresh_replay_lsn(node)
+
         except Exception as e:
             logger.warning(f"Health check failed for node {node.id}: {e}")
             node.error_count += 1
@@ -500,9 +828,22 @@ class ReadWriteSplitEngine:
                     "avg_response_time": stats.avg_response_time,
                     "current_connections": stats.current_connections,
                     "error_count": node.error_count,
-                    "last_used": stats.last_used
+                    "last_used": stats.last_used,
+                    "replication_lag": node.replication_lag,
+                    "lag_ejected": node.lag_ejected,
+                    "latency_ewma": round(node.latency_ewma, 3),
+                    "dynamic_weight": round(self._dynamic_weight(node), 6)
                 }
 
+        routing = dict(self.routing_stats)
+        reads = routing["replica_reads"] + routing["master_reads_consistency"] + routing["master_reads_fallback"]
+        routing["replica_read_fraction"] = round(routing["replica_reads"] / reads, 4) if reads else 0.0
+        routing["active_sessions"] = len(self._routing_sessions)
+        routing["classifier_cache"] = self.classifier.get_stats()
+
+        analytics_queue = dict(self.analytics_stats)
+        analytics_queue["waiting"] = {node.id: self._analytics_waiting[node.id] for node in self.analytics_nodes}
+
         return {
             "total_queries": total_queries,
             "recent_queries_1h": len(recent_queries),
@@ -511,7 +852,9 @@ class ReadWriteSplitEngine:
             "node_stats": node_stats,
             "load_balance_strategy": self.load_balance_strategy.value,
             "healthy_nodes": sum(1 for healthy in self.node_health.values() if healthy),
-            "total_nodes": len(self.node_health)
+            "total_nodes": len(self.node_health),
+            "routing": routing,
+            "analytics_queue": analytics_queue
         }
 
     async def get_query_performance(self, limit: int = 100) -> List[Dict[str, Any]]:
@@ -593,6 +936,10 @@ class ReadWriteSplitEngine:
                 except asyncio.CancelledError:
                     pass
 
+            # 回滚未结束的事务会话
+            for session_key in list(self._routing_sessions):
+                await self.release_routing_session(session_key)
+
             # 关闭所有引擎
             for engine in self.engines.values():
                 await engine.dispose()
@@ -618,7 +965,6 @@ async def initialize_read_write_split(
 
     # 创建主库节点
     master_node = DatabaseNode(
-        id=master_config["id"],
         role=DatabaseRole.MASTER,
         **master_config
     )
@@ -0,0 +1,205 @@
+"""
+SQL语句分类 - SQL Statement Classification
+基于词法分析的轻量分类器：跳过注释、字符串和引号标识符，识别读写、事务控制和分析查询，
+并生成去除字面量的规范化语句指纹
+"""
+
+import re
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+
+class StatementKind(Enum):
+    """语句类别"""
+    READ = "read"
+    WRITE = "write"
+    TRANSACTION = "transaction"
+    ANALYTICS = "analytics"
+
+
+@dataclass(frozen=True)
+class StatementInfo:
+    """语句分类结果"""
+    kind: StatementKind
+    fingerprint: str
+    transaction: Optional[str] = None  # "begin" / "end"：语句结束后事务的开启或结束
+    statement_count: int = 1
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<estring>[Ee]'(?:[^'\\]|\\.|'')*')
+  | (?P<string>[BbXxNn]?'(?:[^']|'')*')
+  | (?P<dollar>\$(?P<tag>[A-Za-z_][A-Za-z_0-9]*|)\$.*?\$(?P=tag)\$)
+  | (?P<ident>"(?:[^"]|"")*"|`[^`]*`)
+  | (?P<param>\$\d+|:[A-Za-z_][A-Za-z_0-9]*|%\([A-Za-z_0-9]+\)s|%s|\?)
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z_0-9$]*)
+  | (?P<punct>::|<>|!=|<=|>=|\|\||.)
+""", re.S | re.X)
+
+_SKIP = frozenset(("ws", "comment"))
+_LITERALS = frozenset(("estring", "string", "dollar", "number", "param"))
+_IN_LIST_RE = re.compile(r"\( \?(?: , \?)+ \)")
+
+_BEGIN = frozenset(("BEGIN", "START"))
+_END = frozenset(("COMMIT", "END", "ROLLBACK", "ABORT"))
+_TRANSACTION_OTHER = frozenset(("SAVEPOINT", "RELEASE", "PREPARE"))
+_DML = frozenset(("INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "REPLACE"))
+_WRITE_LEADING = _DML | frozenset((
+    "CREATE", "DROP", "ALTER", "TRUNCATE", "GRANT", "REVOKE", "COPY", "VACUUM", "ANALYZE", "ANALYSE",
+    "REINDEX", "CLUSTER", "REFRESH", "LOCK", "CALL", "DO", "COMMENT", "NOTIFY", "LISTEN", "UNLISTEN",
+    "SET", "RESET", "DISCARD", "SECURITY", "IMPORT", "LOAD", "CHECKPOINT"
+))
+_READ_LEADING = frozenset(("SELECT", "WITH", "VALUES", "TABLE", "SHOW", "EXPLAIN", "DESCRIBE", "DESC"))
+_WRITE_FUNCTIONS = frozenset(("NEXTVAL", "SETVAL", "PG_ADVISORY_LOCK", "PG_ADVISORY_XACT_LOCK",
+                              "PG_TRY_ADVISORY_LOCK", "LO_CREATE", "LO_UNLINK", "TXID_CURRENT"))
+_LOCK_STRENGTH = frozenset(("UPDATE", "SHARE", "NO", "KEY"))
+
+_RANK = {StatementKind.READ: 0, StatementKind.ANALYTICS: 1, StatementKind.WRITE: 2, StatementKind.TRANSACTION: 3}
+
+
+def tokenize(sql: str) -> Iterator[Tuple[str, str]]:
+    """生成 (类型, 文本) 词法单元，忽略空白和注释"""
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind not in _SKIP:
+            yield kind, match.group()
+
+
+def _classify_statement(tokens: List[Tuple[str, str]]) -> Tuple[StatementKind, Optional[str]]:
+    """单条语句分类，tokens中的word已转为大写"""
+    words = [value for kind, value in tokens if kind == "word"]
+    if not words:
+        return StatementKind.READ, None
+    leading = words[0]
+
+    if leading in _BEGIN:
+        return StatementKind.TRANSACTION, "begin"
+    if leading in _END:
+        # ROLLBACK TO SAVEPOINT 不结束事务
+        if leading == "ROLLBACK" and "TO" in words[1:3]:
+            return StatementKind.TRANSACTION, None
+        # COMMIT/ROLLBACK PREPARED 处理的是两阶段事务，不影响当前会话
+        if len(words) > 1 and words[1] == "PREPARED":
+            return StatementKind.TRANSACTION, None
+        return StatementKind.TRANSACTION, "end"
+    if leading in _TRANSACTION_OTHER:
+        return StatementKind.TRANSACTION, None
+    if leading == "SET" and len(words) > 1 and words[1] == "TRANSACTION":
+        return StatementKind.TRANSACTION, None
+    if leading in _WRITE_LEADING:
+        return StatementKind.WRITE, None
+    if leading == "EXPLAIN":
+        # EXPLAIN ANALYZE 会真正执行被解释的语句
+        if ("ANALYZE" in words[1:4] or "ANALYSE" in words[1:4]) and not _DML.isdisjoint(words):
+            return StatementKind.WRITE, None
+        return StatementKind.READ, None
+    if leading not in _READ_LEADING:
+        # 未知语句按写处理，保证路由到主库
+        return StatementKind.WRITE, None
+
+    analytics = False
+    previous = ""
+    for index, (kind, value) in enumerate(tokens):
+        if kind == "word":
+            if previous == "FOR" and value in _LOCK_STRENGTH:
+                # SELECT ... FOR UPDATE/SHARE 需要在主库加锁
+                return StatementKind.WRITE, None
+            if value in _DML and leading == "WITH" and previous not in ("KEY", "NO", "ON"):
+                # 数据修改CTE
+                return StatementKind.WRITE, None
+            if value == "INTO" and leading == "SELECT":
+                # SELECT INTO 创建新表
+                return StatementKind.WRITE, None
+            if ((value == "BY" and previous == "GROUP") or value in ("HAVING", "WINDOW") or
+                    (value == "RECURSIVE" and previous == "WITH")):
+                analytics = True
+            elif value == "OVER" and index + 1 < len(tokens):
+                following_kind, following = tokens[index + 1]
+                if following == "(" or following_kind == "word":
+                    analytics = True
+        elif kind == "punct" and value == "(" and previous in _WRITE_FUNCTIONS:
+            return StatementKind.WRITE, None
+        previous = value
+
+    return (StatementKind.ANALYTICS if analytics else StatementKind.READ), None
+
+
+def analyze(sql: str) -> StatementInfo:
+    """分类语句并生成规范化指纹（多语句时取最需要主库的类别）"""
+    statements: List[List[Tuple[str, str]]] = [[]]
+    parts: List[str] = []
+    for kind, value in tokenize(sql):
+        if kind == "word":
+            value = value.upper()
+        if kind == "punct" and value == ";":
+            if statements[-1]:
+                statements.append([])
+            parts.append(";")
+            continue
+        statements[-1].append((kind, value))
+        parts.append("?" if kind in _LITERALS else value)
+    if not statements[-1] and len(statements) > 1:
+        statements.pop()
+
+    kind = StatementKind.READ
+    transaction = None
+    for tokens in statements:
+        statement_kind, action = _classify_statement(tokens)
+        if _RANK[statement_kind] > _RANK[kind]:
+            kind = statement_kind
+        if action is not None:
+            transaction = action
+
+    # IN (?, ?, ...) 等参数列表归并为 (?)，不同长度的列表得到相同指纹
+    fingerprint = _IN_LIST_RE.sub("( ? )", " ".join(parts)).replace("( ", "(").replace(" )", ")")
+    return StatementInfo(kind=kind, fingerprint=fingerprint.rstrip(" ;"), transaction=transaction,
+                         statement_count=len(statements))
+
+
+class SQLClassifier:
+    """带LRU缓存的语句分类器
+
+    以原始语句文本为键缓存分类结果和规范化指纹；参数化语句的文本重复，命中率高。
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._analyze = lru_cache(maxsize=max_size)(analyze)
+
+    def classify(self, sql: str) -> StatementInfo:
+        return self._analyze(sql)
+
+    def fingerprint(self, sql: str) -> str:
+        return self._analyze(sql).fingerprint
+
+    def clear(self) -> None:
+        self._analyze.cache_clear()
+
+    def get_stats(self) -> dict:
+        info = self._analyze.cache_info()
+        total = info.hits + info.misses
+        return {
+            "entries": info.currsize,
+            "max_size": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / total, 4) if total else 0.0
+        }
+
+
+_default_classifier = SQLClassifier()
+
+
+def classify_sql(sql: str) -> StatementInfo:
+    """使用全局缓存分类语句"""
+    return _default_classifier.classify(sql)
+
+
+def get_sql_classifier() -> SQLClassifier:
+    """获取全局分类器"""
+    return _default_classifier
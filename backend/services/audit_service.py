@@ -10,7 +10,7 @@ from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any
 from enum import Enum
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc
+from sqlalchemy import and_, or_, desc, asc, func
 
 from ..models.audit import AuditLog, AuditAction, AuditResource
 from ..models.organization import Organization
@@ -240,13 +240,11 @@ class AuditService:
             if end_date:
                 query = query.filter(AuditLog.created_at <= end_date)
 
-            # 统计各类型操作数量
-            action_counts = {}
-            for log in query.all():
-                action = log.action
-                if action not in action_counts:
-                    action_counts[action] = 0
-                action_counts[action] += 1
+            # 统计各类型操作数量（分组聚合，不再逐行加载日志）
+            action_counts = dict(
+                query.with_entities(AuditLog.action, func.count(AuditLog.id))
+                .group_by(AuditLog.action).all()
+            )
 
             # 统计用户数量
             unique_users = query.with_entities(
@@ -254,12 +252,10 @@ class AuditService:
             ).distinct().count()
 
             # 统计资源类型
-            resource_types = {}
-            for log in query.all():
-                resource = log.resource_type
-                if resource not in resource_types:
-                    resource_types[resource] = 0
-                resource_types[resource] += 1
+            resource_types = dict(
+                query.with_entities(AuditLog.resource_type, func.count(AuditLog.id))
+                .group_by(AuditLog.resource_type).all()
+            )
 
             # 获取最近的操作
             recent_logs = query.order_by(desc(AuditLog.created_at)).limit(10).all()
@@ -270,7 +266,7 @@ class AuditService:
                     "end_date": end_date.isoformat() if end_date else None
                 },
                 "summary": {
-                    "total_actions": len(query.all()),
+                    "total_actions": sum(action_counts.values()),
                     "unique_users": unique_users,
                     "action_counts": action_counts,
                     "resource_types": resource_types
@@ -10,7 +10,7 @@ from datetime import datetime, date, timedelta
 from decimal import Decimal
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, and_, or_, desc
+from sqlalchemy import select, func, and_, or_, desc, bindparam
 
 from backend.models.budget import (
     Budget, BudgetCreate, BudgetUpdate, BudgetWithStats,
@@ -19,10 +19,25 @@ from backend.models.budget import (
 )
 from backend.models.organization import Organization
 from backend.models.usage_record import UsageRecord
-from backend.core.database import get_db
+from backend.core.database import get_request_session, request_db
+from backend.optimization.prepared_statements import prepared_statement
 
 logger = logging.getLogger(__name__)
 
+# Hot-path statements for budget checks, built once and served from the compiled cache
+BUDGET_BY_ORGANIZATION = prepared_statement(
+    "budget.by_organization",
+    lambda: select(Budget).where(Budget.organization_id == bindparam("organization_id"))
+)
+MONTH_SPEND = prepared_statement(
+    "budget.month_spend",
+    lambda: select(func.sum(UsageRecord.cost)).where(
+        UsageRecord.organization_id == bindparam("organization_id"),
+        UsageRecord.timestamp >= bindparam("month_start"),
+        UsageRecord.timestamp <= bindparam("month_end")
+    )
+)
+
 
 class BudgetExceededException(Exception):
     """Exception raised when budget limit is exceeded"""
@@ -99,13 +114,10 @@ class BudgetService:
             Budget or None if not found
         """
         try:
-            budget = self.db.execute(
-                select(Budget)
-                .where(Budget.organization_id == organization_id)
+            return BUDGET_BY_ORGANIZATION.execute(
+                self.db, organization_id=organization_id
             ).scalar_one_or_none()
 
-            return budget
-
         except Exception as e:
             logger.error(f"Error getting budget for organization {organization_id}: {e}")
             return None
@@ -443,15 +455,8 @@ class BudgetService:
         try:
             month_end = self._get_last_day_of_month(month_start.year, month_start.month)
 
-            total_cost = self.db.execute(
-                select(func.sum(UsageRecord.cost))
-                .where(
-                    and_(
-                        UsageRecord.organization_id == organization_id,
-                        UsageRecord.timestamp >= month_start,
-                        UsageRecord.timestamp <= month_end
-                    )
-                )
+            total_cost = MONTH_SPEND.execute(
+                self.db, organization_id=organization_id, month_start=month_start, month_end=month_end
             ).scalar()
 
             return Decimal(str(total_cost)) if total_cost else Decimal('0.00')
@@ -480,7 +485,7 @@ class BudgetService:
 def get_budget_service(db: Session = None) -> BudgetService:
     """Get budget service instance"""
     if db is None:
-        db = next(get_db())
+        db = get_request_session()
     return BudgetService(db)
 
 
@@ -495,6 +500,6 @@ async def check_organization_budget(organization_id: str, estimated_cost: Decima
     Returns:
         True if within budget limits
     """
-    db = next(get_db())
-    budget_service = BudgetService(db)
-    return await budget_service.check_budget_limit(organization_id, estimated_cost)
\ No newline at end of file
+    with request_db() as db:
+        budget_service = BudgetService(db)
+        return await budget_service.check_budget_limit(organization_id, estimated_cost)
\ No newline at end of file
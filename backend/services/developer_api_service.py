@@ -8,14 +8,31 @@ import hashlib
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc
+from sqlalchemy import and_, or_, desc, bindparam, select
 
 from backend.models.developer import Developer, DeveloperAPIKey, DeveloperType
 from backend.models.developer import APIUsageRecord
 from backend.config.settings import get_settings
+from backend.optimization.prepared_statements import prepared_statement
 
 settings = get_settings()
 
+# 每个开发者API请求都会验证密钥：密钥和开发者状态一次查询完成
+ACTIVE_API_KEY_BY_HASH = prepared_statement(
+    "developer_api.active_key_by_hash",
+    lambda: select(DeveloperAPIKey)
+    .join(Developer, Developer.id == DeveloperAPIKey.developer_id)
+    .where(
+        DeveloperAPIKey.key_hash == bindparam("key_hash"),
+        DeveloperAPIKey.is_active == True,
+        or_(
+            DeveloperAPIKey.expires_at.is_(None),
+            DeveloperAPIKey.expires_at > bindparam("now")
+        ),
+        Developer.is_active == True
+    )
+)
+
 
 class DeveloperAPIService:
     """开发者API密钥管理服务"""
@@ -124,30 +141,10 @@ class DeveloperAPIService:
         # 计算密钥哈希
         key_hash = hashlib.sha256(api_key.encode()).hexdigest()
 
-        # 查找API密钥
-        db_api_key = await self.db.query(DeveloperAPIKey).filter(
-            and_(
-                DeveloperAPIKey.key_hash == key_hash,
-                DeveloperAPIKey.is_active == True,
-                or_(
-                    DeveloperAPIKey.expires_at.is_(None),
-                    DeveloperAPIKey.expires_at > datetime.utcnow()
-                )
-            )
-        ).first()
-
-        if not db_api_key:
-            return None
-
-        # 检查关联的开发者是否活跃
-        developer = await self.db.query(Developer).filter(
-            Developer.id == db_api_key.developer_id
-        ).first()
-
-        if not developer or not developer.is_active:
-            return None
-
-        return db_api_key
+        # 查找有效密钥（开发者需处于活跃状态）
+        return ACTIVE_API_KEY_BY_HASH.execute(
+            self.db, key_hash=key_hash, now=datetime.utcnow()
+        ).scalars().first()
 
     async def get_api_keys(
         self,
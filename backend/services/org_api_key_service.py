@@ -22,7 +22,7 @@ from backend.models.org_api_key import (
 from backend.models.organization import Organization
 from backend.models.user import User
 from backend.models.usage_record import UsageRecord
-from backend.core.database import get_db
+from backend.core.database import get_request_session, request_db
 
 logger = logging.getLogger(__name__)
 
@@ -545,7 +545,7 @@ class OrgApiKeyService:
 def get_org_api_key_service(db: Session = None) -> OrgApiKeyService:
     """Get organization API key service instance"""
     if db is None:
-        db = next(get_db())
+        db = get_request_session()
     return OrgApiKeyService(db)
 
 
@@ -559,6 +559,6 @@ async def validate_organization_api_key(api_key: str) -> Optional[OrgApiKey]:
     Returns:
         API key record if valid
     """
-    db = next(get_db())
-    key_service = OrgApiKeyService(db)
-    return await key_service.validate_api_key(api_key)
\ No newline at end of file
+    with request_db() as db:
+        key_service = OrgApiKeyService(db)
+        return await key_service.validate_api_key(api_key)
\ No newline at end of file
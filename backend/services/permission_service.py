@@ -7,7 +7,7 @@ import uuid
 import logging
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any, Set
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import and_, or_, desc, asc
 
 from ..models.permissions import (
@@ -17,6 +17,7 @@ from ..models.permissions import (
 from ..models.user import User
 from ..models.organization import Organization
 from ..core.auth import get_current_user
+from ..optimization.batch_loader import model_loader
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,11 @@ class PermissionService:
     def __init__(self, db: Session):
         self.db = db
 
+    def _load_roles(self, user_roles: List[UserRole]) -> Dict[Any, Role]:
+        """一次查询加载用户角色对应的角色及其权限"""
+        loader = model_loader(self.db, Role.id, options=[selectinload(Role.permissions)])
+        return loader.load_map(user_role.role_id for user_role in user_roles)
+
     async def create_permission(
         self,
         name: str,
@@ -293,15 +299,13 @@ class PermissionService:
                 )
             )
         ).all()
+        roles = self._load_roles(user_roles)
 
         for user_role in user_roles:
             # 获取角色权限
-            role = self.db.query(Role).filter(
-                Role.id == user_role.role_id,
-                Role.is_active == True
-            ).first()
+            role = roles.get(user_role.role_id)
 
-            if not role:
+            if not role or not role.is_active:
                 continue
 
             # 检查角色权限
@@ -342,17 +346,12 @@ class PermissionService:
                 )
             )
         ).all()
+        roles = self._load_roles(user_roles)
 
         for user_role in user_roles:
-            role = self.db.query(Role).filter(
-                and_(
-                    Role.id == user_role.role_id,
-                    Role.scope == "organization",
-                    Role.is_active == True
-                )
-            ).first()
+            role = roles.get(user_role.role_id)
 
-            if not role:
+            if not role or role.scope != "organization" or not role.is_active:
                 continue
 
             # 检查组织级权限
@@ -499,9 +498,10 @@ class PermissionService:
                     )
                 )
             ).all()
+            roles = self._load_roles(user_roles)
 
             for user_role in user_roles:
-                role = self.db.query(Role).filter(Role.id == user_role.role_id).first()
+                role = roles.get(user_role.role_id)
                 if role:
                     for perm in role.permissions:
                         if perm.is_active:
@@ -548,10 +548,11 @@ class PermissionService:
                 )
 
             user_roles = query.all()
+            users = model_loader(self.db, User.id).load_map(user_role.user_id for user_role in user_roles)
 
             result = []
             for user_role in user_roles:
-                user = self.db.query(User).filter(User.id == user_role.user_id).first()
+                user = users.get(user_role.user_id)
                 if user:
                     result.append({
                         "user_id": str(user.id),
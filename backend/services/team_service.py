@@ -16,6 +16,7 @@ from backend.models.member import Member, OrganizationRole
 from backend.models.user import User
 from backend.models.usage_record import UsageRecord
 from backend.core.database import get_db
+from backend.optimization.batch_loader import aggregate_loader, model_loader
 
 logger = logging.getLogger(__name__)
 
@@ -164,8 +165,9 @@ class TeamService:
 
             if include_stats:
                 teams_with_stats = []
+                all_stats = await self._get_teams_stats([team.id for team in result], teams=result)
                 for team in result:
-                    stats = await self._get_team_stats(team.id)
+                    stats = all_stats[team.id]
                     team_data = TeamWithStats.from_orm(team)
                     team_data.member_count = stats['member_count']
                     team_data.sub_team_count = stats['sub_team_count']
@@ -771,25 +773,25 @@ class TeamService:
         Returns:
             True if circular reference would be created
         """
-        visited = set()
-
-        def check_circular(team_id: str) -> bool:
-            if team_id in visited:
-                return True
+        # Load the organization's parent links in one query and walk the chain in memory
+        parents = {
+            str(team_id): parent_id
+            for team_id, parent_id in self.db.execute(
+                select(Team.id, Team.parent_team_id)
+                .where(Team.organization_id == organization_id)
+            ).all()
+        }
 
+        visited = set()
+        team_id = str(parent_team_id)
+        while team_id not in visited:
             visited.add(team_id)
+            parent_id = parents.get(team_id)
+            if not parent_id:
+                return False
+            team_id = str(parent_id)
 
-            team = self.db.execute(
-                select(Team)
-                .where(Team.id == team_id)
-            ).scalar_one_or_none()
-
-            if team and team.parent_team_id:
-                return check_circular(team.parent_team_id)
-
-            return False
-
-        return check_circular(parent_team_id)
+        return True
 
     async def _get_team_stats(self, team_id: str) -> Dict[str, Any]:
         """
@@ -801,62 +803,64 @@ class TeamService:
         Returns:
             Team statistics
         """
-        try:
-            # Member count
-            member_count = self.db.execute(
-                select(func.count(Member.id))
-                .where(Member.team_id == team_id)
-            ).scalar()
-
-            # Sub-team count
-            sub_team_count = self.db.execute(
-                select(func.count(Team.id))
-                .where(Team.parent_team_id == team_id)
-            ).scalar()
+        return (await self._get_teams_stats([team_id]))[team_id]
 
-            # Current month spend
-            from datetime import datetime, timedelta
-            start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-            usage_records = self.db.execute(
-                select(func.sum(UsageRecord.estimated_cost))
-                .where(
-                    and_(
-                        UsageRecord.team_id == team_id,
-                        UsageRecord.timestamp >= start_of_month
-                    )
-                )
-            ).scalar()
+    async def _get_teams_stats(self, team_ids: List[Any], teams: List[Team] = ()) -> Dict[Any, Dict[str, Any]]:
+        """
+        Get statistics for several teams with one grouped query per statistic
 
-            current_month_spend = float(usage_records) if usage_records else 0.0
+        Args:
+            team_ids: Team IDs
+            teams: Already loaded Team objects (avoids reloading them)
 
-            # Parent team name
-            team = self.db.execute(
-                select(Team)
-                .where(Team.id == team_id)
-            ).scalar_one_or_none()
+        Returns:
+            Team statistics keyed by team ID
+        """
+        try:
+            start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-            parent_team_name = None
-            if team and team.parent_team_id:
-                parent_team = self.db.execute(
-                    select(Team)
-                    .where(Team.id == team.parent_team_id)
-                ).scalar_one_or_none()
-                if parent_team:
-                    parent_team_name = parent_team.name
+            # Member count / sub-team count / current month spend
+            member_counts = aggregate_loader(
+                self.db, Member.team_id, func.count(Member.id)
+            ).load_map(team_ids)
+            sub_team_counts = aggregate_loader(
+                self.db, Team.parent_team_id, func.count(Team.id)
+            ).load_map(team_ids)
+            spends = aggregate_loader(
+                self.db, UsageRecord.team_id, func.sum(UsageRecord.estimated_cost),
+                UsageRecord.timestamp >= start_of_month, default=None
+            ).load_map(team_ids)
+
+            # Parent team names
+            team_loader = model_loader(self.db, Team.id)
+            for team in teams:
+                team_loader.prime(team.id, team)
+            team_map = team_loader.load_map(team_ids)
+            parents = team_loader.load_map(
+                team.parent_team_id for team in team_map.values() if team and team.parent_team_id
+            )
 
-            return {
-                "member_count": member_count,
-                "sub_team_count": sub_team_count,
-                "current_month_spend": current_month_spend,
-                "parent_team_name": parent_team_name
-            }
+            stats = {}
+            for team_id in team_ids:
+                team = team_map.get(team_id)
+                parent_team = parents.get(team.parent_team_id) if team and team.parent_team_id else None
+                spend = spends.get(team_id)
+                stats[team_id] = {
+                    "member_count": member_counts.get(team_id, 0),
+                    "sub_team_count": sub_team_counts.get(team_id, 0),
+                    "current_month_spend": float(spend) if spend else 0.0,
+                    "parent_team_name": parent_team.name if parent_team else None
+                }
+            return stats
 
         except Exception as e:
             logger.error(f"Failed to get team stats: {e}")
             return {
-                "member_count": 0,
-                "sub_team_count": 0,
-                "current_month_spend": 0.0,
-                "parent_team_name": None
-            }
\ No newline at end of file
+                team_id: {
+                    "member_count": 0,
+                    "sub_team_count": 0,
+                    "current_month_spend": 0.0,
+                    "parent_team_name": None
+                }
+                for team_id in team_ids
+            }
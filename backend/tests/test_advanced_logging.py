@@ -0,0 +1,184 @@
+"""
+高级日志流式分析测试
+测试增量异常检测、增量统计、合并正则模式匹配和独立进程解析
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.core.logging.advanced_logging import (
+    AdvancedLogManager, AnomalyType, ErrorBurstDetector, ErrorSpikeDetector, LogAnalyzer,
+    LogCategory, LogEntry, LogLevel, LogParser, LogPattern, LogStatisticsAccumulator,
+    PatternChangeDetector, SilenceDetector, required_literal
+)
+
+BASE = datetime(2024, 1, 1, 8, 0, 0)
+
+
+def entry(seconds, level=LogLevel.INFO, message="ok", category=LogCategory.APPLICATION, source="api"):
+    return LogEntry(timestamp=BASE + timedelta(seconds=seconds), level=level, category=category,
+                    message=message, source=source)
+
+
+def feed(detector, logs):
+    anomalies = []
+    for log in logs:
+        anomalies.extend(detector.observe(log))
+    return anomalies
+
+
+class TestStreamingDetectors:
+    """流式检测器测试"""
+
+    def test_error_spike(self):
+        """测试当前5分钟桶错误数超过历史基线时告警一次"""
+        logs = []
+        for bucket in range(4):
+            logs += [entry(bucket * 300 + i, LogLevel.ERROR) for i in range(2 + bucket % 2)]
+        logs += [entry(1500 + i, LogLevel.ERROR) for i in range(30)]
+
+        anomalies = feed(ErrorSpikeDetector(), logs)
+
+        assert [a.anomaly_type for a in anomalies] == [AnomalyType.SPIKE]
+        assert anomalies[0].metrics["error_count"] == 6
+
+    def test_error_burst_with_cooldown(self):
+        """测试1分钟内超过10个错误告警，且同一窗口内不重复告警"""
+        logs = [entry(i * 2, LogLevel.ERROR) for i in range(25)]
+        logs += [entry(200 + i, LogLevel.ERROR) for i in range(11)]
+
+        anomalies = feed(ErrorBurstDetector(), logs)
+
+        assert len(anomalies) == 2
+        assert anomalies[0].metrics["error_count"] == 11
+        assert len(anomalies[0].affected_logs) == 11
+
+    def test_silence_gap_and_tick(self):
+        """测试日志间隔过长告警，以及无新日志时通过tick发现静默"""
+        detector = SilenceDetector()
+        logs = [entry(i) for i in range(12)] + [entry(12 + 900)]
+        assert len(feed(detector, logs)) == 1
+
+        assert detector.tick(BASE + timedelta(seconds=1000)) == []
+        assert len(detector.tick(BASE + timedelta(seconds=2000))) == 1
+        assert detector.tick(BASE + timedelta(seconds=3000)) == []
+        # 静默结束后的第一条日志不再重复告警
+        assert detector.observe(entry(3100)) == []
+
+    def test_pattern_change_incremental_similarity(self):
+        """测试错误模式分布变化时告警，增量相似度与全量计算一致"""
+        detector = PatternChangeDetector()
+        detector.half_size = 20
+        logs = [entry(i, LogLevel.ERROR, f"db timeout after {i}ms") for i in range(20)]
+        logs += [entry(100 + i, LogLevel.ERROR, f"auth token {i} expired") for i in range(20)]
+
+        anomalies = feed(detector, logs)
+
+        assert [a.anomaly_type for a in anomalies] == [AnomalyType.PATTERN_CHANGE]
+        assert anomalies[0].metrics["pattern_similarity"] == pytest.approx(0.0)
+
+        # 持续混合后相似度恢复，重新计算应与增量结果一致
+        feed(detector, [entry(200 + i, LogLevel.ERROR, "db timeout after 1ms" if i % 2 else "auth token 1 expired")
+                        for i in range(40)])
+        older, newer = detector._older_counts, detector._newer_counts
+        patterns = [p for p in detector._totals]
+        expected = sum(min(older[p], newer[p]) / (older[p] + newer[p]) for p in patterns) / len(patterns)
+        assert detector._ratio_sum / len(detector._totals) == pytest.approx(expected)
+
+    def test_analyzer_observe_runs_all_detectors(self):
+        """测试分析器流式检测汇总各检测器结果"""
+        analyzer = LogAnalyzer()
+        logs = [entry(i, LogLevel.ERROR, "boom") for i in range(12)]
+
+        anomalies = [a for log in logs for a in analyzer.observe(log)]
+
+        assert [a.anomaly_type for a in anomalies] == [AnomalyType.ERROR_BURST]
+        assert anomalies[0].severity_score == 5
+
+
+class TestPatternMatching:
+    """模式匹配测试"""
+
+    def test_required_literal(self):
+        """测试必需字面量提取"""
+        assert required_literal(r'Database\s+(?P<error>\w+):\s*(?P<message>.+)') == "Database"
+        assert required_literal(r'(?P<method>\w+)\s+(?P<status>\d{3})\s+(?P<d>\d+)ms') == "ms"
+        assert required_literal(r'colou?r') == "colo"
+        assert required_literal(r'a(b|c)d') == ""
+
+    def test_priority_preserved(self):
+        """测试合并正则下仍按模式顺序取第一个匹配"""
+        parser = LogParser()
+        parser.add_pattern(LogPattern(
+            pattern_id="timeout", name="超时", regex=r'timeout', category=LogCategory.NETWORK,
+            severity=LogLevel.WARN, description="", sample_messages=[], created_at=BASE
+        ))
+
+        # 后加入的模式出现在更靠前的位置，但优先级较低
+        match = parser.match_pattern(entry(0, message="timeout: Database Connection: refused"))
+        assert match.pattern_id == "database_error"
+        assert parser.match_pattern(entry(0, message="socket timeout")).pattern_id == "timeout"
+        assert parser.match_pattern(entry(0, message="GET /api/v1/chat 200 150ms")).pattern_id == "http_request"
+        assert parser.match_pattern(entry(0, message="nothing here")) is None
+
+    def test_backreference_pattern_matched_standalone(self):
+        """测试含反向引用的模式单独匹配"""
+        parser = LogParser()
+        parser.add_pattern(LogPattern(
+            pattern_id="repeat", name="重复", regex=r'(?P<word>\w+) (?P=word)', category=LogCategory.SYSTEM,
+            severity=LogLevel.INFO, description="", sample_messages=[], created_at=BASE
+        ))
+
+        assert parser.match_pattern(entry(0, message="retry retry")).pattern_id == "repeat"
+        assert parser.patterns[-1].match_count == 1
+
+
+class TestStatistics:
+    """增量统计测试"""
+
+    def test_matches_batch_statistics(self):
+        """测试增量统计与批量统计结果一致"""
+        logs = [
+            entry(i * 600, LogLevel.ERROR if i % 4 == 0 else LogLevel.INFO, f"error {i % 3}",
+                  LogCategory.PERFORMANCE if i % 5 == 0 else LogCategory.APPLICATION, f"svc-{i % 2}")
+            for i in range(30)
+        ]
+        accumulator = LogStatisticsAccumulator()
+        for log in logs:
+            accumulator.add(log)
+
+        incremental = accumulator.get_statistics(BASE)
+        batch = LogAnalyzer().get_log_statistics(logs)
+
+        for key in ("total_logs", "level_distribution", "category_distribution", "source_distribution",
+                    "time_distribution", "performance_logs_count"):
+            assert incremental[key] == batch[key]
+        assert incremental["error_rate"] == pytest.approx(batch["error_rate"])
+        assert incremental["avg_severity"] == pytest.approx(batch["avg_severity"])
+        assert sorted(incremental["top_errors"], key=str) == sorted(batch["top_errors"], key=str)
+
+        performance_only = accumulator.get_statistics(BASE, LogCategory.PERFORMANCE)
+        assert performance_only["total_logs"] == 6
+
+
+class TestParserWorker:
+    """独立进程解析测试"""
+
+    @pytest.mark.asyncio
+    async def test_worker_parses_queued_logs(self):
+        """测试通过队列投递的日志在解析进程中解析并进入流式分析"""
+        manager = AdvancedLogManager()
+        await manager.start_parser_worker()
+        try:
+            for i in range(20):
+                assert manager.submit_log(f"2024-01-01 08:00:{i:02d} ERROR [api] Database Timeout: query {i}", "api")
+            batch = await manager.ingest_logs_batch(['{"message": "GET /health 200 3ms", "level": "INFO"}'], "json")
+        finally:
+            await manager.stop_parser_worker()
+
+        assert batch[0].tags == ["pattern:http_request"]
+        assert len(manager.log_entries) == 21
+        assert manager.parser.patterns[1].match_count == 20
+        assert any(a.anomaly_type == AnomalyType.ERROR_BURST for a in manager.anomalies)
+        assert manager.parser_worker.get_stats()["parsed"] == 21
@@ -0,0 +1,168 @@
+"""
+告警引擎测试
+测试按指标索引的规则评估、持续时间与滞回状态、抑制规则和有界事件历史
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.monitoring.alert_engine import (
+    AlertCondition, AlertEngine, AlertSeverity, AlertStatus, benchmark_alert_engine, compile_predicate
+)
+
+BASE = datetime(2024, 1, 3, 10, 0, 0)  # 周三
+
+
+def rule(rule_id="cpu_high", metric="cpu", operator=">", threshold=80.0, duration=1, **kwargs):
+    return AlertCondition(id=rule_id, name=rule_id, metric_name=metric, operator=operator,
+                          threshold=threshold, duration_minutes=duration,
+                          severity=AlertSeverity.WARNING, **kwargs)
+
+
+async def feed(engine, metric, values, start=BASE, step=30):
+    for i, value in enumerate(values):
+        await engine.evaluate_metric(metric, value, start + timedelta(seconds=i * step))
+
+
+class TestCompiledPredicates:
+    """编译条件测试"""
+
+    def test_operators(self):
+        """测试各运算符编译结果"""
+        assert compile_predicate('>', '80')(81) and not compile_predicate('>', 80)(80)
+        assert compile_predicate('<=', 5)(5)
+        assert compile_predicate('in', ['a', 'b'])('a')
+        assert compile_predicate('regex', r'time(out)?')('socket timeout')
+        assert compile_predicate('not_contains', 'ok')('failed')
+        assert compile_predicate('~', 1) is None
+
+    def test_offset_relaxes_threshold(self):
+        """测试滞回偏移把阈值向更容易满足的方向移动"""
+        assert compile_predicate('>', 80, 5)(76)
+        assert compile_predicate('<', 10, 5)(14)
+
+
+class TestEvaluation:
+    """规则评估测试"""
+
+    @pytest.mark.asyncio
+    async def test_only_rules_for_metric_are_evaluated(self):
+        """测试只评估对应指标上已启用的规则"""
+        engine = AlertEngine()
+        engine.add_rule(rule("cpu_high"))
+        engine.add_rule(rule("mem_high", metric="memory"))
+        engine.add_rule(rule("cpu_disabled", enabled=False))
+
+        await engine.evaluate_metric("cpu", 95)
+
+        assert set(engine.active_conditions) == {"cpu_high"}
+        assert [r.id for r in engine.get_rules_for_metric("cpu")] == ["cpu_high"]
+
+        engine.remove_rule("cpu_high")
+        assert engine.get_rules_for_metric("cpu") == []
+        assert "cpu" in {r.metric_name for r in engine.rules.values()}
+
+    @pytest.mark.asyncio
+    async def test_duration_and_resolve(self):
+        """测试条件持续满足指定时间后才创建事件，恢复后自动解决"""
+        engine = AlertEngine()
+        engine.add_rule(rule(duration=1))
+
+        await feed(engine, "cpu", [90, 90])
+        assert engine.get_active_alerts() == []
+
+        await feed(engine, "cpu", [90], start=BASE + timedelta(seconds=60))
+        incident = engine.incidents["cpu_high"]
+        assert incident.status == AlertStatus.ACTIVE
+
+        await feed(engine, "cpu", [50], start=BASE + timedelta(seconds=90))
+        assert incident.status == AlertStatus.RESOLVED
+        assert engine.active_conditions == {}
+
+    @pytest.mark.asyncio
+    async def test_in_place_threshold_change_recompiles(self):
+        """测试直接修改规则阈值后使用新阈值"""
+        engine = AlertEngine()
+        condition = rule()
+        engine.add_rule(condition)
+
+        await engine.evaluate_metric("cpu", 85, BASE)
+        assert "cpu_high" in engine.active_conditions
+
+        condition.threshold = 90.0
+        await engine.evaluate_metric("cpu", 85, BASE + timedelta(seconds=10))
+        assert "cpu_high" not in engine.active_conditions
+
+    @pytest.mark.asyncio
+    async def test_hysteresis(self):
+        """测试滞回区间内的回落不解除告警"""
+        engine = AlertEngine()
+        engine.add_rule(rule(duration=0, hysteresis=5.0))
+
+        await feed(engine, "cpu", [85, 85, 78, 82])
+        assert engine.incidents["cpu_high"].status == AlertStatus.ACTIVE
+        assert len(engine.get_alert_history(hours=24 * 365 * 10)) == 1
+
+        await feed(engine, "cpu", [74], start=BASE + timedelta(minutes=5))
+        assert engine.incidents["cpu_high"].status == AlertStatus.RESOLVED
+
+    @pytest.mark.asyncio
+    async def test_suppression(self):
+        """测试时间段和周末抑制"""
+        engine = AlertEngine()
+        engine.add_rule(rule(duration=0))
+        engine.add_suppression_rule("cpu_high", {"suppress_hours": [10], "suppress_weekends": True})
+
+        await feed(engine, "cpu", [90, 90])
+        await feed(engine, "cpu", [90, 90], start=BASE + timedelta(days=3, hours=5))  # 周六
+        assert engine.incidents == {}
+
+        await feed(engine, "cpu", [90, 90], start=BASE + timedelta(hours=5))
+        assert "cpu_high" in engine.incidents
+
+    @pytest.mark.asyncio
+    async def test_evaluation_stats(self):
+        """测试评估历史为定长缓冲，统计按指标汇总"""
+        engine = AlertEngine()
+        engine.add_rule(rule(duration=0))
+        now = datetime.utcnow()
+
+        await feed(engine, "cpu", [90] * 1200, start=now, step=0)
+
+        stats = engine.get_evaluation_stats()
+        assert len(engine.evaluation_history) == engine.max_history_size
+        assert stats["triggered_evaluations"] == engine.max_history_size
+        assert stats["metric_trigger_counts"] == {"cpu": engine.max_history_size}
+
+
+class TestIncidentHistory:
+    """事件历史测试"""
+
+    @pytest.mark.asyncio
+    async def test_bounded_history_and_lookup(self):
+        """测试历史有上限，按时间窗口查询，并按事件ID确认"""
+        engine = AlertEngine(max_incident_history=20)
+        engine.add_rule(rule(duration=0))
+        now = datetime.utcnow()
+
+        for i in range(30):
+            start = now - timedelta(hours=60 - i * 2)
+            await feed(engine, "cpu", [90, 90, 10], start=start)
+
+        assert len(engine._history) <= 20
+        recent = engine.get_alert_history(hours=24)
+        assert recent and all(i.triggered_at >= now - timedelta(hours=24) for i in recent)
+        assert recent == sorted(recent, key=lambda i: i.triggered_at)
+
+        await feed(engine, "cpu", [90, 90], start=now)
+        incident = engine.incidents["cpu_high"]
+        assert await engine.acknowledge_alert(incident.id, "ops")
+        assert incident.acknowledged_by == "ops"
+        assert await engine.resolve_alert(incident.id, "ops")
+        assert not await engine.resolve_alert(incident.id, "ops")
+
+    def test_benchmark_runs(self):
+        """测试基准可运行"""
+        result = benchmark_alert_engine(samples=2000, metrics=50, rules_per_metric=2)
+        assert result["samples"] == 2000 and result["rules"] == 100
@@ -0,0 +1,213 @@
+"""
+异常检测向量化计算测试
+测试整序列特征矩阵与逐点计算一致，以及展平后的IsolationForest批量打分
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.monitoring.anomaly_scoring import (
+    FEATURE_NAMES, CompiledForest, ForestBank, average_path_length, feature_matrix, last_row_features,
+    series_arrays
+)
+
+
+def make_series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 3, 1, 6, 0)
+    return [
+        {"value": float(100 + 20 * np.sin(i / 10) + rng.normal(0, 5) + (300 if i == n - 3 else 0)),
+         "timestamp": (start + timedelta(minutes=17 * i)).isoformat()}
+        for i in range(n)
+    ]
+
+
+def reference_features(data, index):
+    """逐点计算的参考实现"""
+    values = [p["value"] for p in data]
+    current = values[index]
+    time = datetime.fromisoformat(data[index]["timestamp"])
+
+    def window(w):
+        return values[max(0, index - w + 1):index + 1]
+
+    def slope(w):
+        y = window(w)
+        return np.polyfit(np.arange(len(y)), y, 1)[0] if len(y) >= 3 else 0
+
+    prefix = values[:index + 1]
+    mean, median = np.mean(prefix), np.median(prefix)
+    std = max(np.std(prefix) if len(prefix) > 1 else 1, 1)
+    q75, q25 = np.percentile(prefix, [75, 25])
+    hourly = defaultdict(list)
+    for point in data:
+        hourly[datetime.fromisoformat(point["timestamp"]).hour].append(point["value"])
+    same_hour = hourly[time.hour]
+    return [
+        current,
+        (current - values[index - 1]) / max(abs(values[index - 1]), 1) if index > 0 else 0,
+        np.mean(window(5)), np.mean(window(15)), np.mean(window(60)),
+        np.std(window(5)) if len(window(5)) > 1 else 0,
+        np.std(window(15)) if len(window(15)) > 1 else 0,
+        slope(15), slope(60),
+        time.hour, time.weekday(), time.weekday() >= 5, 9 <= time.hour <= 17,
+        (current - mean) / std, (current - median) / std,
+        sum(1 for v in prefix if v <= current) / len(prefix) * 100,
+        (current - mean) / std,
+        (current - median) / max(q75 - q25, 1) if len(prefix) > 3 else 0,
+        (current - np.mean(same_hour)) / max(np.std(same_hour), 1) if len(same_hour) > 2 else 0,
+    ]
+
+
+class TestFeatureMatrix:
+    """特征矩阵测试"""
+
+    def test_matches_pointwise_reference(self):
+        """测试全序列矩阵与逐点计算一致"""
+        data = make_series(240)
+        matrix = feature_matrix(*series_arrays(data))
+
+        assert matrix.shape == (240, len(FEATURE_NAMES))
+        expected = np.array([reference_features(data, i) for i in range(240)], dtype=float)
+        np.testing.assert_allclose(matrix, expected, rtol=1e-7, atol=1e-7)
+
+    def test_last_row_matches_matrix(self):
+        """测试检测路径只计算最后一行时与全量矩阵相同"""
+        arrays = series_arrays(make_series(300, seed=3))
+        full = feature_matrix(*arrays)
+
+        np.testing.assert_allclose(last_row_features(*arrays), full[-1], rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(feature_matrix(*arrays, rows=[-1, 10])[1], full[10], rtol=1e-9, atol=1e-9)
+
+    def test_short_series_returns_zeros(self):
+        """测试序列过短时返回零向量"""
+        assert not feature_matrix(*series_arrays(make_series(4))).any()
+
+
+def make_tree(rng, n_features, depth=4):
+    """构造先序存储的随机树，模拟sklearn的tree_结构"""
+    left, right, feature, threshold, samples = [], [], [], [], []
+
+    def build(level, count):
+        node = len(left)
+        left.append(-1)
+        right.append(-1)
+        feature.append(-2)
+        threshold.append(-2.0)
+        samples.append(count)
+        if level < depth and count > 1:
+            feature[node] = int(rng.integers(n_features))
+            threshold[node] = float(np.float32(rng.normal()))
+            split = int(rng.integers(1, count))
+            left[node] = build(level + 1, split)
+            right[node] = build(level + 1, count - split)
+        return node
+
+    build(0, 64)
+    return SimpleNamespace(children_left=left, children_right=right, feature=feature,
+                           threshold=threshold, n_node_samples=samples)
+
+
+def make_model(seed, n_features=4, n_trees=12):
+    rng = np.random.default_rng(seed)
+    trees = [SimpleNamespace(tree_=make_tree(rng, n_features, depth=int(rng.integers(2, 7))))
+             for _ in range(n_trees)]
+    columns = [rng.permutation(n_features) for _ in range(n_trees)]
+    model = SimpleNamespace(estimators_=trees, estimators_features_=columns, max_samples_=64, offset_=-0.52)
+    scaler = SimpleNamespace(mean_=rng.normal(size=n_features), scale_=rng.uniform(0.5, 2, size=n_features))
+    return model, scaler
+
+
+def reference_decision(model, scaler, X):
+    """逐样本、逐树遍历的参考打分"""
+    X = ((np.asarray(X) - scaler.mean_) / scaler.scale_).astype(np.float32)
+    scores = []
+    for row in X:
+        depth_sum = 0.0
+        for estimator, columns in zip(model.estimators_, model.estimators_features_):
+            tree, node, depth = estimator.tree_, 0, 0
+            while tree.children_left[node] != -1:
+                value = row[columns][tree.feature[node]]
+                node = tree.children_left[node] if value <= tree.threshold[node] else tree.children_right[node]
+                depth += 1
+            depth_sum += depth + average_path_length([tree.n_node_samples[node]])[0]
+        denominator = len(model.estimators_) * average_path_length([model.max_samples_])[0]
+        scores.append(-(2 ** (-depth_sum / denominator)) - model.offset_)
+    return np.array(scores)
+
+
+class TestForestScoring:
+    """批量打分测试"""
+
+    def test_average_path_length(self):
+        """测试平均路径长度公式"""
+        result = average_path_length([1, 2, 256])
+        assert result[0] == 0 and result[1] == 1
+        assert result[2] == pytest.approx(2 * (np.log(255) + np.euler_gamma) - 2 * 255 / 256)
+
+    def test_compiled_forest_matches_reference(self):
+        """测试展平后的模型打分与逐树遍历一致"""
+        model, scaler = make_model(1)
+        X = np.random.default_rng(9).normal(size=(50, 4)) * 2
+
+        scores = CompiledForest(model, scaler).decision_function(X)
+
+        np.testing.assert_allclose(scores, reference_decision(model, scaler, X), rtol=1e-12)
+
+    def test_bank_scores_all_metrics_at_once(self):
+        """测试多指标一次打分与各自单独打分一致，移除模型后不再返回"""
+        bank = ForestBank()
+        inputs, expected = {}, {}
+        for i in range(5):
+            model, scaler = make_model(10 + i)
+            bank.add(f"metric_{i}", CompiledForest(model, scaler))
+            inputs[f"metric_{i}"] = np.random.default_rng(i).normal(size=(i + 1, 4))
+            expected[f"metric_{i}"] = reference_decision(model, scaler, inputs[f"metric_{i}"])
+        inputs["untrained"] = np.zeros((1, 4))
+
+        scores = bank.score(inputs)
+
+        assert set(scores) == set(expected)
+        for name, values in expected.items():
+            np.testing.assert_allclose(scores[name], values, rtol=1e-12)
+
+        bank.remove("metric_0")
+        assert set(bank.score(inputs)) == set(expected) - {"metric_0"}
+
+    def test_compiled_forest_matches_sklearn(self):
+        """测试编译后的打分与真实IsolationForest.decision_function一致"""
+        ensemble = pytest.importorskip("sklearn.ensemble")
+        preprocessing = pytest.importorskip("sklearn.preprocessing")
+        features = feature_matrix(*series_arrays(make_series(400, seed=5)))
+        scaler = preprocessing.StandardScaler().fit(features)
+        model = ensemble.IsolationForest(n_estimators=50, max_samples=128, max_features=0.8,
+                                         contamination=0.1, random_state=7)
+        model.fit(scaler.transform(features))
+        X = np.vstack([features, np.random.default_rng(2).normal(size=(20, features.shape[1])) * 50])
+
+        scores = CompiledForest(model, scaler).decision_function(X)
+
+        np.testing.assert_allclose(scores, model.decision_function(scaler.transform(X)), rtol=1e-9, atol=1e-9)
+
+
+class TestDetectorTraining:
+    """检测路径与训练的分离测试"""
+
+    def test_detect_without_model_queues_training(self, tmp_path, monkeypatch):
+        """测试没有模型时检测不在调用方训练，而是排队等待进程池"""
+        pytest.importorskip("sklearn")
+        pytest.importorskip("pandas")
+        from backend.monitoring.anomaly_detection import AnomalyDetector
+
+        detector = AnomalyDetector(model_dir=str(tmp_path))
+        monkeypatch.setattr(detector, "train_model", lambda *args, **kwargs: pytest.fail("trained inline"))
+        history = make_series(150)
+
+        assert detector.detect_anomaly("latency", history[-1], history[:-1]) is None
+        assert detector.detect_anomalies_batch({"errors": (history[-1], history[:-1])}) == {}
+        assert detector.has_pending_training
+        assert set(detector._pending_training) == {"latency", "errors"}
@@ -0,0 +1,189 @@
+"""
+异步日志管道测试
+测试JSON预序列化、重复日志采样、有界队列丢弃计数、写线程批量写入和轮转压缩
+"""
+
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+
+import pytest
+
+from backend.core.logging.async_pipeline import (
+    AsyncLoggingPipeline, BoundedQueueHandler, BufferedRotatingFileHandler, JsonLineFormatter, LogSampler
+)
+
+
+class CollectingHandler(logging.Handler):
+    """收集写线程输出的文本"""
+
+    def __init__(self, gate: threading.Event = None):
+        super().__init__()
+        self.lines = []
+        self.flushes = 0
+        self.gate = gate
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        self.lines.append(self.format(record))
+
+    def flush(self):
+        self.flushes += 1
+
+
+def make_logger(name, pipeline):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    pipeline.attach(logger)
+    return logger
+
+
+def make_record(msg, level=logging.INFO, created=1000.0, name="app"):
+    record = logging.makeLogRecord({"name": name, "msg": msg, "levelno": level,
+                                    "levelname": logging.getLevelName(level)})
+    record.created = created
+    return record
+
+
+class TestSerialization:
+    """预序列化测试"""
+
+    def test_prepared_on_caller_side(self):
+        """测试参数插值、异常和extra字段在入队前序列化"""
+        log_queue = queue.Queue()
+        handler = BoundedQueueHandler(log_queue)
+        logger = logging.getLogger("test.prepare")
+        logger.propagate = False
+        logger.handlers = [handler]
+
+        payload = {"n": 1}
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.error("failed %s", payload, exc_info=True, extra={"path": "/api", "status_code": 500})
+        payload["n"] = 2
+
+        record = log_queue.get_nowait()
+        data = json.loads(record._json)
+        assert data["message"] == "failed {'n': 1}"
+        assert data["path"] == "/api" and data["status_code"] == 500
+        assert "ValueError: boom" in data["exception"]
+        assert record.args is None and record.exc_info is None
+        assert data["timestamp"].endswith("Z")
+
+    def test_format_cached(self):
+        """测试同一记录只序列化一次"""
+        formatter = JsonLineFormatter()
+        record = make_record("hello")
+
+        first = formatter.format(record)
+        record.msg = "changed"
+
+        assert formatter.format(record) is first
+
+
+class TestSampler:
+    """采样测试"""
+
+    def test_burst_then_sample(self):
+        """测试窗口内超过burst后按比例保留，下一窗口报告丢弃数"""
+        sampler = LogSampler(burst=10, sample_every=20, window=1.0)
+
+        kept = [sampler.filter(make_record("GET %s", created=1000.0)) for _ in range(110)]
+
+        assert sum(kept) == 10 + 5
+        next_window = make_record("GET %s", created=1001.5)
+        assert sampler.filter(next_window)
+        assert next_window.suppressed == 95
+        assert sampler.suppressed_total == 95
+
+    def test_errors_and_distinct_templates_pass(self):
+        """测试错误级别不采样，不同模板分别计数"""
+        sampler = LogSampler(burst=1, sample_every=1000)
+
+        assert all(sampler.filter(make_record("db down", logging.ERROR)) for _ in range(50))
+        assert sampler.filter(make_record("a")) and sampler.filter(make_record("b"))
+        assert not sampler.filter(make_record("a"))
+
+
+class TestPipeline:
+    """管道测试"""
+
+    def test_slow_handler_does_not_block_caller(self):
+        """测试写线程阻塞时调用方不等待，超出队列的记录丢弃并计数"""
+        gate = threading.Event()
+        sink = CollectingHandler(gate)
+        pipeline = AsyncLoggingPipeline([sink], queue_size=10)
+        logger = make_logger("test.slow", pipeline)
+        pipeline.start()
+
+        start = time.perf_counter()
+        for i in range(100):
+            logger.info("request %d", i)
+        elapsed = time.perf_counter() - start
+
+        gate.set()
+        pipeline.stop()
+        stats = pipeline.get_stats()
+
+        assert elapsed < 0.5
+        assert stats["dropped"]["INFO"] >= 80
+        assert stats["written"] == len(sink.lines) == 100 - stats["dropped"]["INFO"]
+        assert json.loads(sink.lines[0])["message"] == "request 0"
+
+    def test_batches_flush_once(self):
+        """测试写线程按批写入，每批flush一次"""
+        sink = CollectingHandler()
+        pipeline = AsyncLoggingPipeline([sink], queue_size=1000, batch_size=100)
+        logger = make_logger("test.batch", pipeline)
+        for i in range(250):
+            logger.debug("event %d", i)
+
+        pipeline.start()
+        pipeline.stop()
+
+        assert len(sink.lines) == 250
+        assert sink.flushes == pipeline.get_stats()["batches"] <= 4
+
+    def test_stop_restores_handlers(self):
+        """测试停止后日志器恢复原有处理器"""
+        original = logging.NullHandler()
+        logger = logging.getLogger("test.restore")
+        logger.handlers = [original]
+        pipeline = AsyncLoggingPipeline([CollectingHandler()])
+
+        pipeline.attach(logger)
+        assert logger.handlers == [pipeline.handler]
+        pipeline.start()
+        pipeline.stop()
+
+        assert logger.handlers == [original]
+
+
+class TestRotation:
+    """轮转测试"""
+
+    def test_rotation_compresses_in_background(self, tmp_path):
+        """测试按写入字节数轮转，旧文件gzip压缩"""
+        path = tmp_path / "logs" / "app.log"
+        handler = BufferedRotatingFileHandler(str(path), max_bytes=2000, backup_count=3)
+        pipeline = AsyncLoggingPipeline([handler])
+        logger = make_logger("test.rotate", pipeline)
+        pipeline.start()
+
+        for i in range(100):
+            logger.info("line %d %s", i, "x" * 40)
+        pipeline.stop()
+
+        backups = sorted(p.name for p in path.parent.iterdir() if p.name != "app.log")
+        assert backups == ["app.log.1.gz", "app.log.2.gz", "app.log.3.gz"]
+        with gzip.open(path.parent / "app.log.1.gz", "rt") as f:
+            rotated = [json.loads(line) for line in f]
+        current = [json.loads(line) for line in path.read_text().splitlines()]
+        assert rotated[-1]["message"].split()[1] == str(int(current[0]["message"].split()[1]) - 1)
+        assert current[-1]["message"].startswith("line 99 ")
@@ -0,0 +1,145 @@
+"""
+业务监控指标存储测试
+测试环形缓冲区、分位数草图、去重计数、时间桶聚合以及统计接口的输出
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from backend.monitoring.business_monitor import BusinessMonitor
+from backend.monitoring.metric_store import (
+    ColumnarRingBuffer, DDSketch, HyperLogLog, StringInterner, TimeBucketedAggregates
+)
+
+
+class TestMetricStore:
+    """指标存储结构测试"""
+
+    def test_ring_buffer_wraparound(self):
+        """测试环形缓冲区覆盖最旧记录并保持写入顺序"""
+        buffer = ColumnarRingBuffer(4, {"timestamp": np.float64, "value": np.int32})
+        for i in range(10):
+            buffer.append(timestamp=float(i), value=i)
+
+        assert len(buffer) == 4
+        assert buffer.select()["value"].tolist() == [6, 7, 8, 9]
+        assert buffer.select(since=8)["value"].tolist() == [8, 9]
+
+    def test_interner_overflow(self):
+        """测试驻留表超过容量后映射到溢出ID"""
+        interner = StringInterner(max_size=3)
+        a, b = interner.intern("/a"), interner.intern("/b")
+
+        assert interner.intern("/a") == a
+        assert interner.intern("/c") == interner.overflow_id
+        assert interner.lookup(b) == "/b"
+
+    def test_sketch_relative_accuracy(self):
+        """测试DDSketch分位数相对误差有界且合并无损"""
+        rng = random.Random(1)
+        values = [rng.lognormvariate(-2, 1) for _ in range(20000)]
+        left, right = DDSketch(0.01), DDSketch(0.01)
+        for i, value in enumerate(values):
+            (left if i % 2 else right).add(value)
+        left.merge(right)
+
+        ordered = sorted(values)
+        for q in (0.5, 0.95, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            assert abs(left.quantile(q) - exact) / exact <= 0.02
+        assert left.count == len(values)
+
+    def test_hyperloglog_estimate(self):
+        """测试HyperLogLog估计误差和合并"""
+        first, second = HyperLogLog(12), HyperLogLog(12)
+        for i in range(5000):
+            first.add(i)
+        for i in range(2500, 7500):
+            second.add(i)
+        first.merge(second)
+
+        assert abs(first.count() - 7500) / 7500 < 0.05
+
+        small = HyperLogLog()
+        for i in range(30):
+            small.add(i)
+        assert abs(small.count() - 30) <= 1
+
+    def test_buckets_expire_and_window(self):
+        """测试时间桶按窗口合并并丢弃过期桶"""
+        now = [12000.0]
+        aggregates = TimeBucketedAggregates(bucket_seconds=60, retention_seconds=600,
+                                            clock=lambda: now[0])
+        for minute in range(20):
+            now[0] = 12000.0 + minute * 60
+            aggregates.add(now[0], 1, minute, 0.1, minute % 5 == 0)
+
+        # 窗口起点所在的桶也被包含（精度为一个桶）
+        merged, users = aggregates.summarize(120)
+        assert len(aggregates) <= 11
+        assert merged[1].count == 3
+        assert users.count() == 3
+
+
+class TestBusinessMonitor:
+    """业务监控统计测试"""
+
+    @pytest.fixture
+    def monitor(self):
+        return BusinessMonitor(max_metrics_size=100)
+
+    def test_api_stats(self, monitor):
+        """测试API统计保持原有字段和语义"""
+        for i in range(300):
+            endpoint = "/api/chat" if i % 3 else "/api/models"
+            status = 500 if i % 10 == 0 else 200
+            monitor.track_api_call(endpoint, "POST", f"user-{i % 7}", (i % 100 + 1) / 1000, status)
+
+        stats = monitor.get_api_stats(1)
+
+        assert stats["total_requests"] == 300
+        assert stats["successful_requests"] == 270
+        assert stats["error_rate_percent"] == 10.0
+        assert stats["unique_users"] == 7
+        assert stats["avg_response_time_ms"] == pytest.approx(50.5, rel=0.01)
+        assert stats["p95_response_time_ms"] == pytest.approx(96, rel=0.02)
+        assert stats["top_endpoints"][0] == {
+            "endpoint": "/api/chat", "count": 200, "avg_time_ms": stats["top_endpoints"][0]["avg_time_ms"],
+            "p95_time_ms": stats["top_endpoints"][0]["p95_time_ms"], "error_count": 20
+        }
+        # 原始记录只保留最近max_metrics_size条
+        assert len(monitor.api_calls) == 100
+        assert monitor.api_calls[-1].user_id == "user-5"
+
+    def test_ai_model_stats(self, monitor):
+        """测试AI模型统计（平均响应时间只计成功调用）"""
+        monitor.track_ai_model_usage("gpt-4", "openai", "u1", 100, 50, 0.01, 2.0)
+        monitor.track_ai_model_usage("gpt-4", "openai", "u2", 100, 50, 0.01, 10.0,
+                                     success=False, error_message="timeout")
+        monitor.track_ai_model_usage("gemini", "google", "u1", 10, 5, 0.001, 1.0)
+
+        stats = monitor.get_ai_model_stats(1)
+
+        assert stats["total_calls"] == 3
+        assert stats["successful_calls"] == 2
+        assert stats["total_tokens"] == 315
+        assert stats["total_cost_usd"] == 0.021
+        assert stats["avg_response_time_s"] == 1.5
+        assert stats["top_models"][0]["model_name"] == "gpt-4"
+        assert stats["top_models"][0]["error_count"] == 1
+        assert monitor.ai_model_calls[1].error_message == "timeout"
+
+    def test_empty_stats_and_user_activity(self, monitor):
+        """测试无数据时的返回值和用户活动统计"""
+        assert monitor.get_api_stats(1) == {"period_hours": 1, "total_requests": 0}
+        assert monitor.get_ai_model_stats(1) == {"period_hours": 1, "total_calls": 0}
+
+        monitor.track_api_call("/a", "GET", "u1", 0.1, 200)
+        monitor.track_ai_model_usage("m", "p", "u2", 1, 1, 0.0, 0.1)
+        activity = monitor.get_user_activity_stats(1)
+
+        assert activity["active_api_users"] == 1
+        assert activity["active_ai_users"] == 1
+        assert activity["unique_users_today"] == 2
@@ -0,0 +1,173 @@
+"""
+缓存编解码器测试
+测试帧格式编解码、压缩阈值、按键前缀选择、历史格式兼容和线程池转移
+"""
+
+import gzip
+import json
+import pickle
+import threading
+
+import pytest
+
+from backend.core.cache_codecs import CodecRegistry, FRAME_MAGIC, sample_payloads
+from backend.core.cache_core import RedisTier
+
+
+@pytest.fixture
+def registry():
+    return CodecRegistry(offload_threshold=16 * 1024)
+
+
+class TestCodecRegistry:
+    """编解码器注册表测试"""
+
+    @pytest.mark.parametrize("codec", ["json", "json-gzip", "pickle", "pickle-fast", "structured"])
+    def test_roundtrip(self, registry, codec):
+        """测试各编解码器往返一致"""
+        value = {"models": [{"id": i, "name": f"m{i}"} for i in range(200)], "total": 200}
+        data = registry.encode_sync(value, codec=codec)
+
+        assert data[0] == FRAME_MAGIC
+        assert registry.decode_sync(data) == value
+
+    def test_compression_threshold(self, registry):
+        """测试只压缩超过阈值的数据"""
+        small = registry.encode_sync({"a": 1}, codec="json-gzip")
+        large = registry.encode_sync({"text": "x" * 5000}, codec="json-gzip")
+
+        assert small[2] == 0
+        assert large[2] != 0
+        assert len(large) < 5000
+
+    def test_prefix_rules_select_codec(self, registry):
+        """测试按最长键前缀选择编解码器"""
+        registry.load_prefix_rules("api_cache:=json, api_cache:get:models=pickle")
+
+        assert registry.codec_for("api_cache:get:models:all").name == "pickle"
+        assert registry.codec_for("api_cache:get:stats").name == "json"
+        assert registry.codec_for("other", codec="pickle-gzip").name == "pickle-gzip"
+        assert registry.codec_for("other").name == registry.default_codec
+
+    def test_legacy_data_uses_fallback(self, registry):
+        """测试无帧头的历史数据交给legacy解码"""
+        legacy = gzip.compress(pickle.dumps({"old": True}))
+
+        assert registry.decode_sync(json.dumps([1, 2]).encode()) == [1, 2]
+        assert registry.decode_sync(legacy, legacy=lambda data: pickle.loads(gzip.decompress(data))) == {"old": True}
+
+    @pytest.mark.asyncio
+    async def test_large_values_offloaded(self, registry):
+        """测试按序列化后的实际大小决定压缩是否转移到线程池，与此前写入的大小无关"""
+        threads = []
+        compressor = registry.codecs["json-gzip"].compressor
+        original = compressor.compress
+
+        def tracking_compress(data):
+            threads.append(threading.current_thread().name)
+            return original(data)
+
+        object.__setattr__(compressor, "compress", tracking_compress)
+        try:
+            small = {"rows": ["payload" * 20] * 10}
+            for _ in range(200):
+                await registry.encode(small, codec="json-gzip")
+            assert len(threads) == 200 and not any(name.startswith("cache-codec") for name in threads)
+
+            large = {"rows": ["payload" * 20] * 200}
+            data = await registry.encode(large, codec="json-gzip")
+            assert threads[-1].startswith("cache-codec")
+            assert await registry.decode(data) == large
+
+            await registry.encode(small, codec="json-gzip")
+            assert not threads[-1].startswith("cache-codec")
+        finally:
+            object.__setattr__(compressor, "compress", original)
+
+        assert registry.codecs["json-gzip"].stats.offloaded == 1
+        assert registry.codecs["json-gzip"].stats.encodes == 202
+        assert await registry.encode("small", codec="json") == registry.encode_sync("small", codec="json")
+        registry.close()
+
+    @pytest.mark.asyncio
+    async def test_large_uncompressed_payload_serialized_off_loop(self, registry):
+        """测试不压缩的编解码器也在线程池中序列化大值：按容器长度或同前缀键上次的编码大小预判"""
+        threads = []
+        serializer = registry.codecs["json"].serializer
+        original = serializer.dumps
+
+        def tracking_dumps(value):
+            threads.append(threading.current_thread().name)
+            return original(value)
+
+        object.__setattr__(serializer, "dumps", tracking_dumps)
+        try:
+            rows = [{"id": i, "name": f"model-{i}"} for i in range(2000)]
+            await registry.encode(rows, codec="json")
+            assert threads[-1].startswith("cache-codec")
+
+            # 元素少但内容大的值：首次在当前线程编码并记录大小，同前缀的下一个键转移到线程池
+            report = {"rows": rows}
+            await registry.encode(report, key="analytics:2026-01", codec="json")
+            assert not threads[-1].startswith("cache-codec")
+            await registry.encode(report, key="analytics:2026-02", codec="json")
+            assert threads[-1].startswith("cache-codec")
+
+            await registry.encode({"id": 1}, key="user:1", codec="json")
+            assert not threads[-1].startswith("cache-codec")
+        finally:
+            object.__setattr__(serializer, "dumps", original)
+
+        assert registry.codecs["json"].stats.offloaded == 2
+        registry.close()
+
+    def test_benchmark_reports_each_codec(self, registry):
+        """测试基准测试输出每个编解码器的体积和耗时"""
+        results = registry.benchmark(sample_payloads(), codecs=["json", "structured"], rounds=2)
+
+        assert set(results) == {"json", "structured"}
+        models = results["structured"]["models"]
+        assert models["encoded_bytes"] < models["raw_bytes"]
+        assert models["encode_us"] > 0
+        assert registry.codecs["json"].stats.encodes == 0
+
+
+class FakeRedis:
+    """模拟Redis客户端"""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.data.get(key)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def set(self, key, value, ex=None):
+        self.redis.data[key] = value
+
+    async def execute(self):
+        return []
+
+
+class TestRedisTierCodecs:
+    """Redis层编解码集成测试"""
+
+    @pytest.mark.asyncio
+    async def test_tier_roundtrip_and_legacy(self, registry):
+        """测试Redis层通过注册表编解码并兼容历史JSON数据"""
+        client = FakeRedis()
+        tier = RedisTier(client, key_prefix="ns:", codecs=registry)
+
+        await tier.set("k", {"v": 1}, ttl=60)
+        assert client.data["ns:k"][0] == FRAME_MAGIC
+        assert await tier.get("k") == {"v": 1}
+
+        client.data["ns:old"] = json.dumps({"v": 0}).encode()
+        assert await tier.get("old") == {"v": 0}
@@ -0,0 +1,179 @@
+"""
+统一缓存核心测试
+测试共享内存预算、命名空间分层、跨命名空间标签失效和统一统计
+"""
+
+import json
+
+import fakeredis.aioredis
+import pytest
+
+from backend.core.cache import cache_manager
+from backend.core.cache_core import (
+    CacheCore, CacheNamespace, MemoryBudget, MemoryTier, RedisPoolRegistry, RedisTier, estimate_size
+)
+
+
+@pytest.fixture
+def core():
+    """创建小预算的缓存核心"""
+    return CacheCore(memory_budget_bytes=1000)
+
+
+class TestMemoryBudget:
+    """共享内存预算测试"""
+
+    def test_budget_shared_across_tiers(self, core):
+        """测试多个内存层共享同一预算"""
+        first = core.memory_tier()
+        second = core.memory_tier()
+
+        first.set_local("a", "x" * 400)
+        second.set_local("b", "y" * 400)
+        assert core.budget.used_bytes == 800
+
+        # 超出预算时从占用最多的层淘汰
+        second.set_local("c", "z" * 400)
+        assert core.budget.used_bytes <= 1000
+        assert second.get_local("b") is None
+        assert first.get_local("a") == "x" * 400
+
+    def test_delete_releases_budget(self, core):
+        """测试删除和清空释放预算"""
+        tier = core.memory_tier()
+        tier.set_local("a", "x" * 100)
+        tier.set_local("b", "x" * 100)
+
+        tier.delete_local(["a"])
+        assert core.budget.used_bytes == 100
+
+        tier.clear_local()
+        assert core.budget.used_bytes == 0
+
+    def test_max_entries_evicts_lru(self):
+        """测试条目数上限按LRU淘汰"""
+        tier = MemoryTier(MemoryBudget(10 ** 6), max_entries=2)
+        tier.set_local("a", 1)
+        tier.set_local("b", 2)
+        tier.get_local("a")
+        tier.set_local("c", 3)
+
+        assert tier.keys() == ["a", "c"]
+        assert tier.stats.evictions == 1
+
+
+    def test_size_estimate_tracks_serialized_size(self):
+        """测试容器大小按采样估算，与序列化大小同一量级"""
+        rows = [{"id": i, "name": f"user-{i}", "tags": ["a", "b"]} for i in range(1000)]
+        actual = len(json.dumps(rows))
+        assert actual / 2 < estimate_size(rows) < actual * 2
+        assert estimate_size({}) > 0 and estimate_size("abc") == 3
+
+
+class TestCacheNamespace:
+    """命名空间测试"""
+
+    @pytest.mark.asyncio
+    async def test_backfill_upper_tiers(self, core):
+        """测试低层命中后回填高层"""
+        upper = core.memory_tier()
+        lower = core.memory_tier()
+        namespace = core.namespace("layered", tiers=[upper, lower])
+
+        lower.set_local("k", "v", ttl=60)
+        assert await namespace.get("k") == "v"
+        assert upper.get_local("k") == "v"
+
+    @pytest.mark.asyncio
+    async def test_tag_invalidation_across_namespaces(self, core):
+        """测试标签失效作用于所有命名空间"""
+        users = core.namespace("users")
+        reports = core.namespace("reports")
+
+        await users.set("u:1", {"id": 1}, tags=["org:1"])
+        await users.set("u:2", {"id": 2}, tags=["org:2"])
+        await reports.set("r:1", [1, 2], tags=["org:1"])
+
+        assert await core.invalidate_tag("org:1") == 2
+        assert await users.get("u:1") is None
+        assert await reports.get("r:1") is None
+        assert await users.get("u:2") == {"id": 2}
+
+    @pytest.mark.asyncio
+    async def test_registered_adapter_participates(self, core):
+        """测试注册的适配器参与统计和标签失效"""
+        tier = core.memory_tier()
+        core.register(CacheNamespace("adapter", [tier]))
+        await core.namespaces["adapter"].set("k", 1, tags=["t"])
+        await core.namespaces["adapter"].get("k")
+
+        stats = core.get_stats()
+        assert stats["overall"]["hits"] == 1
+        assert "adapter" in stats["namespaces"]
+        assert await core.invalidate_tag("t") == 1
+
+
+    @pytest.mark.asyncio
+    async def test_cache_managers_share_one_redis_tier(self, core, monkeypatch):
+        """测试多个CacheManager初始化时共享命名空间只挂一个Redis层"""
+        client = fakeredis.aioredis.FakeRedis()
+        monkeypatch.setattr(cache_manager, "get_cache_core", lambda: core)
+        monkeypatch.setattr(core, "redis_client", lambda url=None, decode_responses=False: client)
+
+        first, second = cache_manager.CacheManager(), cache_manager.CacheManager()
+        await first.initialize()
+        await second.initialize()
+
+        assert first.cache is second.cache
+        assert sum(isinstance(tier, RedisTier) for tier in first.cache.tiers) == 1
+        await second.set("k", {"v": 1})
+        assert await first.get("k") == {"v": 1}
+
+
+class TestRedisTier:
+    """Redis层测试"""
+
+    @pytest.mark.asyncio
+    async def test_tag_index_ttl_only_extends(self, core):
+        """测试短TTL写入不会缩短标签索引的TTL，长TTL条目仍可按标签失效"""
+        client = fakeredis.aioredis.FakeRedis()
+        namespace = core.namespace("reports", tiers=[RedisTier(client, key_prefix="reports:")])
+
+        await namespace.set("long", "kept", ttl=3600, tags=["org:1"])
+        await namespace.set("short", "brief", ttl=5, tags=["org:1"])
+        assert await client.ttl("reports:tag:org:1") > 3500
+
+        await client.delete("reports:short")
+        assert await namespace.invalidate_tag("org:1") == 1
+        assert await namespace.get("long") is None
+
+    @pytest.mark.asyncio
+    async def test_backfill_keeps_remaining_ttl_and_tags(self, core):
+        """测试从Redis回填的内存副本保留来源的剩余TTL和标签"""
+        client = fakeredis.aioredis.FakeRedis()
+        memory = core.memory_tier()
+        redis_tier = RedisTier(client, key_prefix="users:")
+        namespace = core.namespace("users", tiers=[memory, redis_tier], default_ttl=3600)
+
+        await redis_tier.set("u:1", {"id": 1}, 30, tags=["org:1"])
+        assert await namespace.get("u:1") == {"id": 1}
+
+        _, remaining, tags = await memory.get_entry("u:1")
+        assert remaining <= 30 and tags == ("org:1",)
+        core.generations.bump("org:1")
+        assert memory.get_local("u:1") is None
+
+
+class TestRedisPoolRegistry:
+    """共享连接池测试"""
+
+    def test_clients_share_pool_per_url(self):
+        """测试同一地址的客户端共享连接池"""
+        registry = RedisPoolRegistry(max_connections=5)
+        first = registry.get_client("redis://localhost:6379/0")
+        second = registry.get_client("redis://localhost:6379/0")
+        other = registry.get_client("redis://localhost:6379/1")
+
+        assert first.connection_pool is second.connection_pool
+        assert first.connection_pool is not other.connection_pool
+        assert len(registry.get_stats()) == 2
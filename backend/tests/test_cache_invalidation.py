@@ -0,0 +1,313 @@
+"""
+跨进程缓存失效总线测试
+测试键版本失效、标签代数同步、消息合并和重连后的状态恢复
+"""
+
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from backend.core.cache_core import CacheCore, RedisTier
+from backend.core.cache_invalidation import CacheInvalidationBus
+
+
+class FakeBroker:
+    """模拟Redis服务端（共享存储与频道）"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.values = {}
+        self.subscribers = []
+        self.published = []
+        self.down = False
+
+
+class FakePipeline:
+    """模拟Redis管道"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.commands = []
+
+    def hincrby(self, name, key, amount):
+        self.commands.append(("hincrby", name, key, amount))
+
+    def incr(self, key):
+        self.commands.append(("incr", key))
+
+    async def execute(self):
+        if self.broker.down:
+            raise ConnectionError("redis unavailable")
+        results = []
+        for command in self.commands:
+            if command[0] == "hincrby":
+                data = self.broker.hashes.setdefault(command[1], {})
+                data[command[2]] = data.get(command[2], 0) + command[3]
+                results.append(data[command[2]])
+            else:
+                self.broker.values[command[1]] = self.broker.values.get(command[1], 0) + 1
+                results.append(self.broker.values[command[1]])
+        return results
+
+
+class FakePubSub:
+    """模拟订阅连接"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.broker.subscribers.append(self)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        if self in self.broker.subscribers:
+            self.broker.subscribers.remove(self)
+
+
+class FakeRedis:
+    """模拟Redis客户端"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.broker)
+
+    def pubsub(self):
+        return FakePubSub(self.broker)
+
+    async def publish(self, channel, message):
+        self.broker.published.append(message)
+        for subscriber in list(self.broker.subscribers):
+            subscriber.queue.put_nowait({"type": "message", "data": message})
+        return len(self.broker.subscribers)
+
+    async def hgetall(self, name):
+        return dict(self.broker.hashes.get(name, {}))
+
+    async def get(self, key):
+        return self.broker.values.get(key)
+
+
+def make_worker(broker):
+    """创建一个带失效总线的模拟worker"""
+    core = CacheCore(memory_budget_bytes=10 ** 6)
+    bus = CacheInvalidationBus(core, FakeRedis(broker), coalesce_window=0.001)
+    core.bus = bus
+    namespace = core.namespace("sessions", broadcast=True)
+    return core, bus, namespace
+
+
+@pytest.fixture
+def broker():
+    return FakeBroker()
+
+
+class TestKeyInvalidation:
+    """键失效测试"""
+
+    @pytest.mark.asyncio
+    async def test_write_drops_remote_copy(self, broker):
+        """测试一个worker写入后其他worker的本地副本失效"""
+        _, bus_a, sessions_a = make_worker(broker)
+        _, bus_b, sessions_b = make_worker(broker)
+
+        await sessions_b.set("s:1", "old")
+        await bus_b.flush()
+        await sessions_a.set("s:1", "new")
+        await bus_a.flush()
+
+        assert bus_b.apply_message(broker.published[-1])
+        assert await sessions_b.get("s:1") is None
+        assert await sessions_a.get("s:1") == "new"
+
+    @pytest.mark.asyncio
+    async def test_stale_message_keeps_newer_local_write(self, broker):
+        """测试晚到的旧失效消息不会删除更新的本地写入"""
+        _, bus_a, sessions_a = make_worker(broker)
+        _, bus_b, sessions_b = make_worker(broker)
+
+        await sessions_a.set("s:1", "v1")
+        await bus_a.flush()
+        message = broker.published[-1]
+
+        await sessions_b.set("s:1", "v2")
+        bus_b.apply_message(message)
+
+        assert await sessions_b.get("s:1") == "v2"
+
+    @pytest.mark.asyncio
+    async def test_own_messages_ignored(self, broker):
+        """测试忽略自身发出的消息"""
+        _, bus, sessions = make_worker(broker)
+        await sessions.set("k", 1)
+        await bus.flush()
+
+        assert not bus.apply_message(broker.published[-1])
+        assert await sessions.get("k") == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidations_are_coalesced(self, broker):
+        """测试合并窗口内的失效只发布一条消息"""
+        _, bus, sessions = make_worker(broker)
+        for i in range(20):
+            await sessions.set(f"k:{i}", i)
+        await asyncio.sleep(0.01)
+
+        assert len(broker.published) == 1
+        assert bus.stats["published_keys"] == 20
+
+
+class TestTagGenerations:
+    """标签代数测试"""
+
+    @pytest.mark.asyncio
+    async def test_tag_invalidation_propagates(self, broker):
+        """测试标签失效通过代数同步到其他worker"""
+        core_a, bus_a, _ = make_worker(broker)
+        core_b, bus_b, sessions_b = make_worker(broker)
+
+        await sessions_b.set("u:1", "user", tags=["org:1"])
+        await sessions_b.set("u:2", "other", tags=["org:2"])
+        await bus_b.flush()
+
+        await core_a.invalidate_tag("org:1")
+        await bus_a.flush()
+        bus_b.apply_message(broker.published[-1])
+
+        assert core_b.generations.current("org:1") == 1
+        assert await sessions_b.get("u:1") is None
+        assert await sessions_b.get("u:2") == "other"
+
+
+class TestResync:
+    """重连恢复测试"""
+
+    @pytest.mark.asyncio
+    async def test_resync_after_missed_messages(self, broker):
+        """测试重连后发现错过消息时清空本地层并恢复代数"""
+        core_a, bus_a, sessions_a = make_worker(broker)
+        core_b, bus_b, sessions_b = make_worker(broker)
+
+        await sessions_b.set("k", "cached", tags=["t"])
+        await bus_b.flush()
+
+        # B断开期间A发布的失效均未送达
+        await sessions_a.set("k", "fresh")
+        await core_a.invalidate_tag("t")
+        await bus_a.flush()
+
+        await bus_b.resync()
+
+        assert bus_b.stats["full_clears"] == 1
+        assert core_b.generations.current("t") == 1
+        assert await sessions_b.get("k") is None
+
+    @pytest.mark.asyncio
+    async def test_listener_applies_published_messages(self, broker):
+        """测试订阅任务接收并应用消息"""
+        core_a, bus_a, sessions_a = make_worker(broker)
+        core_b, bus_b, sessions_b = make_worker(broker)
+        await bus_b.start()
+        await asyncio.sleep(0.01)
+
+        await sessions_b.set("k", "old")
+        await sessions_a.set("k", "new")
+        await bus_a.flush()
+        await asyncio.sleep(0.01)
+
+        assert await sessions_b.get("k") is None
+        assert bus_b.stats["received_messages"] == 1
+        await bus_b.stop()
+        assert core_b.bus is None
+
+
+class TestPublishFailure:
+    """发布失败测试"""
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_is_retried(self, broker):
+        """测试发布失败的失效重新排队并在恢复后重试发布"""
+        core_a, bus_a, sessions_a = make_worker(broker)
+        _, bus_b, sessions_b = make_worker(broker)
+        bus_a.reconnect_delay = 0.01
+
+        await sessions_b.set("s:1", "old")
+        broker.down = True
+        await sessions_a.set("s:1", "new")
+        await core_a.invalidate_tag("t")
+        assert await bus_a.flush() == 0
+        assert bus_a.get_stats()["pending"] == 2
+
+        broker.down = False
+        await asyncio.sleep(0.05)
+
+        assert bus_a.stats["published_messages"] == 1
+        assert bus_a.get_stats()["pending"] == 0
+        bus_b.apply_message(broker.published[-1])
+        assert await sessions_b.get("s:1") is None
+
+    @pytest.mark.asyncio
+    async def test_overflow_requests_full_clear(self, broker):
+        """测试积压超过上限时丢弃键失效，恢复后要求其他worker清空本地层"""
+        _, bus_a, sessions_a = make_worker(broker)
+        _, bus_b, sessions_b = make_worker(broker)
+        bus_a.max_pending = 3
+        bus_a.reconnect_delay = 60
+
+        await sessions_b.set("k:0", "cached")
+        broker.down = True
+        for i in range(5):
+            await sessions_a.set(f"k:{i}", i)
+        await bus_a.flush()
+        assert bus_a.get_stats()["pending_clear"]
+
+        broker.down = False
+        await bus_a.flush()
+        bus_b.apply_message(broker.published[-1])
+
+        assert bus_b.stats["full_clears"] == 1
+        assert await sessions_b.get("k:0") is None
+
+
+class TestCrossWorkerTiers:
+    """内存层+Redis层跨worker测试"""
+
+    @pytest.mark.asyncio
+    async def test_tag_invalidation_evicts_backfilled_copy(self):
+        """测试从Redis回填到本地的副本也会被其他worker的标签失效清除"""
+        server = fakeredis.FakeServer()
+        workers = []
+        for _ in range(2):
+            client = fakeredis.aioredis.FakeRedis(server=server)
+            core = CacheCore(memory_budget_bytes=10 ** 6)
+            bus = CacheInvalidationBus(core, client, coalesce_window=0.001)
+            namespace = core.namespace(
+                "users", tiers=[core.memory_tier(), RedisTier(client, key_prefix="users:")], broadcast=True
+            )
+            await bus.start()
+            workers.append((core, bus, namespace))
+        (core_a, bus_a, users_a), (core_b, bus_b, users_b) = workers
+        await asyncio.sleep(0.05)
+
+        await users_a.set("u:1", "user", tags=["org:1"])
+        await bus_a.flush()
+        assert await users_b.get("u:1") == "user"
+        assert users_b.tiers[0].get_local("u:1") == "user"
+
+        await core_a.invalidate_tag("org:1")
+        await bus_a.flush()
+        await asyncio.sleep(0.05)
+
+        assert await users_b.get("u:1") is None
+        for _, bus, _ in workers:
+            await bus.stop()
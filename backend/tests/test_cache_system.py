@@ -4,6 +4,7 @@
 """
 
 import pytest
+import pytest_asyncio
 import asyncio
 import time
 import json
@@ -126,7 +127,7 @@ class TestCacheEntry:
 class TestMemoryCache:
     """内存缓存测试"""
 
-    @pytest.fixture
+    @pytest_asyncio.fixture
     async def memory_cache(self):
         """创建内存缓存实例"""
         cache = MemoryCache(max_size=5, default_ttl=1)
@@ -222,7 +223,7 @@ class TestMemoryCache:
 class TestMultiLevelCacheManager:
     """多级缓存管理器测试"""
 
-    @pytest.fixture
+    @pytest_asyncio.fixture
     async def mock_cache_manager(self):
         """创建模拟的多级缓存管理器"""
         config = CacheConfig(
@@ -376,7 +377,7 @@ class TestAPICacheMiddleware:
 class TestCacheWarmupManager:
     """缓存预热管理器测试"""
 
-    @pytest.fixture
+    @pytest_asyncio.fixture
     async def warmup_manager(self):
         """创建预热管理器"""
         manager = CacheWarmupManager()
@@ -447,6 +448,108 @@ class TestCacheWarmupManager:
         assert score > 0
         assert isinstance(score, float)
 
+    def test_access_time_model_predicts_daily_peak(self):
+        """测试时间模型预测每日高峰"""
+        from backend.core.cache.cache_warmup import AccessTimeModel, DAY_SECONDS, HOUR_SECONDS
+
+        model = AccessTimeModel()
+        base = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+        for day in range(3):
+            for minute in range(0, 60, 6):
+                model.observe("report", base + day * DAY_SECONDS + 9 * HOUR_SECONDS + minute * 60)
+
+        peak = base + 3 * DAY_SECONDS + 9 * HOUR_SECONDS
+        assert model.predict("report", peak, HOUR_SECONDS) == pytest.approx(10.0)
+        assert model.predict("report", peak + 3 * HOUR_SECONDS, HOUR_SECONDS) == 0
+        assert model.peak_hours("report") == [9]
+
+    def test_predictive_plan_respects_budget(self):
+        """测试预测性预热在预算内按收益选取"""
+        from backend.core.cache.cache_warmup import WarmupBudget
+
+        manager = CacheWarmupManager()
+        manager.budget = WarmupBudget(max_calls=2, max_generation_seconds=10)
+        now = time.mktime((2024, 1, 1, 12, 0, 0, 0, 0, -1))
+        # 前一天同一小时的访问量：hot > warm > cool
+        for key, count in (("hot", 60), ("warm", 40), ("cool", 30)):
+            for i in range(count):
+                manager.observe_access(key, generation_time=0.1, timestamp=now - 86400 + i * 10)
+
+        tasks = manager.plan_predictive_warmup(now)
+
+        assert [task.key for task in tasks] == ["hot", "warm"]
+        assert manager.budget.rejections == 1
+        assert all(task.strategy == WarmupStrategy.PREDICTIVE for task in tasks)
+
+    @pytest.mark.asyncio
+    async def test_cache_manager_accesses_drive_warmup(self, monkeypatch):
+        """测试CacheManager.get的命中/未命中记入预热模型，预热写回该命名空间并归因命中"""
+        from backend.core.cache import cache_manager
+        from backend.core.cache_core import CacheCore
+
+        core = CacheCore(memory_budget_bytes=10 ** 6)
+        monkeypatch.setattr(cache_manager, "get_cache_core", lambda: core)
+        api_cache = cache_manager.CacheManager()
+        manager = CacheWarmupManager()
+        manager.attach(core)
+
+        assert await api_cache.get("models:list") is None
+        assert manager.access_history["models:list"][-1]["hit"] is False
+        assert manager.access_patterns["models:list"].access_count == 1
+        assert sum(manager.access_model._hourly["models:list"]) == 1
+
+        task = WarmupTask(
+            id="predictive_models", key="models:list",
+            data_generator=AsyncMock(return_value=["gpt-4o"]),
+            priority=WarmupPriority.HIGH, strategy=WarmupStrategy.PREDICTIVE, ttl=60
+        )
+        await manager._warmup_worker(task)
+
+        assert await api_cache.get("models:list") == ["gpt-4o"]
+        assert manager.access_history["models:list"][-1]["hit"] is True
+        assert manager.usefulness.active["models:list"].hits == 1
+
+        manager.detach()
+        await api_cache.get("models:list")
+        assert manager.access_patterns["models:list"].access_count == 2
+
+    def test_usefulness_suppresses_wasted_warmups(self):
+        """测试长期无命中的预热键被抑制"""
+        from backend.core.cache.cache_warmup import WarmupUsefulnessTracker
+
+        tracker = WarmupUsefulnessTracker(alpha=0.5)
+        for round_index in range(4):
+            tracker.record_warmup("idle", round_index * 100, ttl=50)
+        tracker.record_warmup("busy", 0, ttl=50)
+        tracker.record_access("busy", hit=True, now=10)
+        tracker.expire(1000)
+
+        assert tracker.score("idle") < 0.2
+        assert tracker.score("busy") == 1.0
+        assert tracker.get_stats()["warmed_key_hits"] == 1
+
+    def test_simulator_reports_hit_rate_gain(self):
+        """测试离线回放报告预热带来的命中率提升"""
+        from backend.core.cache.cache_warmup import AccessLogRecord, WarmupSimulator, DAY_SECONDS
+
+        base = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+        records = []
+        for day in range(5):
+            for slot in range(12):
+                # 每天9点起每200秒访问一次，间隔大于缓存TTL
+                records.append(AccessLogRecord(
+                    timestamp=base + day * DAY_SECONDS + 9 * 3600 + slot * 200,
+                    key="dashboard",
+                    generation_time=0.2
+                ))
+
+        report = WarmupSimulator(records, cache_ttl=120).run()
+
+        assert report["events"] == 60
+        assert report["baseline_hit_rate"] == 0
+        assert report["hit_rate_gain"] > 0
+        assert report["useful_warmups"] > 0
+
 
 class TestCacheMonitoringSystem:
     """缓存监控系统测试"""
@@ -0,0 +1,125 @@
+"""
+数据库引擎注册表与请求级会话测试
+测试共享引擎、连接池扩缩容、请求内会话复用和会话中间件
+"""
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+
+from backend.core import database
+from backend.core.database import (
+    DB_POOL_CHECKOUT_WAIT, EngineRegistry, InstrumentedAsyncQueuePool, InstrumentedQueuePool,
+    get_db, get_request_session, request_db, request_session_scope
+)
+from backend.middleware.db_session import DatabaseSessionMiddleware
+from backend.optimization.connection_pool import recommend_pool_size
+
+
+@pytest_asyncio.fixture
+async def registry(tmp_path, monkeypatch):
+    registry = EngineRegistry()
+    monkeypatch.setattr(database, "engine_registry", registry)
+    monkeypatch.setattr(database.settings, "database_url", f"sqlite:///{tmp_path / 'app.db'}")
+    yield registry
+    await registry.dispose_all()
+
+
+async def drain(generator):
+    try:
+        await generator.__anext__()
+    except StopAsyncIteration:
+        pass
+
+
+class TestEngineRegistry:
+    """引擎注册表测试"""
+
+    def test_one_engine_per_url(self, registry, tmp_path):
+        """测试同一URL复用引擎，同步和异步引擎各一个"""
+        url = f"sqlite:///{tmp_path / 'other.db'}"
+        engine = registry.get_async_engine(url, pool_size=3)
+
+        assert registry.get_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://")) is engine
+        assert isinstance(engine.sync_engine.pool, InstrumentedAsyncQueuePool)
+        assert isinstance(registry.get_sync_engine(url).pool, InstrumentedQueuePool)
+        assert registry.get_async_session_factory(url) is registry.get_async_session_factory(url)
+        assert engine.sync_engine.pool.size() == 3
+
+    @pytest.mark.asyncio
+    async def test_resize_keeps_engine(self, registry):
+        """测试扩缩容替换连接池而不替换引擎，借出的连接归还后关闭"""
+        engine = database.get_async_engine()
+        async with engine.connect() as conn:
+            old_pool = engine.sync_engine.pool
+            assert await registry.resize(database.settings.database_url, 4, 1)
+            await conn.execute(text("SELECT 1"))
+        assert old_pool.checkedin() == 0
+
+        assert database.get_async_engine() is engine
+        assert engine.sync_engine.pool.size() == 4
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        assert not await registry.resize(database.settings.database_url, 4, 1)
+
+        status = next(iter(registry.pool_status().values()))
+        assert status["pool_size"] == 4 and status["max_overflow"] == 1 and status["checked_in"] == 1
+        assert sum(DB_POOL_CHECKOUT_WAIT.collect()[("default-async",)][:-1]) >= 2
+
+    @pytest.mark.parametrize("current, utilization, expected", [
+        (20, 0.9, 25), (48, 0.9, 50), (30, 0.1, 28), (21, 0.1, 20), (20, 0.1, 20), (30, 0.5, 30),
+    ])
+    def test_recommend_pool_size(self, current, utilization, expected):
+        assert recommend_pool_size(current, utilization, min_size=20, max_size=50) == expected
+
+
+class TestRequestSessions:
+    """请求级会话测试"""
+
+    @pytest.mark.asyncio
+    async def test_sessions_shared_within_scope(self, registry):
+        """测试作用域内同步和异步会话各只创建一次，作用域结束时关闭"""
+        async with request_session_scope() as sessions:
+            with request_db() as first:
+                first.execute(text("SELECT 1"))
+            with request_db() as second:
+                assert second is first
+            assert get_request_session() is first
+
+            dependency = get_db()
+            session = await dependency.__anext__()
+            await session.execute(text("SELECT 1"))
+            other = get_db()
+            assert await other.__anext__() is session
+            await drain(dependency)
+            await drain(other)
+
+            assert sessions.opened == 2
+        assert sessions.opened == 0
+
+        pool = database.get_sync_engine().pool
+        assert pool.checkedout() == 0
+
+    @pytest.mark.asyncio
+    async def test_sessions_outside_scope_are_closed(self, registry):
+        with request_db() as first:
+            first.execute(text("SELECT 1"))
+        with request_db() as second:
+            assert second is not first
+        assert database.get_sync_engine().pool.checkedout() == 0
+
+    @pytest.mark.asyncio
+    async def test_middleware_scopes_http_requests(self, registry):
+        """测试中间件为每个HTTP请求建立独立作用域"""
+        seen = []
+
+        async def app(scope, receive, send):
+            with request_db() as first, request_db() as second:
+                seen.append((first, second))
+
+        middleware = DatabaseSessionMiddleware(app)
+        for _ in range(2):
+            await middleware({"type": "http", "method": "GET", "path": "/items"}, None, None)
+
+        (a1, a2), (b1, b2) = seen
+        assert a1 is a2 and b1 is b2 and a1 is not b1
@@ -0,0 +1,147 @@
+"""
+分布式追踪测试
+测试上下文传播、尾部采样、有界缓冲区和OTLP/JSON批量导出
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from backend.monitoring.distributed_tracing import (
+    DistributedTracingManager, SpanBuffer, SpanKind, SpanStatus, benchmark_tracing_overhead,
+    format_trace_id
+)
+
+
+@pytest.fixture
+def manager():
+    # 采样率为0：只有慢请求和错误Trace被保留
+    return DistributedTracingManager(sample_rate=0.0, slow_threshold_ms=50)
+
+
+class TestContextPropagation:
+    """上下文传播测试"""
+
+    @pytest.mark.asyncio
+    async def test_nested_spans_share_trace(self):
+        """测试嵌套Span继承trace_id与父Span"""
+        manager = DistributedTracingManager(sample_rate=1.0)
+        async with manager.trace_span("request", kind=SpanKind.SERVER) as root:
+            async with manager.trace_span("db.query") as child:
+                assert child.trace_id == root.trace_id
+                assert child.parent_span_id == root.span_id
+
+        trace = manager.collector.get_trace(format_trace_id(root.trace_id))
+        assert trace.span_count == 2
+        assert trace.to_dict()["spans"][0]["trace_id"] == format_trace_id(root.trace_id)
+
+    @pytest.mark.asyncio
+    async def test_context_isolated_between_tasks(self):
+        """测试并发任务之间的追踪上下文互不干扰"""
+        manager = DistributedTracingManager(sample_rate=1.0)
+
+        async def request(name):
+            async with manager.trace_span(name) as root:
+                await asyncio.sleep(0.001)
+                async with manager.trace_span(f"{name}.child") as child:
+                    return root.trace_id, child.trace_id
+
+        results = await asyncio.gather(*(request(f"r{i}") for i in range(5)))
+
+        assert all(root == child for root, child in results)
+        assert len({root for root, _ in results}) == 5
+
+    def test_headers_roundtrip(self):
+        """测试追踪头注入与提取"""
+        manager = DistributedTracingManager(sample_rate=1.0)
+        with manager.trace_span("outgoing") as span:
+            headers = manager.inject_headers({})
+
+        context = manager.extract_headers(headers)
+        assert context.trace_id == span.trace_id
+        assert context.span_id == span.span_id
+        assert manager.extract_headers({"X-Trace-Id": "not-hex", "X-Parent-Span-Id": "1"}) is None
+
+
+class TestTailSampling:
+    """尾部采样测试"""
+
+    @pytest.mark.asyncio
+    async def test_keeps_error_and_slow_traces(self, manager):
+        """测试错误和慢Trace全部保留，普通Trace按采样率丢弃"""
+        for _ in range(20):
+            async with manager.trace_span("fast"):
+                pass
+
+        with pytest.raises(RuntimeError):
+            async with manager.trace_span("failing"):
+                async with manager.trace_span("child"):
+                    raise RuntimeError("boom")
+
+        async with manager.trace_span("slow"):
+            await asyncio.sleep(0.06)
+
+        stats = manager.tail_sampler.stats
+        assert stats["dropped"] == 20
+        assert stats["kept_error"] == 1
+        assert stats["kept_slow"] == 1
+
+        errors = manager.collector.search_traces(status=SpanStatus.ERROR)
+        assert len(errors) == 1 and errors[0].span_count == 2
+        assert errors[0].spans[0].attributes["error.message"] == "boom"
+
+    def test_pending_traces_bounded(self, manager):
+        """测试未结束的Trace数量有上限并可过期清理"""
+        manager.tail_sampler.max_pending_traces = 3
+        tracer = manager.get_tracer("svc")
+        for _ in range(5):
+            root = tracer.start_span("root")
+            tracer.finish_span(tracer.start_span("child", parent_span=root))
+
+        assert len(manager.tail_sampler.pending) == 3
+        assert manager.tail_sampler.expire(now=2 ** 62) == 3
+
+
+class TestExport:
+    """批量导出测试"""
+
+    def test_buffer_drops_oldest_when_full(self, manager):
+        """测试缓冲区满时覆盖最旧Span并计数"""
+        tracer = manager.get_tracer("svc")
+        spans = [tracer.start_span(f"s{i}") for i in range(5)]
+        buffer = SpanBuffer(capacity=3)
+        buffer.extend(spans)
+
+        assert buffer.dropped == 2
+        assert [span.operation_name for span in buffer.drain(10)] == ["s2", "s3", "s4"]
+
+    @pytest.mark.asyncio
+    async def test_otlp_json_file_export(self, tmp_path):
+        """测试保留的Trace以OTLP/JSON批量写入文件"""
+        path = tmp_path / "traces.jsonl"
+        manager = DistributedTracingManager(sample_rate=1.0, export_path=str(path))
+
+        async with manager.trace_span("chat", kind=SpanKind.SERVER, attributes={"model": "gpt", "tokens": 12}):
+            async with manager.trace_span("llm.call", kind=SpanKind.CLIENT):
+                pass
+        await manager.shutdown()
+
+        batches = [json.loads(line) for line in path.read_text().splitlines()]
+        assert len(batches) == 1
+        resource_spans = batches[0]["resourceSpans"][0]
+        spans = resource_spans["scopeSpans"][0]["spans"]
+        assert {span["name"] for span in spans} == {"chat", "llm.call"}
+
+        root = next(span for span in spans if span["name"] == "chat")
+        assert root["kind"] == 2 and len(root["traceId"]) == 32
+        assert {"key": "tokens", "value": {"intValue": "12"}} in root["attributes"]
+        assert int(root["endTimeUnixNano"]) >= int(root["startTimeUnixNano"])
+        assert manager.get_pipeline_stats()["exported_spans"] == 2
+
+    def test_benchmark_reports_overhead(self):
+        """测试开销基准输出"""
+        result = benchmark_tracing_overhead(iterations=50)
+
+        assert result["handler_us"] > 0
+        assert "overhead_percent" in result
@@ -0,0 +1,190 @@
+"""
+索引顾问测试
+测试语句访问方式提取、工作负载采集、代价模型评估和SQLite回放评估
+"""
+
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Column, DateTime, Index, Integer, String, create_engine, select, update
+from sqlalchemy.orm import Session, declarative_base
+from datetime import datetime, timedelta
+
+from backend.optimization.index_advisor import (
+    CostModelEvaluator, HypotheticalIndexEvaluator, IndexAdvisor, SQLiteReplayEvaluator, Workload, extract_table_accesses, load_sqlite_indexes,
+    load_sqlite_statistics
+)
+from backend.optimization.query_instrumentation import remove_workload_listener, track_queries
+from backend.optimization.query_optimizer import QueryOptimizer
+
+Base = declarative_base()
+
+
+class UsageRecord(Base):
+    __tablename__ = "usage_records"
+    id = Column(Integer, primary_key=True)
+    organization_id = Column(Integer)
+    model_name = Column(String)
+    status = Column(String)
+    created_at = Column(DateTime)
+    __table_args__ = (Index("idx_usage_records_status", "status"),)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'workload.db'}")
+    Base.metadata.create_all(engine)
+    start = datetime(2026, 1, 1)
+    with Session(engine) as session:
+        session.add_all(
+            UsageRecord(id=i, organization_id=i % 200, model_name=f"model-{i % 5}", status="ok",
+                        created_at=start + timedelta(minutes=i))
+            for i in range(1, 4001)
+        )
+        session.commit()
+    yield engine
+    engine.dispose()
+
+
+class Postgres15:
+    """模拟PostgreSQL 15 + hypopg：不支持GENERIC_PLAN，organization_id上有（假设）索引时代价下降"""
+
+    def __init__(self):
+        self.hypothetical = []
+        self.explained = []
+
+    def begin_nested(self):
+        return nullcontext()
+
+    def exec_driver_sql(self, sql, parameters=()):
+        rows = []
+        if sql.startswith("SHOW server_version_num"):
+            rows = [("150004",)]
+        elif "hypopg_create_index" in sql:
+            self.hypothetical.append(parameters[0])
+        elif "hypopg_reset" in sql:
+            self.hypothetical.clear()
+        elif sql.startswith("EXPLAIN"):
+            if "GENERIC_PLAN" in sql:
+                raise RuntimeError('unrecognized EXPLAIN option "generic_plan"')
+            if "$1" in sql:
+                raise RuntimeError("there is no parameter $1")
+            self.explained.append((sql, parameters))
+            indexed = any("organization_id" in create for create in self.hypothetical)
+            rows = [([{"Plan": {"Total Cost": 8.0 if indexed else 400.0}}],)]
+        return SimpleNamespace(fetchall=lambda: rows)
+
+
+def run_workload(session: Session):
+    since = datetime(2026, 1, 2)
+    for org_id in range(20):
+        session.execute(
+            select(UsageRecord).where(UsageRecord.organization_id == org_id, UsageRecord.created_at > since)
+            .order_by(UsageRecord.created_at)
+        ).all()
+    for record_id in range(1, 6):
+        session.execute(update(UsageRecord).where(UsageRecord.id == record_id).values(status="done"))
+    session.rollback()
+
+
+class TestStatementParsing:
+    """语句访问方式提取测试"""
+
+    def test_predicates_joins_and_order(self):
+        accesses = extract_table_accesses(
+            "SELECT t.id FROM teams t JOIN team_members m ON m.team_id = t.id "
+            "WHERE m.user_id = $1 AND t.created_at >= $2 ORDER BY t.created_at"
+        )
+        assert accesses["team_members"].equality == ["user_id"]
+        assert accesses["team_members"].joins == ["team_id"]
+        assert accesses["teams"].ranges == ["created_at"] and accesses["teams"].order_by == ["created_at"]
+
+    def test_writes_and_unindexable_predicates(self):
+        insert = extract_table_accesses("INSERT INTO usage_records (id, status) VALUES (?, ?)")["usage_records"]
+        assert insert.write and not insert.read
+        access = extract_table_accesses(
+            "DELETE FROM sessions WHERE token LIKE '%abc' AND expires_at < ?"
+        )["sessions"]
+        assert access.write and access.ranges == ["expires_at"]
+
+
+class TestIndexAdvisor:
+    """索引建议测试"""
+
+    def test_captured_workload_recommends_composite_index(self, engine):
+        """测试请求作用域的语句被记入工作负载，并推荐等值列在前、范围列在后的复合索引"""
+        with Session(engine) as session:
+            optimizer = QueryOptimizer(session, engine)
+            optimizer.enable_workload_capture()
+            try:
+                with track_queries("GET /usage"):
+                    run_workload(session)
+            finally:
+                remove_workload_listener(optimizer.record_workload)
+
+            assert optimizer.performance_stats["total_queries"] >= 25
+            advice = optimizer.advise_indexes_sync()
+
+        create = [a for a in advice if a["action"] == "create"]
+        assert create[0]["table"] == "usage_records"
+        assert create[0]["columns"] == ["organization_id", "created_at"]
+        assert create[0]["projected_savings_ms"] > 0
+        drop = [a for a in advice if a["action"] == "drop"]
+        assert [a["name"] for a in drop] == ["idx_usage_records_status"]
+
+    def test_sqlite_replay_evaluator(self, engine):
+        """测试在SQLite副本上回放工作负载评估候选索引，回放不修改副本"""
+        workload = Workload()
+        for org_id in range(5):
+            workload.record(
+                "SELECT id FROM usage_records WHERE organization_id = ? AND model_name = ?", 2.0,
+                parameters=(org_id, "model-1")
+            )
+        workload.record("SELECT id FROM usage_records WHERE created_at > now()", 1.0)  # SQLite不支持，跳过
+
+        evaluator = SQLiteReplayEvaluator(engine.url.database)
+        statistics = evaluator.statistics()
+        existing = evaluator.existing_indexes(["usage_records"])
+        advice = IndexAdvisor(workload.entries(), statistics, existing, evaluator).recommend(max_create=1)
+
+        create = [a for a in advice if a.action == "create"]
+        assert len(create) == 1 and create[0].columns[0] == "organization_id"
+        assert create[0].improvement_percent > 50
+        assert len(evaluator.failed) == 1
+        with engine.connect() as conn:
+            indexes = {index.index_name for index in load_sqlite_indexes(conn, ["usage_records"])}
+            assert indexes == {"usage_records_rowid", "idx_usage_records_status"}
+
+    def test_statistics_and_covered_candidates(self, engine):
+        with engine.connect() as conn:
+            statistics = load_sqlite_statistics(conn, ["usage_records"])
+            existing = load_sqlite_indexes(conn, ["usage_records"])
+        stats = statistics["usage_records"]
+        assert stats.row_count == 4000 and stats.eq_selectivity("organization_id") == pytest.approx(1 / 200)
+
+        workload = Workload()
+        workload.record("SELECT * FROM usage_records WHERE status = ?", 5.0)
+        workload.record("SELECT * FROM usage_records WHERE missing_column = ?", 5.0)
+        assert IndexAdvisor(workload.entries(), statistics, existing).candidates() == []
+
+    def test_hypothetical_explain_without_generic_plan(self, engine):
+        """测试PostgreSQL 16以下代入采集的参数EXPLAIN，没有参数的语句改用代价模型"""
+        with engine.connect() as conn:
+            statistics = load_sqlite_statistics(conn, ["usage_records"])
+        workload = Workload()
+        workload.record("SELECT id FROM usage_records WHERE organization_id = %(org)s", 5.0, parameters={"org": 3})
+        workload.record("SELECT id FROM usage_records WHERE organization_id = $1 AND status = $1", 5.0,
+                        parameters=(4,))
+        workload.record("SELECT id FROM usage_records WHERE model_name = %s", 5.0)
+
+        connection = Postgres15()
+        evaluator = HypotheticalIndexEvaluator(connection, fallback=CostModelEvaluator(statistics))
+        advice = IndexAdvisor(workload.entries(), statistics, [], evaluator).recommend(max_create=2)
+
+        assert [a.columns[0] for a in advice] == ["organization_id", "model_name"]
+        assert ("EXPLAIN (FORMAT JSON) SELECT id FROM usage_records WHERE organization_id = %s AND status = %s",
+                (4, 4)) in connection.explained
+        assert [entry.sample for entry in workload.entries() if entry.fingerprint in evaluator.failed] == [
+            "SELECT id FROM usage_records WHERE model_name = %s"
+        ]
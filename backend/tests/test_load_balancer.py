@@ -0,0 +1,201 @@
+"""
+负载均衡器测试
+测试平滑加权轮询、一致性哈希环和二选一策略的后端选择，以及重试、对冲请求和会话亲和性
+"""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+import pytest_asyncio
+
+from backend.core.ha.load_balancer import (
+    BackendResponseError, BackendServer, BackendStatus, LoadBalancer, LoadBalancingConfig,
+    LoadBalancingStrategy, RetryBudget, SessionAffinityTable
+)
+
+
+@pytest.fixture
+def config():
+    """负载均衡配置"""
+    return LoadBalancingConfig(
+        strategy=LoadBalancingStrategy.ROUND_ROBIN,
+        health_check_interval=5,
+        health_check_timeout=2,
+        max_retries=2,
+        retry_delay=0.1
+    )
+
+
+@pytest.fixture
+def backends():
+    """测试后端服务器"""
+    return [
+        BackendServer(id=f"backend-{i}", host="localhost", port=8000 + i, weight=i, max_connections=10)
+        for i in range(1, 4)
+    ]
+
+
+@pytest_asyncio.fixture
+async def load_balancer(config, backends):
+    """初始化负载均衡器"""
+    lb = LoadBalancer(config)
+    for backend in backends:
+        lb.add_backend(backend)
+    yield lb
+    await lb.close()
+
+
+class TestBackendSelection:
+    """后端选择策略测试"""
+
+    @pytest.mark.asyncio
+    async def test_smooth_weighted_round_robin_sequence(self, load_balancer):
+        """测试平滑加权轮询按权重交错分配"""
+        load_balancer.config.strategy = LoadBalancingStrategy.WEIGHTED_ROUND_ROBIN
+
+        sequence = [(await load_balancer.select_backend()).id for _ in range(6)]
+
+        assert sequence == ["backend-3", "backend-2", "backend-1", "backend-3", "backend-2", "backend-3"]
+
+    @pytest.mark.asyncio
+    async def test_consistent_hash_remaps_few_keys(self, load_balancer):
+        """测试增删后端时一致性哈希只迁移少量会话"""
+        load_balancer.config.strategy = LoadBalancingStrategy.CONSISTENT_HASH
+        sessions = [f"session-{i}" for i in range(2000)]
+
+        async def assignment():
+            return {s: (await load_balancer.select_backend({"session_id": s})).id for s in sessions}
+
+        before = await assignment()
+        load_balancer.add_backend(BackendServer(id="backend-4", host="localhost", port=8004, weight=2))
+        after = await assignment()
+
+        moved = [s for s in sessions if before[s] != after[s]]
+        assert all(after[s] == "backend-4" for s in moved)
+        assert 0.1 < len(moved) / len(sessions) < 0.4
+
+        # 后端不健康时只有它的会话迁移
+        load_balancer.backends["backend-1"].status = BackendStatus.UNHEALTHY
+        degraded = await assignment()
+        assert all(degraded[s] == after[s] for s in sessions if after[s] != "backend-1")
+        assert "backend-1" not in degraded.values()
+
+    @pytest.mark.asyncio
+    async def test_power_of_two_prefers_less_loaded(self, load_balancer):
+        """测试二选一策略偏向延迟低、连接少的后端"""
+        load_balancer.config.strategy = LoadBalancingStrategy.POWER_OF_TWO_CHOICES
+        for backend, latency in zip(load_balancer.backends.values(), [0.5, 0.05, 0.5]):
+            backend.response_time = latency
+            backend.weight = 1
+
+        counts = {"backend-1": 0, "backend-2": 0, "backend-3": 0}
+        for _ in range(600):
+            counts[(await load_balancer.select_backend()).id] += 1
+
+        # backend-2 与任一其他后端配对时都会胜出：期望占 2/3
+        assert counts["backend-2"] > 350
+
+    @pytest.mark.asyncio
+    async def test_full_backend_skipped(self, load_balancer):
+        """测试连接已满的后端不被选中"""
+        load_balancer.config.strategy = LoadBalancingStrategy.CONSISTENT_HASH
+        context = {"session_id": "sticky"}
+        preferred = await load_balancer.select_backend(context)
+
+        preferred.current_connections = preferred.max_connections
+        fallback = await load_balancer.select_backend(context)
+
+        assert fallback.id != preferred.id
+        preferred.current_connections = 0
+        assert (await load_balancer.select_backend(context)).id == preferred.id
+
+
+class TestRequestRouting:
+    """请求重试、对冲和会话亲和性测试"""
+
+    @pytest.mark.asyncio
+    async def test_retry_goes_to_other_backend(self, load_balancer):
+        """测试5xx失败后换后端重试，4xx不重试"""
+        calls = []
+
+        async def fake_request(backend, method, url, headers=None, data=None, params=None):
+            calls.append(backend.id)
+            if backend.id == "backend-1":
+                raise BackendResponseError(503, "unavailable")
+            return {"status_code": 200, "backend_id": backend.id}
+
+        load_balancer._make_request_to_backend = fake_request
+        result = await load_balancer.make_request("GET", "/api")
+
+        assert calls[0] == "backend-1" and len(set(calls)) == len(calls) == 2
+        assert result["backend_id"] != "backend-1" and result["attempt"] == 2
+
+        async def client_error(backend, *args, **kwargs):
+            calls.append(backend.id)
+            raise BackendResponseError(404, "missing")
+
+        calls.clear()
+        load_balancer._make_request_to_backend = client_error
+        with pytest.raises(BackendResponseError):
+            await load_balancer.make_request("GET", "/api")
+        assert len(calls) == 1
+
+    def test_retry_budget_limits_retries(self):
+        """测试重试预算按请求比例限制重试数"""
+        budget = RetryBudget(ratio=0.1, min_per_second=0, window=10)
+        for _ in range(100):
+            budget.record_request()
+
+        granted = sum(budget.try_withdraw() for _ in range(50))
+
+        assert granted == 10
+        assert budget.get_stats()["rejected"] == 40
+
+    @pytest.mark.asyncio
+    async def test_hedged_request_uses_faster_backend(self, load_balancer):
+        """测试幂等请求超过对冲延迟后由另一后端返回结果"""
+        load_balancer.config.hedge_requests = True
+        load_balancer._hedge_delay = 0.02
+
+        async def fake_request(backend, method, url, headers=None, data=None, params=None):
+            await asyncio.sleep(1 if backend.id == "backend-1" else 0.01)
+            return {"status_code": 200, "backend_id": backend.id}
+
+        load_balancer._make_request_to_backend = fake_request
+        start = time.perf_counter()
+        result = await load_balancer.make_request("GET", "/api")
+
+        assert time.perf_counter() - start < 0.5
+        assert result["backend_id"] != "backend-1"
+        assert load_balancer.hedged_requests == load_balancer.hedge_wins == 1
+
+        # 非幂等请求不对冲
+        load_balancer._hedge_delay = 0.001
+        load_balancer.current_index = 0
+        load_balancer._make_request_to_backend = AsyncMock(return_value={"backend_id": "backend-1"})
+        await load_balancer.make_request("POST", "/api")
+        assert load_balancer.hedged_requests == 1
+
+    @pytest.mark.asyncio
+    async def test_session_affinity_table_is_bounded(self):
+        """测试会话亲和性表按LRU淘汰、过期失效，并写穿Redis"""
+        redis_client = Mock()
+        redis_client.get.return_value = b"backend-9"
+        table = SessionAffinityTable(max_size=2, ttl=60, redis_client=redis_client)
+
+        await table.set("a", "backend-1")
+        await table.set("b", "backend-2")
+        assert await table.get("a") == "backend-1"
+        await table.set("c", "backend-3")
+        await table.set("c", "backend-3")
+
+        assert len(table) == 2 and "b" not in table
+        assert redis_client.setex.call_count == 3
+        # 本地淘汰后从Redis读取其他节点写入的绑定
+        assert await table.get("b") == "backend-9"
+
+        table.ttl = 0
+        await table.set("d", "backend-1")
+        assert table.purge_expired() == 1 and "d" not in table
@@ -0,0 +1,166 @@
+"""
+纯ASGI性能中间件测试
+测试整体压缩、大响应体线程池压缩、SSE流式增量压缩、错误处理和中间件开销基准
+"""
+
+import asyncio
+import json
+import threading
+import zlib
+
+import pytest
+from fastapi import HTTPException
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from backend.middleware.error_handler import ErrorHandlingMiddleware, PerformanceMiddleware
+from backend.middleware.performance_middleware import (
+    PerformanceOptimizationMiddleware, ResponseCompressor, StreamingCompressor,
+    benchmark_middleware_overhead
+)
+
+
+async def call(app, headers=None, path="/api/v1/test"):
+    """直接调用ASGI应用，返回发送的全部消息"""
+    messages = []
+    received = [{"type": "http.request", "body": b"", "more_body": False}]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "server": ("testserver", 80),
+        "client": ("127.0.0.1", 1234),
+        "headers": [(k.encode(), v.encode()) for k, v in (headers or {}).items()]
+    }
+
+    async def receive():
+        if received:
+            return received.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+def response_headers(messages):
+    return {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+
+
+class TestCompression:
+    """响应压缩测试"""
+
+    @pytest.mark.asyncio
+    async def test_full_body_gzip(self):
+        """测试完整响应体按Accept-Encoding压缩"""
+        payload = {"items": [{"id": i, "name": f"item-{i}"} for i in range(200)]}
+        middleware = PerformanceOptimizationMiddleware(JSONResponse(payload))
+
+        messages = await call(middleware, {"accept-encoding": "gzip, deflate"})
+        headers = response_headers(messages)
+
+        assert headers["content-encoding"] == "gzip"
+        assert headers["vary"] == "Accept-Encoding"
+        assert int(headers["content-length"]) == len(messages[1]["body"])
+        assert json.loads(zlib.decompress(messages[1]["body"], 31)) == payload
+
+        stats = middleware.get_performance_stats()
+        assert stats["compression_stats"]["compressed_requests"] == 1
+        assert middleware.recent_metrics[-1].compression_type == "gzip"
+
+    @pytest.mark.asyncio
+    async def test_small_and_unaccepted_passthrough(self):
+        """测试小响应和不支持压缩的客户端直接透传"""
+        small = PerformanceOptimizationMiddleware(JSONResponse({"ok": True}))
+        messages = await call(small, {"accept-encoding": "gzip"})
+        assert "content-encoding" not in response_headers(messages)
+
+        large = PerformanceOptimizationMiddleware(Response("x" * 5000, media_type="text/plain"))
+        messages = await call(large, {"accept-encoding": "identity, gzip;q=0"})
+        assert "content-encoding" not in response_headers(messages)
+        assert messages[1]["body"] == b"x" * 5000
+
+    @pytest.mark.asyncio
+    async def test_large_body_offloaded(self):
+        """测试大响应体在线程池中压缩"""
+        threads = []
+        compressor = ResponseCompressor(offload_threshold=16 * 1024)
+        original = compressor.compress_bytes
+
+        def tracking(data, encoding):
+            threads.append(threading.current_thread())
+            return original(data, encoding)
+
+        compressor.compress_bytes = tracking
+        middleware = PerformanceOptimizationMiddleware(Response("y" * 100000, media_type="text/plain"))
+        middleware.compressor = compressor
+
+        messages = await call(middleware, {"accept-encoding": "gzip"})
+
+        assert threads and threads[0] is not threading.main_thread()
+        assert compressor.compression_stats["offloaded_requests"] == 1
+        assert zlib.decompress(messages[1]["body"], 31) == b"y" * 100000
+
+    @pytest.mark.asyncio
+    async def test_sse_stream_compressed_incrementally(self):
+        """测试SSE流逐块压缩且每个分块都能立即解出"""
+        events = [f"data: {json.dumps({'delta': 'token ' * 50, 'n': i})}\n\n" for i in range(5)]
+
+        async def stream():
+            for event in events:
+                yield event
+
+        middleware = PerformanceOptimizationMiddleware(
+            StreamingResponse(stream(), media_type="text/event-stream")
+        )
+        messages = await call(middleware, {"accept-encoding": "gzip"})
+        headers = response_headers(messages)
+
+        assert headers["content-encoding"] == "gzip"
+        assert "content-length" not in headers
+
+        decompressor = zlib.decompressobj(31)
+        bodies = [m for m in messages[1:] if m["type"] == "http.response.body"]
+        for event, message in zip(events, bodies):
+            assert decompressor.decompress(message["body"]).decode() == event
+        assert bodies[-1]["more_body"] is False
+        assert middleware.compressor.compression_stats["streamed_requests"] == 1
+
+    def test_streaming_compressor_deflate(self):
+        """测试增量deflate与一次性解压兼容"""
+        compressor = StreamingCompressor("deflate")
+        data = compressor.compress(b"abc" * 100, flush=True) + compressor.compress(b"def" * 100)
+        data += compressor.finish()
+
+        assert zlib.decompress(data) == b"abc" * 100 + b"def" * 100
+
+
+class TestPureASGIMiddlewares:
+    """错误处理与性能监控中间件测试"""
+
+    @pytest.mark.asyncio
+    async def test_exceptions_converted(self):
+        """测试响应开始前的异常转换为错误响应"""
+        async def failing(scope, receive, send):
+            raise HTTPException(status_code=404, detail="missing")
+
+        messages = await call(ErrorHandlingMiddleware(PerformanceMiddleware(failing)))
+
+        assert messages[0]["status"] == 404
+        assert json.loads(messages[1]["body"])["message"] == "missing"
+
+    @pytest.mark.asyncio
+    async def test_timing_headers(self):
+        """测试添加处理时间和请求ID响应头"""
+        app = ErrorHandlingMiddleware(PerformanceMiddleware(JSONResponse({"ok": True})))
+        headers = response_headers(await call(app))
+
+        assert "x-process-time" in headers
+        assert "x-request-id" in headers
+
+    def test_benchmark_reports_stacks(self):
+        """测试中间件开销基准输出各中间件栈"""
+        results = benchmark_middleware_overhead(requests=20)
+
+        assert set(results) == {"bare", "base_http_middleware", "pure_asgi", "pure_asgi_gzip"}
+        assert all(value > 0 for value in results.values())
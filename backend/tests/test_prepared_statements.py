@@ -0,0 +1,122 @@
+"""
+预编译语句注册表测试
+测试具名语句复用、编译缓存命中统计、按接口的耗时报告和asyncpg预处理语句配置
+"""
+
+import pytest
+from sqlalchemy import Column, Integer, String, bindparam, create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from backend.core.database import EngineRegistry
+from backend.optimization.prepared_statements import (
+    BACKGROUND_ENDPOINT, StatementRegistry, install_statement_timing, prepared_statement_name
+)
+from backend.optimization.query_instrumentation import (
+    install_query_instrumentation, remove_workload_listener, track_queries
+)
+
+Base = declarative_base()
+
+
+class Member(Base):
+    __tablename__ = "members"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String)
+    organization_id = Column(String)
+    role = Column(String)
+
+
+@pytest.fixture
+def registry():
+    registry = StatementRegistry()
+    yield registry
+    remove_workload_listener(registry._flush_scope)
+
+
+@pytest.fixture
+def member_role(registry):
+    return registry.register(
+        "multi_tenant.member_role",
+        lambda: select(Member.role).where(
+            Member.user_id == bindparam("user_id"),
+            Member.organization_id == bindparam("organization_id")
+        )
+    )
+
+
+def seed(session):
+    session.add_all(Member(user_id=f"u{i}", organization_id="org", role="admin" if i == 0 else "member")
+                    for i in range(3))
+    session.commit()
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    install_query_instrumentation(engine)
+    install_statement_timing(engine)
+    with Session(engine) as session:
+        seed(session)
+        yield session
+    engine.dispose()
+
+
+class TestStatementRegistry:
+    """具名语句测试"""
+
+    def test_statement_built_once_and_reported_per_endpoint(self, registry, member_role, db):
+        """测试语句对象复用，首次编译后命中编译缓存，耗时按接口汇总"""
+        with track_queries("/organizations/org") as tracker:
+            roles = [member_role.execute(db, user_id=f"u{i}", organization_id="org").scalar_one_or_none()
+                     for i in range(3)]
+            statement = member_role.statement
+            # 中间件在请求结束时按路由模板重命名作用域
+            tracker.name = "GET /organizations/{organization_id}"
+
+        assert roles == ["admin", "member", "member"]
+        assert member_role.statement is statement
+
+        stats = registry.report()["endpoints"]["GET /organizations/{organization_id}"]["multi_tenant.member_role"]
+        assert stats["calls"] == 3
+        assert stats["compiled_cache_misses"] == 1 and stats["compiled_cache_hits"] == 2
+        assert stats["compile_ms"] is not None and stats["avg_execute_ms"] > 0
+        assert 0 < stats["python_share_percent"] < 100
+
+    def test_untracked_executions_reported_as_background(self, registry, member_role, db):
+        member_role.execute(db, user_id="u0", organization_id="org").all()
+        report = registry.report()
+        assert report["endpoints"][BACKGROUND_ENDPOINT]["multi_tenant.member_role"]["calls"] == 1
+        assert report["statements"]["multi_tenant.member_role"]["build_ms"] > 0
+
+        registry.reset()
+        assert registry.report()["endpoints"] == {}
+
+    @pytest.mark.asyncio
+    async def test_async_session(self, registry, member_role, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'members.db'}")
+        install_statement_timing(engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            await session.run_sync(seed)
+            result = await member_role.execute_async(session, user_id="u0", organization_id="org")
+            assert result.scalar_one_or_none() == "admin"
+        await engine.dispose()
+
+        assert registry.report()["statements"]["multi_tenant.member_role"]["calls"] == 1
+
+
+class TestPreparedStatementSettings:
+    """asyncpg预处理语句配置测试"""
+
+    def test_asyncpg_engine_kwargs(self):
+        kwargs = EngineRegistry()._engine_kwargs("postgresql+asyncpg://user@localhost/db", "default", True, {})
+        assert kwargs["connect_args"]["prepared_statement_cache_size"] > 0
+        assert kwargs["connect_args"]["prepared_statement_name_func"] is prepared_statement_name
+        assert kwargs["query_cache_size"] > 0
+
+        sync_kwargs = EngineRegistry()._engine_kwargs("postgresql://user@localhost/db", "default", False, {})
+        assert "connect_args" not in sync_kwargs
+        assert prepared_statement_name().startswith("__ahub_stmt_")
@@ -0,0 +1,118 @@
+"""
+健康探针缓存测试
+测试TTL缓存、并发请求合并、单探针超时、过期后后台刷新和存活检查
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from backend.health.probe_cache import ProbeCache, liveness
+
+
+class CountingProbe:
+    """记录调用次数的探针"""
+
+    def __init__(self, delay=0.0, value="ok"):
+        self.calls = 0
+        self.delay = delay
+        self.value = value
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"status": self.value, "call": self.calls}
+
+
+class TestProbeCache:
+    """探针缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_fresh_results_served_from_cache(self):
+        """测试TTL内重复请求不再探测，并发请求共享一次执行"""
+        probe = CountingProbe(delay=0.02)
+        cache = ProbeCache()
+        cache.register("db", probe, ttl=60)
+
+        results = await asyncio.gather(*(cache.get("db") for _ in range(50)))
+        for _ in range(100):
+            await cache.get("db")
+
+        assert probe.calls == 1
+        assert all(r["call"] == 1 for r in results)
+        assert cache.stats["hits"] == 100
+
+        assert (await cache.get("db", force=True))["call"] == 2
+
+    @pytest.mark.asyncio
+    async def test_probes_run_concurrently_with_timeouts(self):
+        """测试多探针并发执行，慢探针按自身超时返回失败结果"""
+        cache = ProbeCache()
+        cache.register("fast", CountingProbe(delay=0.05), ttl=60, timeout=1)
+        cache.register("medium", CountingProbe(delay=0.05), ttl=60, timeout=1)
+        cache.register("hung", CountingProbe(delay=10), ttl=60, timeout=0.1,
+                       on_error=lambda name, e: {"status": "timeout" if isinstance(e, asyncio.TimeoutError) else "x"})
+
+        start = time.perf_counter()
+        results = await cache.get_many()
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.5
+        assert results["fast"]["status"] == "ok"
+        assert results["hung"] == {"status": "timeout"}
+        assert cache.stats["timeouts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_errors_use_default_result(self):
+        """测试探针异常转换为不健康结果"""
+        async def broken():
+            raise ConnectionError("refused")
+
+        cache = ProbeCache()
+        cache.register("redis", broken)
+
+        result = await cache.get("redis")
+
+        assert result["status"] == "unhealthy" and "refused" in result["error"]
+        assert cache.stats["errors"] == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_result_served_while_refreshing(self):
+        """测试过期结果立即返回，同时在后台刷新"""
+        probe = CountingProbe(delay=0.05)
+        cache = ProbeCache()
+        cache.register("api", probe, ttl=0.05, max_stale=10)
+        await cache.get("api")
+        await asyncio.sleep(0.06)
+
+        start = time.perf_counter()
+        stale = await cache.get("api")
+        assert time.perf_counter() - start < 0.02
+        assert stale["call"] == 1 and cache.stats["stale_hits"] == 1
+
+        await asyncio.sleep(0.1)
+        result, age = cache.peek("api")
+        assert result["call"] == 2 and age < 0.1
+
+    @pytest.mark.asyncio
+    async def test_background_refresh_keeps_cache_warm(self):
+        """测试后台刷新按TTL提前更新，请求路径不触发探测"""
+        probe = CountingProbe()
+        cache = ProbeCache()
+        cache.register("disk", probe, ttl=0.1)
+
+        cache.start(tick=0.02)
+        await asyncio.sleep(0.35)
+        misses_before = cache.stats["misses"]
+        for _ in range(20):
+            await cache.get("disk")
+        await cache.stop()
+
+        assert probe.calls >= 3
+        assert cache.stats["misses"] == misses_before == 0
+        assert not cache.is_running
+
+    def test_liveness_has_no_dependencies(self):
+        """测试存活检查只返回进程状态"""
+        assert liveness()["status"] == "alive"
@@ -0,0 +1,152 @@
+"""
+Prometheus指标注册表测试
+测试各类指标的文本输出、标签基数上限、回调仪表和多进程快照合并
+"""
+
+import json
+import os
+
+import pytest
+
+from backend.monitoring.prometheus_registry import (
+    OVERFLOW_LABEL_VALUE, MetricsRegistry, benchmark_instrumentation, merge_snapshots
+)
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry(max_series_per_metric=100)
+
+
+def parse(text):
+    """解析文本输出为{样本名+标签: 值}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+class TestInstruments:
+    """指标类型测试"""
+
+    def test_counter_and_gauge_exposition(self, registry):
+        """测试计数器和仪表的文本格式与标签转义"""
+        requests = registry.counter("http_requests_total", "HTTP请求总数", ("method", "route"))
+        requests.labels("GET", "/a").inc()
+        requests.labels("GET", "/a").inc(2)
+        requests.labels(method="POST", route='/b"x').inc()
+        in_flight = registry.gauge("in_flight", "进行中的请求")
+        in_flight.inc(3)
+        in_flight.dec()
+
+        text = registry.render()
+        samples = parse(text)
+
+        assert "# TYPE http_requests_total counter" in text
+        assert samples['http_requests_total{method="GET",route="/a"}'] == 3
+        assert samples['http_requests_total{method="POST",route="/b\\"x"}'] == 1
+        assert samples["in_flight"] == 2
+        with pytest.raises(ValueError):
+            requests.labels("GET", "/a").inc(-1)
+
+    def test_histogram_cumulative_buckets(self, registry):
+        """测试直方图桶累计计数、总和与计数"""
+        latency = registry.histogram("latency_seconds", "耗时", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.labels(200).observe(value)
+
+        samples = parse(registry.render())
+
+        assert samples['latency_seconds_bucket{route="200",le="0.1"}'] == 2
+        assert samples['latency_seconds_bucket{route="200",le="1"}'] == 3
+        assert samples['latency_seconds_bucket{route="200",le="+Inf"}'] == 4
+        assert samples['latency_seconds_count{route="200"}'] == 4
+        assert samples['latency_seconds_sum{route="200"}'] == pytest.approx(3.65)
+
+    def test_cardinality_limit(self, registry):
+        """测试超出标签组合上限后归入溢出序列并计数"""
+        users = registry.counter("per_user_total", "按用户计数", ("user",), max_series=3)
+        for i in range(10):
+            users.labels(f"user-{i}").inc()
+
+        samples = parse(registry.render())
+
+        # 3个正常序列 + 1个溢出序列
+        assert len([name for name in samples if name.startswith("per_user_total{")]) == 4
+        assert samples[f'per_user_total{{user="{OVERFLOW_LABEL_VALUE}"}}'] == 7
+        assert samples['metrics_label_overflow_total{metric="per_user_total"}'] == 7
+
+    def test_registration_is_idempotent(self, registry):
+        """测试重复注册返回同一指标，类型冲突时报错"""
+        first = registry.counter("jobs_total", "任务数", ("queue",))
+        assert registry.counter("jobs_total", "任务数", ("queue",)) is first
+        with pytest.raises(ValueError):
+            registry.gauge("jobs_total", "任务数", ("queue",))
+
+    def test_callback_gauge(self, registry):
+        """测试回调仪表在抓取时求值，异常时跳过"""
+        sessions = {"a": 1, "b": 2}
+        registry.callback_gauge("active_sessions", "活跃会话", lambda: len(sessions))
+        registry.callback_gauge("pool_size", "连接池", lambda: {("primary",): 5, "replica": 2}, ("pool",))
+        registry.callback_gauge("broken", "异常", lambda: 1 / 0)
+
+        sessions["c"] = 3
+        samples = parse(registry.render())
+
+        assert samples["active_sessions"] == 3
+        assert samples['pool_size{pool="replica"}'] == 2
+        assert not any(name.startswith("broken") for name in samples)
+
+
+class TestMultiprocess:
+    """多进程合并测试"""
+
+    def test_merge_worker_snapshots(self, tmp_path):
+        """测试计数器和直方图跨worker累加、仪表按模式合并、退出进程的仪表被丢弃"""
+        worker = MetricsRegistry(multiprocess_dir=str(tmp_path))
+        worker.counter("requests_total", "请求", ("route",)).labels("/a").inc(5)
+        worker.histogram("latency_seconds", "耗时", buckets=(1.0,)).observe(0.5)
+        worker.gauge("queue_depth", "队列深度", multiprocess_mode="max").set(7)
+        worker.gauge("in_flight", "进行中").set(2)
+        snapshot = worker.snapshot()
+
+        # 模拟另一个存活的worker与一个已退出的worker
+        (tmp_path / "1.json").write_text(json.dumps(snapshot))
+        dead_pid = 2 ** 22 + 12345
+        (tmp_path / f"{dead_pid}.json").write_text(json.dumps(snapshot))
+
+        worker.counter("requests_total", "请求", ("route",)).labels("/a").inc()
+        samples = parse(worker.render())
+
+        assert samples['requests_total{route="/a"}'] == 16
+        assert samples["latency_seconds_count"] == 3
+        assert samples['latency_seconds_bucket{le="1"}'] == 3
+        assert samples["queue_depth"] == 7
+        assert samples["in_flight"] == 4
+
+    def test_liveall_gauge_keeps_pid(self):
+        """测试liveall模式按pid区分各worker的仪表"""
+        family = {"type": "gauge", "help": "内存", "labelnames": [], "mode": "liveall",
+                  "buckets": [], "samples": [[[], 100.0]]}
+        merged = merge_snapshots([(11, True, {"rss": family}), (12, True, {"rss": family})])
+
+        assert merged["rss"]["labelnames"] == ["pid"]
+        assert sorted(key for key, _ in merged["rss"]["samples"]) == [["11"], ["12"]]
+
+    def test_write_snapshot_atomic(self, tmp_path):
+        """测试快照文件以进程号命名写入"""
+        registry = MetricsRegistry(multiprocess_dir=str(tmp_path))
+        registry.counter("x_total", "x").inc()
+
+        path = registry.write_snapshot()
+
+        assert path.name == f"{os.getpid()}.json"
+        assert json.loads(path.read_text())["x_total"]["samples"] == [[[], 1.0]]
+
+    def test_benchmark(self):
+        """测试基准输出"""
+        result = benchmark_instrumentation(updates=1000, series=10)
+
+        assert result["series"] == 20 and result["update_ns"] > 0
@@ -0,0 +1,138 @@
+"""
+N+1查询检测与批量加载测试
+测试请求内重复语句检测、查询预算、QueryOptimizer汇总和BatchLoader批量加载
+"""
+
+import pytest
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine, func, select
+from sqlalchemy.orm import Session, declarative_base, relationship, selectinload
+
+from backend.optimization.batch_loader import BatchLoader, aggregate_loader, group_loader, model_loader
+from backend.optimization.query_instrumentation import (
+    QueryBudgetExceeded, install_query_instrumentation, query_budget, remove_n_plus_one_listener, track_queries
+)
+from backend.optimization.query_optimizer import QueryOptimizer
+
+Base = declarative_base()
+
+
+class Role(Base):
+    __tablename__ = "roles"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    permissions = relationship("Permission", back_populates="role")
+
+
+class Permission(Base):
+    __tablename__ = "permissions"
+    id = Column(Integer, primary_key=True)
+    role_id = Column(Integer, ForeignKey("roles.id"))
+    action = Column(String)
+    role = relationship("Role", back_populates="permissions")
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    install_query_instrumentation(engine)
+    with Session(engine) as session:
+        for role_id in range(1, 11):
+            session.add(Role(id=role_id, name=f"role-{role_id}"))
+            session.add_all(Permission(role_id=role_id, action=f"action-{i}") for i in range(role_id % 3))
+        session.commit()
+        session.expunge_all()
+        yield session
+    engine.dispose()
+
+
+class TestQueryTracking:
+    """请求内语句统计测试"""
+
+    def test_repeated_statement_shape_flagged(self, db):
+        """测试逐行查询被识别为同一语句形状"""
+        with track_queries("GET /roles") as tracker:
+            for role_id in range(1, 11):
+                db.execute(select(Role).where(Role.id == role_id)).scalar_one()
+            db.execute(select(func.count(Permission.id))).scalar()
+
+        reports = tracker.n_plus_one()
+        assert tracker.query_count == 11
+        assert len(reports) == 1 and reports[0].count == 10
+        assert reports[0].fingerprint == "SELECT ROLES . ID , ROLES . NAME FROM ROLES WHERE ROLES . ID = ?"
+
+    def test_lazy_loads_flagged_and_batched_load_is_not(self, db):
+        """测试遍历关联触发的懒加载被识别，改用预加载后不再报告"""
+        with track_queries("lazy") as lazy:
+            for role in db.execute(select(Role)).scalars().all():
+                len(role.permissions)
+        db.expunge_all()
+        with track_queries("batched") as batched:
+            loader = model_loader(db, Role.id, options=[selectinload(Role.permissions)])
+            for role in loader.load_many(range(1, 11)):
+                len(role.permissions)
+
+        assert lazy.query_count == 11 and lazy.n_plus_one()[0].count == 10
+        assert batched.query_count == 2 and batched.n_plus_one() == []
+
+    def test_query_budget(self, db):
+        """测试超出预算时失败，外层作用域同样计数"""
+        with track_queries("outer") as outer:
+            with query_budget(3):
+                db.execute(select(Role)).all()
+            with pytest.raises(QueryBudgetExceeded, match="executed 4 queries, budget is 3"):
+                with query_budget(3):
+                    for role_id in range(4):
+                        db.execute(select(Role).where(Role.id == role_id)).all()
+        assert outer.query_count == 5
+
+    def test_untracked_queries_ignored(self, db):
+        db.execute(select(Role)).all()
+        with track_queries() as tracker:
+            pass
+        assert tracker.query_count == 0
+
+    def test_optimizer_reports_patterns(self, db):
+        """测试QueryOptimizer汇总各请求的疑似N+1查询"""
+        optimizer = QueryOptimizer(db, db.get_bind())
+        optimizer.enable_n_plus_one_detection()
+        try:
+            for _ in range(2):
+                with track_queries("GET /roles", n_plus_one_threshold=3):
+                    for role_id in range(1, 5):
+                        db.execute(select(Role).where(Role.id == role_id)).all()
+        finally:
+            remove_n_plus_one_listener(optimizer.record_n_plus_one)
+
+        report = optimizer.get_performance_report()["n_plus_one"]
+        assert report["total_patterns"] == 1
+        pattern = report["top_10"][0]
+        assert pattern["scope"] == "GET /roles" and pattern["occurrences"] == 2 and pattern["max_repeat"] == 4
+        assert any("N+1" in item for item in optimizer.get_performance_report()["recommendations"])
+
+
+class TestBatchLoader:
+    """批量加载测试"""
+
+    def test_dedup_chunk_and_cache(self):
+        batches = []
+
+        def fetch(keys):
+            batches.append(list(keys))
+            return {key: key * 10 for key in keys if key != 3}
+
+        loader = BatchLoader(fetch, max_batch_size=2)
+        assert loader.load_many([1, 2, 2, 3, None]) == [10, 20, 20, None, None]
+        assert loader.load(1) == 10 and loader.load(3) is None
+        loader.prime(5, 50)
+        assert loader.load_map([4, 5]) == {4: 40, 5: 50}
+        assert batches == [[1, 2], [3], [4]]
+
+    def test_group_and_aggregate_loaders(self, db):
+        with track_queries() as tracker:
+            permissions = group_loader(db, Permission.role_id).load_map([1, 2, 3])
+            counts = aggregate_loader(db, Permission.role_id, func.count(Permission.id)).load_map([1, 2, 3])
+
+        assert [len(permissions[key]) for key in (1, 2, 3)] == [1, 2, 0]
+        assert counts == {1: 1, 2: 2, 3: 0}
+        assert tracker.query_count == 2
@@ -0,0 +1,179 @@
+"""
+区域缓存测试
+测试CIDR前缀树区域解析、管道化多级探测、对冲查询和批量访问统计
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from backend.core.region_cache import (
+    RegionCacheManager, IPRegionTrie, CacheRegion, CacheLevel, ENTRY_FORMAT_VERSION
+)
+
+
+class FakePipeline:
+    """模拟Redis管道"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append(("get", key))
+
+    def setex(self, key, ttl, value):
+        self.commands.append(("setex", key, value))
+
+    def hincrby(self, name, key, amount):
+        self.commands.append(("hincrby", name, key, amount))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        if self.redis.delay:
+            await asyncio.sleep(self.redis.delay)
+        results = []
+        for command in self.commands:
+            if command[0] == "get":
+                results.append(self.redis.data.get(command[1]))
+            elif command[0] == "setex":
+                self.redis.data[command[1]] = command[2]
+                results.append(True)
+            else:
+                hash_data = self.redis.hashes.setdefault(command[1], {})
+                hash_data[command[2]] = hash_data.get(command[2], 0) + command[3]
+                results.append(hash_data[command[2]])
+        return results
+
+
+class FakeRedis:
+    """模拟Redis连接"""
+
+    def __init__(self, delay: float = 0):
+        self.data = {}
+        self.hashes = {}
+        self.delay = delay
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """创建带模拟连接的区域缓存管理器"""
+    cache = RegionCacheManager(config_path=str(tmp_path / "cache_config.json"))
+    for region in (CacheRegion.AMERICAS, CacheRegion.EUROPE, CacheRegion.ASIA_PACIFIC):
+        cache.cache_connections[region] = FakeRedis()
+        cache.cache_stats[region] = {"hits": 0, "misses": 0, "sets": 0, "deletes": 0}
+    return cache
+
+
+class TestIPRegionTrie:
+    """CIDR前缀树测试"""
+
+    def test_longest_prefix_match(self):
+        """测试最长前缀匹配"""
+        trie = IPRegionTrie()
+        trie.insert("10.0.0.0/8", CacheRegion.AMERICAS)
+        trie.insert("10.1.0.0/16", CacheRegion.EUROPE)
+        trie.insert("2001:db8::/32", CacheRegion.ASIA_PACIFIC)
+
+        assert trie.lookup("10.2.3.4") == CacheRegion.AMERICAS
+        assert trie.lookup("10.1.3.4") == CacheRegion.EUROPE
+        assert trie.lookup("2001:db8::1") == CacheRegion.ASIA_PACIFIC
+        assert trie.lookup("11.0.0.1") is None
+        assert trie.lookup("not-an-ip") is None
+
+    @pytest.mark.asyncio
+    async def test_region_from_ip(self, manager):
+        """测试默认IP段的区域解析"""
+        assert await manager.get_region_from_ip("81.2.3.4") == CacheRegion.EUROPE
+        assert await manager.get_region_from_ip("58.1.1.1") == CacheRegion.CHINA
+        assert await manager.get_region_from_ip("8.8.8.8") == CacheRegion.AMERICAS
+        assert manager._ip_in_range("203.1.2.3", "203.0.0.0/8")
+        assert not manager._ip_in_range("204.1.2.3", "203.0.0.0/8")
+
+
+class TestRegionCacheLookup:
+    """区域缓存查找测试"""
+
+    @pytest.mark.asyncio
+    async def test_set_uses_single_encoding(self, manager):
+        """测试条目值只编码一次并通过管道写入"""
+        value = {"models": ["a", "b"]}
+        assert await manager.set("k", value, "static_assets", region=CacheRegion.EUROPE)
+
+        connection = manager.cache_connections[CacheRegion.EUROPE]
+        assert connection.round_trips == 1
+
+        entry = json.loads(connection.data["l1_edge:k"])
+        assert entry["format"] == ENTRY_FORMAT_VERSION
+        assert entry["value"] == value
+
+    @pytest.mark.asyncio
+    async def test_get_pipelines_levels(self, manager):
+        """测试单区域内所有级别一次往返探测"""
+        await manager.set("k", [1, 2], "static_assets", region=CacheRegion.EUROPE)
+        connection = manager.cache_connections[CacheRegion.EUROPE]
+        connection.data.pop("l1_edge:k")
+        connection.round_trips = 0
+
+        value = await manager.get("k", region=CacheRegion.EUROPE, cache_level=None)
+
+        assert value == [1, 2]
+        assert connection.round_trips == 1
+
+    @pytest.mark.asyncio
+    async def test_get_hedges_to_other_regions(self, manager):
+        """测试首选区域未命中时对冲查询其他区域"""
+        await manager.set("k", "v", "api_responses", region=CacheRegion.ASIA_PACIFIC)
+        manager.cache_connections[CacheRegion.AMERICAS].delay = 0.5
+
+        start = time.perf_counter()
+        value = await manager.get("k")
+
+        assert value == "v"
+        assert time.perf_counter() - start < 0.5
+
+    @pytest.mark.asyncio
+    async def test_get_prefers_nearest_region(self, manager):
+        """测试按用户IP优先查询最近区域"""
+        await manager.set("k", "eu", "api_responses", region=CacheRegion.EUROPE)
+        await manager.set("k", "us", "api_responses", region=CacheRegion.AMERICAS)
+
+        assert await manager.get("k", user_ip="81.1.1.1") == "eu"
+        assert await manager.get("k") == "us"
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_removed(self, manager):
+        """测试过期条目被删除并视为未命中"""
+        connection = manager.cache_connections[CacheRegion.EUROPE]
+        connection.data["l1_edge:old"] = manager._encode_entry(
+            "old", 1, "api", time.time() - 10, time.time() - 1, 1,
+            CacheLevel.L1_EDGE, CacheRegion.EUROPE, ""
+        )
+
+        assert await manager.get("old", region=CacheRegion.EUROPE) is None
+        assert "l1_edge:old" not in connection.data
+        assert manager.cache_stats[CacheRegion.EUROPE]["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_access_stats_flushed_in_batch(self, manager):
+        """测试访问统计在内存累积后批量刷新"""
+        await manager.set("k", 1, "api_responses", region=CacheRegion.EUROPE)
+        connection = manager.cache_connections[CacheRegion.EUROPE]
+
+        for _ in range(5):
+            await manager.get("k", region=CacheRegion.EUROPE)
+
+        assert connection.hashes == {}
+        assert manager.cache_stats[CacheRegion.EUROPE]["hits"] == 5
+
+        assert await manager.flush_access_stats() == 1
+        assert connection.hashes[manager.ACCESS_STATS_KEY]["l1_edge:k"] == 5
@@ -0,0 +1,179 @@
+"""
+从库延迟感知路由测试
+基于SQLite的本地复制模拟：主库和每个从库各用一个数据库文件，从库按设定延迟回放主库写入
+"""
+
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.optimization.read_write_split import DatabaseNode, DatabaseRole, ReadWriteSplitEngine
+
+
+class SQLiteReplicationHarness:
+    """模拟主从复制，时钟手动推进"""
+
+    def __init__(self, tmp_path, replica_delays, analytics_pool_size=None, **engine_kwargs):
+        self.tmp_path = tmp_path
+        self.delays = dict(replica_delays)
+        self.now = 1000.0
+        self.log = []  # (写入时间, value)
+        self.applied = {replica_id: 0 for replica_id in replica_delays}
+
+        master = self._node("master", DatabaseRole.MASTER)
+        replicas = [self._node(replica_id, DatabaseRole.REPLICA) for replica_id in replica_delays]
+        analytics = []
+        if analytics_pool_size is not None:
+            analytics = [self._node("analytics", DatabaseRole.ANALYTICS, pool_size=analytics_pool_size)]
+        self.rw = ReadWriteSplitEngine(master, replicas, analytics, **engine_kwargs)
+
+    def _node(self, node_id, role, pool_size=5):
+        return DatabaseNode(id=node_id, role=role, host="localhost", port=0, database=node_id,
+                            username="", password="", pool_size=pool_size, max_overflow=0)
+
+    async def setup(self):
+        for node_id in self.rw.nodes_by_id:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{self.tmp_path / node_id}.db")
+            async with engine.begin() as conn:
+                await conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)"))
+            self.rw.engines[node_id] = engine
+            self.rw.session_factories[node_id] = sessionmaker(engine, class_=AsyncSession,
+                                                              expire_on_commit=False)
+
+    async def close(self):
+        for engine in self.rw.engines.values():
+            await engine.dispose()
+
+    async def write(self, value):
+        async with self.rw.get_session("INSERT INTO items (value) VALUES (:value)") as session:
+            await session.execute(text("INSERT INTO items (value) VALUES (:value)"), {"value": value})
+            await session.commit()
+        self.log.append((self.now, value))
+
+    async def replicate(self):
+        """按延迟回放写入，并把复制延迟报告给路由引擎"""
+        for replica_id, delay in self.delays.items():
+            pending = self.log[self.applied[replica_id]:]
+            due = [value for written_at, value in pending if self.now - written_at >= delay]
+            if due:
+                async with self.rw.engines[replica_id].begin() as conn:
+                    for value in due:
+                        await conn.execute(text("INSERT INTO items (value) VALUES (:value)"), {"value": value})
+                self.applied[replica_id] += len(due)
+            behind = self.log[self.applied[replica_id]:]
+            lag = self.now - behind[0][0] if behind else 0.0
+            self.rw.update_replication_lag(replica_id, lag)
+
+    async def read_count(self):
+        async with self.rw.get_session("SELECT count(*) FROM items") as session:
+            result = await session.execute(text("SELECT count(*) FROM items"))
+            return session.bind.url.database, result.scalar()
+
+
+@pytest_asyncio.fixture
+async def harness(tmp_path):
+    harness = SQLiteReplicationHarness(tmp_path, {"fast": 0.0, "slow": 30.0}, replica_lag_slo=10.0)
+    await harness.setup()
+    yield harness
+    await harness.close()
+
+
+class TestLagAwareRouting:
+    """延迟感知路由测试"""
+
+    @pytest.mark.asyncio
+    async def test_lagging_replica_ejected_and_readmitted(self, harness):
+        """测试延迟超过SLO的从库被摘除，追上后恢复"""
+        for i in range(3):
+            await harness.write(f"v{i}")
+        harness.now += 5
+        await harness.replicate()
+        assert not harness.rw.nodes_by_id["slow"].lag_ejected
+
+        harness.now += 10
+        await harness.replicate()
+        assert harness.rw.nodes_by_id["slow"].lag_ejected
+
+        reads = [await harness.read_count() for _ in range(20)]
+        assert all(database.endswith("fast.db") and count == 3 for database, count in reads)
+
+        harness.delays["slow"] = 0.0
+        await harness.replicate()
+        assert not harness.rw.nodes_by_id["slow"].lag_ejected
+        stats = await harness.rw.get_system_stats()
+        assert stats["routing"]["lag_ejections"] == 1
+        assert stats["node_stats"]["slow"]["replication_lag"] == 0.0
+
+    @pytest.mark.asyncio
+    async def test_all_replicas_ejected_falls_back_to_master(self, harness):
+        harness.delays["fast"] = 30.0
+        await harness.write("v")
+        harness.now += 20
+        await harness.replicate()
+
+        database, count = await harness.read_count()
+
+        assert database.endswith("master.db") and count == 1
+
+    @pytest.mark.asyncio
+    async def test_dynamic_weight_prefers_healthy_replica(self, harness):
+        """测试延迟、连接饱和度和耗时共同决定权重"""
+        rw = harness.rw
+        fast, slow = rw.nodes_by_id["fast"], rw.nodes_by_id["slow"]
+        rw.update_replication_lag("slow", 8.0)
+        assert rw._dynamic_weight(slow) == pytest.approx(rw._dynamic_weight(fast) * 0.2)
+
+        rw.load_balance_stats["fast"].current_connections = 4
+        slow.latency_ewma = 1.0
+        assert rw._dynamic_weight(fast) == pytest.approx(rw._dynamic_weight(slow) * 2)
+
+        rw.load_balance_stats["fast"].current_connections = 0
+        random.seed(7)
+        picks = Counter(rw._select_node_for_read().id for _ in range(1000))
+        assert picks["fast"] > 850
+
+
+class TestAnalyticsQueue:
+    """分析库排队测试"""
+
+    @pytest.mark.asyncio
+    async def test_analytics_queries_queue_on_dedicated_node(self, tmp_path):
+        """测试分析查询只发往分析库，超出并发时排队，队列满时拒绝"""
+        harness = SQLiteReplicationHarness(tmp_path, {"replica": 0.0}, analytics_pool_size=1,
+                                           analytics_queue_limit=1, analytics_queue_timeout=1.0)
+        await harness.setup()
+        rw = harness.rw
+        query = "SELECT value, count(*) FROM items GROUP BY value"
+        release = asyncio.Event()
+        order = []
+
+        async def run(name):
+            async with rw.get_session(query) as session:
+                order.append(name)
+                assert session.bind.url.database.endswith("analytics.db")
+                await session.execute(text(query))
+                if name == "first":
+                    await release.wait()
+
+        first = asyncio.create_task(run("first"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(run("second"))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(RuntimeError, match="queue"):
+            async with rw.get_session(query):
+                pass
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+
+        stats = (await rw.get_system_stats())["analytics_queue"]
+        assert stats["queued"] == 1 and stats["rejected"] == 1 and stats["waiting"] == {"analytics": 0}
+        await harness.close()
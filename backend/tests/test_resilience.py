@@ -0,0 +1,287 @@
+"""
+上游弹性控制测试
+测试熔断器状态转换、连续错误摘除、自适应并发上限和按分组的许可获取
+"""
+
+import asyncio
+
+import pytest
+
+from backend.core.resilience import (
+    AdaptiveConcurrencyLimiter, CircuitBreaker, CircuitBreakerConfig, CircuitState, ConcurrencyLimitConfig,
+    OutlierDetectionConfig, OutlierDetector, Outcome, UpstreamGuard, UpstreamUnavailable, classify_exception
+)
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class TestCircuitBreaker:
+    """熔断器测试"""
+
+    def test_opens_and_recovers_through_half_open(self):
+        """测试连续失败打开，超时后半开限量探测，连续成功后关闭"""
+        clock = FakeClock()
+        breaker = CircuitBreaker("api", CircuitBreakerConfig(
+            consecutive_failures=3, recovery_timeout=10, half_open_max_calls=2, success_threshold=2
+        ), clock)
+
+        for _ in range(3):
+            assert breaker.allow_request()
+            breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN and not breaker.allow_request()
+
+        clock.now += 10
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow_request() and breaker.allow_request()
+        assert not breaker.allow_request()
+
+        breaker.record_success()
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_half_open_failure_reopens(self):
+        """测试半开探测失败重新打开"""
+        clock = FakeClock()
+        breaker = CircuitBreaker("api", CircuitBreakerConfig(consecutive_failures=1, recovery_timeout=5), clock)
+        breaker.record_failure()
+        clock.now += 5
+        assert breaker.allow_request()
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitState.OPEN and breaker.times_opened == 2
+
+    def test_failure_rate_threshold(self):
+        """测试窗口内失败率达到阈值时打开"""
+        breaker = CircuitBreaker("api", CircuitBreakerConfig(
+            failure_rate_threshold=0.5, minimum_calls=10, window_size=10, consecutive_failures=100
+        ))
+        for i in range(9):
+            breaker.record_failure() if i % 2 else breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitState.OPEN
+
+
+class TestOutlierDetector:
+    """异常摘除测试"""
+
+    def test_ejection_time_grows_and_percent_cap(self):
+        """测试摘除时长按次数增长，同组摘除比例受限"""
+        clock = FakeClock()
+        detector = OutlierDetector(OutlierDetectionConfig(
+            consecutive_errors=2, base_ejection_time=10, max_ejection_percent=50
+        ), clock)
+        for key in ("a", "b", "c"):
+            detector.track(key, "provider")
+
+        assert not detector.record_failure("a", "provider")
+        assert detector.record_failure("a", "provider") and detector.is_ejected("a")
+
+        # 再摘除一个会超过50%
+        detector.record_failure("b", "provider")
+        assert not detector.record_failure("b", "provider")
+
+        clock.now += 10
+        assert not detector.is_ejected("a")
+        detector.record_failure("a", "provider")
+        detector.record_failure("a", "provider")
+        assert detector.get_stats("a")["ejected_for_seconds"] == 20
+
+
+class TestAdaptiveConcurrencyLimiter:
+    """自适应并发上限测试"""
+
+    def _saturate(self, limiter, latency, rounds=50):
+        for _ in range(rounds):
+            slots = limiter.current_limit
+            for _ in range(slots):
+                assert limiter.try_acquire()
+            assert not limiter.try_acquire()
+            for _ in range(slots):
+                limiter.release(latency)
+
+    def test_limit_tracks_latency(self):
+        """测试延迟稳定时上限增长，延迟上升时收缩"""
+        limiter = AdaptiveConcurrencyLimiter(ConcurrencyLimitConfig(initial_limit=10, max_limit=100))
+        self._saturate(limiter, 0.1, rounds=20)
+        grown = limiter.current_limit
+        assert grown > 10
+
+        self._saturate(limiter, 1.0, rounds=20)
+
+        assert limiter.current_limit < grown / 2
+        assert limiter.rejected == 40
+
+    def test_timeouts_back_off(self):
+        """测试超时按比例收缩上限，不低于下限"""
+        limiter = AdaptiveConcurrencyLimiter(ConcurrencyLimitConfig(initial_limit=10, min_limit=2,
+                                                                    backoff_ratio=0.5))
+        for _ in range(10):
+            limiter.try_acquire()
+            limiter.release(dropped=True)
+
+        assert limiter.current_limit == 2 and limiter.in_flight == 0
+
+    def test_idle_traffic_does_not_grow_limit(self):
+        """测试并发远低于上限时不调整"""
+        limiter = AdaptiveConcurrencyLimiter(ConcurrencyLimitConfig(initial_limit=20))
+        for _ in range(100):
+            limiter.try_acquire()
+            limiter.release(0.05)
+
+        assert limiter.current_limit == 20
+
+
+class TestUpstreamGuard:
+    """组合许可测试"""
+
+    def test_classify_exception(self):
+        """测试异常分类"""
+        assert classify_exception(asyncio.TimeoutError()) == Outcome.TIMEOUT
+        assert classify_exception(StatusError(503)) == Outcome.ERROR
+        assert classify_exception(StatusError(429)) == Outcome.OVERLOAD
+        assert classify_exception(StatusError(400)) == Outcome.IGNORED
+        assert classify_exception(ConnectionError("reset")) == Outcome.ERROR
+
+    def test_sheds_without_queueing(self):
+        """测试达到模型或分组并发上限时立即拒绝"""
+        guard = UpstreamGuard(limit_config=ConcurrencyLimitConfig(initial_limit=2),
+                              group_limit_config=ConcurrencyLimitConfig(initial_limit=3))
+        permits = [guard.try_acquire("gpt", "openrouter") for _ in range(2)]
+        assert all(permits) and guard.try_acquire("gpt", "openrouter") is None
+
+        assert guard.try_acquire("claude", "openrouter") is not None
+        with pytest.raises(UpstreamUnavailable) as error:
+            guard.acquire("llama", "openrouter")
+        assert error.value.reason == "group_concurrency"
+
+        permits[0].release()
+        assert guard.has_capacity("gpt", "openrouter")
+
+    @pytest.mark.asyncio
+    async def test_permit_context_records_failures(self):
+        """测试许可上下文按异常类型记录结果，连续5xx后摘除"""
+        clock = FakeClock()
+        guard = UpstreamGuard(outlier_config=OutlierDetectionConfig(consecutive_errors=3), clock=clock)
+
+        with pytest.raises(StatusError):
+            async with guard.acquire("gpt"):
+                raise StatusError(404)
+        assert guard.breaker("gpt").get_stats()["consecutive_failures"] == 0
+
+        for _ in range(3):
+            with pytest.raises(StatusError):
+                async with guard.acquire("gpt"):
+                    raise StatusError(502)
+
+        assert not guard.is_routable("gpt")
+        assert guard.try_acquire("gpt") is None
+        assert guard.limiter("gpt").in_flight == 0
+        assert guard.get_stats()["upstreams"]["gpt"]["outlier"]["ejected"]
+
+
+class FakeChatService:
+    """记录调用时模型许可占用情况的假AI服务"""
+
+    def __init__(self, name, guard=None):
+        self.name = name
+        self.guard = guard
+        self.in_flight = []
+
+    async def generate_response(self, prompt, model=None, **kwargs):
+        return f"{self.name} reply"
+
+    async def stream_response(self, prompt, model=None, **kwargs):
+        for chunk in ("a", "b"):
+            self.in_flight.append(self.guard.limiter(model).in_flight)
+            yield chunk
+
+
+class FakeSessions:
+    async def create_session(self):
+        return type("Session", (), {"id": "s1"})()
+
+    async def add_message(self, **kwargs):
+        pass
+
+    async def get_conversation_context(self, session_id):
+        return []
+
+
+class FakeCostTracker:
+    async def track_usage(self, **kwargs):
+        record = type("Usage", (), {"input_tokens": 1, "output_tokens": 1, "total_tokens": 2,
+                                    "estimated_cost_usd": 0.0})()
+        record.to_dict = lambda: {}
+        return record
+
+
+class TestChatEndpointGuard:
+    """聊天接口经过模型并发/熔断保护"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        chat = pytest.importorskip("backend.api.v1.chat")
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+
+        guard = UpstreamGuard(limit_config=ConcurrencyLimitConfig(initial_limit=1))
+        services = {"openrouter": FakeChatService("openrouter", guard), "gemini": FakeChatService("gemini")}
+
+        async def get_service(name="openrouter"):
+            return services[name]
+
+        monkeypatch.setattr(chat.model_manager, "upstream_guard", guard)
+        monkeypatch.setattr(chat.ai_manager, "get_service", get_service)
+        monkeypatch.setattr(chat.ai_manager, "session_manager", FakeSessions())
+        monkeypatch.setattr(chat.ai_manager, "cost_tracker", FakeCostTracker())
+        app = FastAPI()
+        app.include_router(chat.router, prefix="/chat")
+        client = TestClient(app)
+        client.guard, client.services = guard, services
+        return client
+
+    def test_saturated_model_falls_back_then_sheds(self, client):
+        """测试请求的模型达到并发上限时转到备用模型，备用模型也满时返回503"""
+        body = {"message": "hello", "service": "openrouter", "model": "x-ai/grok-beta"}
+        held = client.guard.try_acquire("x-ai/grok-beta", "openrouter")
+
+        response = client.post("/chat/", json=body)
+        assert response.status_code == 200
+        assert response.json()["model"] == "gemini:gemini-pro"
+
+        fallback_held = client.guard.try_acquire("gemini-pro", "gemini")
+        response = client.post("/chat/", json=body)
+        assert response.status_code == 503
+        assert client.post("/chat/stream", json=body).status_code == 503
+
+        held.release()
+        fallback_held.release()
+        assert client.post("/chat/", json=body).json()["model"] == "openrouter:x-ai/grok-beta"
+
+    def test_stream_holds_permit_until_done(self, client):
+        """测试流式响应在整个流期间占用许可，结束后归还"""
+        body = {"message": "hello", "service": "openrouter", "model": "x-ai/grok-beta"}
+
+        response = client.post("/chat/stream", json=body)
+
+        assert response.status_code == 200 and '"type": "done"' in response.text
+        assert client.services["openrouter"].in_flight == [1, 1]
+        assert client.guard.limiter("x-ai/grok-beta").in_flight == 0
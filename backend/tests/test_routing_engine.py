@@ -0,0 +1,156 @@
+"""
+路由决策加速测试
+测试GeoIP网段缓存、规则编译与索引、距离表和路由决策缓存
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.core.routing_engine import (
+    DecisionCache, DistanceTable, GeoIPCache, RuleIndex, haversine_km, ip_prefix_key
+)
+
+
+def make_rule(rule_id, conditions, priority=1, enabled=True):
+    return SimpleNamespace(rule_id=rule_id, conditions=conditions, priority=priority, enabled=enabled)
+
+
+class TestGeoIPCache:
+    """GeoIP缓存测试"""
+
+    def test_prefix_keys(self):
+        """测试IPv4按/24、IPv6按/48归并，非法地址不缓存"""
+        assert ip_prefix_key("8.8.8.8") == ip_prefix_key("8.8.8.200") == "8.8.8"
+        assert ip_prefix_key("8.8.9.1") != ip_prefix_key("8.8.8.1")
+        assert ip_prefix_key("2001:db8:1::1") == ip_prefix_key("2001:0db8:0001:ffff::2")
+        assert ip_prefix_key("2001:db8:2::1") != ip_prefix_key("2001:db8:1::1")
+        assert ip_prefix_key("8.8.8.256") is None and ip_prefix_key("not-an-ip") is None
+
+    def test_lookup_once_per_prefix(self):
+        """测试同一网段只查询一次，失败结果同样缓存，容量按LRU淘汰"""
+        calls = []
+
+        def lookup(ip):
+            calls.append(ip)
+            return None if ip.startswith("10.") else {"country": "US"}
+
+        cache = GeoIPCache(lookup, max_size=2)
+        for last in range(1, 50):
+            assert cache.get(f"1.2.3.{last}") == {"country": "US"}
+            assert cache.get(f"10.0.0.{last}") is None
+
+        assert calls == ["1.2.3.1", "10.0.0.1"]
+        assert cache.get_stats()["hits"] == 96
+
+        cache.get("5.6.7.8")
+        assert len(cache) == 2
+        cache.get("1.2.3.4")
+        assert calls[-1] == "1.2.3.4"
+
+
+class TestRuleIndex:
+    """规则索引测试"""
+
+    @pytest.fixture
+    def index(self):
+        healthy = {"value": True}
+        rules = [
+            make_rule("us", [{"type": "geo_location", "operator": "in", "values": ["US", "CA"]},
+                             {"type": "health_status", "operator": "equals", "value": "healthy"}], priority=1),
+            make_rule("premium", [{"type": "performance_tier", "operator": "equals", "value": "premium"}],
+                      priority=4),
+            make_rule("free_api", [{"type": "user_tier", "operator": "equals", "value": "free"},
+                                   {"type": "path_prefix", "operator": "starts_with", "values": ["/api/v1/"]}],
+                      priority=5),
+            make_rule("partial", [{"type": "path_prefix", "operator": "starts_with", "value": "/up"}], priority=6),
+            make_rule("disabled", [], priority=0, enabled=False),
+        ]
+        index = RuleIndex(rules, lambda status: healthy["value"])
+        index.healthy = healthy
+        return index
+
+    def test_match_by_country_path_and_context(self, index):
+        """测试按国家、路径前缀和用户上下文匹配，结果按优先级排序"""
+        match = lambda **kw: [r.rule_id for r in index.match(**kw)]
+
+        assert match(geo_info={"country": "US"}, user_context={"performance_tier": "premium"}) == ["us", "premium"]
+        assert match(geo_info={"country": "DE"}, request_path="/api/v1/chat", user_context={"tier": "free"}) == \
+            ["free_api"]
+        assert match(request_path="/api/v2/chat", user_context={"tier": "free"}) == []
+        assert match(request_path="/uploads/a") == ["partial"]
+
+        index.healthy["value"] = False
+        assert match(geo_info={"country": "US"}) == []
+
+    def test_candidate_lists_are_indexed(self, index):
+        """测试候选规则按 (国家, 路径段) 预筛"""
+        assert [r.rule_id for r in index.candidates("US", "api")] == ["us", "premium", "free_api", "partial"]
+        assert [r.rule_id for r in index.candidates("DE", "health")] == ["premium", "partial"]
+
+
+class TestDistanceAndDecisions:
+    """距离表与决策缓存测试"""
+
+    def test_distance_table_matches_haversine(self):
+        """测试预计算距离与haversine公式一致"""
+        table = DistanceTable({
+            "us-east": {"lat": 37.5407, "lon": -77.6363},
+            "ap-southeast": {"lat": 1.3521, "lon": 103.8198}
+        })
+        distances = table.distances(51.5, -0.12)
+
+        assert distances["us-east"] == pytest.approx(haversine_km(51.5, -0.12, 37.5407, -77.6363))
+        assert distances["ap-southeast"] == pytest.approx(10850, rel=0.01)
+        assert table.distances(51.5, -0.12) is distances
+
+    def test_decision_cache_ttl_and_validation(self):
+        """测试决策缓存过期和命中校验"""
+        cache = DecisionCache(ttl=0.05)
+        endpoint = SimpleNamespace(healthy=True)
+        cache.set(("us",), endpoint)
+
+        assert cache.get(("us",), lambda e: e.healthy) is endpoint
+        endpoint.healthy = False
+        assert cache.get(("us",), lambda e: e.healthy) is None
+
+        endpoint.healthy = True
+        time.sleep(0.06)
+        assert cache.get(("us",)) is None
+        assert cache.get_stats()["hits"] == 1
+
+
+class TestSmartRouterDecisions:
+    """SmartRouter决策缓存测试"""
+
+    @pytest.fixture
+    def router(self, tmp_path):
+        pytest.importorskip("geoip2")
+        from backend.core.smart_routing import SmartRouter
+
+        router = SmartRouter(str(tmp_path / "smart_routing.json"))
+        router.geo_cache.lookup = lambda ip: {"country": "US", "city": "Test", "lat": 40.0, "lon": -75.0}
+        return router
+
+    @pytest.mark.asyncio
+    async def test_load_balanced_decisions_are_not_cached(self, router):
+        """测试默认混合策略每次按实时负载选择，结果不进入缓存"""
+        router.set_rules([])
+        await router.route_request(client_ip="203.0.113.7")
+        await router.route_request(client_ip="203.0.113.7")
+
+        assert router.decision_cache.get_stats()["entries"] == 0
+        assert router.decision_cache.get_stats()["hits"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cached_endpoint_requires_load_headroom(self, router):
+        """测试缓存的端点负载超过阈值后不再复用"""
+        endpoint = router.endpoints["us-east"]
+        assert await router.route_request(client_ip="203.0.113.7") == endpoint.endpoint_url
+        assert router._is_selectable(endpoint)
+
+        endpoint.current_load["connections"] = int(endpoint.capacity["max_connections"] * 0.9)
+        assert not router._is_selectable(endpoint)
+        await router.route_request(client_ip="203.0.113.7")
+        assert router.decision_cache.get_stats()["hits"] == 0
@@ -0,0 +1,186 @@
+"""
+SQL语句分类与读写路由测试
+测试词法分类、规范化指纹、事务会话固定和读己之写路由
+"""
+
+import time
+
+import pytest
+
+from backend.optimization.read_write_split import (
+    DatabaseNode, DatabaseRole, LoadBalanceStrategy, QueryType, ReadWriteSplitEngine, consistency_scope, parse_lsn
+)
+from backend.optimization.sql_classifier import SQLClassifier, StatementKind, analyze
+
+
+class TestClassification:
+    """语句分类测试"""
+
+    @pytest.mark.parametrize("sql, kind", [
+        ("SELECT * FROM users WHERE id = 1", StatementKind.READ),
+        ("  -- DELETE FROM users\n SELECT 'DELETE me' FROM t", StatementKind.READ),
+        ("SELECT updated_at, \"insert\" FROM t WHERE name LIKE 'UPDATE%'", StatementKind.READ),
+        ("WITH recent AS (SELECT * FROM t) SELECT * FROM recent", StatementKind.READ),
+        ("/* hint */ UPDATE users SET name = 'x'", StatementKind.WRITE),
+        ("WITH moved AS (DELETE FROM a RETURNING *) SELECT * FROM moved", StatementKind.WRITE),
+        ("SELECT * FROM jobs FOR UPDATE SKIP LOCKED", StatementKind.WRITE),
+        ("SELECT nextval('seq')", StatementKind.WRITE),
+        ("SELECT * INTO backup FROM users", StatementKind.WRITE),
+        ("VACUUM users", StatementKind.WRITE),
+        ("SELECT org_id, count(*) FROM usage GROUP BY org_id", StatementKind.ANALYTICS),
+        ("SELECT rank() OVER (ORDER BY cost) FROM usage", StatementKind.ANALYTICS),
+        ("BEGIN", StatementKind.TRANSACTION),
+        ("SELECT 1; UPDATE t SET a = 1", StatementKind.WRITE),
+    ])
+    def test_kinds(self, sql, kind):
+        assert analyze(sql).kind == kind
+
+    def test_transaction_actions(self):
+        """测试事务开始、结束和不影响事务状态的语句"""
+        assert analyze("START TRANSACTION ISOLATION LEVEL SERIALIZABLE").transaction == "begin"
+        assert analyze("commit;").transaction == "end"
+        assert analyze("ROLLBACK TO SAVEPOINT s1").transaction is None
+        assert analyze("COMMIT PREPARED 'tx'").transaction is None
+        assert analyze("BEGIN; UPDATE t SET a = 1; COMMIT").transaction == "end"
+
+    def test_fingerprint_normalizes_literals(self):
+        """测试字面量、参数和IN列表归一化"""
+        a = analyze("select * from t where id in (1, 2, 3) and name = 'a' -- x")
+        b = analyze("SELECT *  FROM t WHERE id IN ($1, $2) AND name = $$b$$")
+        assert a.fingerprint == b.fingerprint == "SELECT * FROM T WHERE ID IN (?) AND NAME = ?"
+
+    def test_cache_stats(self):
+        classifier = SQLClassifier(max_size=2)
+        for _ in range(3):
+            classifier.classify("SELECT 1")
+        classifier.classify("SELECT 2")
+        stats = classifier.get_stats()
+        assert stats["hits"] == 2 and stats["misses"] == 2 and stats["entries"] == 2
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeSession:
+    """记录执行语句的会话替身"""
+
+    def __init__(self, node_id, master_lsn):
+        self.node_id = node_id
+        self.master_lsn = master_lsn
+        self.closed = False
+        self.rolled_back = False
+
+    async def execute(self, statement):
+        return FakeResult(self.master_lsn["value"])
+
+    async def rollback(self):
+        self.rolled_back = True
+
+    async def close(self):
+        self.closed = True
+
+
+def make_node(node_id, role):
+    return DatabaseNode(id=node_id, role=role, host="localhost", port=5432, database="app",
+                        username="app", password="")
+
+
+@pytest.fixture
+def engine():
+    master = make_node("master", DatabaseRole.MASTER)
+    replica = make_node("replica", DatabaseRole.REPLICA)
+    engine = ReadWriteSplitEngine(master, [replica], load_balance_strategy=LoadBalanceStrategy.ROUND_ROBIN)
+    engine.master_lsn = {"value": "0/3000060"}
+    engine.opened = []
+    for node in (master, replica):
+        def factory(node_id=node.id):
+            session = FakeSession(node_id, engine.master_lsn)
+            engine.opened.append(session)
+            return session
+        engine.session_factories[node.id] = factory
+    return engine
+
+
+class TestConsistentRouting:
+    """一致性路由测试"""
+
+    @pytest.mark.asyncio
+    async def test_reads_go_to_replica_without_session(self, engine):
+        async with engine.get_session("INSERT INTO t VALUES (1)") as session:
+            assert session.node_id == "master"
+        async with engine.get_session("SELECT * FROM t") as session:
+            assert session.node_id == "replica"
+        assert engine._classify_query("SELECT 1 FOR SHARE") == QueryType.WRITE
+
+    @pytest.mark.asyncio
+    async def test_read_your_writes_until_replica_catches_up(self, engine):
+        """测试写入后读主库，从库回放到写入位置后恢复读从库"""
+        replica = engine.replica_nodes[0]
+        replica.replay_lsn = parse_lsn("0/3000000")
+        replica.replay_lsn_checked_at = time.time()
+
+        with consistency_scope("user-1"):
+            async with engine.get_session("UPDATE t SET a = 1"):
+                pass
+            async with engine.get_session("SELECT a FROM t") as session:
+                assert session.node_id == "master"
+
+            # 其他会话不受影响
+            async with engine.get_session("SELECT a FROM t", session_key="user-2") as session:
+                assert session.node_id == "replica"
+
+            replica.replay_lsn = parse_lsn("0/3000060")
+            async with engine.get_session("SELECT a FROM t") as session:
+                assert session.node_id == "replica"
+
+        routing = (await engine.get_system_stats())["routing"]
+        assert routing["master_reads_consistency"] == 1 and routing["tracked_writes"] == 1
+
+    @pytest.mark.asyncio
+    async def test_lag_estimate_without_lsn(self, engine):
+        """测试无法获取LSN时按复制延迟估计"""
+        engine.lsn_tracking = False
+        replica = engine.replica_nodes[0]
+        replica.replication_lag = 0.0
+        engine.lag_safety_margin = 0.05
+
+        async with engine.get_session("DELETE FROM t", session_key="s"):
+            pass
+        async with engine.get_session("SELECT 1", session_key="s") as session:
+            assert session.node_id == "master"
+        time.sleep(0.06)
+        async with engine.get_session("SELECT 1", session_key="s") as session:
+            assert session.node_id == "replica"
+
+    @pytest.mark.asyncio
+    async def test_transaction_pins_master_session(self, engine):
+        """测试BEGIN到COMMIT之间复用同一个主库会话"""
+        async with engine.get_session("BEGIN", session_key="tx") as begin_session:
+            pass
+        async with engine.get_session("SELECT * FROM t", session_key="tx") as session:
+            assert session is begin_session
+        async with engine.get_session("UPDATE t SET a = 2", session_key="tx") as session:
+            assert session is begin_session and not session.closed
+        async with engine.get_session("COMMIT", session_key="tx") as session:
+            assert session is begin_session
+
+        assert begin_session.closed and len(engine.opened) == 1
+        assert engine.load_balance_stats["master"].current_connections == 0
+        assert engine._routing_sessions["tx"].write_lsn == parse_lsn("0/3000060")
+
+    @pytest.mark.asyncio
+    async def test_failed_pinned_statement_rolls_back(self, engine):
+        async with engine.get_session("BEGIN", session_key="tx") as begin_session:
+            pass
+        with pytest.raises(RuntimeError):
+            async with engine.get_session("UPDATE t SET a = 1", session_key="tx"):
+                raise RuntimeError("constraint violation")
+
+        assert begin_session.rolled_back and begin_session.closed
+        async with engine.get_session("SELECT 1", session_key="tx") as session:
+            assert session is not begin_session
@@ -0,0 +1,199 @@
+"""
+时序存储测试
+测试Gorilla编码往返、压缩率、按时间索引读取、自动汇总、分层保留期和分辨率选择
+"""
+
+import json
+import math
+import random
+import threading
+
+import pytest
+
+from backend.core.analytics import tsdb
+from backend.core.analytics.tsdb import (
+    TierConfig, TimeSeriesStore, decode_block, encode_block, merge_rollup_rows
+)
+
+BASE = 1_700_000_000  # 与各分区边界对齐无关的固定起点
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TimeSeriesStore(tmp_path / "tsdb")
+
+
+class TestEncoding:
+    """数据块编码测试"""
+
+    def test_roundtrip_with_jitter_and_special_values(self):
+        """测试时间戳抖动、乱序和特殊浮点值无损往返"""
+        rng = random.Random(7)
+        timestamps = [BASE * 1000 + i * 10000 + rng.randint(-300, 300) for i in range(300)]
+        timestamps[10:12] = [timestamps[11], timestamps[10]]
+        values = [rng.random() * 100 for _ in range(300)]
+        values[:6] = [0.0, -0.0, float("inf"), -1.5e300, 5e-324, 42.0]
+
+        decoded_ts, (decoded,) = decode_block(encode_block(timestamps, [values]))
+
+        assert decoded_ts == timestamps
+        assert [math.copysign(1, v) for v in decoded[:2]] == [1, -1]
+        assert decoded == values
+
+    def test_regular_series_compresses(self):
+        """测试等间隔、缓变序列的压缩率"""
+        timestamps = [BASE * 1000 + i * 15000 for i in range(1000)]
+        values = [float(100 + (i // 50)) for i in range(1000)]
+
+        block = encode_block(timestamps, [values])
+
+        # 原始为每点16字节
+        assert len(block) < 1000 * 16 / 20
+
+
+class TestStore:
+    """存储读写测试"""
+
+    def test_query_reads_only_matching_blocks(self, store):
+        """测试范围查询通过时间索引只解码相交的数据块"""
+        for i in range(5000):
+            store.append("cpu", BASE + i * 10, 50 + math.sin(i / 50), {"host": "a"})
+        store.flush()
+
+        series, = store.query("cpu", BASE + 10000, BASE + 10100)
+
+        assert series.labels == {"host": "a"}
+        assert series.timestamps == [(BASE + 10000 + i * 10) * 1000 for i in range(11)]
+        assert store.stats["blocks_read"] == 1
+
+    def test_head_and_disk_merge_and_label_filter(self, store):
+        """测试写盘前后的数据一并返回，并按标签过滤"""
+        for i in range(10):
+            store.append("req", BASE + i, i, {"route": "/a" if i % 2 else "/b"})
+            if i == 4:
+                store.flush()
+
+        assert len(store.query("req", BASE, BASE + 100)) == 2
+        only_a, = store.query("req", BASE, BASE + 100, labels={"route": "/a"})
+        assert only_a.values == [1.0, 3.0, 5.0, 7.0, 9.0]
+
+    def test_rollups_merge_partial_buckets(self, store):
+        """测试汇总层在多次写盘拆分同一桶时读取合并"""
+        start = BASE - BASE % 3600
+        for i in range(120):
+            store.append("latency", start + i * 30, float(i))
+            if i == 50:
+                store.flush()
+        store.flush()
+
+        minute, = store.query("latency", start, start + 3600, "1m")
+        hour, = store.query("latency", start, start + 3600, "1h")
+
+        assert len(minute.timestamps) == 60
+        assert minute.columns[0][0] == 2 and minute.columns[1][0] == 1.0
+        assert hour.columns[0] == [120]
+        assert hour.columns[1] == [sum(range(120))]
+        assert (hour.columns[2], hour.columns[3], hour.columns[4]) == ([0.0], [119.0], [119.0])
+
+    def test_regroup_rollups(self):
+        """测试1m汇总重新分桶为5m"""
+        timestamps = [i * 60000 for i in range(10)]
+        columns = [[1.0] * 10, [float(i) for i in range(10)], [float(i) for i in range(10)],
+                   [float(i) for i in range(10)], [float(i) for i in range(10)]]
+
+        merged_ts, merged = merge_rollup_rows(timestamps, columns, step_ms=300000)
+
+        assert merged_ts == [0, 300000]
+        assert merged[0] == [5.0, 5.0]
+        assert merged[1] == [10.0, 35.0]
+        assert merged[4] == [4.0, 9.0]
+
+    def test_registry_persists(self, tmp_path):
+        """测试序列注册表和数据在重新打开后可读"""
+        store = TimeSeriesStore(tmp_path / "tsdb")
+        store.append("disk", BASE, 1.0, {"mount": "/"})
+        store.flush()
+
+        reopened = TimeSeriesStore(tmp_path / "tsdb")
+        series, = reopened.query("disk", BASE - 1, BASE + 1)
+        assert series.values == [1.0]
+
+
+    def test_series_registered_during_flush_is_kept(self, tmp_path, monkeypatch):
+        """测试写盘期间注册的序列不会因清除脏标记而丢失，下一次flush写入"""
+        store = TimeSeriesStore(tmp_path / "tsdb")
+        store.append("cpu", BASE, 1.0, {"host": "a"})
+        original = json.dump
+
+        def dump_while_registering(obj, f):
+            # 模拟事件循环在线程池写盘期间注册新序列
+            store.series_id("cpu", {"host": "b"})
+            monkeypatch.setattr(tsdb.json, "dump", original)
+            original(obj, f)
+
+        monkeypatch.setattr(tsdb.json, "dump", dump_while_registering)
+        store.flush()
+        assert len(json.loads(store.series_path.read_text())) == 1
+
+        store.flush()
+        assert len(json.loads(store.series_path.read_text())) == 2
+
+    def test_concurrent_registration_and_flush(self, tmp_path):
+        """测试线程池flush与序列注册并发时不出错"""
+        store = TimeSeriesStore(tmp_path / "tsdb")
+        errors = []
+        done = threading.Event()
+
+        def flusher():
+            while not done.is_set():
+                try:
+                    store.flush()
+                except Exception as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=flusher)
+        thread.start()
+        try:
+            for i in range(3000):
+                store.series_id("requests", {"path": f"/p/{i}"})
+        finally:
+            done.set()
+            thread.join()
+        store.flush()
+
+        assert errors == []
+        assert len(json.loads(store.series_path.read_text())) == 3000
+
+
+class TestRetention:
+    """保留期与分辨率测试"""
+
+    def test_per_tier_retention(self, tmp_path):
+        """测试原始层过期分区被删除而汇总层保留"""
+        tiers = {
+            "raw": TierConfig(0, 3600, 7200),
+            "1m": TierConfig(60, 86400, 30 * 86400),
+        }
+        store = TimeSeriesStore(tmp_path / "tsdb", tiers=tiers)
+        start = BASE - BASE % 86400
+        for i in range(48):
+            store.append("qps", start + i * 3600, float(i))
+        store.flush()
+
+        dropped = store.enforce_retention(now=start + 48 * 3600)
+
+        assert dropped == 46
+        assert len(store.query("qps", start, start + 48 * 3600)[0].timestamps) == 2
+        assert len(store.query("qps", start, start + 48 * 3600, "1m")[0].timestamps) == 48
+
+    def test_choose_tier(self, store):
+        """测试按范围和点数上限选择分辨率"""
+        now = BASE
+        assert store.choose_tier(now - 3600, now, 1000, now=now) == "raw"
+        # 原始点间隔10秒时12小时超过点数上限
+        assert store.choose_tier(now - 12 * 3600, now, 1000, raw_interval=10, now=now) == "1m"
+        assert store.choose_tier(now - 86400, now, 1000, now=now) == "1h"
+        assert store.choose_tier(now - 7 * 86400, now, 1000, now=now) == "1h"
+        # 超出1m层保留期时即使点数足够也使用更粗的层
+        assert store.choose_tier(now - 30 * 86400, now - 29 * 86400, 2000, now=now) == "1h"
+        assert store.choose_tier(now - 365 * 86400, now, 1000, now=now) == "1d"